@@ -0,0 +1,237 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmark suite for bpca on synthetic data
+
+Runs bpca end to end on synthetic datasets (bpca.utils.create_synthetic_data)
+over a grid of number of stations, time series length, number of PCs and
+missing-data fraction, and records runtime (compile, sampling), ESS/s, peak
+memory and the recovery error of trends and EOFs with respect to the known
+truth and the analytical least-squares uncertainties.
+
+Results are written as json, so that runs can be compared over time:
+
+    $ python benchmarks/bench_bpca.py --stations 100 500 --time 26 52 --pcs 1 2 --output bench.json
+    $ python benchmarks/bench_bpca.py --compare bench_old.json bench.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import bpca as bpca_package
+from bpca.bpca import bpca
+from bpca.model_settings import set_settings
+from bpca.utils import create_synthetic_data, create_synthetic_cube, compute_analytical_uncertainties
+
+
+def benchmark_settings(number_of_pcs,cluster_index,n_samples=500,tune=500,cores=2):
+    """
+    settings used in the tutorial, with a reduced number of samples
+    """
+    settings = set_settings()
+    settings['model_settings']['number_of_pcs']=number_of_pcs
+    settings['model_settings']['trend_factor_sigma']=0.001
+    settings['model_settings']['trend_distr']='normal'
+    settings['model_settings']['sigma_random_walk']=0.001
+    settings['model_settings']['sigma']=0.4
+    settings['model_settings']['sigma_random_walk_factor']=0.04
+    settings['model_settings']['sigma_eofs']=1.15
+    settings['model_settings']['cluster_index'] = cluster_index
+    settings['model_settings']['estimate_cluster_sigma']=True
+    settings['model_settings']['estimate_sigma_eof']=True
+    settings['model_settings']['estimate_point_variance']=True
+    settings['run_settings']['n_samples'] = n_samples
+    settings['run_settings']['sample_settings']['tune'] = tune
+    settings['run_settings']['sample_settings']['cores'] = cores
+    settings['run_settings']['sample_settings']['progressbar'] = False
+    settings['run_settings']['compress'] = True
+    settings['run_settings']['check_convergence'] = False
+    settings['run_settings']['adjust_pca_symmetry'] = cores > 1
+    return settings
+
+
+def recovery_errors(bpca_object,data_set_synt,chain=0):
+    """recovery errors of trends and EOFs
+
+    Trends are compared with the true (perturbed) trends and normalized by
+    the combined analytical and estimated uncertainty (should be ~N(0,1)).
+    EOFs are matched to the true pattern by their absolute correlation and
+    compared after a least-squares scaling (EOFs are only defined up to scale),
+    normalized by the combined uncertainty of every PC (eofs_un).
+    """
+    errors = {}
+    mean_ = bpca_object.trace['mean'].posterior
+    std_ = bpca_object.trace['std'].posterior
+
+    # bpca trends are per time step, convert to mm/year
+    steps_per_year = 1./np.median(np.diff(data_set_synt['time_series'].values))
+    trend_fit = mean_['trend_g'][chain,:].values*1000.*steps_per_year
+    trend_std = std_['trend_g'][chain,:].values*1000.*steps_per_year
+    trend_diff = data_set_synt['trend_with_noise'].values - trend_fit
+    combined_error = np.sqrt(data_set_synt['trend_un'].values**2 + trend_std**2)
+    errors['trend_rmse'] = float(np.sqrt(np.mean(trend_diff**2)))
+    errors['trend_sig_ratio_std'] = float(np.std(trend_diff/combined_error))
+    errors['trend_std_ratio'] = float(np.median(trend_std)/np.median(data_set_synt['trend_un'].values))
+
+    number_of_pcs = bpca_object.model_settings['number_of_pcs']
+    fitted = np.asarray([mean_['W'+str(i)][chain,:].values for i in range(number_of_pcs)])
+    for k,true_eof in enumerate(data_set_synt['eofs_with_noise'].values):
+        correlations = [abs(np.corrcoef(true_eof,fitted_eof)[0,1]) for fitted_eof in fitted]
+        best = fitted[int(np.argmax(correlations))]
+        scale = np.dot(best,true_eof)/np.dot(best,best)
+        errors['eof'+str(k)+'_correlation'] = float(np.max(correlations))
+        errors['eof'+str(k)+'_rmse'] = float(np.sqrt(np.mean((true_eof-scale*best)**2)))
+        combined_error_eof = np.sqrt(data_set_synt['eofs_un'].values[k]**2 +
+                                     (std_['W'+str(int(np.argmax(correlations)))][chain,:].values*scale)**2)
+        errors['eof'+str(k)+'_sig_ratio_std'] = float(np.std((true_eof-scale*best)/combined_error_eof))
+    return errors
+
+
+def run_benchmark(number_gnss,time_series_length,number_of_pcs,missing_fraction,
+                  sattg_fraction=0.06,n_samples=500,tune=500,cores=2,random_seed=100,
+                  generator='tutorial',freq='Y'):
+    """
+    run one benchmark case, returns a json serializable record
+    
+    generator: 'tutorial' (create_synthetic_data) or 'cube' (create_synthetic_cube, 
+    any time frequency freq)
+    """
+    number_sattg = max(int(number_gnss*sattg_fraction),1)
+    parameters = {'number_gnss':number_gnss,'number_sattg':number_sattg,'time_series_length':time_series_length,
+                  'number_of_pcs':number_of_pcs,'missing_fraction':missing_fraction,
+                  'n_samples':n_samples,'tune':tune,'cores':cores,'random_seed':random_seed}
+    if generator != 'tutorial':
+        parameters.update({'generator':generator,'freq':freq})
+    print('run benchmark: '+str(parameters))
+
+    start = time.perf_counter()
+    if generator == 'tutorial':
+        data_set_synt,_ = create_synthetic_data(number_gnss=number_gnss,number_sattg=number_sattg,
+                                                time_series_length=time_series_length,number_of_pcs=number_of_pcs,
+                                                missing_fraction=missing_fraction,random_seed=random_seed)
+    else:
+        data_set_synt,_ = create_synthetic_cube(number_gnss=number_gnss,number_sattg=number_sattg,
+                                                time_series_length=time_series_length,freq=freq,
+                                                number_of_pcs=number_of_pcs,missing_fraction=missing_fraction,
+                                                random_seed=random_seed)
+    data_set_synt = compute_analytical_uncertainties(data_set_synt)
+    data_time = time.perf_counter()-start
+
+    settings = benchmark_settings(number_of_pcs,data_set_synt['ID'].values,n_samples=n_samples,tune=tune,cores=cores)
+    bpca_object = bpca(data_set_synt['data_with_noise']/1000.,run_settings=settings['run_settings'],
+                       model_settings=settings['model_settings'],name='benchmark')
+    bpca_object.run()
+
+    report = bpca_object.run_report.to_dict()
+    phases = report['phases']
+    record = {'parameters':parameters,
+              'data_generation_time':data_time,
+              'observed_fraction':float(data_set_synt['data_with_noise'].notnull().mean()),
+              'model_build_time':phases['model_build']['wall_time'],
+              'compile_time':phases['compile']['wall_time'],
+              'sampling_time':phases['sampling']['wall_time'],
+              'sampling_cpu_time':phases['sampling']['cpu_time'],
+              'peak_rss':max(entry['peak_rss'] or 0. for entry in phases.values()),
+              'peak_rss_children':max(entry['peak_rss_children'] or 0. for entry in phases.values()),
+              'ess_per_second':report['sampler'].get('ess_per_second',{}),
+              'divergences':report['sampler'].get('divergences',None),
+              'gradient_evaluations':report['sampler'].get('gradient_evaluations',None),
+              'recovery':recovery_errors(bpca_object,data_set_synt),
+              'run_report':report}
+    return record
+
+
+def environment():
+    """
+    information on the benchmark environment
+    """
+    try:
+        commit = subprocess.run(['git','rev-parse','HEAD'],capture_output=True,text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'date':datetime.datetime.now().isoformat(),'bpca_version':bpca_package.__version__,'git_commit':commit,
+            'python':sys.version,'platform':platform.platform(),'processor':platform.processor(),
+            'numpy':np.__version__}
+
+
+def compare(old_file,new_file,keys=['compile_time','sampling_time','peak_rss']):
+    """
+    print relative changes of matching benchmark cases of two result files
+    """
+    with open(old_file) as file_:
+        old = json.load(file_)
+    with open(new_file) as file_:
+        new = json.load(file_)
+    old_results = {json.dumps(result['parameters'],sort_keys=True): result for result in old['results']}
+    for result in new['results']:
+        case = json.dumps(result['parameters'],sort_keys=True)
+        if case not in old_results:
+            continue
+        print(case)
+        for key in keys:
+            change = (result[key]-old_results[case][key])/old_results[case][key]*100.
+            print('  {:<16} {:12.2f} -> {:12.2f} ({:+.1f} %)'.format(key,old_results[case][key],result[key],change))
+        for key,value in result['recovery'].items():
+            print('  {:<22} {:10.4f} -> {:10.4f}'.format(key,old_results[case]['recovery'].get(key,np.nan),value))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='bpca benchmark suite on synthetic data')
+    parser.add_argument('--stations',type=int,nargs='+',default=[100,500],help='number of GNSS stations')
+    parser.add_argument('--time',type=int,nargs='+',default=[26],help='time series lengths')
+    parser.add_argument('--pcs',type=int,nargs='+',default=[1],help='number of PCs')
+    parser.add_argument('--missing',type=float,nargs='+',default=[0.1],help='missing-data fractions')
+    parser.add_argument('--sattg-fraction',type=float,default=0.06,help='number of SATTG stations per GNSS station')
+    parser.add_argument('--samples',type=int,default=500)
+    parser.add_argument('--tune',type=int,default=500)
+    parser.add_argument('--cores',type=int,default=2)
+    parser.add_argument('--seed',type=int,default=100)
+    parser.add_argument('--generator',choices=['tutorial','cube'],default='tutorial',
+                        help='synthetic data generator: create_synthetic_data or create_synthetic_cube')
+    parser.add_argument('--freq',default='Y',help='time frequency of the cube generator, e.g. D')
+    parser.add_argument('--output',default='bench_output.json')
+    parser.add_argument('--compare',nargs=2,metavar=('OLD','NEW'),help='compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {'environment':environment(),'results':[]}
+    for number_gnss,time_series_length,number_of_pcs,missing_fraction in itertools.product(args.stations,args.time,
+                                                                                         args.pcs,args.missing):
+        results['results'].append(run_benchmark(number_gnss,time_series_length,number_of_pcs,missing_fraction,
+                                                sattg_fraction=args.sattg_fraction,n_samples=args.samples,
+                                                tune=args.tune,cores=args.cores,random_seed=args.seed,
+                                                generator=args.generator,freq=args.freq))
+        # write after every case, long benchmark runs keep partial results
+        with open(args.output,'w') as output_file:
+            json.dump(results,output_file,indent=2)
+    print('benchmark results written to '+args.output)
+
+
+if __name__ == '__main__':
+    main()
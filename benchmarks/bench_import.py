@@ -0,0 +1,136 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Import-time benchmark of the bpca modules
+
+Every module is imported in a fresh interpreter (repeated, the median is
+reported), together with the heavy libraries (Theano, PyMC3, ArviZ,
+matplotlib) it loads. Only bpca.models should load Theano and PyMC3.
+Saved bpca objects (bpca.save) are loaded with bpca.load in the same way,
+loading should not load any heavy library:
+
+    $ python benchmarks/bench_import.py --output bench_import.json
+    $ python benchmarks/bench_import.py --load results/model.bpca --output bench_import.json
+    $ python benchmarks/bench_import.py --compare bench_import_old.json bench_import.json
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+from bench_bpca import environment
+
+
+MODULES = ['bpca.bpca','bpca.utils','bpca.bpca_plots','bpca.pipeline','bpca.observed',
+           'bpca.changepoints','bpca.normalization','bpca.cache','bpca.report','bpca.models']
+
+HEAVY_MODULES = ['theano','pymc3','arviz','matplotlib.pyplot','scipy.stats']
+
+# runs in the fresh interpreter
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+import_time = time.perf_counter()-start
+print(json.dumps({{'import_time':import_time,'loaded':[name for name in {heavy} if name in sys.modules]}}))
+"""
+
+# bpca.load of a saved object (file without the .bpca extension) in the fresh interpreter
+LOAD_SCRIPT = """
+import json, sys, time
+from bpca.bpca import bpca
+start = time.perf_counter()
+bpca.load({file!r})
+import_time = time.perf_counter()-start
+print(json.dumps({{'import_time':import_time,'loaded':[name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def import_time(module,repeat=5,script=None):
+    """
+    import time [s] of module in fresh interpreters (median of repeat) and the heavy modules it loads
+    """
+    if script is None:
+        script = IMPORT_SCRIPT.format(module=module,heavy=repr(HEAVY_MODULES))
+    times = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable,'-c',script],capture_output=True,text=True)
+        if process.returncode != 0:
+            return {'module':module,'error':process.stderr.strip().split('\n')[-1]}
+        result = json.loads(process.stdout.strip().split('\n')[-1])
+        times.append(result['import_time'])
+    return {'module':module,'import_time':float(np.median(times)),'import_time_min':float(np.min(times)),
+            'loaded':result['loaded']}
+
+
+def load_time(file,repeat=5):
+    """
+    time [s] of bpca.load of a saved object (.bpca file) and the heavy modules it loads
+    """
+    name = file[:-len('.bpca')] if file.endswith('.bpca') else file
+    script = LOAD_SCRIPT.format(file=name,heavy=repr(HEAVY_MODULES))
+    return import_time('bpca.load '+name,repeat=repeat,script=script)
+
+
+def compare(old_file,new_file):
+    """
+    print relative changes of the import times of two result files
+    """
+    with open(old_file) as file_:
+        old = {result['module']: result for result in json.load(file_)['results']}
+    with open(new_file) as file_:
+        new = json.load(file_)['results']
+    for result in new:
+        if result['module'] not in old or 'import_time' not in result or 'import_time' not in old[result['module']]:
+            continue
+        old_time = old[result['module']]['import_time']
+        change = (result['import_time']-old_time)/old_time*100.
+        print('  {:<22} {:8.3f} s -> {:8.3f} s ({:+.1f} %)'.format(result['module'],old_time,result['import_time'],change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='bpca import-time benchmark')
+    parser.add_argument('--modules',nargs='+',default=MODULES)
+    parser.add_argument('--load',nargs='+',default=[],metavar='FILE',help='saved bpca objects (.bpca) to load')
+    parser.add_argument('--repeat',type=int,default=5)
+    parser.add_argument('--output',default='bench_import.json')
+    parser.add_argument('--compare',nargs=2,metavar=('OLD','NEW'),help='compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {'environment':environment(),'results':[]}
+    for result in ([import_time(module,repeat=args.repeat) for module in args.modules]+
+                   [load_time(file,repeat=args.repeat) for file in args.load]):
+        results['results'].append(result)
+        if 'error' in result:
+            print('  {:<22} failed: {}'.format(result['module'],result['error']))
+        else:
+            print('  {:<22} {:8.3f} s  loads: {}'.format(result['module'],result['import_time'],', '.join(result['loaded']) or '-'))
+    with open(args.output,'w') as output_file:
+        json.dump(results,output_file,indent=2)
+    print('benchmark results written to '+args.output)
+
+
+if __name__ == '__main__':
+    main()
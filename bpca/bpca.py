@@ -21,180 +21,227 @@
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-from theano.tensor import *
-from theano import tensor
-from arviz import *
-import arviz as az
+# Theano, PyMC3 and ArviZ are imported on first use (model build, sampling and
+# trace statistics), reading data and loading saved results does not load them
 import pickle
 import xarray as xr
-import pymc3 as pm
 import pandas as pd
 import numpy as np
 import copy
+import inspect
+import time
+import os
+import glob
+import functools
+import concurrent.futures
+import hashlib
+import threading
+from bpca.report import run_report, sampler_statistics, draws_wall_time
+from bpca.normalization import normalizer
+from bpca.cache import result_cache
+from bpca import resources
 
-class bpca_model(pm.model.Model):
-    """ PyMC model for Bayesian Principal Component analysis.
+# defaults of the run settings used by bpca.run(), if not given
+RUN_DEFAULTS = {'adaptive_sampling':False,'adaptation_state':None,'adjust_pca_symmetry':False,
+                'check_convergence':False,'export_adaptation_state':True,'compress':False,
+                'prune_components':True,'component_threshold':0.05,'adaptation_settings':{}}
+
+class sparse_observations():
+    """Observations of a time*space field as compact index/value arrays.
+    
+    Only the observed entries are stored (COO layout), which keeps memory 
+    and the likelihood of bpca_model proportional to the number of 
+    observations instead of the full time*space cube.
     
     Parameters
     ----------
-    observed: xarray.DataArray of time*space dimensions
-    
-    name: str, default: True,
-        model name
-    
-    model_trend :  bool, default: False
-        estimate trend or not        
+    time_index: np.array() of int,
+        time index of every observation
         
-    number_of_pcs: int,
-        number of modelled pcs
-    
-    sigma: float,
-        variance prior 
+    space_index: np.array() of int,
+        station index of every observation
+        
+    values: np.array(),
+        observed values
+        
+    time: array of datetimes,
+        time axis
+        
+    coords: None or dict, default: None,
+        station coordinates {name: np.array() of size space_dim}, e.g. lon, lat, ID
+        
+    name: str, default: 'data',
+        name of the variable
+        
+    space_dim: int, default: None,
+        number of stations, default: size of the coordinates or max(space_index)+1
         
-    sigma_offset: float,
-        offset-variance prior 
+    errors: None or np.array(), default: None,
+        formal errors (standard deviations) of the observations, combined 
+        with the estimated sigma in the likelihood of bpca_model
+    """
+    
+    def __init__(self,time_index,space_index,values,time,coords=None,name='data',space_dim=None,errors=None):
+        self.time_index = np.asarray(time_index,dtype=np.int64)
+        self.space_index = np.asarray(space_index,dtype=np.int64)
+        self.values = np.asarray(values,dtype=float)
+        self.errors = None if errors is None else np.asarray(errors,dtype=float)
+        self.coords = {} if coords is None else {key: np.asarray(value) for key,value in coords.items()}
+        self.name = name
+        if space_dim is None:
+            space_dim = len(next(iter(self.coords.values()))) if len(self.coords) > 0 else int(self.space_index.max())+1
+        time = np.asarray(time)
+        self.time = xr.DataArray(time,dims='time',coords={'time':time},name='time')
+        self.shape = (len(self.time),space_dim)
+        self.dims = ('time','x')
+        if not (len(self.time_index) == len(self.space_index) == len(self.values)):
+            raise Exception('time_index, space_index and values must have the same length!')
+        if self.errors is not None and (len(self.errors) != len(self.values) or 
+                                        not np.all(np.isfinite(self.errors) & (self.errors >= 0))):
+            raise Exception('errors must be finite, non-negative and of the same length as values!')
+        if len(self.values) > 0 and (self.time_index.min() < 0 or self.time_index.max() >= self.shape[0] or 
+                                     self.space_index.min() < 0 or self.space_index.max() >= self.shape[1]):
+            raise Exception('indices exceed the time*space dimensions!')
         
-    sigma_random_walk: float,
-        random walk innovations prior 
+    @classmethod
+    def from_dataframe(cls,table,time='time',station='station',value='value',locations=None,name=None,freq=None,
+                       error=None):
+        """observations from a long-format table
         
-    sigma_random_walk_factor: float,
-        factor by which sigma_random_walk is divided for subsequent PCs;
-        sets some prior contraints, such thus the first EOFs capture most of the variance.
-        e.g. if sigma_random_walk_factor is 2 and sigma_random_walk is 2,
-        then sigma_random_walk(PC1) = 2; sigma_random_walk(PC2) = 1; sigma_random_walk(PC3) = 0.5 ...
+        Parameters
+        ----------
+        table: pd.DataFrame,
+            one row per observation, repeated (station, time) pairs are averaged
             
-    sigma_eofs: float,
-        EOF variance prior 
+        time, station, value: str,
+            column names
             
-    trend_factor_sigma: float,
-        trend-variance prior 
-        
-    trend_factor_nu: float,
-        trend-shape prior parameter for Student's T distribution
-    
-    trend_distr: str,
-        'student_t' or 'normal'
-    
-    estimate_point_variance :  bool, default: False,
-        estimate variance (sigma) at every point
-        
-    estimate_cluster_sigma :  bool, default: False,
-        estimate variance (sigma) for different clusters      
-    
-    trend_pattern :  None or np.array() of size space_dim, default: None,
-        prior of trend pattern, initialize trends
-    
-    initialize_trend_pattern :  bool, default: False,
-        enable trend initialization
-    
-    estimate_offsets :  bool, default: True,    
-        estimate constant offsets (at every location),        
-        
-    estimate_cluster_sigma :  bool, default: False,    
-        estimate variance for different cluster (in space)
-        
-    estimate_sigma_eof : bool, default: True,
-        estimate hierarchical sigma for eof pattern
-        
-    cluster_index :  None or np.array(), default: None,    
-        array of cluster indices (0,1,2,...) indicating the clusters for which sigma should be computed
-        
-    """
-                                
-    def __init__(self, 
-                 observed=None,
-                 name='',
-                 model_trend=True,
-                 number_of_pcs = 3 ,
-                 sigma=0.4, 
-                 sigma_offset =0.2, 
-                 sigma_random_walk=0.1,
-                 sigma_random_walk_factor=2,
-                 sigma_eofs=0.2,
-                 trend_factor_sigma=0.001, 
-                 trend_factor_nu=2.1303,
-                 trend_distr='student_t',
-                 estimate_point_variance=False,
-                 estimate_cluster_sigma=False,
-                 trend_pattern=None,
-                 initialize_trend_pattern=False,
-                 estimate_offsets=False,
-                 estimate_sigma_eof=True,
-                 cluster_index=None,
-                 **kwargs):
-
-        super().__init__(name)
-
-        Y = pd.DataFrame(observed.values[:,:]) # time vs space
-        time_dim,space_dim=Y.shape
-
-        with pm.Model() as model:
-            if estimate_offsets:
-                offset = pm.Normal("offset", 0,sigma=sigma_offset,shape = space_dim)                                
-            else:
-                offset = np.empty(space_dim)*0
-            sigma_eofs = [sigma_eofs]*number_of_pcs
-            if estimate_sigma_eof:
-                sigma_eofs  = pm.HalfNormal('sigma_eof',sigma=np.asarray(sigma_eofs),shape = number_of_pcs)                
-            if estimate_point_variance:
-                if estimate_cluster_sigma:
-                    number_of_cluster= len(np.unique(cluster_index))
-                    print('estimate different sigma for different clusters')
-                    sigma_hier = pm.HalfNormal('sigma_hier',sigma=sigma,shape = number_of_cluster)
-                    coeff_mat = np.zeros([len(cluster_index),number_of_cluster])
-                    for i in range(number_of_cluster):
-                        coeff_mat[:,i] = (cluster_index==i)*1
-                    sigma = pm.Deterministic("sigma", det_dot(sigma_hier, coeff_mat).flatten())
-                    
-                else:
-                    sigma=pm.HalfNormal('sigma',sigma=sigma,shape = space_dim)
-            else:                
-                sigma=pm.HalfNormal('sigma',sigma=sigma)
-            PCS_EOFs_mult= 0 
-            for i in range(number_of_pcs):
-                    
-                PCS_EOFs_mult=pm.math.matrix_dot(pm.GaussianRandomWalk("PC"+str(i), mu=0,sd=sigma_random_walk, shape=time_dim)[:,np.newaxis],
-                                                        pm.Normal("W"+str(i), 0,sigma=sigma_eofs[i],shape = space_dim)[np.newaxis,:])+ PCS_EOFs_mult
-                    
-                sigma_random_walk=sigma_random_walk/sigma_random_walk_factor    
-                         
-            if model_trend:
-                
-                mu_trend=0                 
-                if initialize_trend_pattern:
-                    mu_trend=trend_pattern
-                    
-                if trend_distr=='student_t':
-                    trend_pattern = pm.StudentT("trend_g", mu=mu_trend,sigma=trend_factor_sigma,nu=trend_factor_nu,shape = space_dim)
-                else:
-                    trend_pattern = pm.Normal("trend_g", mu_trend,sigma=trend_factor_sigma,shape = space_dim)                    
-                shift=-6 # so time series is centered to 2014
-                trend_series = np.linspace(-time_dim/2 + shift,time_dim-1-time_dim/2 + shift,time_dim)
-                trend = pm.math.matrix_dot(trend_series[:,np.newaxis],trend_pattern[np.newaxis,:])
-                
-                PCS_EOFs_mult=PCS_EOFs_mult + trend
+        locations: None or pd.DataFrame, default: None,
+            indexed by station with coordinate columns (e.g. 'lon', 'lat')
             
-            mu = pm.Deterministic("Estimates",   PCS_EOFs_mult + 
-                                          offset[np.newaxis,:])
-
-            Y_obs = pm.Normal('Observations', mu=mu, sigma=sigma, observed=Y)    
+        name: str, default: None,
+            variable name, default: value
             
+        freq: None or str, default: None,
+            frequency of a regular time axis between the first and last epoch 
+            (epochs are assigned to the bins of pd.Series.resample), 
+            default: the observed epochs
             
-          
+        error: None or str, default: None,
+            column of the formal errors of the observations, errors of 
+            averaged observations are combined (error of the mean)
+        """
+        columns = [time,station,value] if error is None else [time,station,value,error]
+        table = table[columns].dropna(subset=[value])
+        if freq is not None:
+            labels = bin_labels(table[time],freq)
+            time_axis = pd.date_range(start=labels.min(),end=labels.max(),freq=freq)
+            table = table.assign(**{time: time_axis.get_indexer(labels)})
+        if error is None:
+            table = table.groupby([station,time],sort=False)[value].mean().reset_index()
+            errors = None
+        else:
+            table = (table.assign(**{error: table[error]**2}).groupby([station,time],sort=False)
+                     .agg(**{value: (value,'mean'),error: (error,'sum'),'count': (value,'size')}).reset_index())
+            errors = np.sqrt(table[error].values)/table['count'].values
+        if freq is not None:
+            time_index = table[time].values
+        else:
+            time_index,time_axis = pd.factorize(table[time],sort=True)
+        space_index,stations = pd.factorize(table[station],sort=True)
+        coords = {'ID':np.asarray(stations)}
+        if locations is not None:
+            locations = locations.reindex(stations)
+            for column in locations.columns:
+                coords[column] = locations[column].values
+        return cls(time_index,space_index,table[value].values,np.asarray(time_axis),coords=coords,
+                   name=value if name is None else name,errors=errors)
+    
+    @classmethod
+    def from_coo(cls,matrix,time,coords=None,name='data'):
+        """observations from a sparse time*space matrix (scipy.sparse, stored entries are observations)
+        """
+        matrix = matrix.tocoo()
+        return cls(matrix.row,matrix.col,matrix.data,time,coords=coords,name=name,space_dim=matrix.shape[1])
+    
+    @classmethod
+    def from_dataarray(cls,dataset,chunk_size=None,errors=None):
+        """finite entries of a time*space DataArray, lazy DataArrays are read block by block (see iterate_blocks)
+        
+        errors: None or xarray.DataArray, default: None,
+            formal errors of dataset (same dimensions)
+        """
+        time_index,space_index,values,error_values = [],[],[],[]
+        for block,block_values in iterate_blocks(dataset,chunk_size=chunk_size):
+            block_time_index,block_space_index = np.nonzero(np.isfinite(block_values))
+            time_index.append(block_time_index+block.start)
+            space_index.append(block_space_index)
+            values.append(block_values[block_time_index,block_space_index])
+            if errors is not None:
+                error_values.append(np.asarray(errors[block].values,dtype=float)[block_time_index,block_space_index])
+        coords = {key: dataset[dataset.dims[1]][key].values for key in dataset[dataset.dims[1]].coords
+                  if key != dataset.dims[1] and dataset[key].dims == (dataset.dims[1],)}
+        return cls(np.concatenate(time_index),np.concatenate(space_index),np.concatenate(values),
+                   dataset.time.values,coords=coords,name=dataset.name,space_dim=dataset.shape[1],
+                   errors=None if errors is None else np.concatenate(error_values))
+    
+    def observation_counts(self):
+        """
+        number of observations per station
+        """
+        return np.bincount(self.space_index,minlength=self.shape[1])
+    
+    def to_dataarray(self,values=None,name=None):
+        """time*space DataArray with NaNs at unobserved entries
+        
+        values: None or np.array(), default: None,
+            values at the observations (e.g. estimates), default: the observations
+        """
+        cube = np.full(self.shape,np.nan)
+        cube[self.time_index,self.space_index] = self.values if values is None else values
+        coords = {key: ('x',value) for key,value in self.coords.items()}
+        coords['time'] = self.time.values
+        return xr.DataArray(cube,dims=self.dims,coords=coords,name=self.name if name is None else name)
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def __repr__(self):
+        return ('sparse_observations '+str(self.name)+': '+str(len(self))+' observations, '+
+                str(self.shape[0])+' epochs x '+str(self.shape[1])+' stations')
             
 class bpca():
     """Bayesian Principal Component analysis.
     
     Parameters
     ----------
-    dataset: xarray.DataArray of time*space dimensions
+    dataset: xarray.DataArray of time*space dimensions, sparse_observations or pd.DataFrame,
+        a DataFrame is read as long-format table with columns 'time', 'station' 
+        and 'value' (see sparse_observations.from_dataframe); sparse inputs are 
+        kept as index/value arrays and only densified by recombine_datasets(); 
+        formal errors of the observations (sparse_observations.errors, column 
+        'error' of a DataFrame) are combined with the estimated sigma
     
     run_settings: Run settings, i.e. input arguments for pm.sample()
     
     model_settings: Dictionary of model settings
     
+    normalization_settings: Dictionary of normalization settings (see normalization.normalizer),
+        the model is fitted to the normalized dataset, reconstructions and 
+        trends (get_trends) are converted back to physical units
+    
     name: str model name, used to save the model
     
+    Results are cached when run_settings['cache_dir'] is set: run() returns 
+    the stored compressed result of the same observations and settings 
+    (see cache.result_cache), run_settings['cache_size'] is the disk budget 
+    of the cache in MB.
+    
+    Sampling splits the available cores (CPU affinity and cgroup limit) 
+    between parallel chains and BLAS/OpenMP threads per chain, see 
+    resources.configure() and run_settings['resource_settings']; the layout 
+    is stored in run_report.info['resources'].
+    
     """
     
     
@@ -207,15 +254,22 @@ class bpca():
                  name='bpca_model'
                 ):
         
-        self.dataset=self._normalize_data(dataset)      
+        from bpca.models import bpca_model
+        self.normalization_settings = normalization_settings        
+        self.normalizer = normalizer(**normalization_settings)
+        self.dataset=self._normalize_data(self._observations(dataset))
+        self.observation_stats=None
         self.estimated_dataset=None
         self.estimated_dataset_map=None  
         self.estimated_dataset_map_pattern = []         
         self.run_settings = run_settings
         self.model_settings = model_settings
-        self.normalization_settings = normalization_settings        
         self.name = name
-        self.model = bpca_model(observed =  self.dataset,**self.model_settings)
+        self.run_report = run_report()
+        with self.run_report.phase('validation'):
+            self._validate()
+        with self.run_report.phase('model_build'):
+            self.model = bpca_model(observed =  self.dataset,**self.model_settings)
 
         self.trace = None
         self.random = None
@@ -224,17 +278,108 @@ class bpca():
         self.convergence_stats = {}
         self.random=[]   
         self.initial_values={}
+        self.adaptation_state=None
+        self.adaptive_sampling_stats={}
+        self.resource_layout=None
         #self.=_normalize_data(dataset)
 
 
-    def _normalize_data(self,dataset):
+    @property
+    def model(self):
         """
-        normalize and adjust the dataset
-        
+        bpca_model of the dataset, rebuilt on first use after loading a saved object
         """
-        
+        if self._model is None:
+            from bpca.models import bpca_model
+            self._model = bpca_model(observed=self.dataset,**self.model_settings)
+        return self._model
+    
+    @model.setter
+    def model(self,model):
+        self._model = model
+    
+    @property
+    def trace(self):
+        """
+        InferenceData of the samples (dict of 'mean' and 'std' InferenceData if compressed)
+        """
+        if self._trace_groups is not None:
+            self._trace = inference_data(self._trace_groups)
+            self._trace_groups = None
+        return self._trace
+    
+    @trace.setter
+    def trace(self,trace):
+        self._trace = trace
+        self._trace_groups = None
+    
+    def __getstate__(self):
+        """
+        pickled without the model and with the trace as plain xarray.Datasets, 
+        so that loading does not import Theano, PyMC3 and ArviZ
+        """
+        state = self.__dict__.copy()
+        state['_model'] = None
+        if state.get('_trace_groups',None) is None:
+            state['_trace_groups'] = trace_groups(state.get('_trace',None))
+            if state['_trace_groups'] is not None:
+                state['_trace'] = None
+        return state
+    
+    def __setstate__(self,state):
+        # objects saved before the model and trace were stored separately
+        for name in ['model','trace']:
+            if name in state:
+                state['_'+name] = state.pop(name)
+        state.setdefault('_trace_groups',None)
+        self.__dict__.update(state)
+    
+    @property
+    def sparse(self):
+        """
+        dataset is stored as sparse_observations
+        """
+        return isinstance(self.dataset,sparse_observations)
+    
+    def _observations(self,dataset):
+        """
+        convert long-format tables to sparse_observations
+        """
+        if isinstance(dataset,pd.DataFrame):
+            dataset = sparse_observations.from_dataframe(dataset,error='error' if 'error' in dataset else None)
         return dataset
     
+    def _validate(self):
+        """
+        compute observation statistics (block by block for lazy data) and check the dataset
+        """
+        if len(self.dataset.shape) != 2:
+            raise Exception('dataset must have time*space dimensions!')
+        self.observation_stats = observation_statistics(self.dataset,
+                                                        chunk_size=self.model_settings.get('chunk_size',None))
+        if self.observation_stats['count'].sum() == 0:
+            raise Exception('dataset does not contain any observations!')
+        empty = np.sum(self.observation_stats['count'] == 0)
+        if empty > 0:
+            print(str(empty)+' stations without observations')
+    
+    def _dense_dataset(self):
+        """
+        dataset as time*space DataArray (densifies sparse observations)
+        """
+        if self.sparse:
+            return self.dataset.to_dataarray()
+        return self.dataset
+
+    def _normalize_data(self,dataset,fit=True):
+        """
+        normalize and adjust the dataset, fit=False applies the stored statistics
+        
+        """
+        if fit:
+            return self.normalizer.fit_transform(dataset)
+        return self.normalizer.transform(dataset)
+    
     def get_pca_correlation_sorting_indices(self,data_comb):
         """
         get indices to sort PCs and scale their variances
@@ -249,7 +394,7 @@ class bpca():
         # always use chain 0 as reference
         variable = 'PC'
         for i in np.arange(self.model_settings['number_of_pcs']):
-            for j in np.arange(self.run_settings['sample_settings']['cores']):
+            for j in np.arange(len(self.trace.posterior.chain)):
                 corr_sub = corr_[variable+str(i)+'c0']
                 corr_sub2 = corr_sub[np.asarray(['c'+str(j) in val for val in corr_sub.index])]  
                 var_index = int(corr_sub2[abs(corr_sub2)==np.max(abs(corr_sub2))].index[0][2:3])
@@ -269,7 +414,7 @@ class bpca():
         name=[]
         data_ =[]
         for i in np.arange(self.model_settings['number_of_pcs']):
-            for j in np.arange(self.run_settings['sample_settings']['cores']):
+            for j in np.arange(len(self.trace.posterior.chain)):
                 data_.append(series_w[variable+str(i)][j].values)
                 name.append(variable+str(i)+'c'+str(j))
         data_comb = pd.DataFrame(data_,index=name).T
@@ -282,34 +427,37 @@ class bpca():
         data_comb = self.get_pca_correlation()
         var_indices,chain_indices,signs = self.get_pca_correlation_sorting_indices(data_comb)
 
-        vars_ = ['PC','W']
+        vars_ = [variable for variable in COMPONENT_SERIES if variable+'0' in self.trace.posterior]
         relevant_data = copy.deepcopy(self.trace.posterior[[variable+str(i) for i in np.arange(self.model_settings['number_of_pcs']) for variable in vars_]])
-        if 'sigma_eof' in self.trace.posterior:
-            relevant_data['sigma_eof'] = copy.deepcopy(self.trace.posterior['sigma_eof'])
+        # per-component variables, sorted with the components
+        component_vars = [variable for variable in COMPONENT_VARIABLES if variable in self.trace.posterior]
+        for variable in component_vars:
+            relevant_data[variable] = copy.deepcopy(self.trace.posterior[variable])
         
         # normalize pattern and pcs
         for i in np.arange(self.model_settings['number_of_pcs']):
-            for j in np.arange(self.run_settings['sample_settings']['cores']):
+            for j in np.arange(len(self.trace.posterior.chain)):
                 std_ = float(relevant_data['W'+str(i)][j].mean(dim='draw').std())
                 relevant_data['W'+str(i)][j] = relevant_data['W'+str(i)][j]/std_
                 relevant_data['PC'+str(i)][j] = relevant_data['PC'+str(i)][j]*std_
+                if 'W_raw'+str(i) in relevant_data:
+                    relevant_data['W_raw'+str(i)][j] = relevant_data['W_raw'+str(i)][j]/std_
                 if 'sigma_eof' in self.trace.posterior:
                     relevant_data['sigma_eof'][j,:,i] = relevant_data['sigma_eof'][j,:,i]/std_
         # update trace
         for variable in vars_:
             ii = 0
             for i in np.arange(self.model_settings['number_of_pcs']):
-                for j in np.arange(self.run_settings['sample_settings']['cores']):
+                for j in np.arange(len(self.trace.posterior.chain)):
                     self.trace.posterior[variable+str(i)][j] =signs[ii]*relevant_data[variable+str(var_indices[ii])][chain_indices[ii]].values
                     print('replaced variable '+variable+str(i)+' (chain '+str(j)+' ) with variable '+variable+str(var_indices[ii])+' (chain '+str(chain_indices[ii])+')')
                     ii=ii+1 
                     
-        if 'sigma_eof' in self.trace.posterior:
+        for variable in component_vars:
             ii = 0
-            variable = 'sigma_eof'
             for i in np.arange(self.model_settings['number_of_pcs']):
-                for j in np.arange(self.run_settings['sample_settings']['cores']):
-                    self.trace.posterior['sigma_eof'][j,:,i] =relevant_data['sigma_eof'][chain_indices[ii],:,var_indices[ii]].values
+                for j in np.arange(len(self.trace.posterior.chain)):
+                    self.trace.posterior[variable][j,:,i] =relevant_data[variable][chain_indices[ii],:,var_indices[ii]].values
                     print('replaced variable '+variable+str(i)+' (chain '+str(j)+' ) with variable '+variable+str(var_indices[ii])+' (chain '+str(chain_indices[ii])+')')
                     ii=ii+1             
         
@@ -317,6 +465,7 @@ class bpca():
         """
         
         """
+        import pymc3 as pm
         all_={}
 
         for i in range(len(self.trace.posterior.chain)):
@@ -325,6 +474,7 @@ class bpca():
         self.chain_stats=pm.compare(all_)   
         
     def check_convergence(self,check_main_components=True):
+        import arviz as az
         data_ = []
         summary_out = az.summary(self.trace)
         for var in list(self.trace.posterior.keys()):
@@ -334,7 +484,7 @@ class bpca():
         self.convergence_stats = summary_out_combined 
         if check_main_components:
             convergence_stats = summary_out_combined.loc[['r_hat','ess_mean']]
-            convergence_stats.loc['ess_mean']=summary_out_combined.loc['ess_mean']/self.run_settings['n_samples']
+            convergence_stats.loc['ess_mean']=summary_out_combined.loc['ess_mean']/len(self.trace.posterior.draw)
             self.convergence_stats = convergence_stats[['PC0','W0','trend_g','sigma']] 
         
     def recombine_datasets(self,chain=0,kind='mean',draw=4,with_offset=False):
@@ -357,8 +507,11 @@ class bpca():
 
         data = 0
         data_std = 0
-        dataset=copy.deepcopy(self.dataset)
-        dataset_std=copy.deepcopy(self.dataset).rename(dataset.name+'_std') 
+        observed = self._dense_dataset()
+        # template with the coordinates only, lazy observed data are not loaded
+        dataset=xr.DataArray(np.full(observed.shape,np.nan),dims=observed.dims,coords=observed.coords,
+                             name=observed.name,attrs=observed.attrs)
+        dataset_std=copy.deepcopy(dataset).rename(dataset.name+'_std') 
         chain_z = chain
         if kind == 'mean':
             mean_trace = self.trace['mean'].posterior
@@ -375,8 +528,8 @@ class bpca():
             mean_trace_rand = self.trace['mean'].posterior
             std_trace_rand = self.trace['std'].posterior       
 
-            time_ = self.dataset.time
-            dataset = xr.concat([mean_trace['W0']]*len(time_),dim='time').rename(self.dataset.name)*np.nan
+            time_ = observed.time
+            dataset = xr.concat([mean_trace['W0']]*len(time_),dim='time').rename(observed.name)*np.nan
             dataset_std = xr.concat([mean_trace['W0']]*len(time_),dim='time').rename(dataset.name+'_std')*np.nan
             dataset['time']=time_
             chain_z =...
@@ -436,6 +589,10 @@ class bpca():
         dataset[:,:]=data
         #dataset_std[:,:]=np.sqrt(data_std+std_trace['offset'][chain,:].values**2)
         dataset_std[:,:]=data_std
+        if kind != 'maps':
+            # back to physical units
+            dataset = self.normalizer.inverse_transform(dataset)
+            dataset_std = self.normalizer.inverse_transform(dataset_std,std=True)
 
         if kind == 'maps':
             if self.model_settings['model_trend']:
@@ -459,13 +616,298 @@ class bpca():
         """
         
         """
-        if self.estimated_dataset == None:
+        if self.sparse:
+            # computed at the observations, without densifying
+            estimates = self.recombine_observations()
+            observed = self.observed_dataset()
+            counts = self.dataset.observation_counts()
+            def station_var(values):
+                mean_ = np.bincount(self.dataset.space_index,weights=values,minlength=len(counts))/counts
+                return np.bincount(self.dataset.space_index,weights=(values-mean_[self.dataset.space_index])**2,
+                                   minlength=len(counts))/counts
+            with np.errstate(invalid='ignore',divide='ignore'):
+                explained = 1-station_var(observed-estimates)/station_var(observed)
+            return xr.DataArray(explained,dims='x',coords={key: ('x',value) for key,value in self.dataset.coords.items()})
+        
+        if self.estimated_dataset is None:
             self.recombine_datasets()
             
-        return 1-((self.estimated_dataset[self.dataset.name]-self.dataset).var(dim='time')/self.dataset.var(dim='time'))
+        observed = self.observed_dataset()
+        return 1-((self.estimated_dataset[self.dataset.name]-observed).var(dim='time')/observed.var(dim='time'))
+    
+    def recombine_observations(self,chain=0):
+        """reconstruction (posterior mean) at the observed entries of a sparse dataset
+        
+        Unlike recombine_datasets(), the time*space cube is not densified.
+        
+        Returns
+        -------
+        np.array() of the estimates, ordered as self.dataset.values
+        """
+        if not self.sparse:
+            raise Exception('recombine_observations() requires sparse observations, use recombine_datasets()!')
+        if not self.compressed:
+            raise Exception('recombine_observations() requires a compressed trace, run compress() first!')
+        mean_trace = self.trace['mean'].posterior
+        time_index,space_index = self.dataset.time_index,self.dataset.space_index
+        estimates = np.zeros(len(self.dataset))
+        for i in range(self.model_settings['number_of_pcs']):
+            estimates += (mean_trace['PC'+str(i)][chain,:].values[time_index]*
+                          mean_trace['W'+str(i)][chain,:].values[space_index])
+        if self.model_settings['model_trend']:
+            time_dim = self.dataset.shape[0]
+            shift=-6
+            trend_series = np.linspace(-time_dim/2 + shift,time_dim-1-time_dim/2 + shift,time_dim)
+            estimates += trend_series[time_index]*mean_trace['trend_g'][chain,:].values[space_index]
+        if 'offset' in mean_trace:
+            estimates += mean_trace['offset'][chain,:].values[space_index]
+        return self.normalizer.inverse_transform(estimates,time_index,space_index)
+    
+    def observed_dataset(self):
+        """
+        observations in physical units (after outlier rejection), np.array() of 
+        the observations for sparse datasets, otherwise a time*space DataArray
+        """
+        if self.sparse:
+            return self.normalizer.inverse_transform(self.dataset.values,self.dataset.time_index,
+                                                     self.dataset.space_index)
+        return self.normalizer.inverse_transform(self.dataset)
+    
+    def get_trends(self,chain=0):
+        """trends (per time step) and their uncertainties in physical units
+        
+        Returns
+        -------
+        xarray.Dataset with 'trend' and 'trend_std' of every station
+        """
+        if not self.compressed:
+            raise Exception('get_trends() requires a compressed trace, run compress() first!')
+        trend = self.trace['mean'].posterior['trend_g'][chain,:]
+        trend_std = self.trace['std'].posterior['trend_g'][chain,:]
+        trends = xr.merge([trend.copy(data=self.normalizer.inverse_trend(trend.values)).rename('trend'),
+                           trend_std.copy(data=self.normalizer.inverse_trend(trend_std.values,std=True)).rename('trend_std')])
+        trends.attrs = {'chain':chain}
+        return trends
+        
+        
+    
+    def _model_setting(self,name):
+        """
+        model setting, falls back to the bpca_model default
+        """
+        if name in self.model_settings:
+            return self.model_settings[name]
+        from bpca.models import bpca_model
+        return inspect.signature(bpca_model.__init__).parameters[name].default
+    
+    def component_relevance(self,threshold=0.05):
+        """amplitudes of the components and the effective number of PCs
+        
+        The amplitude of a component is the standard deviation of its 
+        (posterior mean) PC times the root mean square of its EOF. Components 
+        with an amplitude below threshold times the largest amplitude in all 
+        chains are inactive, e.g. switched off by the ARD prior (model_settings['ARD']).
+        
+        Returns
+        -------
+        dict with 'amplitude' and 'relative_amplitude' (chain*component), 'active' 
+        (component), 'effective_number_of_pcs' and 'relevance' (chain*component, 
+        posterior mean of ard_relevance, if estimated)
+        """
+        number_of_pcs = self._model_setting('number_of_pcs')
+        variables = ['PC'+str(i) for i in range(number_of_pcs)]+['W'+str(i) for i in range(number_of_pcs)]
+        if self.compressed:
+            mean_trace = self.trace['mean'].posterior
+        else:
+            mean_trace = self.trace.posterior[variables+[var for var in ['ard_relevance'] 
+                                                         if var in self.trace.posterior]].mean(dim='draw')
+        amplitude = np.stack([mean_trace['PC'+str(i)].std(dim=mean_trace['PC'+str(i)].dims[-1]).values*
+                              np.sqrt((mean_trace['W'+str(i)]**2).mean(dim=mean_trace['W'+str(i)].dims[-1]).values)
+                              for i in range(number_of_pcs)],axis=-1)
+        relative = amplitude/np.max(amplitude,axis=-1,keepdims=True)
+        active = np.any(relative >= threshold,axis=0)
+        components = {'amplitude':amplitude,'relative_amplitude':relative,'active':active,
+                      'effective_number_of_pcs':int(active.sum())}
+        if 'ard_relevance' in mean_trace:
+            components['relevance'] = mean_trace['ard_relevance'].values
+        return components
+    
+    def prune_components(self,threshold=0.05):
+        """remove inactive components (see component_relevance) from the trace
         
+        The remaining components are renumbered (PC0, W0, PC1, ...) in their 
+        order and model_settings['number_of_pcs'] is set to their number, so 
+        that all methods (and update()) work on the pruned trace and 
+        adaptation state.
         
+        Returns
+        -------
+        component_relevance() before pruning
+        """
+        components = self.component_relevance(threshold)
+        number_of_pcs = self._model_setting('number_of_pcs')
+        active = np.flatnonzero(components['active'])
+        print('effective number of PCs: '+str(len(active))+' of '+str(number_of_pcs))
+        if len(active) == number_of_pcs:
+            return components
+        if self.compressed:
+            for op in self.trace:
+                self.trace[op].posterior = prune_posterior(self.trace[op].posterior,active,number_of_pcs)
+            if isinstance(self.random,dict):
+                self.random = {op: prune_posterior(values,active,number_of_pcs) for op,values in self.random.items()}
+        else:
+            self.trace.posterior = prune_posterior(self.trace.posterior,active,number_of_pcs)
+        if getattr(self,'adaptation_state',None) is not None:
+            self.adaptation_state = prune_adaptation_state(self.adaptation_state,active,number_of_pcs)
+        self.model_settings = dict(self.model_settings)
+        self.model_settings['number_of_pcs'] = len(active)
+        print('pruned '+str(number_of_pcs-len(active))+' components')
+        return components
     
+    def project_stations(self,new_data,chain=0,sigma=None,cluster_index=None,errors=None):
+        """project new stations onto the fitted PCs
+        
+        Estimates EOF loadings W, trends (trend_g) and offsets of new stations 
+        without refitting the network. The compressed PCs are treated as known, 
+        so that every station is a small conjugate (Gaussian) regression, which 
+        is solved for all stations at once. Missing data are masked. The new 
+        stations are normalized like the fitted dataset (normalizer.fit_stations: 
+        station statistics of the new stations, group statistics of the fitted 
+        ones) and the results are converted back to physical units.
+        
+        Parameters
+        ----------
+        new_data: xarray.DataArray of time*space dimensions or sparse_observations,
+            new stations on the time axis of the fitted dataset, in physical units, 
+            formal errors of sparse_observations are used as errors
+            
+        chain: int,
+            chain of the compressed trace to use
+            
+        sigma: None, float or np.array() of size space_dim of new_data, default: None,
+            noise standard deviation (normalized units), by default the posterior 
+            mean sigma (or sigma_hier of the given clusters) is used
+            
+        cluster_index: None or np.array(), default: None,
+            cluster indices of the new stations, used with estimate_cluster_sigma 
+            and as group_index of 'group' normalization statistics
+            
+        errors: None or xarray.DataArray, default: None,
+            formal errors of new_data (same dimensions, physical units), combined 
+            with sigma as in the model, sqrt(sigma**2 + errors**2)
+            
+        Returns
+        -------
+        dict of xarray.Datasets: 'mean', 'std', layout as in trace['mean'].posterior, 
+        in physical units: W per unit PC, trend_g per time step (as get_trends), offset
+        
+        Note
+        ----
+        Uncertainties of the PCs are not propagated and trend priors are 
+        approximated by normal distributions.
+        """
+        if not self.compressed:
+            raise Exception('project_stations() requires a compressed trace, run compress() first!')
+        mean_trace = self.trace['mean'].posterior.sel(chain=chain)
+        time_dim = len(self.dataset.time)
+        if isinstance(new_data,sparse_observations):
+            if not np.array_equal(new_data.time.values,self.dataset.time.values):
+                raise Exception('new_data must be on the time axis of the fitted dataset!')
+            if errors is not None:
+                raise Exception('formal errors of sparse new_data are given by sparse_observations.errors!')
+            coords_data = new_data.to_dataarray()
+        else:
+            new_data = new_data.reindex({'time':self.dataset.time.values})
+            coords_data = new_data
+            if errors is not None:
+                # errors are normalized with the observations
+                new_data = sparse_observations.from_dataarray(new_data,errors=errors.reindex({'time':self.dataset.time.values}))
+        space_name = coords_data.dims[1]
+        coords = {key: coords_data[space_name][key] for key in coords_data[space_name].coords}
+        station_normalizer = self.normalizer.fit_stations(new_data,cluster_index)
+        new_data = station_normalizer.transform(new_data)
+        errors = None
+        if isinstance(new_data,sparse_observations):
+            if new_data.errors is not None:
+                errors = new_data.to_dataarray(values=new_data.errors).values
+            new_data = new_data.to_dataarray()
+        
+        # design matrix (time x parameters) and prior stddevs
+        columns = []
+        prior_std = []
+        names = []
+        for i in range(self._model_setting('number_of_pcs')):
+            columns.append(mean_trace['PC'+str(i)].values)
+            if 'sigma_eof' in mean_trace:
+                prior_std.append(float(mean_trace['sigma_eof'][i]))
+            else:
+                prior_std.append(np.atleast_1d(self._model_setting('sigma_eofs'))[0])
+            if 'ard_relevance' in mean_trace:
+                # W<i> = ard_relevance[i]*W_raw<i>
+                prior_std[-1] = prior_std[-1]*float(mean_trace['ard_relevance'][i])
+            names.append('W'+str(i))
+        if self._model_setting('model_trend'):
+            shift=-6
+            columns.append(np.linspace(-time_dim/2 + shift,time_dim-1-time_dim/2 + shift,time_dim))
+            prior_std.append(self._model_setting('trend_factor_sigma'))
+            names.append('trend_g')
+        if self._model_setting('estimate_offsets'):
+            columns.append(np.ones(time_dim))
+            prior_std.append(self._model_setting('sigma_offset'))
+            names.append('offset')
+        X = np.stack(columns,axis=1)
+        n_params = X.shape[1]
+        
+        if sigma is None:
+            if cluster_index is not None and 'sigma_hier' in mean_trace:
+                # sigma_hier is ordered by the sorted cluster labels of the model
+                labels = np.unique(self._model_setting('cluster_index'))
+                cluster_index = np.asarray(cluster_index)
+                position = np.minimum(np.searchsorted(labels,cluster_index),len(labels)-1)
+                if np.any(labels[position] != cluster_index):
+                    raise Exception('unknown clusters '+str(np.setdiff1d(cluster_index,labels))+' of new stations!')
+                sigma = mean_trace['sigma_hier'].values[position]
+            else:
+                sigma = float(mean_trace['sigma'].mean())
+        variance = np.broadcast_to(np.asarray(sigma,dtype=float)**2,new_data.shape[1:])
+        
+        # normal equations of all stations: X^T P X and X^T P y, P = precision of the observations (0 if missing)
+        Y = new_data.values
+        mask = np.isfinite(Y)
+        if errors is not None:
+            variance = variance + np.where(mask,errors,0.)**2
+        P = np.where(mask,1./np.broadcast_to(variance,Y.shape),0.)
+        Y = np.where(mask,Y,0.)
+        XX = (X[:,:,np.newaxis]*X[:,np.newaxis,:]).reshape(time_dim,n_params**2)
+        XtPX = np.matmul(P.T,XX).reshape(-1,n_params,n_params)
+        XtPy = np.matmul((P*Y).T,X)
+        
+        A = XtPX + np.diag(1./np.asarray(prior_std,dtype=float)**2)[np.newaxis,:,:]
+        cov = np.linalg.inv(A)
+        mean_ = np.matmul(cov,XtPy[:,:,np.newaxis])[:,:,0]
+        std_ = np.sqrt(np.diagonal(cov,axis1=1,axis2=2))
+        
+        # physical units, the trend as in get_trends
+        std = {'mean':False,'std':True}
+        physical = {}
+        for op,values in zip(['mean','std'],[mean_,std_]):
+            physical[op] = {}
+            for i,name in enumerate(names):
+                if name == 'trend_g':
+                    physical[op][name] = station_normalizer.inverse_trend(values[:,i],std=std[op])
+                elif name == 'offset' and not std[op]:
+                    physical[op][name] = station_normalizer.inverse_transform(values[:,i],np.zeros(len(values),dtype=int),
+                                                                              np.arange(len(values)))
+                else:
+                    physical[op][name] = station_normalizer.inverse_trend(values[:,i],std=True)
+        
+        projected = {}
+        for op in ['mean','std']:
+            projected[op] = xr.Dataset({name: ([space_name],physical[op][name]) for name in names},
+                                       coords=coords)
+            projected[op].attrs = {'chain':chain}
+        return projected
+        
     def compress(self,random_sample_size = 20,number_of_rands = 5):
         
         """compress trace
@@ -475,6 +917,7 @@ class bpca():
         4. set compressed to True
         """
         
+        import arviz as az
         self.get_chain_statistics() # set and safe statistics
 
         factor_ = int(self.trace.posterior.draw.max().values/number_of_rands)
@@ -511,24 +954,569 @@ class bpca():
         
     def run(self):
         """
-        run model
+        run model, or load the cached result (see run_settings['cache_dir'])
+        """
+        cache = self._result_cache()
+        if cache is not None:
+            with self.run_report.phase('cache'):
+                key = self._cache_key(cache)
+                hit = cache.load(key,self)
+            if hit:
+                print('loaded cached result '+key)
+                return
+        
+        self.adaptive_sampling_stats = {}
+        if self._run_setting('adaptive_sampling'):
+            self.sample_adaptive()
+        else:
+            self.trace = self._sample(self.run_settings['n_samples'],
+                                      adaptation_state=self._run_setting('adaptation_state'))
+
+        self._finalize_run()
+        if cache is not None and self.compressed:
+            with self.run_report.phase('cache'):
+                cache.store(key,self)
+        
+    def _result_cache(self):
+        """
+        result_cache of run_settings['cache_dir'], None if not set
+        """
+        if self.run_settings.get('cache_dir',None) is None:
+            return None
+        return result_cache(self.run_settings['cache_dir'],max_size=self.run_settings.get('cache_size',None))
+    
+    def _run_setting(self,name):
+        """
+        run setting, falls back to the default of run() (RUN_DEFAULTS)
+        """
+        return self.run_settings.get(name,RUN_DEFAULTS[name])
+    
+    def _effective_settings(self):
+        """
+        settings as used by run(): the given settings completed with the defaults 
+        of run(), bpca_model and normalizer
+        """
+        from bpca.models import bpca_model
+        settings = {}
+        for group,defaults,given in [('run_settings',RUN_DEFAULTS,self.run_settings),
+                                     ('model_settings',bpca_model.__init__,self.model_settings),
+                                     ('normalization_settings',normalizer.__init__,self.normalization_settings)]:
+            if callable(defaults):
+                defaults = {name: parameter.default for name,parameter in inspect.signature(defaults).parameters.items()
+                            if parameter.default is not inspect.Parameter.empty}
+            settings[group] = copy.deepcopy(defaults)
+            settings[group].update(given)
+        return settings
+    
+    def _cache_key(self,cache):
+        """
+        cache key of the observations and the effective settings
+        """
+        return cache.key(dataset_hash(self.dataset,chunk_size=self.model_settings.get('chunk_size',None)),
+                         self._effective_settings())
+    
+    def invalidate_cache(self):
+        """
+        remove the cached result of the observations and settings of this object
+        """
+        cache = self._result_cache()
+        if cache is None:
+            raise Exception('no cache defined, set run_settings[\'cache_dir\']!')
+        cache.invalidate(self._cache_key(cache))
+        
+    def _sample(self,n_samples,adaptation_state=None,tune=None,start=None,initial_weight=None,step=None,
+                random_seed=None):
+        """
+        run pm.sample(), with a NUTS step built from adaptation_state if given 
+        (or with a given step, e.g. of a continued chain), random_seed overrides 
+        sample_settings['random_seed']
+        
+        Step initialization (compilation) and sampling are timed separately in the run report.
+        Chains and BLAS/OpenMP threads are placed on the available cores (see _resource_layout).
+        """
+        import pymc3 as pm
+        self.resource_layout = self._resource_layout()
+        if self.resource_layout is not None:
+            self.run_report.info['resources'] = self.resource_layout
+        threads = None if self.resource_layout is None else self.resource_layout['blas_threads']
+        with self.model, resources.limit_threads(threads):
+            with self.run_report.phase('compile'):
+                if step is not None:
+                    sample_settings = self._split_sample_settings()[0]
+                    sample_settings['tune'] = 0 if tune is None else tune
+                elif adaptation_state is None:
+                    step,sample_settings = self._default_step()
+                else:
+                    adaptation_settings = self._run_setting('adaptation_settings')
+                    if initial_weight is None:
+                        initial_weight = adaptation_settings.get('initial_weight',50)
+                    step,sample_settings = self._adapted_step(adaptation_state,initial_weight=initial_weight,
+                                                              dense_mass=adaptation_settings.get('dense_mass',False))
+                    sample_settings['tune'] = adaptation_settings.get('tune',300) if tune is None else tune
+            if start is not None:
+                sample_settings['start'] = start
+                sample_settings['chains'] = len(start)
+            if random_seed is not None:
+                sample_settings['random_seed'] = random_seed
+            with self.run_report.phase('sampling'):
+                return pm.sample(n_samples,step=step,**sample_settings)
+            
+    def _split_sample_settings(self):
+        """
+        copy of sample_settings without the NUTS arguments, NUTS arguments
+        """
+        sample_settings = copy.deepcopy(self.run_settings['sample_settings'])
+        layout = getattr(self,'resource_layout',None)
+        if layout is not None:
+            sample_settings['chains'] = layout['chains']
+            sample_settings['cores'] = layout['cores']
+        nuts_settings = {key: sample_settings.pop(key) for key in ['target_accept','max_treedepth','early_max_treedepth'] 
+                         if key in sample_settings}
+        return sample_settings,nuts_settings
+            
+    def _resource_layout(self):
+        """split the cores between parallel chains and BLAS/OpenMP threads per chain
+        
+        Uses the process-wide settings (resources.configure) updated with 
+        run_settings['resource_settings']; the number of chains defaults to 
+        sample_settings 'cores' as before, but at most as many chains as 
+        available cores (affinity and cgroup limit) run in parallel. 
+        Returns None if resource management is disabled.
+        """
+        settings = dict(resources.SETTINGS)
+        settings.update(self.run_settings.get('resource_settings',{}))
+        if not settings['manage']:
+            return None
+        sample_settings = self.run_settings['sample_settings']
+        return resources.resource_layout(chains=sample_settings.get('chains',None),
+                                         cores=sample_settings.get('cores',None),
+                                         blas_threads=settings['blas_threads'],max_cores=settings['max_cores'])
+            
+    def _default_step(self):
+        """
+        NUTS step and start points initialized as in pm.sample(), must be called in the model context
+        """
+        import pymc3 as pm
+        sample_settings,nuts_settings = self._split_sample_settings()
+        cores = sample_settings.get('cores',None) or min(4,os.cpu_count())
+        chains = sample_settings.get('chains',None) or max(2,cores)
+        sample_settings['chains'] = chains
+        init = sample_settings.pop('init','auto')
+        if init == 'auto':
+            init = 'jitter+adapt_diag'
+        start,step = pm.init_nuts(init=init,chains=chains,n_init=sample_settings.pop('n_init',200000),
+                                  random_seed=sample_settings.get('random_seed',None),
+                                  progressbar=sample_settings.get('progressbar',True),**nuts_settings)
+        if sample_settings.get('start',None) is None:
+            sample_settings['start'] = start
+        return step,sample_settings
+        
+    def sample_adaptive(self):
+        """sample in increments until convergence targets are met
+        
+        After every increment r_hat and bulk ESS of the variables in 
+        run_settings['adaptive_settings']['variables'] are checked (on 
+        symmetry-adjusted chains if adjust_pca_symmetry is enabled). Sampling 
+        stops when all targets are met, max_samples is reached or the next 
+        increment would exceed time_budget (in seconds of drawing, without 
+        compilation and tuning). Subsequent increments continue every chain 
+        from its last draw with its own adapted step size and mass matrix 
+        (without tuning), see _continue_chains. The diagnostics, draw time and 
+        ESS per second of drawing are stored in self.adaptive_sampling_stats.
+        """
+        import arviz as az
+        settings = self.run_settings.get('adaptive_settings',{})
+        increment = settings.get('increment',1000)
+        max_samples = settings.get('max_samples',5*self.run_settings['n_samples'])
+        time_budget = settings.get('time_budget',None)
+        dense_mass = self._run_setting('adaptation_settings').get('dense_mass',False)
+        
+        start_time = time.time()
+        sampling_time = self.run_report.phases.get('sampling',{}).get('wall_time',0.)
+        self.trace = self._sample(increment,adaptation_state=self._run_setting('adaptation_state'))
+        draw_time = draws_wall_time(self.trace)
+        while True:
+            stats = self._convergence_targets(settings)
+            n_samples = len(self.trace.posterior.draw)
+            stats['elapsed'] = time.time()-start_time
+            # draws only, sampling phases (without compilation) if the draws are not timed
+            stats['draw_time'] = draw_time
+            if draw_time is None:
+                stats['draw_time'] = self.run_report.phases['sampling']['wall_time']-sampling_time
+            stats['ess_per_second'] = {var: ess/max(stats['draw_time'],1e-12) for var,ess in stats['ess_bulk'].items()}
+            self.adaptive_sampling_stats = stats
+            print('adaptive sampling: '+str(n_samples)+' draws, r_hat: '+str(stats['r_hat'])+', ess_bulk: '+str(stats['ess_bulk']))
+            if stats['converged']:
+                print('convergence targets met after '+str(n_samples)+' draws')
+                break
+            if n_samples + increment > max_samples:
+                print('max_samples reached before convergence targets are met')
+                break
+            if time_budget is not None and stats['draw_time']*(n_samples+increment)/n_samples > time_budget:
+                print('time budget exhausted before convergence targets are met')
+                break
+            
+            new_trace = self._continue_chains(increment,self.get_adaptation_state(dense_mass=dense_mass),
+                                              self._last_draws(),dense_mass=dense_mass)
+            if draw_time is not None:
+                # the continued chains run one after another
+                new_draw_time = draws_wall_time(new_trace,parallel=False)
+                draw_time = None if new_draw_time is None else draw_time+new_draw_time
+            self.trace = az.concat(self.trace,new_trace,dim='draw')
+            
+    def _last_draws(self):
+        """
+        last draw of every chain in the sampler (transformed) space
+        """
+        posterior = self.trace.posterior
+        start = []
+        for chain in posterior.chain.values:
+            point = {}
+            for name,untransformed_name in self._free_variables():
+                values = posterior[untransformed_name].sel(chain=chain).isel(draw=-1).values
+                if name != untransformed_name:
+                    values = self.model.named_vars[untransformed_name].transformation.forward_val(values)
+                point[name] = values
+            start.append(point)
+        return start
+    
+    def _chain_potentials(self,adaptation_state,dense_mass=False):
+        """
+        (mass matrix) potentials of the chains from the per-chain moments of an adaptation state
+        """
+        from pymc3.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt, QuadPotentialFullAdapt
+        chains = adaptation_state['chains']
+        n = self.model.ndim
+        initial_weight = self._run_setting('adaptation_settings').get('initial_weight',50)
+        potentials = []
+        for chain in range(len(chains['step_size'])):
+            mean_ = self.model.dict_to_array({name: values[chain] for name,values in chains['mean'].items()})
+            if dense_mass and adaptation_state.get('cov',None) is not None:
+                potentials.append(QuadPotentialFullAdapt(n,mean_,adaptation_state['cov']+np.eye(n)*1e-10,initial_weight))
+            else:
+                var_ = self.model.dict_to_array({name: values[chain] for name,values in chains['var'].items()})
+                var_ = np.where(np.isfinite(var_) & (var_ > 0),var_,1.)
+                potentials.append(QuadPotentialDiagAdapt(n,mean_,var_,initial_weight))
+        return potentials
+    
+    def _continue_chains(self,n_samples,adaptation_state,start,dense_mass=False):
+        """continue every chain from its start point with its adapted step size and mass matrix
+        
+        One pm.sample() run (one chain, no tuning) per chain with a pm.NUTS 
+        step of the per-chain step size and potential of adaptation_state 
+        (see get_adaptation_state), the chains are concatenated. Random seeds 
+        of sample_settings are offset by the number of draws sampled so far.
+        
+        Returns
+        -------
+        InferenceData of the continued chains
+        """
+        import arviz as az
+        import pymc3 as pm
+        nuts_settings = self._split_sample_settings()[1]
+        potentials = self._chain_potentials(adaptation_state,dense_mass=dense_mass)
+        step_sizes = adaptation_state['chains']['step_size']
+        random_seed = self.run_settings['sample_settings'].get('random_seed',None)
+        n_draws = len(self.trace.posterior.draw)
+        n = self.model.ndim
+        traces = []
+        for chain,point in enumerate(start):
+            with self.model:
+                with self.run_report.phase('compile'):
+                    # NUTS scales step_scale by ndim**(-1/4)
+                    step = pm.NUTS(potential=potentials[chain],step_scale=step_sizes[chain]*n**0.25,**nuts_settings)
+            seed = None
+            if random_seed is not None:
+                seed = [int(np.atleast_1d(random_seed)[chain % np.size(random_seed)])+n_draws]
+            traces.append(self._sample(n_samples,tune=0,start=[point],step=step,random_seed=seed))
+        return az.concat(*traces,dim='chain')
+    
+    def _convergence_targets(self,settings):
+        """
+        max r_hat and min bulk ESS of the monitored variables and whether targets are met
+        """
+        import arviz as az
+        trace = self.trace
+        if self._run_setting('adjust_pca_symmetry'):
+            # evaluate on a symmetry-adjusted copy, sampling continues on the raw chains
+            adjusted = copy.copy(self)
+            adjusted.trace = copy.deepcopy(self.trace)
+            adjusted.adjust_pca_symmetry()
+            trace = adjusted.trace
+        variables = [var for var in settings.get('variables',['PC0','W0','trend_g','sigma']) if var in trace.posterior]
+        r_hat = az.rhat(trace,var_names=variables)
+        ess_bulk = az.ess(trace,var_names=variables,method='bulk')
+        stats = {'r_hat':{var: float(r_hat[var].max()) for var in variables},
+                 'ess_bulk':{var: float(ess_bulk[var].min()) for var in variables}}
+        stats['converged'] = (all(value <= settings.get('r_hat',1.01) for value in stats['r_hat'].values()) and
+                              all(value >= settings.get('ess_bulk',400) for value in stats['ess_bulk'].values()))
+        return stats
+
+    def _finalize_run(self):
         """
-        with self.model:
-            self.trace = pm.sample(self.run_settings['n_samples'],**self.run_settings['sample_settings'])            
+        apply the post-processing steps selected in run_settings and collect sampler statistics
+        """
+        if self._run_setting('export_adaptation_state'):
+            # from the raw chains, adjust_pca_symmetry rescales and permutes the components
+            with self.run_report.phase('adaptation_state'):
+                self.get_adaptation_state(dense_mass=self._run_setting('adaptation_settings').get('dense_mass',False))
+            
+        if self._run_setting('adjust_pca_symmetry'):
+            with self.run_report.phase('adjust_pca_symmetry'):
+                self.adjust_pca_symmetry()
+        
+        if self._run_setting('check_convergence'):   
+            with self.run_report.phase('check_convergence'):
+                self.check_convergence()
+            
+        with self.run_report.phase('sampler_statistics'):
+            self.run_report.sampler = sampler_statistics(self.trace,
+                                                         sampling_time=self.run_report.phases['sampling']['wall_time'],
+                                                         draw_time=self.adaptive_sampling_stats.get('draw_time',None))
+            
+        if self._run_setting('compress'):
+            with self.run_report.phase('compress'):
+                self.compress()    
+        
+        if self._model_setting('ARD'):
+            with self.run_report.phase('prune_components'):
+                if self._run_setting('prune_components'):
+                    components = self.prune_components(self._run_setting('component_threshold'))
+                else:
+                    components = self.component_relevance(self._run_setting('component_threshold'))
+                self.run_report.info['components'] = components
 
-        if self.run_settings['adjust_pca_symmetry']:
-            self.adjust_pca_symmetry()
+    def update(self,dataset,n_samples=None,tune=None):
+        """warm-start the model on an extended dataset
+        
+        The dataset has to contain the fitted stations and epochs plus new 
+        time steps appended at the end. The chains are initialized at the 
+        compressed posterior means of the previous run (PCs are extended 
+        forward with their last value) and the step size and (diagonal) 
+        mass matrix are taken from the exported adaptation state (or derived 
+        from the compressed trace), so that only a short tuning and sampling 
+        phase is needed.
+        
+        Parameters
+        ----------
+        dataset: xarray.DataArray of time*space dimensions, sparse_observations or pd.DataFrame,
+            extended dataset
+            
+        n_samples: int, default: None,
+            number of draws, default: run_settings['update_settings']['n_samples']
+            
+        tune: int, default: None,
+            number of tuning steps, default: run_settings['update_settings']['tune']
+        
+        """
+        from bpca.models import bpca_model
+        if not self.compressed:
+            raise Exception('update() requires a compressed trace, run compress() first!')
+        dataset = self._normalize_data(self._observations(dataset),fit=False)
+        old_time_dim,space_dim = self.dataset.shape
+        if dataset.shape[1] != space_dim or dataset.shape[0] < old_time_dim:
+            raise Exception('dataset must contain the same stations and extend the time axis!')
+        if not np.array_equal(dataset.time.values[:old_time_dim],self.dataset.time.values):
+            raise Exception('dataset must start with the fitted epochs followed by the new time steps!')
         
-        if self.run_settings['check_convergence']:   
-            self.check_convergence()
+        update_settings = self.run_settings.get('update_settings',{})
+        if n_samples is None:
+            n_samples = update_settings.get('n_samples',1000)
+        if tune is None:
+            tune = update_settings.get('tune',200)
             
-        if self.run_settings['compress']:
-            self.compress()    
+        start = self._warm_start_values(dataset.shape[0])
+        adaptation_state = getattr(self,'adaptation_state',None)
+        if adaptation_state is None:
+            adaptation_state = self._compressed_adaptation_state()
+        
+        self.dataset = dataset
+        self.run_report = run_report()
+        self.adaptive_sampling_stats = {}
+        with self.run_report.phase('validation'):
+            self._validate()
+        with self.run_report.phase('model_build'):
+            self.model = bpca_model(observed = self.dataset,**self.model_settings)
+        
+        self.trace = self._sample(n_samples,adaptation_state=adaptation_state,tune=tune,start=start,
+                                  initial_weight=update_settings.get('initial_weight',50))
+        print('updated model with '+str(dataset.shape[0]-old_time_dim)+' new time steps')
+        
+        self.compressed = False
+        self.estimated_dataset = None
+        self._finalize_run()
+        
+    def _free_variables(self):
+        """
+        list of (name, untransformed name) of the free model variables
+        """
+        from pymc3.util import get_untransformed_name, is_transformed_name
+        return [(var.name,get_untransformed_name(var.name) if is_transformed_name(var.name) else var.name) 
+                for var in self.model.free_RVs]
+        
+    def _extend_time(self,name,values,time_dim):
+        """
+        extend PC values forward in time with their last value
+        """
+        if name.startswith('PC') and values.shape[-1] < time_dim:
+            values = np.concatenate([values,np.repeat(values[...,-1:],time_dim-values.shape[-1],axis=-1)],axis=-1)
+        return values
+        
+    def _warm_start_values(self,time_dim):
+        """
+        per-chain initial values from the compressed posterior mean, extended to time_dim
+        """
+        mean_trace = self.trace['mean'].posterior
+        # the trend time axis is re-centred on the extended series, 
+        # shift the offsets such that the initial estimates do not change
+        trend_shift = (time_dim-self.dataset.shape[0])/2.
+        start = []
+        for chain in mean_trace.chain.values:
+            point = {}
+            for _,name in self._free_variables():
+                if name in mean_trace:
+                    point[name] = self._extend_time(name,mean_trace[name].sel(chain=chain).values,time_dim)
+            if 'offset' in point and 'trend_g' in point:
+                point['offset'] = point['offset'] + point['trend_g']*trend_shift
+            start.append(point)
+        return start
     
+    def get_adaptation_state(self,dense_mass=False):
+        """export the NUTS adaptation state of the current (uncompressed) trace
+        
+        The state contains the final step size and the posterior mean and 
+        variance of every free variable in the sampler (transformed) space, 
+        which is what the diagonal mass matrix adaptation converges to, 
+        averaged over the chains and per chain ('chains'). It is stored in 
+        self.adaptation_state, saved with the object and can be passed to 
+        another run via run_settings['adaptation_state']. run() exports it 
+        before adjust_pca_symmetry, which rescales and permutes the 
+        components of the chains, so that it describes the space the 
+        sampler adapted in.
+        
+        Parameters
+        ----------
+        dense_mass: bool, default: False,
+            also export the full covariance matrix for dense mass matrix adaptation
+        """
+        from pymc3.util import is_transformed_name
+        if self.compressed:
+            raise Exception('adaptation state requires the full trace, call before compress()!')
+        posterior = self.trace.posterior
+        step_sizes = self.trace.sample_stats['step_size'][:,-1].values
+        state = {'step_size':float(step_sizes.mean()),'mean':{},'var':{},'cov':None,
+                 'chains':{'step_size':step_sizes,'mean':{},'var':{}}}
+        flat_draws = []
+        for name,untransformed_name in self._free_variables():
+            values = posterior[untransformed_name].values
+            if is_transformed_name(name):
+                values = self.model.named_vars[untransformed_name].transformation.forward_val(values)
+            # chain-wise moments, chains might be label-switched
+            state['chains']['mean'][name] = values.mean(axis=1)
+            state['chains']['var'][name] = values.var(axis=1)
+            state['mean'][name] = state['chains']['mean'][name].mean(axis=0)
+            state['var'][name] = state['chains']['var'][name].mean(axis=0)
+            if dense_mass:
+                centred = values - values.mean(axis=1,keepdims=True)
+                flat_draws.append(centred.reshape(centred.shape[0]*centred.shape[1],-1))
+        if dense_mass:
+            flat_draws = np.concatenate(flat_draws,axis=1)
+            state['cov'] = np.matmul(flat_draws.T,flat_draws)/(flat_draws.shape[0]-1)
+        self.adaptation_state = state
+        return state
+    
+    def _compressed_adaptation_state(self):
+        """
+        approximate adaptation state derived from the compressed trace
+
+        Means of transformed variables are mapped to the sampler space with
+        the forward transformation (as in get_adaptation_state), standard
+        deviations are propagated with its derivative, i.e. divided by the
+        derivative of the backward transformation (exp(jacobian_det)).
+        """
+        from pymc3.util import is_transformed_name
+        from theano import tensor
+        mean_trace = self.trace['mean'].posterior
+        std_trace = self.trace['std'].posterior
+        state = {'step_size':float(self.trace['mean'].sample_stats['step_size'].mean()),
+                 'mean':{},'var':{},'cov':None}
+        for name,untransformed_name in self._free_variables():
+            mean_ = mean_trace[untransformed_name].mean(dim='chain').values
+            std_ = std_trace[untransformed_name].mean(dim='chain').values
+            if is_transformed_name(name):
+                transformation = self.model.named_vars[untransformed_name].transformation
+                mean_ = transformation.forward_val(mean_)
+                log_derivative = transformation.jacobian_det(tensor.as_tensor_variable(mean_)).eval()
+                std_ = std_*np.exp(-log_derivative)
+            state['var'][name] = std_**2
+            state['mean'][name] = mean_
+        return state
+    
+    def _adapted_step(self,adaptation_state,initial_weight=50,dense_mass=False):
+        """build a NUTS step from an adaptation state
+        
+        Variables of the state are matched to the current model by name; 
+        PCs of a shorter time axis are extended, variables of other shape 
+        (e.g. a different number of stations) are initialized with the 
+        median variance of that variable. Must be called in the model context.
+        
+        Parameters
+        ----------
+        adaptation_state: dict or str,
+            adaptation state (see get_adaptation_state) or file saved with save(kind='adaptation')
+            
+        initial_weight: int,
+            weight (in draws) of the imported moments during adaptation
+            
+        dense_mass: bool,
+            use dense mass matrix adaptation, requires a state with matching covariance
+            
+        Returns
+        -------
+        pm.NUTS step, remaining settings for pm.sample()
+        """
+        import pymc3 as pm
+        from pymc3.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt, QuadPotentialFullAdapt
+        if isinstance(adaptation_state,str):
+            with open(adaptation_state,'rb') as adaptation_file:
+                adaptation_state = pickle.load(adaptation_file)
+        sample_settings,nuts_settings = self._split_sample_settings()
+        
+        test_point = self.model.test_point
+        mean_point = {}
+        var_point = {}
+        matched = True
+        for name,untransformed_name in self._free_variables():
+            shape = np.shape(test_point[name])
+            mean_ = np.asarray(adaptation_state['mean'].get(name,test_point[name]),dtype=float)
+            var_ = np.asarray(adaptation_state['var'].get(name,1.),dtype=float)
+            if len(shape) > 0 and np.shape(mean_) != shape:
+                mean_ = self._extend_time(untransformed_name,mean_,shape[-1])
+                var_ = self._extend_time(untransformed_name,var_,shape[-1])
+                matched = False
+            if np.shape(mean_) != shape:
+                mean_ = test_point[name]
+                var_ = np.full(shape,np.nanmedian(var_))
+            mean_point[name] = np.where(np.isfinite(mean_),mean_,0.)
+            var_point[name] = np.where(np.isfinite(var_) & (var_ > 0),var_,1.)
+            
+        n = self.model.ndim
+        if dense_mass and matched and adaptation_state.get('cov',None) is not None:
+            cov = adaptation_state['cov'] + np.eye(n)*1e-10
+            potential = QuadPotentialFullAdapt(n,self.model.dict_to_array(mean_point),cov,initial_weight)
+        else:
+            if dense_mass:
+                print('no matching covariance in adaptation state, use diagonal mass matrix')
+            potential = QuadPotentialDiagAdapt(n,self.model.dict_to_array(mean_point),
+                                               self.model.dict_to_array(var_point),initial_weight)
+        # NUTS scales step_scale by ndim**(-1/4)
+        step = pm.NUTS(potential=potential,step_scale=adaptation_state['step_size']*n**0.25,**nuts_settings)
+        return step,sample_settings
 
     def save(self,save_dir='',kind='bpca'):
         """
-        save object
+        save object, the trace (kind='trace'), the adaptation state (kind='adaptation') 
+        or the run report as json (kind='report')
         """
         if self.name == '' or save_dir=='':
             raise Exception('Define Object.name and save_dir before saving!')
@@ -536,12 +1524,18 @@ class bpca():
             if kind == 'bpca':
                 with open(save_dir+self.name+'.bpca', 'wb') as ilame_file:
                     pickle.dump(self, ilame_file, pickle.HIGHEST_PROTOCOL)
+            elif kind == 'adaptation':
+                with open(save_dir+self.name+'.adaptation', 'wb') as adaptation_file:
+                    pickle.dump(self.adaptation_state, adaptation_file, pickle.HIGHEST_PROTOCOL)
+            elif kind == 'report':
+                self.run_report.save(save_dir+self.name+'_report.json')
             else:
                 self.trace.to_netcdf(save_dir+self.name)
 
     def load(save_dir='',kind='bpca'):
         """
-        load object
+        load object (without importing Theano, PyMC3 and ArviZ, the model and 
+        the trace are rebuilt on first use)
         """
         if save_dir=='':
             raise Exception('Define filename before loading!')
@@ -553,7 +1547,347 @@ class bpca():
                 self=xr.open_dataset(save_dir)
             return self
 
-def file_reader(file,variable='auto',resample='D'):
+def trace_groups(trace):
+    """
+    groups of a trace (InferenceData or dict of compressed InferenceData) as 
+    (kind, dict of xarray.Datasets), None if trace is not an InferenceData
+    """
+    if isinstance(trace,dict):
+        if not all(hasattr(value,'groups') for value in trace.values()):
+            return None
+        return ('compressed',{op: {group: getattr(value,group) for group in value.groups()} 
+                              for op,value in trace.items()})
+    if not hasattr(trace,'groups') or isinstance(trace,(xr.Dataset,xr.DataArray)):
+        return None
+    return ('full',{group: getattr(trace,group) for group in trace.groups()})
+
+def inference_data(groups):
+    """
+    trace from trace_groups()
+    """
+    import arviz as az
+    kind,groups = groups
+    if kind == 'compressed':
+        return {op: az.InferenceData(**value) for op,value in groups.items()}
+    return az.InferenceData(**groups)
+
+def __getattr__(name):
+    """
+    the model classes are defined in bpca.models (imports Theano and PyMC3 on first use)
+    """
+    if name in ['bpca_model','det_dot']:
+        from bpca import models
+        return getattr(models,name)
+    raise AttributeError('module '+__name__+' has no attribute '+name)
+
+# variables with one entry per component (last dimension)
+COMPONENT_VARIABLES = ['sigma_eof','ard_lambda','ard_relevance']
+# variables of every component, named <variable><i>
+COMPONENT_SERIES = ['PC','W','W_raw']
+
+def prune_posterior(posterior,active,number_of_pcs):
+    """keep the components active of a posterior Dataset, renumbered PC0, W0, PC1, ...
+    
+    posterior: xarray.Dataset with PC<i>, W<i> (COMPONENT_SERIES) and per-component variables (COMPONENT_VARIABLES)
+    active: index array of the components to keep
+    """
+    renamed = {}
+    for new,old in enumerate(active):
+        for variable in COMPONENT_SERIES:
+            if variable+str(old) in posterior:
+                values = posterior[variable+str(old)]
+                dims = {dim: variable+str(new)+dim[len(variable+str(old)):] for dim in values.dims 
+                        if dim.startswith(variable+str(old)+'_')}
+                renamed[variable+str(new)] = values.rename(dims).rename(variable+str(new))
+    posterior = posterior.drop_vars([variable+str(i) for i in range(number_of_pcs) for variable in COMPONENT_SERIES 
+                                     if variable+str(i) in posterior])
+    for variable in COMPONENT_VARIABLES:
+        if variable in posterior:
+            posterior = posterior.isel({posterior[variable].dims[-1]: active})
+    posterior = posterior.assign(renamed)
+    # coordinates of removed components
+    used = set(dim for values in posterior.data_vars.values() for dim in values.dims)
+    return posterior.drop_vars([coord for coord in posterior.coords if coord not in used and coord in posterior.dims])
+
+def prune_adaptation_state(state,active,number_of_pcs):
+    """keep the components active of an adaptation state (see bpca.get_adaptation_state), renumbered as in prune_posterior
+    
+    The covariance of the dense mass matrix is dropped.
+    """
+    def prune(moments):
+        pruned = {}
+        for name,values in moments.items():
+            # untransformed name as pymc3.util.get_untransformed_name, e.g. sigma_eof_log__
+            variable = '_'.join(name.split('_')[:-3]) if name.endswith('__') and name.count('_') >= 3 else name
+            if variable in COMPONENT_VARIABLES:
+                pruned[name] = np.take(values,active,axis=-1)
+            elif name not in [series+str(i) for i in range(number_of_pcs) for series in COMPONENT_SERIES]:
+                pruned[name] = values
+        for new,old in enumerate(active):
+            for series in COMPONENT_SERIES:
+                if series+str(old) in moments:
+                    pruned[series+str(new)] = moments[series+str(old)]
+        return pruned
+    
+    pruned = dict(state,mean=prune(state['mean']),var=prune(state['var']),cov=None)
+    if 'chains' in state:
+        pruned['chains'] = dict(state['chains'],mean=prune(state['chains']['mean']),var=prune(state['chains']['var']))
+    return pruned
+
+# version of the parsers, part of the cache key
+PARSER_VERSION = 1
+
+def decimal_year_to_datetime(years):
+    """
+    convert decimal years to datetime64[ns], exact for leap years 
+    (the fraction refers to the length of the respective calendar year)
+    """
+    years = np.asarray(years,dtype=float)
+    year = np.floor(years).astype(np.int64)
+    start = (year-1970).astype('datetime64[Y]').astype('datetime64[ns]')
+    end = (year-1969).astype('datetime64[Y]').astype('datetime64[ns]')
+    length = (end-start).astype(np.int64)
+    return start + np.round((years-year)*length).astype(np.int64).astype('timedelta64[ns]')
+
+def mjd_to_datetime(mjd):
+    """
+    convert modified julian dates to datetime64[ns]
+    """
+    mjd = np.asarray(mjd,dtype=float)
+    return np.datetime64('1858-11-17','ns') + np.round(mjd*86400e9).astype(np.int64).astype('timedelta64[ns]')
+
+def iterate_blocks(dataset,chunk_size=None):
+    """iterate over blocks of time steps of a time*space DataArray
+    
+    Only one block is loaded at a time, for dask- or Zarr-backed (lazy) 
+    DataArrays only this block is read from disk.
+    
+    Parameters
+    ----------
+    dataset: xarray.DataArray of time*space dimensions
+    
+    chunk_size: None or int, default: None,
+        number of time steps per block, default: the dask chunks or, 
+        for in-memory data, the full time axis
+        
+    Yields
+    ------
+    time slice, np.array() of the block
+    """
+    time_dim = dataset.shape[0]
+    if chunk_size is None:
+        chunk_size = dataset.chunks[0][0] if dataset.chunks is not None else time_dim
+    for start in range(0,time_dim,max(int(chunk_size),1)):
+        block = slice(start,min(start+chunk_size,time_dim))
+        yield block,np.asarray(dataset[block].values,dtype=float)
+
+def load_observed(dataset,chunk_size=None,time=None,space=None):
+    """load (a slice of) a time*space DataArray block by block into a single array
+    
+    time, space: None, slice or index array, default: None,
+        slice to load, e.g. the tile of a tile-wise or minibatch engine; 
+        only this slice is read from disk
+    """
+    indexers = {dim: index for dim,index in zip(dataset.dims,[time,space]) if index is not None}
+    if len(indexers) > 0:
+        dataset = dataset.isel(indexers)
+    if dataset.chunks is None and chunk_size is None:
+        return np.asarray(dataset.values,dtype=float)
+    values = np.empty(dataset.shape)
+    for block,block_values in iterate_blocks(dataset,chunk_size=chunk_size):
+        values[block] = block_values
+    return values
+
+def dataset_hash(dataset,chunk_size=None):
+    """hash of the observations and coordinates, computed block by block
+    
+    Parameters
+    ----------
+    dataset: xarray.DataArray of time*space dimensions or sparse_observations
+    
+    chunk_size: None or int, default: None,
+        number of time steps per block, see iterate_blocks
+    """
+    digest = hashlib.sha256()
+    def update(values):
+        values = np.asarray(values)
+        if values.dtype.kind == 'O':
+            values = values.astype(str)
+        digest.update(repr((values.dtype.str,values.shape)).encode())
+        digest.update(np.ascontiguousarray(values).tobytes())
+    
+    if isinstance(dataset,sparse_observations):
+        digest.update(b'sparse')
+        for values in [dataset.time_index,dataset.space_index,dataset.values,dataset.time.values]:
+            update(values)
+        if dataset.errors is not None:
+            update(dataset.errors)
+    else:
+        digest.update(b'dense')
+        update(np.asarray(dataset.dims))
+        digest.update(repr(dataset.shape).encode())
+        # independent of the block size
+        for block,values in iterate_blocks(dataset,chunk_size=chunk_size):
+            digest.update(np.ascontiguousarray(values).tobytes())
+    for name in sorted(dataset.coords):
+        digest.update(str(name).encode())
+        update(np.asarray(dataset.coords[name]))
+    return digest.hexdigest()
+
+def observation_statistics(dataset,chunk_size=None):
+    """per-station statistics of the observations, computed block by block
+    
+    Parameters
+    ----------
+    dataset: xarray.DataArray of time*space dimensions or sparse_observations
+    
+    chunk_size: None or int, default: None,
+        number of time steps per block, see iterate_blocks
+        
+    Returns
+    -------
+    dict of np.arrays of size space_dim: 'count', 'mean', 'std' and 
+    'first', 'last' (time index of the first and last observation, -1 without observations)
+    """
+    space_dim = dataset.shape[1]
+    if isinstance(dataset,sparse_observations):
+        count = dataset.observation_counts()
+        sums = np.bincount(dataset.space_index,weights=dataset.values,minlength=space_dim)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            mean_ = sums/count
+        squares = np.bincount(dataset.space_index,weights=(dataset.values-mean_[dataset.space_index])**2,
+                              minlength=space_dim)
+        first = np.full(space_dim,dataset.shape[0],dtype=np.int64)
+        np.minimum.at(first,dataset.space_index,dataset.time_index)
+        last = np.full(space_dim,-1,dtype=np.int64)
+        np.maximum.at(last,dataset.space_index,dataset.time_index)
+    else:
+        count = np.zeros(space_dim,dtype=np.int64)
+        mean_ = np.zeros(space_dim)
+        squares = np.zeros(space_dim)
+        first = np.full(space_dim,dataset.shape[0],dtype=np.int64)
+        last = np.full(space_dim,-1,dtype=np.int64)
+        for block,values in iterate_blocks(dataset,chunk_size=chunk_size):
+            mask = np.isfinite(values)
+            block_count = mask.sum(axis=0)
+            block_values = np.where(mask,values,0.)
+            with np.errstate(invalid='ignore',divide='ignore'):
+                block_mean = np.where(block_count > 0,block_values.sum(axis=0)/block_count,0.)
+            block_squares = (np.where(mask,values-block_mean,0.)**2).sum(axis=0)
+            # combine the moments of the blocks (Chan et al.)
+            total = count+block_count
+            delta = block_mean-mean_
+            with np.errstate(invalid='ignore',divide='ignore'):
+                mean_ = np.where(total > 0,mean_+delta*block_count/total,0.)
+                squares = np.where(total > 0,squares+block_squares+delta**2*count*block_count/total,0.)
+            count = total
+            time_index = np.arange(block.start,block.stop)[:,np.newaxis]
+            first = np.minimum(first,np.where(mask,time_index,dataset.shape[0]).min(axis=0))
+            last = np.maximum(last,np.where(mask,time_index,-1).max(axis=0))
+        mean_ = np.where(count > 0,mean_,np.nan)
+    first = np.where(count > 0,first,-1)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        std_ = np.sqrt(squares/count)
+    return {'count':count,'mean':mean_,'std':std_,'first':first,'last':last}
+
+def bin_labels(times,resample='D'):
+    """
+    labels of the resample bins of times, as in pd.Series.resample() (resample=None: times)
+    """
+    times = pd.DatetimeIndex(times)
+    if resample is None or len(times) == 0:
+        return times
+    # bins are contiguous in time order, the labels of all (also empty) bins and their counts
+    order = np.argsort(times.values,kind='stable')
+    counts = pd.Series(np.ones(len(times)),index=times[order]).resample(resample).count()
+    labels = np.empty(len(times),dtype=counts.index.values.dtype)
+    labels[order] = np.repeat(counts.index.values,counts.values)
+    return pd.DatetimeIndex(labels)
+
+def aggregate_series(times,values,resample='D'):
+    """average values in bins of frequency resample (as pd.Series.resample().mean())
+    
+    Parameters
+    ----------
+    times : np.array() of datetime64
+    values : np.array()
+    resample : str
+        pandas frequency, None: no aggregation
+        
+    Returns
+    -------
+    pd.Series on a regular time axis, empty bins are NaN
+    """
+    times = pd.DatetimeIndex(times)
+    values = np.asarray(values,dtype=float)
+    if resample is None:
+        return pd.Series(values,index=times).sort_index()
+    labels = bin_labels(times,resample)
+    unique_labels,inverse = np.unique(labels.values,return_inverse=True)
+    valid = np.isfinite(values)
+    sums = np.bincount(inverse[valid],weights=values[valid],minlength=len(unique_labels))
+    counts = np.bincount(inverse[valid],minlength=len(unique_labels))
+    with np.errstate(invalid='ignore',divide='ignore'):
+        means = sums/counts
+    index = pd.date_range(start=unique_labels[0],end=unique_labels[-1],freq=resample)
+    data = pd.Series(np.nan,index=index)
+    data.iloc[index.get_indexer(unique_labels)] = means
+    return data
+
+def _read_columns(file,usecols,skiprows=0):
+    """
+    read selected whitespace separated columns (C parser)
+    """
+    return pd.read_csv(file,sep=r'\s+',header=None,usecols=usecols,skiprows=skiprows,engine='c')
+
+def _header(file):
+    """
+    column names of the first line
+    """
+    with open(file) as file_:
+        return file_.readline().split()
+
+def read_tenv3(file,variable='____up(m)',resample='D'):
+    """
+    parse a NGL tenv3 file, epochs from the MJD column, coordinates in data.attrs
+    """
+    header = _header(file)
+    column = header.index(variable) if isinstance(variable,str) else variable
+    columns = _read_columns(file,[3,column,20,21],skiprows=1)
+    data = aggregate_series(mjd_to_datetime(columns[3].values),columns[column].values,resample)
+    data.name = header[column] if column < len(header) else column
+    data.attrs = {'lat':float(columns[20].iloc[0]),'lon':float(columns[21].iloc[0])}
+    return data
+
+def read_txyz2(file,variable=3,resample='D'):
+    """
+    parse a NGL txyz2 file, epochs from the decimal year column
+    """
+    columns = _read_columns(file,sorted({2,variable}))
+    data = aggregate_series(decimal_year_to_datetime(columns[2].values),columns[variable].values,resample)
+    data.name = variable
+    return data
+
+def read_txt(file,variable='Height',resample='D'):
+    """
+    parse a txt file with header, epochs from the decimal year column 'Year'
+    """
+    header = _header(file)
+    columns = _read_columns(file,[header.index('Year'),header.index(variable)],skiprows=1)
+    data = aggregate_series(decimal_year_to_datetime(columns[header.index('Year')].values),
+                            columns[header.index(variable)].values,resample)
+    data.name = variable
+    return data
+
+def _cache_file(file,cache_dir,*keys):
+    """
+    cache file name, hash of path, modification time, size and keys
+    """
+    stat = os.stat(file)
+    key = repr((os.path.abspath(file),stat.st_mtime_ns,stat.st_size,PARSER_VERSION)+keys)
+    return os.path.join(cache_dir,hashlib.sha1(key.encode()).hexdigest()+'.npz')
+
+def file_reader(file,variable='auto',resample='D',cache_dir=None):
     
     """ read different file types
     
@@ -567,48 +1901,140 @@ def file_reader(file,variable='auto',resample='D'):
     variable : str
         variable to read from file 
         (default: 'auto', selects the first availabe variable/column)
+    resample : str
+        average the series in bins of this frequency
+    cache_dir : None or str, default: None
+        directory of a binary cache of parsed series, entries are keyed by 
+        path, modification time, variable and resample (not used for netcdf)
         
     """
 
-    ending = file.split(".",1) 
+    ending = os.path.basename(file).split(".",1) 
 
     if len(ending)==1:
         ending ='txt'
     else:
         ending=ending[1]
+    if ending =='nc':
+        return xr.open_dataset(file)
+    if ending not in ['txt','','tenv3','txyz2']:
+        raise Exception('File of type *.'+ending+' not implemented')
+        
+    if cache_dir is not None:
+        cache_file = _cache_file(file,cache_dir,variable,resample)
+        if os.path.exists(cache_file):
+            with np.load(cache_file,allow_pickle=False) as cached:
+                data = pd.Series(cached['values'],index=pd.DatetimeIndex(cached['time']),name=cached['name'].item())
+                data.attrs = {key: float(cached[key]) for key in ['lat','lon'] if key in cached}
+            return data
+        
     if ending =='txt' or ending =='':
-        if variable=='auto':
-            variable='Height'
-        data=pd.read_csv(file,delim_whitespace=True)
-        data['Year']=pd.to_datetime(data['Year']-1970.,unit='Y')
-        data.set_index('Year',inplace=True)
-        data=data.resample(resample).mean()[variable] 
+        data = read_txt(file,variable='Height' if variable=='auto' else variable,resample=resample)
     elif ending =='tenv3':
-        if variable=='auto':
-            variable='____up(m)'
-        data=pd.read_csv(file,delim_whitespace=True,header=None)
-        data['Year']=pd.to_datetime(data[2]-1970.,unit='Y')
-        data.set_index('Year',inplace=True)
-        data=data.resample(resample).mean()[variable]   
+        data = read_tenv3(file,variable='____up(m)' if variable=='auto' else variable,resample=resample)
     elif ending =='txyz2':
-        if variable=='auto':
-            variable=3
-        file = 'discotimes/examples/HOB2'
-        data=pd.read_csv(file,delim_whitespace=True,header=None)
-        data['Year']=pd.to_datetime(data[2]-1970.,unit='Y')
-        data.set_index('Year',inplace=True)
-        data=data.resample(resample).mean()[variable]
-    elif ending =='nc':
-        data = xr.open_dataset(file)
-    else:
-        raise Exception('File of type *.'+ending+' not implemented')
+        data = read_txyz2(file,variable=3 if variable=='auto' else variable,resample=resample)
+        
+    if cache_dir is not None:
+        os.makedirs(cache_dir,exist_ok=True)
+        # write to a temporary file first, parallel readers never see partial files
+        temporary_file = cache_file[:-4]+'_'+str(os.getpid())+'_'+str(threading.get_ident())+'.npz'
+        np.savez(temporary_file,time=data.index.values,values=data.values,name=np.asarray(data.name),**data.attrs)
+        os.replace(temporary_file,cache_file)
     return data    
 
-def det_dot(a, b):
+def _read_station(file,variable='auto',resample='D',cache_dir=None):
     """
-    The theano dot product and NUTS sampler don't work with large matrices?
+    read a station file for read_files(), returns ID and series
+    """
+    data = file_reader(file,variable=variable,resample=resample,cache_dir=cache_dir)
+    if isinstance(data,xr.Dataset):
+        raise Exception('netcdf files are not supported by read_files: '+file)
+    return os.path.basename(file).split('.',1)[0],data
+
+def read_files(files,variable='auto',resample='D',time=None,locations=None,
+               workers=None,executor='thread',errors='raise',cache_dir=None):
+    """read many station files into a time*space DataArray
     
-    :param a: (np matrix)
-    :param b: (theano vector)
+    Files are parsed in parallel with file_reader, every series is placed 
+    on a common time axis and written into a single preallocated array.
+    
+    Parameters
+    ----------
+    files : str or list
+        glob pattern or list of files ('txt', 'tenv3', 'txyz2')
+    variable : str
+        variable to read from the files, see file_reader
+    resample : None or str
+        resampling frequency of the series and of the common time axis, 
+        None: no resampling
+    time : None or array of datetimes, default: None
+        common time axis, default: all epochs between the first and last 
+        epoch of all series with frequency resample (resample=None: all 
+        epochs of the series)
+    locations : None, dict or pd.DataFrame, default: None
+        station coordinates {ID: (lon, lat)} or DataFrame indexed by ID with 
+        columns 'lon' and 'lat', default: coordinates from the files (tenv3), 
+        stations without coordinates get NaN
+    workers : None or int, default: None
+        number of parallel workers, default: number of CPUs
+    executor : str, default: 'thread'
+        'thread' or 'process' pool
+    errors : str, default: 'raise'
+        'raise' or 'skip' files that cannot be read
+    cache_dir : None or str, default: None
+        binary parse cache, see file_reader
+        
+    Returns
+    -------
+    xarray.DataArray of time*space (dims: 'time', 'x') with coordinates lon, lat, ID
     """
-    return (a * b[None, :]).sum(axis=-1)
\ No newline at end of file
+    if isinstance(files,str):
+        files = sorted(glob.glob(files))
+    if len(files) == 0:
+        raise Exception('no files to read!')
+    
+    pool = concurrent.futures.ProcessPoolExecutor if executor == 'process' else concurrent.futures.ThreadPoolExecutor
+    reader = functools.partial(_read_station,variable=variable,resample=resample,cache_dir=cache_dir)
+    ids = []
+    series = []
+    with pool(max_workers=workers) as pool_:
+        futures = [pool_.submit(reader,file) for file in files]
+        for file,future in zip(files,futures):
+            try:
+                id_,data = future.result()
+            except Exception as error:
+                if errors != 'skip':
+                    raise
+                print('skip '+file+': '+str(error))
+                continue
+            ids.append(id_)
+            series.append(data)
+    if len(series) == 0:
+        raise Exception('none of the files could be read!')
+            
+    if time is None and resample is None:
+        # all epochs of the series
+        time = np.unique(np.concatenate([data.index.values for data in series]))
+    elif time is None:
+        time = pd.date_range(start=min(data.index[0] for data in series),
+                             end=max(data.index[-1] for data in series),freq=resample)
+    time = pd.DatetimeIndex(time)
+    
+    cube = np.full((len(time),len(series)),np.nan)
+    for i,data in enumerate(series):
+        indices = time.get_indexer(data.index)
+        valid = indices >= 0
+        cube[indices[valid],i] = data.values[valid]
+    
+    lon = np.asarray([data.attrs.get('lon',np.nan) for data in series],dtype=float)
+    lat = np.asarray([data.attrs.get('lat',np.nan) for data in series],dtype=float)
+    if locations is not None:
+        if isinstance(locations,pd.DataFrame):
+            locations = {id_: (row['lon'],row['lat']) for id_,row in locations.iterrows()}
+        for i,id_ in enumerate(ids):
+            if id_ in locations:
+                lon[i],lat[i] = locations[id_]
+    name = variable if isinstance(variable,str) and variable != 'auto' else 'data'
+    return xr.DataArray(cube,dims=('time','x'),name=name,
+                        coords={'time':time,'lon':('x',lon),'lat':('x',lat),'ID':('x',np.asarray(ids))})
@@ -20,6 +20,8 @@
 from matplotlib import pyplot as plt
 from bpca.utils import *
 
+plt.rc('axes', unicode_minus=False)
+
 
 def plot_synthetic_data_maps(data_set_synt,synthetic_data_settings,coastline,
                              validation=False,map_data=False,bpca_object=None,save=False,plt_dir='',indices=None):
@@ -0,0 +1,197 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#    cache: content-addressed store of compressed bpca results
+
+import os
+import json
+import shutil
+import pickle
+import hashlib
+import numpy as np
+
+# version of the stored entries, part of the cache key
+CACHE_VERSION = 2
+
+# settings (of any group) that do not change the result
+IGNORED_SETTINGS = ['cache_dir','cache_size','resource_settings','chunk_size']
+
+# attributes of a fitted bpca object stored besides the compressed trace
+# (model_settings: number_of_pcs of pruned components)
+STATE_ATTRIBUTES = ['random','chain_stats','convergence_stats','adaptation_state',
+                    'adaptive_sampling_stats','run_report','model_settings']
+
+
+def _canonical(value):
+    """
+    json representation of arrays (hash of the data) and other objects
+    """
+    if isinstance(value,np.ndarray):
+        return {'dtype':str(value.dtype),'shape':list(value.shape),
+                'sha256':hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()}
+    if isinstance(value,np.generic):
+        return value.item()
+    return repr(value)
+
+def settings_hash(settings):
+    """
+    hash of (nested) settings dicts, independent of the order of the keys
+    """
+    settings = {group: {key: value for key,value in values.items() if key not in IGNORED_SETTINGS}
+                if isinstance(values,dict) else values for group,values in settings.items()}
+    text = json.dumps(settings,sort_keys=True,default=_canonical)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class result_cache():
+    """Content-addressed store of compressed bpca results.
+
+    Entries are keyed by the hash of the observed data and of the
+    effective settings (see bpca.bpca.bpca._effective_settings), so the
+    same fit is only run once. Every entry is a directory with the compressed trace
+    (mean.nc, std.nc) and the remaining results (state.pickle). The
+    modification time of the entry records the last access, the least
+    recently used entries are removed when the store exceeds max_size.
+
+    Parameters
+    ----------
+    cache_dir : str
+        directory of the store
+    max_size : None or float, default: None
+        disk budget in MB, default: unlimited
+    """
+
+    def __init__(self,cache_dir,max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self,data_hash,settings):
+        """
+        key of the observed data (hash, see bpca.bpca.dataset_hash) and settings
+        """
+        key = repr((data_hash,settings_hash(settings),CACHE_VERSION))
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _entry(self,key):
+        return os.path.join(self.cache_dir,key)
+
+    def __contains__(self,key):
+        return os.path.exists(os.path.join(self._entry(key),'state.pickle'))
+
+    def load(self,key,target):
+        """load the stored result into the bpca object target
+
+        Returns
+        -------
+        True on a hit, False otherwise
+        """
+        if key not in self:
+            return False
+        import arviz as az
+        entry = self._entry(key)
+        with open(os.path.join(entry,'state.pickle'),'rb') as state_file:
+            state = pickle.load(state_file)
+        # load into memory, so the entry can be evicted while the result is used
+        target.trace = {op: az.from_netcdf(os.path.join(entry,op+'.nc')) for op in ['mean','std']}
+        for op in target.trace:
+            target.trace[op].load()
+        for name,value in state.items():
+            if name == 'run_report':
+                # the report of the current run records the loading, keep the cached one as info
+                target.run_report.info['cached_run_report'] = value.to_dict()
+                target.run_report.sampler = value.sampler
+            else:
+                setattr(target,name,value)
+        target.compressed = True
+        os.utime(entry)
+        return True
+
+    def store(self,key,source):
+        """
+        store the compressed result of the bpca object source and evict old entries
+        """
+        if not source.compressed:
+            raise Exception('only compressed results are cached, run compress() first!')
+        os.makedirs(self.cache_dir,exist_ok=True)
+        entry = self._entry(key)
+        temporary_entry = entry+'.'+str(os.getpid())+'.tmp'
+        os.makedirs(temporary_entry,exist_ok=True)
+        for op in ['mean','std']:
+            source.trace[op].to_netcdf(os.path.join(temporary_entry,op+'.nc'),compress=True)
+        with open(os.path.join(temporary_entry,'state.pickle'),'wb') as state_file:
+            pickle.dump({name: getattr(source,name) for name in STATE_ATTRIBUTES},
+                        state_file,pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.replace(temporary_entry,entry)
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        stored entries as list of (key, size [MB], last access [s since epoch]), least recently used first
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry(key)
+            if key.endswith('.tmp') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry,file)) for file in os.listdir(entry))
+            entries.append((key,size/1024.**2,os.path.getmtime(entry)))
+        return sorted(entries,key=lambda entry: entry[2])
+
+    def evict(self,keep=None):
+        """
+        remove the least recently used entries until the store fits max_size (MB)
+        """
+        if self.max_size is None:
+            return []
+        entries = self.entries()
+        total = sum(size for _,size,_ in entries)
+        removed = []
+        for key,size,_ in entries:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            self.invalidate(key)
+            total -= size
+            removed.append(key)
+        if len(removed) > 0:
+            print('evicted '+str(len(removed))+' cached results')
+        return removed
+
+    def invalidate(self,key=None):
+        """
+        remove the entry of key, all entries if key is None
+        """
+        keys = [entry[0] for entry in self.entries()] if key is None else [key]
+        for entry_key in keys:
+            if os.path.exists(self._entry(entry_key)):
+                shutil.rmtree(self._entry(entry_key))
+        # leftovers of interrupted writes
+        if key is None and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.tmp'):
+                    shutil.rmtree(os.path.join(self.cache_dir,name),ignore_errors=True)
+
+    def __repr__(self):
+        entries = self.entries()
+        return ('result_cache '+self.cache_dir+': '+str(len(entries))+' entries, '+
+                str(round(sum(size for _,size,_ in entries),1))+' MB')
@@ -0,0 +1,402 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#    changepoints: frequentist prescreening and posterior summaries for the discotimes models
+
+import numpy as np
+
+
+def _as_batch(x,y,mask=None):
+    """
+    station*time arrays of x, y and mask (single series are promoted)
+    """
+    x = np.atleast_2d(np.asarray(x,dtype=float))
+    y = np.atleast_2d(np.asarray(y,dtype=float))
+    if mask is None:
+        mask = np.isfinite(y)
+    mask = np.atleast_2d(np.asarray(mask,dtype=bool)) & np.isfinite(y) & np.isfinite(x)
+    return x,np.where(mask,y,0.),mask
+
+def _robust_slope(x,y,mask,lag):
+    """
+    median of lagged difference quotients of every station (insensitive to a few offsets)
+    """
+    valid = mask[:,lag:] & mask[:,:-lag]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        quotients = np.where(valid,(y[:,lag:]-y[:,:-lag])/(x[:,lag:]-x[:,:-lag]),np.nan)
+        slope = np.nanmedian(quotients,axis=1)
+    return np.where(np.isfinite(slope),slope,0.)
+
+def _segment_slope(x,y,mask,segment):
+    """
+    least-squares slope of every station with one intercept per segment
+    """
+    n_stations = x.shape[0]
+    n_segments = segment.max()+1
+    flat = (np.arange(n_stations)[:,None]*n_segments+segment)[mask]
+    counts = np.bincount(flat,minlength=n_stations*n_segments)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        x_mean = np.bincount(flat,weights=x[mask],minlength=n_stations*n_segments)/counts
+        y_mean = np.bincount(flat,weights=y[mask],minlength=n_stations*n_segments)/counts
+    x_c = x[mask]-x_mean[flat]
+    station = np.nonzero(mask)[0]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        slope = (np.bincount(station,weights=x_c*(y[mask]-y_mean[flat]),minlength=n_stations)/
+                 np.bincount(station,weights=x_c**2,minlength=n_stations))
+    return np.where(np.isfinite(slope),slope,0.)
+
+def _residuals(x,y,mask,slope):
+    """
+    residuals of a line with the given slopes, centred
+    """
+    residuals = np.where(mask,y-slope[:,None]*x,0.)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        mean_ = residuals.sum(axis=1)/mask.sum(axis=1)
+    return np.where(mask,residuals-np.where(np.isfinite(mean_),mean_,0.)[:,None],0.)
+
+def _robust_sigma(residuals,mask):
+    """
+    noise standard deviation from the MAD of first differences (insensitive to offsets)
+    """
+    diff = np.diff(residuals,axis=1)
+    valid = mask[:,1:] & mask[:,:-1]
+    diff = np.where(valid,diff,np.nan)
+    with np.errstate(invalid='ignore'):
+        mad = np.nanmedian(abs(diff-np.nanmedian(diff,axis=1)[:,None]),axis=1)
+    sigma = mad*1.4826/np.sqrt(2.)
+    return np.where(np.isfinite(sigma) & (sigma > 0),sigma,1.)
+
+def _binary_segmentation(x,residuals,mask,threshold,factor,max_changepoints,min_size):
+    """
+    offsets of all stations by binary segmentation, returns the segment start indicators (station*time+1)
+    """
+    n_stations,time_dim = residuals.shape
+    index = np.arange(time_dim)
+    C = np.concatenate([np.zeros((n_stations,1)),np.cumsum(residuals,axis=1)],axis=1)
+    N = np.concatenate([np.zeros((n_stations,1)),np.cumsum(mask,axis=1)],axis=1)
+    is_start = np.zeros((n_stations,time_dim+1),dtype=bool)
+    is_start[:,0] = True
+    is_start[:,-1] = True
+    active = np.ones(n_stations,dtype=bool)
+    rows = np.arange(n_stations)
+    for _ in range(max_changepoints):
+        # segment [a,b) containing every candidate split t (split before t)
+        a = np.maximum.accumulate(np.where(is_start[:,:-1],index,0),axis=1)
+        b = np.minimum.accumulate(np.where(is_start[:,:0:-1],index[::-1]+1,time_dim),axis=1)[:,::-1]
+        S_l = C[:,:-1]-np.take_along_axis(C,a,axis=1)
+        n_l = N[:,:-1]-np.take_along_axis(N,a,axis=1)
+        S_r = np.take_along_axis(C,b,axis=1)-C[:,:-1]
+        n_r = np.take_along_axis(N,b,axis=1)-N[:,:-1]
+        with np.errstate(invalid='ignore',divide='ignore'):
+            gain = S_l**2/n_l + S_r**2/n_r - (S_l+S_r)**2/(n_l+n_r)
+        valid = (n_l >= min_size) & (n_r >= min_size) & mask & ~is_start[:,:-1]
+        gain = np.where(valid,gain/factor,-np.inf)
+        best = np.argmax(gain,axis=1)
+        accept = active & (gain[rows,best] > threshold)
+        if not accept.any():
+            break
+        is_start[rows[accept],best[accept]] = True
+        active = accept
+    return is_start
+
+def prescreen_changepoints(x,y,mask=None,max_changepoints=5,penalty=3.,min_size=5,
+                           events=None,event_window=None,event_penalty_factor=0.5,n_iterations=2):
+    """vectorized binary segmentation of offsets on residuals of a linear trend
+
+    All stations are processed at once: in every iteration the best split of
+    any segment is computed for every station (with cumulative sums) and
+    accepted if the reduction of the squared residuals exceeds
+    penalty * sigma**2 * log(n), sigma is a robust noise estimate. The trend 
+    is first estimated robustly (median of lagged difference quotients) and 
+    then refined with one intercept per detected segment (n_iterations).
+
+    Parameters
+    ----------
+    x, y : np.array() of time or station*time
+        epochs and observations, e.g. stacked_observed.x and .y
+    mask : None or np.array(), default: None
+        True at observations, default: finite y
+    max_changepoints : int
+        maximum number of changepoints per station
+    penalty : float
+        penalty factor of a new changepoint
+    min_size : int
+        minimum number of observations between changepoints
+    events : None, array or list of arrays, default: None
+        epochs of known events (e.g. earthquakes, equipment changes) of all
+        stations or a list with one array per station, the penalty is reduced
+        by event_penalty_factor within event_window
+    event_window : None or float, default: None
+        window around events (units of x), default: median sampling interval
+    n_iterations : int
+        number of alternating trend and segmentation estimates
+
+    Returns
+    -------
+    dict with 'n_changepoints' (station), 'positions' and 'offsets'
+    (station*max_changepoints, NaN padded, sorted by position) and 'sigma'
+    """
+    x,y,mask = _as_batch(x,y,mask)
+    n_stations,time_dim = y.shape
+    n = mask.sum(axis=1)
+    # lag of the robust slope: long enough to average the noise, short compared to segments
+    lag = int(np.clip(np.median(n)//(2*(max_changepoints+1)),1,max(time_dim-1,1)))
+    residuals = _residuals(x,y,mask,_robust_slope(x,y,mask,lag))
+    sigma = _robust_sigma(residuals,mask)
+    threshold = penalty*sigma**2*np.log(np.maximum(n,2))
+
+    # penalty factor of a split before epoch t
+    factor = np.ones((n_stations,time_dim))
+    if events is not None:
+        if event_window is None:
+            diff = np.diff(x,axis=1)[mask[:,1:] & mask[:,:-1]]
+            event_window = np.median(diff) if len(diff) > 0 else 0.
+        if not isinstance(events,list):
+            events = [events]*n_stations
+        for i,station_events in enumerate(events):
+            station_events = np.atleast_1d(np.asarray(station_events,dtype=float))
+            if station_events.size > 0:
+                near = (abs(x[i][:,None]-station_events[None,:]) <= event_window).any(axis=1)
+                factor[i,near] = event_penalty_factor
+
+    for iteration in range(max(n_iterations,1)):
+        is_start = _binary_segmentation(x,residuals,mask,threshold,factor,max_changepoints,min_size)
+        segment = np.cumsum(is_start[:,:-1],axis=1)-1
+        if iteration < n_iterations-1:
+            residuals = _residuals(x,y,mask,_segment_slope(x,y,mask,segment))
+
+    index = np.arange(time_dim)
+    rows = np.arange(n_stations)
+    positions = np.full((n_stations,max_changepoints),np.nan)
+    offsets = np.full((n_stations,max_changepoints),np.nan)
+    station_index,split_index = np.nonzero(is_start[:,1:-1])
+    split_index = split_index+1
+    n_changepoints = np.bincount(station_index,minlength=n_stations)
+    rank = np.arange(len(station_index))-np.concatenate([[0],np.cumsum(n_changepoints)[:-1]])[station_index]
+    # changepoint between the last epoch before and the first epoch after the split
+    previous = np.maximum.accumulate(np.where(mask,index,0),axis=1)[station_index,split_index-1]
+    positions[station_index,rank] = (x[station_index,previous]+x[station_index,split_index])/2.
+    # offsets: difference of the mean residuals of adjacent segments
+    n_segments = segment.max()+1
+    flat = (rows[:,None]*n_segments+segment)[mask]
+    sums = np.bincount(flat,weights=residuals[mask],minlength=n_stations*n_segments)
+    counts = np.bincount(flat,minlength=n_stations*n_segments)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        means = (sums/counts).reshape(n_stations,n_segments)
+    offsets[station_index,rank] = means[station_index,rank+1]-means[station_index,rank]
+    return {'n_changepoints':n_changepoints,'positions':positions,'offsets':offsets,'sigma':sigma}
+
+def initial_values_from_prescreening(prescreening,x,additional_changepoints=1,min_changepoints=1,mask=None):
+    """initial_values for discotimes_model (one dict per station) from prescreen_changepoints()
+
+    Every station gets n_changepoints = detected + additional_changepoints
+    (at least min_changepoints); undetected changepoints start with zero
+    offsets at equally spaced positions, p_ is the fraction of detected changepoints.
+
+    Parameters
+    ----------
+    prescreening : dict
+        output of prescreen_changepoints
+    x : np.array() of time or station*time
+        epochs
+
+    Returns
+    -------
+    list of dicts {'n_changepoints','p_','positions','offsets'}
+    """
+    x = np.atleast_2d(np.asarray(x,dtype=float))
+    if mask is None:
+        mask = np.isfinite(x)
+    initial_values = []
+    for i,detected in enumerate(prescreening['n_changepoints']):
+        n_changepoints = max(int(detected)+additional_changepoints,min_changepoints)
+        x_i = x[i][np.atleast_2d(mask)[i]]
+        positions = np.linspace(x_i.min(),x_i.max(),n_changepoints+2)[1:-1]
+        offsets = np.zeros(n_changepoints)
+        positions[:detected] = prescreening['positions'][i,:detected]
+        offsets[:detected] = prescreening['offsets'][i,:detected]
+        p_ = float(np.clip(detected/n_changepoints,0.05,0.95))
+        initial_values.append({'n_changepoints':n_changepoints,'p_':p_,
+                               'positions':positions,'offsets':offsets})
+    return initial_values
+
+def stack_initial_values(initial_values):
+    """
+    initial_values of discotimes_batch_model from a list of initial_values of single stations
+    (padded with inactive changepoints to the largest number of changepoints, p_ as column)
+    """
+    n_changepoints = max(len(values['offsets']) for values in initial_values)
+    positions = np.empty((len(initial_values),n_changepoints))
+    offsets = np.zeros((len(initial_values),n_changepoints))
+    for i,values in enumerate(initial_values):
+        k = len(values['offsets'])
+        positions[i,:k] = values['positions']
+        positions[i,k:] = values['positions'][-1] if k > 0 else np.nan
+        offsets[i,:k] = values['offsets']
+    p_ = np.asarray([values['p_'] for values in initial_values])[:,None]
+    return {'n_changepoints':n_changepoints,'p_':p_,'positions':positions,'offsets':offsets}
+
+def posterior_changepoints(trace):
+    """positions, offsets and activity of all draws as station*sample*changepoint arrays
+
+    Parameters
+    ----------
+    trace : arviz.InferenceData or dict
+        trace of discotimes_model (chain*draw*changepoint) or of
+        discotimes_batch_model (chain*draw*station*changepoint), a dict
+        needs the arrays 'positions', 'offsets' and 'mult'
+
+    Returns
+    -------
+    positions, offsets, active (bool)
+    """
+    posterior = getattr(trace,'posterior',trace)
+    arrays = []
+    for name in ['positions','offsets','mult']:
+        values = np.asarray(posterior[name])
+        if values.ndim == 3:
+            values = values[:,:,np.newaxis,:]
+        # chain*draw*station*changepoint -> station*sample*changepoint
+        values = values.reshape(-1,values.shape[2],values.shape[3]).transpose(1,0,2)
+        arrays.append(values)
+    positions,offsets,active = arrays
+    return positions,offsets,active > 0.5
+
+def changepoint_histogram(trace,bins=50,range_=None):
+    """posterior histogram of active changepoint epochs of all stations
+
+    Parameters
+    ----------
+    bins : int or np.array()
+        number of bins or bin edges
+    range_ : None or tuple
+        (min, max) of the bins, default: range of the active positions
+
+    Returns
+    -------
+    histogram (station*bins, expected number of changepoints per bin), bin edges
+    """
+    positions,offsets,active = posterior_changepoints(trace)
+    n_stations,n_samples,_ = positions.shape
+    if np.ndim(bins) == 0:
+        if range_ is None:
+            range_ = (np.min(positions[active]),np.max(positions[active])) if active.any() else (0.,1.)
+        bins = np.linspace(range_[0],range_[1],int(bins)+1)
+    bins = np.asarray(bins,dtype=float)
+    n_bins = len(bins)-1
+    station_index = np.broadcast_to(np.arange(n_stations)[:,None,None],positions.shape)[active]
+    bin_index = np.searchsorted(bins,positions[active],side='right')-1
+    # the last bin includes its right edge
+    bin_index = np.where(positions[active] == bins[-1],n_bins-1,bin_index)
+    inside = (bin_index >= 0) & (bin_index < n_bins)
+    counts = np.bincount(station_index[inside]*n_bins+bin_index[inside],minlength=n_stations*n_bins)
+    return counts.reshape(n_stations,n_bins)/n_samples,bins
+
+def window_probability(trace,start,end):
+    """posterior probability of at least one active changepoint in [start, end)
+
+    start, end : float or np.array() of size station
+
+    Returns
+    -------
+    np.array() of size station
+    """
+    positions,offsets,active = posterior_changepoints(trace)
+    start = np.reshape(np.broadcast_to(start,positions.shape[:1]),(-1,1,1))
+    end = np.reshape(np.broadcast_to(end,positions.shape[:1]),(-1,1,1))
+    inside = active & (positions >= start) & (positions < end)
+    return inside.any(axis=2).mean(axis=1)
+
+def _group_quantiles(groups,values,n_groups,quantiles):
+    """
+    quantiles (linear interpolation) of values within groups, returns n_groups*len(quantiles)
+    """
+    order = np.lexsort((values,groups))
+    groups,values = groups[order],values[order]
+    counts = np.bincount(groups,minlength=n_groups)
+    starts = np.concatenate([[0],np.cumsum(counts)[:-1]])
+    result = np.full((n_groups,len(quantiles)),np.nan)
+    has_values = counts > 0
+    for i,q in enumerate(quantiles):
+        position = q*(counts[has_values]-1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position-lower
+        result[has_values,i] = ((1-fraction)*values[starts[has_values]+lower] +
+                                fraction*values[starts[has_values]+upper])
+    return result
+
+def changepoint_events(trace,bandwidth=None,min_probability=0.5,credible_interval=0.95):
+    """clustered changepoint events with offsets and credible intervals of all stations
+
+    Active changepoints of all draws are sorted in time and clustered per
+    station where consecutive positions are closer than bandwidth. The
+    probability of an event is the fraction of draws with at least one
+    changepoint in the cluster, its offset is the sum of the offsets of a
+    draw within the cluster.
+
+    Parameters
+    ----------
+    bandwidth : None or float
+        maximum distance of positions within a cluster (units of x),
+        default: 1 % of the range of the active positions
+    min_probability : float
+        minimum probability of a returned event
+    credible_interval : float
+        probability mass of the credible intervals
+
+    Returns
+    -------
+    dict of np.arrays (one entry per event): 'station', 'time', 'time_lower',
+    'time_upper', 'probability', 'offset', 'offset_lower', 'offset_upper'
+    """
+    positions,offsets,active = posterior_changepoints(trace)
+    n_stations,n_samples,_ = positions.shape
+    keys = ['station','time','time_lower','time_upper','probability','offset','offset_lower','offset_upper']
+    if not active.any():
+        return {key: np.empty(0) for key in keys}
+    station_index,sample_index,_ = np.nonzero(active)
+    times = positions[active]
+    values = offsets[active]
+    if bandwidth is None:
+        bandwidth = 0.01*(times.max()-times.min()) or 1.
+
+    order = np.lexsort((times,station_index))
+    station_index,sample_index,times,values = (station_index[order],sample_index[order],
+                                                times[order],values[order])
+    new_cluster = np.concatenate([[True],(station_index[1:] != station_index[:-1]) |
+                                  (np.diff(times) > bandwidth)])
+    cluster = np.cumsum(new_cluster)-1
+    n_clusters = cluster[-1]+1
+    cluster_station = station_index[new_cluster]
+
+    # draws with at least one changepoint in the cluster, offsets summed per draw
+    cluster_draw,draw_index = np.unique(cluster*n_samples+sample_index,return_inverse=True)
+    draw_offsets = np.bincount(draw_index,weights=values,minlength=len(cluster_draw))
+    draw_cluster = cluster_draw//n_samples
+    probability = np.bincount(draw_cluster,minlength=n_clusters)/n_samples
+
+    tail = (1-credible_interval)/2.
+    time_quantiles = _group_quantiles(cluster,times,n_clusters,[0.5,tail,1-tail])
+    offset_quantiles = _group_quantiles(draw_cluster,draw_offsets,n_clusters,[0.5,tail,1-tail])
+    selected = probability >= min_probability
+    return {'station':cluster_station[selected],
+            'time':time_quantiles[selected,0],'time_lower':time_quantiles[selected,1],
+            'time_upper':time_quantiles[selected,2],'probability':probability[selected],
+            'offset':offset_quantiles[selected,0],'offset_lower':offset_quantiles[selected,1],
+            'offset_upper':offset_quantiles[selected,2]}
@@ -26,20 +26,28 @@ def set_settings(external_settings={}):
     Parameters
     ----------
     external_settings: dict,
-        can contain dicts: 'model_settings', 'run_settings', 'initial_run_settings'
+        can contain dicts: 'model_settings', 'run_settings', 'initial_run_settings', 'pipeline_settings'
     """
     
     settings={}
     settings['model_settings']   = model_settings(external_settings=external_settings)
     settings['run_settings']   = run_settings(external_settings=external_settings)        
     settings['normalization_settings']   = normalization_settings(external_settings=external_settings)  
+    settings['pipeline_settings']   = pipeline_settings(external_settings=external_settings)  
     
     return settings
 
 def run_settings(external_settings={}):
     specs={'n_samples':4000,'compress':True,'adjust_pca_symmetry':True,'check_convergence':True,
            'sample_settings':{'tune':2000,'cores':4,
-                      'target_accept':0.9,'return_inferencedata':True,'max_treedepth':15 }}
+                      'target_accept':0.9,'return_inferencedata':True,'max_treedepth':15 },
+           'update_settings':{'n_samples':1000,'tune':200,'initial_weight':50},
+           'export_adaptation_state':True,'adaptation_state':None,
+           'adaptation_settings':{'tune':300,'initial_weight':50,'dense_mass':False},
+           'adaptive_sampling':False,'cache_dir':None,'cache_size':None,'resource_settings':{},
+           'prune_components':True,'component_threshold':0.05,
+           'adaptive_settings':{'increment':1000,'max_samples':20000,'time_budget':None,
+                                'r_hat':1.01,'ess_bulk':400,'variables':['PC0','W0','trend_g','sigma']}}
 
     if 'run_settings' in external_settings:
         for item in external_settings['run_settings']:
@@ -48,12 +56,38 @@ def run_settings(external_settings={}):
 
 def normalization_settings(external_settings={}):
     
-    specs={}
+    specs={'center':None,'scale':None,'group_index':None,'outlier_threshold':None,
+           'detrend':False,'gap_statistics':False,'chunk_size':None}
     if 'normalization_settings' in external_settings:
         for item in external_settings['normalization_settings']:
             specs[item]=external_settings['normalization_settings'][item]  
     return specs          
 
+def pipeline_settings(external_settings={}):
+    """
+    settings of the discotimes pipeline (bpca.pipeline.run_pipeline), 
+    model_settings are passed to discotimes_model
+    """
+    specs={'workers':None,'chains':2,'chain_cores':1,'blas_threads':1,
+           'n_samples':2000,'tune':2000,'sample_settings':{'target_accept':0.9},
+           'variable':'auto','resample':'D','cache_dir':None,'compile_dir':None,'min_observations':50,
+           'model_settings':{'change_trend':True,'n_changepoints':5,'annual_cycle':True}}
+    if 'pipeline_settings' in external_settings:
+        for item in external_settings['pipeline_settings']:
+            specs[item]=external_settings['pipeline_settings'][item]  
+    return specs
+
+def resource_settings(external_settings={}):
+    """
+    process-wide defaults of the CPU resource manager (bpca.resources.configure), 
+    runs override them with run_settings['resource_settings']
+    """
+    specs={'manage':True,'max_cores':None,'blas_threads':None}
+    if 'resource_settings' in external_settings:
+        for item in external_settings['resource_settings']:
+            specs[item]=external_settings['resource_settings'][item]  
+    return specs
+
 def model_settings(external_settings={}):
     
     specs = {'number_of_pcs' :3,'model_trend':True,'sigma_random_walk':0.001,
@@ -61,7 +95,8 @@ def model_settings(external_settings={}):
                       'initialize_trend_pattern':False,'estimate_offsets':False,
                       'trend_factor_sigma':0.01,'trend_factor_nu':2.1,
                       'trend_distr':'normal','cluster_index':None,'sigma':0.4,'sigma_offset':0.1,
-                      'sigma_eofs':0.15,'sigma_random_walk_factor':0.04}  
+                      'sigma_eofs':0.15,'sigma_random_walk_factor':0.04,'chunk_size':None,
+                      'AR1':False,'ARD':False,'ard_global_scale':1.}  
     if 'model_settings' in external_settings:
         for item in external_settings['model_settings']:
             specs[item]=external_settings['model_settings'][item]  
@@ -16,15 +16,251 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from theano.tensor import *
+# models import Theano and PyMC3, bpca.bpca and bpca.pipeline import this module on first model build
 from theano import tensor
-from arviz import *
-import pickle
-import pandas as pd
 import numpy as np
 import pymc3 as pm
+from bpca.observed import observed_series
+from bpca.bpca import sparse_observations, load_observed
 
                     
+class bpca_model(pm.model.Model):
+    """ PyMC model for Bayesian Principal Component analysis.
+    
+    Parameters
+    ----------
+    observed: xarray.DataArray of time*space dimensions or sparse_observations,
+        with sparse_observations the likelihood is evaluated at the observed 
+        entries only and no (time*space) Estimates are stored; formal errors 
+        of sparse_observations (errors) are combined with the estimated noise, 
+        sqrt(sigma**2 + errors**2) (with AR1: with the conditional innovation 
+        standard deviation, see AR1)
+    
+    name: str, default: True,
+        model name
+    
+    model_trend :  bool, default: False
+        estimate trend or not        
+        
+    number_of_pcs: int,
+        number of modelled pcs
+    
+    sigma: float,
+        variance prior 
+        
+    sigma_offset: float,
+        offset-variance prior 
+        
+    sigma_random_walk: float,
+        random walk innovations prior 
+        
+    sigma_random_walk_factor: float,
+        factor by which sigma_random_walk is divided for subsequent PCs;
+        sets some prior contraints, such thus the first EOFs capture most of the variance.
+        e.g. if sigma_random_walk_factor is 2 and sigma_random_walk is 2,
+        then sigma_random_walk(PC1) = 2; sigma_random_walk(PC2) = 1; sigma_random_walk(PC3) = 0.5 ...
+            
+    sigma_eofs: float,
+        EOF variance prior 
+            
+    trend_factor_sigma: float,
+        trend-variance prior 
+        
+    trend_factor_nu: float,
+        trend-shape prior parameter for Student's T distribution
+    
+    trend_distr: str,
+        'student_t' or 'normal'
+    
+    estimate_point_variance :  bool, default: False,
+        estimate variance (sigma) at every point
+        
+    estimate_cluster_sigma :  bool, default: False,
+        estimate variance (sigma) for different clusters      
+    
+    trend_pattern :  None or np.array() of size space_dim, default: None,
+        prior of trend pattern, initialize trends
+    
+    initialize_trend_pattern :  bool, default: False,
+        enable trend initialization
+    
+    estimate_offsets :  bool, default: True,    
+        estimate constant offsets (at every location),        
+        
+    estimate_cluster_sigma :  bool, default: False,    
+        estimate variance for different cluster (in space)
+        
+    estimate_sigma_eof : bool, default: True,
+        estimate hierarchical sigma for eof pattern
+        
+    cluster_index :  None or np.array(), default: None,    
+        array of cluster indices (0,1,2,...) indicating the clusters for which sigma should be computed,
+        'sigma_hier' is ordered by the sorted cluster labels
+        
+    chunk_size :  None or int, default: None,
+        number of time steps read at once from lazy (dask- or Zarr-backed) observed data
+        
+    AR1 :  bool, default: False,
+        AR(1) noise of the residuals of every station (one autocorrelation 'AR1_beta' 
+        at a lag of one time step), gaps are handled exactly (see models.ar1_conditional). 
+        Dense observed data are converted to sparse_observations, so the 
+        (time*space) 'Estimates' are not stored (see bpca.recombine_datasets). 
+        Formal errors are approximated as white noise added to the conditional 
+        innovations, sqrt(sigma_cond**2 + errors**2): the residuals of the 
+        previous observation still contain its measurement error, which is 
+        not removed from the conditional mean, so large errors bias 'AR1_beta' 
+        towards 0 (exact treatment: AR(1) plus white noise, i.e. ARMA(1,1))
+        
+    ARD :  bool, default: False,
+        automatic relevance determination: the EOF of every component is 
+        multiplied by a relevance 'ard_relevance' = 'ard_lambda' * 'ard_tau' 
+        (half-Cauchy local and global scales), so that components not needed 
+        are shrunk towards zero; choose a generous number_of_pcs and remove 
+        the inactive components after the run (bpca.prune_components). 
+        Non-centred parameterization: the PCs keep their random walk prior 
+        and the sampled patterns 'W_raw<i>' their prior scale (sigma_eof), 
+        'W<i>' = 'ard_relevance'[i] * 'W_raw<i>' is deterministic, which avoids 
+        the funnel of a relevance scaling both priors
+        
+    ard_global_scale :  float, default: 1.,
+        scale of the global half-Cauchy relevance 'ard_tau', small values shrink more
+        
+    """
+                                
+    def __init__(self, 
+                 observed=None,
+                 name='',
+                 model_trend=True,
+                 number_of_pcs = 3 ,
+                 sigma=0.4, 
+                 sigma_offset =0.2, 
+                 sigma_random_walk=0.1,
+                 sigma_random_walk_factor=2,
+                 sigma_eofs=0.2,
+                 trend_factor_sigma=0.001, 
+                 trend_factor_nu=2.1303,
+                 trend_distr='student_t',
+                 estimate_point_variance=False,
+                 estimate_cluster_sigma=False,
+                 trend_pattern=None,
+                 initialize_trend_pattern=False,
+                 estimate_offsets=False,
+                 estimate_sigma_eof=True,
+                 cluster_index=None,
+                 chunk_size=None,
+                 AR1=False,
+                 ARD=False,
+                 ard_global_scale=1.,
+                 **kwargs):
+
+        super().__init__(name)
+
+        if AR1 and not isinstance(observed,sparse_observations):
+            print('AR1: observed data are used as sparse_observations, Estimates are not stored')
+            observed = sparse_observations.from_dataarray(observed,chunk_size=chunk_size)
+        sparse = isinstance(observed,sparse_observations)
+        errors = None
+        if sparse:
+            Y = observed.values
+            time_index,space_index = observed.time_index,observed.space_index
+            errors = observed.errors
+            time_dim,space_dim = observed.shape
+            if AR1:
+                # residual series of every station in time order
+                order = np.lexsort((time_index,space_index))
+                Y,time_index,space_index = Y[order],time_index[order],space_index[order]
+                if errors is not None:
+                    errors = errors[order]
+        else:
+            # time vs space, lazy data are loaded block by block into a single array, NaNs are masked by pymc3
+            Y = load_observed(observed,chunk_size=chunk_size)
+            time_dim,space_dim=Y.shape
+
+        with pm.Model() as model:
+            if estimate_offsets:
+                offset = pm.Normal("offset", 0,sigma=sigma_offset,shape = space_dim)                                
+            else:
+                offset = np.empty(space_dim)*0
+            sigma_eofs = np.asarray([sigma_eofs]*number_of_pcs,dtype=float)
+            if ARD:
+                ard_tau = pm.HalfCauchy('ard_tau', beta=ard_global_scale)
+                ard_lambda = pm.HalfCauchy('ard_lambda', beta=1., shape=number_of_pcs)
+                relevance = pm.Deterministic('ard_relevance', ard_lambda*ard_tau)
+            if estimate_sigma_eof:
+                sigma_eofs  = pm.HalfNormal('sigma_eof',sigma=sigma_eofs,shape = number_of_pcs)                
+            if estimate_point_variance:
+                if estimate_cluster_sigma:
+                    # gather of the cluster sigma of every station
+                    labels,station_cluster = np.unique(cluster_index,return_inverse=True)
+                    number_of_cluster= len(labels)
+                    print('estimate different sigma for different clusters')
+                    sigma_hier = pm.HalfNormal('sigma_hier',sigma=sigma,shape = number_of_cluster)
+                    sigma = pm.Deterministic("sigma", sigma_hier[station_cluster.ravel()])
+                    
+                else:
+                    sigma=pm.HalfNormal('sigma',sigma=sigma,shape = space_dim)
+            else:                
+                sigma=pm.HalfNormal('sigma',sigma=sigma)
+            PCS_EOFs_mult= 0 
+            for i in range(number_of_pcs):
+                PC = pm.GaussianRandomWalk("PC"+str(i), mu=0,sd=sigma_random_walk, shape=time_dim)
+                if ARD:
+                    # non-centred, the relevance only scales the pattern
+                    W_raw = pm.Normal("W_raw"+str(i), 0,sigma=sigma_eofs[i],shape = space_dim)
+                    W = pm.Deterministic("W"+str(i), relevance[i]*W_raw)
+                else:
+                    W = pm.Normal("W"+str(i), 0,sigma=sigma_eofs[i],shape = space_dim)
+                if sparse:
+                    PCS_EOFs_mult=PC[time_index]*W[space_index] + PCS_EOFs_mult
+                else:
+                    PCS_EOFs_mult=pm.math.matrix_dot(PC[:,np.newaxis],W[np.newaxis,:])+ PCS_EOFs_mult
+                    
+                sigma_random_walk=sigma_random_walk/sigma_random_walk_factor    
+                         
+            if model_trend:
+                
+                mu_trend=0                 
+                if initialize_trend_pattern:
+                    mu_trend=trend_pattern
+                    
+                if trend_distr=='student_t':
+                    trend_pattern = pm.StudentT("trend_g", mu=mu_trend,sigma=trend_factor_sigma,nu=trend_factor_nu,shape = space_dim)
+                else:
+                    trend_pattern = pm.Normal("trend_g", mu_trend,sigma=trend_factor_sigma,shape = space_dim)                    
+                shift=-6 # so time series is centered to 2014
+                trend_series = np.linspace(-time_dim/2 + shift,time_dim-1-time_dim/2 + shift,time_dim)
+                if sparse:
+                    trend = trend_series[time_index]*trend_pattern[space_index]
+                else:
+                    trend = pm.math.matrix_dot(trend_series[:,np.newaxis],trend_pattern[np.newaxis,:])
+                
+                PCS_EOFs_mult=PCS_EOFs_mult + trend
+            
+            if sparse:
+                mu = PCS_EOFs_mult + offset[space_index]
+                if estimate_point_variance:
+                    sigma = sigma[space_index]
+            else:
+                mu = pm.Deterministic("Estimates",   PCS_EOFs_mult + 
+                                              offset[np.newaxis,:])
+
+            if AR1:
+                beta = pm.Uniform('AR1_beta', lower=0, upper=1)
+                first = np.concatenate([[True],space_index[1:] != space_index[:-1]])
+                dt = np.concatenate([[0.],np.diff(time_index)])
+                mu,sigma = ar1_conditional(mu,Y,dt,beta,sigma,dt_ref=1.,first=first)
+            
+            if errors is not None:
+                # known errors of the observations and estimated noise are independent; 
+                # with AR1 an approximation, the errors are not propagated through the 
+                # conditional mean (see AR1 in the docstring)
+                sigma = tensor.sqrt(sigma**2 + errors**2)
+
+            Y_obs = pm.Normal('Observations', mu=mu, sigma=sigma, observed=Y)    
+            
+            
+          
+            
 class discotimes_model(pm.model.Model):
     # 1) override init
     
@@ -35,7 +271,8 @@ class discotimes_model(pm.model.Model):
     def __init__(self, observed=None,name='',change_trend=False,n_changepoints=5,offsets_std=1,p_=0.1,
                       sigma_noise=1.,trend_inc_sigma=0.01,annual_cycle=False,change_offsets=True,
                  estimate_offset_sigma=False,estimate_trend_inc_sigma=False,post_seismic=False,
-                 AR1=False,distribute_offsets=False,robust_reg=False,initial_values={},**kwargs):
+                 AR1=False,distribute_offsets=False,robust_reg=False,initial_values={},
+                 changepoint_model='bernoulli',step_width=None,**kwargs):
         
         """Requires parameters as defined in model_settings
         
@@ -43,8 +280,8 @@ class discotimes_model(pm.model.Model):
         Parameters
         ----------
         
-        observed : discotimes.observed
-            observed object
+        observed : observed_series
+            observed object (with .x, .y and .month_index or .X_mat)
         name : str
             Name of the data/model
         change_trend : bool
@@ -69,8 +306,11 @@ class discotimes_model(pm.model.Model):
             Turn on/off estimating hyperparameter trend-inc. sigma   
         post_seismic : bool
             Turn on/off post-seismic module ! to be implemented
-        AR1 : bool
-            Turn on/off AR1 model, if false, only white noise is estimated
+        AR1 : bool or str
+            Turn on/off AR1 model, if false, only white noise is estimated; 
+            True: pm.AR of the residuals (one lag per observation, beta ~ HalfNormal(0.4)), 
+            'exact': exact for irregular sampling and gaps (see ar1_conditional), 
+            beta ~ Uniform(0,1) is the lag-1 autocorrelation at the median time step
         distribute_offsets : bool
             Turn on/off equally distribute offsets in the beginning        
         robust_reg : bool
@@ -78,6 +318,13 @@ class discotimes_model(pm.model.Model):
         initial_values : dict
             dictionary of initial conditions e.g. 
             {'n_changepoints':n_changepoints,'p_':p_,'positions':positions,'offsets':offsets}
+        changepoint_model : str
+            'bernoulli': changepoints are switched on/off by Bernoulli variables (compound step), 
+            'relaxed': sigmoid steps and horseshoe shrinkage of offsets and trend increments 
+            (p_ is the global shrinkage scale), the model is continuous and runs with pure NUTS
+        step_width : None or float
+            width of the sigmoid steps (changepoint_model='relaxed') in units of x, 
+            default: median sampling interval
         
         """
         super().__init__(name)
@@ -90,7 +337,9 @@ class discotimes_model(pm.model.Model):
         xmax=np.max(x)
         
         
-        X_mat=observed.X_mat
+        # month index of the annual cycle (gather), dense X_mat of other observed objects
+        month_index=getattr(observed,'month_index',None)
+        X_mat=observed.X_mat if month_index is None else None
         
         if 'offsets' in initial_values:
             # integrate pre-defined offsets
@@ -100,56 +349,81 @@ class discotimes_model(pm.model.Model):
             estimate_offset_sigma=False
             offsets_mu=initial_values['offsets']
             p_=initial_values['p_']
+            n_changepoints=initial_values.get('n_changepoints',len(initial_values['offsets']))
             start = {'offsets': initial_values['offsets'], 'positions': initial_values['positions']}
 
         else:
             offsets_mu=0
             start={}
+        positions_init=_positions_testval(start.get('positions',None),xmin,xmax)
 
+        relaxed = changepoint_model == 'relaxed'
+        if changepoint_model not in ['bernoulli','relaxed']:
+            raise Exception('changepoint_model '+changepoint_model+' not implemented')
+        
         # Priors for model parameters
         offset = pm.Normal('offset', mu=0, sigma=1)
         trend = pm.Normal('trend', mu=0, sigma=1) 
         sigma = pm.HalfNormal('sigma', sigma=sigma_noise)   
-        act_number = pm.Bernoulli('act_number', p = p_, shape=n_changepoints)
 
         if not change_offsets:
             mult_offsets=0.
         else:
             mult_offsets=1. 
 
-        if estimate_offset_sigma: # estimate one distribution for multiple offsets
-            offset_sigma = pm.HalfNormal('offset_sigma', sigma=offsets_std)   
-            offsets = pm.Normal('offsets', mu=offsets_mu, sigma=offset_sigma,
-                                shape=n_changepoints)*mult_offsets   
-            
-        else: # estimate multiple distributions for multiple offsets
-            offsets = pm.Normal('offsets', mu=offsets_mu, sigma=offsets_std,
-                                shape=n_changepoints)*mult_offsets  
+        if relaxed:
+            # continuous relaxation: horseshoe shrinkage instead of Bernoulli switches
+            offsets,activity = horseshoe('offsets',n_changepoints,scale=offsets_std,global_scale=p_,
+                                         testval=offsets_mu)
+            offsets=offsets*mult_offsets
+            mult=pm.Deterministic('mult', (activity> 0.5)*1) # changepoints which are not shrunk
+        else:
+            act_number = pm.Bernoulli('act_number', p = p_, shape=n_changepoints)
+            if estimate_offset_sigma: # estimate one distribution for multiple offsets
+                offset_sigma = pm.HalfNormal('offset_sigma', sigma=offsets_std)   
+                offsets = pm.Normal('offsets', mu=offsets_mu, sigma=offset_sigma,
+                                    shape=n_changepoints)*mult_offsets   
+                
+            else: # estimate multiple distributions for multiple offsets
+                offsets = pm.Normal('offsets', mu=offsets_mu, sigma=offsets_std,
+                                    shape=n_changepoints)*mult_offsets  
 
-        mult=pm.Deterministic('mult', (act_number> 0.5)*1) # array with 1,0 defining changep =True/False
-        offsets=offsets*mult
+            mult=pm.Deterministic('mult', (act_number> 0.5)*1) # array with 1,0 defining changep =True/False
+            offsets=offsets*mult
         if distribute_offsets:
             # equally distributed offset initial positions
             mup=np.linspace(xmin,xmax,n_changepoints)
-            mu_pos=pm.Uniform('mu_pos',mup, lower=xmin, upper=xmax, shape=n_changepoints) 
+            mu_pos=pm.Uniform('mu_pos',testval=mup, lower=xmin, upper=xmax, shape=n_changepoints) 
+        elif positions_init is not None:
+            # positions from initial_values (e.g. prescreening)
+            mu_pos=pm.Uniform('mu_pos',testval=positions_init, lower=xmin, upper=xmax, shape=n_changepoints) 
         else: 
             # randomly distributed offsets
             mu_pos=pm.Uniform('mu_pos', lower=xmin, upper=xmax, shape=n_changepoints) 
 
-        s = pm.Normal('positions',  mu=mu_pos, sigma=5, shape=n_changepoints)
+        if positions_init is not None:
+            s = pm.Normal('positions',  mu=mu_pos, sigma=5, shape=n_changepoints, testval=positions_init)
+        else:
+            s = pm.Normal('positions',  mu=mu_pos, sigma=5, shape=n_changepoints)
 
-        A = (x[:, None] >= s) * 1
+        if relaxed:
+            A = pm.math.sigmoid((x[:, None] - s)/_step_width(x,step_width))
+        else:
+            A = (x[:, None] >= s) * 1
         offset_change = elem_matrix_vector_product(A, offsets)
 
         if change_trend:
-            if estimate_trend_inc_sigma:
+            if relaxed:
+                trend_inc,trend_activity = horseshoe('trend_inc',n_changepoints,scale=trend_inc_sigma,global_scale=p_)
+            elif estimate_trend_inc_sigma:
                 # estimate one hyperparameter distribution from which trend increments can stem from
                 trend_inc_sigma_est = pm.HalfNormal('trend_inc_sigma_est', sigma=trend_inc_sigma)  
                 trend_inc = pm.Normal('trend_inc', mu=0, sigma=trend_inc_sigma_est,shape=n_changepoints)
             else:
                 # no hyperparameter distribution estimation
                 trend_inc = pm.Normal('trend_inc', mu=0, sigma=trend_inc_sigma,shape=n_changepoints)
-            trend_inc=trend_inc*mult
+            if not relaxed:
+                trend_inc=trend_inc*mult
             gamma = -s* trend_inc
 
             trend_inc=elem_matrix_vector_product(A, trend_inc)
@@ -163,11 +437,14 @@ class discotimes_model(pm.model.Model):
             etau=pm.HalfNormal('etau', sigma=3,shape=n_changepoints)  
             t_vec=(A*x[:,None])-s
             inside_function=((t_vec-t_vec*[t_vec<0]).squeeze()/etau)              
-            post_seismic=sum(c_constant*(1-np.exp(-((t_vec-t_vec*[t_vec<0]).squeeze()/etau)))*mult,axis=1)
+            post_seismic=tensor.sum(c_constant*(1-np.exp(-((t_vec-t_vec*[t_vec<0]).squeeze()/etau)))*mult,axis=1)
             offset_change=offset_change+post_seismic 
         if annual_cycle:
             m_coeffs=pm.Normal('m_coeffs', mu=0, sigma=1,shape=12)
-            annual=pm.Deterministic("annual", elem_matrix_vector_product(X_mat,m_coeffs)) 
+            if month_index is not None:
+                annual=pm.Deterministic("annual", m_coeffs[month_index]) 
+            else:
+                annual=pm.Deterministic("annual", elem_matrix_vector_product(X_mat,m_coeffs)) 
             mu = pm.Deterministic("mu", offset_change + trend*x + offset + annual)   
         else:
             mu = pm.Deterministic("mu", offset_change + trend*x + offset)            
@@ -179,15 +456,341 @@ class discotimes_model(pm.model.Model):
                              sigma=sigma_s, nu=nu)
       
         else:
-            if AR1: # first order autoregressive ...
+            if AR1 == 'exact': # continuous-time AR1, conditional likelihood of every observation
+                beta = pm.Uniform('beta', lower=0, upper=1)
+                dt = np.concatenate([[0.],np.diff(x)])
+                mu_cond,sigma_cond = ar1_conditional(mu,y,dt,beta,sigma,dt_ref=_step_width(x))
+                Y_obs = pm.Normal('Y_obs', mu=mu_cond, sigma=sigma_cond, observed=y)
+            elif AR1: # first order autoregressive ...
                 beta = pm.HalfNormal('beta', sigma=0.4)
                 likelihood = pm.AR('AR1_coeff', beta, sigma=sigma, observed=y-mu) 
             else:    
                 Y_obs = pm.Normal('Y_obs', mu=mu, sigma=sigma, observed=y)
 
 
+class stacked_observed():
+    """observations of many stations on a padded station*time layout
+    
+    Parameters
+    ----------
+    observed : list
+        observed objects of single stations (observed_series or objects with .x, .y and optionally .X_mat)
+        
+    Attributes
+    ----------
+    x, y : np.array() of station*time,
+        padded with the last epoch and zeros
+    mask : np.array() of station*time,
+        True at observations
+    month_index : None or np.array() of station*time,
+        padded month indices (of observed_series)
+    X_mat : None or np.array() of station*time*12,
+        padded monthly design matrices (of other observed objects)
+    """
+    
+    def __init__(self,observed):
+        lengths = np.asarray([len(obs.y) for obs in observed])
+        n_stations,n_max = len(observed),int(lengths.max())
+        self.mask = np.arange(n_max)[np.newaxis,:] < lengths[:,np.newaxis]
+        self.x = np.empty((n_stations,n_max))
+        self.y = np.zeros((n_stations,n_max))
+        self.X_mat = None
+        self.month_index = None
+        if all(getattr(obs,'month_index',None) is not None for obs in observed):
+            self.month_index = np.zeros((n_stations,n_max),dtype=np.int64)
+        elif all(getattr(obs,'X_mat',None) is not None for obs in observed):
+            self.X_mat = np.zeros((n_stations,n_max,np.shape(observed[0].X_mat)[1]))
+        for i,obs in enumerate(observed):
+            self.x[i,:lengths[i]] = obs.x
+            self.x[i,lengths[i]:] = obs.x[-1]
+            self.y[i,:lengths[i]] = obs.y
+            if self.month_index is not None:
+                self.month_index[i,:lengths[i]] = obs.month_index
+            elif self.X_mat is not None:
+                self.X_mat[i,:lengths[i]] = obs.X_mat
+                
+    @property
+    def n_stations(self):
+        return self.mask.shape[0]
+
+
+class discotimes_batch_model(pm.model.Model):
+    """model for changepoint detection (discontinuities and trend changes) of many stations
+    type pm.model.Model
+    
+    Batched variant of discotimes_model: all parameters have a station 
+    dimension (positions, offsets and trend increments are indexed by 
+    station and changepoint), series of different length are padded and 
+    masked in the likelihood, so that all stations are sampled with one 
+    compiled graph.
+    """
+    
+    def __init__(self, observed=None,name='',change_trend=False,n_changepoints=5,offsets_std=1,p_=0.1,
+                      sigma_noise=1.,trend_inc_sigma=0.01,annual_cycle=False,change_offsets=True,
+                 estimate_offset_sigma=False,estimate_trend_inc_sigma=False,post_seismic=False,
+                 AR1=False,distribute_offsets=False,robust_reg=False,initial_values={},
+                 changepoint_model='bernoulli',step_width=None,**kwargs):
+        
+        """Requires parameters as defined in model_settings, see discotimes_model
+        
+        Parameters
+        ----------
+        
+        observed : stacked_observed
+            observations of all stations (station*time)
+        initial_values : dict
+            dictionary of initial conditions of all stations e.g. 
+            {'p_':p_,'positions':positions,'offsets':offsets} with arrays of station*n_changepoints, 
+            see changepoints.stack_initial_values
+        changepoint_model : str
+            'bernoulli' or 'relaxed', see discotimes_model
+        step_width : None or float
+            width of the sigmoid steps, see discotimes_model
+        AR1 : bool or str
+            only AR1='exact' (one autocorrelation per station), see discotimes_model
+        
+        """
+        super().__init__(name)
+        
+        if post_seismic or robust_reg:
+            raise Exception('post_seismic and robust_reg are not implemented in the batched model')
+        if AR1 and AR1 != 'exact':
+            raise Exception("AR1=True (pm.AR) is not implemented in the batched model, use AR1='exact'")
+        relaxed = changepoint_model == 'relaxed'
+        if changepoint_model not in ['bernoulli','relaxed']:
+            raise Exception('changepoint_model '+changepoint_model+' not implemented')
+        
+        x=observed.x
+        y=observed.y
+        mask=observed.mask
+        n_stations=observed.n_stations
+        
+        # station-wise bounds of the changepoint positions (observed epochs only)
+        xmin=np.where(mask,x,np.inf).min(axis=1)[:,None]
+        xmax=np.where(mask,x,-np.inf).max(axis=1)[:,None]
+        
+        if 'offsets' in initial_values:
+            # integrate pre-defined offsets
+            print('manually initialize with: ')
+            print(initial_values)
+            estimate_offset_sigma=False
+            offsets_mu=initial_values['offsets']
+            p_=initial_values['p_']
+            n_changepoints=np.shape(initial_values['offsets'])[1]
+            positions_init=_positions_testval(initial_values['positions'],xmin,xmax)
+        else:
+            offsets_mu=0
+            positions_init=None
+            
+        # Priors for model parameters
+        offset = pm.Normal('offset', mu=0, sigma=1, shape=n_stations)
+        trend = pm.Normal('trend', mu=0, sigma=1, shape=n_stations) 
+        sigma = pm.HalfNormal('sigma', sigma=sigma_noise, shape=n_stations)   
+
+        if not change_offsets:
+            mult_offsets=0.
+        else:
+            mult_offsets=1. 
+
+        if relaxed:
+            # continuous relaxation: horseshoe shrinkage (global scale per station) instead of Bernoulli switches
+            offsets,activity = horseshoe('offsets',(n_stations,n_changepoints),scale=offsets_std,global_scale=p_,
+                                         testval=offsets_mu,global_shape=n_stations)
+            offsets=offsets*mult_offsets
+            mult=pm.Deterministic('mult', (activity> 0.5)*1)
+        else:
+            act_number = pm.Bernoulli('act_number', p = p_, shape=(n_stations,n_changepoints))
+            if estimate_offset_sigma: # estimate one distribution for the offsets of every station
+                offset_sigma = pm.HalfNormal('offset_sigma', sigma=offsets_std, shape=n_stations)   
+                offsets = pm.Normal('offsets', mu=offsets_mu, sigma=offset_sigma[:,None],
+                                    shape=(n_stations,n_changepoints))*mult_offsets   
+            else:
+                offsets = pm.Normal('offsets', mu=offsets_mu, sigma=offsets_std,
+                                    shape=(n_stations,n_changepoints))*mult_offsets  
+
+            mult=pm.Deterministic('mult', (act_number> 0.5)*1) # array with 1,0 defining changep =True/False
+            offsets=offsets*mult
+        if distribute_offsets:
+            # equally distributed offset initial positions
+            mup=xmin+(xmax-xmin)*np.linspace(0,1,n_changepoints)[None,:]
+            mu_pos=pm.Uniform('mu_pos',testval=mup, lower=xmin, upper=xmax, shape=(n_stations,n_changepoints)) 
+        elif positions_init is not None:
+            mu_pos=pm.Uniform('mu_pos',testval=positions_init, lower=xmin, upper=xmax, shape=(n_stations,n_changepoints)) 
+        else: 
+            mu_pos=pm.Uniform('mu_pos', lower=xmin, upper=xmax, shape=(n_stations,n_changepoints)) 
+
+        if positions_init is not None:
+            s = pm.Normal('positions',  mu=mu_pos, sigma=5, shape=(n_stations,n_changepoints), testval=positions_init)
+        else:
+            s = pm.Normal('positions',  mu=mu_pos, sigma=5, shape=(n_stations,n_changepoints))
+
+        if relaxed:
+            if step_width is None:
+                # median sampling interval of all stations
+                step_width = np.median(np.diff(x,axis=1)[mask[:,1:]]) if mask[:,1:].any() else 1.
+            A = pm.math.sigmoid((x[:, :, None] - s[:, None, :])/step_width)
+        else:
+            A = (x[:, :, None] >= s[:, None, :]) * 1 # station*time*changepoint
+        offset_change = (A*offsets[:, None, :]).sum(axis=-1)
+
+        if change_trend:
+            if relaxed:
+                trend_inc,trend_activity = horseshoe('trend_inc',(n_stations,n_changepoints),scale=trend_inc_sigma,
+                                                     global_scale=p_,global_shape=n_stations)
+            elif estimate_trend_inc_sigma:
+                trend_inc_sigma_est = pm.HalfNormal('trend_inc_sigma_est', sigma=trend_inc_sigma, shape=n_stations)  
+                trend_inc = pm.Normal('trend_inc', mu=0, sigma=trend_inc_sigma_est[:,None],shape=(n_stations,n_changepoints))
+            else:
+                trend_inc = pm.Normal('trend_inc', mu=0, sigma=trend_inc_sigma,shape=(n_stations,n_changepoints))
+            if not relaxed:
+                trend_inc=trend_inc*mult
+            gamma = -s* trend_inc
+
+            trend=trend[:,None]+(A*trend_inc[:, None, :]).sum(axis=-1)
+            offset_change=offset_change+(A*gamma[:, None, :]).sum(axis=-1)
+        else:
+            trend=trend[:,None]
+        if annual_cycle:
+            m_coeffs=pm.Normal('m_coeffs', mu=0, sigma=1,shape=(n_stations,12))
+            if observed.month_index is not None:
+                annual=pm.Deterministic("annual", m_coeffs[np.arange(n_stations)[:,None],observed.month_index]) 
+            else:
+                annual=pm.Deterministic("annual", (observed.X_mat*m_coeffs[:, None, :]).sum(axis=-1)) 
+            mu = pm.Deterministic("mu", offset_change + trend*x + offset[:,None] + annual)   
+        else:
+            mu = pm.Deterministic("mu", offset_change + trend*x + offset[:,None])
+            
+        # masked likelihood, padded epochs are excluded
+        station_index,time_index = np.nonzero(mask)
+        if AR1 == 'exact':
+            # one autocorrelation per station, series restart at every station
+            beta = pm.Uniform('beta', lower=0, upper=1, shape=n_stations)
+            first = np.concatenate([[True],station_index[1:] != station_index[:-1]])
+            dt = np.concatenate([[0.],np.diff(x[station_index,time_index])])
+            mu_cond,sigma_cond = ar1_conditional(mu[station_index,time_index],y[station_index,time_index],dt,
+                                                 beta[station_index],sigma[station_index],
+                                                 dt_ref=_step_width(x[mask]),first=first)
+            Y_obs = pm.Normal('Y_obs', mu=mu_cond, sigma=sigma_cond, observed=y[station_index,time_index])
+        else:
+            Y_obs = pm.Normal('Y_obs', mu=mu[station_index,time_index], sigma=sigma[station_index], 
+                              observed=y[station_index,time_index])
+
+
+def horseshoe(name,shape,scale=1.,global_scale=0.1,testval=None,global_shape=None):
+    """horseshoe prior (non-centred parametrization)
+    
+    values = name_raw * name_lambda * name_tau * scale, with local (name_lambda) 
+    and global (name_tau) half-Cauchy scales
+    
+    Parameters
+    ----------
+    shape : int or tuple
+        shape of the variable
+    scale : float
+        scale of the variable
+    global_scale : float
+        scale of the global shrinkage parameter, small values shrink more
+    testval : None, float or np.array()
+        initial values of the variable
+    global_shape : None or int
+        one global scale per row (e.g. station), default: a single global scale
+        
+    Returns
+    -------
+    values, activity (1 - shrinkage factor, 0: shrunk to zero, 1: not shrunk)
+    """
+    if global_shape is None:
+        tau = pm.HalfCauchy(name+'_tau', beta=global_scale)
+    else:
+        tau = pm.HalfCauchy(name+'_tau', beta=np.ravel(global_scale) if np.ndim(global_scale) > 0 else global_scale,
+                            shape=global_shape)[:,None]
+    lam = pm.HalfCauchy(name+'_lambda', beta=1., shape=shape)
+    if testval is not None and np.any(np.asarray(testval) != 0):
+        # half-Cauchy variables start at their median (beta)
+        raw = pm.Normal(name+'_raw', mu=0, sigma=1, shape=shape,
+                        testval=np.broadcast_to(np.asarray(testval)/(scale*global_scale),shape))
+    else:
+        raw = pm.Normal(name+'_raw', mu=0, sigma=1, shape=shape)
+    values = pm.Deterministic(name, raw*lam*tau*scale)
+    return values,1-1/(1+(lam*tau)**2)
+
+def ar1_conditional(mu,y,dt,phi,sigma,dt_ref=1.,first=None):
+    """conditional mean and standard deviation of AR(1) noise for irregular series with gaps
+    
+    The noise is a continuous-time AR(1) (Ornstein-Uhlenbeck) process 
+    observed at arbitrary epochs: the autocorrelation between observations 
+    dt apart is phi**(dt/dt_ref) and the innovation variance is exact for 
+    every time step, so gaps are handled without imputation. Given the 
+    previous observation, y is normally distributed with the returned mean 
+    and standard deviation (use them in the likelihood of y, e.g. 
+    pm.Normal(mu=mu_cond, sigma=sigma_cond, observed=y)). All observations 
+    are evaluated at once (no scan).
+    
+    Parameters
+    ----------
+    mu : tensor
+        expected values of the observations
+    y : np.array()
+        observations, ordered in time (within every series)
+    dt : np.array()
+        time step to the previous observation (ignored at the start of a series)
+    phi : tensor
+        lag-1 autocorrelation at time step dt_ref (0 < phi < 1), scalar or per observation
+    sigma : tensor
+        innovation standard deviation at time step dt_ref, scalar or per observation
+    dt_ref : float
+        reference time step
+    first : None or np.array() of bool
+        observations starting a new series (e.g. a new station), 
+        default: only the first observation
+        
+    Returns
+    -------
+    mu_cond, sigma_cond
+    """
+    dt = np.asarray(dt,dtype=float)
+    new_series = np.zeros(len(dt),dtype=bool) if first is None else np.array(first,dtype=bool)
+    new_series[0] = True
+    # duplicate epochs would give a degenerate transition
+    steps = np.where(new_series,0.,np.maximum(dt,1e-6*dt_ref)/dt_ref)
+    phi_i = tensor.exp(steps*tensor.log(phi))*(~new_series)
+    residuals = y - mu
+    previous = tensor.concatenate([tensor.zeros((1,)),residuals[:-1]])
+    mu_cond = mu + phi_i*previous
+    # stationary variance sigma**2/(1-phi**2) at the start of a series
+    sigma_cond = sigma*tensor.sqrt((1-phi_i**2)/(1-phi**2))
+    return mu_cond,sigma_cond
+
+def _positions_testval(positions,xmin,xmax):
+    """
+    initial changepoint positions inside the (open) interval of the observations
+    """
+    if positions is None:
+        return None
+    margin = (xmax-xmin)*1e-6
+    positions = np.asarray(positions,dtype=float)
+    positions = np.where(np.isfinite(positions),positions,(xmin+xmax)/2.)
+    return np.clip(positions,xmin+margin,xmax-margin)
+
+def _step_width(x,step_width=None):
+    """
+    width of sigmoid steps, default: median sampling interval
+    """
+    if step_width is None:
+        step_width = np.median(np.diff(np.sort(np.unique(x)))) if len(np.unique(x)) > 1 else 1.
+    return step_width
+
 def elem_matrix_vector_product(matrix, vector):
     """
     compute elementwise matrix*vector product
     """
-    return (matrix * vector[None, :]).sum(axis=-1)
\ No newline at end of file
+    return (matrix * vector[None, :]).sum(axis=-1)
+
+def det_dot(a, b):
+    """
+    The theano dot product and NUTS sampler don't work with large matrices?
+    
+    :param a: (np matrix)
+    :param b: (theano vector)
+    """
+    return (a * b[None, :]).sum(axis=-1)
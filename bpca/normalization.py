@@ -0,0 +1,477 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#    normalization: reversible preprocessing of bpca datasets
+
+import numpy as np
+import xarray as xr
+
+# MAD to standard deviation of a normal distribution
+MAD_FACTOR = 1.4826
+
+
+def _dense(dataset):
+    """
+    dataset is a time*space DataArray (otherwise sparse_observations)
+    """
+    return isinstance(dataset,xr.DataArray)
+
+def _station_field(dataset,station_values):
+    """
+    station values broadcast to the layout of the dataset
+    """
+    if _dense(dataset):
+        return xr.DataArray(station_values,dims=dataset.dims[1])
+    return station_values[dataset.space_index]
+
+def _time_field(dataset):
+    """
+    time index broadcast to the layout of the dataset
+    """
+    if _dense(dataset):
+        return xr.DataArray(np.arange(dataset.shape[0],dtype=float),dims=dataset.dims[0])
+    return dataset.time_index.astype(float)
+
+def _values(dataset):
+    if _dense(dataset):
+        return dataset
+    return dataset.values
+
+def _select(dataset,mask):
+    """
+    keep the observations where mask is True (DataArray: set NaN)
+    """
+    if _dense(dataset):
+        return dataset.where(mask)
+    errors = getattr(dataset,'errors',None)
+    return type(dataset)(dataset.time_index[mask],dataset.space_index[mask],dataset.values[mask],
+                         dataset.time.values,coords=dataset.coords,name=dataset.name,space_dim=dataset.shape[1],
+                         errors=None if errors is None else errors[mask])
+
+def observation_blocks(dataset,chunk_size=None):
+    """observations of blocks of stations
+
+    sparse_observations are a single block. time*space DataArrays are read
+    block by block of stations (all time steps), so that dask- or
+    Zarr-backed cubes are never loaded at once. All station statistics of
+    the normalizer are computed per block, stations are not shared between
+    blocks.
+
+    Parameters
+    ----------
+    dataset: xarray.DataArray of time*space dimensions or sparse_observations
+
+    chunk_size: None or int, default: None,
+        stations per block, default: the dask chunks of the station
+        dimension or all stations of in-memory data
+
+    Yields
+    ------
+    time_index, space_index, values: np.arrays of the finite observations
+    """
+    if not _dense(dataset):
+        valid = np.isfinite(dataset.values)
+        yield dataset.time_index[valid],dataset.space_index[valid],np.asarray(dataset.values[valid],dtype=float)
+        return
+    space_dim = dataset.shape[1]
+    if chunk_size is None:
+        chunk_size = dataset.chunks[1][0] if dataset.chunks is not None else space_dim
+    for start in range(0,space_dim,max(int(chunk_size),1)):
+        block = np.asarray(dataset[:,start:start+chunk_size].values,dtype=float)
+        time_index,space_index = np.nonzero(np.isfinite(block))
+        yield time_index,space_index+start,block[time_index,space_index]
+
+def _station_sum(space_index,values,space_dim):
+    return np.bincount(space_index,weights=values,minlength=space_dim)
+
+def _station_median(space_index,values,space_dim):
+    """
+    median of values per station (NaN without observations)
+    """
+    order = np.lexsort((values,space_index))
+    sorted_values = values[order]
+    counts = np.bincount(space_index,minlength=space_dim)
+    starts = np.concatenate([[0],np.cumsum(counts)[:-1]])
+    median = np.full(space_dim,np.nan)
+    has_data = counts > 0
+    lower = sorted_values[(starts+(counts-1)//2)[has_data]]
+    upper = sorted_values[(starts+counts//2)[has_data]]
+    median[has_data] = (lower+upper)/2.
+    return median
+
+def _fit_line(time_index,space_index,values,space_dim):
+    """
+    least-squares intercept (at time index 0) and slope (per time step) of every station
+    """
+    time_ = time_index.astype(float)
+    n = np.bincount(space_index,minlength=space_dim)*1.
+    sum_t = _station_sum(space_index,time_,space_dim)
+    sum_tt = _station_sum(space_index,time_**2,space_dim)
+    sum_y = _station_sum(space_index,values,space_dim)
+    sum_ty = _station_sum(space_index,time_*values,space_dim)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        slope = (n*sum_ty-sum_t*sum_y)/(n*sum_tt-sum_t**2)
+        slope = np.where(np.isfinite(slope),slope,0.)
+        intercept = np.where(n > 0,(sum_y-slope*sum_t)/n,0.)
+    return intercept,slope
+
+
+def _add_gaps(statistics,time_index,space_index):
+    """
+    add the gaps of a block of stations to the gap statistics
+    """
+    space_dim = len(statistics['count'])
+    statistics['count'] += np.bincount(space_index,minlength=space_dim)
+    if len(time_index) == 0:
+        return
+    order = np.lexsort((time_index,space_index))
+    time_index,space_index = time_index[order],space_index[order]
+    # first and last observation of every station in the sorted arrays
+    is_first = np.concatenate([[True],space_index[1:] != space_index[:-1]])
+    is_last = np.concatenate([space_index[1:] != space_index[:-1],[True]])
+    statistics['first'][space_index[is_first]] = time_index[is_first]
+    statistics['last'][space_index[is_last]] = time_index[is_last]
+    gaps = np.diff(time_index)-1
+    gaps = np.where(is_first[1:],0,gaps)
+    np.add.at(statistics['number_of_gaps'],space_index[1:],gaps > 0)
+    np.maximum.at(statistics['longest_gap'],space_index[1:],gaps)
+
+def _empty_gaps(space_dim):
+    return {'count':np.zeros(space_dim,dtype=np.int64),'first':np.full(space_dim,-1,dtype=np.int64),
+            'last':np.full(space_dim,-1,dtype=np.int64),'number_of_gaps':np.zeros(space_dim,dtype=np.int64),
+            'longest_gap':np.zeros(space_dim,dtype=np.int64)}
+
+def _finish_gaps(statistics):
+    count,first,last = statistics['count'],statistics['first'],statistics['last']
+    with np.errstate(invalid='ignore',divide='ignore'):
+        statistics['observed_fraction'] = np.where(count > 0,count/(last-first+1.),0.)
+    return statistics
+
+
+def gap_statistics(dataset,chunk_size=None):
+    """gap statistics per station
+
+    Parameters
+    ----------
+    dataset: xarray.DataArray of time*space dimensions or sparse_observations
+
+    chunk_size: None or int, default: None,
+        stations per block of lazy data (see observation_blocks())
+
+    Returns
+    -------
+    dict of np.arrays of size space_dim: 'count', 'first', 'last' (time indices,
+    -1 without observations), 'observed_fraction' (between first and last
+    observation), 'number_of_gaps' and 'longest_gap' (in time steps)
+    """
+    statistics = _empty_gaps(dataset.shape[1])
+    for time_index,space_index,_ in observation_blocks(dataset,chunk_size):
+        _add_gaps(statistics,time_index,space_index)
+    return _finish_gaps(statistics)
+
+
+class normalizer():
+    """Vectorized, reversible preprocessing of bpca datasets.
+
+    Steps (all optional, in this order): gap statistics, robust outlier
+    rejection, detrending, centering and scaling. Works on time*space
+    DataArrays and sparse_observations. The statistics are fitted in one
+    pass over blocks of stations (see observation_blocks()), lazy data
+    stay lazy in transform(). The fitted statistics are stored in
+    self.statistics, so that model outputs can be converted back to
+    physical units.
+
+    Parameters
+    ----------
+    center: None or str, default: None,
+        'station': remove the mean of every station,
+        'group': remove the mean of every group of stations
+
+    scale: None or str, default: None,
+        divide by the standard deviation of every 'station', 'group' or
+        of all stations ('global')
+
+    group_index: None or np.array(), default: None,
+        array of group indices (0,1,2,...) of the stations, e.g. the
+        cluster_index of GNSS and altimetry-minus-tide-gauge stations
+
+    outlier_threshold: None or float, default: None,
+        reject observations deviating more than outlier_threshold robust
+        standard deviations (MAD) from the station median (of the
+        detrended series if detrend is True)
+
+    detrend: bool, default: False,
+        remove a linear trend (and intercept) of every station
+
+    gap_statistics: bool, default: False,
+        compute gap statistics of the stations (see gap_statistics())
+
+    chunk_size: None or int, default: None,
+        stations per block when fitting time*space DataArrays
+    """
+
+    def __init__(self,center=None,scale=None,group_index=None,outlier_threshold=None,
+                 detrend=False,gap_statistics=False,chunk_size=None):
+        self.center = center
+        self.scale = scale
+        self.group_index = group_index
+        self.outlier_threshold = outlier_threshold
+        self.detrend = detrend
+        self.gap_statistics = gap_statistics
+        self.chunk_size = chunk_size
+        self.statistics = {}
+
+    @property
+    def active(self):
+        """
+        any transformation enabled
+        """
+        return (self.center is not None or self.scale is not None or
+                self.outlier_threshold is not None or self.detrend)
+
+    def _groups(self,space_dim):
+        if self.group_index is None:
+            return np.zeros(space_dim,dtype=np.int64)
+        return np.asarray(self.group_index,dtype=np.int64)
+
+    def _residuals(self,dataset,intercept,slope):
+        return _values(dataset) - _station_field(dataset,intercept) - _station_field(dataset,slope)*_time_field(dataset)
+
+    def _reject_outliers(self,dataset):
+        """
+        apply the stored outlier thresholds
+        """
+        statistics = self.statistics
+        residuals = abs(self._residuals(dataset,statistics['outlier_intercept'],statistics['outlier_slope']) -
+                        _station_field(dataset,statistics['outlier_median']))
+        limit = _station_field(dataset,self.outlier_threshold*statistics['outlier_mad'])
+        return _select(dataset,~(residuals > limit))
+
+    def _fit_outliers(self,statistics,time_index,space_index,values,space_dim):
+        """
+        outlier statistics of a block of stations, returns the mask of the kept observations
+        """
+        if self.detrend:
+            intercept,slope = _fit_line(time_index,space_index,values,space_dim)
+        else:
+            intercept,slope = np.zeros(space_dim),np.zeros(space_dim)
+        residuals = values-intercept[space_index]-slope[space_index]*time_index
+        median = _station_median(space_index,residuals,space_dim)
+        mad = _station_median(space_index,abs(residuals-median[space_index]),space_dim)*MAD_FACTOR
+        median = np.where(np.isfinite(median),median,0.)
+        mad = np.where(np.isfinite(mad) & (mad > 0),mad,np.inf)
+        stations = np.unique(space_index)
+        for name,value in [('outlier_intercept',intercept),('outlier_slope',slope),
+                           ('outlier_median',median),('outlier_mad',mad)]:
+            statistics[name][stations] = value[stations]
+        keep = ~(abs(residuals-median[space_index]) > self.outlier_threshold*mad[space_index])
+        statistics['outliers'] += np.bincount(space_index[~keep],minlength=space_dim)
+        return keep
+
+    def fit(self,dataset,fixed=None):
+        """fit the statistics of the transformation to the dataset
+
+        fixed: None or dict, default: None,
+            np.arrays of 'center' and/or 'scale' per station used instead
+            of fitting them, e.g. group statistics (see fit_stations())
+        """
+        fixed = {} if fixed is None else fixed
+        space_dim = dataset.shape[1]
+        statistics = {}
+        self.statistics = statistics
+        zeros = np.zeros(space_dim)
+        if self.gap_statistics:
+            gaps = _empty_gaps(space_dim)
+        if self.outlier_threshold is not None:
+            statistics.update({'outlier_intercept':zeros.copy(),'outlier_slope':zeros.copy(),
+                               'outlier_median':zeros.copy(),'outlier_mad':np.full(space_dim,np.inf),
+                               'outliers':np.zeros(space_dim,dtype=np.int64)})
+
+        # moments per station: count, sum, squares around the station mean
+        # and around the station line (detrend)
+        counts,sums,squares = zeros.copy(),zeros.copy(),zeros.copy()
+        intercept,slope,line_squares = zeros.copy(),zeros.copy(),zeros.copy()
+        for time_index,space_index,values in observation_blocks(dataset,self.chunk_size):
+            if self.gap_statistics:
+                _add_gaps(gaps,time_index,space_index)
+            if self.outlier_threshold is not None:
+                keep = self._fit_outliers(statistics,time_index,space_index,values,space_dim)
+                time_index,space_index,values = time_index[keep],space_index[keep],values[keep]
+            block_counts = np.bincount(space_index,minlength=space_dim)
+            block_sums = _station_sum(space_index,values,space_dim)
+            with np.errstate(invalid='ignore',divide='ignore'):
+                block_mean = np.where(block_counts > 0,block_sums/block_counts,0.)
+            counts += block_counts
+            sums += block_sums
+            squares += _station_sum(space_index,(values-block_mean[space_index])**2,space_dim)
+            if self.detrend:
+                block_intercept,block_slope = _fit_line(time_index,space_index,values,space_dim)
+                stations = np.unique(space_index)
+                intercept[stations] = block_intercept[stations]
+                slope[stations] = block_slope[stations]
+                residuals = values-block_intercept[space_index]-block_slope[space_index]*time_index
+                line_squares += _station_sum(space_index,residuals**2,space_dim)
+        if self.gap_statistics:
+            statistics['gaps'] = _finish_gaps(gaps)
+
+        groups = self._groups(space_dim)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            mean = np.where(counts > 0,sums/counts,0.)
+        if self.detrend:
+            center = intercept
+        else:
+            slope = zeros
+            center = zeros
+            if self.center is not None:
+                if self.center == 'group':
+                    sums_ = np.bincount(groups,weights=sums)[groups]
+                    counts_ = np.bincount(groups,weights=counts)[groups]
+                    with np.errstate(invalid='ignore',divide='ignore'):
+                        center = np.where(counts_ > 0,sums_/counts_,0.)
+                else:
+                    center = mean
+            if 'center' in fixed:
+                center = np.asarray(fixed['center'],dtype=float)
+
+        scale = np.ones(space_dim)
+        if 'scale' in fixed:
+            scale = np.asarray(fixed['scale'],dtype=float)
+        elif self.scale is not None:
+            # squares around the center: station squares + shift of the station mean
+            squares = line_squares if self.detrend else squares+counts*(mean-center)**2
+            counts_ = counts*1.
+            if self.scale == 'group':
+                squares = np.bincount(groups,weights=squares)[groups]
+                counts_ = np.bincount(groups,weights=counts_)[groups]
+            elif self.scale == 'global':
+                squares = np.full(space_dim,squares.sum())
+                counts_ = np.full(space_dim,counts_.sum())
+            with np.errstate(invalid='ignore',divide='ignore'):
+                scale = np.sqrt(squares/counts_)
+            scale = np.where(np.isfinite(scale) & (scale > 0),scale,1.)
+        statistics.update({'center':center,'slope':slope,'scale':scale})
+        return self
+
+    def _group_statistic(self,name,group_index):
+        """
+        fitted statistic of the groups group_index (one value per new station)
+        """
+        values = self.statistics[name]
+        if group_index is None:
+            raise Exception('group statistics of new stations require their group_index!')
+        groups,first = np.unique(self._groups(len(values)),return_index=True)
+        group_index = np.asarray(group_index,dtype=np.int64)
+        position = np.minimum(np.searchsorted(groups,group_index),len(groups)-1)
+        if np.any(groups[position] != group_index):
+            raise Exception('unknown groups '+str(np.setdiff1d(group_index,groups))+' of new stations!')
+        return values[first][position]
+
+    def fit_stations(self,dataset,group_index=None):
+        """normalizer of new stations, consistent with the fitted one
+
+        Station statistics (outliers, detrending, 'station' center and
+        scale) are fitted to the new stations, 'group' and 'global'
+        statistics are taken from the fitted stations.
+
+        Parameters
+        ----------
+        dataset: xarray.DataArray of time*space dimensions or sparse_observations,
+            new stations on the time axis of the fitted dataset
+
+        group_index: None or np.array(), default: None,
+            group indices of the new stations, required for 'group' statistics
+
+        Returns
+        -------
+        fitted normalizer of the new stations
+        """
+        stations = normalizer(center=self.center,scale=self.scale,outlier_threshold=self.outlier_threshold,
+                              detrend=self.detrend,gap_statistics=self.gap_statistics,chunk_size=self.chunk_size)
+        if not self.active:
+            return stations
+        space_dim = dataset.shape[1]
+        fixed = {}
+        if self.center == 'group' and not self.detrend:
+            fixed['center'] = self._group_statistic('center',group_index)
+        if self.scale == 'group':
+            fixed['scale'] = self._group_statistic('scale',group_index)
+        elif self.scale == 'global':
+            fixed['scale'] = np.full(space_dim,self.statistics['scale'][0])
+        return stations.fit(dataset,fixed=fixed)
+
+    def transform(self,dataset):
+        """
+        normalize a dataset with the stored statistics (the time axis may be extended)
+        """
+        if not self.active:
+            return dataset
+        if 'outlier_mad' in self.statistics:
+            dataset = self._reject_outliers(dataset)
+        statistics = self.statistics
+        normalized = self._residuals(dataset,statistics['center'],statistics['slope'])/_station_field(dataset,statistics['scale'])
+        if _dense(dataset):
+            return normalized.rename(dataset.name).assign_attrs(dataset.attrs)
+        errors = getattr(dataset,'errors',None)
+        if errors is not None:
+            # errors are scaled like the values
+            errors = errors/statistics['scale'][dataset.space_index]
+        return type(dataset)(dataset.time_index,dataset.space_index,normalized,dataset.time.values,
+                             coords=dataset.coords,name=dataset.name,space_dim=dataset.shape[1],errors=errors)
+
+    def fit_transform(self,dataset):
+        return self.fit(dataset).transform(dataset)
+
+    def inverse_transform(self,values,time_index=None,space_index=None,std=False):
+        """convert normalized values back to physical units
+
+        Parameters
+        ----------
+        values: xarray.DataArray of time*space dimensions or np.array(),
+            normalized values, np.arrays are values at (time_index, space_index)
+
+        std: bool, default: False,
+            values are standard deviations (only scaled)
+        """
+        if not self.active:
+            return values
+        statistics = self.statistics
+        if isinstance(values,xr.DataArray):
+            time_dim,space_dim = values.dims
+            scale = xr.DataArray(statistics['scale'],dims=space_dim)
+            if std:
+                return (values*scale).rename(values.name).assign_attrs(values.attrs)
+            time_ = xr.DataArray(np.arange(values.shape[0],dtype=float),dims=time_dim)
+            physical = (values*scale + xr.DataArray(statistics['center'],dims=space_dim) +
+                        xr.DataArray(statistics['slope'],dims=space_dim)*time_)
+            return physical.rename(values.name).assign_attrs(values.attrs)
+        space_index = np.asarray(space_index)
+        if std:
+            return values*statistics['scale'][space_index]
+        return (values*statistics['scale'][space_index] + statistics['center'][space_index] +
+                statistics['slope'][space_index]*np.asarray(time_index,dtype=float))
+
+    def inverse_trend(self,trend,std=False):
+        """
+        convert normalized trends (per time step, one per station) back to physical units
+        """
+        if not self.active:
+            return trend
+        trend = trend*self.statistics['scale']
+        if std:
+            return trend
+        return trend + self.statistics['slope']
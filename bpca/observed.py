@@ -0,0 +1,116 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#    observed: containers of observed series for the discotimes models
+
+import numpy as np
+import pandas as pd
+
+
+def datetime_to_decimal_year(times):
+    """
+    convert datetime64 to decimal years (the fraction refers to the length of the respective calendar year)
+    """
+    times = np.asarray(times,dtype='datetime64[ns]')
+    year = times.astype('datetime64[Y]')
+    start = year.astype('datetime64[ns]')
+    end = (year+1).astype('datetime64[ns]')
+    return (year.astype(np.int64)+1970) + (times-start).astype(np.int64)/(end-start).astype(np.int64)
+
+
+class observed_series():
+    """Observed series of a station for discotimes_model.
+
+    Only the observed epochs are stored, as contiguous arrays. The month
+    index replaces the dense n*12 design matrix of the annual cycle (a
+    gather of the monthly coefficients), the gap mask refers to the
+    regular time axis of the input.
+
+    Parameters
+    ----------
+    time : array of datetime64
+        epochs of the (regular) input series
+    y : np.array()
+        values, NaN at missing epochs
+    name : str, default: None
+        name of the station/series
+    attrs : dict, default: None
+        additional information, e.g. coordinates
+
+    Attributes
+    ----------
+    x : np.array()
+        decimal years of the observations
+    y : np.array()
+        observations
+    time : np.array() of datetime64
+        epochs of the observations
+    month_index : np.array() of int
+        month (0-11) of the observations
+    dt : np.array()
+        time step to the previous observation (decimal years, 0 for the first)
+    mask : np.array() of bool
+        observed epochs on the time axis of the input
+    """
+
+    __slots__ = ('x','y','time','month_index','dt','mask','name','attrs')
+
+    def __init__(self,time,y,name=None,attrs=None):
+        time = np.asarray(time,dtype='datetime64[ns]')
+        y = np.asarray(y,dtype=float)
+        self.mask = np.isfinite(y)
+        order = np.argsort(time[self.mask],kind='stable')
+        self.time = time[self.mask][order]
+        self.y = np.ascontiguousarray(y[self.mask][order])
+        self.x = datetime_to_decimal_year(self.time)
+        self.month_index = (self.time.astype('datetime64[M]').astype(np.int64) % 12).astype(np.int64)
+        self.dt = np.concatenate([[0.],np.diff(self.x)])
+        self.name = name
+        self.attrs = {} if attrs is None else dict(attrs)
+
+    @classmethod
+    def from_series(cls,series,name=None):
+        """
+        observed series from the output of bpca.bpca.file_reader (pd.Series)
+        """
+        return cls(series.index.values,series.values,name=series.name if name is None else name,
+                   attrs=getattr(series,'attrs',None))
+
+    @property
+    def X_mat(self):
+        """
+        dense monthly design matrix (n*12), built on request
+        """
+        X_mat = np.zeros((len(self.y),12))
+        X_mat[np.arange(len(self.y)),self.month_index] = 1
+        return X_mat
+
+    def gaps(self,max_dt=None):
+        """
+        True at observations preceded by a gap longer than max_dt (decimal years),
+        default: 1.5 times the median time step
+        """
+        if max_dt is None:
+            max_dt = 1.5*np.median(self.dt[1:]) if len(self.dt) > 1 else np.inf
+        return self.dt > max_dt
+
+    def __len__(self):
+        return len(self.y)
+
+    def __repr__(self):
+        return 'observed_series '+str(self.name)+': '+str(len(self))+' observations'
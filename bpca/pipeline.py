@@ -0,0 +1,219 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#    pipeline: resumable discotimes fits of many stations
+
+# Theano, PyMC3 and the models are imported in the workers, after the
+# compile directory and thread settings of the worker are set
+import os
+import glob
+import json
+import time
+import traceback
+import multiprocessing
+import concurrent.futures
+
+from bpca.model_settings import pipeline_settings
+from bpca.resources import available_cores, thread_environment
+
+def budget(workers=None,chain_cores=1,blas_threads=1,cores=None):
+    """number of workers such that workers*chain_cores*blas_threads <= cores
+
+    Parameters
+    ----------
+    workers : None or int
+        requested number of workers, default: as many as fit
+    chain_cores : int
+        chains sampled in parallel per station
+    blas_threads : int
+        BLAS/OpenMP threads per chain
+    cores : None or int
+        available cores, default: available_cores()
+    """
+    if cores is None:
+        cores = available_cores()
+    per_worker = max(int(chain_cores),1)*max(int(blas_threads),1)
+    max_workers = max(cores//per_worker,1)
+    if workers is None:
+        return max_workers
+    if workers > max_workers:
+        print('reduce workers from '+str(workers)+' to '+str(max_workers)+' ('+str(cores)+' cores)')
+    return min(workers,max_workers)
+
+def _worker_init(compile_dir):
+    """
+    per-worker Theano compile directory, set before Theano is imported
+    """
+    flags = [flag for flag in os.environ.get('THEANO_FLAGS','').split(',')
+             if flag and not flag.startswith('compiledir=')]
+    flags.append('compiledir='+os.path.join(compile_dir,'worker_'+str(os.getpid())))
+    os.environ['THEANO_FLAGS'] = ','.join(flags)
+
+def station_id(file):
+    """
+    station ID of a file (file name without endings)
+    """
+    return os.path.basename(file).split('.',1)[0]
+
+def _result_file(results_dir,id_):
+    return os.path.join(results_dir,id_+'.nc')
+
+def _failed_file(results_dir,id_):
+    return os.path.join(results_dir,id_+'.failed')
+
+def _process_alive(pid):
+    """
+    process pid is running (assumed running where it cannot be checked)
+    """
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def stale_temporary_files(results_dir,ids):
+    """
+    temporary result files (<ID>.nc.<pid>.tmp) of the stations ids whose writing process has ended
+    """
+    stale = []
+    for id_ in ids:
+        for temporary_file in glob.glob(glob.escape(_result_file(results_dir,id_))+'.*.tmp'):
+            pid = temporary_file[:-len('.tmp')].rsplit('.',1)[-1]
+            if pid.isdigit() and not _process_alive(int(pid)):
+                stale.append(temporary_file)
+    return stale
+
+def fit_station(file,results_dir,settings):
+    """fit discotimes_model to a station file and write the compressed trace
+
+    The trace is written to a temporary file first and moved to
+    results_dir/<ID>.nc, so that a result is either complete or missing.
+
+    Returns
+    -------
+    station ID, wall time [s]
+    """
+    import pymc3 as pm
+    from bpca.bpca import file_reader
+    from bpca.models import discotimes_model
+    from bpca.observed import observed_series
+
+    start_time = time.time()
+    id_ = station_id(file)
+    series = file_reader(file,variable=settings['variable'],resample=settings['resample'],
+                         cache_dir=settings['cache_dir'])
+    observed = observed_series.from_series(series,name=id_)
+    if len(observed.y) < settings['min_observations']:
+        raise Exception('station '+id_+' has less than '+str(settings['min_observations'])+' observations')
+    model = discotimes_model(observed=observed,name='',**settings['model_settings'])
+    with model:
+        trace = pm.sample(settings['n_samples'],tune=settings['tune'],chains=settings['chains'],
+                          cores=settings['chain_cores'],return_inferencedata=True,progressbar=False,
+                          **settings['sample_settings'])
+    trace.posterior.attrs.update({'station':id_,'file':os.path.abspath(file)})
+    temporary_file = _result_file(results_dir,id_)+'.'+str(os.getpid())+'.tmp'
+    trace.to_netcdf(temporary_file,compress=True)
+    os.replace(temporary_file,_result_file(results_dir,id_))
+    return id_,time.time()-start_time
+
+def run_pipeline(files,results_dir,settings={},retry_failed=False):
+    """fit discotimes_model to many station files in a process pool
+
+    Stations with a result in results_dir are skipped, so an interrupted
+    run resumes where it stopped (temporary files of ended processes are
+    removed, see stale_temporary_files). Failed stations are recorded in
+    <ID>.failed files (json with the error) and skipped unless retry_failed.
+    Workers, parallel chains per station and BLAS threads per chain are
+    budgeted to the available cores, every worker compiles into its own
+    Theano compile directory.
+
+    Parameters
+    ----------
+    files : str or list
+        glob pattern or list of station files (see bpca.bpca.file_reader)
+    results_dir : str
+        results store, one compressed netcdf file per station
+    settings : dict
+        pipeline settings, see model_settings.pipeline_settings()
+    retry_failed : bool, default: False
+        fit stations again that failed before
+
+    Returns
+    -------
+    dict with lists of 'done', 'skipped' and dict of 'failed' stations (ID: error)
+    """
+    settings = pipeline_settings({'pipeline_settings':settings})
+    if isinstance(files,str):
+        files = sorted(glob.glob(files))
+    os.makedirs(results_dir,exist_ok=True)
+    compile_dir = settings['compile_dir'] or os.path.join(results_dir,'.theano')
+
+    summary = {'done':[],'skipped':[],'failed':{}}
+    todo = []
+    for file in files:
+        id_ = station_id(file)
+        if os.path.exists(_result_file(results_dir,id_)):
+            summary['skipped'].append(id_)
+        elif os.path.exists(_failed_file(results_dir,id_)) and not retry_failed:
+            summary['skipped'].append(id_)
+        else:
+            todo.append(file)
+    # leftovers of interrupted writes, files of running (e.g. concurrent) pipelines are kept
+    for temporary_file in stale_temporary_files(results_dir,[station_id(file) for file in todo]):
+        os.remove(temporary_file)
+    print(str(len(todo))+' stations to fit, '+str(len(summary['skipped']))+' skipped')
+    if len(todo) == 0:
+        return summary
+
+    workers = budget(settings['workers'],settings['chain_cores'],settings['blas_threads'])
+    workers = min(workers,len(todo))
+    print('fit with '+str(workers)+' workers, '+str(settings['chain_cores'])+' parallel chains and '+
+          str(settings['blas_threads'])+' BLAS threads per chain')
+    context = multiprocessing.get_context('spawn')
+    with thread_environment(settings['blas_threads']):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,mp_context=context,
+                                                    initializer=_worker_init,initargs=(compile_dir,)) as pool:
+            futures = {pool.submit(fit_station,file,results_dir,settings): file for file in todo}
+            for future in concurrent.futures.as_completed(futures):
+                id_ = station_id(futures[future])
+                try:
+                    _,wall_time = future.result()
+                except Exception as error:
+                    summary['failed'][id_] = str(error)
+                    with open(_failed_file(results_dir,id_),'w') as failed_file:
+                        json.dump({'file':futures[future],'error':str(error),
+                                   'traceback':traceback.format_exc()},failed_file)
+                    print('failed '+id_+': '+str(error))
+                    continue
+                if os.path.exists(_failed_file(results_dir,id_)):
+                    os.remove(_failed_file(results_dir,id_))
+                summary['done'].append(id_)
+                print('fitted '+id_+' ('+str(round(wall_time,1))+' s), '+
+                      str(len(summary['done'])+len(summary['failed']))+'/'+str(len(todo)))
+    return summary
+
+def load_result(results_dir,id_):
+    """
+    load the trace of a station from the results store
+    """
+    import arviz as az
+    return az.from_netcdf(_result_file(results_dir,id_))
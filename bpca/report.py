@@ -0,0 +1,237 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#    run report: timing, memory and sampler statistics of bpca runs
+
+import os
+import time
+import json
+import contextlib
+import numpy as np
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+def _current_peak_rss():
+    """
+    peak resident set size (MB) of this process since the last reset
+    """
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return float(line.split()[1])/1024.
+    except (OSError, IndexError, ValueError):
+        pass
+    if resource is not None:
+        # lifetime peak, kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    return None
+
+def _reset_peak_rss():
+    """
+    reset the peak resident set size (Linux >= 4.0), returns True on success
+    """
+    try:
+        with open('/proc/self/clear_refs','w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def _children_peak_rss():
+    """
+    peak resident set size (MB) of the largest terminated child process
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024.
+
+
+class run_report():
+    """Structured report of a bpca run.
+
+    Collects wall time, CPU time (including child processes, i.e.
+    parallel chains) and peak memory for every phase, as well as sampler
+    statistics and further information on the run setup.
+
+    Attributes
+    ----------
+    phases: dict,
+        per phase: 'wall_time' [s], 'cpu_time' [s], 'peak_rss' [MB],
+        'peak_rss_children' [MB] and 'calls'
+
+    sampler: dict,
+        sampler statistics, see sampler_statistics()
+
+    info: dict,
+        additional information (e.g. resource layout)
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.sampler = {}
+        self.info = {}
+
+    @contextlib.contextmanager
+    def phase(self,name):
+        """
+        context manager measuring a phase, repeated phases are accumulated
+        """
+        reset = _reset_peak_rss()
+        children_rss = _children_peak_rss()
+        times_start = os.times()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter()-wall_start
+            times_end = os.times()
+            cpu = sum(times_end[i]-times_start[i] for i in range(4))
+            peak_rss = _current_peak_rss()
+            # without reset, peak_rss is the peak since process start
+            self.info['peak_rss_per_phase'] = reset
+            children_rss_end = _children_peak_rss()
+            children_peak = children_rss_end if children_rss_end != children_rss else None
+
+            entry = self.phases.setdefault(name,{'wall_time':0.,'cpu_time':0.,'peak_rss':None,
+                                                 'peak_rss_children':None,'calls':0})
+            entry['wall_time'] += wall
+            entry['cpu_time'] += cpu
+            entry['calls'] += 1
+            for key,value in [('peak_rss',peak_rss),('peak_rss_children',children_peak)]:
+                if value is not None:
+                    entry[key] = value if entry.get(key) is None else max(entry[key],value)
+
+    def to_dict(self):
+        """
+        report as (json serializable) dictionary
+        """
+        return json.loads(json.dumps({'phases':self.phases,'sampler':self.sampler,'info':self.info},
+                                     default=_to_builtin))
+
+    def save(self,file):
+        """
+        save report as json
+        """
+        with open(file,'w') as report_file:
+            json.dump(self.to_dict(),report_file,indent=2)
+
+    def __repr__(self):
+        lines = ['run_report']
+        for name,entry in self.phases.items():
+            lines.append('  {:<22} wall: {:10.2f} s  cpu: {:10.2f} s'.format(name,entry['wall_time'],entry['cpu_time']))
+        return '\n'.join(lines)
+
+
+def _to_builtin(value):
+    """
+    convert numpy types for json
+    """
+    if isinstance(value,np.ndarray):
+        return value.tolist()
+    if isinstance(value,np.generic):
+        return value.item()
+    return str(value)
+
+def _sample_stat(sample_stats,*names):
+    """
+    select a sample statistic by its arviz or pymc3 name
+    """
+    for name in names:
+        if name in sample_stats:
+            return sample_stats[name].values
+    return None
+
+def draws_wall_time(trace,parallel=True):
+    """
+    wall time [s] of the draws (without tuning) of an InferenceData trace, 
+    set by the slowest of the parallel chains (parallel=False: sum of the 
+    chains, sampled one after another), None if not recorded
+    """
+    draw_time = _sample_stat(trace.sample_stats,'perf_counter_diff')
+    if draw_time is None:
+        return None
+    chain_time = draw_time.sum(axis=1)
+    return float(chain_time.max() if parallel else chain_time.sum())
+
+def sampler_statistics(trace,variables=['PC0','W0','trend_g','sigma'],sampling_time=None,draw_time=None):
+    """sampler statistics of an (uncompressed) InferenceData trace
+
+    Parameters
+    ----------
+    trace: arviz.InferenceData,
+        trace with sample_stats
+
+    variables: list,
+        variables for which the bulk ESS is computed
+
+    sampling_time: float, default: None,
+        wall time of the sampling phase [s], used to compute ESS/s if the 
+        draws are not timed
+
+    draw_time: float, default: None,
+        wall time of the draws [s], default: draws_wall_time(trace), e.g. 
+        of chains sampled one after another (bpca.sample_adaptive)
+
+    Returns
+    -------
+    dict with draws, gradient evaluations, tree depth histogram, divergences,
+    draw timing and ESS (per second) of the variables
+    """
+    sample_stats = trace.sample_stats
+    stats = {'chains':int(trace.posterior.sizes['chain']),'draws':int(trace.posterior.sizes['draw'])}
+
+    n_steps = _sample_stat(sample_stats,'n_steps','tree_size')
+    if n_steps is not None:
+        stats['gradient_evaluations'] = int(np.nansum(n_steps))
+        stats['gradient_evaluations_per_draw'] = float(np.nanmean(n_steps))
+    depth = _sample_stat(sample_stats,'tree_depth','depth')
+    if depth is not None:
+        values,counts = np.unique(depth.astype(int),return_counts=True)
+        stats['tree_depth_histogram'] = {int(value): int(count) for value,count in zip(values,counts)}
+    diverging = _sample_stat(sample_stats,'diverging')
+    if diverging is not None:
+        stats['divergences'] = int(diverging.sum())
+        stats['divergences_per_chain'] = diverging.sum(axis=1).astype(int).tolist()
+    if draw_time is None:
+        draw_time = draws_wall_time(trace)
+    if draw_time is not None:
+        stats['draws_wall_time'] = draw_time
+    draw_cpu = _sample_stat(sample_stats,'process_time_diff')
+    if draw_cpu is not None:
+        stats['draws_cpu_time'] = float(draw_cpu.sum())
+    if sampling_time is not None:
+        stats['sampling_time'] = float(sampling_time)
+        if 'draws_wall_time' in stats:
+            # includes conversion of the trace
+            stats['tuning_wall_time'] = max(float(sampling_time)-stats['draws_wall_time'],0.)
+
+    variables = [var for var in variables if var in trace.posterior]
+    if len(variables) > 0:
+        import arviz as az
+        ess_bulk = az.ess(trace,var_names=variables,method='bulk')
+        stats['ess_bulk'] = {var: float(ess_bulk[var].min()) for var in variables}
+        # per second of drawing (without tuning and compilation) as in bpca.sample_adaptive
+        time_ = stats.get('draws_wall_time',sampling_time)
+        if time_:
+            stats['ess_per_second'] = {var: ess/float(time_) for var,ess in stats['ess_bulk'].items()}
+    return stats
@@ -0,0 +1,158 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+#    resources: CPU cores of chains and BLAS/OpenMP threads
+
+import os
+import math
+import contextlib
+
+from bpca.model_settings import resource_settings
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError: # optional, without it the thread variables only apply to new processes
+    threadpool_limits = None
+
+# environment variables limiting the threads of BLAS/OpenMP libraries
+THREAD_VARIABLES = ['OMP_NUM_THREADS','OPENBLAS_NUM_THREADS','MKL_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS','NUMEXPR_NUM_THREADS']
+
+# process-wide resource settings, see configure()
+SETTINGS = resource_settings()
+
+
+def configure(**settings):
+    """set the process-wide resource settings of all bpca runs
+
+    Parameters
+    ----------
+    manage : bool
+        split the cores between parallel chains and BLAS/OpenMP threads per chain
+    max_cores : None or int
+        cores used by a run, default: all available cores
+    blas_threads : None or int
+        BLAS/OpenMP threads per chain, default: available cores / parallel chains
+    """
+    for key in settings:
+        if key not in SETTINGS:
+            raise Exception('unknown resource setting '+key+', use one of '+str(list(SETTINGS)))
+    SETTINGS.update(settings)
+    return dict(SETTINGS)
+
+def cgroup_cpu_limit():
+    """
+    CPU limit (quota/period) of the cgroup of this process (v2 or v1), None if unlimited
+    """
+    files = [('/sys/fs/cgroup/cpu.max',None),
+             ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us','/sys/fs/cgroup/cpu/cpu.cfs_period_us'),
+             ('/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_quota_us','/sys/fs/cgroup/cpu,cpuacct/cpu.cfs_period_us')]
+    for quota_file,period_file in files:
+        try:
+            with open(quota_file) as file_:
+                values = file_.read().split()
+            if period_file is not None:
+                with open(period_file) as file_:
+                    values = values[:1]+file_.read().split()[:1]
+        except (OSError,IndexError):
+            continue
+        if len(values) < 2 or values[0] in ['max','-1']:
+            return None
+        return int(values[0])/int(values[1])
+    return None
+
+def available_cores():
+    """
+    number of cores available to this process (CPU affinity and cgroup limit)
+    """
+    if hasattr(os,'sched_getaffinity'):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cores = min(cores,max(int(math.ceil(limit)),1))
+    return cores
+
+@contextlib.contextmanager
+def thread_environment(threads):
+    """
+    set the BLAS/OpenMP thread variables (inherited by child processes)
+    """
+    previous = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+    os.environ.update({name: str(threads) for name in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for name,value in previous.items():
+            if value is None:
+                os.environ.pop(name,None)
+            else:
+                os.environ[name] = value
+
+@contextlib.contextmanager
+def limit_threads(threads=None):
+    """limit BLAS/OpenMP threads of this process and of its child processes
+
+    The thread variables apply to spawned processes, the thread pools of
+    libraries already loaded (inherited by forked chain processes) are
+    limited with threadpoolctl, if installed. threads=None does nothing.
+    """
+    if threads is None:
+        yield
+        return
+    with thread_environment(threads):
+        if threadpool_limits is None:
+            yield
+        else:
+            with threadpool_limits(limits=threads):
+                yield
+
+def resource_layout(chains=None,cores=None,blas_threads=None,max_cores=None):
+    """split the available cores between parallel chains and BLAS/OpenMP threads per chain
+
+    Parameters
+    ----------
+    chains : None or int
+        number of chains, default: max(2, cores)
+    cores : None or int
+        requested parallel chains (pm.sample cores), default: min(4, available cores)
+    blas_threads : None or int
+        BLAS/OpenMP threads per chain, default: available cores / parallel chains
+    max_cores : None or int
+        limit of the available cores
+
+    Returns
+    -------
+    dict with 'available_cores', 'cgroup_limit', 'chains', 'cores' (parallel chains),
+    'blas_threads' and 'used_cores'
+    """
+    available = available_cores()
+    if max_cores is not None:
+        available = max(min(available,int(max_cores)),1)
+    if cores is None:
+        cores = min(4,available)
+    if chains is None:
+        chains = max(2,cores)
+    parallel = max(min(int(cores),int(chains),available),1)
+    if parallel < min(int(cores),int(chains)):
+        print('reduce parallel chains from '+str(cores)+' to '+str(parallel)+' ('+str(available)+' cores)')
+    if blas_threads is None:
+        blas_threads = max(available//parallel,1)
+    return {'available_cores':available,'cgroup_limit':cgroup_cpu_limit(),'chains':int(chains),
+            'cores':parallel,'blas_threads':int(blas_threads),'used_cores':parallel*int(blas_threads)}
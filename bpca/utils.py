@@ -18,20 +18,28 @@
 
 
 import numpy as np
-import matplotlib.colors as mcolors
-from matplotlib.colors import ListedColormap
 import random
 import xarray as xr
-import scipy.stats as stats
-import matplotlib.pyplot as plt
 import pandas as pd
+import copy
+import os
+import json
+import functools
 
-plt.rc('axes', unicode_minus=False)
+# matplotlib is imported by cmap(), the colormap table is read on first use
+COLORMAP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),'colormaps.json')
 
-colors = {"seaice_2":[[0.0,0.0,139.0],[9.0,47.0,175.0],[25.0,122.0,237.0],[134.0,205.0,249.0],[30.0,250.0,160.0],[173.0,255.0,47.0],[250.0,250.0,0.0],[250.0,187.0,0.0],[250.0,125.0,0.0],[250.0,0.0,0.0],[165.0,42.0,42.0],[120.0,0.0,90.0],[148.0,0.0,211.0],[186.0,85.0,211.0]],"MPL_Oranges":[[0.999877,0.958939,0.918001],[0.999631,0.955248,0.910865],[0.999385,0.951557,0.903729],[0.999139,0.947866,0.896594],[0.998893,0.944175,0.889458],[0.998647,0.940484,0.882322],[0.998401,0.936794,0.875186],[0.998155,0.933103,0.868051],[0.997908,0.929412,0.860915],[0.997785,0.927566,0.857347],[0.997416,0.92203,0.846644],[0.997293,0.920185,0.843076],[0.996924,0.914648,0.832372],[0.996801,0.912803,0.828804],[0.996432,0.907266,0.818101],[0.996309,0.905421,0.814533],[0.99594,0.898916,0.801753],[0.995694,0.893503,0.790927],[0.995571,0.890796,0.785513],[0.995202,0.882676,0.769273],[0.994956,0.877263,0.758447],[0.99471,0.871849,0.74762],[0.994587,0.869143,0.742207],[0.994218,0.861023,0.725967],[0.993972,0.855609,0.71514],[0.993725,0.850196,0.704314],[0.993602,0.847489,0.6989],[0.993233,0.839369,0.682661],[0.992987,0.833956,0.671834],[0.992741,0.828543,0.661007],[0.992618,0.825836,0.655594],[0.992249,0.817716,0.639354],[0.992157,0.810458,0.626836],[0.992157,0.802092,0.613303],[0.992157,0.793726,0.599769],[0.992157,0.785359,0.586236],[0.992157,0.776993,0.572703],[0.992157,0.77281,0.565936],[0.992157,0.760261,0.545636],[0.992157,0.751895,0.532103],[0.992157,0.743529,0.51857],[0.992157,0.735163,0.505037],[0.992157,0.726797,0.491503],[0.992157,0.718431,0.47797],[0.992157,0.710065,0.464437],[0.992157,0.705882,0.45767],[0.992157,0.693333,0.43737],[0.992157,0.684967,0.423837],[0.992157,0.67677,0.411657],[0.992157,0.668651,0.400092],[0.992157,0.660531,0.388527],[0.992157,0.652411,0.376963],[0.992157,0.644291,0.365398],[0.992157,0.640231,0.359616],[0.992157,0.628051,0.342268],[0.992157,0.619931,0.330704],[0.992157,0.611811,0.319139],[0.992157,0.603691,0.307574],[0.992157,0.595571,0.296009],[0.992157,0.587451,0.284444],[0.992157,0.579331,0.27288],[0.992157,0.575271,0.267097],[0.992157,0.563091,0.24975],[0.992157,0.554971,0.238185],[0.989942,0.546298,0.227728],[0.98699,0.537439,0.217639],[0.984037,0.528581,0.207551],[0.981084,0.519723,0.197463],[0.978131,0.510865,0.187374],[0.975179,0.502007,0.177286],[0.972226,0.493149,0.167197],[0.969273,0.484291,0.157109],[0.966321,0.475433,0.14702],[0.963368,0.466574,0.136932],[0.960415,0.457716,0.126844],[0.958939,0.453287,0.121799],[0.95451,0.44,0.106667],[0.951557,0.431142,0.096578],[0.948604,0.422284,0.08649],[0.945652,0.413426,0.076401],[0.9403,0.405167,0.070911],[0.934394,0.397047,0.066482],[0.928489,0.388927,0.062053],[0.922584,0.380807,0.057624],[0.916678,0.372687,0.053195],[0.910773,0.364567,0.048766],[0.904867,0.356448,0.044337],[0.898962,0.348328,0.039908],[0.893057,0.340208,0.035479],[0.887151,0.332088,0.03105],[0.881246,0.323968,0.026621],[0.878293,0.319908,0.024406],[0.869435,0.307728,0.017762],[0.863529,0.299608,0.013333],[0.857624,0.291488,0.008904],[0.851719,0.283368,0.004475],[0.84,0.278478,0.004352],[0.827451,0.274048,0.004844],[0.814902,0.269619,0.005336],[0.802353,0.26519,0.005829],[0.789804,0.260761,0.006321],[0.777255,0.256332,0.006813],[0.764706,0.251903,0.007305],[0.752157,0.247474,0.007797],[0.739608,0.243045,0.008289],[0.727059,0.238616,0.008781],[0.71451,0.234187,0.009273],[0.708235,0.231972,0.009519],[0.689412,0.225329,0.010258],[0.676863,0.2209,0.01075],[0.664314,0.216471,0.011242],[0.651765,0.212042,0.011734],[0.641984,0.208305,0.011995],[0.632388,0.204614,0.012241],[0.622791,0.200923,0.012488],[0.613195,0.197232,0.012734],[0.603599,0.193541,0.01298],[0.594002,0.18985,0.013226],[0.584406,0.186159,0.013472],[0.57481,0.182468,0.013718],[0.565213,0.178777,0.013964],[0.555617,0.175087,0.01421],[0.546021,0.171396,0.014456],[0.541223,0.16955,0.014579],[0.526828,0.164014,0.014948],[0.517232,0.160323,0.015194],[0.507636,0.156632,0.01544],[0.498039,0.152941,0.015686]],"thelix":[[1.0,1.0,0.0],[2.0,1.0,0.0],[3.0,2.0,0.0],[4.0,2.0,0.0],[5.0,3.0,0.0],[6.0,4.0,0.0],[7.0,4.0,0.0],[7.0,5.0,0.0],[8.0,6.0,0.0],[9.0,6.0,0.0],[10.0,7.0,0.0],[10.0,8.0,0.0],[11.0,9.0,0.0],[12.0,10.0,0.0],[12.0,11.0,0.0],[13.0,11.0,0.0],[14.0,12.0,0.0],[14.0,13.0,0.0],[15.0,14.0,0.0],[15.0,15.0,0.0],[16.0,16.0,0.0],[16.0,17.0,0.0],[17.0,18.0,0.0],[17.0,19.0,0.0],[18.0,20.0,0.0],[18.0,21.0,0.0],[18.0,22.0,0.0],[19.0,23.0,0.0],[19.0,25.0,0.0],[19.0,26.0,0.0],[20.0,27.0,0.0],[20.0,28.0,0.0],[20.0,29.0,0.0],[20.0,30.0,0.0],[20.0,31.0,1.0],[21.0,33.0,1.0],[21.0,34.0,1.0],[21.0,35.0,1.0],[21.0,36.0,2.0],[21.0,37.0,2.0],[21.0,39.0,2.0],[21.0,40.0,2.0],[21.0,41.0,3.0],[21.0,42.0,3.0],[21.0,43.0,4.0],[21.0,44.0,4.0],[20.0,46.0,4.0],[20.0,47.0,5.0],[20.0,48.0,5.0],[20.0,49.0,6.0],[20.0,50.0,7.0],[19.0,52.0,7.0],[19.0,53.0,8.0],[19.0,54.0,8.0],[18.0,55.0,9.0],[18.0,56.0,10.0],[18.0,57.0,10.0],[17.0,58.0,11.0],[17.0,59.0,12.0],[17.0,60.0,13.0],[16.0,61.0,14.0],[16.0,62.0,15.0],[16.0,63.0,15.0],[15.0,64.0,16.0],[15.0,65.0,17.0],[14.0,66.0,18.0],[14.0,67.0,19.0],[13.0,68.0,21.0],[13.0,69.0,22.0],[12.0,70.0,23.0],[12.0,71.0,24.0],[11.0,72.0,25.0],[11.0,72.0,26.0],[10.0,73.0,28.0],[10.0,74.0,29.0],[9.0,75.0,30.0],[9.0,75.0,32.0],[8.0,76.0,33.0],[8.0,76.0,34.0],[7.0,77.0,36.0],[7.0,78.0,37.0],[6.0,78.0,39.0],[6.0,79.0,40.0],[5.0,79.0,42.0],[5.0,79.0,43.0],[4.0,80.0,45.0],[4.0,80.0,46.0],[4.0,80.0,48.0],[3.0,81.0,50.0],[3.0,81.0,51.0],[2.0,81.0,53.0],[2.0,81.0,55.0],[2.0,81.0,56.0],[1.0,81.0,58.0],[1.0,81.0,60.0],[1.0,81.0,62.0],[1.0,81.0,63.0],[0.0,81.0,65.0],[0.0,81.0,67.0],[0.0,81.0,69.0],[0.0,81.0,71.0],[0.0,81.0,73.0],[0.0,80.0,74.0],[0.0,80.0,76.0],[0.0,80.0,78.0],[0.0,79.0,80.0],[0.0,79.0,82.0],[0.0,79.0,84.0],[0.0,78.0,86.0],[0.0,77.0,88.0],[0.0,77.0,90.0],[0.0,76.0,91.0],[0.0,76.0,93.0],[1.0,75.0,95.0],[1.0,74.0,97.0],[1.0,74.0,99.0],[2.0,73.0,101.0],[2.0,72.0,103.0],[3.0,71.0,105.0],[3.0,70.0,106.0],[4.0,69.0,108.0],[4.0,69.0,110.0],[5.0,68.0,112.0],[6.0,67.0,114.0],[6.0,66.0,115.0],[7.0,65.0,117.0],[8.0,64.0,119.0],[9.0,62.0,121.0],[10.0,61.0,122.0],[11.0,60.0,124.0],[12.0,59.0,126.0],[13.0,58.0,127.0],[14.0,57.0,129.0],[15.0,55.0,130.0],[16.0,54.0,132.0],[18.0,53.0,133.0],[19.0,52.0,135.0],[20.0,50.0,136.0],[22.0,49.0,138.0],[23.0,48.0,139.0],[25.0,47.0,140.0],[26.0,45.0,142.0],[28.0,44.0,143.0],[29.0,43.0,144.0],[31.0,41.0,145.0],[33.0,40.0,146.0],[34.0,39.0,147.0],[36.0,37.0,148.0],[38.0,36.0,149.0],[40.0,35.0,150.0],[42.0,33.0,151.0],[44.0,32.0,152.0],[46.0,31.0,153.0],[48.0,29.0,154.0],[50.0,28.0,154.0],[52.0,27.0,155.0],[54.0,25.0,156.0],[57.0,24.0,156.0],[59.0,23.0,157.0],[61.0,22.0,157.0],[63.0,20.0,158.0],[66.0,19.0,158.0],[68.0,18.0,158.0],[71.0,17.0,158.0],[73.0,16.0,159.0],[75.0,15.0,159.0],[78.0,14.0,159.0],[81.0,13.0,159.0],[83.0,12.0,159.0],[86.0,11.0,159.0],[88.0,10.0,159.0],[91.0,9.0,158.0],[94.0,8.0,158.0],[96.0,7.0,158.0],[99.0,6.0,157.0],[102.0,5.0,157.0],[104.0,5.0,156.0],[107.0,4.0,156.0],[110.0,3.0,155.0],[113.0,3.0,155.0],[115.0,2.0,154.0],[118.0,2.0,153.0],[121.0,1.0,152.0],[124.0,1.0,151.0],[127.0,1.0,150.0],[129.0,0.0,149.0],[132.0,0.0,148.0],[135.0,0.0,147.0],[138.0,0.0,146.0],[141.0,0.0,145.0],[143.0,0.0,143.0],[146.0,0.0,142.0],[149.0,0.0,141.0],[152.0,0.0,139.0],[155.0,0.0,138.0],[157.0,0.0,136.0],[160.0,1.0,135.0],[163.0,1.0,133.0],[165.0,1.0,132.0],[168.0,2.0,130.0],[171.0,3.0,128.0],[173.0,3.0,126.0],[176.0,4.0,125.0],[179.0,5.0,123.0],[181.0,6.0,121.0],[184.0,6.0,119.0],[186.0,7.0,117.0],[188.0,8.0,115.0],[191.0,10.0,113.0],[193.0,11.0,111.0],[196.0,12.0,109.0],[198.0,13.0,107.0],[200.0,15.0,105.0],[202.0,16.0,103.0],[204.0,18.0,100.0],[206.0,19.0,98.0],[209.0,21.0,96.0],[211.0,23.0,94.0],[212.0,24.0,92.0],[214.0,26.0,89.0],[216.0,28.0,87.0],[218.0,30.0,85.0],[220.0,32.0,83.0],[221.0,34.0,80.0],[223.0,37.0,78.0],[224.0,39.0,76.0],[226.0,41.0,73.0],[227.0,44.0,71.0],[229.0,46.0,69.0],[230.0,48.0,66.0],[231.0,51.0,64.0],[232.0,54.0,62.0],[233.0,56.0,60.0],[234.0,59.0,57.0],[235.0,62.0,55.0],[236.0,65.0,53.0],[237.0,68.0,51.0],[238.0,71.0,49.0],[238.0,74.0,46.0],[239.0,77.0,44.0],[240.0,80.0,42.0],[240.0,83.0,40.0],[240.0,86.0,38.0],[241.0,89.0,36.0],[241.0,93.0,34.0],[241.0,96.0,32.0],[241.0,99.0,30.0],[241.0,103.0,28.0],[241.0,106.0,27.0],[241.0,110.0,25.0],[240.0,113.0,23.0],[240.0,117.0,21.0],[239.0,120.0,20.0],[239.0,124.0,18.0]],"MPL_YlGnBu":[[0.997785,0.999139,0.846059],[0.993356,0.997416,0.836217],[0.988927,0.995694,0.826374],[0.984498,0.993972,0.816532],[0.980069,0.992249,0.80669],[0.97564,0.990527,0.796847],[0.971211,0.988804,0.787005],[0.966782,0.987082,0.777163],[0.962353,0.985359,0.76732],[0.960138,0.984498,0.762399],[0.953495,0.981915,0.747636],[0.95128,0.981053,0.742714],[0.944637,0.97847,0.727951],[0.942422,0.977609,0.72303],[0.935779,0.975025,0.708266],[0.933564,0.974164,0.703345],[0.924152,0.970473,0.694533],[0.914802,0.966782,0.695271],[0.910127,0.964937,0.69564],[0.896102,0.9594,0.696747],[0.886751,0.955709,0.697486],[0.877401,0.952018,0.698224],[0.872726,0.950173,0.698593],[0.858701,0.944637,0.6997],[0.84935,0.940946,0.700438],[0.84,0.937255,0.701176],[0.835325,0.935409,0.701546],[0.8213,0.929873,0.702653],[0.811949,0.926182,0.703391],[0.802599,0.922491,0.704129],[0.797924,0.920646,0.704498],[0.783899,0.91511,0.705606],[0.76932,0.909419,0.706959],[0.751603,0.90253,0.708681],[0.733887,0.89564,0.710404],[0.716171,0.88875,0.712126],[0.698454,0.881861,0.713849],[0.689596,0.878416,0.71471],[0.663022,0.868082,0.717293],[0.645306,0.861192,0.719016],[0.627589,0.854302,0.720738],[0.609873,0.847413,0.722461],[0.592157,0.840523,0.724183],[0.574441,0.833633,0.725905],[0.556724,0.826744,0.727628],[0.547866,0.823299,0.728489],[0.521292,0.812964,0.731073],[0.503576,0.806075,0.732795],[0.487551,0.800031,0.734856],[0.472295,0.794371,0.73707],[0.45704,0.788712,0.739285],[0.441784,0.783053,0.741499],[0.426528,0.777393,0.743714],[0.4189,0.774564,0.744821],[0.396017,0.766075,0.748143],[0.380761,0.760415,0.750358],[0.365506,0.754756,0.752572],[0.35025,0.749097,0.754787],[0.334994,0.743437,0.757001],[0.319739,0.737778,0.759216],[0.304483,0.732118,0.76143],[0.296855,0.729289,0.762537],[0.273972,0.7208,0.765859],[0.258716,0.71514,0.768074],[0.248258,0.706897,0.767889],[0.2394,0.697793,0.766905],[0.230542,0.688689,0.765921],[0.221684,0.679585,0.764937],[0.212826,0.670481,0.763952],[0.203968,0.661376,0.762968],[0.19511,0.652272,0.761984],[0.186251,0.643168,0.761],[0.177393,0.634064,0.760015],[0.168535,0.62496,0.759031],[0.159677,0.615855,0.758047],[0.155248,0.611303,0.757555],[0.141961,0.597647,0.756078],[0.133103,0.588543,0.755094],[0.124245,0.579439,0.75411],[0.115386,0.570335,0.753126],[0.114725,0.558431,0.748143],[0.115955,0.545882,0.742238],[0.117186,0.533333,0.736332],[0.118416,0.520784,0.730427],[0.119646,0.508235,0.724521],[0.120877,0.495686,0.718616],[0.122107,0.483137,0.712711],[0.123337,0.470588,0.706805],[0.124567,0.458039,0.7009],[0.125798,0.44549,0.694994],[0.127028,0.432941,0.689089],[0.127643,0.426667,0.686136],[0.129489,0.407843,0.677278],[0.130719,0.395294,0.671373],[0.131949,0.382745,0.665467],[0.13318,0.370196,0.659562],[0.133979,0.359585,0.654518],[0.134717,0.34925,0.649596],[0.135456,0.338916,0.644675],[0.136194,0.328581,0.639754],[0.136932,0.318247,0.634833],[0.13767,0.307912,0.629912],[0.138408,0.297578,0.62499],[0.139146,0.287243,0.620069],[0.139885,0.276909,0.615148],[0.140623,0.266574,0.610227],[0.141361,0.25624,0.605306],[0.14173,0.251073,0.602845],[0.142837,0.235571,0.595463],[0.143576,0.225236,0.590542],[0.144314,0.214902,0.585621],[0.145052,0.204567,0.5807],[0.138408,0.198616,0.566551],[0.131273,0.192957,0.551788],[0.124137,0.187297,0.537024],[0.117001,0.181638,0.522261],[0.109865,0.175978,0.507497],[0.10273,0.170319,0.492734],[0.095594,0.16466,0.47797],[0.088458,0.159,0.463206],[0.081323,0.153341,0.448443],[0.074187,0.147682,0.433679],[0.067051,0.142022,0.418916],[0.063483,0.139193,0.411534],[0.05278,0.130704,0.389389],[0.045644,0.125044,0.374625],[0.038508,0.119385,0.359862],[0.031373,0.113725,0.345098]],"prcp_2":[[245.0,245.0,245.0],[175.0,237.0,237.0],[152.0,251.0,152.0],[67.0,205.0,128.0],[59.0,179.0,113.0],[250.0,250.0,210.0],[255.0,255.0,0.0],[255.0,164.0,0.0],[255.0,0.0,0.0],[205.0,55.0,0.0],[199.0,20.0,133.0],[237.0,130.0,237.0]],"rainbow":[[84.0,0.0,159.0],[84.0,0.0,163.0],[84.0,0.0,168.0],[79.0,0.0,177.0],[78.0,0.0,182.0],[77.0,0.0,186.0],[76.0,0.0,191.0],[70.0,0.0,200.0],[68.0,0.0,204.0],[66.0,0.0,209.0],[60.0,0.0,214.0],[58.0,0.0,218.0],[55.0,0.0,223.0],[46.0,0.0,232.0],[43.0,0.0,236.0],[40.0,0.0,241.0],[36.0,0.0,245.0],[33.0,0.0,250.0],[25.0,0.0,255.0],[16.0,0.0,255.0],[12.0,0.0,255.0],[4.0,0.0,255.0],[0.0,0.0,255.0],[0.0,4.0,255.0],[0.0,16.0,255.0],[0.0,21.0,255.0],[0.0,25.0,255.0],[0.0,29.0,255.0],[0.0,38.0,255.0],[0.0,42.0,255.0],[0.0,46.0,255.0],[0.0,51.0,255.0],[0.0,63.0,255.0],[0.0,67.0,255.0],[0.0,72.0,255.0],[0.0,84.0,255.0],[0.0,89.0,255.0],[0.0,93.0,255.0],[0.0,97.0,255.0],[0.0,106.0,255.0],[0.0,110.0,255.0],[0.0,114.0,255.0],[0.0,119.0,255.0],[0.0,127.0,255.0],[0.0,135.0,255.0],[0.0,140.0,255.0],[0.0,152.0,255.0],[0.0,157.0,255.0],[0.0,161.0,255.0],[0.0,165.0,255.0],[0.0,174.0,255.0],[0.0,178.0,255.0],[0.0,182.0,255.0],[0.0,187.0,255.0],[0.0,195.0,255.0],[0.0,199.0,255.0],[0.0,216.0,255.0],[0.0,220.0,255.0],[0.0,225.0,255.0],[0.0,229.0,255.0],[0.0,233.0,255.0],[0.0,242.0,255.0],[0.0,246.0,255.0],[0.0,250.0,255.0],[0.0,255.0,255.0],[0.0,255.0,246.0],[0.0,255.0,242.0],[0.0,255.0,238.0],[0.0,255.0,225.0],[0.0,255.0,216.0],[0.0,255.0,212.0],[0.0,255.0,203.0],[0.0,255.0,199.0],[0.0,255.0,195.0],[0.0,255.0,191.0],[0.0,255.0,187.0],[0.0,255.0,178.0],[0.0,255.0,174.0],[0.0,255.0,170.0],[0.0,255.0,157.0],[0.0,255.0,152.0],[0.0,255.0,144.0],[0.0,255.0,135.0],[0.0,255.0,131.0],[0.0,255.0,127.0],[0.0,255.0,123.0],[0.0,255.0,114.0],[0.0,255.0,110.0],[0.0,255.0,106.0],[0.0,255.0,102.0],[0.0,255.0,89.0],[0.0,255.0,84.0],[0.0,255.0,80.0],[0.0,255.0,76.0],[0.0,255.0,63.0],[0.0,255.0,59.0],[0.0,255.0,55.0],[0.0,255.0,46.0],[0.0,255.0,42.0],[0.0,255.0,38.0],[0.0,255.0,25.0],[0.0,255.0,21.0],[0.0,255.0,16.0],[0.0,255.0,12.0],[0.0,255.0,8.0],[0.0,255.0,0.0],[8.0,255.0,0.0],[12.0,255.0,0.0],[21.0,255.0,0.0],[25.0,255.0,0.0],[29.0,255.0,0.0],[42.0,255.0,0.0],[46.0,255.0,0.0],[51.0,255.0,0.0],[55.0,255.0,0.0],[63.0,255.0,0.0],[67.0,255.0,0.0],[72.0,255.0,0.0],[76.0,255.0,0.0],[89.0,255.0,0.0],[93.0,255.0,0.0],[97.0,255.0,0.0],[110.0,255.0,0.0],[114.0,255.0,0.0],[119.0,255.0,0.0],[123.0,255.0,0.0],[131.0,255.0,0.0],[135.0,255.0,0.0],[140.0,255.0,0.0],[144.0,255.0,0.0],[153.0,255.0,0.0],[161.0,255.0,0.0],[165.0,255.0,0.0],[178.0,255.0,0.0],[182.0,255.0,0.0],[187.0,255.0,0.0],[191.0,255.0,0.0],[199.0,255.0,0.0],[203.0,255.0,0.0],[208.0,255.0,0.0],[212.0,255.0,0.0],[221.0,255.0,0.0],[225.0,255.0,0.0],[242.0,255.0,0.0],[246.0,255.0,0.0],[250.0,255.0,0.0],[255.0,255.0,0.0],[255.0,250.0,0.0],[255.0,242.0,0.0],[255.0,238.0,0.0],[255.0,233.0,0.0],[255.0,229.0,0.0],[255.0,221.0,0.0],[255.0,216.0,0.0],[255.0,212.0,0.0],[255.0,199.0,0.0],[255.0,191.0,0.0],[255.0,187.0,0.0],[255.0,178.0,0.0],[255.0,174.0,0.0],[255.0,170.0,0.0],[255.0,165.0,0.0],[255.0,161.0,0.0],[255.0,153.0,0.0],[255.0,148.0,0.0],[255.0,144.0,0.0],[255.0,131.0,0.0],[255.0,127.0,0.0],[255.0,119.0,0.0],[255.0,110.0,0.0],[255.0,106.0,0.0],[255.0,102.0,0.0],[255.0,97.0,0.0],[255.0,89.0,0.0],[255.0,85.0,0.0],[255.0,80.0,0.0],[255.0,76.0,0.0],[255.0,63.0,0.0],[255.0,59.0,0.0],[255.0,55.0,0.0],[255.0,51.0,0.0],[255.0,38.0,0.0],[255.0,34.0,0.0],[255.0,29.0,0.0],[255.0,21.0,0.0],[255.0,17.0,0.0],[255.0,12.0,0.0],[255.0,0.0,0.0]],"NCV_roullet":[[91.0,96.0,152.0],[63.0,70.0,156.0],[21.0,32.0,159.0],[4.0,16.0,162.0],[0.0,13.0,164.0],[0.0,13.0,160.0],[0.0,11.0,134.0],[0.0,5.0,66.0],[0.0,2.0,23.0],[0.0,7.0,77.0],[0.0,14.0,147.0],[0.0,17.0,177.0],[0.0,20.0,185.0],[5.0,25.0,188.0],[28.0,46.0,190.0],[82.0,95.0,193.0],[117.0,126.0,195.0],[76.0,91.0,197.0],[25.0,46.0,199.0],[4.0,30.0,201.0],[0.0,27.0,202.0],[0.0,27.0,197.0],[0.0,23.0,167.0],[0.0,14.0,97.0],[0.0,8.0,58.0],[0.0,17.0,115.0],[0.0,29.0,183.0],[0.0,34.0,209.0],[1.0,37.0,216.0],[7.0,44.0,218.0],[35.0,68.0,220.0],[99.0,121.0,221.0],[132.0,150.0,222.0],[82.0,110.0,224.0],[25.0,66.0,225.0],[4.0,50.0,226.0],[0.0,49.0,226.0],[0.0,48.0,220.0],[0.0,42.0,186.0],[0.0,26.0,115.0],[0.0,19.0,80.0],[0.0,35.0,141.0],[0.0,52.0,206.0],[0.0,60.0,230.0],[1.0,64.0,235.0],[8.0,72.0,237.0],[42.0,98.0,237.0],[111.0,148.0,238.0],[141.0,171.0,239.0],[84.0,133.0,240.0],[25.0,95.0,241.0],[4.0,83.0,241.0],[0.0,83.0,240.0],[0.0,82.0,232.0],[0.0,71.0,196.0],[0.0,46.0,123.0],[0.0,36.0,94.0],[0.0,62.0,158.0],[0.0,89.0,220.0],[0.0,101.0,241.0],[2.0,107.0,246.0],[11.0,115.0,247.0],[48.0,139.0,247.0],[120.0,180.0,248.0],[146.0,195.0,248.0],[83.0,165.0,249.0],[25.0,139.0,249.0],[6.0,133.0,249.0],[3.0,134.0,248.0],[3.0,133.0,239.0],[3.0,114.0,200.0],[2.0,74.0,125.0],[2.0,62.0,102.0],[4.0,105.0,169.0],[6.0,146.0,228.0],[8.0,163.0,248.0],[11.0,170.0,251.0],[22.0,178.0,252.0],[62.0,195.0,252.0],[133.0,219.0,252.0],[152.0,226.0,253.0],[91.0,213.0,253.0],[40.0,205.0,253.0],[25.0,206.0,253.0],[25.0,209.0,251.0],[26.0,205.0,241.0],[23.0,173.0,199.0],[16.0,111.0,124.0],[15.0,98.0,107.0],[28.0,165.0,177.0],[41.0,222.0,233.0],[48.0,243.0,250.0],[55.0,251.0,253.0],[68.0,254.0,252.0],[106.0,254.0,249.0],[164.0,254.0,249.0],[177.0,254.0,248.0],[131.0,254.0,241.0],[100.0,254.0,233.0],[95.0,254.0,228.0],[99.0,252.0,224.0],[101.0,240.0,211.0],[88.0,195.0,170.0],[57.0,121.0,104.0],[56.0,111.0,95.0],[97.0,182.0,155.0],[133.0,235.0,200.0],[150.0,251.0,213.0],[160.0,254.0,216.0],[172.0,254.0,218.0],[194.0,254.0,226.0],[220.0,254.0,238.0],[226.0,254.0,239.0],[212.0,254.0,231.0],[207.0,254.0,227.0],[210.0,254.0,227.0],[214.0,252.0,228.0],[209.0,239.0,219.0],[171.0,191.0,177.0],[107.0,117.0,110.0],[106.0,114.0,108.0],[177.0,187.0,179.0],[229.0,237.0,230.0],[245.0,252.0,246.0],[250.0,254.0,251.0],[253.0,254.0,253.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[253.0,254.0,253.0],[251.0,254.0,250.0],[246.0,252.0,245.0],[230.0,237.0,229.0],[179.0,187.0,177.0],[108.0,114.0,106.0],[110.0,117.0,107.0],[177.0,191.0,171.0],[219.0,239.0,209.0],[228.0,252.0,214.0],[227.0,254.0,210.0],[227.0,254.0,207.0],[231.0,254.0,212.0],[239.0,254.0,226.0],[238.0,254.0,220.0],[226.0,254.0,194.0],[218.0,254.0,172.0],[216.0,254.0,160.0],[213.0,251.0,150.0],[200.0,235.0,133.0],[155.0,182.0,97.0],[95.0,111.0,56.0],[104.0,121.0,57.0],[170.0,195.0,88.0],[211.0,240.0,101.0],[224.0,252.0,99.0],[228.0,254.0,95.0],[233.0,254.0,100.0],[241.0,254.0,131.0],[248.0,254.0,177.0],[249.0,254.0,164.0],[249.0,254.0,106.0],[252.0,254.0,68.0],[253.0,251.0,55.0],[250.0,243.0,48.0],[233.0,222.0,41.0],[177.0,165.0,28.0],[107.0,98.0,15.0],[124.0,111.0,16.0],[199.0,173.0,23.0],[241.0,205.0,26.0],[251.0,209.0,25.0],[253.0,206.0,25.0],[253.0,205.0,40.0],[253.0,213.0,91.0],[253.0,226.0,152.0],[252.0,219.0,133.0],[252.0,195.0,62.0],[252.0,178.0,22.0],[251.0,170.0,11.0],[248.0,163.0,8.0],[228.0,146.0,6.0],[169.0,105.0,4.0],[102.0,62.0,2.0],[125.0,74.0,2.0],[200.0,114.0,3.0],[239.0,133.0,3.0],[248.0,134.0,3.0],[249.0,133.0,6.0],[249.0,139.0,25.0],[249.0,165.0,83.0],[248.0,195.0,146.0],[248.0,180.0,120.0],[247.0,139.0,48.0],[247.0,115.0,11.0],[246.0,107.0,2.0],[241.0,101.0,0.0],[220.0,89.0,0.0],[158.0,62.0,0.0],[94.0,36.0,0.0],[123.0,46.0,0.0],[196.0,71.0,0.0],[232.0,82.0,0.0],[240.0,83.0,0.0],[241.0,83.0,4.0],[241.0,95.0,25.0],[240.0,133.0,84.0],[239.0,171.0,141.0],[238.0,148.0,111.0],[237.0,98.0,42.0],[237.0,72.0,8.0],[235.0,64.0,1.0],[230.0,60.0,0.0],[206.0,52.0,0.0],[141.0,35.0,0.0],[80.0,19.0,0.0],[115.0,26.0,0.0],[186.0,42.0,0.0],[220.0,48.0,0.0],[226.0,49.0,0.0],[226.0,50.0,4.0],[225.0,66.0,25.0],[224.0,110.0,82.0],[222.0,150.0,132.0],[221.0,121.0,99.0],[220.0,68.0,35.0],[218.0,44.0,7.0],[216.0,37.0,1.0],[209.0,34.0,0.0],[183.0,29.0,0.0],[115.0,17.0,0.0],[58.0,8.0,0.0],[97.0,14.0,0.0],[167.0,23.0,0.0],[197.0,27.0,0.0],[202.0,27.0,0.0],[201.0,30.0,4.0],[199.0,46.0,25.0],[197.0,91.0,76.0],[195.0,126.0,117.0],[193.0,95.0,82.0],[190.0,46.0,28.0],[188.0,25.0,5.0],[185.0,20.0,0.0],[177.0,17.0,0.0],[147.0,14.0,0.0],[77.0,7.0,0.0],[23.0,2.0,0.0],[66.0,5.0,0.0],[134.0,11.0,0.0],[160.0,13.0,0.0],[164.0,13.0,0.0],[162.0,16.0,4.0],[159.0,32.0,21.0],[156.0,70.0,63.0],[152.0,96.0,91.0]],"psgcap":[[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0],[0.0,1.0,1.0],[1.0,0.0,0.83],[1.0,1.0,0.0],[1.0,0.5,0.0],[0.6,0.83,0.0],[0.0,1.0,0.6],[0.0,0.5,1.0],[0.55,0.0,0.83],[1.0,0.0,0.55],[0.33,0.33,0.33],[0.67,0.67,0.67],[1.0,1.0,0.33],[0.75,1.0,0.45],[0.45,1.0,0.6],[0.17,1.0,0.75],[0.25,0.83,0.83],[0.5,0.67,0.83],[0.75,0.55,0.83],[1.0,0.33,0.9],[0.67,0.9,0.45],[0.4,0.9,0.55],[0.17,0.9,0.67],[0.17,0.67,0.9],[0.17,0.5,1.0],[0.45,0.33,1.0],[0.75,0.17,1.0],[0.9,0.09,1.0],[0.83,1.0,0.17],[0.67,1.0,0.25],[0.45,1.0,0.33],[0.17,1.0,0.5],[0.17,0.83,0.6],[0.17,0.67,0.75],[0.17,0.55,0.83],[0.25,0.45,0.9],[0.4,0.33,0.9],[0.67,0.17,0.9],[0.83,0.17,0.83],[0.9,0.33,0.67],[0.83,0.45,0.6],[0.83,0.6,0.5],[0.9,0.67,0.4],[0.9,0.67,0.25],[1.0,0.9,0.09],[0.83,1.0,0.09],[0.6,1.0,0.17],[0.45,1.0,0.25],[0.17,0.9,0.45],[0.17,0.83,0.55],[0.17,0.67,0.67],[0.17,0.55,0.75],[0.17,0.4,0.9],[0.4,0.25,0.9],[0.55,0.17,0.9],[0.83,0.17,0.75],[1.0,0.17,0.67],[1.0,0.25,0.6],[1.0,0.4,0.5],[1.0,0.5,0.4],[1.0,0.83,0.09],[0.75,1.0,0.0],[0.6,1.0,0.13],[0.4,1.0,0.17],[0.13,1.0,0.33],[0.13,0.83,0.45],[0.17,0.75,0.5],[0.13,0.6,0.67],[0.13,0.5,0.75],[0.13,0.4,0.83],[0.17,0.25,0.9],[0.17,0.17,1.0],[0.33,0.09,1.0],[0.55,0.09,0.9],[0.75,0.0,0.83],[0.9,0.0,0.75],[0.9,0.75,0.09],[0.67,0.9,0.09],[0.55,0.9,0.13],[0.25,0.9,0.25],[0.13,0.9,0.33],[0.17,0.75,0.4],[0.13,0.67,0.5],[0.13,0.55,0.6],[0.13,0.45,0.67],[0.17,0.33,0.75],[0.17,0.25,0.83],[0.33,0.17,0.83],[0.55,0.13,0.75],[0.75,0.13,0.67],[0.9,0.17,0.55],[0.83,0.25,0.5],[0.83,0.75,0.0],[0.6,0.83,0.09],[0.45,0.9,0.09],[0.33,0.9,0.13],[0.13,0.9,0.25],[0.17,0.83,0.25],[0.17,0.75,0.33],[0.17,0.6,0.45],[0.13,0.5,0.55],[0.13,0.45,0.6],[0.17,0.33,0.67],[0.33,0.25,0.67],[0.45,0.25,0.6],[0.67,0.25,0.5],[0.83,0.25,0.4],[1.0,0.25,0.33],[0.75,0.67,0.0],[0.55,0.75,0.09],[0.4,0.83,0.09],[0.25,0.9,0.09],[0.17,0.9,0.13],[0.17,0.83,0.17],[0.13,0.75,0.25],[0.13,0.67,0.33],[0.13,0.6,0.4],[0.13,0.45,0.5],[0.13,0.4,0.55],[0.25,0.33,0.55],[0.45,0.33,0.45],[0.55,0.33,0.4],[0.67,0.33,0.33],[0.83,0.33,0.25],[0.67,0.6,0.0],[0.5,0.67,0.09],[0.4,0.67,0.13],[0.25,0.67,0.17],[0.13,0.67,0.25],[0.09,0.6,0.33],[0.09,0.5,0.4],[0.13,0.4,0.45],[0.13,0.33,0.5],[0.09,0.17,0.67],[0.17,0.13,0.67],[0.4,0.13,0.55],[0.5,0.13,0.5],[0.6,0.13,0.45],[0.75,0.13,0.4],[0.9,0.13,0.33],[0.55,0.5,0.09],[0.45,0.6,0.09],[0.33,0.6,0.13],[0.17,0.6,0.17],[0.09,0.55,0.25],[0.13,0.45,0.33],[0.09,0.4,0.4],[0.17,0.33,0.4],[0.17,0.25,0.45],[0.25,0.17,0.5],[0.25,0.13,0.55],[0.33,0.13,0.5],[0.45,0.13,0.45],[0.55,0.13,0.4],[0.67,0.13,0.33],[0.83,0.13,0.25],[0.5,0.45,0.09],[0.4,0.5,0.09],[0.33,0.6,0.0],[0.17,0.6,0.09],[0.13,0.67,0.09],[0.13,0.6,0.13],[0.13,0.5,0.17],[0.09,0.45,0.25],[0.13,0.4,0.25],[0.13,0.33,0.33],[0.09,0.25,0.4],[0.09,0.17,0.5],[0.09,0.13,0.55],[0.13,0.0,0.6],[0.33,0.0,0.5],[0.5,0.0,0.4],[0.75,0.33,0.0],[0.67,0.4,0.0],[0.55,0.4,0.09],[0.33,0.4,0.17],[0.25,0.33,0.25],[0.25,0.25,0.33],[0.25,0.17,0.4],[0.33,0.13,0.4],[0.5,0.13,0.33],[0.6,0.13,0.25],[0.75,0.09,0.25],[0.83,0.0,0.25],[1.0,0.0,0.17],[1.0,0.13,0.13],[0.9,0.17,0.09],[0.83,0.25,0.09],[0.6,0.25,0.0],[0.45,0.4,0.0],[0.25,0.4,0.13],[0.25,0.33,0.17],[0.17,0.25,0.25],[0.17,0.17,0.33],[0.25,0.13,0.33],[0.33,0.09,0.33],[0.5,0.09,0.25],[0.67,0.09,0.17],[0.83,0.0,0.17],[0.9,0.0,0.13],[1.0,0.0,0.09],[1.0,0.13,0.09],[0.83,0.17,0.0],[0.75,0.25,0.0],[0.5,0.17,0.0],[0.4,0.33,0.0],[0.13,0.45,0.09],[0.09,0.4,0.13],[0.09,0.33,0.17],[0.09,0.25,0.25],[0.13,0.17,0.33],[0.17,0.09,0.4],[0.25,0.0,0.33],[0.45,0.0,0.25],[0.6,0.0,0.17],[0.75,0.0,0.13],[0.83,0.0,0.09],[0.75,0.09,0.09],[0.67,0.13,0.09],[0.6,0.17,0.0],[0.4,0.17,0.0],[0.17,0.33,0.0],[0.09,0.33,0.0],[0.09,0.25,0.09],[0.09,0.17,0.13],[0.09,0.13,0.25],[0.09,0.13,0.33],[0.09,0.0,0.33],[0.13,0.0,0.25],[0.17,0.0,0.17],[0.33,0.0,0.17],[0.33,0.0,0.13],[0.4,0.0,0.09],[0.45,0.09,0.09],[0.45,0.13,0.0],[0.17,0.09,0.0]],"GMT_jet":[[0.0,0.0,0.505882],[0.0,0.0,0.521569],[0.0,0.0,0.537255],[0.0,0.0,0.552941],[0.0,0.0,0.568627],[0.0,0.0,0.584314],[0.0,0.0,0.6],[0.0,0.0,0.615686],[0.0,0.0,0.631373],[0.0,0.0,0.647059],[0.0,0.0,0.662745],[0.0,0.0,0.678431],[0.0,0.0,0.694118],[0.0,0.0,0.709804],[0.0,0.0,0.72549],[0.0,0.0,0.741176],[0.0,0.0,0.756863],[0.0,0.0,0.772549],[0.0,0.0,0.788235],[0.0,0.0,0.803922],[0.0,0.0,0.819608],[0.0,0.0,0.835294],[0.0,0.0,0.85098],[0.0,0.0,0.866667],[0.0,0.0,0.882353],[0.0,0.0,0.898039],[0.0,0.0,0.913725],[0.0,0.0,0.929412],[0.0,0.0,0.945098],[0.0,0.0,0.960784],[0.0,0.0,0.976471],[0.0,0.0,0.992157],[0.0,0.007812,1.0],[0.0,0.023438,1.0],[0.0,0.039062,1.0],[0.0,0.054688,1.0],[0.0,0.070312,1.0],[0.0,0.085938,1.0],[0.0,0.101562,1.0],[0.0,0.117188,1.0],[0.0,0.132812,1.0],[0.0,0.148438,1.0],[0.0,0.164062,1.0],[0.0,0.179688,1.0],[0.0,0.195312,1.0],[0.0,0.210938,1.0],[0.0,0.226562,1.0],[0.0,0.242188,1.0],[0.0,0.257812,1.0],[0.0,0.273438,1.0],[0.0,0.289062,1.0],[0.0,0.304688,1.0],[0.0,0.320312,1.0],[0.0,0.335938,1.0],[0.0,0.351562,1.0],[0.0,0.367188,1.0],[0.0,0.382812,1.0],[0.0,0.398438,1.0],[0.0,0.414062,1.0],[0.0,0.429688,1.0],[0.0,0.445312,1.0],[0.0,0.460938,1.0],[0.0,0.476562,1.0],[0.0,0.492188,1.0],[0.0,0.507812,1.0],[0.0,0.523438,1.0],[0.0,0.539062,1.0],[0.0,0.554688,1.0],[0.0,0.570312,1.0],[0.0,0.585938,1.0],[0.0,0.601562,1.0],[0.0,0.617188,1.0],[0.0,0.632812,1.0],[0.0,0.648438,1.0],[0.0,0.664062,1.0],[0.0,0.679688,1.0],[0.0,0.695312,1.0],[0.0,0.710938,1.0],[0.0,0.726562,1.0],[0.0,0.742188,1.0],[0.0,0.757812,1.0],[0.0,0.773438,1.0],[0.0,0.789062,1.0],[0.0,0.804688,1.0],[0.0,0.820312,1.0],[0.0,0.835938,1.0],[0.0,0.851562,1.0],[0.0,0.867188,1.0],[0.0,0.882812,1.0],[0.0,0.898438,1.0],[0.0,0.914062,1.0],[0.0,0.929688,1.0],[0.0,0.945312,1.0],[0.0,0.960938,1.0],[0.0,0.976562,1.0],[0.0,0.992188,1.0],[1.0,1.0,0.998581],[1.0,1.0,0.990699],[1.0,1.0,0.982816],[1.0,1.0,0.974933],[1.0,1.0,0.967051],[1.0,1.0,0.959168],[1.0,1.0,0.951286],[1.0,1.0,0.943403],[1.0,1.0,0.935521],[1.0,1.0,0.927638],[1.0,1.0,0.919756],[1.0,1.0,0.911873],[1.0,1.0,0.903991],[1.0,1.0,0.896108],[1.0,1.0,0.888225],[1.0,1.0,0.880343],[1.0,1.0,0.87246],[1.0,1.0,0.864578],[1.0,1.0,0.856695],[1.0,1.0,0.848813],[1.0,1.0,0.84093],[1.0,1.0,0.833048],[1.0,1.0,0.825165],[1.0,1.0,0.817282],[1.0,1.0,0.8094],[1.0,1.0,0.801517],[1.0,1.0,0.793635],[1.0,1.0,0.785752],[1.0,1.0,0.77787],[1.0,1.0,0.769987],[1.0,1.0,0.762105],[1.0,1.0,0.754222],[1.0,1.0,0.74634],[1.0,1.0,0.738457],[1.0,1.0,0.730574],[1.0,1.0,0.722692],[1.0,1.0,0.714809],[1.0,1.0,0.706927],[1.0,1.0,0.699044],[1.0,1.0,0.691162],[1.0,1.0,0.683279],[1.0,1.0,0.675397],[1.0,1.0,0.667514],[1.0,1.0,0.659631],[1.0,1.0,0.651749],[1.0,1.0,0.643866],[1.0,1.0,0.635984],[1.0,1.0,0.628101],[1.0,1.0,0.620219],[1.0,1.0,0.612336],[1.0,1.0,0.604454],[1.0,1.0,0.596571],[1.0,1.0,0.588689],[1.0,1.0,0.580806],[1.0,1.0,0.572923],[1.0,1.0,0.565041],[1.0,1.0,0.557158],[1.0,1.0,0.549276],[1.0,1.0,0.541393],[1.0,1.0,0.533511],[1.0,1.0,0.525628],[1.0,1.0,0.517746],[1.0,1.0,0.509863],[1.0,1.0,0.50198],[1.0,0.997173,0.0],[1.0,0.98147,0.0],[1.0,0.965766,0.0],[1.0,0.950063,0.0],[1.0,0.934359,0.0],[1.0,0.918656,0.0],[1.0,0.902952,0.0],[1.0,0.887249,0.0],[1.0,0.871545,0.0],[1.0,0.855842,0.0],[1.0,0.840138,0.0],[1.0,0.824435,0.0],[1.0,0.808731,0.0],[1.0,0.793028,0.0],[1.0,0.777324,0.0],[1.0,0.761621,0.0],[1.0,0.745917,0.0],[1.0,0.730214,0.0],[1.0,0.71451,0.0],[1.0,0.698807,0.0],[1.0,0.683103,0.0],[1.0,0.667399,0.0],[1.0,0.651696,0.0],[1.0,0.635992,0.0],[1.0,0.620289,0.0],[1.0,0.604585,0.0],[1.0,0.588882,0.0],[1.0,0.573178,0.0],[1.0,0.557475,0.0],[1.0,0.541771,0.0],[1.0,0.526068,0.0],[1.0,0.510364,0.0],[1.0,0.494661,0.0],[1.0,0.478957,0.0],[1.0,0.463254,0.0],[1.0,0.44755,0.0],[1.0,0.431847,0.0],[1.0,0.416143,0.0],[1.0,0.40044,0.0],[1.0,0.384736,0.0],[1.0,0.369033,0.0],[1.0,0.353329,0.0],[1.0,0.337626,0.0],[1.0,0.321922,0.0],[1.0,0.306219,0.0],[1.0,0.290515,0.0],[1.0,0.274812,0.0],[1.0,0.259108,0.0],[1.0,0.243405,0.0],[1.0,0.227701,0.0],[1.0,0.211997,0.0],[1.0,0.196294,0.0],[1.0,0.18059,0.0],[1.0,0.164887,0.0],[1.0,0.149183,0.0],[1.0,0.13348,0.0],[1.0,0.117776,0.0],[1.0,0.102073,0.0],[1.0,0.086369,0.0],[1.0,0.070666,0.0],[1.0,0.054962,0.0],[1.0,0.039259,0.0],[1.0,0.023555,0.0],[1.0,0.007852,0.0],[0.992157,0.0,0.0],[0.976471,0.0,0.0],[0.960784,0.0,0.0],[0.945098,0.0,0.0],[0.929412,0.0,0.0],[0.913725,0.0,0.0],[0.898039,0.0,0.0],[0.882353,0.0,0.0],[0.866667,0.0,0.0],[0.85098,0.0,0.0],[0.835294,0.0,0.0],[0.819608,0.0,0.0],[0.803922,0.0,0.0],[0.788235,0.0,0.0],[0.772549,0.0,0.0],[0.756863,0.0,0.0],[0.741176,0.0,0.0],[0.72549,0.0,0.0],[0.709804,0.0,0.0],[0.694118,0.0,0.0],[0.678431,0.0,0.0],[0.662745,0.0,0.0],[0.647059,0.0,0.0],[0.631373,0.0,0.0],[0.615686,0.0,0.0],[0.6,0.0,0.0],[0.584314,0.0,0.0],[0.568627,0.0,0.0],[0.552941,0.0,0.0],[0.537255,0.0,0.0],[0.521569,0.0,0.0],[0.505882,0.0,0.0]],"GMT_paired":[[0.65098,0.807843,0.890196],[0.121569,0.470588,0.705882],[0.698039,0.87451,0.541176],[0.2,0.627451,0.172549],[0.984314,0.603922,0.6],[0.890196,0.101961,0.109804],[0.992157,0.74902,0.435294],[1.0,0.498039,0.0],[0.792157,0.698039,0.839216],[0.415686,0.239216,0.603922],[1.0,1.0,0.6],[0.694118,0.34902,0.156863]],"SVG_feb_sunrise":[[131.0,60.0,64.0],[187.0,95.0,80.0],[208.0,107.0,79.0],[222.0,115.0,77.0],[235.0,123.0,75.0],[245.0,131.0,75.0],[249.0,140.0,76.0],[251.0,143.0,75.0],[252.0,152.0,75.0],[253.0,177.0,79.0],[253.0,199.0,84.0],[252.0,190.0,77.0],[251.0,173.0,77.0],[252.0,166.0,85.0],[252.0,159.0,86.0],[253.0,160.0,92.0],[253.0,162.0,95.0],[253.0,164.0,97.0],[253.0,166.0,98.0],[253.0,170.0,100.0],[253.0,174.0,100.0],[253.0,183.0,98.0],[253.0,195.0,94.0],[253.0,203.0,89.0],[253.0,198.0,85.0],[250.0,174.0,78.0],[248.0,148.0,75.0],[246.0,140.0,80.0],[244.0,142.0,84.0],[244.0,144.0,84.0],[246.0,143.0,82.0],[251.0,143.0,79.0],[253.0,156.0,80.0],[253.0,172.0,81.0],[253.0,181.0,80.0],[253.0,183.0,80.0],[252.0,171.0,78.0],[249.0,154.0,79.0],[246.0,142.0,80.0],[243.0,135.0,84.0],[240.0,131.0,87.0],[232.0,123.0,87.0],[227.0,119.0,90.0],[228.0,119.0,92.0],[234.0,123.0,92.0],[242.0,129.0,91.0],[249.0,137.0,90.0],[252.0,145.0,88.0],[253.0,150.0,86.0],[254.0,153.0,84.0],[254.0,155.0,84.0],[254.0,155.0,85.0],[254.0,152.0,86.0],[253.0,146.0,86.0],[253.0,141.0,90.0],[248.0,135.0,95.0],[237.0,132.0,103.0],[228.0,135.0,115.0],[219.0,139.0,124.0],[207.0,135.0,123.0],[196.0,126.0,118.0],[189.0,117.0,115.0],[185.0,116.0,115.0],[184.0,117.0,118.0],[185.0,121.0,124.0],[186.0,123.0,126.0],[184.0,123.0,125.0],[183.0,120.0,122.0],[178.0,114.0,118.0],[171.0,108.0,115.0],[168.0,107.0,117.0],[167.0,109.0,120.0],[167.0,114.0,127.0],[170.0,122.0,136.0],[172.0,130.0,146.0],[184.0,152.0,168.0],[197.0,175.0,186.0],[201.0,182.0,191.0],[207.0,188.0,196.0],[216.0,198.0,204.0],[221.0,202.0,206.0],[221.0,198.0,201.0],[216.0,188.0,190.0],[209.0,175.0,179.0],[205.0,167.0,173.0],[198.0,160.0,167.0],[191.0,155.0,163.0],[181.0,144.0,154.0],[171.0,134.0,149.0],[173.0,143.0,162.0],[177.0,155.0,171.0],[174.0,156.0,171.0],[169.0,150.0,167.0],[165.0,150.0,171.0],[174.0,166.0,189.0],[184.0,184.0,205.0],[188.0,192.0,211.0],[188.0,194.0,212.0],[186.0,192.0,209.0],[185.0,190.0,207.0],[184.0,186.0,203.0],[183.0,182.0,199.0],[183.0,179.0,196.0],[184.0,177.0,194.0],[186.0,174.0,191.0],[187.0,172.0,189.0],[186.0,169.0,186.0],[186.0,166.0,184.0],[186.0,165.0,183.0],[188.0,165.0,183.0],[194.0,166.0,185.0],[201.0,168.0,185.0],[208.0,169.0,184.0],[214.0,170.0,182.0],[216.0,168.0,180.0],[217.0,166.0,178.0],[214.0,163.0,175.0],[210.0,161.0,175.0],[205.0,159.0,174.0],[199.0,157.0,173.0],[193.0,156.0,173.0],[189.0,154.0,172.0],[184.0,151.0,171.0],[181.0,149.0,170.0],[176.0,148.0,168.0],[172.0,145.0,166.0],[165.0,142.0,165.0],[158.0,140.0,164.0],[152.0,137.0,162.0],[148.0,137.0,162.0],[146.0,137.0,162.0],[144.0,137.0,164.0],[142.0,139.0,166.0],[141.0,141.0,168.0],[139.0,144.0,172.0],[137.0,145.0,175.0],[136.0,147.0,177.0],[136.0,149.0,180.0],[135.0,150.0,182.0],[134.0,151.0,184.0],[134.0,153.0,186.0],[133.0,154.0,187.0],[133.0,154.0,188.0],[134.0,156.0,189.0],[134.0,157.0,192.0],[135.0,158.0,195.0],[135.0,160.0,198.0],[138.0,163.0,201.0],[138.0,164.0,202.0],[139.0,165.0,204.0],[140.0,167.0,206.0],[141.0,169.0,209.0],[141.0,170.0,210.0],[143.0,172.0,213.0],[143.0,173.0,214.0],[143.0,174.0,215.0],[143.0,175.0,217.0],[144.0,176.0,218.0],[144.0,176.0,219.0],[145.0,178.0,220.0],[145.0,178.0,220.0],[145.0,178.0,221.0],[144.0,178.0,221.0],[144.0,177.0,220.0],[143.0,177.0,220.0],[142.0,175.0,218.0],[141.0,174.0,218.0],[140.0,174.0,217.0],[140.0,174.0,216.0],[140.0,173.0,215.0],[138.0,172.0,215.0],[137.0,171.0,214.0],[136.0,170.0,213.0],[136.0,169.0,213.0],[135.0,169.0,213.0],[134.0,169.0,213.0],[134.0,169.0,213.0],[134.0,169.0,214.0],[135.0,170.0,215.0],[135.0,171.0,216.0],[135.0,172.0,217.0],[135.0,173.0,218.0],[135.0,173.0,219.0],[134.0,173.0,219.0],[134.0,173.0,219.0],[134.0,173.0,219.0],[134.0,173.0,219.0],[133.0,172.0,218.0],[133.0,172.0,218.0],[132.0,171.0,218.0],[132.0,171.0,218.0],[132.0,172.0,219.0],[131.0,172.0,219.0],[131.0,172.0,219.0],[131.0,171.0,219.0],[131.0,171.0,219.0],[131.0,171.0,219.0],[131.0,171.0,219.0],[131.0,171.0,220.0],[130.0,171.0,220.0],[129.0,171.0,220.0],[129.0,171.0,220.0],[129.0,171.0,220.0],[129.0,171.0,219.0],[128.0,171.0,219.0],[128.0,171.0,219.0],[128.0,171.0,220.0],[128.0,171.0,220.0],[128.0,171.0,220.0],[127.0,171.0,220.0],[127.0,171.0,220.0],[127.0,171.0,220.0],[127.0,171.0,220.0],[126.0,170.0,220.0],[126.0,170.0,220.0],[126.0,170.0,220.0],[126.0,170.0,220.0],[125.0,169.0,220.0],[125.0,169.0,220.0],[125.0,169.0,220.0]],"MPL_Dark2":[[0.126336,0.612826,0.454072],[0.167243,0.599262,0.428881],[0.208151,0.585698,0.403691],[0.249058,0.572134,0.378501],[0.289965,0.55857,0.35331],[0.330873,0.545006,0.32812],[0.37178,0.531442,0.30293],[0.412687,0.517878,0.277739],[0.453595,0.504314,0.252549],[0.474048,0.497532,0.239954],[0.535409,0.477186,0.202168],[0.555863,0.470404,0.189573],[0.617224,0.450058,0.151788],[0.637678,0.443276,0.139193],[0.699039,0.42293,0.101407],[0.719493,0.416148,0.088812],[0.780854,0.395802,0.051027],[0.821761,0.382238,0.025836],[0.842215,0.375456,0.013241],[0.823299,0.377255,0.05684],[0.801769,0.380915,0.094948],[0.780238,0.384575,0.133057],[0.769473,0.386405,0.152111],[0.737178,0.391895,0.209273],[0.715648,0.395556,0.247382],[0.694118,0.399216,0.28549],[0.683353,0.401046,0.304544],[0.651057,0.406536,0.361707],[0.629527,0.410196,0.399815],[0.607997,0.413856,0.437924],[0.597232,0.415686,0.456978],[0.564937,0.421176,0.514141],[0.543406,0.424837,0.552249],[0.521876,0.428497,0.590358],[0.500346,0.432157,0.628466],[0.478816,0.435817,0.666574],[0.460577,0.438124,0.70133],[0.472849,0.430481,0.696917],[0.509666,0.407551,0.683676],[0.53421,0.392265,0.674848],[0.558754,0.376978,0.666021],[0.583299,0.361692,0.657193],[0.607843,0.346405,0.648366],[0.632388,0.331119,0.639539],[0.656932,0.315832,0.630711],[0.669204,0.308189,0.626298],[0.706021,0.28526,0.613057],[0.730565,0.269973,0.604229],[0.75511,0.254687,0.595402],[0.779654,0.2394,0.586574],[0.804198,0.224114,0.577747],[0.828743,0.208827,0.56892],[0.853287,0.193541,0.560092],[0.865559,0.185898,0.555679],[0.902376,0.162968,0.542438],[0.882076,0.183852,0.521246],[0.854302,0.210765,0.497993],[0.826528,0.237678,0.474741],[0.798754,0.264591,0.451488],[0.77098,0.291503,0.428235],[0.743206,0.318416,0.404983],[0.729319,0.331872,0.393356],[0.687659,0.372241,0.358478],[0.659885,0.399154,0.335225],[0.632111,0.426067,0.311972],[0.604337,0.45298,0.28872],[0.576563,0.479892,0.265467],[0.548789,0.506805,0.242215],[0.521015,0.533718,0.218962],[0.493241,0.560631,0.195709],[0.465467,0.587543,0.172457],[0.437693,0.614456,0.149204],[0.409919,0.641369,0.125952],[0.417716,0.651672,0.113772],[0.445275,0.652749,0.107743],[0.459054,0.653287,0.104729],[0.500392,0.654902,0.095686],[0.527951,0.655978,0.089658],[0.555509,0.657055,0.083629],[0.583068,0.658132,0.077601],[0.610627,0.659208,0.071572],[0.638185,0.660285,0.065544],[0.665744,0.661361,0.059516],[0.693303,0.662438,0.053487],[0.720861,0.663514,0.047459],[0.74842,0.664591,0.04143],[0.775978,0.665667,0.035402],[0.803537,0.666744,0.029373],[0.831096,0.66782,0.023345],[0.858654,0.668897,0.017316],[0.886213,0.669973,0.011288],[0.899992,0.670511,0.008274],[0.882276,0.654287,0.016148],[0.868497,0.642876,0.021961],[0.854717,0.631465,0.027774],[0.840938,0.620054,0.033587],[0.827159,0.608643,0.0394],[0.813379,0.597232,0.045213],[0.7996,0.585821,0.051027],[0.785821,0.57441,0.05684],[0.772042,0.562999,0.062653],[0.758262,0.551588,0.068466],[0.744483,0.540177,0.074279],[0.730704,0.528766,0.080092],[0.716924,0.517355,0.085905],[0.703145,0.505944,0.091719],[0.689366,0.494533,0.097532],[0.682476,0.488827,0.100438],[0.661807,0.471711,0.109158],[0.648028,0.462007,0.117093],[0.634248,0.458562,0.13281],[0.620469,0.455117,0.148527],[0.60669,0.451672,0.164245],[0.59291,0.448228,0.179962],[0.579131,0.444783,0.195679],[0.565352,0.441338,0.211396],[0.551572,0.437893,0.227113],[0.537793,0.434448,0.24283],[0.524014,0.431003,0.258547],[0.510235,0.427559,0.274264],[0.496455,0.424114,0.289981],[0.482676,0.420669,0.305698],[0.468897,0.417224,0.321415],[0.462007,0.415502,0.329273],[0.441338,0.410334,0.352849],[0.427559,0.40689,0.368566],[0.413779,0.403445,0.384283],[0.4,0.4,0.4]],"MPL_Spectral":[[0.036604,0.0,0.041827],[0.109812,0.0,0.125482],[0.18302,0.0,0.209137],[0.256227,0.0,0.292792],[0.329435,0.0,0.376447],[0.402643,0.0,0.460102],[0.468006,0.0,0.534608],[0.478453,0.0,0.545071],[0.4889,0.0,0.555533],[0.494124,0.0,0.560765],[0.509794,0.0,0.576459],[0.515018,0.0,0.58169],[0.530688,0.0,0.597384],[0.512386,0.0,0.602616],[0.386904,0.0,0.61831],[0.345076,0.0,0.623541],[0.219594,0.0,0.639235],[0.135939,0.0,0.649698],[0.094112,0.0,0.654929],[0.0,0.0,0.678465],[0.0,0.0,0.709837],[0.0,0.0,0.74121],[0.0,0.0,0.756896],[0.0,0.0,0.803955],[0.0,0.0,0.835327],[0.0,0.0,0.8667],[0.0,0.036604,0.8667],[0.0,0.146416,0.8667],[0.0,0.219624,0.8667],[0.0,0.292831,0.8667],[0.0,0.329435,0.8667],[0.0,0.439247,0.8667],[0.0,0.479769,0.8667],[0.0,0.500678,0.8667],[0.0,0.521588,0.8667],[0.0,0.542498,0.8667],[0.0,0.563408,0.8667],[0.0,0.573863,0.8667],[0.0,0.602616,0.858857],[0.0,0.613078,0.827484],[0.0,0.623541,0.796112],[0.0,0.634004,0.764739],[0.0,0.644467,0.733367],[0.0,0.654929,0.701994],[0.0,0.665392,0.670622],[0.0,0.6667,0.658853],[0.0,0.6667,0.627465],[0.0,0.6667,0.606539],[0.0,0.6667,0.585614],[0.0,0.6667,0.564688],[0.0,0.6667,0.543763],[0.0,0.661469,0.491473],[0.0,0.651006,0.407818],[0.0,0.645775,0.36599],[0.0,0.63008,0.240508],[0.0,0.619618,0.156853],[0.0,0.609155,0.073198],[0.0,0.602614,0.0],[0.0,0.623524,0.0],[0.0,0.644433,0.0],[0.0,0.665343,0.0],[0.0,0.675798,0.0],[0.0,0.707163,0.0],[0.0,0.728073,0.0],[0.0,0.748994,0.0],[0.0,0.76992,0.0],[0.0,0.790845,0.0],[0.0,0.811771,0.0],[0.0,0.832696,0.0],[0.0,0.853622,0.0],[0.0,0.874541,0.0],[0.0,0.895451,0.0],[0.0,0.916361,0.0],[0.0,0.937271,0.0],[0.0,0.95818,0.0],[0.0,0.968635,0.0],[0.0,1.0,0.0],[0.115027,1.0,0.0],[0.230055,1.0,0.0],[0.345082,1.0,0.0],[0.46011,1.0,0.0],[0.575137,1.0,0.0],[0.690165,1.0,0.0],[0.752908,0.993461,0.0],[0.78428,0.982998,0.0],[0.815653,0.972535,0.0],[0.847025,0.962073,0.0],[0.878398,0.95161,0.0],[0.909771,0.941147,0.0],[0.935916,0.928073,0.0],[0.946378,0.907163,0.0],[0.95161,0.896708,0.0],[0.967304,0.865343,0.0],[0.977767,0.844433,0.0],[0.988229,0.823524,0.0],[0.998692,0.802614,0.0],[1.0,0.772549,0.0],[1.0,0.741176,0.0],[1.0,0.709804,0.0],[1.0,0.678431,0.0],[1.0,0.647059,0.0],[1.0,0.615686,0.0],[1.0,0.552941,0.0],[1.0,0.458824,0.0],[1.0,0.364706,0.0],[1.0,0.270588,0.0],[1.0,0.176471,0.0],[1.0,0.129412,0.0],[0.997386,0.0,0.0],[0.976476,0.0,0.0],[0.955567,0.0,0.0],[0.934657,0.0,0.0],[0.913747,0.0,0.0],[0.892837,0.0,0.0],[0.871927,0.0,0.0],[0.858853,0.0,0.0],[0.84839,0.0,0.0],[0.837927,0.0,0.0],[0.827465,0.0,0.0],[0.817002,0.0,0.0],[0.806539,0.0,0.0],[0.8,0.047059,0.047059],[0.8,0.172549,0.172549],[0.8,0.235294,0.235294],[0.8,0.423529,0.423529],[0.8,0.54902,0.54902],[0.8,0.67451,0.67451],[0.8,0.8,0.8]],"MPL_gnuplot":[[0.062622,0.0,0.024637],[0.108465,2e-06,0.073853],[0.140028,8e-06,0.122888],[0.165683,2.1e-05,0.171626],[0.187867,4.4e-05,0.219946],[0.207695,8e-05,0.267733],[0.225788,0.000132,0.31487],[0.242536,0.000204,0.361242],[0.258199,0.000296,0.406737],[0.265684,0.000352,0.429121],[0.286972,0.000559,0.494656],[0.293725,0.000642,0.515918],[0.313112,0.000942,0.577774],[0.319313,0.00106,0.597707],[0.337232,0.001471,0.655284],[0.342997,0.001628,0.673696],[0.359738,0.002167,0.726434],[0.370479,0.002586,0.759405],[0.375735,0.002814,0.775204],[0.391077,0.003577,0.81974],[0.400979,0.004157,0.846958],[0.410643,0.004795,0.87212],[0.41539,0.005137,0.88391],[0.429318,0.006261,0.916034],[0.438357,0.007095,0.93468],[0.447214,0.008,0.951057],[0.451577,0.00848,0.958381],[0.46442,0.010034,0.976848],[0.472789,0.011169,0.986201],[0.481012,0.012386,0.993159],[0.485071,0.013027,0.995734],[0.49705,0.01508,0.999829],[0.504878,0.016562,0.999526],[0.512587,0.018139,0.996795],[0.520181,0.019812,0.991645],[0.527666,0.021585,0.984086],[0.535046,0.023461,0.974139],[0.538699,0.024439,0.968276],[0.54951,0.027533,0.947177],[0.5566,0.029735,0.930229],[0.563602,0.03205,0.911023],[0.570517,0.034484,0.889604],[0.57735,0.037037,0.866025],[0.584103,0.039713,0.840344],[0.590779,0.042516,0.812622],[0.594089,0.043965,0.798017],[0.603909,0.04851,0.751332],[0.610368,0.051707,0.717912],[0.616759,0.055042,0.682749],[0.623085,0.058517,0.645928],[0.629348,0.062136,0.607539],[0.635548,0.065901,0.567675],[0.641689,0.069815,0.526432],[0.644737,0.071829,0.505325],[0.653797,0.078101,0.440216],[0.659768,0.08248,0.395451],[0.665686,0.087019,0.349727],[0.671551,0.091722,0.303153],[0.677365,0.096591,0.255843],[0.68313,0.10163,0.207912],[0.688847,0.10684,0.159476],[0.691687,0.109511,0.135105],[0.70014,0.11779,0.061561],[0.705719,0.123535,0.01232],[0.711254,0.129464,0.0],[0.716746,0.135579,0.0],[0.722197,0.141884,0.0],[0.727607,0.148382,0.0],[0.732977,0.155075,0.0],[0.738308,0.161966,0.0],[0.7436,0.169058,0.0],[0.748855,0.176355,0.0],[0.754074,0.183858,0.0],[0.759257,0.191572,0.0],[0.764404,0.199498,0.0],[0.766965,0.203542,0.0],[0.774597,0.216,0.0],[0.779643,0.224582,0.0],[0.784657,0.233388,0.0],[0.789639,0.242421,0.0],[0.79459,0.251685,0.0],[0.79951,0.261181,0.0],[0.8044,0.270914,0.0],[0.80926,0.280885,0.0],[0.814092,0.291098,0.0],[0.818895,0.301556,0.0],[0.823669,0.312261,0.0],[0.828417,0.323217,0.0],[0.833137,0.334425,0.0],[0.837831,0.34589,0.0],[0.842499,0.357615,0.0],[0.844823,0.363575,0.0],[0.851757,0.381852,0.0],[0.856349,0.39437,0.0],[0.860916,0.40716,0.0],[0.865459,0.420223,0.0],[0.869979,0.433562,0.0],[0.874475,0.447181,0.0],[0.878948,0.461082,0.0],[0.883398,0.475268,0.0],[0.887826,0.489742,0.0],[0.892232,0.504507,0.0],[0.896617,0.519566,0.0],[0.90098,0.534922,0.0],[0.905322,0.550577,0.0],[0.909643,0.566535,0.0],[0.913944,0.582798,0.0],[0.916087,0.591045,0.0],[0.922486,0.616252,0.0],[0.926727,0.633449,0.0],[0.930949,0.650963,0.0],[0.935152,0.668797,0.0],[0.939336,0.686953,0.0],[0.943502,0.705435,0.0],[0.947649,0.724246,0.0],[0.951779,0.743388,0.0],[0.95589,0.762864,0.0],[0.959984,0.782678,0.0],[0.96406,0.802832,0.0],[0.968119,0.823329,0.0],[0.972162,0.844171,0.0],[0.976187,0.865363,0.0],[0.980196,0.886906,0.0],[0.982194,0.897811,0.0],[0.988165,0.93106,0.0],[0.992126,0.953675,0.0],[0.996071,0.976655,0.0],[1.0,1.0,0.0]],"amwg_blueyellowred":[[130.0,32.0,240.0],[0.0,0.0,150.0],[0.0,0.0,205.0],[65.0,105.0,225.0],[30.0,144.0,255.0],[0.0,191.0,255.0],[160.0,210.0,255.0],[210.0,245.0,255.0],[255.0,255.0,200.0],[255.0,225.0,50.0],[255.0,170.0,0.0],[255.0,110.0,0.0],[255.0,0.0,0.0],[200.0,0.0,0.0],[160.0,35.0,35.0],[255.0,105.0,180.0]],"MPL_gnuplot2":[[0.0,0.0,0.015686],[0.0,0.0,0.047059],[0.0,0.0,0.078431],[0.0,0.0,0.109804],[0.0,0.0,0.141176],[0.0,0.0,0.172549],[0.0,0.0,0.203922],[0.0,0.0,0.235294],[0.0,0.0,0.266667],[0.0,0.0,0.282353],[0.0,0.0,0.329412],[0.0,0.0,0.345098],[0.0,0.0,0.392157],[0.0,0.0,0.407843],[0.0,0.0,0.454902],[0.0,0.0,0.470588],[0.0,0.0,0.517647],[0.0,0.0,0.54902],[0.0,0.0,0.564706],[0.0,0.0,0.611765],[0.0,0.0,0.643137],[0.0,0.0,0.67451],[0.0,0.0,0.690196],[0.0,0.0,0.737255],[0.0,0.0,0.768627],[0.0,0.0,0.8],[0.0,0.0,0.815686],[0.0,0.0,0.862745],[0.0,0.0,0.894118],[0.0,0.0,0.92549],[0.0,0.0,0.941176],[0.0,0.0,0.988235],[0.015319,0.0,1.0],[0.039828,0.0,1.0],[0.064338,0.0,1.0],[0.088848,0.0,1.0],[0.113358,0.0,1.0],[0.125613,0.0,1.0],[0.162377,0.0,1.0],[0.186887,0.0,1.0],[0.211397,0.0,1.0],[0.235907,0.0,1.0],[0.260417,0.0,1.0],[0.284926,0.0,1.0],[0.309436,0.0,1.0],[0.321691,0.0,1.0],[0.358456,0.0,1.0],[0.382966,0.0,1.0],[0.407475,0.0,1.0],[0.431985,0.0,1.0],[0.456495,0.0,1.0],[0.481005,0.0,1.0],[0.505515,0.0,1.0],[0.51777,0.0,1.0],[0.554534,0.014902,0.985098],[0.579044,0.030588,0.969412],[0.603554,0.046275,0.953725],[0.628064,0.061961,0.938039],[0.652574,0.077647,0.922353],[0.677083,0.093333,0.906667],[0.701593,0.10902,0.89098],[0.713848,0.116863,0.883137],[0.750613,0.140392,0.859608],[0.775123,0.156078,0.843922],[0.799632,0.171765,0.828235],[0.824142,0.187451,0.812549],[0.848652,0.203137,0.796863],[0.873162,0.218824,0.781176],[0.897672,0.23451,0.76549],[0.922181,0.250196,0.749804],[0.946691,0.265882,0.734118],[0.971201,0.281569,0.718431],[0.995711,0.297255,0.702745],[1.0,0.312941,0.687059],[1.0,0.328627,0.671373],[1.0,0.336471,0.663529],[1.0,0.36,0.64],[1.0,0.375686,0.624314],[1.0,0.391373,0.608627],[1.0,0.407059,0.592941],[1.0,0.422745,0.577255],[1.0,0.438431,0.561569],[1.0,0.454118,0.545882],[1.0,0.469804,0.530196],[1.0,0.48549,0.51451],[1.0,0.501176,0.498824],[1.0,0.516863,0.483137],[1.0,0.532549,0.467451],[1.0,0.548235,0.451765],[1.0,0.563922,0.436078],[1.0,0.579608,0.420392],[1.0,0.587451,0.412549],[1.0,0.61098,0.38902],[1.0,0.626667,0.373333],[1.0,0.642353,0.357647],[1.0,0.658039,0.341961],[1.0,0.673725,0.326275],[1.0,0.689412,0.310588],[1.0,0.705098,0.294902],[1.0,0.720784,0.279216],[1.0,0.736471,0.263529],[1.0,0.752157,0.247843],[1.0,0.767843,0.232157],[1.0,0.783529,0.216471],[1.0,0.799216,0.200784],[1.0,0.814902,0.185098],[1.0,0.830588,0.169412],[1.0,0.838431,0.161569],[1.0,0.861961,0.138039],[1.0,0.877647,0.122353],[1.0,0.893333,0.106667],[1.0,0.90902,0.09098],[1.0,0.924706,0.075294],[1.0,0.940392,0.059608],[1.0,0.956078,0.043922],[1.0,0.971765,0.028235],[1.0,0.987451,0.012549],[1.0,1.0,0.019608],[1.0,1.0,0.117647],[1.0,1.0,0.215686],[1.0,1.0,0.313725],[1.0,1.0,0.411765],[1.0,1.0,0.509804],[1.0,1.0,0.558824],[1.0,1.0,0.705882],[1.0,1.0,0.803922],[1.0,1.0,0.901961],[1.0,1.0,1.0]],"NCV_manga":[[47.0,55.0,159.0],[43.0,52.0,160.0],[33.0,43.0,162.0],[21.0,32.0,163.0],[11.0,23.0,165.0],[5.0,18.0,166.0],[2.0,16.0,168.0],[0.0,15.0,169.0],[0.0,16.0,170.0],[0.0,16.0,170.0],[0.0,16.0,170.0],[0.0,16.0,166.0],[0.0,16.0,158.0],[0.0,15.0,144.0],[0.0,13.0,125.0],[0.0,12.0,110.0],[0.0,12.0,105.0],[0.0,13.0,114.0],[0.0,16.0,133.0],[0.0,19.0,154.0],[0.0,22.0,170.0],[0.0,24.0,180.0],[0.0,26.0,186.0],[0.0,27.0,189.0],[0.0,29.0,191.0],[1.0,31.0,193.0],[3.0,33.0,194.0],[7.0,38.0,195.0],[15.0,45.0,196.0],[27.0,57.0,197.0],[43.0,71.0,199.0],[56.0,82.0,200.0],[60.0,87.0,201.0],[54.0,83.0,202.0],[40.0,73.0,203.0],[25.0,62.0,204.0],[14.0,55.0,205.0],[7.0,51.0,206.0],[3.0,50.0,207.0],[2.0,50.0,208.0],[2.0,52.0,209.0],[2.0,53.0,209.0],[2.0,55.0,207.0],[2.0,55.0,203.0],[2.0,54.0,194.0],[2.0,51.0,178.0],[2.0,48.0,160.0],[2.0,44.0,145.0],[2.0,45.0,141.0],[3.0,50.0,152.0],[4.0,58.0,171.0],[5.0,67.0,191.0],[6.0,74.0,206.0],[7.0,80.0,215.0],[8.0,84.0,220.0],[8.0,88.0,222.0],[10.0,92.0,224.0],[12.0,96.0,225.0],[15.0,101.0,226.0],[21.0,107.0,227.0],[31.0,115.0,228.0],[46.0,127.0,228.0],[64.0,139.0,229.0],[78.0,149.0,230.0],[82.0,153.0,231.0],[75.0,152.0,232.0],[61.0,148.0,232.0],[47.0,144.0,233.0],[38.0,143.0,234.0],[33.0,144.0,234.0],[32.0,147.0,235.0],[33.0,151.0,235.0],[35.0,155.0,236.0],[38.0,159.0,235.0],[40.0,161.0,233.0],[41.0,162.0,228.0],[42.0,158.0,217.0],[41.0,150.0,201.0],[40.0,139.0,182.0],[39.0,131.0,168.0],[41.0,133.0,165.0],[46.0,145.0,177.0],[55.0,164.0,196.0],[63.0,184.0,216.0],[71.0,200.0,229.0],[78.0,211.0,238.0],[84.0,219.0,242.0],[89.0,225.0,244.0],[94.0,230.0,245.0],[100.0,234.0,246.0],[106.0,238.0,246.0],[114.0,242.0,247.0],[125.0,246.0,247.0],[139.0,247.0,246.0],[153.0,248.0,244.0],[164.0,248.0,243.0],[169.0,249.0,242.0],[167.0,249.0,240.0],[164.0,249.0,238.0],[161.0,250.0,236.0],[162.0,250.0,234.0],[164.0,250.0,232.0],[169.0,251.0,231.0],[173.0,251.0,230.0],[178.0,250.0,229.0],[183.0,249.0,228.0],[186.0,247.0,225.0],[186.0,240.0,220.0],[181.0,229.0,209.0],[171.0,212.0,194.0],[159.0,192.0,177.0],[151.0,179.0,165.0],[153.0,178.0,165.0],[167.0,191.0,178.0],[188.0,210.0,197.0],[207.0,228.0,215.0],[222.0,241.0,229.0],[232.0,248.0,237.0],[238.0,252.0,242.0],[242.0,253.0,245.0],[245.0,254.0,247.0],[248.0,254.0,249.0],[250.0,254.0,250.0],[251.0,254.0,252.0],[253.0,254.0,253.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[253.0,254.0,253.0],[252.0,254.0,251.0],[250.0,254.0,250.0],[249.0,254.0,248.0],[247.0,254.0,245.0],[245.0,253.0,242.0],[242.0,252.0,238.0],[237.0,248.0,232.0],[229.0,241.0,222.0],[215.0,228.0,207.0],[197.0,210.0,188.0],[178.0,191.0,167.0],[165.0,178.0,153.0],[165.0,179.0,151.0],[177.0,192.0,159.0],[194.0,212.0,171.0],[209.0,229.0,181.0],[220.0,240.0,186.0],[225.0,247.0,186.0],[228.0,249.0,183.0],[229.0,250.0,178.0],[230.0,251.0,173.0],[231.0,251.0,169.0],[232.0,250.0,164.0],[234.0,250.0,162.0],[236.0,250.0,161.0],[238.0,249.0,164.0],[240.0,249.0,167.0],[242.0,249.0,169.0],[243.0,248.0,164.0],[244.0,248.0,153.0],[246.0,247.0,139.0],[247.0,246.0,125.0],[247.0,242.0,114.0],[246.0,238.0,106.0],[246.0,234.0,100.0],[245.0,230.0,94.0],[244.0,225.0,89.0],[242.0,219.0,84.0],[238.0,211.0,78.0],[229.0,200.0,71.0],[216.0,184.0,63.0],[196.0,164.0,55.0],[177.0,145.0,46.0],[165.0,133.0,41.0],[168.0,131.0,39.0],[182.0,139.0,40.0],[201.0,150.0,41.0],[217.0,158.0,42.0],[228.0,162.0,41.0],[233.0,161.0,40.0],[235.0,159.0,38.0],[236.0,155.0,35.0],[235.0,151.0,33.0],[235.0,147.0,32.0],[234.0,144.0,33.0],[234.0,143.0,38.0],[233.0,144.0,47.0],[232.0,148.0,61.0],[232.0,152.0,75.0],[231.0,153.0,82.0],[230.0,149.0,78.0],[229.0,139.0,64.0],[228.0,127.0,46.0],[228.0,115.0,31.0],[227.0,107.0,21.0],[226.0,101.0,15.0],[225.0,96.0,12.0],[224.0,92.0,10.0],[222.0,88.0,8.0],[220.0,84.0,8.0],[215.0,80.0,7.0],[206.0,74.0,6.0],[191.0,67.0,5.0],[171.0,58.0,4.0],[152.0,50.0,3.0],[141.0,45.0,2.0],[145.0,44.0,2.0],[160.0,48.0,2.0],[178.0,51.0,2.0],[194.0,54.0,2.0],[203.0,55.0,2.0],[207.0,55.0,2.0],[209.0,53.0,2.0],[209.0,52.0,2.0],[208.0,50.0,2.0],[207.0,50.0,3.0],[206.0,51.0,7.0],[205.0,55.0,14.0],[204.0,62.0,25.0],[203.0,73.0,40.0],[202.0,83.0,54.0],[201.0,87.0,60.0],[200.0,82.0,56.0],[199.0,71.0,43.0],[197.0,57.0,27.0],[196.0,45.0,15.0],[195.0,38.0,7.0],[194.0,33.0,3.0],[193.0,31.0,1.0],[191.0,29.0,0.0],[189.0,27.0,0.0],[186.0,26.0,0.0],[180.0,24.0,0.0],[170.0,22.0,0.0],[154.0,19.0,0.0],[133.0,16.0,0.0],[114.0,13.0,0.0],[105.0,12.0,0.0],[110.0,12.0,0.0],[125.0,13.0,0.0],[144.0,15.0,0.0],[158.0,16.0,0.0],[166.0,16.0,0.0],[170.0,16.0,0.0],[170.0,16.0,0.0],[170.0,16.0,0.0],[169.0,15.0,0.0],[168.0,16.0,2.0],[166.0,18.0,5.0],[165.0,23.0,11.0],[163.0,32.0,21.0],[162.0,43.0,33.0],[160.0,52.0,43.0],[159.0,55.0,47.0]],"so4_21":[[0.0,0.0,0.0],[29.0,0.0,45.0],[58.0,0.0,91.0],[87.0,0.0,136.0],[58.0,0.0,176.0],[29.0,0.0,215.0],[0.0,0.0,255.0],[3.0,60.0,175.0],[5.0,119.0,95.0],[8.0,179.0,15.0],[132.0,217.0,8.0],[255.0,255.0,0.0],[255.0,170.0,0.0],[255.0,85.0,0.0],[255.0,0.0,0.0],[250.0,27.0,80.0],[245.0,53.0,160.0],[240.0,80.0,240.0],[245.0,138.0,245.0],[250.0,197.0,250.0],[255.0,255.0,255.0]],"NCV_blu_red":[[42.0,0.0,127.0],[42.0,0.0,130.0],[42.0,0.0,133.0],[42.0,0.0,136.0],[42.0,0.0,139.0],[41.0,0.0,142.0],[41.0,0.0,145.0],[41.0,0.0,148.0],[40.0,0.0,151.0],[40.0,0.0,154.0],[40.0,0.0,157.0],[39.0,0.0,160.0],[39.0,0.0,163.0],[38.0,0.0,166.0],[37.0,0.0,169.0],[37.0,0.0,172.0],[36.0,0.0,175.0],[35.0,0.0,178.0],[34.0,0.0,181.0],[34.0,0.0,184.0],[33.0,0.0,187.0],[32.0,0.0,190.0],[31.0,0.0,193.0],[30.0,0.0,196.0],[28.0,0.0,199.0],[27.0,0.0,202.0],[26.0,0.0,205.0],[25.0,0.0,208.0],[24.0,0.0,211.0],[22.0,0.0,214.0],[21.0,0.0,217.0],[19.0,0.0,220.0],[18.0,0.0,223.0],[16.0,0.0,226.0],[15.0,0.0,229.0],[13.0,0.0,232.0],[12.0,0.0,235.0],[10.0,0.0,238.0],[8.0,0.0,241.0],[6.0,0.0,244.0],[4.0,0.0,247.0],[2.0,0.0,250.0],[0.0,0.0,253.0],[1.0,2.0,255.0],[4.0,7.0,255.0],[7.0,12.0,255.0],[10.0,17.0,255.0],[13.0,22.0,255.0],[16.0,26.0,255.0],[19.0,31.0,255.0],[22.0,36.0,255.0],[25.0,40.0,255.0],[28.0,45.0,255.0],[31.0,49.0,255.0],[34.0,54.0,255.0],[37.0,58.0,255.0],[40.0,63.0,255.0],[43.0,67.0,255.0],[46.0,71.0,255.0],[49.0,76.0,255.0],[52.0,80.0,255.0],[55.0,84.0,255.0],[58.0,88.0,255.0],[61.0,92.0,255.0],[64.0,96.0,255.0],[67.0,100.0,255.0],[70.0,104.0,255.0],[73.0,108.0,255.0],[76.0,112.0,255.0],[79.0,115.0,255.0],[82.0,119.0,255.0],[85.0,123.0,255.0],[88.0,127.0,255.0],[91.0,130.0,255.0],[94.0,134.0,255.0],[97.0,137.0,255.0],[100.0,141.0,255.0],[103.0,144.0,255.0],[106.0,147.0,255.0],[109.0,151.0,255.0],[112.0,154.0,255.0],[115.0,157.0,255.0],[118.0,160.0,255.0],[121.0,163.0,255.0],[124.0,166.0,255.0],[127.0,170.0,255.0],[130.0,172.0,255.0],[133.0,175.0,255.0],[136.0,178.0,255.0],[139.0,181.0,255.0],[142.0,184.0,255.0],[145.0,187.0,255.0],[148.0,189.0,255.0],[151.0,192.0,255.0],[154.0,195.0,255.0],[157.0,197.0,255.0],[160.0,200.0,255.0],[163.0,202.0,255.0],[166.0,205.0,255.0],[169.0,207.0,255.0],[172.0,209.0,255.0],[175.0,211.0,255.0],[178.0,214.0,255.0],[181.0,216.0,255.0],[184.0,218.0,255.0],[187.0,220.0,255.0],[190.0,222.0,255.0],[193.0,224.0,255.0],[196.0,226.0,255.0],[199.0,228.0,255.0],[202.0,230.0,255.0],[205.0,232.0,255.0],[208.0,233.0,255.0],[211.0,235.0,255.0],[214.0,237.0,255.0],[217.0,238.0,255.0],[220.0,240.0,255.0],[223.0,241.0,255.0],[226.0,243.0,255.0],[229.0,244.0,255.0],[232.0,246.0,255.0],[235.0,247.0,255.0],[238.0,248.0,255.0],[241.0,250.0,255.0],[244.0,251.0,255.0],[247.0,252.0,255.0],[250.0,253.0,255.0],[253.0,254.0,255.0],[255.0,254.0,253.0],[255.0,253.0,250.0],[255.0,252.0,247.0],[255.0,251.0,244.0],[255.0,250.0,241.0],[255.0,248.0,238.0],[255.0,247.0,235.0],[255.0,246.0,232.0],[255.0,244.0,229.0],[255.0,243.0,226.0],[255.0,241.0,223.0],[255.0,240.0,220.0],[255.0,238.0,217.0],[255.0,237.0,214.0],[255.0,235.0,211.0],[255.0,233.0,208.0],[255.0,232.0,205.0],[255.0,230.0,202.0],[255.0,228.0,199.0],[255.0,226.0,196.0],[255.0,224.0,193.0],[255.0,222.0,190.0],[255.0,220.0,187.0],[255.0,218.0,184.0],[255.0,216.0,181.0],[255.0,214.0,178.0],[255.0,211.0,175.0],[255.0,209.0,172.0],[255.0,207.0,169.0],[255.0,205.0,166.0],[255.0,202.0,163.0],[255.0,200.0,160.0],[255.0,197.0,157.0],[255.0,195.0,154.0],[255.0,192.0,151.0],[255.0,189.0,148.0],[255.0,187.0,145.0],[255.0,184.0,142.0],[255.0,181.0,139.0],[255.0,178.0,136.0],[255.0,175.0,133.0],[255.0,172.0,130.0],[255.0,169.0,127.0],[255.0,166.0,124.0],[255.0,163.0,121.0],[255.0,160.0,118.0],[255.0,157.0,115.0],[255.0,154.0,112.0],[255.0,151.0,109.0],[255.0,147.0,106.0],[255.0,144.0,103.0],[255.0,141.0,100.0],[255.0,137.0,97.0],[255.0,134.0,94.0],[255.0,130.0,91.0],[255.0,127.0,88.0],[255.0,123.0,85.0],[255.0,119.0,82.0],[255.0,115.0,79.0],[255.0,112.0,76.0],[255.0,108.0,73.0],[255.0,104.0,70.0],[255.0,100.0,67.0],[255.0,96.0,64.0],[255.0,92.0,61.0],[255.0,88.0,58.0],[255.0,84.0,55.0],[255.0,80.0,52.0],[255.0,76.0,49.0],[255.0,71.0,46.0],[255.0,67.0,43.0],[255.0,63.0,40.0],[255.0,58.0,37.0],[255.0,54.0,34.0],[255.0,49.0,31.0],[255.0,45.0,28.0],[255.0,40.0,25.0],[255.0,36.0,22.0],[255.0,31.0,19.0],[255.0,26.0,16.0],[255.0,22.0,13.0],[255.0,17.0,10.0],[255.0,12.0,7.0],[255.0,7.0,4.0],[255.0,2.0,1.0],[253.0,0.0,0.0],[250.0,0.0,2.0],[247.0,0.0,4.0],[244.0,0.0,6.0],[241.0,0.0,8.0],[238.0,0.0,10.0],[235.0,0.0,12.0],[232.0,0.0,13.0],[229.0,0.0,15.0],[226.0,0.0,16.0],[223.0,0.0,18.0],[220.0,0.0,19.0],[217.0,0.0,21.0],[214.0,0.0,22.0],[211.0,0.0,24.0],[208.0,0.0,25.0],[205.0,0.0,26.0],[202.0,0.0,27.0],[199.0,0.0,28.0],[196.0,0.0,30.0],[193.0,0.0,31.0],[190.0,0.0,32.0],[187.0,0.0,33.0],[184.0,0.0,34.0],[181.0,0.0,34.0],[178.0,0.0,35.0],[175.0,0.0,36.0],[172.0,0.0,37.0],[169.0,0.0,37.0],[166.0,0.0,38.0],[163.0,0.0,39.0],[160.0,0.0,39.0],[157.0,0.0,40.0],[154.0,0.0,40.0],[151.0,0.0,40.0],[148.0,0.0,41.0],[145.0,0.0,41.0],[142.0,0.0,41.0],[139.0,0.0,42.0],[136.0,0.0,42.0],[133.0,0.0,42.0],[130.0,0.0,42.0],[127.0,0.0,42.0]],"BlAqGrYeOrRe":[[0.0,0.0,255.0],[0.0,21.0,255.0],[0.0,43.0,255.0],[0.0,64.0,255.0],[0.0,85.0,255.0],[0.0,106.0,255.0],[0.0,128.0,255.0],[0.0,149.0,255.0],[0.0,170.0,255.0],[0.0,191.0,255.0],[0.0,213.0,255.0],[0.0,234.0,255.0],[0.0,255.0,255.0],[12.0,255.0,255.0],[24.0,255.0,255.0],[35.0,255.0,255.0],[47.0,255.0,255.0],[59.0,255.0,255.0],[71.0,255.0,255.0],[82.0,255.0,255.0],[94.0,255.0,255.0],[106.0,255.0,255.0],[118.0,255.0,255.0],[129.0,255.0,255.0],[141.0,255.0,255.0],[153.0,255.0,255.0],[140.0,255.0,234.0],[128.0,255.0,213.0],[115.0,255.0,191.0],[102.0,255.0,170.0],[89.0,255.0,149.0],[77.0,255.0,128.0],[64.0,255.0,106.0],[51.0,255.0,85.0],[38.0,255.0,64.0],[26.0,255.0,43.0],[13.0,255.0,21.0],[0.0,255.0,0.0],[16.0,255.0,0.0],[31.0,255.0,0.0],[47.0,255.0,0.0],[63.0,255.0,0.0],[78.0,255.0,0.0],[94.0,255.0,0.0],[110.0,255.0,0.0],[126.0,255.0,0.0],[141.0,255.0,0.0],[157.0,255.0,0.0],[173.0,255.0,0.0],[188.0,255.0,0.0],[204.0,255.0,0.0],[207.0,255.0,0.0],[210.0,255.0,0.0],[214.0,255.0,0.0],[217.0,255.0,0.0],[220.0,255.0,0.0],[223.0,255.0,0.0],[226.0,255.0,0.0],[230.0,255.0,0.0],[233.0,255.0,0.0],[236.0,255.0,0.0],[239.0,255.0,0.0],[242.0,255.0,0.0],[245.0,255.0,0.0],[249.0,255.0,0.0],[252.0,255.0,0.0],[255.0,255.0,0.0],[255.0,248.0,0.0],[255.0,240.0,0.0],[255.0,233.0,0.0],[255.0,225.0,0.0],[255.0,218.0,0.0],[255.0,210.0,0.0],[255.0,203.0,0.0],[255.0,195.0,0.0],[255.0,188.0,0.0],[255.0,180.0,0.0],[255.0,173.0,0.0],[255.0,165.0,0.0],[255.0,158.0,0.0],[255.0,150.0,0.0],[255.0,143.0,0.0],[255.0,135.0,0.0],[255.0,128.0,0.0],[255.0,120.0,0.0],[255.0,112.0,0.0],[255.0,104.0,0.0],[255.0,96.0,0.0],[255.0,88.0,0.0],[255.0,80.0,0.0],[255.0,72.0,0.0],[255.0,64.0,0.0],[255.0,56.0,0.0],[255.0,48.0,0.0],[255.0,40.0,0.0],[255.0,32.0,0.0],[255.0,24.0,0.0],[255.0,16.0,0.0],[255.0,8.0,0.0],[255.0,0.0,0.0]],"SVG_es_landscape_79":[[34.0,11.0,5.0],[36.0,11.0,5.0],[38.0,12.0,5.0],[40.0,12.0,5.0],[42.0,13.0,5.0],[44.0,14.0,5.0],[46.0,14.0,5.0],[48.0,15.0,5.0],[50.0,15.0,5.0],[52.0,16.0,5.0],[54.0,17.0,5.0],[56.0,17.0,5.0],[58.0,18.0,5.0],[60.0,18.0,5.0],[62.0,19.0,5.0],[64.0,20.0,5.0],[67.0,20.0,5.0],[69.0,21.0,5.0],[71.0,22.0,5.0],[73.0,22.0,5.0],[75.0,23.0,5.0],[77.0,23.0,5.0],[79.0,24.0,5.0],[81.0,25.0,6.0],[83.0,25.0,6.0],[85.0,26.0,6.0],[88.0,27.0,6.0],[90.0,27.0,6.0],[92.0,28.0,6.0],[94.0,29.0,6.0],[97.0,29.0,6.0],[99.0,30.0,6.0],[101.0,31.0,6.0],[103.0,31.0,6.0],[106.0,32.0,6.0],[108.0,33.0,6.0],[110.0,33.0,6.0],[112.0,34.0,6.0],[115.0,35.0,6.0],[117.0,35.0,6.0],[119.0,36.0,6.0],[121.0,37.0,6.0],[123.0,37.0,6.0],[126.0,38.0,6.0],[128.0,39.0,7.0],[130.0,40.0,8.0],[132.0,42.0,9.0],[133.0,43.0,10.0],[135.0,45.0,11.0],[137.0,46.0,12.0],[139.0,48.0,13.0],[141.0,49.0,14.0],[143.0,51.0,14.0],[144.0,52.0,15.0],[146.0,54.0,16.0],[148.0,55.0,17.0],[150.0,57.0,18.0],[152.0,58.0,19.0],[154.0,60.0,20.0],[155.0,61.0,21.0],[157.0,63.0,22.0],[159.0,64.0,23.0],[161.0,66.0,24.0],[163.0,67.0,25.0],[165.0,69.0,26.0],[167.0,70.0,27.0],[168.0,72.0,28.0],[170.0,73.0,29.0],[172.0,75.0,30.0],[174.0,76.0,31.0],[176.0,78.0,32.0],[178.0,79.0,33.0],[179.0,81.0,34.0],[181.0,82.0,35.0],[183.0,84.0,36.0],[185.0,85.0,37.0],[187.0,87.0,38.0],[189.0,88.0,39.0],[190.0,90.0,40.0],[192.0,91.0,41.0],[194.0,92.0,42.0],[196.0,94.0,43.0],[198.0,95.0,44.0],[200.0,97.0,45.0],[202.0,98.0,46.0],[203.0,100.0,47.0],[205.0,101.0,48.0],[207.0,103.0,49.0],[209.0,104.0,50.0],[211.0,106.0,51.0],[213.0,107.0,52.0],[214.0,109.0,52.0],[216.0,110.0,53.0],[218.0,112.0,54.0],[220.0,113.0,55.0],[222.0,115.0,56.0],[224.0,116.0,57.0],[225.0,118.0,58.0],[227.0,119.0,59.0],[229.0,121.0,60.0],[231.0,122.0,61.0],[233.0,124.0,62.0],[235.0,125.0,63.0],[237.0,127.0,64.0],[238.0,128.0,65.0],[240.0,130.0,66.0],[242.0,131.0,67.0],[244.0,133.0,68.0],[246.0,134.0,69.0],[248.0,136.0,70.0],[249.0,147.0,84.0],[251.0,169.0,112.0],[252.0,190.0,140.0],[253.0,212.0,168.0],[255.0,231.0,193.0],[255.0,231.0,193.0],[255.0,231.0,193.0],[255.0,231.0,193.0],[255.0,231.0,193.0],[255.0,231.0,193.0],[255.0,231.0,193.0],[255.0,232.0,194.0],[255.0,232.0,194.0],[255.0,232.0,194.0],[255.0,232.0,194.0],[255.0,232.0,194.0],[255.0,232.0,194.0],[255.0,232.0,195.0],[255.0,233.0,195.0],[255.0,233.0,195.0],[255.0,233.0,195.0],[255.0,233.0,195.0],[255.0,233.0,195.0],[255.0,233.0,196.0],[255.0,233.0,196.0],[255.0,234.0,196.0],[255.0,234.0,196.0],[255.0,234.0,196.0],[255.0,234.0,196.0],[255.0,234.0,197.0],[255.0,234.0,197.0],[255.0,234.0,197.0],[255.0,235.0,197.0],[255.0,235.0,197.0],[255.0,235.0,197.0],[255.0,235.0,198.0],[255.0,235.0,198.0],[255.0,235.0,198.0],[255.0,235.0,198.0],[255.0,236.0,198.0],[255.0,236.0,198.0],[255.0,236.0,199.0],[255.0,236.0,199.0],[255.0,236.0,199.0],[255.0,236.0,199.0],[255.0,236.0,199.0],[255.0,237.0,199.0],[255.0,237.0,199.0],[255.0,237.0,200.0],[255.0,237.0,200.0],[255.0,237.0,200.0],[255.0,237.0,200.0],[255.0,237.0,200.0],[255.0,238.0,200.0],[255.0,238.0,201.0],[255.0,238.0,201.0],[255.0,238.0,201.0],[255.0,238.0,201.0],[255.0,238.0,201.0],[255.0,238.0,201.0],[255.0,239.0,202.0],[255.0,239.0,202.0],[255.0,239.0,202.0],[255.0,239.0,202.0],[255.0,239.0,202.0],[255.0,239.0,202.0],[255.0,239.0,203.0],[255.0,240.0,203.0],[255.0,240.0,203.0],[255.0,240.0,203.0],[255.0,240.0,203.0],[255.0,240.0,203.0],[255.0,240.0,204.0],[255.0,240.0,204.0],[255.0,241.0,204.0],[255.0,241.0,204.0],[255.0,241.0,204.0],[255.0,241.0,204.0],[255.0,241.0,204.0],[255.0,241.0,205.0],[255.0,241.0,205.0],[255.0,242.0,205.0],[255.0,242.0,205.0],[255.0,242.0,205.0],[255.0,242.0,205.0],[255.0,242.0,206.0],[255.0,242.0,206.0],[255.0,242.0,206.0],[255.0,243.0,206.0],[255.0,243.0,206.0],[255.0,243.0,206.0],[255.0,243.0,207.0],[255.0,243.0,207.0],[255.0,243.0,207.0],[255.0,243.0,207.0],[255.0,244.0,207.0],[255.0,244.0,207.0],[255.0,244.0,208.0],[255.0,244.0,208.0],[255.0,244.0,208.0],[255.0,244.0,208.0],[255.0,244.0,208.0],[255.0,245.0,208.0],[255.0,245.0,209.0],[255.0,245.0,209.0],[255.0,245.0,209.0],[255.0,245.0,209.0],[255.0,245.0,209.0],[255.0,245.0,209.0],[255.0,246.0,210.0]],"nice_gfdl":[[0.996078,0.984314,0.964706],[0.92549,0.929412,0.945098],[0.905882,0.909804,0.92549],[0.862745,0.882353,0.901961],[0.835294,0.854902,0.87451],[0.811765,0.823529,0.858824],[0.784314,0.796078,0.831373],[0.74902,0.772549,0.811765],[0.729412,0.74902,0.788235],[0.694118,0.717647,0.768627],[0.670588,0.690196,0.741176],[0.639216,0.666667,0.72549],[0.611765,0.639216,0.698039],[0.580392,0.607843,0.666667],[0.560784,0.588235,0.647059],[0.517647,0.560784,0.623529],[0.490196,0.537255,0.596078],[0.462745,0.517647,0.576471],[0.435294,0.490196,0.545098],[0.4,0.447059,0.52549],[0.384314,0.431373,0.509804],[0.352941,0.407843,0.486275],[0.32549,0.380392,0.458824],[0.294118,0.356863,0.443137],[0.270588,0.329412,0.415686],[0.247059,0.301961,0.396078],[0.223529,0.282353,0.372549],[0.196078,0.254902,0.360784],[0.168627,0.223529,0.32549],[0.133333,0.203922,0.301961],[0.113725,0.180392,0.27451],[0.094118,0.14902,0.25098],[0.07451,0.12549,0.227451],[0.05098,0.109804,0.203922],[0.047059,0.105882,0.196078],[0.05098,0.117647,0.203922],[0.062745,0.129412,0.219608],[0.07451,0.141176,0.235294],[0.086275,0.156863,0.254902],[0.094118,0.176471,0.258824],[0.105882,0.188235,0.27451],[0.121569,0.207843,0.298039],[0.133333,0.219608,0.309804],[0.137255,0.243137,0.32549],[0.145098,0.254902,0.337255],[0.160784,0.270588,0.356863],[0.176471,0.286275,0.372549],[0.180392,0.301961,0.380392],[0.196078,0.313725,0.396078],[0.203922,0.32549,0.407843],[0.219608,0.341176,0.423529],[0.223529,0.360784,0.427451],[0.247059,0.384314,0.45098],[0.247059,0.396078,0.458824],[0.262745,0.415686,0.478431],[0.282353,0.439216,0.490196],[0.290196,0.447059,0.498039],[0.298039,0.462745,0.513725],[0.309804,0.478431,0.529412],[0.313725,0.501961,0.533333],[0.329412,0.517647,0.54902],[0.333333,0.529412,0.560784],[0.34902,0.54902,0.580392],[0.356863,0.564706,0.592157],[0.372549,0.580392,0.607843],[0.392157,0.603922,0.631373],[0.403922,0.615686,0.643137],[0.403922,0.631373,0.643137],[0.423529,0.654902,0.666667],[0.431373,0.662745,0.67451],[0.447059,0.678431,0.694118],[0.454902,0.698039,0.705882],[0.47451,0.717647,0.72549],[0.482353,0.72549,0.733333],[0.501961,0.74902,0.756863],[0.505882,0.772549,0.752941],[0.517647,0.788235,0.764706],[0.52549,0.807843,0.784314],[0.541176,0.819608,0.8],[0.54902,0.839216,0.811765],[0.564706,0.858824,0.831373],[0.580392,0.87451,0.847059],[0.596078,0.894118,0.862745],[0.596078,0.905882,0.862745],[0.596078,0.905882,0.862745],[0.576471,0.890196,0.819608],[0.564706,0.878431,0.811765],[0.54902,0.866667,0.760784],[0.541176,0.858824,0.752941],[0.529412,0.847059,0.729412],[0.517647,0.835294,0.713725],[0.498039,0.827451,0.662745],[0.478431,0.807843,0.643137],[0.470588,0.803922,0.607843],[0.454902,0.784314,0.588235],[0.443137,0.776471,0.556863],[0.431373,0.764706,0.545098],[0.415686,0.74902,0.501961],[0.407843,0.741176,0.494118],[0.392157,0.729412,0.458824],[0.380392,0.713725,0.447059],[0.368627,0.701961,0.415686],[0.352941,0.682353,0.4],[0.345098,0.678431,0.360784],[0.329412,0.662745,0.345098],[0.317647,0.647059,0.32549],[0.305882,0.635294,0.313725],[0.282353,0.623529,0.270588],[0.27451,0.615686,0.262745],[0.262745,0.592157,0.223529],[0.258824,0.584314,0.215686],[0.247059,0.576471,0.180392],[0.243137,0.572549,0.176471],[0.270588,0.584314,0.14902],[0.282353,0.6,0.160784],[0.313725,0.619608,0.117647],[0.329412,0.639216,0.129412],[0.372549,0.654902,0.098039],[0.384314,0.666667,0.109804],[0.419608,0.686275,0.070588],[0.435294,0.701961,0.086275],[0.478431,0.721569,0.023529],[0.494118,0.741176,0.05098],[0.529412,0.756863,0.0],[0.545098,0.772549,0.0],[0.588235,0.788235,0.0],[0.603922,0.807843,0.0],[0.635294,0.811765,0.0],[0.658824,0.835294,0.0],[0.698039,0.85098,0.0],[0.721569,0.87451,0.0],[0.756863,0.878431,0.0],[0.780392,0.905882,0.0],[0.823529,0.909804,0.0],[0.847059,0.933333,0.0],[0.878431,0.945098,0.0],[0.901961,0.968627,0.0],[0.933333,0.972549,0.0],[0.960784,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,0.984314,0.0],[1.0,0.972549,0.0],[1.0,0.921569,0.0],[1.0,0.905882,0.0],[1.0,0.862745,0.0],[1.0,0.847059,0.0],[1.0,0.803922,0.0],[1.0,0.788235,0.0],[1.0,0.74902,0.0],[1.0,0.733333,0.0],[1.0,0.694118,0.0],[1.0,0.678431,0.0],[1.0,0.631373,0.0],[1.0,0.619608,0.0],[1.0,0.580392,0.0],[1.0,0.568627,0.0],[1.0,0.529412,0.0],[1.0,0.509804,0.0],[1.0,0.466667,0.0],[1.0,0.458824,0.0],[1.0,0.431373,0.0],[1.0,0.407843,0.0],[1.0,0.376471,0.0],[0.980392,0.360784,0.0],[0.952941,0.333333,0.0],[0.929412,0.313725,0.0],[0.909804,0.290196,0.0],[0.886275,0.270588,0.0],[0.862745,0.243137,0.0],[0.843137,0.231373,0.0],[0.819608,0.203922,0.0],[0.792157,0.184314,0.0],[0.772549,0.160784,0.0],[0.74902,0.145098,0.0],[0.72549,0.121569,0.023529],[0.721569,0.117647,0.019608],[0.686275,0.12549,0.023529],[0.67451,0.117647,0.011765],[0.631373,0.117647,0.035294],[0.627451,0.117647,0.031373],[0.603922,0.109804,0.031373],[0.592157,0.101961,0.023529],[0.54902,0.105882,0.035294],[0.545098,0.101961,0.031373],[0.505882,0.101961,0.027451],[0.501961,0.098039,0.023529],[0.47451,0.101961,0.035294],[0.466667,0.098039,0.031373],[0.431373,0.094118,0.039216],[0.427451,0.090196,0.035294],[0.392157,0.094118,0.039216],[0.388235,0.090196,0.035294],[0.360784,0.086275,0.039216],[0.34902,0.078431,0.031373],[0.313725,0.086275,0.047059],[0.301961,0.078431,0.043137],[0.290196,0.078431,0.043137],[0.278431,0.070588,0.039216],[0.239216,0.07451,0.039216],[0.235294,0.070588,0.039216],[0.215686,0.066667,0.043137],[0.207843,0.062745,0.039216],[0.180392,0.062745,0.043137],[0.160784,0.05098,0.031373],[0.141176,0.054902,0.035294],[0.137255,0.05098,0.031373],[0.113725,0.05098,0.035294],[0.101961,0.043137,0.023529],[0.082353,0.043137,0.031373],[0.070588,0.031373,0.019608],[0.058824,0.031373,0.023529],[0.058824,0.031373,0.023529],[0.054902,0.031373,0.019608],[0.05098,0.031373,0.015686],[0.047059,0.023529,0.019608],[0.05098,0.027451,0.023529],[0.043137,0.027451,0.019608],[0.039216,0.015686,0.0],[0.035294,0.019608,0.015686],[0.031373,0.011765,0.0],[0.023529,0.015686,0.0],[0.023529,0.015686,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0]],"GreenYellow":[[25.0,255.0,82.0],[27.0,255.0,84.0],[28.0,255.0,85.0],[30.0,255.0,86.0],[31.0,255.0,87.0],[33.0,255.0,88.0],[34.0,255.0,89.0],[36.0,255.0,90.0],[37.0,255.0,92.0],[39.0,255.0,93.0],[40.0,255.0,94.0],[42.0,255.0,95.0],[43.0,255.0,96.0],[45.0,255.0,97.0],[46.0,255.0,98.0],[48.0,255.0,100.0],[49.0,255.0,101.0],[51.0,255.0,102.0],[53.0,255.0,103.0],[54.0,255.0,104.0],[56.0,255.0,105.0],[57.0,255.0,106.0],[59.0,255.0,108.0],[60.0,255.0,109.0],[62.0,255.0,110.0],[63.0,255.0,111.0],[65.0,255.0,112.0],[66.0,255.0,113.0],[68.0,255.0,115.0],[69.0,255.0,116.0],[71.0,255.0,117.0],[72.0,255.0,118.0],[74.0,255.0,119.0],[75.0,255.0,120.0],[77.0,255.0,121.0],[79.0,255.0,123.0],[80.0,255.0,124.0],[82.0,255.0,125.0],[83.0,255.0,126.0],[85.0,255.0,127.0],[86.0,255.0,128.0],[88.0,255.0,129.0],[89.0,255.0,131.0],[91.0,255.0,132.0],[92.0,255.0,133.0],[94.0,255.0,134.0],[95.0,255.0,135.0],[97.0,255.0,136.0],[98.0,255.0,137.0],[100.0,255.0,139.0],[102.0,255.0,140.0],[103.0,255.0,141.0],[105.0,255.0,142.0],[106.0,255.0,143.0],[108.0,255.0,144.0],[109.0,255.0,145.0],[111.0,255.0,147.0],[112.0,255.0,148.0],[114.0,255.0,149.0],[115.0,255.0,150.0],[117.0,255.0,151.0],[118.0,255.0,152.0],[120.0,255.0,154.0],[121.0,255.0,155.0],[123.0,255.0,156.0],[124.0,255.0,157.0],[126.0,255.0,158.0],[128.0,255.0,159.0],[129.0,255.0,160.0],[131.0,255.0,162.0],[132.0,255.0,163.0],[134.0,255.0,164.0],[135.0,255.0,165.0],[137.0,255.0,166.0],[138.0,255.0,167.0],[140.0,255.0,168.0],[141.0,255.0,170.0],[143.0,255.0,171.0],[144.0,255.0,172.0],[146.0,255.0,173.0],[147.0,255.0,174.0],[149.0,255.0,175.0],[150.0,255.0,176.0],[152.0,255.0,178.0],[154.0,255.0,179.0],[155.0,255.0,180.0],[157.0,255.0,181.0],[158.0,255.0,182.0],[160.0,255.0,183.0],[161.0,255.0,185.0],[163.0,255.0,186.0],[164.0,255.0,187.0],[166.0,255.0,188.0],[167.0,255.0,189.0],[169.0,255.0,190.0],[170.0,255.0,191.0],[172.0,255.0,193.0],[173.0,255.0,194.0],[175.0,255.0,195.0],[176.0,255.0,196.0],[178.0,255.0,197.0],[180.0,255.0,198.0],[181.0,255.0,199.0],[183.0,255.0,201.0],[184.0,255.0,202.0],[186.0,255.0,203.0],[187.0,255.0,204.0],[189.0,255.0,205.0],[190.0,255.0,206.0],[192.0,255.0,207.0],[193.0,255.0,209.0],[195.0,255.0,210.0],[196.0,255.0,211.0],[198.0,255.0,212.0],[199.0,255.0,213.0],[201.0,255.0,214.0],[202.0,255.0,215.0],[204.0,255.0,217.0],[206.0,255.0,218.0],[207.0,255.0,219.0],[209.0,255.0,220.0],[210.0,255.0,221.0],[212.0,255.0,222.0],[213.0,255.0,224.0],[215.0,255.0,225.0],[216.0,255.0,226.0],[250.0,255.0,216.0],[250.0,255.0,215.0],[249.0,255.0,213.0],[249.0,255.0,212.0],[249.0,255.0,210.0],[249.0,255.0,209.0],[249.0,255.0,207.0],[248.0,255.0,206.0],[248.0,255.0,204.0],[248.0,255.0,202.0],[248.0,255.0,201.0],[248.0,255.0,199.0],[247.0,255.0,198.0],[247.0,255.0,196.0],[247.0,255.0,195.0],[247.0,255.0,193.0],[247.0,255.0,192.0],[246.0,255.0,190.0],[246.0,255.0,189.0],[246.0,255.0,187.0],[246.0,255.0,186.0],[246.0,255.0,184.0],[246.0,255.0,183.0],[245.0,255.0,181.0],[245.0,255.0,180.0],[245.0,255.0,178.0],[245.0,255.0,176.0],[245.0,255.0,175.0],[244.0,255.0,173.0],[244.0,255.0,172.0],[244.0,255.0,170.0],[244.0,255.0,169.0],[244.0,255.0,167.0],[243.0,255.0,166.0],[243.0,255.0,164.0],[243.0,255.0,163.0],[243.0,255.0,161.0],[243.0,255.0,160.0],[242.0,255.0,158.0],[242.0,255.0,157.0],[242.0,255.0,155.0],[242.0,255.0,154.0],[242.0,255.0,152.0],[241.0,255.0,150.0],[241.0,255.0,149.0],[241.0,255.0,147.0],[241.0,255.0,146.0],[241.0,255.0,144.0],[241.0,255.0,143.0],[240.0,255.0,141.0],[240.0,255.0,140.0],[240.0,255.0,138.0],[240.0,255.0,137.0],[240.0,255.0,135.0],[239.0,255.0,134.0],[239.0,255.0,132.0],[239.0,255.0,131.0],[239.0,255.0,129.0],[239.0,255.0,128.0],[238.0,255.0,126.0],[238.0,255.0,124.0],[238.0,255.0,123.0],[238.0,255.0,121.0],[238.0,255.0,120.0],[237.0,255.0,118.0],[237.0,255.0,117.0],[237.0,255.0,115.0],[237.0,255.0,114.0],[237.0,255.0,112.0],[237.0,255.0,111.0],[236.0,255.0,109.0],[236.0,255.0,108.0],[236.0,255.0,106.0],[236.0,255.0,105.0],[236.0,255.0,103.0],[235.0,255.0,101.0],[235.0,255.0,100.0],[235.0,255.0,98.0],[235.0,255.0,97.0],[235.0,255.0,95.0],[234.0,255.0,94.0],[234.0,255.0,92.0],[234.0,255.0,91.0],[234.0,255.0,89.0],[234.0,255.0,88.0],[233.0,255.0,86.0],[233.0,255.0,85.0],[233.0,255.0,83.0],[233.0,255.0,82.0],[233.0,255.0,80.0],[233.0,255.0,79.0],[232.0,255.0,77.0],[232.0,255.0,75.0],[232.0,255.0,74.0],[232.0,255.0,72.0],[232.0,255.0,71.0],[231.0,255.0,69.0],[231.0,255.0,68.0],[231.0,255.0,66.0],[231.0,255.0,65.0],[231.0,255.0,63.0],[230.0,255.0,62.0],[230.0,255.0,60.0],[230.0,255.0,59.0],[230.0,255.0,57.0],[230.0,255.0,56.0],[229.0,255.0,54.0],[229.0,255.0,53.0],[229.0,255.0,51.0],[229.0,255.0,49.0],[229.0,255.0,48.0],[228.0,255.0,46.0],[228.0,255.0,45.0],[228.0,255.0,43.0],[228.0,255.0,42.0],[228.0,255.0,40.0],[228.0,255.0,39.0],[227.0,255.0,37.0],[227.0,255.0,36.0],[227.0,255.0,34.0],[227.0,255.0,33.0],[227.0,255.0,31.0],[226.0,255.0,30.0],[226.0,255.0,28.0],[226.0,255.0,27.0],[226.0,255.0,25.0]],"hotcolr_19lev":[[0.0,0.0,50.0],[24.0,24.0,112.0],[16.0,78.0,139.0],[23.0,116.0,205.0],[72.0,118.0,255.0],[91.0,172.0,237.0],[173.0,215.0,230.0],[209.0,237.0,237.0],[229.0,239.0,249.0],[242.0,255.0,255.0],[253.0,245.0,230.0],[255.0,228.0,180.0],[243.0,164.0,96.0],[237.0,118.0,0.0],[205.0,102.0,29.0],[224.0,49.0,15.0],[237.0,0.0,0.0],[205.0,0.0,0.0],[139.0,0.0,0.0],[50.0,0.0,0.0]],"prcp_3":[[255.0,255.0,255.0],[0.0,0.0,0.0],[255.0,255.0,255.0],[233.0,204.0,249.0],[207.0,128.0,223.0],[131.0,51.0,147.0],[58.0,0.0,176.0],[29.0,0.0,215.0],[0.0,0.0,255.0],[3.0,60.0,175.0],[5.0,119.0,95.0],[8.0,179.0,15.0],[132.0,217.0,8.0],[255.0,255.0,0.0],[255.0,170.0,0.0],[255.0,85.0,0.0],[255.0,0.0,0.0],[179.0,0.0,0.0],[102.0,0.0,0.0],[51.0,0.0,0.0],[0.0,0.0,0.0],[250.0,197.0,250.0],[255.0,255.0,255.0]],"gui_default":[[0.0,0.0,1.0],[0.0,0.4,1.0],[0.0,0.835294,1.0],[0.094118,1.0,1.0],[0.4,1.0,1.0],[0.6,1.0,1.0],[0.4,1.0,0.6],[0.101961,1.0,0.168627],[0.2,1.0,0.0],[0.494118,1.0,0.0],[0.8,1.0,0.0],[0.878431,0.964706,0.007843],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,0.909804,0.0],[1.0,0.8,0.0],[1.0,0.6,0.0],[1.0,0.5,0.0],[1.0,0.4,0.0],[1.0,0.2,0.0],[1.0,0.160784,0.0],[1.0,0.0,0.0]],"MPL_PuRd":[[0.966659,0.954525,0.97524],[0.962722,0.94985,0.97278],[0.958785,0.945175,0.970319],[0.954848,0.9405,0.967859],[0.950911,0.935825,0.965398],[0.946974,0.93115,0.962937],[0.943037,0.926474,0.960477],[0.9391,0.921799,0.958016],[0.935163,0.917124,0.955556],[0.933195,0.914787,0.954325],[0.92729,0.907774,0.950634],[0.925321,0.905436,0.949404],[0.919416,0.898424,0.945713],[0.917447,0.896086,0.944483],[0.911542,0.889073,0.940792],[0.909573,0.886736,0.939562],[0.903253,0.876817,0.934348],[0.898577,0.866974,0.929181],[0.89624,0.862053,0.926597],[0.889227,0.84729,0.918847],[0.884552,0.837447,0.913679],[0.879877,0.827605,0.908512],[0.877539,0.822684,0.905928],[0.870527,0.80792,0.898178],[0.865852,0.798078,0.89301],[0.861176,0.788235,0.887843],[0.858839,0.783314,0.88526],[0.851826,0.768551,0.877509],[0.847151,0.758708,0.872341],[0.842476,0.748866,0.867174],[0.840138,0.743945,0.864591],[0.833126,0.729181,0.85684],[0.829681,0.7198,0.85198],[0.826974,0.710696,0.847305],[0.824268,0.701592,0.84263],[0.821561,0.692488,0.837955],[0.818854,0.683383,0.83328],[0.817501,0.678831,0.830942],[0.813441,0.665175,0.823929],[0.810734,0.656071,0.819254],[0.808028,0.646967,0.814579],[0.805321,0.637862,0.809904],[0.802614,0.628758,0.805229],[0.799908,0.619654,0.800554],[0.797201,0.61055,0.795879],[0.795848,0.605998,0.793541],[0.791788,0.592341,0.786528],[0.789081,0.583237,0.781853],[0.791957,0.572441,0.776501],[0.79737,0.560877,0.770842],[0.802784,0.549312,0.765183],[0.808197,0.537747,0.759523],[0.81361,0.526182,0.753864],[0.816317,0.5204,0.751034],[0.824437,0.503053,0.742545],[0.82985,0.491488,0.736886],[0.835263,0.479923,0.731226],[0.840677,0.468358,0.725567],[0.84609,0.456794,0.719908],[0.851503,0.445229,0.714248],[0.856917,0.433664,0.708589],[0.859623,0.427882,0.705759],[0.867743,0.410534,0.69727],[0.873156,0.39897,0.691611],[0.875986,0.385006,0.683183],[0.877955,0.370242,0.673833],[0.879923,0.355479,0.664483],[0.881892,0.340715,0.655133],[0.88386,0.325952,0.645782],[0.885829,0.311188,0.636432],[0.887797,0.296424,0.627082],[0.889765,0.281661,0.617732],[0.891734,0.266897,0.608381],[0.893702,0.252134,0.599031],[0.895671,0.23737,0.589681],[0.896655,0.229988,0.585006],[0.899608,0.207843,0.57098],[0.901576,0.19308,0.56163],[0.903545,0.178316,0.55228],[0.905513,0.163552,0.54293],[0.900884,0.156186,0.53078],[0.894733,0.150527,0.517985],[0.888581,0.144867,0.50519],[0.88243,0.139208,0.492395],[0.876278,0.133549,0.4796],[0.870127,0.127889,0.466805],[0.863975,0.12223,0.45401],[0.857824,0.116571,0.441215],[0.851672,0.110911,0.42842],[0.845521,0.105252,0.415625],[0.839369,0.099592,0.40283],[0.836294,0.096763,0.396432],[0.827067,0.088274,0.37724],[0.820915,0.082614,0.364444],[0.814764,0.076955,0.351649],[0.808612,0.071296,0.338854],[0.796217,0.066713,0.333164],[0.78293,0.062284,0.328489],[0.769642,0.057855,0.323814],[0.756355,0.053426,0.319139],[0.743068,0.048997,0.314464],[0.729781,0.044567,0.309789],[0.716494,0.040138,0.305113],[0.703206,0.035709,0.300438],[0.689919,0.03128,0.295763],[0.676632,0.026851,0.291088],[0.663345,0.022422,0.286413],[0.656701,0.020208,0.284075],[0.63677,0.013564,0.277063],[0.623483,0.009135,0.272388],[0.610196,0.004706,0.267712],[0.596909,0.000277,0.263037],[0.584775,0.0,0.254441],[0.572718,0.0,0.245582],[0.560661,0.0,0.236724],[0.548604,0.0,0.227866],[0.536548,0.0,0.219008],[0.524491,0.0,0.21015],[0.512434,0.0,0.201292],[0.500377,0.0,0.192434],[0.48832,0.0,0.183576],[0.476263,0.0,0.174717],[0.464206,0.0,0.165859],[0.458178,0.0,0.16143],[0.440092,0.0,0.148143],[0.428035,0.0,0.139285],[0.415978,0.0,0.130427],[0.403922,0.0,0.121569]],"MPL_gist_nca":[[0.0,0.02862,0.465106],[0.0,0.085859,0.391319],[0.0,0.143099,0.317532],[0.0,0.200338,0.243745],[0.0,0.257578,0.169958],[0.0,0.314817,0.096171],[0.0,0.372057,0.022384],[0.0,0.31916,0.152299],[0.0,0.265986,0.282725],[0.0,0.2394,0.347938],[0.0,0.15964,0.543576],[0.0,0.133053,0.608789],[0.0,0.053293,0.804427],[0.0,0.026706,0.86964],[0.0,0.110508,1.0],[0.0,0.165887,1.0],[0.0,0.332023,1.0],[0.0,0.44278,1.0],[0.0,0.498159,1.0],[0.0,0.664295,1.0],[0.0,0.753565,1.0],[0.0,0.792512,1.0],[0.0,0.809797,1.0],[0.0,0.861654,1.0],[0.0,0.896226,1.0],[0.0,0.930797,1.0],[0.0,0.948083,0.999859],[0.0,0.99994,0.922728],[0.0,0.99644,0.871307],[0.0,0.992873,0.819887],[0.0,0.991089,0.794176],[0.0,0.985739,0.717045],[0.0,0.982173,0.665625],[0.0,0.9804,0.614029],[0.0,0.9804,0.532203],[0.0,0.983666,0.450376],[0.0,0.986937,0.368549],[0.0,0.988572,0.327635],[0.0,0.993478,0.204895],[2.5e-05,0.996749,0.123068],[0.049973,0.999823,0.041241],[0.099922,0.970311,0.0],[0.14987,0.940799,0.0],[0.199819,0.911288,0.0],[0.249767,0.881776,0.0],[0.274741,0.86702,0.0],[0.349664,0.822753,0.0],[0.399397,0.820966,0.0],[0.41493,0.84652,0.0],[0.430462,0.872073,0.0],[0.445995,0.897627,0.0],[0.461527,0.92318,0.0],[0.47706,0.948733,0.0],[0.484826,0.96151,0.0],[0.518281,0.99984,0.046804],[0.553975,1.0,0.078043],[0.589669,1.0,0.109282],[0.625363,1.0,0.140522],[0.661057,1.0,0.171761],[0.696752,1.0,0.203],[0.732446,1.0,0.234161],[0.750293,1.0,0.218541],[0.803834,1.0,0.171683],[0.839528,1.0,0.140443],[0.875222,1.0,0.109204],[0.910916,1.0,0.077965],[0.946611,1.0,0.046726],[0.982305,0.980734,0.015487],[1.0,0.96139,0.0],[1.0,0.942047,0.0],[1.0,0.922703,0.0],[1.0,0.90336,0.0],[1.0,0.884016,0.0],[1.0,0.864673,0.0],[1.0,0.845329,0.004213],[1.0,0.835657,0.008434],[1.0,0.806642,0.021099],[1.0,0.787298,0.029542],[1.0,0.767955,0.037985],[1.0,0.748611,0.046428],[1.0,0.729268,0.05487],[1.0,0.665194,0.047603],[1.0,0.600963,0.04028],[1.0,0.536732,0.032957],[1.0,0.472501,0.025634],[1.0,0.40827,0.018311],[1.0,0.34404,0.010988],[1.0,0.279809,0.003665],[1.0,0.242426,0.0],[1.0,0.205131,0.0],[1.0,0.167836,0.0],[1.0,0.149189,0.0],[1.0,0.093247,0.0],[1.0,0.055952,0.0],[1.0,0.018657,0.06876],[1.0,0.0,0.207879],[1.0,0.0,0.346998],[1.0,0.0,0.486117],[1.0,0.0,0.625237],[1.0,0.0,0.764356],[1.0,0.0,0.903475],[0.973282,0.013357,0.986828],[0.919251,0.040369,1.0],[0.865221,0.067381,1.0],[0.81119,0.094393,1.0],[0.75716,0.121405,1.0],[0.703129,0.148416,1.0],[0.676114,0.161922,1.0],[0.6448,0.221908,0.990541],[0.691289,0.268295,0.981126],[0.737778,0.314682,0.971711],[0.784266,0.36107,0.962297],[0.830755,0.407457,0.952882],[0.877244,0.453845,0.943468],[0.923528,0.500182,0.934124],[0.92911,0.536514,0.938891],[0.934693,0.572846,0.943659],[0.940275,0.609178,0.948426],[0.945858,0.64551,0.953193],[0.95144,0.681843,0.957961],[0.957023,0.718175,0.962728],[0.962605,0.754507,0.967496],[0.968188,0.790839,0.972263],[0.970979,0.809005,0.974647],[0.979353,0.863503,0.981798],[0.984935,0.899836,0.986565],[0.990518,0.936168,0.991333],[0.9961,0.9725,0.9961]],"MPL_Reds":[[0.999877,0.958201,0.937486],[0.999631,0.953033,0.930104],[0.999385,0.947866,0.922722],[0.999139,0.942699,0.91534],[0.998893,0.937532,0.907958],[0.998647,0.932364,0.900577],[0.998401,0.927197,0.893195],[0.998155,0.92203,0.885813],[0.997908,0.916863,0.878431],[0.997785,0.914279,0.87474],[0.997416,0.906528,0.863668],[0.997293,0.903945,0.859977],[0.996924,0.896194,0.848904],[0.996801,0.89361,0.845213],[0.996432,0.885859,0.834141],[0.996309,0.883276,0.83045],[0.995802,0.87331,0.816747],[0.995309,0.864206,0.804691],[0.995063,0.859654,0.798662],[0.994325,0.845998,0.780577],[0.993833,0.836894,0.76852],[0.993341,0.827789,0.756463],[0.993095,0.823237,0.750434],[0.992357,0.809581,0.732349],[0.991865,0.800477,0.720292],[0.991373,0.791373,0.708235],[0.991126,0.78682,0.702207],[0.990388,0.773164,0.684122],[0.989896,0.76406,0.672065],[0.989404,0.754956,0.660008],[0.989158,0.750404,0.653979],[0.98842,0.736747,0.635894],[0.988235,0.727028,0.624145],[0.988235,0.71694,0.61258],[0.988235,0.706851,0.601015],[0.988235,0.696763,0.58945],[0.988235,0.686674,0.577885],[0.988235,0.68163,0.572103],[0.988235,0.666498,0.554756],[0.988235,0.656409,0.543191],[0.988235,0.646321,0.531626],[0.988235,0.636232,0.520062],[0.988235,0.626144,0.508497],[0.988235,0.616055,0.496932],[0.988235,0.605967,0.485367],[0.988235,0.600923,0.479585],[0.988235,0.58579,0.462238],[0.988235,0.575702,0.450673],[0.988066,0.565782,0.440292],[0.98782,0.55594,0.43045],[0.987574,0.546098,0.420607],[0.987328,0.536255,0.410765],[0.987082,0.526413,0.400923],[0.986959,0.521492,0.396002],[0.98659,0.506728,0.381238],[0.986344,0.496886,0.371396],[0.986098,0.487043,0.361553],[0.985852,0.477201,0.351711],[0.985606,0.467359,0.341869],[0.985359,0.457516,0.332026],[0.985113,0.447674,0.322184],[0.98499,0.442753,0.317263],[0.984621,0.427989,0.302499],[0.984375,0.418147,0.292657],[0.982099,0.407013,0.28466],[0.979146,0.395448,0.277278],[0.976194,0.383883,0.269896],[0.973241,0.372318,0.262514],[0.970288,0.360754,0.255133],[0.967336,0.349189,0.247751],[0.964383,0.337624,0.240369],[0.96143,0.326059,0.232987],[0.958478,0.314494,0.225606],[0.955525,0.30293,0.218224],[0.952572,0.291365,0.210842],[0.951096,0.285582,0.207151],[0.946667,0.268235,0.196078],[0.943714,0.256671,0.188697],[0.940761,0.245106,0.181315],[0.937809,0.233541,0.173933],[0.930058,0.224375,0.16955],[0.9212,0.215763,0.165859],[0.912341,0.207151,0.162168],[0.903483,0.198539,0.158478],[0.894625,0.189927,0.154787],[0.885767,0.181315,0.151096],[0.876909,0.172703,0.147405],[0.868051,0.164091,0.143714],[0.859193,0.155479,0.140023],[0.850334,0.146867,0.136332],[0.841476,0.138255,0.132641],[0.837047,0.133948,0.130796],[0.82376,0.12103,0.12526],[0.814902,0.112418,0.121569],[0.806044,0.103806,0.117878],[0.797186,0.095194,0.114187],[0.787897,0.09218,0.112003],[0.778547,0.089965,0.110035],[0.769196,0.087751,0.108066],[0.759846,0.085536,0.106098],[0.750496,0.083322,0.104129],[0.741146,0.081107,0.102161],[0.731795,0.078893,0.100192],[0.722445,0.076678,0.098224],[0.713095,0.074464,0.096255],[0.703745,0.072249,0.094287],[0.694394,0.070035,0.092318],[0.689719,0.068927,0.091334],[0.675694,0.065606,0.088381],[0.666344,0.063391,0.086413],[0.656993,0.061176,0.084444],[0.647643,0.058962,0.082476],[0.632757,0.055363,0.080507],[0.617501,0.051672,0.078539],[0.602245,0.047982,0.076571],[0.58699,0.044291,0.074602],[0.571734,0.0406,0.072634],[0.556478,0.036909,0.070665],[0.541223,0.033218,0.068697],[0.525967,0.029527,0.066728],[0.510711,0.025836,0.06476],[0.495456,0.022145,0.062791],[0.4802,0.018454,0.060823],[0.472572,0.016609,0.059839],[0.449689,0.011073,0.056886],[0.434433,0.007382,0.054917],[0.419177,0.003691,0.052949],[0.403922,0.0,0.05098]],"ncview_default":[[131.0,0.0,255.0],[128.0,0.0,255.0],[125.0,0.0,254.0],[122.0,0.0,254.0],[119.0,0.0,254.0],[116.0,0.0,253.0],[113.0,1.0,253.0],[110.0,2.0,252.0],[108.0,3.0,252.0],[106.0,3.0,252.0],[103.0,4.0,251.0],[101.0,5.0,251.0],[99.0,6.0,250.0],[96.0,7.0,250.0],[94.0,8.0,249.0],[92.0,9.0,249.0],[90.0,10.0,248.0],[87.0,12.0,247.0],[85.0,13.0,247.0],[83.0,14.0,246.0],[81.0,16.0,245.0],[79.0,18.0,244.0],[76.0,19.0,243.0],[74.0,21.0,242.0],[72.0,23.0,241.0],[70.0,24.0,240.0],[68.0,26.0,239.0],[66.0,28.0,238.0],[64.0,30.0,237.0],[62.0,32.0,236.0],[60.0,35.0,235.0],[58.0,37.0,233.0],[56.0,39.0,232.0],[54.0,41.0,231.0],[52.0,44.0,229.0],[50.0,46.0,228.0],[48.0,48.0,227.0],[47.0,51.0,225.0],[45.0,53.0,224.0],[43.0,56.0,222.0],[41.0,59.0,221.0],[39.0,61.0,219.0],[38.0,64.0,217.0],[36.0,67.0,216.0],[35.0,69.0,214.0],[33.0,72.0,212.0],[31.0,75.0,211.0],[30.0,78.0,209.0],[28.0,81.0,207.0],[27.0,84.0,205.0],[25.0,87.0,203.0],[24.0,90.0,202.0],[23.0,93.0,200.0],[21.0,96.0,198.0],[20.0,99.0,196.0],[19.0,102.0,194.0],[18.0,105.0,192.0],[16.0,108.0,190.0],[15.0,111.0,188.0],[14.0,114.0,186.0],[13.0,117.0,184.0],[12.0,120.0,182.0],[11.0,123.0,179.0],[10.0,126.0,177.0],[9.0,130.0,175.0],[8.0,133.0,173.0],[7.0,136.0,171.0],[7.0,139.0,169.0],[6.0,142.0,166.0],[5.0,145.0,164.0],[5.0,148.0,162.0],[4.0,151.0,160.0],[3.0,154.0,157.0],[3.0,157.0,155.0],[2.0,160.0,153.0],[2.0,163.0,151.0],[1.0,166.0,148.0],[1.0,169.0,146.0],[1.0,172.0,144.0],[0.0,175.0,141.0],[0.0,178.0,139.0],[0.0,181.0,137.0],[0.0,184.0,134.0],[0.0,186.0,132.0],[0.0,189.0,130.0],[0.0,192.0,127.0],[0.0,194.0,125.0],[0.0,197.0,123.0],[0.0,200.0,120.0],[0.0,202.0,118.0],[0.0,205.0,116.0],[0.0,207.0,113.0],[0.0,209.0,111.0],[1.0,212.0,109.0],[1.0,214.0,106.0],[2.0,216.0,104.0],[2.0,218.0,102.0],[2.0,221.0,99.0],[3.0,223.0,97.0],[3.0,225.0,95.0],[4.0,227.0,93.0],[5.0,229.0,90.0],[5.0,230.0,88.0],[6.0,232.0,86.0],[7.0,234.0,84.0],[8.0,235.0,82.0],[9.0,237.0,79.0],[9.0,239.0,77.0],[10.0,240.0,75.0],[11.0,241.0,73.0],[12.0,243.0,71.0],[13.0,244.0,69.0],[14.0,245.0,67.0],[16.0,246.0,65.0],[17.0,247.0,63.0],[18.0,248.0,61.0],[19.0,249.0,59.0],[20.0,250.0,57.0],[22.0,250.0,55.0],[23.0,251.0,53.0],[24.0,252.0,51.0],[26.0,252.0,49.0],[27.0,253.0,47.0],[29.0,253.0,45.0],[30.0,253.0,44.0],[32.0,253.0,42.0],[33.0,253.0,40.0],[35.0,254.0,38.0],[37.0,253.0,37.0],[38.0,253.0,35.0],[40.0,253.0,33.0],[42.0,253.0,32.0],[44.0,253.0,30.0],[45.0,252.0,29.0],[47.0,252.0,27.0],[49.0,251.0,26.0],[51.0,250.0,24.0],[53.0,250.0,23.0],[55.0,249.0,22.0],[57.0,248.0,20.0],[59.0,247.0,19.0],[61.0,246.0,18.0],[63.0,245.0,17.0],[65.0,244.0,16.0],[67.0,243.0,14.0],[69.0,241.0,13.0],[71.0,240.0,12.0],[73.0,239.0,11.0],[75.0,237.0,10.0],[77.0,235.0,9.0],[79.0,234.0,9.0],[82.0,232.0,8.0],[84.0,230.0,7.0],[86.0,229.0,6.0],[88.0,227.0,5.0],[90.0,225.0,5.0],[93.0,223.0,4.0],[95.0,221.0,3.0],[97.0,218.0,3.0],[99.0,216.0,2.0],[102.0,214.0,2.0],[104.0,212.0,2.0],[106.0,209.0,1.0],[109.0,207.0,1.0],[111.0,205.0,0.0],[113.0,202.0,0.0],[116.0,200.0,0.0],[118.0,197.0,0.0],[120.0,194.0,0.0],[123.0,192.0,0.0],[125.0,189.0,0.0],[127.0,186.0,0.0],[130.0,184.0,0.0],[132.0,181.0,0.0],[134.0,178.0,0.0],[137.0,175.0,0.0],[139.0,172.0,0.0],[141.0,169.0,0.0],[144.0,166.0,1.0],[146.0,163.0,1.0],[148.0,160.0,1.0],[151.0,157.0,2.0],[153.0,154.0,2.0],[155.0,151.0,3.0],[157.0,148.0,3.0],[160.0,145.0,4.0],[162.0,142.0,5.0],[164.0,139.0,5.0],[166.0,136.0,6.0],[169.0,133.0,7.0],[171.0,130.0,7.0],[173.0,126.0,8.0],[175.0,123.0,9.0],[177.0,120.0,10.0],[179.0,117.0,11.0],[182.0,114.0,12.0],[184.0,111.0,13.0],[186.0,108.0,14.0],[188.0,105.0,15.0],[190.0,102.0,16.0],[192.0,99.0,18.0],[194.0,96.0,19.0],[196.0,93.0,20.0],[198.0,90.0,21.0],[200.0,87.0,23.0],[202.0,84.0,24.0],[203.0,81.0,25.0],[205.0,78.0,27.0],[207.0,75.0,28.0],[209.0,72.0,30.0],[211.0,69.0,31.0],[212.0,67.0,33.0],[214.0,64.0,35.0],[216.0,61.0,36.0],[217.0,59.0,38.0],[219.0,56.0,39.0],[221.0,53.0,41.0],[222.0,51.0,43.0],[224.0,48.0,45.0],[225.0,46.0,47.0],[227.0,44.0,48.0],[228.0,41.0,50.0],[229.0,39.0,52.0],[231.0,37.0,54.0],[232.0,35.0,56.0],[233.0,32.0,58.0],[235.0,30.0,60.0],[236.0,28.0,62.0],[237.0,26.0,64.0],[238.0,24.0,66.0],[239.0,23.0,68.0],[240.0,21.0,70.0],[241.0,19.0,72.0],[242.0,18.0,74.0],[243.0,16.0,76.0],[244.0,14.0,79.0],[245.0,13.0,81.0],[246.0,12.0,83.0],[247.0,10.0,85.0],[247.0,9.0,87.0],[248.0,8.0,90.0],[249.0,7.0,92.0],[249.0,6.0,94.0],[250.0,5.0,96.0],[250.0,4.0,99.0],[251.0,3.0,101.0],[251.0,3.0,103.0],[252.0,2.0,106.0],[252.0,1.0,108.0],[252.0,1.0,110.0],[253.0,0.0,113.0],[253.0,0.0,115.0],[253.0,0.0,117.0],[253.0,0.0,119.0]],"example":[[1.0,1.0,0.968627],[1.0,1.0,0.905882],[1.0,1.0,0.843137],[1.0,1.0,0.780392],[1.0,1.0,0.717647],[1.0,1.0,0.654902],[1.0,1.0,0.592157],[1.0,1.0,0.529412],[1.0,1.0,0.470588],[1.0,1.0,0.407843],[1.0,1.0,0.345098],[1.0,1.0,0.282353],[1.0,1.0,0.219608],[1.0,1.0,0.156863],[1.0,1.0,0.094118],[1.0,1.0,0.031373],[1.0,0.968627,0.031373],[1.0,0.905882,0.094118],[1.0,0.843137,0.156863],[1.0,0.780392,0.219608],[1.0,0.717647,0.282353],[1.0,0.654902,0.345098],[1.0,0.592157,0.407843],[1.0,0.529412,0.470588],[1.0,0.470588,0.529412],[1.0,0.407843,0.592157],[1.0,0.345098,0.654902],[1.0,0.282353,0.717647],[1.0,0.219608,0.780392],[1.0,0.156863,0.843137],[1.0,0.094118,0.905882],[1.0,0.031373,0.968627],[1.0,0.0,0.968627],[1.0,0.0,0.905882],[1.0,0.0,0.843137],[1.0,0.0,0.780392],[1.0,0.0,0.717647],[1.0,0.0,0.654902],[1.0,0.0,0.592157],[1.0,0.0,0.529412],[1.0,0.0,0.470588],[1.0,0.0,0.407843],[1.0,0.0,0.345098],[1.0,0.0,0.282353],[1.0,0.0,0.219608],[1.0,0.0,0.156863],[1.0,0.0,0.094118],[1.0,0.0,0.031373],[0.968627,0.031373,0.031373],[0.905882,0.094118,0.094118],[0.843137,0.156863,0.156863],[0.780392,0.219608,0.219608],[0.717647,0.282353,0.282353],[0.654902,0.345098,0.345098],[0.592157,0.407843,0.407843],[0.529412,0.470588,0.470588],[0.470588,0.529412,0.529412],[0.407843,0.592157,0.592157],[0.345098,0.654902,0.654902],[0.282353,0.717647,0.717647],[0.219608,0.780392,0.780392],[0.156863,0.843137,0.843137],[0.094118,0.905882,0.905882],[0.031373,0.968627,0.968627],[0.0,1.0,0.968627],[0.0,1.0,0.937255],[0.0,1.0,0.87451],[0.0,1.0,0.811765],[0.0,1.0,0.780392],[0.0,1.0,0.717647],[0.0,1.0,0.654902],[0.0,1.0,0.592157],[0.0,1.0,0.529412],[0.0,1.0,0.470588],[0.0,1.0,0.407843],[0.0,1.0,0.345098],[0.0,1.0,0.282353],[0.0,1.0,0.219608],[0.0,1.0,0.156863],[0.0,1.0,0.094118],[0.0,1.0,0.031373],[0.0,0.968627,0.031373],[0.0,0.905882,0.094118],[0.0,0.843137,0.156863],[0.0,0.780392,0.219608],[0.0,0.717647,0.282353],[0.0,0.654902,0.345098],[0.0,0.592157,0.407843],[0.0,0.529412,0.470588],[0.0,0.470588,0.529412],[0.0,0.407843,0.592157],[0.0,0.345098,0.654902],[0.0,0.282353,0.717647],[0.0,0.219608,0.780392],[0.0,0.156863,0.843137],[0.0,0.094118,0.905882],[0.0,0.031373,0.968627],[0.0,0.0,0.968627],[0.0,0.0,0.905882],[0.0,0.0,0.843137],[0.0,0.0,0.780392],[0.0,0.0,0.717647],[0.0,0.0,0.654902],[0.0,0.0,0.592157],[0.0,0.0,0.529412],[0.0,0.0,0.470588],[0.0,0.0,0.407843],[0.0,0.0,0.345098],[0.0,0.0,0.282353],[0.0,0.0,0.219608],[0.0,0.0,0.156863],[0.0,0.0,0.094118],[0.0,0.0,0.031373]],"MPL_Purples":[[0.986636,0.982591,0.991173],[0.983437,0.979146,0.989204],[0.980238,0.975702,0.987236],[0.97704,0.972257,0.985267],[0.973841,0.968812,0.983299],[0.970642,0.965367,0.98133],[0.967443,0.961922,0.979362],[0.964245,0.958478,0.977393],[0.961046,0.955033,0.975425],[0.959446,0.95331,0.974441],[0.954648,0.948143,0.971488],[0.953049,0.946421,0.970504],[0.948251,0.941253,0.967551],[0.946651,0.939531,0.966567],[0.941853,0.934364,0.963614],[0.940254,0.932641,0.96263],[0.934348,0.926782,0.9594],[0.929181,0.922107,0.95694],[0.926597,0.919769,0.955709],[0.918847,0.912757,0.952018],[0.913679,0.908082,0.949558],[0.908512,0.903406,0.947097],[0.905928,0.901069,0.945867],[0.898178,0.894056,0.942176],[0.89301,0.889381,0.939715],[0.887843,0.884706,0.937255],[0.88526,0.882368,0.936025],[0.877509,0.875356,0.932334],[0.872341,0.870681,0.929873],[0.867174,0.866005,0.927413],[0.864591,0.863668,0.926182],[0.85684,0.856655,0.922491],[0.850288,0.850442,0.919262],[0.842907,0.843306,0.915571],[0.835525,0.836171,0.91188],[0.828143,0.829035,0.908189],[0.820761,0.821899,0.904498],[0.81707,0.818331,0.902653],[0.805998,0.807628,0.897116],[0.798616,0.800492,0.893426],[0.791234,0.793356,0.889735],[0.783852,0.786221,0.886044],[0.776471,0.779085,0.882353],[0.769089,0.771949,0.878662],[0.761707,0.764814,0.874971],[0.758016,0.761246,0.873126],[0.746943,0.750542,0.867589],[0.739562,0.743406,0.863899],[0.73218,0.735256,0.859362],[0.724798,0.726644,0.854441],[0.717416,0.718032,0.849519],[0.710035,0.709419,0.844598],[0.702653,0.700807,0.839677],[0.698962,0.696501,0.837216],[0.687889,0.683583,0.829835],[0.680508,0.674971,0.824914],[0.673126,0.666359,0.819992],[0.665744,0.657747,0.815071],[0.658362,0.649135,0.81015],[0.65098,0.640523,0.805229],[0.643599,0.631911,0.800308],[0.639908,0.627605,0.797847],[0.628835,0.614687,0.790465],[0.621453,0.606075,0.785544],[0.614072,0.59857,0.78173],[0.60669,0.591434,0.778285],[0.599308,0.584298,0.77484],[0.591926,0.577163,0.771396],[0.584544,0.570027,0.767951],[0.577163,0.562891,0.764506],[0.569781,0.555755,0.761061],[0.562399,0.54862,0.757616],[0.555017,0.541484,0.754171],[0.547636,0.534348,0.750727],[0.540254,0.527213,0.747282],[0.536563,0.523645,0.745559],[0.52549,0.512941,0.740392],[0.518108,0.505805,0.736947],[0.510727,0.49867,0.733503],[0.503345,0.491534,0.730058],[0.497563,0.481399,0.724814],[0.492149,0.470573,0.719154],[0.486736,0.459746,0.713495],[0.481323,0.44892,0.707835],[0.475909,0.438093,0.702176],[0.470496,0.427266,0.696517],[0.465083,0.41644,0.690857],[0.459669,0.405613,0.685198],[0.454256,0.394787,0.679539],[0.448843,0.38396,0.673879],[0.443429,0.373133,0.66822],[0.440723,0.36772,0.66539],[0.432603,0.35148,0.656901],[0.42719,0.340654,0.651242],[0.421776,0.329827,0.645582],[0.416363,0.319,0.639923],[0.41095,0.308604,0.63491],[0.405536,0.29827,0.629988],[0.400123,0.287935,0.625067],[0.39471,0.277601,0.620146],[0.389296,0.267266,0.615225],[0.383883,0.256932,0.610304],[0.37847,0.246597,0.605383],[0.373057,0.236263,0.600461],[0.367643,0.225928,0.59554],[0.36223,0.215594,0.590619],[0.356817,0.20526,0.585698],[0.35411,0.200092,0.583237],[0.34599,0.184591,0.575855],[0.340577,0.174256,0.570934],[0.335163,0.163922,0.566013],[0.32975,0.153587,0.561092],[0.324567,0.143945,0.556632],[0.3194,0.134348,0.552203],[0.314233,0.124752,0.547774],[0.309066,0.115156,0.543345],[0.303899,0.105559,0.538916],[0.298731,0.095963,0.534487],[0.293564,0.086367,0.530058],[0.288397,0.07677,0.525629],[0.28323,0.067174,0.5212],[0.278062,0.057578,0.51677],[0.272895,0.047982,0.512341],[0.270311,0.043183,0.510127],[0.262561,0.028789,0.503483],[0.257393,0.019193,0.499054],[0.252226,0.009596,0.494625],[0.247059,0.0,0.490196]],"BlueGreen14":[[0.0,0.0,255.0],[51.0,51.0,255.0],[101.0,101.0,255.0],[153.0,153.0,255.0],[178.0,178.0,255.0],[203.0,203.0,255.0],[229.0,229.0,255.0],[229.0,255.0,229.0],[203.0,255.0,203.0],[178.0,255.0,178.0],[153.0,255.0,153.0],[101.0,255.0,101.0],[51.0,255.0,51.0],[0.0,255.0,0.0]],"cb_rainbow":[[77.0,0.0,77.0],[76.0,1.0,79.0],[75.0,2.0,82.0],[74.0,3.0,84.0],[73.0,3.0,87.0],[72.0,4.0,89.0],[71.0,6.0,92.0],[70.0,7.0,94.0],[68.0,8.0,97.0],[67.0,9.0,99.0],[65.0,10.0,102.0],[64.0,12.0,105.0],[62.0,13.0,107.0],[60.0,14.0,110.0],[58.0,16.0,112.0],[56.0,17.0,115.0],[54.0,19.0,117.0],[52.0,20.0,120.0],[50.0,22.0,122.0],[48.0,24.0,125.0],[46.0,25.0,128.0],[44.0,27.0,130.0],[42.0,29.0,133.0],[40.0,31.0,135.0],[38.0,33.0,138.0],[35.0,35.0,140.0],[37.0,41.0,143.0],[39.0,47.0,145.0],[41.0,54.0,148.0],[44.0,60.0,150.0],[46.0,67.0,153.0],[48.0,74.0,156.0],[51.0,80.0,158.0],[53.0,87.0,161.0],[55.0,94.0,163.0],[58.0,101.0,166.0],[61.0,108.0,168.0],[63.0,114.0,171.0],[66.0,121.0,173.0],[69.0,128.0,176.0],[71.0,135.0,179.0],[74.0,142.0,181.0],[77.0,149.0,184.0],[80.0,156.0,186.0],[83.0,163.0,189.0],[86.0,170.0,191.0],[89.0,176.0,194.0],[92.0,183.0,196.0],[95.0,190.0,199.0],[99.0,197.0,201.0],[102.0,203.0,204.0],[105.0,207.0,203.0],[109.0,209.0,202.0],[112.0,212.0,200.0],[116.0,214.0,199.0],[119.0,217.0,198.0],[123.0,219.0,197.0],[126.0,222.0,196.0],[130.0,224.0,195.0],[134.0,227.0,194.0],[138.0,230.0,193.0],[142.0,232.0,193.0],[145.0,235.0,192.0],[149.0,237.0,192.0],[153.0,240.0,192.0],[157.0,242.0,192.0],[162.0,245.0,192.0],[166.0,247.0,192.0],[170.0,250.0,193.0],[174.0,252.0,194.0],[179.0,255.0,194.0],[174.0,252.0,187.0],[170.0,250.0,180.0],[166.0,247.0,173.0],[162.0,245.0,166.0],[157.0,242.0,158.0],[156.0,240.0,153.0],[156.0,237.0,149.0],[155.0,235.0,145.0],[155.0,232.0,142.0],[155.0,230.0,138.0],[155.0,227.0,134.0],[156.0,224.0,130.0],[156.0,222.0,126.0],[157.0,219.0,123.0],[157.0,217.0,119.0],[158.0,214.0,116.0],[159.0,212.0,112.0],[160.0,209.0,109.0],[161.0,207.0,105.0],[162.0,204.0,102.0],[163.0,201.0,99.0],[165.0,199.0,95.0],[166.0,196.0,92.0],[168.0,194.0,89.0],[169.0,191.0,86.0],[171.0,189.0,83.0],[172.0,186.0,80.0],[174.0,184.0,77.0],[176.0,181.0,74.0],[177.0,179.0,71.0],[176.0,173.0,69.0],[173.0,166.0,66.0],[171.0,159.0,63.0],[168.0,152.0,61.0],[166.0,146.0,58.0],[163.0,139.0,55.0],[161.0,132.0,53.0],[158.0,125.0,51.0],[156.0,118.0,48.0],[153.0,112.0,46.0],[150.0,105.0,44.0],[148.0,98.0,41.0],[145.0,92.0,39.0],[143.0,85.0,37.0],[140.0,79.0,35.0],[138.0,72.0,33.0],[135.0,66.0,31.0],[133.0,60.0,29.0],[130.0,53.0,27.0],[128.0,47.0,25.0],[125.0,41.0,24.0],[122.0,36.0,22.0],[120.0,30.0,20.0],[117.0,24.0,19.0],[115.0,19.0,17.0],[112.0,16.0,18.0],[110.0,14.0,20.0],[107.0,13.0,23.0],[105.0,12.0,25.0],[102.0,10.0,27.0],[99.0,9.0,29.0],[97.0,8.0,31.0],[94.0,7.0,33.0],[92.0,6.0,35.0],[89.0,4.0,37.0],[87.0,3.0,39.0],[84.0,3.0,40.0],[82.0,2.0,42.0],[79.0,1.0,43.0],[77.0,0.0,45.0],[80.0,2.0,47.0],[84.0,3.0,50.0],[87.0,5.0,53.0],[91.0,7.0,56.0],[94.0,9.0,59.0],[98.0,12.0,62.0],[101.0,14.0,65.0],[105.0,17.0,68.0],[109.0,20.0,72.0],[112.0,22.0,75.0],[116.0,25.0,78.0],[119.0,29.0,82.0],[123.0,32.0,85.0],[126.0,35.0,89.0],[130.0,39.0,92.0],[134.0,43.0,96.0],[137.0,47.0,99.0],[141.0,51.0,103.0],[144.0,55.0,107.0],[148.0,59.0,111.0],[151.0,64.0,115.0],[155.0,68.0,119.0],[159.0,73.0,123.0],[162.0,78.0,127.0],[166.0,83.0,131.0],[169.0,88.0,135.0],[173.0,93.0,140.0],[176.0,99.0,144.0],[180.0,104.0,149.0],[184.0,110.0,153.0],[187.0,116.0,158.0],[191.0,122.0,162.0],[194.0,128.0,167.0],[198.0,135.0,171.0],[201.0,141.0,176.0],[205.0,148.0,181.0],[209.0,154.0,186.0],[212.0,161.0,191.0],[216.0,168.0,196.0],[219.0,175.0,201.0],[223.0,183.0,206.0],[226.0,190.0,211.0],[230.0,198.0,217.0],[234.0,206.0,222.0],[237.0,213.0,227.0],[241.0,221.0,233.0],[244.0,230.0,238.0],[248.0,238.0,244.0],[251.0,246.0,249.0],[255.0,255.0,255.0],[250.0,250.0,250.0],[245.0,245.0,245.0],[240.0,240.0,240.0],[235.0,235.0,235.0],[230.0,230.0,230.0],[224.0,224.0,224.0],[219.0,219.0,219.0],[214.0,214.0,214.0],[209.0,209.0,209.0],[204.0,204.0,204.0],[199.0,199.0,199.0],[194.0,194.0,194.0],[189.0,189.0,189.0],[184.0,184.0,184.0],[179.0,179.0,179.0],[173.0,173.0,173.0],[168.0,168.0,168.0],[163.0,163.0,163.0],[158.0,158.0,158.0],[153.0,153.0,153.0],[148.0,148.0,148.0],[143.0,143.0,143.0],[138.0,138.0,138.0],[133.0,133.0,133.0],[128.0,128.0,128.0],[122.0,122.0,122.0],[117.0,117.0,117.0],[112.0,112.0,112.0],[107.0,107.0,107.0],[102.0,102.0,102.0],[97.0,97.0,97.0],[92.0,92.0,92.0],[87.0,87.0,87.0],[82.0,82.0,82.0],[77.0,77.0,77.0],[71.0,71.0,71.0],[66.0,66.0,66.0],[61.0,61.0,61.0],[56.0,56.0,56.0],[51.0,51.0,51.0],[46.0,46.0,46.0],[41.0,41.0,41.0],[36.0,36.0,36.0],[31.0,31.0,31.0],[26.0,26.0,26.0],[20.0,20.0,20.0],[15.0,15.0,15.0],[10.0,10.0,10.0],[5.0,5.0,5.0],[0.0,0.0,0.0]],"grads_rainbow":[[160.0,0.0,200.0],[130.0,0.0,220.0],[30.0,60.0,255.0],[0.0,160.0,255.0],[0.0,200.0,200.0],[0.0,210.0,140.0],[0.0,220.0,0.0],[160.0,230.0,50.0],[230.0,220.0,50.0],[230.0,175.0,45.0],[240.0,130.0,40.0],[250.0,60.0,60.0],[240.0,0.0,130.0]],"cmp_haxby":[[37.0,57.0,175.0],[37.0,68.0,187.0],[38.0,79.0,199.0],[38.0,90.0,211.0],[39.0,101.0,223.0],[39.0,113.0,235.0],[40.0,124.0,247.0],[41.0,134.0,251.0],[43.0,144.0,252.0],[44.0,154.0,253.0],[46.0,164.0,253.0],[47.0,174.0,254.0],[49.0,184.0,255.0],[54.0,193.0,255.0],[62.0,200.0,255.0],[71.0,207.0,255.0],[80.0,214.0,255.0],[89.0,221.0,255.0],[98.0,229.0,255.0],[107.0,235.0,254.0],[112.0,235.0,241.0],[117.0,235.0,228.0],[122.0,235.0,215.0],[127.0,236.0,202.0],[132.0,236.0,189.0],[137.0,236.0,177.0],[147.0,238.0,172.0],[157.0,241.0,171.0],[168.0,244.0,169.0],[178.0,247.0,167.0],[189.0,250.0,165.0],[200.0,253.0,163.0],[208.0,253.0,159.0],[213.0,250.0,152.0],[219.0,247.0,146.0],[224.0,244.0,139.0],[230.0,241.0,133.0],[236.0,238.0,126.0],[240.0,235.0,120.0],[243.0,227.0,115.0],[245.0,220.0,109.0],[248.0,212.0,104.0],[250.0,205.0,98.0],[252.0,197.0,93.0],[255.0,190.0,88.0],[255.0,185.0,84.0],[255.0,181.0,81.0],[255.0,176.0,78.0],[255.0,172.0,75.0],[255.0,167.0,72.0],[255.0,163.0,69.0],[255.0,163.0,74.0],[255.0,167.0,85.0],[255.0,171.0,95.0],[255.0,175.0,105.0],[255.0,179.0,115.0],[255.0,183.0,126.0],[255.0,189.0,139.0],[255.0,200.0,158.0],[255.0,211.0,178.0],[255.0,222.0,197.0],[255.0,233.0,216.0],[255.0,244.0,236.0],[255.0,255.0,255.0]],"rainbow+white":[[0.0,0.0,0.0],[4.0,0.0,3.0],[9.0,0.0,7.0],[13.0,0.0,10.0],[18.0,0.0,14.0],[22.0,0.0,19.0],[27.0,0.0,23.0],[31.0,0.0,28.0],[36.0,0.0,32.0],[40.0,0.0,38.0],[45.0,0.0,43.0],[50.0,0.0,48.0],[58.0,0.0,59.0],[64.0,0.0,68.0],[68.0,0.0,72.0],[69.0,0.0,77.0],[72.0,0.0,81.0],[74.0,0.0,86.0],[77.0,0.0,91.0],[79.0,0.0,95.0],[80.0,0.0,100.0],[82.0,0.0,104.0],[83.0,0.0,109.0],[84.0,0.0,118.0],[86.0,0.0,122.0],[88.0,0.0,132.0],[86.0,0.0,136.0],[87.0,0.0,141.0],[87.0,0.0,145.0],[87.0,0.0,150.0],[85.0,0.0,154.0],[84.0,0.0,159.0],[84.0,0.0,163.0],[84.0,0.0,168.0],[79.0,0.0,177.0],[78.0,0.0,182.0],[77.0,0.0,186.0],[76.0,0.0,191.0],[70.0,0.0,200.0],[68.0,0.0,204.0],[66.0,0.0,209.0],[60.0,0.0,214.0],[58.0,0.0,218.0],[55.0,0.0,223.0],[46.0,0.0,232.0],[43.0,0.0,236.0],[40.0,0.0,241.0],[36.0,0.0,245.0],[33.0,0.0,250.0],[25.0,0.0,255.0],[16.0,0.0,255.0],[12.0,0.0,255.0],[4.0,0.0,255.0],[0.0,0.0,255.0],[0.0,4.0,255.0],[0.0,16.0,255.0],[0.0,21.0,255.0],[0.0,25.0,255.0],[0.0,29.0,255.0],[0.0,38.0,255.0],[0.0,42.0,255.0],[0.0,46.0,255.0],[0.0,51.0,255.0],[0.0,63.0,255.0],[0.0,67.0,255.0],[0.0,72.0,255.0],[0.0,84.0,255.0],[0.0,89.0,255.0],[0.0,93.0,255.0],[0.0,97.0,255.0],[0.0,106.0,255.0],[0.0,110.0,255.0],[0.0,114.0,255.0],[0.0,119.0,255.0],[0.0,127.0,255.0],[0.0,135.0,255.0],[0.0,140.0,255.0],[0.0,152.0,255.0],[0.0,157.0,255.0],[0.0,161.0,255.0],[0.0,165.0,255.0],[0.0,174.0,255.0],[0.0,178.0,255.0],[0.0,182.0,255.0],[0.0,187.0,255.0],[0.0,195.0,255.0],[0.0,199.0,255.0],[0.0,216.0,255.0],[0.0,220.0,255.0],[0.0,225.0,255.0],[0.0,229.0,255.0],[0.0,233.0,255.0],[0.0,242.0,255.0],[0.0,246.0,255.0],[0.0,250.0,255.0],[0.0,255.0,255.0],[0.0,255.0,246.0],[0.0,255.0,242.0],[0.0,255.0,238.0],[0.0,255.0,225.0],[0.0,255.0,216.0],[0.0,255.0,212.0],[0.0,255.0,203.0],[0.0,255.0,199.0],[0.0,255.0,195.0],[0.0,255.0,191.0],[0.0,255.0,187.0],[0.0,255.0,178.0],[0.0,255.0,174.0],[0.0,255.0,170.0],[0.0,255.0,157.0],[0.0,255.0,152.0],[0.0,255.0,144.0],[0.0,255.0,135.0],[0.0,255.0,131.0],[0.0,255.0,127.0],[0.0,255.0,123.0],[0.0,255.0,114.0],[0.0,255.0,110.0],[0.0,255.0,106.0],[0.0,255.0,102.0],[0.0,255.0,89.0],[0.0,255.0,84.0],[0.0,255.0,80.0],[0.0,255.0,76.0],[0.0,255.0,63.0],[0.0,255.0,59.0],[0.0,255.0,55.0],[0.0,255.0,46.0],[0.0,255.0,42.0],[0.0,255.0,38.0],[0.0,255.0,25.0],[0.0,255.0,21.0],[0.0,255.0,16.0],[0.0,255.0,12.0],[0.0,255.0,8.0],[0.0,255.0,0.0],[8.0,255.0,0.0],[12.0,255.0,0.0],[21.0,255.0,0.0],[25.0,255.0,0.0],[29.0,255.0,0.0],[42.0,255.0,0.0],[46.0,255.0,0.0],[51.0,255.0,0.0],[55.0,255.0,0.0],[63.0,255.0,0.0],[67.0,255.0,0.0],[72.0,255.0,0.0],[76.0,255.0,0.0],[89.0,255.0,0.0],[93.0,255.0,0.0],[97.0,255.0,0.0],[110.0,255.0,0.0],[114.0,255.0,0.0],[119.0,255.0,0.0],[123.0,255.0,0.0],[131.0,255.0,0.0],[135.0,255.0,0.0],[140.0,255.0,0.0],[144.0,255.0,0.0],[153.0,255.0,0.0],[161.0,255.0,0.0],[165.0,255.0,0.0],[178.0,255.0,0.0],[182.0,255.0,0.0],[187.0,255.0,0.0],[191.0,255.0,0.0],[199.0,255.0,0.0],[203.0,255.0,0.0],[208.0,255.0,0.0],[212.0,255.0,0.0],[221.0,255.0,0.0],[225.0,255.0,0.0],[242.0,255.0,0.0],[246.0,255.0,0.0],[250.0,255.0,0.0],[255.0,255.0,0.0],[255.0,250.0,0.0],[255.0,242.0,0.0],[255.0,238.0,0.0],[255.0,233.0,0.0],[255.0,229.0,0.0],[255.0,221.0,0.0],[255.0,216.0,0.0],[255.0,212.0,0.0],[255.0,199.0,0.0],[255.0,191.0,0.0],[255.0,187.0,0.0],[255.0,178.0,0.0],[255.0,174.0,0.0],[255.0,170.0,0.0],[255.0,165.0,0.0],[255.0,161.0,0.0],[255.0,153.0,0.0],[255.0,148.0,0.0],[255.0,144.0,0.0],[255.0,131.0,0.0],[255.0,127.0,0.0],[255.0,119.0,0.0],[255.0,110.0,0.0],[255.0,106.0,0.0],[255.0,102.0,0.0],[255.0,97.0,0.0],[255.0,89.0,0.0],[255.0,85.0,0.0],[255.0,80.0,0.0],[255.0,76.0,0.0],[255.0,63.0,0.0],[255.0,59.0,0.0],[255.0,55.0,0.0],[255.0,51.0,0.0],[255.0,38.0,0.0],[255.0,34.0,0.0],[255.0,29.0,0.0],[255.0,21.0,0.0],[255.0,17.0,0.0],[255.0,12.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,255.0,255.0]],"MPL_coppe":[[0.004844,0.003064,0.001951],[0.014533,0.009191,0.005853],[0.024221,0.015318,0.009755],[0.03391,0.021445,0.013657],[0.043599,0.027572,0.017559],[0.053287,0.033699,0.021461],[0.062976,0.039826,0.025363],[0.072664,0.045953,0.029265],[0.082353,0.05208,0.033167],[0.087197,0.055144,0.035118],[0.10173,0.064334,0.040971],[0.106574,0.067398,0.042922],[0.121107,0.076588,0.048775],[0.125952,0.079652,0.050725],[0.140484,0.088842,0.056578],[0.145329,0.091906,0.058529],[0.159862,0.101096,0.064382],[0.16955,0.107224,0.068284],[0.174394,0.110287,0.070235],[0.188927,0.119478,0.076088],[0.198616,0.125605,0.07999],[0.208304,0.131732,0.083892],[0.213149,0.134795,0.085843],[0.227682,0.143986,0.091696],[0.23737,0.150113,0.095598],[0.247059,0.15624,0.0995],[0.251903,0.159304,0.101451],[0.266436,0.168494,0.107304],[0.276125,0.174621,0.111206],[0.285813,0.180748,0.115108],[0.290657,0.183812,0.117059],[0.30519,0.193002,0.122912],[0.314879,0.199129,0.126814],[0.324567,0.205256,0.130716],[0.334256,0.211384,0.134618],[0.343945,0.217511,0.13852],[0.353633,0.223638,0.142422],[0.358477,0.226701,0.144373],[0.37301,0.235892,0.150225],[0.382699,0.242019,0.154127],[0.392387,0.248146,0.158029],[0.402076,0.254273,0.161931],[0.411765,0.2604,0.165833],[0.421453,0.266527,0.169735],[0.431142,0.272654,0.173637],[0.435986,0.275718,0.175588],[0.450519,0.284908,0.181441],[0.460208,0.291035,0.185343],[0.469896,0.297162,0.189245],[0.479585,0.303289,0.193147],[0.489273,0.309416,0.197049],[0.498962,0.315544,0.200951],[0.50865,0.321671,0.204853],[0.513495,0.324734,0.206804],[0.528028,0.333925,0.212657],[0.537716,0.340052,0.216559],[0.547405,0.346179,0.220461],[0.557093,0.352306,0.224363],[0.566782,0.358433,0.228265],[0.57647,0.36456,0.232167],[0.586159,0.370687,0.236069],[0.591003,0.373751,0.23802],[0.605536,0.382941,0.243873],[0.615225,0.389068,0.247775],[0.624913,0.395195,0.251676],[0.634602,0.401322,0.255578],[0.644291,0.407449,0.25948],[0.653979,0.413576,0.263382],[0.663668,0.419704,0.267284],[0.673356,0.425831,0.271186],[0.683045,0.431958,0.275088],[0.692733,0.438085,0.27899],[0.702422,0.444212,0.282892],[0.712111,0.450339,0.286794],[0.721799,0.456466,0.290696],[0.726643,0.459529,0.292647],[0.741176,0.46872,0.2985],[0.750865,0.474847,0.302402],[0.760553,0.480974,0.306304],[0.770242,0.487101,0.310206],[0.779931,0.493228,0.314108],[0.789619,0.499355,0.31801],[0.799308,0.505482,0.321912],[0.808996,0.511609,0.325814],[0.818685,0.517736,0.329716],[0.828374,0.523864,0.333618],[0.838062,0.529991,0.33752],[0.847751,0.536118,0.341422],[0.857439,0.542245,0.345324],[0.867128,0.548372,0.349225],[0.876816,0.554499,0.353127],[0.881661,0.557562,0.355078],[0.896194,0.566753,0.360931],[0.905882,0.57288,0.364833],[0.915571,0.579007,0.368735],[0.925259,0.585134,0.372637],[0.934948,0.591261,0.376539],[0.944636,0.597388,0.380441],[0.954325,0.603515,0.384343],[0.964014,0.609642,0.388245],[0.973702,0.615769,0.392147],[0.983391,0.621896,0.396049],[0.993079,0.628024,0.399951],[1.0,0.634151,0.403853],[1.0,0.640278,0.407755],[1.0,0.646405,0.411657],[1.0,0.652532,0.415559],[1.0,0.655595,0.41751],[1.0,0.664786,0.423363],[1.0,0.670913,0.427265],[1.0,0.67704,0.431167],[1.0,0.683167,0.435069],[1.0,0.689294,0.438971],[1.0,0.695421,0.442873],[1.0,0.701548,0.446775],[1.0,0.707675,0.450676],[1.0,0.713802,0.454578],[1.0,0.719929,0.45848],[1.0,0.726056,0.462382],[1.0,0.732184,0.466284],[1.0,0.738311,0.470186],[1.0,0.744438,0.474088],[1.0,0.750565,0.47799],[1.0,0.753628,0.479941],[1.0,0.762819,0.485794],[1.0,0.768946,0.489696],[1.0,0.775073,0.493598],[1.0,0.7812,0.4975]],"precip4_diff_19lev":[[107.0,33.0,7.0],[181.0,59.0,33.0],[199.0,85.0,66.0],[205.0,105.0,90.0],[166.0,50.0,55.0],[173.0,64.0,88.0],[194.0,103.0,114.0],[217.0,154.0,159.0],[255.0,223.0,224.0],[254.0,254.0,254.0],[254.0,254.0,254.0],[223.0,255.0,249.0],[154.0,217.0,202.0],[103.0,194.0,163.0],[64.0,173.0,117.0],[50.0,166.0,150.0],[90.0,160.0,205.0],[66.0,146.0,199.0],[76.0,141.0,196.0],[7.0,47.0,107.0]],"precip2_15lev":[[255.0,255.0,255.0],[100.0,0.0,100.0],[175.0,0.0,175.0],[220.0,0.0,220.0],[50.0,50.0,200.0],[0.0,100.0,255.0],[0.0,150.0,150.0],[0.0,200.0,50.0],[100.0,255.0,0.0],[150.0,255.0,0.0],[200.0,255.0,50.0],[255.0,255.0,0.0],[255.0,200.0,0.0],[255.0,160.0,0.0],[255.0,125.0,0.0],[225.0,25.0,0.0]],"MPL_Greens":[[0.966413,0.987374,0.958201],[0.961984,0.985652,0.953033],[0.957555,0.983929,0.947866],[0.953126,0.982207,0.942699],[0.948697,0.980484,0.937532],[0.944268,0.978762,0.932364],[0.939839,0.97704,0.927197],[0.935409,0.975317,0.92203],[0.93098,0.973595,0.916863],[0.928766,0.972734,0.914279],[0.922122,0.97015,0.906528],[0.919908,0.969289,0.903945],[0.913264,0.966705,0.896194],[0.91105,0.965844,0.89361],[0.904406,0.96326,0.885859],[0.902191,0.962399,0.883276],[0.893887,0.959123,0.874002],[0.886505,0.956171,0.866128],[0.882814,0.954694,0.862191],[0.871742,0.950265,0.850381],[0.86436,0.947313,0.842507],[0.856978,0.94436,0.834633],[0.853287,0.942884,0.830696],[0.842215,0.938454,0.818885],[0.834833,0.935502,0.811011],[0.827451,0.932549,0.803137],[0.82376,0.931073,0.7992],[0.812687,0.926644,0.787389],[0.805306,0.923691,0.779516],[0.797924,0.920738,0.771642],[0.794233,0.919262,0.767705],[0.78316,0.914833,0.755894],[0.774548,0.911265,0.747251],[0.765198,0.907328,0.738147],[0.755848,0.903391,0.729043],[0.746498,0.899454,0.719939],[0.737147,0.895517,0.710834],[0.732472,0.893549,0.706282],[0.718447,0.887643,0.692626],[0.709097,0.883706,0.683522],[0.699746,0.879769,0.674418],[0.690396,0.875832,0.665313],[0.681046,0.871895,0.656209],[0.671696,0.867958,0.647105],[0.662345,0.864022,0.638001],[0.65767,0.862053,0.633449],[0.643645,0.856148,0.619792],[0.634295,0.852211,0.610688],[0.62376,0.847428,0.601584],[0.612687,0.842261,0.59248],[0.601615,0.837093,0.583376],[0.590542,0.831926,0.574271],[0.579469,0.826759,0.565167],[0.573933,0.824175,0.560615],[0.557324,0.816424,0.546959],[0.546251,0.811257,0.537855],[0.535179,0.80609,0.52875],[0.524106,0.800923,0.519646],[0.513033,0.795755,0.510542],[0.501961,0.790588,0.501438],[0.490888,0.785421,0.492334],[0.485352,0.782837,0.487782],[0.468743,0.775087,0.474125],[0.45767,0.769919,0.465021],[0.44549,0.764014,0.458131],[0.432941,0.757862,0.45198],[0.420392,0.751711,0.445829],[0.407843,0.745559,0.439677],[0.395294,0.739408,0.433526],[0.382745,0.733256,0.427374],[0.370196,0.727105,0.421223],[0.357647,0.720953,0.415071],[0.345098,0.714802,0.40892],[0.332549,0.708651,0.402768],[0.32,0.702499,0.396617],[0.313726,0.699423,0.393541],[0.294902,0.690196,0.384314],[0.282353,0.684045,0.378162],[0.269804,0.677893,0.372011],[0.257255,0.671742,0.365859],[0.248904,0.664191,0.359908],[0.241523,0.656317,0.354002],[0.234141,0.648443,0.348097],[0.226759,0.640569,0.342191],[0.219377,0.632695,0.336286],[0.211995,0.624821,0.330381],[0.204614,0.616947,0.324475],[0.197232,0.609073,0.31857],[0.18985,0.6012,0.312664],[0.182468,0.593326,0.306759],[0.175087,0.585452,0.300854],[0.171396,0.581515,0.297901],[0.160323,0.569704,0.289043],[0.152941,0.56183,0.283137],[0.145559,0.553956,0.277232],[0.138178,0.546082,0.271326],[0.129719,0.538639,0.265206],[0.121107,0.531257,0.259054],[0.112495,0.523875,0.252903],[0.103883,0.516494,0.246751],[0.095271,0.509112,0.2406],[0.086659,0.50173,0.234448],[0.078047,0.494348,0.228297],[0.069435,0.486967,0.222145],[0.060823,0.479585,0.215994],[0.052211,0.472203,0.209842],[0.043599,0.464821,0.203691],[0.039293,0.46113,0.200615],[0.026374,0.450058,0.191388],[0.017762,0.442676,0.185236],[0.00915,0.435294,0.179085],[0.000538,0.427912,0.172933],[0.0,0.417993,0.168627],[0.0,0.407905,0.164444],[0.0,0.397816,0.160261],[0.0,0.387728,0.156078],[0.0,0.377639,0.151895],[0.0,0.367551,0.147712],[0.0,0.357463,0.143529],[0.0,0.347374,0.139346],[0.0,0.337286,0.135163],[0.0,0.327197,0.13098],[0.0,0.317109,0.126797],[0.0,0.312065,0.124706],[0.0,0.296932,0.118431],[0.0,0.286844,0.114248],[0.0,0.276755,0.110065],[0.0,0.266667,0.105882]],"uniform":[[0.75,1.0,1.0],[0.5,1.0,1.0],[0.25,1.0,1.0],[0.0,1.0,1.0],[1.0,0.8333,1.0],[0.75,0.8333,1.0],[0.5,0.8333,1.0],[0.25,0.8333,1.0],[0.0,0.8333,1.0],[1.0,0.6667,1.0],[0.75,0.6667,1.0],[0.5,0.6667,1.0],[0.25,0.6667,1.0],[0.0,0.6667,1.0],[1.0,0.5,1.0],[0.75,0.5,1.0],[0.5,0.5,1.0],[0.25,0.5,1.0],[0.0,0.5,1.0],[1.0,0.3333,1.0],[0.75,0.3333,1.0],[0.5,0.3333,1.0],[0.25,0.3333,1.0],[0.0,0.3333,1.0],[1.0,0.1667,1.0],[0.75,0.1667,1.0],[0.5,0.1667,1.0],[0.25,0.1667,1.0],[0.0,0.1667,1.0],[1.0,0.0,1.0],[0.75,0.0,1.0],[0.5,0.0,1.0],[0.25,0.0,1.0],[0.0,0.0,1.0],[1.0,1.0,0.25],[0.75,1.0,0.25],[0.5,1.0,0.25],[0.25,1.0,0.25],[0.0,1.0,0.25],[1.0,0.8333,0.25],[0.75,0.8333,0.25],[0.5,0.8333,0.25],[0.25,0.8333,0.25],[0.0,0.8333,0.25],[1.0,0.6667,0.25],[0.75,0.6667,0.25],[0.5,0.6667,0.25],[0.25,0.6667,0.25],[0.0,0.6667,0.25],[1.0,0.5,0.25],[0.75,0.5,0.25],[0.5,0.5,0.25],[0.25,0.5,0.25],[0.0,0.5,0.25],[1.0,0.3333,0.25],[0.75,0.3333,0.25],[0.5,0.3333,0.25],[0.25,0.3333,0.25],[0.0,0.3333,0.25],[1.0,0.1667,0.25],[0.75,0.1667,0.25],[0.5,0.1667,0.25],[0.25,0.1667,0.25],[0.0,0.1667,0.25],[1.0,0.0,0.25],[0.75,0.0,0.25],[0.5,0.0,0.25],[0.25,0.0,0.25],[0.0,0.0,0.25],[1.0,1.0,0.5],[0.75,1.0,0.5],[0.5,1.0,0.5],[0.25,1.0,0.5],[0.0,1.0,0.5],[1.0,0.8333,0.5],[0.75,0.8333,0.5],[0.5,0.8333,0.5],[0.25,0.8333,0.5],[0.0,0.8333,0.5],[1.0,0.6667,0.5],[0.75,0.6667,0.5],[0.5,0.6667,0.5],[0.25,0.6667,0.5],[0.0,0.6667,0.5],[1.0,0.5,0.5],[0.75,0.5,0.5],[0.5,0.5,0.5],[0.25,0.5,0.5],[0.0,0.5,0.5],[1.0,0.3333,0.5],[0.75,0.3333,0.5],[0.5,0.3333,0.5],[0.25,0.3333,0.5],[0.0,0.3333,0.5],[1.0,0.1667,0.5],[0.75,0.1667,0.5],[0.5,0.1667,0.5],[0.25,0.1667,0.5],[0.0,0.1667,0.5],[1.0,0.0,0.5],[0.75,0.0,0.5],[0.5,0.0,0.5],[0.25,0.0,0.5],[0.0,0.0,0.5],[1.0,1.0,0.75],[0.75,1.0,0.75],[0.5,1.0,0.75],[0.25,1.0,0.75],[0.0,1.0,0.75],[1.0,0.8333,0.75],[0.75,0.8333,0.75],[0.5,0.8333,0.75],[0.25,0.8333,0.75],[0.0,0.8333,0.75],[1.0,0.6667,0.75],[0.75,0.6667,0.75],[0.5,0.6667,0.75],[0.25,0.6667,0.75],[0.0,0.6667,0.75],[1.0,0.5,0.75],[0.75,0.5,0.75],[0.5,0.5,0.75],[0.25,0.5,0.75],[0.0,0.5,0.75],[1.0,0.3333,0.75],[0.75,0.3333,0.75],[0.5,0.3333,0.75],[0.25,0.3333,0.75],[0.0,0.3333,0.75],[1.0,0.1667,0.75],[0.75,0.1667,0.75],[0.5,0.1667,0.75],[0.25,0.1667,0.75],[0.0,0.1667,0.75],[1.0,0.0,0.75],[0.75,0.0,0.75],[0.5,0.0,0.75],[0.25,0.0,0.75],[0.0,0.0,0.75],[1.0,1.0,0.0],[0.75,1.0,0.0],[0.5,1.0,0.0],[0.25,1.0,0.0],[0.0,1.0,0.0],[1.0,0.8333,0.0],[0.75,0.8333,0.0],[0.5,0.8333,0.0],[0.25,0.8333,0.0],[0.0,0.8333,0.0],[1.0,0.6667,0.0],[0.75,0.6667,0.0],[0.5,0.6667,0.0],[0.25,0.6667,0.0],[0.0,0.6667,0.0],[1.0,0.5,0.0],[0.75,0.5,0.0],[0.5,0.5,0.0],[0.25,0.5,0.0],[0.0,0.5,0.0],[1.0,0.3333,0.0],[0.75,0.3333,0.0],[0.5,0.3333,0.0],[0.25,0.3333,0.0],[0.0,0.3333,0.0],[1.0,0.1667,0.0],[0.75,0.1667,0.0],[0.5,0.1667,0.0],[0.25,0.1667,0.0],[0.0,0.1667,0.0],[1.0,0.0,0.0],[0.75,0.0,0.0],[0.5,0.0,0.0],[0.25,0.0,0.0]],"WhViBlGrYeOrReWh":[[255.0,255.0,255.0],[240.0,232.0,244.0],[224.0,209.0,233.0],[209.0,185.0,223.0],[194.0,162.0,212.0],[179.0,139.0,201.0],[163.0,116.0,190.0],[148.0,93.0,179.0],[133.0,70.0,168.0],[118.0,46.0,158.0],[102.0,23.0,147.0],[87.0,0.0,136.0],[79.0,0.0,135.0],[71.0,0.0,135.0],[63.0,0.0,134.0],[55.0,0.0,133.0],[47.0,0.0,132.0],[40.0,0.0,132.0],[32.0,0.0,131.0],[24.0,0.0,130.0],[16.0,0.0,129.0],[8.0,0.0,129.0],[0.0,0.0,128.0],[0.0,0.0,140.0],[0.0,0.0,151.0],[0.0,0.0,163.0],[0.0,0.0,174.0],[0.0,0.0,186.0],[0.0,0.0,197.0],[0.0,0.0,209.0],[0.0,0.0,220.0],[0.0,0.0,232.0],[0.0,0.0,243.0],[0.0,0.0,255.0],[0.0,23.0,232.0],[0.0,46.0,209.0],[0.0,70.0,185.0],[0.0,93.0,162.0],[0.0,116.0,139.0],[0.0,139.0,116.0],[0.0,162.0,93.0],[0.0,185.0,70.0],[0.0,209.0,46.0],[0.0,232.0,23.0],[0.0,255.0,0.0],[21.0,255.0,0.0],[43.0,255.0,0.0],[64.0,255.0,0.0],[85.0,255.0,0.0],[106.0,255.0,0.0],[128.0,255.0,0.0],[149.0,255.0,0.0],[170.0,255.0,0.0],[191.0,255.0,0.0],[213.0,255.0,0.0],[234.0,255.0,0.0],[255.0,255.0,0.0],[255.0,247.0,0.0],[255.0,239.0,0.0],[255.0,230.0,0.0],[255.0,222.0,0.0],[255.0,214.0,0.0],[255.0,206.0,0.0],[255.0,198.0,0.0],[255.0,190.0,0.0],[255.0,181.0,0.0],[255.0,173.0,0.0],[255.0,165.0,0.0],[243.0,150.0,0.0],[232.0,135.0,0.0],[220.0,120.0,0.0],[209.0,105.0,0.0],[197.0,90.0,0.0],[186.0,75.0,0.0],[174.0,60.0,0.0],[163.0,45.0,0.0],[151.0,30.0,0.0],[140.0,15.0,0.0],[128.0,0.0,0.0],[140.0,0.0,0.0],[151.0,0.0,0.0],[163.0,0.0,0.0],[174.0,0.0,0.0],[186.0,0.0,0.0],[197.0,0.0,0.0],[209.0,0.0,0.0],[220.0,0.0,0.0],[232.0,0.0,0.0],[243.0,0.0,0.0],[255.0,0.0,0.0],[255.0,23.0,23.0],[255.0,46.0,46.0],[255.0,70.0,70.0],[255.0,93.0,93.0],[255.0,116.0,116.0],[255.0,139.0,139.0],[255.0,162.0,162.0],[255.0,185.0,185.0],[255.0,209.0,209.0],[255.0,232.0,232.0],[255.0,255.0,255.0]],"ViBlGrWhYeOrRe":[[87.0,0.0,136.0],[81.0,0.0,144.0],[75.0,0.0,152.0],[70.0,0.0,160.0],[64.0,0.0,168.0],[58.0,0.0,176.0],[52.0,0.0,184.0],[46.0,0.0,192.0],[41.0,0.0,199.0],[35.0,0.0,207.0],[29.0,0.0,215.0],[23.0,0.0,223.0],[17.0,0.0,231.0],[12.0,0.0,239.0],[6.0,0.0,247.0],[0.0,0.0,255.0],[1.0,11.0,240.0],[1.0,22.0,225.0],[2.0,34.0,210.0],[2.0,45.0,195.0],[3.0,56.0,180.0],[3.0,67.0,165.0],[4.0,78.0,150.0],[4.0,90.0,135.0],[5.0,101.0,120.0],[5.0,112.0,105.0],[6.0,123.0,90.0],[6.0,134.0,75.0],[7.0,145.0,60.0],[7.0,157.0,45.0],[8.0,168.0,30.0],[8.0,179.0,15.0],[24.0,184.0,31.0],[41.0,189.0,47.0],[57.0,194.0,63.0],[74.0,199.0,79.0],[90.0,204.0,95.0],[107.0,209.0,111.0],[123.0,214.0,127.0],[140.0,220.0,143.0],[156.0,225.0,159.0],[173.0,230.0,175.0],[189.0,235.0,191.0],[206.0,240.0,207.0],[222.0,245.0,223.0],[239.0,250.0,239.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,238.0],[255.0,255.0,221.0],[255.0,255.0,204.0],[255.0,255.0,187.0],[255.0,255.0,170.0],[255.0,255.0,153.0],[255.0,255.0,136.0],[255.0,255.0,119.0],[255.0,255.0,102.0],[255.0,255.0,85.0],[255.0,255.0,68.0],[255.0,255.0,51.0],[255.0,255.0,34.0],[255.0,255.0,17.0],[255.0,255.0,0.0],[255.0,249.0,0.0],[255.0,244.0,0.0],[255.0,238.0,0.0],[255.0,233.0,0.0],[255.0,227.0,0.0],[255.0,221.0,0.0],[255.0,216.0,0.0],[255.0,210.0,0.0],[255.0,204.0,0.0],[255.0,199.0,0.0],[255.0,193.0,0.0],[255.0,188.0,0.0],[255.0,182.0,0.0],[255.0,176.0,0.0],[255.0,171.0,0.0],[255.0,165.0,0.0],[255.0,154.0,0.0],[255.0,143.0,0.0],[255.0,132.0,0.0],[255.0,121.0,0.0],[255.0,110.0,0.0],[255.0,99.0,0.0],[255.0,88.0,0.0],[255.0,77.0,0.0],[255.0,66.0,0.0],[255.0,55.0,0.0],[255.0,44.0,0.0],[255.0,33.0,0.0],[255.0,22.0,0.0],[255.0,11.0,0.0],[255.0,0.0,0.0]],"BlueDarkOrange18":[[0.0,102.0,102.0],[0.0,153.0,153.0],[0.0,204.0,204.0],[0.0,255.0,255.0],[51.0,255.0,255.0],[101.0,255.0,255.0],[153.0,255.0,255.0],[178.0,255.0,255.0],[203.0,255.0,255.0],[229.0,255.0,255.0],[255.0,229.0,203.0],[255.0,202.0,153.0],[255.0,173.0,101.0],[255.0,142.0,51.0],[255.0,110.0,0.0],[204.0,85.0,0.0],[153.0,61.0,0.0],[102.0,39.0,0.0]],"GMT_haxby":[[0.039216,0.0,0.47451],[0.156863,0.0,0.588235],[0.078431,0.019608,0.686275],[0.0,0.039216,0.784314],[0.0,0.098039,0.831373],[0.0,0.156863,0.878431],[0.101961,0.4,0.941176],[0.05098,0.505882,0.972549],[0.098039,0.686275,1.0],[0.196078,0.745098,1.0],[0.266667,0.792157,1.0],[0.380392,0.882353,0.941176],[0.415686,0.921569,0.882353],[0.486275,0.921569,0.784314],[0.541176,0.92549,0.682353],[0.67451,0.960784,0.658824],[0.803922,1.0,0.635294],[0.87451,0.960784,0.552941],[0.941176,0.92549,0.47451],[0.968627,0.843137,0.407843],[1.0,0.741176,0.341176],[1.0,0.627451,0.270588],[0.956863,0.458824,0.294118],[0.933333,0.313725,0.305882],[1.0,0.352941,0.352941],[1.0,0.486275,0.486275],[1.0,0.619608,0.619608],[0.960784,0.701961,0.682353],[1.0,0.768627,0.768627],[1.0,0.843137,0.843137],[1.0,0.921569,0.921569],[1.0,1.0,1.0]],"WhBlGrYeRe":[[255.0,255.0,255.0],[245.0,245.0,255.0],[235.0,235.0,255.0],[224.0,224.0,255.0],[214.0,214.0,255.0],[204.0,204.0,255.0],[194.0,194.0,255.0],[184.0,184.0,255.0],[173.0,173.0,255.0],[163.0,163.0,255.0],[153.0,153.0,255.0],[143.0,143.0,255.0],[133.0,133.0,255.0],[122.0,122.0,255.0],[112.0,112.0,255.0],[102.0,102.0,255.0],[92.0,92.0,255.0],[82.0,82.0,255.0],[71.0,71.0,255.0],[61.0,61.0,255.0],[51.0,51.0,255.0],[41.0,41.0,255.0],[31.0,31.0,255.0],[20.0,20.0,255.0],[10.0,10.0,255.0],[0.0,0.0,255.0],[0.0,7.0,245.0],[1.0,14.0,236.0],[1.0,21.0,226.0],[1.0,29.0,217.0],[2.0,36.0,207.0],[2.0,43.0,197.0],[2.0,50.0,188.0],[3.0,57.0,178.0],[3.0,64.0,169.0],[3.0,72.0,159.0],[4.0,79.0,149.0],[4.0,86.0,140.0],[4.0,93.0,130.0],[4.0,100.0,121.0],[5.0,107.0,111.0],[5.0,115.0,101.0],[5.0,122.0,92.0],[6.0,129.0,82.0],[6.0,136.0,73.0],[6.0,143.0,63.0],[7.0,150.0,53.0],[7.0,158.0,44.0],[7.0,165.0,34.0],[8.0,172.0,25.0],[8.0,179.0,15.0],[18.0,182.0,14.0],[29.0,185.0,14.0],[39.0,189.0,13.0],[49.0,192.0,13.0],[59.0,195.0,12.0],[70.0,198.0,11.0],[80.0,201.0,11.0],[90.0,204.0,10.0],[101.0,208.0,9.0],[111.0,211.0,9.0],[121.0,214.0,8.0],[132.0,217.0,8.0],[142.0,220.0,7.0],[152.0,223.0,6.0],[162.0,227.0,6.0],[173.0,230.0,5.0],[183.0,233.0,4.0],[193.0,236.0,4.0],[204.0,239.0,3.0],[214.0,242.0,3.0],[224.0,246.0,2.0],[234.0,249.0,1.0],[245.0,252.0,1.0],[255.0,255.0,0.0],[255.0,245.0,0.0],[255.0,235.0,0.0],[255.0,224.0,0.0],[255.0,214.0,0.0],[255.0,204.0,0.0],[255.0,194.0,0.0],[255.0,184.0,0.0],[255.0,173.0,0.0],[255.0,163.0,0.0],[255.0,153.0,0.0],[255.0,143.0,0.0],[255.0,133.0,0.0],[255.0,122.0,0.0],[255.0,112.0,0.0],[255.0,102.0,0.0],[255.0,92.0,0.0],[255.0,82.0,0.0],[255.0,71.0,0.0],[255.0,61.0,0.0],[255.0,51.0,0.0],[255.0,41.0,0.0],[255.0,31.0,0.0],[255.0,20.0,0.0],[255.0,10.0,0.0],[255.0,0.0,0.0]],"MPL_ocean":[[0.0,0.494118,0.003922],[0.0,0.482353,0.011765],[0.0,0.470588,0.019608],[0.0,0.458824,0.027451],[0.0,0.447059,0.035294],[0.0,0.435294,0.043137],[0.0,0.423529,0.05098],[0.0,0.411765,0.058824],[0.0,0.4,0.066667],[0.0,0.394118,0.070588],[0.0,0.376471,0.082353],[0.0,0.370588,0.086275],[0.0,0.352941,0.098039],[0.0,0.347059,0.101961],[0.0,0.329412,0.113725],[0.0,0.323529,0.117647],[0.0,0.305882,0.129412],[0.0,0.294118,0.137255],[0.0,0.288235,0.141176],[0.0,0.270588,0.152941],[0.0,0.258824,0.160784],[0.0,0.247059,0.168627],[0.0,0.241176,0.172549],[0.0,0.223529,0.184314],[0.0,0.211765,0.192157],[0.0,0.2,0.2],[0.0,0.194118,0.203922],[0.0,0.176471,0.215686],[0.0,0.164706,0.223529],[0.0,0.152941,0.231373],[0.0,0.147059,0.235294],[0.0,0.129412,0.247059],[0.0,0.117647,0.254902],[0.0,0.105882,0.262745],[0.0,0.094118,0.270588],[0.0,0.082353,0.278431],[0.0,0.070588,0.286275],[0.0,0.064706,0.290196],[0.0,0.047059,0.301961],[0.0,0.035294,0.309804],[0.0,0.023529,0.317647],[0.0,0.011765,0.32549],[0.0,0.0,0.333333],[0.0,0.011765,0.341176],[0.0,0.023529,0.34902],[0.0,0.029412,0.352941],[0.0,0.047059,0.364706],[0.0,0.058824,0.372549],[0.0,0.070588,0.380392],[0.0,0.082353,0.388235],[0.0,0.094118,0.396078],[0.0,0.105882,0.403922],[0.0,0.117647,0.411765],[0.0,0.123529,0.415686],[0.0,0.141176,0.427451],[0.0,0.152941,0.435294],[0.0,0.164706,0.443137],[0.0,0.176471,0.45098],[0.0,0.188235,0.458824],[0.0,0.2,0.466667],[0.0,0.211765,0.47451],[0.0,0.217647,0.478431],[0.0,0.235294,0.490196],[0.0,0.247059,0.498039],[0.0,0.258824,0.505882],[0.0,0.270588,0.513725],[0.0,0.282353,0.521569],[0.0,0.294118,0.529412],[0.0,0.305882,0.537255],[0.0,0.317647,0.545098],[0.0,0.329412,0.552941],[0.0,0.341176,0.560784],[0.0,0.352941,0.568627],[0.0,0.364706,0.576471],[0.0,0.376471,0.584314],[0.0,0.382353,0.588235],[0.0,0.4,0.6],[0.0,0.411765,0.607843],[0.0,0.423529,0.615686],[0.0,0.435294,0.623529],[0.0,0.447059,0.631373],[0.0,0.458824,0.639216],[0.0,0.470588,0.647059],[0.0,0.482353,0.654902],[0.0,0.494118,0.662745],[0.011765,0.505882,0.670588],[0.035294,0.517647,0.678431],[0.058824,0.529412,0.686275],[0.082353,0.541176,0.694118],[0.105882,0.552941,0.701961],[0.129412,0.564706,0.709804],[0.141176,0.570588,0.713725],[0.176471,0.588235,0.72549],[0.2,0.6,0.733333],[0.223529,0.611765,0.741176],[0.247059,0.623529,0.74902],[0.270588,0.635294,0.756863],[0.294118,0.647059,0.764706],[0.317647,0.658824,0.772549],[0.341176,0.670588,0.780392],[0.364706,0.682353,0.788235],[0.388235,0.694118,0.796078],[0.411765,0.705882,0.803922],[0.435294,0.717647,0.811765],[0.458824,0.729412,0.819608],[0.482353,0.741176,0.827451],[0.505882,0.752941,0.835294],[0.517647,0.758824,0.839216],[0.552941,0.776471,0.85098],[0.576471,0.788235,0.858824],[0.6,0.8,0.866667],[0.623529,0.811765,0.87451],[0.647059,0.823529,0.882353],[0.670588,0.835294,0.890196],[0.694118,0.847059,0.898039],[0.717647,0.858824,0.905882],[0.741176,0.870588,0.913725],[0.764706,0.882353,0.921569],[0.788235,0.894118,0.929412],[0.811765,0.905882,0.937255],[0.835294,0.917647,0.945098],[0.858824,0.929412,0.952941],[0.882353,0.941176,0.960784],[0.894118,0.947059,0.964706],[0.929412,0.964706,0.976471],[0.952941,0.976471,0.984314],[0.976471,0.988235,0.992157],[1.0,1.0,1.0]],"gsltod":[[0.96875,0.96875,0.96875],[0.9375,0.9375,0.9375],[0.90625,0.90625,0.90625],[0.875,0.875,0.875],[0.84375,0.84375,0.84375],[0.8125,0.8125,0.8125],[0.78125,0.78125,0.78125],[0.75,0.75,0.75],[0.71875,0.71875,0.71875],[0.6875,0.6875,0.6875],[0.65625,0.65625,0.65625],[0.625,0.625,0.625],[0.59375,0.59375,0.59375],[0.5625,0.5625,0.5625],[0.53125,0.53125,0.53125],[0.5,0.5,0.5],[0.46875,0.46875,0.46875],[0.4375,0.4375,0.4375],[0.40625,0.40625,0.40625],[0.375,0.375,0.375],[0.34375,0.34375,0.34375],[0.3125,0.3125,0.3125],[0.28125,0.28125,0.28125],[0.25,0.25,0.25],[0.21875,0.21875,0.21875],[0.1875,0.1875,0.1875],[0.15625,0.15625,0.15625],[0.125,0.125,0.125],[0.09375,0.09375,0.09375],[0.0625,0.0625,0.0625],[0.03125,0.03125,0.03125]],"rada":[[0.0,255.0,255.0],[0.0,157.0,255.0],[0.0,0.0,255.0],[9.0,130.0,175.0],[0.0,255.0,0.0],[8.0,175.0,20.0],[255.0,214.0,0.0],[255.0,152.0,0.0],[255.0,0.0,0.0],[221.0,0.0,27.0],[188.0,0.0,54.0],[121.0,0.0,109.0],[121.0,51.0,160.0],[195.0,163.0,212.0],[255.0,255.0,255.0]],"MPL_Accent":[[0.504821,0.785329,0.50719],[0.518385,0.779516,0.52549],[0.531949,0.773702,0.543791],[0.545513,0.767889,0.562092],[0.559077,0.762076,0.580392],[0.572641,0.756263,0.598693],[0.586205,0.75045,0.616993],[0.599769,0.744637,0.635294],[0.613333,0.738824,0.653595],[0.620115,0.735917,0.662745],[0.640461,0.727197,0.690196],[0.647243,0.724291,0.699346],[0.667589,0.715571,0.726797],[0.674371,0.712664,0.735948],[0.694717,0.703945,0.763399],[0.701499,0.701038,0.772549],[0.721845,0.692318,0.8],[0.735409,0.686505,0.818301],[0.742191,0.683599,0.827451],[0.762537,0.687336,0.809781],[0.776102,0.691211,0.792987],[0.789666,0.695087,0.776194],[0.796448,0.697024,0.767797],[0.816794,0.702837,0.742607],[0.830358,0.706713,0.725813],[0.843922,0.710588,0.70902],[0.850704,0.712526,0.700623],[0.87105,0.718339,0.675433],[0.884614,0.722215,0.658639],[0.898178,0.72609,0.641845],[0.90496,0.728028,0.633449],[0.925306,0.733841,0.608258],[0.93887,0.737716,0.591465],[0.952434,0.741592,0.574671],[0.965998,0.745467,0.557878],[0.979562,0.749343,0.541084],[0.992188,0.75391,0.525782],[0.992403,0.760692,0.527828],[0.993049,0.781038,0.533964],[0.993479,0.794602,0.538055],[0.99391,0.808166,0.542145],[0.994341,0.82173,0.546236],[0.994771,0.835294,0.550327],[0.995202,0.848858,0.554418],[0.995632,0.862422,0.558508],[0.995848,0.869204,0.560554],[0.996494,0.88955,0.56669],[0.996924,0.903114,0.57078],[0.997355,0.916678,0.574871],[0.997785,0.930242,0.578962],[0.998216,0.943806,0.583053],[0.998647,0.95737,0.587143],[0.999077,0.970934,0.591234],[0.999293,0.977716,0.59328],[0.999938,0.998062,0.599416],[0.963276,0.972872,0.604245],[0.920431,0.941223,0.609196],[0.877586,0.909573,0.614148],[0.83474,0.877924,0.6191],[0.791895,0.846275,0.624052],[0.74905,0.814625,0.629004],[0.727628,0.7988,0.63148],[0.66336,0.751326,0.638908],[0.620515,0.719677,0.64386],[0.57767,0.688028,0.648812],[0.534825,0.656378,0.653764],[0.49198,0.624729,0.658716],[0.449135,0.59308,0.663668],[0.40629,0.56143,0.66862],[0.363445,0.529781,0.673572],[0.3206,0.498131,0.678524],[0.277755,0.466482,0.683476],[0.23491,0.434833,0.688428],[0.245075,0.408858,0.683414],[0.284691,0.386036,0.672864],[0.304498,0.374625,0.667589],[0.363922,0.340392,0.651765],[0.403537,0.31757,0.641215],[0.443153,0.294748,0.630665],[0.482768,0.271926,0.620115],[0.522384,0.249104,0.609566],[0.561999,0.226282,0.599016],[0.601615,0.20346,0.588466],[0.64123,0.180638,0.577916],[0.680846,0.157816,0.567366],[0.720461,0.134994,0.556817],[0.760077,0.112172,0.546267],[0.799692,0.08935,0.535717],[0.839308,0.066528,0.525167],[0.878923,0.043706,0.514617],[0.918539,0.020884,0.504068],[0.938347,0.009473,0.498793],[0.926105,0.035217,0.466052],[0.915556,0.054379,0.44366],[0.905006,0.073541,0.421269],[0.894456,0.092703,0.398877],[0.883906,0.111865,0.376486],[0.873356,0.131027,0.354095],[0.862807,0.150188,0.331703],[0.852257,0.16935,0.309312],[0.841707,0.188512,0.28692],[0.831157,0.207674,0.264529],[0.820607,0.226836,0.242138],[0.810058,0.245998,0.219746],[0.799508,0.26516,0.197355],[0.788958,0.284321,0.174963],[0.778408,0.303483,0.152572],[0.773133,0.313064,0.141376],[0.757309,0.341807,0.107789],[0.744914,0.35737,0.093841],[0.725752,0.359739,0.11085],[0.70659,0.362107,0.127859],[0.687428,0.364475,0.144867],[0.668266,0.366844,0.161876],[0.649104,0.369212,0.178885],[0.629942,0.37158,0.195894],[0.61078,0.373948,0.212903],[0.591619,0.376317,0.229912],[0.572457,0.378685,0.24692],[0.553295,0.381053,0.263929],[0.534133,0.383422,0.280938],[0.514971,0.38579,0.297947],[0.495809,0.388158,0.314956],[0.486228,0.389343,0.32346],[0.457486,0.392895,0.348973],[0.438324,0.395263,0.365982],[0.419162,0.397632,0.382991],[0.4,0.4,0.4]],"gsdtol":[[0.03125,0.03125,0.03125],[0.0625,0.0625,0.0625],[0.09375,0.09375,0.09375],[0.125,0.125,0.125],[0.15625,0.15625,0.15625],[0.1875,0.1875,0.1875],[0.21875,0.21875,0.21875],[0.25,0.25,0.25],[0.28125,0.28125,0.28125],[0.3125,0.3125,0.3125],[0.34375,0.34375,0.34375],[0.375,0.375,0.375],[0.40625,0.40625,0.40625],[0.4375,0.4375,0.4375],[0.46875,0.46875,0.46875],[0.5,0.5,0.5],[0.53125,0.53125,0.53125],[0.5625,0.5625,0.5625],[0.59375,0.59375,0.59375],[0.625,0.625,0.625],[0.65625,0.65625,0.65625],[0.6875,0.6875,0.6875],[0.71875,0.71875,0.71875],[0.75,0.75,0.75],[0.78125,0.78125,0.78125],[0.8125,0.8125,0.8125],[0.84375,0.84375,0.84375],[0.875,0.875,0.875],[0.90625,0.90625,0.90625],[0.9375,0.9375,0.9375],[0.96875,0.96875,0.96875]],"MPL_terrain":[[0.194771,0.210458,0.610458],[0.184314,0.231373,0.631373],[0.173856,0.252288,0.652288],[0.163399,0.273203,0.673203],[0.152941,0.294118,0.694118],[0.142484,0.315033,0.715033],[0.132026,0.335948,0.735948],[0.121569,0.356863,0.756863],[0.111111,0.377778,0.777778],[0.105882,0.388235,0.788235],[0.090196,0.419608,0.819608],[0.084967,0.430065,0.830065],[0.069281,0.461438,0.861438],[0.064052,0.471895,0.871895],[0.048366,0.503268,0.903268],[0.043137,0.513725,0.913725],[0.027451,0.545098,0.945098],[0.016993,0.566013,0.966013],[0.011765,0.576471,0.976471],[0.0,0.605882,0.982353],[0.0,0.621569,0.935294],[0.0,0.637255,0.888235],[0.0,0.645098,0.864706],[0.0,0.668627,0.794118],[0.0,0.684314,0.747059],[0.0,0.7,0.7],[0.0,0.707843,0.676471],[0.0,0.731373,0.605882],[0.0,0.747059,0.558824],[0.0,0.762745,0.511765],[0.0,0.770588,0.488235],[0.0,0.794118,0.417647],[0.019608,0.803922,0.403922],[0.05098,0.810196,0.410196],[0.082353,0.816471,0.416471],[0.113725,0.822745,0.422745],[0.145098,0.82902,0.42902],[0.160784,0.832157,0.432157],[0.207843,0.841569,0.441569],[0.239216,0.847843,0.447843],[0.270588,0.854118,0.454118],[0.301961,0.860392,0.460392],[0.333333,0.866667,0.466667],[0.364706,0.872941,0.472941],[0.396078,0.879216,0.479216],[0.411765,0.882353,0.482353],[0.458824,0.891765,0.491765],[0.490196,0.898039,0.498039],[0.521569,0.904314,0.504314],[0.552941,0.910588,0.510588],[0.584314,0.916863,0.516863],[0.615686,0.923137,0.523137],[0.647059,0.929412,0.529412],[0.662745,0.932549,0.532549],[0.709804,0.941961,0.541961],[0.741176,0.948235,0.548235],[0.772549,0.95451,0.55451],[0.803922,0.960784,0.560784],[0.835294,0.967059,0.567059],[0.866667,0.973333,0.573333],[0.898039,0.979608,0.579608],[0.913725,0.982745,0.582745],[0.960784,0.992157,0.592157],[0.992157,0.998431,0.598431],[0.988235,0.984941,0.593647],[0.972549,0.964863,0.585176],[0.956863,0.944784,0.576706],[0.941176,0.924706,0.568235],[0.92549,0.904627,0.559765],[0.909804,0.884549,0.551294],[0.894118,0.864471,0.542824],[0.878431,0.844392,0.534353],[0.862745,0.824314,0.525882],[0.847059,0.804235,0.517412],[0.831373,0.784157,0.508941],[0.823529,0.774118,0.504706],[0.8,0.744,0.492],[0.784314,0.723922,0.483529],[0.768627,0.703843,0.475059],[0.752941,0.683765,0.466588],[0.737255,0.663686,0.458118],[0.721569,0.643608,0.449647],[0.705882,0.623529,0.441176],[0.690196,0.603451,0.432706],[0.67451,0.583373,0.424235],[0.658824,0.563294,0.415765],[0.643137,0.543216,0.407294],[0.627451,0.523137,0.398824],[0.611765,0.503059,0.390353],[0.596078,0.48298,0.381882],[0.580392,0.462902,0.373412],[0.572549,0.452863,0.369176],[0.54902,0.422745,0.356471],[0.533333,0.402667,0.348],[0.517647,0.382588,0.339529],[0.501961,0.36251,0.331059],[0.513725,0.377569,0.348392],[0.529412,0.397647,0.369412],[0.545098,0.417725,0.390431],[0.560784,0.437804,0.411451],[0.576471,0.457882,0.432471],[0.592157,0.477961,0.45349],[0.607843,0.498039,0.47451],[0.623529,0.518118,0.495529],[0.639216,0.538196,0.516549],[0.654902,0.558275,0.537569],[0.670588,0.578353,0.558588],[0.678431,0.588392,0.569098],[0.701961,0.61851,0.600627],[0.717647,0.638588,0.621647],[0.733333,0.658667,0.642667],[0.74902,0.678745,0.663686],[0.764706,0.698824,0.684706],[0.780392,0.718902,0.705725],[0.796078,0.73898,0.726745],[0.811765,0.759059,0.747765],[0.827451,0.779137,0.768784],[0.843137,0.799216,0.789804],[0.858824,0.819294,0.810824],[0.87451,0.839373,0.831843],[0.890196,0.859451,0.852863],[0.905882,0.879529,0.873882],[0.921569,0.899608,0.894902],[0.929412,0.909647,0.905412],[0.952941,0.939765,0.936941],[0.968627,0.959843,0.957961],[0.984314,0.979922,0.97898],[1.0,1.0,1.0]],"GMT_seis":[[0.672506,0.0,0.0],[0.684183,0.0,0.0],[0.695861,0.0,0.0],[0.707539,0.0,0.0],[0.719217,0.0,0.0],[0.730895,0.0,0.0],[0.742573,0.0,0.0],[0.754251,0.0,0.0],[0.765929,0.0,0.0],[0.777607,0.0,0.0],[0.789284,0.0,0.0],[0.800962,0.0,0.0],[0.81264,0.0,0.0],[0.824318,0.0,0.0],[0.835996,0.0,0.0],[0.847674,0.0,0.0],[0.859352,0.0,0.0],[0.87103,0.0,0.0],[0.882707,0.0,0.0],[0.894385,0.0,0.0],[0.906063,0.0,0.0],[0.917741,0.0,0.0],[0.929419,0.0,0.0],[0.941097,0.0,0.0],[0.952775,0.0,0.0],[0.964453,0.0,0.0],[0.97613,0.0,0.0],[0.987808,0.0,0.0],[0.999486,0.0,0.0],[1.0,0.011214,0.0],[1.0,0.022945,0.0],[1.0,0.034675,0.0],[1.0,0.046406,0.0],[1.0,0.058136,0.0],[1.0,0.069867,0.0],[1.0,0.081597,0.0],[1.0,0.093328,0.0],[1.0,0.105058,0.0],[1.0,0.116789,0.0],[1.0,0.128519,0.0],[1.0,0.14025,0.0],[1.0,0.15198,0.0],[1.0,0.163711,0.0],[1.0,0.175441,0.0],[1.0,0.187172,0.0],[1.0,0.198902,0.0],[1.0,0.210633,0.0],[1.0,0.222363,0.0],[1.0,0.234093,0.0],[1.0,0.245824,0.0],[1.0,0.257554,0.0],[1.0,0.269285,0.0],[1.0,0.281015,0.0],[1.0,0.292746,0.0],[1.0,0.304476,0.0],[1.0,0.316207,0.0],[1.0,0.327937,0.0],[1.0,0.339668,0.0],[1.0,0.351398,0.0],[1.0,0.363129,0.0],[1.0,0.374859,0.0],[1.0,0.38659,0.0],[1.0,0.39832,0.0],[1.0,0.410051,0.0],[1.0,0.421781,0.0],[1.0,0.433512,0.0],[1.0,0.445242,0.0],[1.0,0.456973,0.0],[1.0,0.468703,0.0],[1.0,0.480434,0.0],[1.0,0.492164,0.0],[1.0,0.503895,0.0],[1.0,0.515625,0.0],[1.0,0.527355,0.0],[1.0,0.539086,0.0],[1.0,0.550816,0.0],[1.0,0.562547,0.0],[1.0,0.574277,0.0],[1.0,0.586008,0.0],[1.0,0.597738,0.0],[1.0,0.609469,0.0],[1.0,0.621199,0.0],[1.0,0.63293,0.0],[1.0,0.64466,0.0],[1.0,0.656391,0.0],[1.0,0.668121,0.0],[1.0,0.679852,0.0],[1.0,0.691582,0.0],[1.0,0.703313,0.0],[1.0,0.715043,0.0],[1.0,0.726774,0.0],[1.0,0.738504,0.0],[1.0,0.750235,0.0],[1.0,0.761965,0.0],[1.0,0.773696,0.0],[1.0,0.785426,0.0],[1.0,0.797157,0.0],[1.0,0.808887,0.0],[1.0,0.820617,0.0],[1.0,0.832348,0.0],[1.0,0.844078,0.0],[1.0,0.855809,0.0],[1.0,0.867539,0.0],[1.0,0.87927,0.0],[1.0,0.891,0.0],[1.0,0.902731,0.0],[1.0,0.914461,0.0],[1.0,0.926192,0.0],[1.0,0.937922,0.0],[1.0,0.949653,0.0],[1.0,0.961383,0.0],[1.0,0.973114,0.0],[1.0,0.984844,0.0],[1.0,0.996575,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[1.0,1.0,0.0],[0.993351,1.0,0.001209],[0.97058,1.0,0.005349],[0.947809,1.0,0.009489],[0.925038,1.0,0.013629],[0.902267,1.0,0.01777],[0.879496,1.0,0.02191],[0.856725,1.0,0.02605],[0.833954,1.0,0.03019],[0.811183,1.0,0.03433],[0.788412,1.0,0.03847],[0.765642,1.0,0.042611],[0.742871,1.0,0.046751],[0.7201,1.0,0.050891],[0.697329,1.0,0.055031],[0.674558,1.0,0.059171],[0.651787,1.0,0.063311],[0.629016,1.0,0.067452],[0.606245,1.0,0.071592],[0.583474,1.0,0.075732],[0.560703,1.0,0.079872],[0.537932,1.0,0.084012],[0.515161,1.0,0.088152],[0.49239,1.0,0.092293],[0.469619,1.0,0.096433],[0.446849,1.0,0.100573],[0.424078,1.0,0.104713],[0.401307,1.0,0.108853],[0.378536,1.0,0.112994],[0.355765,1.0,0.117134],[0.342061,0.998187,0.127318],[0.32964,0.996117,0.138359],[0.31722,0.994046,0.149399],[0.304799,0.991976,0.16044],[0.292379,0.989906,0.17148],[0.279958,0.987836,0.182521],[0.267538,0.985766,0.193561],[0.255117,0.983696,0.204602],[0.242697,0.981626,0.215642],[0.230276,0.979556,0.226683],[0.217856,0.977486,0.237723],[0.205435,0.975416,0.248763],[0.193015,0.973346,0.259804],[0.180594,0.971276,0.270844],[0.168174,0.969205,0.281885],[0.155753,0.967135,0.292925],[0.143333,0.965065,0.303966],[0.130912,0.962995,0.315006],[0.118492,0.960925,0.326047],[0.106071,0.958855,0.337087],[0.093651,0.956785,0.348128],[0.08123,0.954715,0.359168],[0.06881,0.952645,0.370208],[0.056389,0.950575,0.381249],[0.043969,0.948505,0.392289],[0.031548,0.946434,0.40333],[0.019128,0.944364,0.41437],[0.006707,0.942294,0.425411],[0.0,0.931019,0.440578],[0.0,0.908938,0.460588],[0.0,0.886857,0.480599],[0.0,0.864777,0.50061],[0.0,0.842696,0.520621],[0.0,0.820615,0.540632],[0.0,0.798534,0.560642],[0.0,0.776453,0.580653],[0.0,0.754372,0.600664],[0.0,0.732291,0.620675],[0.0,0.71021,0.640686],[0.0,0.688129,0.660697],[0.0,0.666048,0.680707],[0.0,0.643967,0.700718],[0.0,0.621887,0.720729],[0.0,0.599806,0.74074],[0.0,0.577725,0.760751],[0.0,0.555644,0.780761],[0.0,0.533563,0.800772],[0.0,0.511482,0.820783],[0.0,0.489401,0.840794],[0.0,0.46732,0.860805],[0.0,0.445239,0.880816],[0.0,0.423158,0.900826],[0.0,0.401078,0.920837],[0.0,0.378997,0.940848],[0.0,0.356916,0.960859],[0.0,0.334835,0.98087],[0.0,0.313242,0.999698],[0.0,0.302251,0.992828],[0.0,0.29126,0.985959],[0.0,0.280269,0.97909],[0.0,0.269278,0.97222],[0.0,0.258287,0.965351],[0.0,0.247296,0.958482],[0.0,0.236305,0.951612],[0.0,0.225314,0.944743],[0.0,0.214323,0.937874],[0.0,0.203332,0.931004],[0.0,0.192342,0.924135],[0.0,0.181351,0.917266],[0.0,0.17036,0.910396],[0.0,0.159369,0.903527],[0.0,0.148378,0.896658],[0.0,0.137387,0.889788],[0.0,0.126396,0.882919],[0.0,0.115405,0.87605],[0.0,0.104414,0.86918],[0.0,0.093423,0.862311],[0.0,0.082432,0.855442],[0.0,0.071441,0.848572],[0.0,0.06045,0.841703],[0.0,0.049459,0.834834],[0.0,0.038468,0.827964],[0.0,0.027477,0.821095],[0.0,0.016486,0.814226],[0.0,0.005495,0.807356]],"helix":[[0.0,0.0,0.0],[0.0,0.0,0.0],[1.0,1.0,0.0],[2.0,1.0,0.0],[3.0,2.0,0.0],[4.0,2.0,0.0],[5.0,3.0,0.0],[6.0,4.0,0.0],[7.0,4.0,0.0],[7.0,5.0,0.0],[8.0,6.0,0.0],[9.0,6.0,0.0],[10.0,7.0,0.0],[10.0,8.0,0.0],[11.0,9.0,0.0],[12.0,10.0,0.0],[12.0,11.0,0.0],[13.0,11.0,0.0],[14.0,12.0,0.0],[14.0,13.0,0.0],[15.0,14.0,0.0],[15.0,15.0,0.0],[16.0,16.0,0.0],[16.0,17.0,0.0],[17.0,18.0,0.0],[17.0,19.0,0.0],[18.0,20.0,0.0],[18.0,21.0,0.0],[18.0,22.0,0.0],[19.0,23.0,0.0],[19.0,25.0,0.0],[19.0,26.0,0.0],[20.0,27.0,0.0],[20.0,28.0,0.0],[20.0,29.0,0.0],[20.0,30.0,0.0],[20.0,31.0,1.0],[21.0,33.0,1.0],[21.0,34.0,1.0],[21.0,35.0,1.0],[21.0,36.0,2.0],[21.0,37.0,2.0],[21.0,39.0,2.0],[21.0,40.0,2.0],[21.0,41.0,3.0],[21.0,42.0,3.0],[21.0,43.0,4.0],[21.0,44.0,4.0],[20.0,46.0,4.0],[20.0,47.0,5.0],[20.0,48.0,5.0],[20.0,49.0,6.0],[20.0,50.0,7.0],[19.0,52.0,7.0],[19.0,53.0,8.0],[19.0,54.0,8.0],[18.0,55.0,9.0],[18.0,56.0,10.0],[18.0,57.0,10.0],[17.0,58.0,11.0],[17.0,59.0,12.0],[17.0,60.0,13.0],[16.0,61.0,14.0],[16.0,62.0,15.0],[16.0,63.0,15.0],[15.0,64.0,16.0],[15.0,65.0,17.0],[14.0,66.0,18.0],[14.0,67.0,19.0],[13.0,68.0,21.0],[13.0,69.0,22.0],[12.0,70.0,23.0],[12.0,71.0,24.0],[11.0,72.0,25.0],[11.0,72.0,26.0],[10.0,73.0,28.0],[10.0,74.0,29.0],[9.0,75.0,30.0],[9.0,75.0,32.0],[8.0,76.0,33.0],[8.0,76.0,34.0],[7.0,77.0,36.0],[7.0,78.0,37.0],[6.0,78.0,39.0],[6.0,79.0,40.0],[5.0,79.0,42.0],[5.0,79.0,43.0],[4.0,80.0,45.0],[4.0,80.0,46.0],[4.0,80.0,48.0],[3.0,81.0,50.0],[3.0,81.0,51.0],[2.0,81.0,53.0],[2.0,81.0,55.0],[2.0,81.0,56.0],[1.0,81.0,58.0],[1.0,81.0,60.0],[1.0,81.0,62.0],[1.0,81.0,63.0],[0.0,81.0,65.0],[0.0,81.0,67.0],[0.0,81.0,69.0],[0.0,81.0,71.0],[0.0,81.0,73.0],[0.0,80.0,74.0],[0.0,80.0,76.0],[0.0,80.0,78.0],[0.0,79.0,80.0],[0.0,79.0,82.0],[0.0,79.0,84.0],[0.0,78.0,86.0],[0.0,77.0,88.0],[0.0,77.0,90.0],[0.0,76.0,91.0],[0.0,76.0,93.0],[1.0,75.0,95.0],[1.0,74.0,97.0],[1.0,74.0,99.0],[2.0,73.0,101.0],[2.0,72.0,103.0],[3.0,71.0,105.0],[3.0,70.0,106.0],[4.0,69.0,108.0],[4.0,69.0,110.0],[5.0,68.0,112.0],[6.0,67.0,114.0],[6.0,66.0,115.0],[7.0,65.0,117.0],[8.0,64.0,119.0],[9.0,62.0,121.0],[10.0,61.0,122.0],[11.0,60.0,124.0],[12.0,59.0,126.0],[13.0,58.0,127.0],[14.0,57.0,129.0],[15.0,55.0,130.0],[16.0,54.0,132.0],[18.0,53.0,133.0],[19.0,52.0,135.0],[20.0,50.0,136.0],[22.0,49.0,138.0],[23.0,48.0,139.0],[25.0,47.0,140.0],[26.0,45.0,142.0],[28.0,44.0,143.0],[29.0,43.0,144.0],[31.0,41.0,145.0],[33.0,40.0,146.0],[34.0,39.0,147.0],[36.0,37.0,148.0],[38.0,36.0,149.0],[40.0,35.0,150.0],[42.0,33.0,151.0],[44.0,32.0,152.0],[46.0,31.0,153.0],[48.0,29.0,154.0],[50.0,28.0,154.0],[52.0,27.0,155.0],[54.0,25.0,156.0],[57.0,24.0,156.0],[59.0,23.0,157.0],[61.0,22.0,157.0],[63.0,20.0,158.0],[66.0,19.0,158.0],[68.0,18.0,158.0],[71.0,17.0,158.0],[73.0,16.0,159.0],[75.0,15.0,159.0],[78.0,14.0,159.0],[81.0,13.0,159.0],[83.0,12.0,159.0],[86.0,11.0,159.0],[88.0,10.0,159.0],[91.0,9.0,158.0],[94.0,8.0,158.0],[96.0,7.0,158.0],[99.0,6.0,157.0],[102.0,5.0,157.0],[104.0,5.0,156.0],[107.0,4.0,156.0],[110.0,3.0,155.0],[113.0,3.0,155.0],[115.0,2.0,154.0],[118.0,2.0,153.0],[121.0,1.0,152.0],[124.0,1.0,151.0],[127.0,1.0,150.0],[129.0,0.0,149.0],[132.0,0.0,148.0],[135.0,0.0,147.0],[138.0,0.0,146.0],[141.0,0.0,145.0],[143.0,0.0,143.0],[146.0,0.0,142.0],[149.0,0.0,141.0],[152.0,0.0,139.0],[155.0,0.0,138.0],[157.0,0.0,136.0],[160.0,1.0,135.0],[163.0,1.0,133.0],[165.0,1.0,132.0],[168.0,2.0,130.0],[171.0,3.0,128.0],[173.0,3.0,126.0],[176.0,4.0,125.0],[179.0,5.0,123.0],[181.0,6.0,121.0],[184.0,6.0,119.0],[186.0,7.0,117.0],[188.0,8.0,115.0],[191.0,10.0,113.0],[193.0,11.0,111.0],[196.0,12.0,109.0],[198.0,13.0,107.0],[200.0,15.0,105.0],[202.0,16.0,103.0],[204.0,18.0,100.0],[206.0,19.0,98.0],[209.0,21.0,96.0],[211.0,23.0,94.0],[212.0,24.0,92.0],[214.0,26.0,89.0],[216.0,28.0,87.0],[218.0,30.0,85.0],[220.0,32.0,83.0],[221.0,34.0,80.0],[223.0,37.0,78.0],[224.0,39.0,76.0],[226.0,41.0,73.0],[227.0,44.0,71.0],[229.0,46.0,69.0],[230.0,48.0,66.0],[231.0,51.0,64.0],[232.0,54.0,62.0],[233.0,56.0,60.0],[234.0,59.0,57.0],[235.0,62.0,55.0],[236.0,65.0,53.0],[237.0,68.0,51.0],[238.0,71.0,49.0],[238.0,74.0,46.0],[239.0,77.0,44.0],[240.0,80.0,42.0],[240.0,83.0,40.0],[240.0,86.0,38.0],[241.0,89.0,36.0],[241.0,93.0,34.0],[241.0,96.0,32.0],[241.0,99.0,30.0],[241.0,103.0,28.0],[241.0,106.0,27.0],[241.0,110.0,25.0],[240.0,113.0,23.0],[240.0,117.0,21.0]],"MPL_Blues":[[0.965552,0.982345,0.999016],[0.9594,0.978408,0.997047],[0.953249,0.974471,0.995079],[0.947097,0.970534,0.99311],[0.940946,0.966597,0.991142],[0.934794,0.962661,0.989173],[0.928643,0.958724,0.987205],[0.922491,0.954787,0.985236],[0.91634,0.95085,0.983268],[0.913264,0.948881,0.982284],[0.904037,0.942976,0.979331],[0.900961,0.941007,0.978347],[0.891734,0.935102,0.975394],[0.888658,0.933133,0.97441],[0.879431,0.927228,0.971457],[0.876355,0.92526,0.970473],[0.867266,0.919354,0.96752],[0.861361,0.915417,0.965552],[0.858408,0.913449,0.964567],[0.84955,0.907543,0.961615],[0.843645,0.903606,0.959646],[0.837739,0.899669,0.957678],[0.834787,0.897701,0.956694],[0.825928,0.891795,0.953741],[0.820023,0.887859,0.951772],[0.814118,0.883922,0.949804],[0.811165,0.881953,0.94882],[0.802307,0.876048,0.945867],[0.796401,0.872111,0.943899],[0.790496,0.868174,0.94193],[0.787543,0.866205,0.940946],[0.778685,0.8603,0.937993],[0.770319,0.856209,0.935102],[0.760477,0.852026,0.931657],[0.750634,0.847843,0.928212],[0.740792,0.84366,0.924767],[0.73095,0.839477,0.921323],[0.726028,0.837386,0.9196],[0.711265,0.831111,0.914433],[0.701423,0.826928,0.910988],[0.69158,0.822745,0.907543],[0.681738,0.818562,0.904098],[0.671895,0.814379,0.900654],[0.662053,0.810196,0.897209],[0.652211,0.806013,0.893764],[0.64729,0.803922,0.892042],[0.632526,0.797647,0.886874],[0.622684,0.793464,0.883429],[0.61098,0.78742,0.880492],[0.598431,0.780531,0.877785],[0.585882,0.773641,0.875079],[0.573333,0.766751,0.872372],[0.560784,0.759862,0.869666],[0.55451,0.756417,0.868312],[0.535686,0.746082,0.864252],[0.523137,0.739193,0.861546],[0.510588,0.732303,0.858839],[0.498039,0.725413,0.856132],[0.48549,0.718524,0.853426],[0.472941,0.711634,0.850719],[0.460392,0.704744,0.848012],[0.454118,0.7013,0.846659],[0.435294,0.690965,0.842599],[0.422745,0.684075,0.839892],[0.412042,0.677186,0.836263],[0.401953,0.670296,0.832326],[0.391865,0.663406,0.828389],[0.381776,0.656517,0.824452],[0.371688,0.649627,0.820515],[0.361599,0.642737,0.816578],[0.351511,0.635848,0.812641],[0.341423,0.628958,0.808704],[0.331334,0.622068,0.804767],[0.321246,0.615179,0.80083],[0.311157,0.608289,0.796894],[0.306113,0.604844,0.794925],[0.29098,0.59451,0.78902],[0.280892,0.58762,0.785083],[0.270804,0.580731,0.781146],[0.260715,0.573841,0.777209],[0.252226,0.565952,0.773072],[0.244106,0.557832,0.768889],[0.235986,0.549712,0.764706],[0.227866,0.541592,0.760523],[0.219746,0.533472,0.75634],[0.211626,0.525352,0.752157],[0.203506,0.517232,0.747974],[0.195386,0.509112,0.743791],[0.187266,0.500992,0.739608],[0.179146,0.492872,0.735425],[0.171027,0.484752,0.731242],[0.166967,0.480692,0.72915],[0.154787,0.468512,0.722876],[0.146667,0.460392,0.718693],[0.138547,0.452272,0.71451],[0.130427,0.444152,0.710327],[0.124029,0.436248,0.704421],[0.117878,0.428374,0.69827],[0.111726,0.4205,0.692118],[0.105575,0.412626,0.685967],[0.099423,0.404752,0.679815],[0.093272,0.396878,0.673664],[0.08712,0.389004,0.667513],[0.080969,0.38113,0.661361],[0.074817,0.373256,0.65521],[0.068666,0.365383,0.649058],[0.062514,0.357509,0.642907],[0.059439,0.353572,0.639831],[0.050211,0.341761,0.630604],[0.04406,0.333887,0.624452],[0.037908,0.326013,0.618301],[0.031757,0.318139,0.612149],[0.031373,0.310035,0.600461],[0.031373,0.301915,0.588404],[0.031373,0.293795,0.576348],[0.031373,0.285675,0.564291],[0.031373,0.277555,0.552234],[0.031373,0.269435,0.540177],[0.031373,0.261315,0.52812],[0.031373,0.253195,0.516063],[0.031373,0.245075,0.504006],[0.031373,0.236955,0.491949],[0.031373,0.228835,0.479892],[0.031373,0.224775,0.473864],[0.031373,0.212595,0.455779],[0.031373,0.204475,0.443722],[0.031373,0.196355,0.431665],[0.031373,0.188235,0.419608]],"NCV_bright":[[232.0,151.0,254.0],[230.0,143.0,254.0],[228.0,135.0,253.0],[226.0,126.0,253.0],[225.0,118.0,253.0],[223.0,109.0,253.0],[221.0,101.0,253.0],[219.0,93.0,253.0],[216.0,84.0,252.0],[213.0,76.0,252.0],[210.0,67.0,252.0],[207.0,59.0,252.0],[204.0,51.0,251.0],[201.0,42.0,251.0],[197.0,35.0,251.0],[193.0,30.0,250.0],[188.0,25.0,250.0],[184.0,20.0,249.0],[179.0,15.0,248.0],[175.0,10.0,248.0],[170.0,5.0,247.0],[166.0,1.0,247.0],[162.0,1.0,246.0],[158.0,1.0,245.0],[154.0,0.0,244.0],[150.0,0.0,243.0],[145.0,0.0,242.0],[141.0,0.0,241.0],[138.0,0.0,240.0],[134.0,0.0,239.0],[131.0,0.0,238.0],[128.0,0.0,238.0],[124.0,0.0,237.0],[121.0,0.0,236.0],[118.0,0.0,235.0],[115.0,1.0,234.0],[113.0,4.0,234.0],[111.0,7.0,233.0],[108.0,9.0,232.0],[106.0,12.0,232.0],[104.0,15.0,231.0],[102.0,18.0,230.0],[100.0,22.0,230.0],[99.0,26.0,230.0],[98.0,31.0,231.0],[97.0,35.0,231.0],[95.0,40.0,231.0],[94.0,44.0,231.0],[93.0,49.0,231.0],[92.0,54.0,232.0],[91.0,59.0,232.0],[91.0,64.0,233.0],[90.0,69.0,234.0],[89.0,74.0,235.0],[89.0,79.0,236.0],[88.0,84.0,236.0],[87.0,89.0,238.0],[87.0,95.0,239.0],[86.0,101.0,240.0],[86.0,107.0,242.0],[85.0,113.0,243.0],[85.0,118.0,244.0],[84.0,124.0,246.0],[84.0,131.0,247.0],[84.0,137.0,248.0],[83.0,143.0,249.0],[83.0,149.0,251.0],[83.0,156.0,252.0],[82.0,162.0,253.0],[82.0,168.0,254.0],[81.0,174.0,254.0],[81.0,179.0,254.0],[80.0,185.0,254.0],[79.0,190.0,254.0],[79.0,196.0,254.0],[78.0,202.0,254.0],[78.0,207.0,254.0],[76.0,211.0,252.0],[75.0,215.0,249.0],[74.0,219.0,247.0],[73.0,223.0,245.0],[72.0,227.0,243.0],[71.0,231.0,241.0],[69.0,235.0,239.0],[67.0,238.0,235.0],[65.0,240.0,231.0],[62.0,243.0,227.0],[60.0,245.0,223.0],[58.0,248.0,219.0],[55.0,251.0,215.0],[53.0,252.0,211.0],[50.0,253.0,206.0],[47.0,253.0,201.0],[44.0,253.0,195.0],[42.0,254.0,190.0],[39.0,254.0,185.0],[36.0,254.0,180.0],[33.0,254.0,174.0],[31.0,254.0,168.0],[29.0,253.0,162.0],[26.0,253.0,156.0],[24.0,252.0,150.0],[22.0,252.0,144.0],[19.0,252.0,138.0],[18.0,250.0,131.0],[16.0,248.0,124.0],[15.0,246.0,118.0],[14.0,243.0,111.0],[12.0,241.0,104.0],[11.0,239.0,98.0],[10.0,236.0,91.0],[9.0,234.0,85.0],[8.0,231.0,78.0],[8.0,229.0,72.0],[7.0,226.0,66.0],[7.0,224.0,60.0],[6.0,221.0,54.0],[6.0,219.0,48.0],[7.0,217.0,43.0],[7.0,216.0,38.0],[8.0,214.0,33.0],[9.0,213.0,29.0],[10.0,211.0,24.0],[10.0,210.0,19.0],[11.0,208.0,15.0],[14.0,209.0,12.0],[16.0,210.0,10.0],[19.0,211.0,8.0],[21.0,212.0,6.0],[24.0,213.0,4.0],[27.0,214.0,2.0],[29.0,215.0,0.0],[34.0,217.0,0.0],[39.0,220.0,0.0],[44.0,222.0,0.0],[48.0,224.0,0.0],[53.0,227.0,0.0],[58.0,229.0,0.0],[63.0,231.0,0.0],[69.0,234.0,0.0],[74.0,237.0,0.0],[80.0,239.0,0.0],[86.0,242.0,0.0],[92.0,245.0,0.0],[98.0,247.0,0.0],[104.0,250.0,0.0],[111.0,250.0,0.0],[118.0,251.0,0.0],[125.0,252.0,0.0],[132.0,253.0,0.0],[139.0,253.0,0.0],[146.0,254.0,0.0],[153.0,255.0,0.0],[159.0,255.0,0.0],[165.0,255.0,0.0],[171.0,255.0,0.0],[177.0,255.0,0.0],[183.0,255.0,0.0],[189.0,255.0,0.0],[195.0,255.0,0.0],[200.0,255.0,0.0],[204.0,255.0,0.0],[209.0,255.0,0.0],[214.0,255.0,0.0],[219.0,255.0,0.0],[224.0,255.0,0.0],[227.0,254.0,0.0],[230.0,252.0,0.0],[233.0,250.0,0.0],[235.0,249.0,0.0],[238.0,247.0,0.0],[241.0,245.0,0.0],[243.0,244.0,0.0],[245.0,240.0,0.0],[247.0,236.0,0.0],[248.0,232.0,0.0],[250.0,228.0,0.0],[251.0,224.0,1.0],[253.0,220.0,1.0],[254.0,216.0,1.0],[254.0,211.0,1.0],[254.0,206.0,1.0],[254.0,200.0,1.0],[254.0,195.0,1.0],[254.0,189.0,1.0],[254.0,184.0,1.0],[254.0,179.0,2.0],[255.0,173.0,1.0],[255.0,168.0,1.0],[255.0,162.0,1.0],[255.0,157.0,0.0],[255.0,151.0,0.0],[255.0,145.0,0.0],[254.0,140.0,0.0],[254.0,134.0,0.0],[253.0,129.0,0.0],[252.0,124.0,0.0],[251.0,118.0,0.0],[250.0,113.0,0.0],[249.0,108.0,0.0],[248.0,102.0,0.0],[247.0,98.0,0.0],[245.0,93.0,0.0],[244.0,88.0,0.0],[243.0,83.0,0.0],[241.0,79.0,0.0],[240.0,74.0,0.0],[239.0,70.0,0.0],[237.0,66.0,0.0],[235.0,63.0,0.0],[234.0,59.0,0.0],[232.0,56.0,0.0],[230.0,53.0,0.0],[229.0,49.0,0.0],[227.0,46.0,0.0],[225.0,45.0,2.0],[224.0,43.0,4.0],[222.0,42.0,5.0],[221.0,40.0,7.0],[219.0,38.0,9.0],[217.0,37.0,11.0],[216.0,36.0,13.0],[215.0,37.0,16.0],[215.0,38.0,20.0],[214.0,38.0,23.0],[213.0,39.0,26.0],[212.0,40.0,29.0],[212.0,40.0,33.0],[212.0,42.0,36.0],[212.0,46.0,41.0],[213.0,49.0,45.0],[213.0,52.0,49.0],[214.0,56.0,53.0],[214.0,59.0,57.0],[215.0,62.0,62.0],[216.0,67.0,66.0],[218.0,73.0,71.0],[219.0,79.0,76.0],[221.0,85.0,81.0],[223.0,90.0,86.0],[224.0,96.0,91.0],[226.0,102.0,96.0],[228.0,108.0,100.0],[231.0,115.0,104.0],[233.0,121.0,107.0],[235.0,128.0,111.0],[238.0,134.0,115.0],[240.0,141.0,118.0],[243.0,147.0,122.0],[245.0,153.0,124.0],[246.0,159.0,125.0],[248.0,165.0,126.0],[250.0,171.0,128.0],[251.0,177.0,129.0],[253.0,183.0,130.0],[255.0,189.0,132.0]],"MPL_RdYlGn":[[0.654748,0.007382,0.149173],[0.670127,0.022145,0.149481],[0.685506,0.036909,0.149789],[0.700884,0.051672,0.150096],[0.716263,0.066436,0.150404],[0.731642,0.0812,0.150711],[0.74702,0.095963,0.151019],[0.762399,0.110727,0.151326],[0.777778,0.12549,0.151634],[0.785467,0.132872,0.151788],[0.808535,0.155017,0.152249],[0.816225,0.162399,0.152403],[0.839293,0.184544,0.152864],[0.845367,0.192926,0.155094],[0.858747,0.221069,0.168012],[0.863206,0.23045,0.172318],[0.876586,0.258593,0.185236],[0.885506,0.277355,0.193849],[0.889965,0.286736,0.198155],[0.903345,0.314879,0.211073],[0.912265,0.333641,0.219685],[0.921184,0.352403,0.228297],[0.925644,0.361784,0.232603],[0.939023,0.389927,0.245521],[0.947943,0.408689,0.254133],[0.956863,0.427451,0.262745],[0.958247,0.437447,0.267359],[0.962399,0.467436,0.2812],[0.965167,0.487428,0.290427],[0.967935,0.50742,0.299654],[0.969319,0.517416,0.304268],[0.973472,0.547405,0.318108],[0.97624,0.567397,0.327336],[0.979008,0.587389,0.336563],[0.981776,0.607382,0.34579],[0.984544,0.627374,0.355017],[0.987313,0.647366,0.364245],[0.988697,0.657363,0.368858],[0.992234,0.686198,0.383622],[0.992541,0.701576,0.39654],[0.992849,0.716955,0.409458],[0.993156,0.732334,0.422376],[0.993464,0.747712,0.435294],[0.993772,0.763091,0.448212],[0.994079,0.77847,0.46113],[0.994233,0.786159,0.467589],[0.994694,0.809227,0.486967],[0.995002,0.824606,0.499885],[0.995309,0.839985,0.512803],[0.995617,0.855363,0.525721],[0.995925,0.870742,0.538639],[0.996232,0.883199,0.553095],[0.99654,0.892734,0.569089],[0.996694,0.897501,0.577086],[0.997155,0.911803,0.601077],[0.997463,0.921338,0.61707],[0.99777,0.930873,0.633064],[0.998078,0.940408,0.649058],[0.998385,0.949942,0.665052],[0.998693,0.959477,0.681046],[0.999,0.969012,0.69704],[0.999154,0.973779,0.705037],[0.999616,0.988082,0.729027],[0.999923,0.997616,0.745021],[0.991234,0.996309,0.737024],[0.979546,0.991388,0.72103],[0.967859,0.986467,0.705037],[0.956171,0.981546,0.689043],[0.944483,0.976624,0.673049],[0.932795,0.971703,0.657055],[0.921107,0.966782,0.641061],[0.909419,0.961861,0.625067],[0.897732,0.95694,0.609073],[0.886044,0.952018,0.59308],[0.874356,0.947097,0.577086],[0.868512,0.944637,0.569089],[0.85098,0.937255,0.545098],[0.835294,0.930488,0.534948],[0.819608,0.923722,0.524798],[0.803922,0.916955,0.514648],[0.788235,0.910188,0.504498],[0.772549,0.903422,0.494348],[0.756863,0.896655,0.484198],[0.741176,0.889889,0.474048],[0.72549,0.883122,0.463899],[0.709804,0.876355,0.453749],[0.694118,0.869589,0.443599],[0.678431,0.862822,0.433449],[0.662745,0.856055,0.423299],[0.646059,0.848827,0.415148],[0.626374,0.840215,0.412995],[0.616532,0.835909,0.411918],[0.587005,0.822991,0.408689],[0.56732,0.814379,0.406536],[0.547636,0.805767,0.404383],[0.527951,0.797155,0.40223],[0.508266,0.788543,0.400077],[0.488581,0.779931,0.397924],[0.468897,0.771319,0.395771],[0.449212,0.762707,0.393618],[0.429527,0.754095,0.391465],[0.409842,0.745483,0.389312],[0.388312,0.735486,0.385313],[0.364937,0.724106,0.379469],[0.341561,0.712726,0.373626],[0.318185,0.701346,0.367782],[0.29481,0.689965,0.361938],[0.283122,0.684275,0.359016],[0.248058,0.667205,0.35025],[0.224683,0.655825,0.344406],[0.201307,0.644444,0.338562],[0.177932,0.633064,0.332718],[0.154556,0.621684,0.326874],[0.13118,0.610304,0.32103],[0.107805,0.598924,0.315186],[0.095963,0.585006,0.307958],[0.087966,0.570242,0.300269],[0.079969,0.555479,0.29258],[0.071972,0.540715,0.28489],[0.063975,0.525952,0.277201],[0.055978,0.511188,0.269512],[0.047982,0.496424,0.261822],[0.039985,0.481661,0.254133],[0.035986,0.474279,0.250288],[0.023991,0.452134,0.238754],[0.015994,0.43737,0.231065],[0.007997,0.422607,0.223376],[0.0,0.407843,0.215686]],"MPL_Set2":[[0.416148,0.755079,0.639846],[0.448443,0.743668,0.625421],[0.480738,0.732257,0.610996],[0.513033,0.720846,0.596571],[0.545329,0.709435,0.582145],[0.577624,0.698024,0.56772],[0.609919,0.686613,0.553295],[0.642215,0.675202,0.53887],[0.67451,0.663791,0.524444],[0.690657,0.658085,0.517232],[0.7391,0.640969,0.495594],[0.755248,0.635263,0.488381],[0.803691,0.618147,0.466744],[0.819839,0.612441,0.459531],[0.868281,0.595325,0.437893],[0.884429,0.589619,0.430681],[0.932872,0.572503,0.409043],[0.965167,0.561092,0.394617],[0.981315,0.555386,0.387405],[0.957509,0.558201,0.413379],[0.93361,0.562291,0.435986],[0.909712,0.566382,0.458593],[0.897762,0.568428,0.469896],[0.861915,0.574564,0.503806],[0.838016,0.578654,0.526413],[0.814118,0.582745,0.54902],[0.802168,0.58479,0.560323],[0.766321,0.590927,0.594233],[0.742422,0.595017,0.61684],[0.718524,0.599108,0.639446],[0.706574,0.601153,0.65075],[0.670727,0.60729,0.68466],[0.646828,0.61138,0.707266],[0.62293,0.615471,0.729873],[0.599031,0.619562,0.75248],[0.575133,0.623652,0.775087],[0.554325,0.627113,0.795955],[0.564014,0.624744,0.795094],[0.59308,0.617639,0.792511],[0.612457,0.612903,0.790788],[0.631834,0.608166,0.789066],[0.651211,0.603429,0.787343],[0.670588,0.598693,0.785621],[0.689965,0.593956,0.783899],[0.709343,0.58922,0.782176],[0.719031,0.586851,0.781315],[0.748097,0.579746,0.778731],[0.767474,0.57501,0.777009],[0.786851,0.570273,0.775286],[0.806228,0.565536,0.773564],[0.825606,0.5608,0.771842],[0.844983,0.556063,0.770119],[0.86436,0.551326,0.768397],[0.874048,0.548958,0.767536],[0.903114,0.541853,0.764952],[0.893887,0.555571,0.744221],[0.879892,0.572365,0.720323],[0.865898,0.589158,0.696424],[0.851903,0.605952,0.672526],[0.837909,0.622745,0.648627],[0.823914,0.639539,0.624729],[0.816917,0.647935,0.61278],[0.795925,0.673126,0.576932],[0.78193,0.689919,0.553033],[0.767935,0.706713,0.529135],[0.753941,0.723506,0.505236],[0.739946,0.7403,0.481338],[0.725952,0.757093,0.457439],[0.711957,0.773887,0.433541],[0.697962,0.790681,0.409642],[0.683968,0.807474,0.385744],[0.669973,0.824268,0.361845],[0.655978,0.841061,0.337947],[0.663299,0.847197,0.324291],[0.682461,0.847413,0.316325],[0.692042,0.84752,0.312341],[0.720784,0.847843,0.300392],[0.739946,0.848058,0.292426],[0.759108,0.848274,0.28446],[0.77827,0.848489,0.276494],[0.797432,0.848704,0.268527],[0.816594,0.84892,0.260561],[0.835755,0.849135,0.252595],[0.854917,0.84935,0.244629],[0.874079,0.849566,0.236663],[0.893241,0.849781,0.228697],[0.912403,0.849996,0.22073],[0.931565,0.850211,0.212764],[0.950727,0.850427,0.204798],[0.969889,0.850642,0.196832],[0.98905,0.850857,0.188866],[0.998631,0.850965,0.184883],[0.992003,0.844521,0.215379],[0.986405,0.84,0.237124],[0.980807,0.835479,0.25887],[0.97521,0.830957,0.280615],[0.969612,0.826436,0.302361],[0.964014,0.821915,0.324106],[0.958416,0.817393,0.345852],[0.952818,0.812872,0.367597],[0.94722,0.808351,0.389343],[0.941622,0.803829,0.411088],[0.936025,0.799308,0.432834],[0.930427,0.794787,0.454579],[0.924829,0.790265,0.476325],[0.919231,0.785744,0.49807],[0.913633,0.781223,0.519815],[0.910834,0.778962,0.530688],[0.902438,0.77218,0.563306],[0.895732,0.767843,0.581822],[0.884967,0.764183,0.588497],[0.874202,0.760523,0.595171],[0.863437,0.756863,0.601845],[0.852672,0.753203,0.60852],[0.841907,0.749542,0.615194],[0.831142,0.745882,0.621869],[0.820377,0.742222,0.628543],[0.809612,0.738562,0.635217],[0.798847,0.734902,0.641892],[0.788082,0.731242,0.648566],[0.777316,0.727582,0.65524],[0.766551,0.723922,0.661915],[0.755786,0.720261,0.668589],[0.750404,0.718431,0.671926],[0.734256,0.712941,0.681938],[0.723491,0.709281,0.688612],[0.712726,0.705621,0.695286],[0.701961,0.701961,0.701961]],"prcp_1":[[255.0,255.0,255.0],[170.0,255.0,255.0],[85.0,160.0,255.0],[29.0,0.0,255.0],[126.0,229.0,91.0],[78.0,204.0,67.0],[46.0,178.0,57.0],[30.0,153.0,61.0],[255.0,255.0,102.0],[255.0,204.0,102.0],[255.0,136.0,76.0],[255.0,25.0,25.0],[204.0,61.0,61.0],[165.0,49.0,49.0],[237.0,0.0,237.0],[137.0,103.0,205.0],[250.0,240.0,230.0]],"GMT_split":[[0.476863,0.476863,0.975098],[0.426667,0.426667,0.925294],[0.376471,0.376471,0.87549],[0.326275,0.326275,0.825686],[0.276078,0.276078,0.775882],[0.225882,0.225882,0.726078],[0.175686,0.175686,0.676275],[0.12549,0.12549,0.626471],[0.075294,0.075294,0.576667],[0.025098,0.025098,0.526863],[0.0,0.0,0.476863],[0.0,0.0,0.426667],[0.0,0.0,0.376471],[0.0,0.0,0.326275],[0.0,0.0,0.276078],[0.0,0.0,0.225882],[0.0,0.0,0.175686],[0.0,0.0,0.12549],[0.0,0.0,0.075294],[0.0,0.0,0.025098],[0.025098,0.0,0.0],[0.075294,0.0,0.0],[0.12549,0.0,0.0],[0.175686,0.0,0.0],[0.225882,0.0,0.0],[0.276078,0.0,0.0],[0.326275,0.0,0.0],[0.376471,0.0,0.0],[0.426667,0.0,0.0],[0.476863,0.0,0.0],[0.526863,0.025098,0.025098],[0.576667,0.075294,0.075294],[0.626471,0.12549,0.12549],[0.676275,0.175686,0.175686],[0.726078,0.225882,0.225882],[0.775882,0.276078,0.276078],[0.825686,0.326275,0.326275],[0.87549,0.376471,0.376471],[0.925294,0.426667,0.426667],[0.975098,0.476863,0.476863]],"MPL_rainbow":[[0.492157,0.01232,0.999981],[0.476471,0.036951,0.999829],[0.460784,0.061561,0.999526],[0.445098,0.086133,0.99907],[0.429412,0.110653,0.998464],[0.413725,0.135105,0.997705],[0.398039,0.159476,0.996795],[0.382353,0.18375,0.995734],[0.366667,0.207912,0.994522],[0.358824,0.219946,0.993859],[0.335294,0.255843,0.991645],[0.327451,0.267733,0.990831],[0.303922,0.303153,0.988165],[0.296078,0.31487,0.987202],[0.272549,0.349727,0.984086],[0.264706,0.361242,0.982973],[0.241176,0.395451,0.97941],[0.22549,0.41796,0.976848],[0.217647,0.429121,0.975512],[0.194118,0.462204,0.971281],[0.178431,0.483911,0.968276],[0.162745,0.505325,0.965124],[0.154902,0.515918,0.963493],[0.131373,0.54722,0.958381],[0.115686,0.567675,0.954791],[0.1,0.587785,0.951057],[0.092157,0.597707,0.949135],[0.068627,0.626924,0.943154],[0.052941,0.645928,0.938988],[0.037255,0.66454,0.93468],[0.029412,0.673696,0.932472],[0.005882,0.700543,0.925638],[0.009804,0.717912,0.920906],[0.02549,0.734845,0.916034],[0.041176,0.751332,0.911023],[0.056863,0.767363,0.905873],[0.072549,0.782928,0.900587],[0.080392,0.790532,0.897892],[0.103922,0.812622,0.889604],[0.119608,0.826734,0.88391],[0.135294,0.840344,0.878081],[0.15098,0.853444,0.87212],[0.166667,0.866025,0.866025],[0.182353,0.878081,0.8598],[0.198039,0.889604,0.853444],[0.205882,0.895163,0.850217],[0.229412,0.911023,0.840344],[0.245098,0.920906,0.833602],[0.260784,0.930229,0.826734],[0.276471,0.938988,0.81974],[0.292157,0.947177,0.812622],[0.307843,0.954791,0.805381],[0.323529,0.961826,0.798017],[0.331373,0.965124,0.79429],[0.354902,0.974139,0.782928],[0.370588,0.97941,0.775204],[0.386275,0.984086,0.767363],[0.401961,0.988165,0.759405],[0.417647,0.991645,0.751332],[0.433333,0.994522,0.743145],[0.44902,0.996795,0.734845],[0.456863,0.997705,0.730653],[0.480392,0.999526,0.717912],[0.496078,0.999981,0.709281],[0.511765,0.999829,0.700543],[0.527451,0.99907,0.691698],[0.543137,0.997705,0.682749],[0.558824,0.995734,0.673696],[0.57451,0.993159,0.66454],[0.590196,0.98998,0.655284],[0.605882,0.986201,0.645928],[0.621569,0.981823,0.636474],[0.637255,0.976848,0.626924],[0.652941,0.971281,0.617278],[0.668627,0.965124,0.607539],[0.676471,0.961826,0.602635],[0.7,0.951057,0.587785],[0.715686,0.943154,0.577774],[0.731373,0.93468,0.567675],[0.747059,0.925638,0.557489],[0.762745,0.916034,0.54722],[0.778431,0.905873,0.536867],[0.794118,0.895163,0.526432],[0.809804,0.88391,0.515918],[0.82549,0.87212,0.505325],[0.841176,0.8598,0.494656],[0.856863,0.846958,0.483911],[0.872549,0.833602,0.473094],[0.888235,0.81974,0.462204],[0.903922,0.805381,0.451244],[0.919608,0.790532,0.440216],[0.927451,0.782928,0.434676],[0.95098,0.759405,0.41796],[0.966667,0.743145,0.406737],[0.982353,0.726434,0.395451],[0.998039,0.709281,0.384106],[1.0,0.691698,0.372702],[1.0,0.673696,0.361242],[1.0,0.655284,0.349727],[1.0,0.636474,0.338158],[1.0,0.617278,0.326539],[1.0,0.597707,0.31487],[1.0,0.577774,0.303153],[1.0,0.557489,0.29139],[1.0,0.536867,0.279583],[1.0,0.515918,0.267733],[1.0,0.494656,0.255843],[1.0,0.483911,0.249883],[1.0,0.451244,0.231948],[1.0,0.429121,0.219946],[1.0,0.406737,0.207912],[1.0,0.384106,0.195845],[1.0,0.361242,0.18375],[1.0,0.338158,0.171626],[1.0,0.31487,0.159476],[1.0,0.29139,0.147302],[1.0,0.267733,0.135105],[1.0,0.243914,0.122888],[1.0,0.219946,0.110653],[1.0,0.195845,0.0984],[1.0,0.171626,0.086133],[1.0,0.147302,0.073853],[1.0,0.122888,0.061561],[1.0,0.110653,0.055411],[1.0,0.073853,0.036951],[1.0,0.04926,0.024637],[1.0,0.024637,0.01232],[1.0,0.0,0.0]],"precip_diff_1lev":[[83.0,189.0,159.0],[225.0,165.0,100.0]],"MPL_pink":[[0.137085,0.025415,0.025415],[0.175654,0.076244,0.076244],[0.208752,0.112895,0.112895],[0.235832,0.133949,0.133949],[0.260677,0.152787,0.152787],[0.282817,0.168943,0.168943],[0.303696,0.184011,0.184011],[0.322896,0.197631,0.197631],[0.341282,0.210595,0.210595],[0.349876,0.216594,0.216594],[0.375094,0.234155,0.234155],[0.382946,0.239579,0.239579],[0.406087,0.255539,0.255539],[0.41336,0.260527,0.260527],[0.434869,0.275261,0.275261],[0.441676,0.279904,0.279904],[0.461856,0.293657,0.293657],[0.474696,0.302378,0.302378],[0.481116,0.306738,0.306738],[0.499532,0.319212,0.319212],[0.511569,0.327355,0.327355],[0.523189,0.335201,0.335201],[0.528999,0.339123,0.339123],[0.54582,0.350459,0.350459],[0.556855,0.357889,0.357889],[0.567548,0.365079,0.365079],[0.572894,0.368674,0.368674],[0.588473,0.379135,0.379135],[0.598721,0.386013,0.386013],[0.608678,0.392688,0.392688],[0.613657,0.396026,0.396026],[0.628234,0.405789,0.405789],[0.637843,0.412221,0.412221],[0.647199,0.418478,0.418478],[0.656529,0.424718,0.424718],[0.665623,0.430794,0.430794],[0.674699,0.436858,0.436858],[0.679124,0.439813,0.439813],[0.692391,0.448669,0.448669],[0.701019,0.454425,0.454425],[0.709642,0.460178,0.460178],[0.718063,0.465792,0.465792],[0.726483,0.471405,0.471405],[0.734711,0.476886,0.476886],[0.742938,0.482368,0.482368],[0.746967,0.48505,0.48505],[0.759038,0.493087,0.493087],[0.762685,0.504734,0.498336],[0.766111,0.516695,0.503579],[0.76951,0.52816,0.508721],[0.772906,0.539586,0.513855],[0.776275,0.550588,0.518898],[0.779641,0.561545,0.523932],[0.781314,0.566865,0.526412],[0.786319,0.582678,0.533817],[0.789632,0.592901,0.538677],[0.792941,0.603071,0.543523],[0.796226,0.612961,0.548299],[0.799507,0.622796,0.553059],[0.802767,0.632385,0.557754],[0.806021,0.641916,0.562434],[0.80764,0.646603,0.564751],[0.812482,0.660484,0.571655],[0.81569,0.669544,0.5762],[0.818891,0.678543,0.580728],[0.822075,0.687369,0.585204],[0.825252,0.696133,0.589663],[0.828411,0.704743,0.594073],[0.831563,0.713291,0.598465],[0.834699,0.721699,0.602811],[0.837827,0.730045,0.607138],[0.84094,0.738266,0.611424],[0.844045,0.746424,0.615689],[0.847135,0.754469,0.619917],[0.850218,0.762452,0.624124],[0.851756,0.766423,0.626221],[0.856345,0.778149,0.632446],[0.859392,0.785873,0.636564],[0.862429,0.793535,0.64066],[0.865454,0.801113,0.644727],[0.86847,0.808629,0.64877],[0.871475,0.816069,0.652787],[0.874471,0.823446,0.65678],[0.877455,0.830755,0.660749],[0.88043,0.838002,0.664694],[0.883394,0.845186,0.668616],[0.886348,0.852309,0.672514],[0.889293,0.859375,0.676391],[0.892228,0.86638,0.680245],[0.895154,0.873334,0.684078],[0.898069,0.880225,0.687889],[0.899527,0.883671,0.689794],[0.903873,0.893857,0.695448],[0.906762,0.900601,0.699199],[0.909639,0.907284,0.702927],[0.91251,0.91251,0.709362],[0.91537,0.91537,0.720199],[0.918223,0.918223,0.730923],[0.921064,0.921064,0.741442],[0.923899,0.923899,0.751864],[0.926723,0.926723,0.762093],[0.929542,0.929542,0.772239],[0.932348,0.932348,0.782199],[0.93515,0.93515,0.792089],[0.93794,0.93794,0.8018],[0.940725,0.940725,0.811452],[0.943498,0.943498,0.820934],[0.944885,0.944885,0.825675],[0.949024,0.949024,0.839632],[0.951777,0.951777,0.848856],[0.954518,0.954518,0.857922],[0.957255,0.957255,0.866952],[0.959979,0.959979,0.87583],[0.962702,0.962702,0.884679],[0.965411,0.965411,0.893379],[0.968118,0.968118,0.902056],[0.970812,0.970812,0.910591],[0.973504,0.973504,0.919106],[0.976183,0.976183,0.927482],[0.978861,0.978861,0.935844],[0.981525,0.981525,0.944072],[0.984188,0.984188,0.952289],[0.986838,0.986838,0.960374],[0.988162,0.988162,0.964417],[0.992122,0.992122,0.976405],[0.994757,0.994757,0.984353],[0.997379,0.997379,0.992177],[1.0,1.0,1.0]],"BrownBlue12":[[51.0,25.0,0.0],[102.0,47.0,0.0],[153.0,96.0,53.0],[204.0,155.0,122.0],[216.0,175.0,151.0],[242.0,218.0,205.0],[204.0,253.0,255.0],[153.0,248.0,255.0],[101.0,239.0,255.0],[50.0,227.0,255.0],[0.0,169.0,204.0],[0.0,122.0,153.0]],"MPL_afmhot":[[0.007843,0.0,0.0],[0.023529,0.0,0.0],[0.039216,0.0,0.0],[0.054902,0.0,0.0],[0.070588,0.0,0.0],[0.086275,0.0,0.0],[0.101961,0.0,0.0],[0.117647,0.0,0.0],[0.133333,0.0,0.0],[0.141176,0.0,0.0],[0.164706,0.0,0.0],[0.172549,0.0,0.0],[0.196078,0.0,0.0],[0.203922,0.0,0.0],[0.227451,0.0,0.0],[0.235294,0.0,0.0],[0.258824,0.0,0.0],[0.27451,0.0,0.0],[0.282353,0.0,0.0],[0.305882,0.0,0.0],[0.321569,0.0,0.0],[0.337255,0.0,0.0],[0.345098,0.0,0.0],[0.368627,0.0,0.0],[0.384314,0.0,0.0],[0.4,0.0,0.0],[0.407843,0.0,0.0],[0.431373,0.0,0.0],[0.447059,0.0,0.0],[0.462745,0.0,0.0],[0.470588,0.0,0.0],[0.494118,0.0,0.0],[0.509804,0.009804,0.0],[0.52549,0.02549,0.0],[0.541176,0.041176,0.0],[0.556863,0.056863,0.0],[0.572549,0.072549,0.0],[0.580392,0.080392,0.0],[0.603922,0.103922,0.0],[0.619608,0.119608,0.0],[0.635294,0.135294,0.0],[0.65098,0.15098,0.0],[0.666667,0.166667,0.0],[0.682353,0.182353,0.0],[0.698039,0.198039,0.0],[0.705882,0.205882,0.0],[0.729412,0.229412,0.0],[0.745098,0.245098,0.0],[0.760784,0.260784,0.0],[0.776471,0.276471,0.0],[0.792157,0.292157,0.0],[0.807843,0.307843,0.0],[0.823529,0.323529,0.0],[0.831373,0.331373,0.0],[0.854902,0.354902,0.0],[0.870588,0.370588,0.0],[0.886275,0.386275,0.0],[0.901961,0.401961,0.0],[0.917647,0.417647,0.0],[0.933333,0.433333,0.0],[0.94902,0.44902,0.0],[0.956863,0.456863,0.0],[0.980392,0.480392,0.0],[0.996078,0.496078,0.0],[1.0,0.511765,0.011765],[1.0,0.527451,0.027451],[1.0,0.543137,0.043137],[1.0,0.558824,0.058824],[1.0,0.57451,0.07451],[1.0,0.590196,0.090196],[1.0,0.605882,0.105882],[1.0,0.621569,0.121569],[1.0,0.637255,0.137255],[1.0,0.652941,0.152941],[1.0,0.668627,0.168627],[1.0,0.676471,0.176471],[1.0,0.7,0.2],[1.0,0.715686,0.215686],[1.0,0.731373,0.231373],[1.0,0.747059,0.247059],[1.0,0.762745,0.262745],[1.0,0.778431,0.278431],[1.0,0.794118,0.294118],[1.0,0.809804,0.309804],[1.0,0.82549,0.32549],[1.0,0.841176,0.341176],[1.0,0.856863,0.356863],[1.0,0.872549,0.372549],[1.0,0.888235,0.388235],[1.0,0.903922,0.403922],[1.0,0.919608,0.419608],[1.0,0.927451,0.427451],[1.0,0.95098,0.45098],[1.0,0.966667,0.466667],[1.0,0.982353,0.482353],[1.0,0.998039,0.498039],[1.0,1.0,0.513725],[1.0,1.0,0.529412],[1.0,1.0,0.545098],[1.0,1.0,0.560784],[1.0,1.0,0.576471],[1.0,1.0,0.592157],[1.0,1.0,0.607843],[1.0,1.0,0.623529],[1.0,1.0,0.639216],[1.0,1.0,0.654902],[1.0,1.0,0.670588],[1.0,1.0,0.678431],[1.0,1.0,0.701961],[1.0,1.0,0.717647],[1.0,1.0,0.733333],[1.0,1.0,0.74902],[1.0,1.0,0.764706],[1.0,1.0,0.780392],[1.0,1.0,0.796078],[1.0,1.0,0.811765],[1.0,1.0,0.827451],[1.0,1.0,0.843137],[1.0,1.0,0.858824],[1.0,1.0,0.87451],[1.0,1.0,0.890196],[1.0,1.0,0.905882],[1.0,1.0,0.921569],[1.0,1.0,0.929412],[1.0,1.0,0.952941],[1.0,1.0,0.968627],[1.0,1.0,0.984314],[1.0,1.0,1.0]],"GMT_red2green":[[1.0,0.05,0.05],[1.0,0.15,0.15],[1.0,0.25,0.25],[1.0,0.35,0.35],[1.0,0.45,0.45],[1.0,0.55,0.55],[1.0,0.65,0.65],[1.0,0.75,0.75],[1.0,0.85,0.85],[1.0,0.95,0.95],[0.95,1.0,0.95],[0.85,1.0,0.85],[0.75,1.0,0.75],[0.65,1.0,0.65],[0.55,1.0,0.55],[0.45,1.0,0.45],[0.35,1.0,0.35],[0.25,1.0,0.25],[0.15,1.0,0.15],[0.05,1.0,0.05]],"BlueDarkRed18":[[36.0,0.0,216.0],[24.0,28.0,247.0],[40.0,87.0,255.0],[61.0,135.0,255.0],[86.0,176.0,255.0],[117.0,211.0,255.0],[153.0,234.0,255.0],[188.0,249.0,255.0],[234.0,255.0,255.0],[255.0,255.0,234.0],[255.0,241.0,188.0],[255.0,214.0,153.0],[255.0,172.0,117.0],[255.0,120.0,86.0],[255.0,61.0,61.0],[247.0,39.0,53.0],[216.0,21.0,47.0],[165.0,0.0,33.0]],"GMT_topo":[[0.85,0.4675,0.554459],[0.85,0.4675,0.575377],[0.85,0.4675,0.596295],[0.85,0.4675,0.617213],[0.85,0.4675,0.638131],[0.85,0.4675,0.659049],[0.85,0.4675,0.679967],[0.85,0.4675,0.700885],[0.85,0.4675,0.721803],[0.9,0.54,0.798337],[0.9,0.54,0.818103],[0.9,0.54,0.83787],[0.9,0.54,0.857636],[0.9,0.54,0.877403],[0.9,0.54,0.897169],[0.883064,0.54,0.9],[0.863297,0.54,0.9],[0.843531,0.54,0.9],[0.824625,0.54,0.9],[0.808875,0.54,0.9],[0.793125,0.54,0.9],[0.777375,0.54,0.9],[0.761625,0.54,0.9],[0.745875,0.54,0.9],[0.730125,0.54,0.9],[0.714375,0.54,0.9],[0.698625,0.54,0.9],[0.682819,0.54,0.9],[0.666281,0.54,0.9],[0.649744,0.54,0.9],[0.633206,0.54,0.9],[0.616669,0.54,0.9],[0.600131,0.54,0.9],[0.583594,0.54,0.9],[0.567056,0.54,0.9],[0.550519,0.54,0.9],[0.54,0.546019,0.9],[0.543047,0.567937,0.905078],[0.546328,0.59049,0.910547],[0.549609,0.613272,0.916016],[0.552891,0.636285,0.921484],[0.556172,0.659527,0.926953],[0.559453,0.682999,0.932422],[0.562734,0.706701,0.937891],[0.566016,0.730632,0.943359],[0.569297,0.754793,0.948828],[0.565918,0.774463,0.95],[0.560723,0.793377,0.95],[0.555527,0.812859,0.95],[0.550332,0.83291,0.95],[0.545137,0.853529,0.95],[0.539941,0.874716,0.95],[0.534746,0.896471,0.95],[0.529551,0.918795,0.95],[0.524355,0.941687,0.95],[0.5225,0.95,0.934971],[0.5225,0.95,0.911592],[0.5225,0.95,0.888213],[0.5225,0.95,0.864834],[0.5225,0.95,0.841455],[0.5225,0.95,0.818076],[0.5225,0.95,0.794697],[0.5225,0.95,0.771318],[0.5225,0.95,0.747939],[0.5225,0.95,0.724093],[0.5225,0.95,0.699779],[0.5225,0.95,0.675465],[0.5225,0.95,0.651151],[0.5225,0.95,0.626837],[0.5225,0.95,0.602523],[0.5225,0.95,0.578209],[0.5225,0.95,0.553895],[0.5225,0.95,0.52958],[0.539066,0.95,0.5225],[0.561509,0.95,0.5225],[0.583953,0.95,0.5225],[0.606397,0.95,0.5225],[0.628841,0.95,0.5225],[0.651284,0.95,0.5225],[0.673728,0.95,0.5225],[0.696172,0.95,0.5225],[0.718616,0.95,0.5225],[0.74126,0.95,0.5225],[0.764639,0.95,0.5225],[0.788018,0.95,0.5225],[0.811396,0.95,0.5225],[0.834775,0.95,0.5225],[0.858154,0.95,0.5225],[0.881533,0.95,0.5225],[0.904912,0.95,0.5225],[0.928291,0.95,0.5225],[0.95,0.94833,0.5225],[0.95,0.924951,0.5225],[0.95,0.901572,0.5225],[0.95,0.878193,0.5225],[0.95,0.854814,0.5225],[0.95,0.831436,0.5225],[0.95,0.808057,0.5225],[0.95,0.784678,0.5225],[0.95,0.761299,0.5225],[0.95,0.73792,0.5225],[0.944922,0.728309,0.524505],[0.939453,0.719968,0.526608],[0.933984,0.711842,0.52865],[0.928516,0.703929,0.530632],[0.923047,0.696226,0.532555],[0.917578,0.688729,0.534418],[0.912109,0.681437,0.536221],[0.906641,0.674345,0.537964],[0.901172,0.667452,0.539647],[0.895703,0.660753,0.541271],[0.890234,0.654247,0.542834],[0.884766,0.647929,0.544338],[0.879297,0.641798,0.545782],[0.873828,0.63585,0.547167],[0.868359,0.630082,0.548491],[0.862891,0.624492,0.549756],[0.857422,0.619076,0.550961],[0.851953,0.613832,0.552106],[0.846671,0.635003,0.635003],[0.84118,0.630885,0.630885],[0.83569,0.626767,0.626767],[0.830199,0.622649,0.622649],[0.824708,0.618531,0.618531],[0.819217,0.614413,0.614413],[0.813727,0.610295,0.610295],[0.808236,0.606177,0.606177],[0.802745,0.602059,0.602059],[0.45052,0.497821,0.7],[0.440853,0.54009,0.7],[0.431186,0.586098,0.7],[0.421519,0.635843,0.7],[0.411934,0.68886,0.7],[0.402363,0.7,0.654541],[0.392793,0.7,0.594278],[0.387793,0.705078,0.538057],[0.402832,0.732422,0.51206],[0.417871,0.759766,0.482564],[0.43291,0.787109,0.449569],[0.459688,0.8,0.44],[0.483312,0.8,0.44],[0.506937,0.8,0.44],[0.530563,0.8,0.44],[0.554188,0.8,0.44],[0.577812,0.8,0.44],[0.601437,0.8,0.44],[0.626966,0.802344,0.44317],[0.65928,0.813281,0.458106],[0.691247,0.824219,0.473282],[0.722828,0.835156,0.488697],[0.753983,0.846094,0.504351],[0.784675,0.857031,0.520245],[0.814862,0.867969,0.536378],[0.844507,0.878906,0.55275],[0.873569,0.889844,0.569361],[0.900195,0.899888,0.585567],[0.90293,0.898397,0.593518],[0.905664,0.89705,0.601506],[0.908398,0.895848,0.609532],[0.911133,0.894793,0.617595],[0.913867,0.893887,0.625696],[0.916602,0.89313,0.633834],[0.919336,0.892524,0.642009],[0.92207,0.892071,0.650222],[0.924805,0.891773,0.658472],[0.927539,0.891631,0.666759],[0.930273,0.891646,0.675084],[0.933008,0.89182,0.683446],[0.935742,0.892155,0.691846],[0.938477,0.892652,0.700283],[0.941211,0.893313,0.708758],[0.943945,0.894139,0.717269],[0.94668,0.895131,0.725819],[0.949414,0.896292,0.734405],[0.952148,0.897622,0.743029],[0.954883,0.899124,0.75169],[0.957617,0.900799,0.760389],[0.960352,0.902648,0.769125],[0.963086,0.904672,0.777899],[0.96582,0.906875,0.78671],[0.968555,0.909256,0.795558],[0.971289,0.911818,0.804444],[0.974023,0.914562,0.813367],[0.976758,0.917489,0.822327],[0.979492,0.920601,0.831325],[0.982227,0.923901,0.84036],[0.984961,0.927388,0.849433],[0.987695,0.931065,0.858543],[0.99043,0.934933,0.86769],[0.993164,0.938994,0.876875],[0.995898,0.943249,0.886097],[0.998633,0.947701,0.895356],[1.0,0.975001,0.950362],[1.0,0.975013,0.951144],[1.0,0.975037,0.951926],[1.0,0.975073,0.952707],[1.0,0.975122,0.953489],[1.0,0.975182,0.954271],[1.0,0.975255,0.955052],[1.0,0.97534,0.955834],[1.0,0.975438,0.956616],[1.0,0.975547,0.957398],[1.0,0.975669,0.958179],[1.0,0.975803,0.958961],[1.0,0.975949,0.959743],[1.0,0.976108,0.960524],[1.0,0.976278,0.961306],[1.0,0.976461,0.962088],[1.0,0.976656,0.962869],[1.0,0.976864,0.963651],[1.0,0.977083,0.964433],[1.0,0.977315,0.965214],[1.0,0.977559,0.965996],[1.0,0.977815,0.966778],[1.0,0.978083,0.96756],[1.0,0.978364,0.968341],[1.0,0.978657,0.969123],[1.0,0.978962,0.969905],[1.0,0.979279,0.970686],[1.0,0.979609,0.971468],[1.0,0.979951,0.97225],[1.0,0.980304,0.973031],[1.0,0.980671,0.973813],[1.0,0.981049,0.974595],[1.0,0.98144,0.975377],[1.0,0.981843,0.976158],[1.0,0.982258,0.97694],[1.0,0.982685,0.977722],[1.0,0.983124,0.978503],[1.0,0.983576,0.979285],[1.0,0.98404,0.980067],[1.0,0.984516,0.980848],[1.0,0.985005,0.98163],[1.0,0.985505,0.982412],[1.0,0.986018,0.983194],[1.0,0.986543,0.983975],[1.0,0.98708,0.984757],[1.0,0.98763,0.985539],[1.0,0.988192,0.98632],[1.0,0.988766,0.987102],[1.0,0.989352,0.987884],[1.0,0.98995,0.988665],[1.0,0.990561,0.989447],[1.0,0.991184,0.990229],[1.0,0.991819,0.99101],[1.0,0.992466,0.991792],[1.0,0.993125,0.992574],[1.0,0.993797,0.993356],[1.0,0.994481,0.994137],[1.0,0.995177,0.994919],[1.0,0.995886,0.995701],[1.0,0.996606,0.996482],[1.0,0.997339,0.997264],[1.0,0.998084,0.998046],[1.0,0.998841,0.998827],[1.0,0.999611,0.999609]],"ncl_default":[[0.505882,0.121569,0.941176],[0.486275,0.117647,0.941176],[0.466667,0.113725,0.945098],[0.447059,0.105882,0.94902],[0.423529,0.101961,0.94902],[0.403922,0.094118,0.952941],[0.380392,0.090196,0.956863],[0.356863,0.082353,0.960784],[0.337255,0.078431,0.960784],[0.313726,0.070588,0.964706],[0.286275,0.066667,0.968627],[0.262745,0.058824,0.968627],[0.239216,0.054902,0.972549],[0.215686,0.047059,0.976471],[0.188235,0.043137,0.980392],[0.164706,0.035294,0.980392],[0.137255,0.027451,0.984314],[0.109804,0.023529,0.988235],[0.082353,0.015686,0.988235],[0.054902,0.011765,0.992157],[0.027451,0.003922,0.996078],[0.0,0.0,1.0],[0.011765,0.023529,0.992157],[0.023529,0.047059,0.988235],[0.039216,0.070588,0.980392],[0.05098,0.094118,0.976471],[0.066667,0.117647,0.968627],[0.078431,0.141176,0.964706],[0.090196,0.164706,0.960784],[0.101961,0.184314,0.952941],[0.113725,0.203922,0.94902],[0.129412,0.223529,0.941176],[0.141176,0.243137,0.937255],[0.152941,0.262745,0.929412],[0.164706,0.282353,0.92549],[0.176471,0.298039,0.921569],[0.188235,0.317647,0.913725],[0.2,0.333333,0.909804],[0.207843,0.34902,0.901961],[0.219608,0.364706,0.898039],[0.231373,0.380392,0.890196],[0.243137,0.396078,0.886275],[0.254902,0.411765,0.882353],[0.247059,0.415686,0.886275],[0.243137,0.419608,0.890196],[0.235294,0.423529,0.898039],[0.231373,0.431373,0.901961],[0.223529,0.435294,0.909804],[0.219608,0.443137,0.913725],[0.211765,0.45098,0.921569],[0.203922,0.454902,0.92549],[0.2,0.462745,0.929412],[0.192157,0.470588,0.937255],[0.184314,0.478431,0.941176],[0.180392,0.482353,0.94902],[0.172549,0.490196,0.952941],[0.164706,0.498039,0.960784],[0.160784,0.509804,0.964706],[0.152941,0.517647,0.968627],[0.145098,0.52549,0.976471],[0.137255,0.533333,0.980392],[0.129412,0.545098,0.988235],[0.121569,0.552941,0.992157],[0.113725,0.564706,1.0],[0.109804,0.568627,1.0],[0.105882,0.576471,1.0],[0.098039,0.584314,1.0],[0.094118,0.592157,1.0],[0.086275,0.6,1.0],[0.082353,0.607843,1.0],[0.07451,0.619608,1.0],[0.070588,0.627451,1.0],[0.066667,0.635294,1.0],[0.058824,0.643137,1.0],[0.054902,0.65098,1.0],[0.047059,0.662745,1.0],[0.043137,0.670588,1.0],[0.035294,0.678431,1.0],[0.031373,0.690196,1.0],[0.027451,0.698039,1.0],[0.019608,0.705882,1.0],[0.015686,0.717647,1.0],[0.007843,0.72549,1.0],[0.003922,0.737255,1.0],[0.0,0.74902,1.0],[0.027451,0.74902,0.996078],[0.054902,0.74902,0.992157],[0.082353,0.74902,0.988235],[0.109804,0.74902,0.984314],[0.137255,0.752941,0.984314],[0.160784,0.752941,0.980392],[0.188235,0.756863,0.976471],[0.215686,0.756863,0.972549],[0.243137,0.760784,0.972549],[0.270588,0.760784,0.968627],[0.294118,0.764706,0.964706],[0.321569,0.768627,0.960784],[0.345098,0.768627,0.960784],[0.372549,0.772549,0.956863],[0.396078,0.776471,0.952941],[0.423529,0.780392,0.94902],[0.447059,0.784314,0.94902],[0.47451,0.788235,0.945098],[0.498039,0.792157,0.941176],[0.521569,0.796078,0.937255],[0.54902,0.803922,0.937255],[0.560784,0.807843,0.937255],[0.572549,0.815686,0.937255],[0.584314,0.819608,0.941176],[0.596078,0.827451,0.941176],[0.607843,0.831373,0.945098],[0.619608,0.839216,0.945098],[0.631373,0.843137,0.94902],[0.643137,0.85098,0.94902],[0.658824,0.854902,0.952941],[0.670588,0.862745,0.952941],[0.682353,0.866667,0.956863],[0.694118,0.870588,0.956863],[0.705882,0.878431,0.960784],[0.721569,0.882353,0.960784],[0.733333,0.890196,0.964706],[0.745098,0.894118,0.964706],[0.756863,0.901961,0.968627],[0.772549,0.905882,0.968627],[0.784314,0.913725,0.972549],[0.796078,0.917647,0.972549],[0.811765,0.92549,0.976471],[1.0,1.0,0.784314],[1.0,0.996078,0.752941],[1.0,0.996078,0.72549],[1.0,0.992157,0.698039],[1.0,0.988235,0.670588],[1.0,0.984314,0.643137],[1.0,0.980392,0.615686],[1.0,0.976471,0.584314],[1.0,0.972549,0.556863],[1.0,0.968627,0.529412],[1.0,0.964706,0.501961],[1.0,0.956863,0.47451],[1.0,0.952941,0.447059],[1.0,0.945098,0.419608],[1.0,0.937255,0.388235],[1.0,0.933333,0.360784],[1.0,0.92549,0.333333],[1.0,0.917647,0.305882],[1.0,0.905882,0.278431],[1.0,0.898039,0.25098],[1.0,0.890196,0.223529],[1.0,0.882353,0.192157],[1.0,0.870588,0.184314],[1.0,0.862745,0.176471],[1.0,0.854902,0.164706],[1.0,0.843137,0.156863],[1.0,0.835294,0.14902],[1.0,0.827451,0.137255],[1.0,0.815686,0.129412],[1.0,0.807843,0.117647],[1.0,0.796078,0.109804],[1.0,0.788235,0.101961],[1.0,0.776471,0.090196],[1.0,0.764706,0.082353],[1.0,0.756863,0.07451],[1.0,0.745098,0.062745],[1.0,0.733333,0.054902],[1.0,0.721569,0.043137],[1.0,0.709804,0.035294],[1.0,0.701961,0.027451],[1.0,0.690196,0.015686],[1.0,0.678431,0.007843],[1.0,0.666667,0.0],[1.0,0.654902,0.0],[1.0,0.643137,0.0],[1.0,0.631373,0.0],[1.0,0.619608,0.0],[1.0,0.607843,0.0],[1.0,0.596078,0.0],[1.0,0.584314,0.0],[1.0,0.576471,0.0],[1.0,0.564706,0.0],[1.0,0.552941,0.0],[1.0,0.541176,0.0],[1.0,0.529412,0.0],[1.0,0.517647,0.0],[1.0,0.505882,0.0],[1.0,0.498039,0.0],[1.0,0.486275,0.0],[1.0,0.47451,0.0],[1.0,0.462745,0.0],[1.0,0.45098,0.0],[1.0,0.439216,0.0],[1.0,0.431373,0.0],[1.0,0.407843,0.0],[1.0,0.388235,0.0],[1.0,0.368627,0.0],[1.0,0.34902,0.0],[1.0,0.32549,0.0],[1.0,0.305882,0.0],[1.0,0.286275,0.0],[1.0,0.266667,0.0],[1.0,0.243137,0.0],[1.0,0.223529,0.0],[1.0,0.203922,0.0],[1.0,0.184314,0.0],[1.0,0.160784,0.0],[1.0,0.141176,0.0],[1.0,0.121569,0.0],[1.0,0.101961,0.0],[1.0,0.078431,0.0],[1.0,0.058824,0.0],[1.0,0.039216,0.0],[1.0,0.019608,0.0],[1.0,0.0,0.0],[0.988235,0.0,0.0],[0.976471,0.0,0.0],[0.968627,0.0,0.0],[0.956863,0.0,0.0],[0.945098,0.0,0.0],[0.937255,0.0,0.0],[0.92549,0.0,0.0],[0.917647,0.0,0.0],[0.905882,0.0,0.0],[0.894118,0.0,0.0],[0.886275,0.0,0.0],[0.87451,0.0,0.0],[0.862745,0.0,0.0],[0.854902,0.0,0.0],[0.843137,0.0,0.0],[0.835294,0.0,0.0],[0.823529,0.0,0.0],[0.811765,0.0,0.0],[0.803922,0.0,0.0],[0.792157,0.0,0.0],[0.784314,0.0,0.0],[0.792157,0.023529,0.023529],[0.803922,0.05098,0.05098],[0.811765,0.078431,0.078431],[0.823529,0.105882,0.105882],[0.835294,0.137255,0.137255],[0.843137,0.168627,0.168627],[0.854902,0.196078,0.196078],[0.862745,0.227451,0.227451],[0.87451,0.258824,0.258824],[0.886275,0.294118,0.294118],[0.894118,0.32549,0.32549],[0.905882,0.360784,0.360784],[0.917647,0.396078,0.396078],[0.92549,0.431373,0.431373],[0.937255,0.466667,0.466667],[0.945098,0.501961,0.501961],[0.956863,0.541176,0.541176],[0.968627,0.576471,0.576471],[0.976471,0.615686,0.615686],[0.988235,0.654902,0.654902],[1.0,0.698039,0.698039]],"tbrAvg1":[[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[17.0,0.0,27.0],[35.0,0.0,54.0],[52.0,0.0,82.0],[70.0,0.0,109.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[83.0,10.0,129.0],[78.0,20.0,123.0],[74.0,30.0,116.0],[69.0,40.0,109.0],[65.0,50.0,102.0],[61.0,60.0,96.0],[56.0,70.0,89.0],[52.0,80.0,82.0],[48.0,90.0,76.0],[43.0,99.0,69.0],[39.0,109.0,62.0],[34.0,119.0,55.0],[30.0,129.0,49.0],[26.0,139.0,42.0],[21.0,149.0,35.0],[17.0,159.0,28.0],[12.0,169.0,22.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[22.0,183.0,14.0],[35.0,187.0,13.0],[49.0,192.0,13.0],[63.0,196.0,12.0],[77.0,200.0,11.0],[90.0,204.0,10.0],[104.0,209.0,9.0],[118.0,213.0,8.0],[132.0,217.0,8.0],[145.0,221.0,7.0],[159.0,225.0,6.0],[173.0,230.0,5.0],[186.0,234.0,4.0],[200.0,238.0,3.0],[214.0,242.0,3.0],[228.0,247.0,2.0],[241.0,251.0,1.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,237.0,0.0],[255.0,219.0,0.0],[255.0,200.0,0.0],[255.0,182.0,0.0],[255.0,164.0,0.0],[255.0,146.0,0.0],[255.0,128.0,0.0],[255.0,109.0,0.0],[255.0,91.0,0.0],[255.0,73.0,0.0],[255.0,55.0,0.0],[255.0,36.0,0.0],[255.0,18.0,0.0],[255.0,0.0,0.0],[254.0,7.0,20.0],[253.0,13.0,40.0],[251.0,20.0,60.0],[250.0,27.0,80.0],[249.0,33.0,100.0],[248.0,40.0,120.0],[246.0,47.0,140.0],[245.0,53.0,160.0],[244.0,60.0,180.0],[243.0,67.0,200.0],[241.0,73.0,220.0],[240.0,80.0,240.0],[242.0,102.0,242.0],[244.0,124.0,244.0],[246.0,146.0,246.0],[248.0,168.0,248.0],[249.0,189.0,249.0],[251.0,211.0,251.0],[253.0,233.0,253.0],[255.0,255.0,255.0]],"temp_diff_1lev":[[240.0,60.0,43.0],[33.0,113.0,181.0]],"MPL_YlOrRd":[[1.0,0.997785,0.794587],[1.0,0.993356,0.78376],[1.0,0.988927,0.772934],[1.0,0.984498,0.762107],[1.0,0.980069,0.75128],[1.0,0.97564,0.740454],[1.0,0.971211,0.729627],[1.0,0.966782,0.7188],[1.0,0.962353,0.707974],[1.0,0.960138,0.702561],[1.0,0.953495,0.686321],[1.0,0.95128,0.680907],[1.0,0.944637,0.664667],[1.0,0.942422,0.659254],[1.0,0.935779,0.643014],[1.0,0.933564,0.637601],[0.999862,0.926644,0.621638],[0.999616,0.921722,0.611303],[0.999493,0.919262,0.606136],[0.999123,0.91188,0.590634],[0.998877,0.906959,0.5803],[0.998631,0.902038,0.569965],[0.998508,0.899577,0.564798],[0.998139,0.892195,0.549296],[0.997893,0.887274,0.538962],[0.997647,0.882353,0.528627],[0.997524,0.879892,0.52346],[0.997155,0.872511,0.507958],[0.996909,0.867589,0.497624],[0.996663,0.862668,0.48729],[0.99654,0.860208,0.482122],[0.996171,0.852826,0.466621],[0.996078,0.844983,0.456286],[0.996078,0.835386,0.445952],[0.996078,0.82579,0.435617],[0.996078,0.816194,0.425283],[0.996078,0.806597,0.414948],[0.996078,0.801799,0.409781],[0.996078,0.787405,0.394279],[0.996078,0.777809,0.383945],[0.996078,0.768212,0.37361],[0.996078,0.758616,0.363276],[0.996078,0.74902,0.352941],[0.996078,0.739423,0.342607],[0.996078,0.729827,0.332272],[0.996078,0.725029,0.327105],[0.996078,0.710634,0.311603],[0.996078,0.701038,0.301269],[0.995909,0.69178,0.295333],[0.995663,0.682676,0.291396],[0.995417,0.673572,0.287459],[0.995171,0.664468,0.283522],[0.994925,0.655363,0.279585],[0.994802,0.650811,0.277616],[0.994433,0.637155,0.271711],[0.994187,0.628051,0.267774],[0.993941,0.618947,0.263837],[0.993695,0.609842,0.2599],[0.993449,0.600738,0.255963],[0.993203,0.591634,0.252026],[0.992957,0.58253,0.248089],[0.992834,0.577978,0.246121],[0.992464,0.564321,0.240215],[0.992218,0.555217,0.236278],[0.991972,0.541315,0.231972],[0.991726,0.525813,0.227543],[0.99148,0.510311,0.223114],[0.991234,0.49481,0.218685],[0.990988,0.479308,0.214256],[0.990742,0.463806,0.209827],[0.990496,0.448305,0.205398],[0.99025,0.432803,0.200969],[0.990004,0.417301,0.19654],[0.989758,0.401799,0.192111],[0.989512,0.386298,0.187682],[0.989389,0.378547,0.185467],[0.98902,0.355294,0.178824],[0.988774,0.339792,0.174394],[0.988527,0.324291,0.169965],[0.988281,0.308789,0.165536],[0.983237,0.295486,0.161907],[0.977086,0.282691,0.158462],[0.970934,0.269896,0.155017],[0.964783,0.257101,0.151572],[0.958631,0.244306,0.148128],[0.95248,0.231511,0.144683],[0.946328,0.218716,0.141238],[0.940177,0.205921,0.137793],[0.934025,0.193126,0.134348],[0.927874,0.180331,0.130904],[0.921722,0.167536,0.127459],[0.918647,0.161138,0.125736],[0.909419,0.141945,0.120569],[0.903268,0.12915,0.117124],[0.897116,0.116355,0.113679],[0.890965,0.10356,0.110235],[0.882015,0.096363,0.111957],[0.872664,0.089965,0.114418],[0.863314,0.083568,0.116878],[0.853964,0.07717,0.119339],[0.844614,0.070773,0.121799],[0.835263,0.064375,0.12426],[0.825913,0.057978,0.12672],[0.816563,0.05158,0.129181],[0.807213,0.045183,0.131642],[0.797862,0.038785,0.134102],[0.788512,0.032388,0.136563],[0.783837,0.029189,0.137793],[0.769812,0.019592,0.141484],[0.760461,0.013195,0.143945],[0.751111,0.006797,0.146405],[0.741761,0.0004,0.148866],[0.727105,0.0,0.14902],[0.712095,0.0,0.14902],[0.697086,0.0,0.14902],[0.682076,0.0,0.14902],[0.667067,0.0,0.14902],[0.652057,0.0,0.14902],[0.637047,0.0,0.14902],[0.622038,0.0,0.14902],[0.607028,0.0,0.14902],[0.592018,0.0,0.14902],[0.577009,0.0,0.14902],[0.569504,0.0,0.14902],[0.54699,0.0,0.14902],[0.53198,0.0,0.14902],[0.51697,0.0,0.14902],[0.501961,0.0,0.14902]],"GMT_wysiwygcont":[[0.25098,0.0,0.276078],[0.25098,0.0,0.326275],[0.25098,0.0,0.376471],[0.25098,0.0,0.426667],[0.25098,0.0,0.476863],[0.25098,0.0,0.527059],[0.25098,0.0,0.577255],[0.25098,0.0,0.627451],[0.25098,0.0,0.677647],[0.25098,0.0,0.727843],[0.238431,0.012549,0.765294],[0.213333,0.037647,0.79],[0.188235,0.062745,0.814706],[0.163137,0.087843,0.839412],[0.138039,0.112941,0.864118],[0.112941,0.138039,0.888824],[0.087843,0.163137,0.913529],[0.062745,0.188235,0.938235],[0.037647,0.213333,0.962941],[0.012549,0.238431,0.987647],[0.0,0.263529,1.0],[0.0,0.288627,1.0],[0.0,0.313725,1.0],[0.0,0.338824,1.0],[0.0,0.363922,1.0],[0.0,0.38902,1.0],[0.0,0.414118,1.0],[0.0,0.439216,1.0],[0.0,0.464314,1.0],[0.0,0.489412,1.0],[0.0,0.508235,1.0],[0.0,0.520784,1.0],[0.0,0.533333,1.0],[0.0,0.545882,1.0],[0.0,0.558431,1.0],[0.0,0.57098,1.0],[0.0,0.583529,1.0],[0.0,0.596078,1.0],[0.0,0.608627,1.0],[0.0,0.621176,1.0],[0.012549,0.633725,1.0],[0.037647,0.646275,1.0],[0.062745,0.658824,1.0],[0.087843,0.671373,1.0],[0.112941,0.683922,1.0],[0.138039,0.696471,1.0],[0.163137,0.70902,1.0],[0.188235,0.721569,1.0],[0.213333,0.734118,1.0],[0.238431,0.746667,1.0],[0.25098,0.759216,1.0],[0.25098,0.771765,1.0],[0.25098,0.784314,1.0],[0.25098,0.796863,1.0],[0.25098,0.809412,1.0],[0.25098,0.821961,1.0],[0.25098,0.83451,1.0],[0.25098,0.847059,1.0],[0.25098,0.859608,1.0],[0.25098,0.872157,1.0],[0.25098,0.88451,1.0],[0.25098,0.896667,1.0],[0.25098,0.908824,1.0],[0.25098,0.92098,1.0],[0.25098,0.933137,1.0],[0.25098,0.945294,1.0],[0.25098,0.957451,1.0],[0.25098,0.969608,1.0],[0.25098,0.981765,1.0],[0.25098,0.993922,1.0],[0.25098,1.0,0.987647],[0.25098,1.0,0.962941],[0.25098,1.0,0.938235],[0.25098,1.0,0.913529],[0.25098,1.0,0.888824],[0.25098,1.0,0.864118],[0.25098,1.0,0.839412],[0.25098,1.0,0.814706],[0.25098,1.0,0.79],[0.25098,1.0,0.765294],[0.25098,1.0,0.727843],[0.25098,1.0,0.677647],[0.25098,1.0,0.627451],[0.25098,1.0,0.577255],[0.25098,1.0,0.527059],[0.25098,1.0,0.476863],[0.25098,1.0,0.426667],[0.25098,1.0,0.376471],[0.25098,1.0,0.326275],[0.25098,1.0,0.276078],[0.263529,1.0,0.25098],[0.288627,1.0,0.25098],[0.313725,1.0,0.25098],[0.338824,1.0,0.25098],[0.363922,1.0,0.25098],[0.38902,1.0,0.25098],[0.414118,1.0,0.25098],[0.439216,1.0,0.25098],[0.464314,1.0,0.25098],[0.489412,1.0,0.25098],[0.51451,1.0,0.25098],[0.539608,1.0,0.25098],[0.564706,1.0,0.25098],[0.589804,1.0,0.25098],[0.614902,1.0,0.25098],[0.64,1.0,0.25098],[0.665098,1.0,0.25098],[0.690196,1.0,0.25098],[0.715294,1.0,0.25098],[0.740392,1.0,0.25098],[0.765294,1.0,0.25098],[0.79,1.0,0.25098],[0.814706,1.0,0.25098],[0.839412,1.0,0.25098],[0.864118,1.0,0.25098],[0.888824,1.0,0.25098],[0.913529,1.0,0.25098],[0.938235,1.0,0.25098],[0.962941,1.0,0.25098],[0.987647,1.0,0.25098],[1.0,0.993922,0.25098],[1.0,0.981765,0.25098],[1.0,0.969608,0.25098],[1.0,0.957451,0.25098],[1.0,0.945294,0.25098],[1.0,0.933137,0.25098],[1.0,0.92098,0.25098],[1.0,0.908824,0.25098],[1.0,0.896667,0.25098],[1.0,0.88451,0.25098],[1.0,0.865882,0.25098],[1.0,0.840784,0.25098],[1.0,0.815686,0.25098],[1.0,0.790588,0.25098],[1.0,0.76549,0.25098],[1.0,0.740392,0.25098],[1.0,0.715294,0.25098],[1.0,0.690196,0.25098],[1.0,0.665098,0.25098],[1.0,0.64,0.25098],[1.0,0.614902,0.25098],[1.0,0.589804,0.25098],[1.0,0.564706,0.25098],[1.0,0.539608,0.25098],[1.0,0.51451,0.25098],[1.0,0.489412,0.25098],[1.0,0.464314,0.25098],[1.0,0.439216,0.25098],[1.0,0.414118,0.25098],[1.0,0.38902,0.25098],[1.0,0.363922,0.25098],[1.0,0.338824,0.25098],[1.0,0.313725,0.25098],[1.0,0.288627,0.25098],[1.0,0.263529,0.25098],[1.0,0.238431,0.25098],[1.0,0.213333,0.25098],[1.0,0.188235,0.25098],[1.0,0.163137,0.25098],[1.0,0.138039,0.25098],[1.0,0.138039,0.276078],[1.0,0.163137,0.326275],[1.0,0.188235,0.376471],[1.0,0.213333,0.426667],[1.0,0.238431,0.476863],[1.0,0.263529,0.527059],[1.0,0.288627,0.577255],[1.0,0.313725,0.627451],[1.0,0.338824,0.677647],[1.0,0.363922,0.727843],[1.0,0.38902,0.765294],[1.0,0.414118,0.79],[1.0,0.439216,0.814706],[1.0,0.464314,0.839412],[1.0,0.489412,0.864118],[1.0,0.51451,0.888824],[1.0,0.539608,0.913529],[1.0,0.564706,0.938235],[1.0,0.589804,0.962941],[1.0,0.614902,0.987647],[1.0,0.64,0.994118],[1.0,0.665098,0.982353],[1.0,0.690196,0.970588],[1.0,0.715294,0.958824],[1.0,0.740392,0.947059],[1.0,0.76549,0.935294],[1.0,0.790588,0.923529],[1.0,0.815686,0.911765],[1.0,0.840784,0.9],[1.0,0.865882,0.888235],[1.0,0.883343,1.0],[1.0,0.895623,1.0],[1.0,0.907903,1.0],[1.0,0.920182,1.0],[1.0,0.932462,1.0],[1.0,0.944742,1.0],[1.0,0.957021,1.0],[1.0,0.969301,1.0],[1.0,0.981581,1.0],[1.0,0.99386,1.0]],"tbrStd1":[[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[10.0,0.0,15.0],[19.0,0.0,30.0],[29.0,0.0,45.0],[39.0,0.0,60.0],[48.0,0.0,76.0],[58.0,0.0,91.0],[68.0,0.0,106.0],[77.0,0.0,121.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[82.0,12.0,128.0],[76.0,24.0,120.0],[71.0,36.0,112.0],[66.0,48.0,104.0],[61.0,60.0,96.0],[55.0,72.0,88.0],[50.0,84.0,80.0],[45.0,95.0,71.0],[40.0,107.0,63.0],[34.0,119.0,55.0],[29.0,131.0,47.0],[24.0,143.0,39.0],[19.0,155.0,31.0],[13.0,167.0,23.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[30.0,186.0,14.0],[53.0,193.0,12.0],[75.0,200.0,11.0],[98.0,207.0,10.0],[120.0,214.0,8.0],[143.0,220.0,7.0],[165.0,227.0,5.0],[188.0,234.0,4.0],[210.0,241.0,3.0],[233.0,248.0,1.0],[255.0,255.0,0.0],[255.0,237.0,0.0],[255.0,219.0,0.0],[255.0,200.0,0.0],[255.0,182.0,0.0],[255.0,164.0,0.0],[255.0,146.0,0.0],[255.0,128.0,0.0],[255.0,109.0,0.0],[255.0,91.0,0.0],[255.0,73.0,0.0],[255.0,55.0,0.0],[255.0,36.0,0.0],[255.0,18.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[250.0,27.0,80.0],[245.0,53.0,160.0],[240.0,80.0,240.0],[243.0,115.0,243.0],[246.0,150.0,246.0],[249.0,185.0,249.0],[252.0,220.0,252.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0]],"MPL_Set3":[[0.572226,0.834894,0.777009],[0.610796,0.849781,0.770242],[0.649366,0.864667,0.763476],[0.687935,0.879554,0.756709],[0.726505,0.894441,0.749942],[0.765075,0.909327,0.743176],[0.803645,0.924214,0.736409],[0.842215,0.9391,0.729642],[0.880784,0.953987,0.722876],[0.900069,0.96143,0.719493],[0.957924,0.98376,0.709343],[0.977209,0.991203,0.705959],[0.980008,0.978777,0.713956],[0.969012,0.967105,0.720554],[0.936025,0.932088,0.740346],[0.925029,0.920415,0.746943],[0.892042,0.885398,0.766736],[0.87005,0.862053,0.779931],[0.859054,0.850381,0.786528],[0.826067,0.815363,0.806321],[0.804075,0.792018,0.819516],[0.782084,0.768674,0.832711],[0.771088,0.757001,0.839308],[0.751665,0.723168,0.843706],[0.772303,0.703545,0.80852],[0.792941,0.683922,0.773333],[0.80326,0.67411,0.75574],[0.834218,0.644675,0.70296],[0.854856,0.625052,0.667774],[0.875494,0.605429,0.632587],[0.885813,0.595617,0.614994],[0.91677,0.566182,0.562215],[0.937409,0.546559,0.527028],[0.958047,0.526936,0.491842],[0.978685,0.507313,0.456655],[0.954048,0.514018,0.470927],[0.912434,0.530596,0.503745],[0.891626,0.538885,0.520154],[0.829204,0.563752,0.569381],[0.787589,0.580331,0.602199],[0.745975,0.596909,0.635017],[0.70436,0.613487,0.667835],[0.662745,0.630065,0.700654],[0.62113,0.646644,0.733472],[0.579516,0.663222,0.76629],[0.558708,0.671511,0.782699],[0.507728,0.694256,0.822238],[0.550019,0.695271,0.784006],[0.592311,0.696286,0.745775],[0.634602,0.697301,0.707543],[0.676894,0.698316,0.669312],[0.719185,0.699331,0.63108],[0.761476,0.700346,0.592849],[0.782622,0.700854,0.573733],[0.846059,0.702376,0.516386],[0.888351,0.703391,0.478155],[0.930642,0.704406,0.439923],[0.972933,0.705421,0.401692],[0.978501,0.713633,0.385606],[0.953464,0.727843,0.387974],[0.928428,0.742053,0.390342],[0.915909,0.749158,0.391526],[0.878354,0.770473,0.395079],[0.853318,0.784683,0.397447],[0.828281,0.798893,0.399815],[0.803245,0.813103,0.402184],[0.778208,0.827313,0.404552],[0.753172,0.841523,0.40692],[0.728135,0.855732,0.409289],[0.703099,0.869942,0.411657],[0.725536,0.865098,0.451811],[0.750235,0.859346,0.493764],[0.774933,0.853595,0.535717],[0.799631,0.847843,0.57767],[0.824329,0.842092,0.619623],[0.836678,0.839216,0.6406],[0.873725,0.830588,0.703529],[0.898424,0.824837,0.745483],[0.923122,0.819085,0.787436],[0.94782,0.813333,0.829389],[0.972518,0.807582,0.871342],[0.983929,0.805398,0.896563],[0.972088,0.809458,0.892503],[0.960246,0.813518,0.888443],[0.948404,0.817578,0.884383],[0.936563,0.821638,0.880323],[0.924721,0.825698,0.876263],[0.91288,0.829758,0.872203],[0.901038,0.833818,0.868143],[0.889196,0.837878,0.864083],[0.877355,0.841938,0.860023],[0.871434,0.843968,0.857993],[0.853672,0.850058,0.851903],[0.843399,0.827712,0.84366],[0.833587,0.797601,0.834187],[0.823775,0.767489,0.824714],[0.813964,0.737378,0.81524],[0.804152,0.707266,0.805767],[0.794341,0.677155,0.796294],[0.784529,0.647043,0.78682],[0.774717,0.616932,0.777347],[0.764906,0.58682,0.767874],[0.755094,0.556709,0.758401],[0.745283,0.526597,0.748927],[0.738239,0.508543,0.741669],[0.743652,0.544744,0.744375],[0.749066,0.580946,0.747082],[0.751772,0.599047,0.748435],[0.759892,0.653349,0.752495],[0.765306,0.68955,0.755202],[0.770719,0.725752,0.757909],[0.776132,0.761953,0.760615],[0.781546,0.798155,0.763322],[0.786959,0.834356,0.766028],[0.792372,0.870557,0.768735],[0.797785,0.906759,0.771442],[0.810196,0.921968,0.755356],[0.827451,0.922645,0.726259],[0.844706,0.923322,0.697163],[0.861961,0.923998,0.668066],[0.879216,0.924675,0.63897],[0.896471,0.925352,0.609873],[0.913725,0.926028,0.580777],[0.922353,0.926367,0.566228],[0.948235,0.927382,0.522584],[0.96549,0.928058,0.493487],[0.982745,0.928735,0.464391],[1.0,0.929412,0.435294]],"GMT_globe":[[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.6,0.0,1.0],[0.533333,0.066667,1.0],[0.533333,0.066667,1.0],[0.533333,0.066667,1.0],[0.533333,0.066667,1.0],[0.533333,0.066667,1.0],[0.533333,0.066667,1.0],[0.533333,0.066667,1.0],[0.466667,0.133333,1.0],[0.466667,0.133333,1.0],[0.466667,0.133333,1.0],[0.466667,0.133333,1.0],[0.466667,0.133333,1.0],[0.466667,0.133333,1.0],[0.4,0.2,1.0],[0.4,0.2,1.0],[0.4,0.2,1.0],[0.4,0.2,1.0],[0.4,0.2,1.0],[0.4,0.2,1.0],[0.333333,0.266667,1.0],[0.333333,0.266667,1.0],[0.333333,0.266667,1.0],[0.333333,0.266667,1.0],[0.333333,0.266667,1.0],[0.333333,0.266667,1.0],[0.333333,0.266667,1.0],[0.266667,0.333333,1.0],[0.266667,0.333333,1.0],[0.266667,0.333333,1.0],[0.266667,0.333333,1.0],[0.266667,0.333333,1.0],[0.266667,0.333333,1.0],[0.2,0.4,1.0],[0.2,0.4,1.0],[0.2,0.4,1.0],[0.2,0.4,1.0],[0.2,0.4,1.0],[0.2,0.4,1.0],[0.2,0.4,1.0],[0.133333,0.466667,1.0],[0.133333,0.466667,1.0],[0.133333,0.466667,1.0],[0.133333,0.466667,1.0],[0.133333,0.466667,1.0],[0.133333,0.466667,1.0],[0.066667,0.533333,1.0],[0.066667,0.533333,1.0],[0.066667,0.533333,1.0],[0.066667,0.533333,1.0],[0.066667,0.533333,1.0],[0.066667,0.533333,1.0],[0.0,0.6,1.0],[0.0,0.6,1.0],[0.0,0.6,1.0],[0.0,0.6,1.0],[0.0,0.6,1.0],[0.0,0.6,1.0],[0.0,0.6,1.0],[0.105882,0.643137,1.0],[0.105882,0.643137,1.0],[0.105882,0.643137,1.0],[0.105882,0.643137,1.0],[0.105882,0.643137,1.0],[0.105882,0.643137,1.0],[0.211765,0.686275,1.0],[0.211765,0.686275,1.0],[0.211765,0.686275,1.0],[0.211765,0.686275,1.0],[0.211765,0.686275,1.0],[0.211765,0.686275,1.0],[0.211765,0.686275,1.0],[0.317647,0.729412,1.0],[0.317647,0.729412,1.0],[0.317647,0.729412,1.0],[0.317647,0.729412,1.0],[0.317647,0.729412,1.0],[0.317647,0.729412,1.0],[0.423529,0.772549,1.0],[0.423529,0.772549,1.0],[0.423529,0.772549,1.0],[0.423529,0.772549,1.0],[0.423529,0.772549,1.0],[0.423529,0.772549,1.0],[0.52549,0.815686,1.0],[0.52549,0.815686,1.0],[0.52549,0.815686,1.0],[0.52549,0.815686,1.0],[0.52549,0.815686,1.0],[0.52549,0.815686,1.0],[0.52549,0.815686,1.0],[0.631373,0.858824,1.0],[0.631373,0.858824,1.0],[0.631373,0.858824,1.0],[0.631373,0.858824,1.0],[0.631373,0.858824,1.0],[0.631373,0.858824,1.0],[0.737255,0.901961,1.0],[0.737255,0.901961,1.0],[0.737255,0.901961,1.0],[0.737255,0.901961,1.0],[0.737255,0.901961,1.0],[0.737255,0.901961,1.0],[0.737255,0.901961,1.0],[0.843137,0.945098,1.0],[0.843137,0.945098,1.0],[0.843137,0.945098,1.0],[0.945098,0.988235,1.0],[0.945098,0.988235,1.0],[0.945098,0.988235,1.0],[0.2,0.553788,0.153788],[0.291667,0.816176,0.429657],[0.708333,0.889706,0.564461],[0.798611,0.886438,0.609988],[0.868056,0.878268,0.649816],[0.9375,0.870098,0.689645],[0.999265,0.861642,0.722549],[0.991912,0.850613,0.693137],[0.984559,0.839583,0.663725],[0.977206,0.828554,0.634314],[0.969853,0.817525,0.604902],[0.9625,0.806495,0.57549],[0.955147,0.795466,0.546078],[0.947365,0.784436,0.516238],[0.9394,0.773407,0.486213],[0.931434,0.762377,0.456189],[0.923468,0.751348,0.426164],[0.915502,0.740319,0.39614],[0.907537,0.729289,0.366115],[0.899571,0.71826,0.336091],[0.891605,0.70723,0.306066],[0.88364,0.696201,0.276042],[0.875674,0.685172,0.246017],[0.867708,0.674142,0.215993],[0.859743,0.663113,0.185968],[0.851777,0.652083,0.155944],[0.823958,0.644363,0.148529],[0.793934,0.63701,0.143627],[0.763909,0.629657,0.138725],[0.733885,0.622304,0.133824],[0.70386,0.614951,0.128922],[0.673836,0.607598,0.12402],[0.657598,0.600858,0.11973],[0.655147,0.59473,0.116054],[0.652696,0.588603,0.112377],[0.650245,0.582475,0.108701],[0.647794,0.576348,0.105025],[0.645343,0.570221,0.101348],[0.643015,0.564093,0.097672],[0.641789,0.557966,0.093995],[0.640564,0.551838,0.090319],[0.639338,0.545711,0.086642],[0.638113,0.539583,0.082966],[0.636887,0.533456,0.079289],[0.635662,0.527328,0.075613],[0.634007,0.520772,0.071936],[0.632169,0.514032,0.06826],[0.630331,0.507292,0.064583],[0.628493,0.500551,0.060907],[0.626654,0.493811,0.05723],[0.624816,0.487071,0.053554],[0.622978,0.480515,0.049877],[0.62114,0.474387,0.046201],[0.619301,0.46826,0.042525],[0.617463,0.462132,0.038848],[0.615625,0.456005,0.035172],[0.613787,0.449877,0.031495],[0.611949,0.44375,0.027819],[0.61011,0.437071,0.023591],[0.608272,0.430331,0.019301],[0.606434,0.423591,0.015012],[0.604596,0.41685,0.010723],[0.602757,0.41011,0.006434],[0.600919,0.40337,0.002145],[0.602757,0.396017,0.027267],[0.608272,0.388051,0.081801],[0.613787,0.380086,0.136336],[0.619301,0.37212,0.19087],[0.624816,0.364154,0.245404],[0.630331,0.356189,0.299939],[0.636275,0.350797,0.350797],[0.646078,0.368566,0.368566],[0.655882,0.386336,0.386336],[0.665686,0.404105,0.404105],[0.67549,0.421875,0.421875],[0.685294,0.439645,0.439645],[0.695098,0.457414,0.457414],[0.700184,0.475184,0.475184],[0.703248,0.492953,0.492953],[0.706311,0.510723,0.510723],[0.709375,0.528493,0.528493],[0.712439,0.546262,0.546262],[0.715502,0.564032,0.564032],[0.719669,0.581801,0.581801],[0.726409,0.599571,0.599571],[0.73315,0.617341,0.617341],[0.73989,0.63511,0.63511],[0.74663,0.65288,0.65288],[0.75337,0.67065,0.67065],[0.76011,0.688419,0.688419],[0.766299,0.705637,0.705637],[0.772426,0.722794,0.722794],[0.778554,0.739951,0.739951],[0.784681,0.757108,0.757108],[0.790809,0.774265,0.774265],[0.796936,0.791422,0.791422],[0.807659,0.807659,0.807659],[0.822978,0.822978,0.822978],[0.838297,0.838297,0.838297],[0.853615,0.853615,0.853615],[0.868934,0.868934,0.868934],[0.884252,0.884252,0.884252],[0.898836,0.898836,0.898836],[0.906801,0.906801,0.906801],[0.914767,0.914767,0.914767],[0.922733,0.922733,0.922733],[0.930699,0.930699,0.930699],[0.938664,0.938664,0.938664],[0.94663,0.94663,0.94663],[0.954596,0.954596,0.954596],[0.962561,0.962561,0.962561],[0.970527,0.970527,0.970527],[0.978493,0.978493,0.978493],[0.986458,0.986458,0.986458],[0.994424,0.994424,0.994424],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0],[1.0,1.0,1.0]],"tbr_240-300":[[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[10.0,0.0,15.0],[19.0,0.0,30.0],[29.0,0.0,45.0],[39.0,0.0,60.0],[48.0,0.0,76.0],[58.0,0.0,91.0],[68.0,0.0,106.0],[77.0,0.0,121.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[85.0,5.0,133.0],[83.0,10.0,129.0],[80.0,15.0,126.0],[78.0,20.0,123.0],[76.0,25.0,119.0],[74.0,30.0,116.0],[72.0,35.0,112.0],[69.0,40.0,109.0],[67.0,45.0,106.0],[65.0,50.0,102.0],[63.0,55.0,99.0],[61.0,60.0,96.0],[58.0,65.0,92.0],[56.0,70.0,89.0],[54.0,75.0,86.0],[52.0,80.0,82.0],[50.0,85.0,79.0],[48.0,90.0,76.0],[45.0,94.0,72.0],[43.0,99.0,69.0],[41.0,104.0,65.0],[39.0,109.0,62.0],[37.0,114.0,59.0],[34.0,119.0,55.0],[32.0,124.0,52.0],[30.0,129.0,49.0],[28.0,134.0,45.0],[26.0,139.0,42.0],[23.0,144.0,39.0],[21.0,149.0,35.0],[19.0,154.0,32.0],[17.0,159.0,28.0],[15.0,164.0,25.0],[12.0,169.0,22.0],[10.0,174.0,18.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[15.0,181.0,15.0],[22.0,183.0,14.0],[29.0,185.0,14.0],[35.0,187.0,13.0],[42.0,190.0,13.0],[49.0,192.0,13.0],[56.0,194.0,12.0],[63.0,196.0,12.0],[70.0,198.0,11.0],[77.0,200.0,11.0],[83.0,202.0,10.0],[90.0,204.0,10.0],[97.0,206.0,10.0],[104.0,209.0,9.0],[111.0,211.0,9.0],[118.0,213.0,8.0],[125.0,215.0,8.0],[132.0,217.0,8.0],[138.0,219.0,7.0],[145.0,221.0,7.0],[152.0,223.0,6.0],[159.0,225.0,6.0],[166.0,228.0,5.0],[173.0,230.0,5.0],[180.0,232.0,5.0],[186.0,234.0,4.0],[193.0,236.0,4.0],[200.0,238.0,3.0],[207.0,240.0,3.0],[214.0,242.0,3.0],[221.0,244.0,2.0],[228.0,247.0,2.0],[234.0,249.0,1.0],[241.0,251.0,1.0],[248.0,253.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,246.0,0.0],[255.0,237.0,0.0],[255.0,229.0,0.0],[255.0,220.0,0.0],[255.0,211.0,0.0],[255.0,202.0,0.0],[255.0,193.0,0.0],[255.0,185.0,0.0],[255.0,176.0,0.0],[255.0,167.0,0.0],[255.0,158.0,0.0],[255.0,149.0,0.0],[255.0,141.0,0.0],[255.0,132.0,0.0],[255.0,123.0,0.0],[255.0,114.0,0.0],[255.0,106.0,0.0],[255.0,97.0,0.0],[255.0,88.0,0.0],[255.0,79.0,0.0],[255.0,70.0,0.0],[255.0,62.0,0.0],[255.0,53.0,0.0],[255.0,44.0,0.0],[255.0,35.0,0.0],[255.0,26.0,0.0],[255.0,18.0,0.0],[255.0,9.0,0.0],[255.0,0.0,0.0],[254.0,3.0,10.0],[254.0,7.0,21.0],[253.0,10.0,31.0],[252.0,14.0,42.0],[252.0,17.0,52.0],[251.0,21.0,63.0],[250.0,24.0,73.0],[250.0,28.0,83.0],[249.0,31.0,94.0],[248.0,35.0,104.0],[248.0,38.0,115.0],[247.0,42.0,125.0],[247.0,45.0,136.0],[246.0,49.0,146.0],[245.0,52.0,157.0],[245.0,56.0,167.0],[244.0,59.0,177.0],[243.0,63.0,188.0],[243.0,66.0,198.0],[242.0,70.0,209.0],[241.0,73.0,219.0],[241.0,77.0,230.0],[240.0,80.0,240.0],[241.0,90.0,241.0],[242.0,101.0,242.0],[243.0,111.0,243.0],[244.0,121.0,244.0],[244.0,131.0,244.0],[245.0,142.0,245.0],[246.0,152.0,246.0],[247.0,162.0,247.0],[248.0,173.0,248.0],[249.0,183.0,249.0],[250.0,193.0,250.0],[251.0,204.0,251.0],[251.0,214.0,251.0],[252.0,224.0,252.0],[253.0,234.0,253.0],[254.0,245.0,254.0],[255.0,255.0,255.0]],"matlab_lines":[[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0],[0.0,127.0,0.0],[255.0,0.0,0.0],[0.0,191.0,191.0],[191.0,0.0,191.0],[191.0,191.0,0.0],[63.0,63.0,63.0],[0.0,0.0,255.0]],"precip_11lev":[[255.0,255.0,255.0],[237.0,250.0,194.0],[205.0,255.0,205.0],[153.0,240.0,178.0],[83.0,189.0,159.0],[50.0,166.0,150.0],[50.0,150.0,180.0],[5.0,112.0,176.0],[5.0,80.0,140.0],[10.0,31.0,150.0],[44.0,2.0,70.0],[106.0,44.0,90.0]],"WhiteYellowOrangeRed":[[255.0,255.0,255.0],[255.0,255.0,253.0],[255.0,254.0,251.0],[255.0,254.0,249.0],[255.0,253.0,247.0],[255.0,253.0,245.0],[255.0,253.0,243.0],[255.0,252.0,242.0],[255.0,252.0,240.0],[254.0,252.0,238.0],[254.0,251.0,236.0],[254.0,251.0,234.0],[254.0,250.0,232.0],[254.0,250.0,230.0],[254.0,250.0,228.0],[254.0,249.0,226.0],[254.0,249.0,224.0],[254.0,248.0,222.0],[254.0,248.0,220.0],[254.0,248.0,218.0],[254.0,247.0,217.0],[254.0,247.0,215.0],[254.0,247.0,213.0],[254.0,246.0,211.0],[254.0,246.0,209.0],[254.0,245.0,207.0],[254.0,245.0,205.0],[253.0,245.0,203.0],[253.0,244.0,201.0],[253.0,244.0,199.0],[253.0,243.0,197.0],[253.0,243.0,195.0],[253.0,243.0,193.0],[253.0,242.0,192.0],[253.0,242.0,190.0],[253.0,242.0,188.0],[253.0,241.0,186.0],[253.0,241.0,184.0],[253.0,240.0,182.0],[253.0,240.0,180.0],[253.0,240.0,178.0],[253.0,239.0,176.0],[253.0,239.0,174.0],[253.0,238.0,172.0],[252.0,238.0,170.0],[252.0,238.0,168.0],[252.0,237.0,167.0],[252.0,237.0,165.0],[252.0,237.0,163.0],[252.0,236.0,161.0],[252.0,236.0,159.0],[252.0,235.0,155.0],[252.0,234.0,153.0],[252.0,233.0,151.0],[252.0,232.0,149.0],[252.0,230.0,147.0],[252.0,229.0,145.0],[252.0,228.0,143.0],[252.0,227.0,141.0],[252.0,226.0,139.0],[252.0,225.0,137.0],[252.0,224.0,135.0],[252.0,223.0,133.0],[252.0,221.0,131.0],[253.0,220.0,129.0],[253.0,219.0,127.0],[253.0,218.0,125.0],[253.0,217.0,123.0],[253.0,216.0,121.0],[253.0,215.0,119.0],[253.0,213.0,117.0],[253.0,212.0,115.0],[253.0,211.0,113.0],[253.0,210.0,111.0],[253.0,209.0,109.0],[253.0,208.0,107.0],[253.0,207.0,105.0],[253.0,206.0,103.0],[253.0,204.0,100.0],[253.0,203.0,98.0],[253.0,202.0,96.0],[253.0,201.0,94.0],[253.0,200.0,92.0],[253.0,199.0,90.0],[253.0,198.0,88.0],[253.0,196.0,86.0],[253.0,195.0,84.0],[253.0,194.0,82.0],[253.0,193.0,80.0],[253.0,192.0,78.0],[254.0,191.0,76.0],[254.0,190.0,74.0],[254.0,188.0,72.0],[254.0,187.0,70.0],[254.0,186.0,68.0],[254.0,185.0,66.0],[254.0,184.0,64.0],[254.0,183.0,62.0],[254.0,182.0,60.0],[254.0,181.0,58.0],[254.0,179.0,56.0],[254.0,176.0,50.0],[254.0,175.0,50.0],[254.0,173.0,50.0],[253.0,172.0,49.0],[253.0,171.0,49.0],[253.0,169.0,49.0],[253.0,168.0,49.0],[253.0,167.0,49.0],[253.0,165.0,49.0],[252.0,164.0,48.0],[252.0,163.0,48.0],[252.0,161.0,48.0],[252.0,160.0,48.0],[252.0,159.0,48.0],[252.0,157.0,48.0],[251.0,156.0,47.0],[251.0,154.0,47.0],[251.0,153.0,47.0],[251.0,152.0,47.0],[251.0,150.0,47.0],[251.0,149.0,47.0],[250.0,148.0,46.0],[250.0,146.0,46.0],[250.0,145.0,46.0],[250.0,144.0,46.0],[250.0,142.0,46.0],[250.0,141.0,46.0],[249.0,140.0,45.0],[249.0,138.0,45.0],[249.0,137.0,45.0],[249.0,136.0,45.0],[249.0,134.0,45.0],[248.0,133.0,44.0],[248.0,132.0,44.0],[248.0,130.0,44.0],[248.0,129.0,44.0],[248.0,128.0,44.0],[248.0,126.0,44.0],[247.0,125.0,43.0],[247.0,124.0,43.0],[247.0,122.0,43.0],[247.0,121.0,43.0],[247.0,119.0,43.0],[247.0,118.0,43.0],[246.0,117.0,42.0],[246.0,115.0,42.0],[246.0,114.0,42.0],[246.0,113.0,42.0],[246.0,111.0,42.0],[246.0,110.0,42.0],[245.0,109.0,41.0],[245.0,106.0,41.0],[244.0,105.0,41.0],[244.0,103.0,41.0],[243.0,102.0,41.0],[242.0,100.0,41.0],[242.0,99.0,41.0],[241.0,97.0,41.0],[240.0,96.0,41.0],[240.0,94.0,41.0],[239.0,93.0,41.0],[238.0,92.0,41.0],[238.0,90.0,41.0],[237.0,89.0,41.0],[237.0,87.0,41.0],[236.0,86.0,41.0],[235.0,84.0,41.0],[235.0,83.0,41.0],[234.0,81.0,41.0],[233.0,80.0,41.0],[233.0,79.0,41.0],[232.0,77.0,41.0],[231.0,76.0,41.0],[231.0,74.0,41.0],[230.0,73.0,41.0],[229.0,71.0,41.0],[229.0,70.0,41.0],[228.0,69.0,41.0],[227.0,67.0,40.0],[227.0,66.0,40.0],[226.0,64.0,40.0],[225.0,63.0,40.0],[225.0,61.0,40.0],[224.0,60.0,40.0],[223.0,58.0,40.0],[223.0,57.0,40.0],[222.0,56.0,40.0],[221.0,54.0,40.0],[221.0,53.0,40.0],[220.0,51.0,40.0],[220.0,50.0,40.0],[219.0,48.0,40.0],[218.0,47.0,40.0],[218.0,45.0,40.0],[217.0,44.0,40.0],[216.0,43.0,40.0],[216.0,41.0,40.0],[215.0,40.0,40.0],[214.0,38.0,40.0],[214.0,37.0,40.0],[213.0,35.0,40.0],[211.0,31.0,40.0],[210.0,31.0,40.0],[209.0,31.0,39.0],[207.0,30.0,39.0],[206.0,30.0,39.0],[205.0,30.0,39.0],[204.0,30.0,38.0],[202.0,30.0,38.0],[201.0,29.0,38.0],[200.0,29.0,37.0],[199.0,29.0,37.0],[197.0,29.0,37.0],[196.0,29.0,37.0],[195.0,29.0,36.0],[194.0,28.0,36.0],[192.0,28.0,36.0],[191.0,28.0,35.0],[190.0,28.0,35.0],[189.0,28.0,35.0],[187.0,27.0,35.0],[186.0,27.0,34.0],[185.0,27.0,34.0],[184.0,27.0,34.0],[182.0,27.0,33.0],[181.0,26.0,33.0],[180.0,26.0,33.0],[179.0,26.0,33.0],[177.0,26.0,32.0],[176.0,26.0,32.0],[175.0,25.0,32.0],[174.0,25.0,31.0],[172.0,25.0,31.0],[171.0,25.0,31.0],[170.0,25.0,30.0],[169.0,24.0,30.0],[167.0,24.0,30.0],[166.0,24.0,30.0],[165.0,24.0,29.0],[164.0,24.0,29.0],[162.0,24.0,29.0],[161.0,23.0,28.0],[160.0,23.0,28.0],[159.0,23.0,28.0],[157.0,23.0,28.0],[156.0,23.0,27.0],[155.0,22.0,27.0],[154.0,22.0,27.0],[152.0,22.0,26.0],[151.0,22.0,26.0],[150.0,22.0,26.0],[149.0,21.0,26.0],[146.0,21.0,25.0]],"GMT_drywet":[[0.545882,0.400392,0.176078],[0.586667,0.440392,0.198824],[0.627451,0.480392,0.221569],[0.668235,0.520392,0.244314],[0.70902,0.560392,0.267059],[0.749804,0.600392,0.289804],[0.790588,0.640392,0.312549],[0.831373,0.680392,0.335294],[0.872157,0.720392,0.358039],[0.912941,0.760392,0.380784],[0.921961,0.788039,0.39902],[0.899216,0.803333,0.412745],[0.876471,0.818627,0.426471],[0.853725,0.833922,0.440196],[0.83098,0.849216,0.453922],[0.808235,0.86451,0.467647],[0.78549,0.879804,0.481373],[0.762745,0.895098,0.495098],[0.74,0.910392,0.508824],[0.717255,0.925686,0.522549],[0.680392,0.933333,0.54902],[0.629412,0.933333,0.588235],[0.578431,0.933333,0.627451],[0.527451,0.933333,0.666667],[0.476471,0.933333,0.705882],[0.42549,0.933333,0.745098],[0.37451,0.933333,0.784314],[0.323529,0.933333,0.823529],[0.272549,0.933333,0.862745],[0.221569,0.933333,0.901961],[0.188627,0.910196,0.922157],[0.173725,0.863922,0.923333],[0.158824,0.817647,0.92451],[0.143922,0.771373,0.925686],[0.12902,0.725098,0.926863],[0.114118,0.678824,0.928039],[0.099216,0.632549,0.929216],[0.084314,0.586275,0.930392],[0.069412,0.54,0.931569],[0.05451,0.493725,0.932745],[0.052157,0.447255,0.922549],[0.062353,0.400588,0.90098],[0.072549,0.353922,0.879412],[0.082745,0.307255,0.857843],[0.092941,0.260588,0.836275],[0.103137,0.213922,0.814706],[0.113333,0.167255,0.793137],[0.123529,0.120588,0.771569],[0.133725,0.073922,0.75],[0.143922,0.027255,0.728431],[0.143137,0.013725,0.703922],[0.131373,0.033333,0.676471],[0.119608,0.052941,0.64902],[0.107843,0.072549,0.621569],[0.096078,0.092157,0.594118],[0.084314,0.111765,0.566667],[0.072549,0.131373,0.539216],[0.060784,0.15098,0.511765],[0.04902,0.170588,0.484314],[0.037255,0.190196,0.456863]],"MPL_Pastel1":[[0.975456,0.708958,0.688874],[0.957739,0.71511,0.701915],[0.940023,0.721261,0.714956],[0.922307,0.727413,0.727997],[0.904591,0.733564,0.741038],[0.886874,0.739716,0.754079],[0.869158,0.745867,0.76712],[0.851442,0.752018,0.780161],[0.833726,0.75817,0.793203],[0.824867,0.761246,0.799723],[0.798293,0.770473,0.819285],[0.789435,0.773549,0.825805],[0.76286,0.782776,0.845367],[0.754002,0.785852,0.851888],[0.727428,0.795079,0.871449],[0.71857,0.798155,0.87797],[0.705421,0.808074,0.886044],[0.711572,0.815456,0.878662],[0.714648,0.819146,0.874971],[0.723875,0.830219,0.863899],[0.730027,0.837601,0.856517],[0.736178,0.844983,0.849135],[0.739254,0.848674,0.845444],[0.748481,0.859746,0.834371],[0.754633,0.867128,0.82699],[0.760784,0.87451,0.819608],[0.76386,0.878201,0.815917],[0.773087,0.889273,0.804844],[0.779239,0.896655,0.797463],[0.78539,0.904037,0.790081],[0.788466,0.907728,0.78639],[0.797693,0.9188,0.775317],[0.802768,0.916647,0.777316],[0.807197,0.908774,0.784944],[0.811626,0.9009,0.792572],[0.816055,0.893026,0.8002],[0.820484,0.885152,0.807828],[0.822699,0.881215,0.811642],[0.829343,0.869404,0.823083],[0.833772,0.86153,0.830711],[0.838201,0.853656,0.838339],[0.84263,0.845782,0.845967],[0.847059,0.837909,0.853595],[0.851488,0.830035,0.861223],[0.855917,0.822161,0.86885],[0.858131,0.818224,0.872664],[0.864775,0.806413,0.884106],[0.869204,0.798539,0.891734],[0.876002,0.798447,0.883629],[0.883875,0.801892,0.868374],[0.891749,0.805336,0.853118],[0.899623,0.808781,0.837862],[0.907497,0.812226,0.822607],[0.911434,0.813948,0.814979],[0.923245,0.819116,0.792095],[0.931119,0.822561,0.77684],[0.938993,0.826005,0.761584],[0.946867,0.82945,0.746328],[0.95474,0.832895,0.731073],[0.962614,0.83634,0.715817],[0.970488,0.839785,0.700561],[0.974425,0.841507,0.692934],[0.986236,0.846674,0.67005],[0.99411,0.850119,0.654794],[0.996263,0.857993,0.657993],[0.996509,0.867343,0.667343],[0.996755,0.876694,0.676694],[0.997001,0.886044,0.686044],[0.997247,0.895394,0.695394],[0.997493,0.904744,0.704744],[0.997739,0.914095,0.714095],[0.997985,0.923445,0.723445],[0.998231,0.932795,0.732795],[0.998478,0.942145,0.742145],[0.998724,0.951496,0.751496],[0.998847,0.956171,0.756171],[0.999216,0.970196,0.770196],[0.999462,0.979546,0.779546],[0.999708,0.988897,0.788897],[0.999954,0.998247,0.798247],[0.994802,0.992203,0.797001],[0.988404,0.982607,0.79331],[0.982007,0.97301,0.789619],[0.975609,0.963414,0.785929],[0.969212,0.953818,0.782238],[0.962814,0.944221,0.778547],[0.956417,0.934625,0.774856],[0.950019,0.925029,0.771165],[0.943622,0.915433,0.767474],[0.937224,0.905836,0.763783],[0.930827,0.89624,0.760092],[0.927628,0.891442,0.758247],[0.918032,0.877047,0.752711],[0.911634,0.867451,0.74902],[0.905236,0.857855,0.745329],[0.898839,0.848258,0.741638],[0.903206,0.847489,0.751296],[0.909112,0.847982,0.76286],[0.915017,0.848474,0.774425],[0.920923,0.848966,0.78599],[0.926828,0.849458,0.797555],[0.932734,0.84995,0.80912],[0.938639,0.850442,0.820684],[0.944544,0.850934,0.832249],[0.95045,0.851426,0.843814],[0.956355,0.851919,0.855379],[0.962261,0.852411,0.866943],[0.965213,0.852657,0.872726],[0.974072,0.853395,0.890073],[0.979977,0.853887,0.901638],[0.985882,0.854379,0.913203],[0.991788,0.854871,0.924767],[0.989619,0.860438,0.926874],[0.986913,0.866344,0.928351],[0.984206,0.872249,0.929827],[0.981499,0.878155,0.931303],[0.978793,0.88406,0.93278],[0.976086,0.889965,0.934256],[0.973379,0.895871,0.935732],[0.970673,0.901776,0.937209],[0.967966,0.907682,0.938685],[0.96526,0.913587,0.940161],[0.962553,0.919493,0.941638],[0.9612,0.922445,0.942376],[0.95714,0.931303,0.944591],[0.954433,0.937209,0.946067],[0.951726,0.943114,0.947543],[0.94902,0.94902,0.94902]],"GMT_no_green":[[0.12549,0.376471,1.0],[0.12549,0.623529,1.0],[0.12549,0.74902,1.0],[0.0,0.811765,1.0],[0.164706,1.0,1.0],[0.333333,1.0,1.0],[0.498039,1.0,1.0],[0.666667,1.0,1.0],[1.0,1.0,0.329412],[1.0,0.941176,0.0],[1.0,0.74902,0.0],[1.0,0.658824,0.0],[1.0,0.541176,0.0],[1.0,0.439216,0.0],[1.0,0.301961,0.0],[1.0,0.0,0.0]],"MPL_YlOrB":[[1.0,0.999016,0.892995],[1.0,0.997047,0.882907],[1.0,0.995079,0.872818],[1.0,0.99311,0.86273],[1.0,0.991142,0.852641],[1.0,0.989173,0.842553],[1.0,0.987205,0.832464],[1.0,0.985236,0.822376],[1.0,0.983268,0.812288],[1.0,0.982284,0.807243],[1.0,0.979331,0.792111],[1.0,0.978347,0.787067],[1.0,0.975394,0.771934],[1.0,0.97441,0.76689],[1.0,0.971457,0.751757],[1.0,0.970473,0.746713],[0.999862,0.965859,0.731303],[0.999616,0.960938,0.720723],[0.999493,0.958478,0.715433],[0.999123,0.951096,0.699562],[0.998877,0.946175,0.688981],[0.998631,0.941253,0.678401],[0.998508,0.938793,0.67311],[0.998139,0.931411,0.65724],[0.997893,0.92649,0.646659],[0.997647,0.921569,0.636078],[0.997524,0.919108,0.630788],[0.997155,0.911726,0.614917],[0.996909,0.906805,0.604337],[0.996663,0.901884,0.593756],[0.99654,0.899423,0.588466],[0.996171,0.892042,0.572595],[0.996078,0.885429,0.558478],[0.996078,0.877801,0.542238],[0.996078,0.870173,0.525998],[0.996078,0.862545,0.509758],[0.996078,0.854917,0.493518],[0.996078,0.851103,0.485398],[0.996078,0.839662,0.461038],[0.996078,0.832034,0.444798],[0.996078,0.824406,0.428558],[0.996078,0.816778,0.412318],[0.996078,0.80915,0.396078],[0.996078,0.801523,0.379839],[0.996078,0.793895,0.363599],[0.996078,0.790081,0.355479],[0.996078,0.778639,0.331119],[0.996078,0.771011,0.314879],[0.996078,0.761353,0.303376],[0.996078,0.750773,0.294025],[0.996078,0.740192,0.284675],[0.996078,0.729612,0.275325],[0.996078,0.719031,0.265975],[0.996078,0.713741,0.2613],[0.996078,0.69787,0.247274],[0.996078,0.68729,0.237924],[0.996078,0.676709,0.228574],[0.996078,0.666128,0.219223],[0.996078,0.655548,0.209873],[0.996078,0.644967,0.200523],[0.996078,0.634387,0.191173],[0.996078,0.629097,0.186498],[0.996078,0.613226,0.172472],[0.996078,0.602645,0.163122],[0.992757,0.592434,0.156909],[0.988328,0.582345,0.151742],[0.983899,0.572257,0.146574],[0.979469,0.562168,0.141407],[0.97504,0.55208,0.13624],[0.970611,0.541992,0.131073],[0.966182,0.531903,0.125905],[0.961753,0.521815,0.120738],[0.957324,0.511726,0.115571],[0.952895,0.501638,0.110404],[0.948466,0.491549,0.105236],[0.946251,0.486505,0.102653],[0.939608,0.471373,0.094902],[0.935179,0.461284,0.089735],[0.93075,0.451196,0.084567],[0.926321,0.441107,0.0794],[0.919093,0.432018,0.074833],[0.911219,0.42316,0.070404],[0.903345,0.414302,0.065975],[0.895471,0.405444,0.061546],[0.887597,0.396586,0.057116],[0.879723,0.387728,0.052687],[0.871849,0.37887,0.048258],[0.863975,0.370012,0.043829],[0.856102,0.361153,0.0394],[0.848228,0.352295,0.034971],[0.840354,0.343437,0.030542],[0.836417,0.339008,0.028328],[0.824606,0.325721,0.021684],[0.816732,0.316863,0.017255],[0.808858,0.308005,0.012826],[0.800984,0.299146,0.008397],[0.78902,0.292872,0.008274],[0.776471,0.286967,0.008766],[0.763922,0.281061,0.009258],[0.751373,0.275156,0.00975],[0.738824,0.26925,0.010242],[0.726275,0.263345,0.010734],[0.713726,0.257439,0.011226],[0.701176,0.251534,0.011719],[0.688627,0.245629,0.012211],[0.676078,0.239723,0.012703],[0.663529,0.233818,0.013195],[0.657255,0.230865,0.013441],[0.638431,0.222007,0.014179],[0.625882,0.216102,0.014671],[0.613333,0.210196,0.015163],[0.600784,0.204291,0.015656],[0.588235,0.200461,0.016148],[0.575686,0.19677,0.01664],[0.563137,0.19308,0.017132],[0.550588,0.189389,0.017624],[0.538039,0.185698,0.018116],[0.52549,0.182007,0.018608],[0.512941,0.178316,0.0191],[0.500392,0.174625,0.019592],[0.487843,0.170934,0.020085],[0.475294,0.167243,0.020577],[0.462745,0.163552,0.021069],[0.456471,0.161707,0.021315],[0.437647,0.156171,0.022053],[0.425098,0.15248,0.022545],[0.412549,0.148789,0.023037],[0.4,0.145098,0.023529]],"wgne15":[[160.0,32.0,240.0],[0.0,0.0,180.0],[60.0,100.0,230.0],[120.0,155.0,242.0],[176.0,224.0,230.0],[46.0,139.0,87.0],[100.0,225.0,0.0],[210.0,255.0,47.0],[245.0,230.0,190.0],[222.0,184.0,135.0],[255.0,225.0,0.0],[255.0,165.0,0.0],[255.0,69.0,0.0],[150.0,34.0,34.0],[255.0,105.0,180.0]],"matlab_hot":[[10.0,0.0,0.0],[21.0,0.0,0.0],[31.0,0.0,0.0],[42.0,0.0,0.0],[53.0,0.0,0.0],[63.0,0.0,0.0],[74.0,0.0,0.0],[84.0,0.0,0.0],[95.0,0.0,0.0],[106.0,0.0,0.0],[116.0,0.0,0.0],[127.0,0.0,0.0],[138.0,0.0,0.0],[148.0,0.0,0.0],[159.0,0.0,0.0],[170.0,0.0,0.0],[180.0,0.0,0.0],[191.0,0.0,0.0],[201.0,0.0,0.0],[212.0,0.0,0.0],[223.0,0.0,0.0],[233.0,0.0,0.0],[244.0,0.0,0.0],[255.0,0.0,0.0],[255.0,10.0,0.0],[255.0,21.0,0.0],[255.0,31.0,0.0],[255.0,42.0,0.0],[255.0,53.0,0.0],[255.0,63.0,0.0],[255.0,74.0,0.0],[255.0,84.0,0.0],[255.0,95.0,0.0],[255.0,106.0,0.0],[255.0,116.0,0.0],[255.0,127.0,0.0],[255.0,138.0,0.0],[255.0,148.0,0.0],[255.0,159.0,0.0],[255.0,170.0,0.0],[255.0,180.0,0.0],[255.0,191.0,0.0],[255.0,201.0,0.0],[255.0,212.0,0.0],[255.0,223.0,0.0],[255.0,233.0,0.0],[255.0,244.0,0.0],[255.0,255.0,0.0],[255.0,255.0,15.0],[255.0,255.0,31.0],[255.0,255.0,47.0],[255.0,255.0,63.0],[255.0,255.0,79.0],[255.0,255.0,95.0],[255.0,255.0,111.0],[255.0,255.0,127.0],[255.0,255.0,143.0],[255.0,255.0,159.0],[255.0,255.0,175.0],[255.0,255.0,191.0],[255.0,255.0,207.0],[255.0,255.0,223.0],[255.0,255.0,239.0],[255.0,255.0,255.0]],"MPL_bone":[[0.003431,0.003431,0.004774],[0.010294,0.010294,0.014322],[0.017157,0.017157,0.02387],[0.02402,0.02402,0.033419],[0.030882,0.030882,0.042967],[0.037745,0.037745,0.052515],[0.044608,0.044608,0.062063],[0.051471,0.051471,0.071611],[0.058333,0.058333,0.081159],[0.061765,0.061765,0.085934],[0.072059,0.072059,0.100256],[0.07549,0.07549,0.10503],[0.085784,0.085784,0.119352],[0.089216,0.089216,0.124126],[0.09951,0.09951,0.138448],[0.102941,0.102941,0.143223],[0.113235,0.113235,0.157545],[0.120098,0.120098,0.167093],[0.123529,0.123529,0.171867],[0.133824,0.133823,0.186189],[0.140686,0.140686,0.195737],[0.147549,0.147549,0.205286],[0.15098,0.15098,0.21006],[0.161275,0.161274,0.224382],[0.168137,0.168137,0.23393],[0.175,0.175,0.243478],[0.178431,0.178431,0.248252],[0.188725,0.188725,0.262575],[0.195588,0.195588,0.272123],[0.202451,0.202451,0.281671],[0.205882,0.205882,0.286445],[0.216176,0.216176,0.300767],[0.223039,0.223039,0.310315],[0.229902,0.229902,0.319864],[0.236765,0.236765,0.329412],[0.243627,0.243627,0.33896],[0.25049,0.25049,0.348508],[0.253922,0.253921,0.353282],[0.264216,0.264216,0.367604],[0.271078,0.271078,0.377153],[0.277941,0.277941,0.386701],[0.284804,0.284804,0.396249],[0.291667,0.291667,0.405797],[0.298529,0.298529,0.415345],[0.305392,0.305392,0.424893],[0.308824,0.308823,0.429668],[0.319118,0.319118,0.44399],[0.32598,0.328431,0.45098],[0.332843,0.337868,0.457843],[0.339706,0.347304,0.464706],[0.346569,0.35674,0.471569],[0.353431,0.366176,0.478431],[0.360294,0.375613,0.485294],[0.363725,0.380331,0.488725],[0.37402,0.394485,0.499019],[0.380882,0.403922,0.505882],[0.387745,0.413358,0.512745],[0.394608,0.422794,0.519608],[0.401471,0.43223,0.52647],[0.408333,0.441667,0.533333],[0.415196,0.451103,0.540196],[0.418627,0.455821,0.543627],[0.428922,0.469975,0.553921],[0.435784,0.479412,0.560784],[0.442647,0.488848,0.567647],[0.44951,0.498284,0.57451],[0.456373,0.507721,0.581372],[0.463235,0.517157,0.588235],[0.470098,0.526593,0.595098],[0.476961,0.536029,0.601961],[0.483824,0.545466,0.608823],[0.490686,0.554902,0.615686],[0.497549,0.564338,0.622549],[0.504412,0.573774,0.629412],[0.511275,0.583211,0.636274],[0.514706,0.587929,0.639706],[0.525,0.602083,0.65],[0.531863,0.61152,0.656863],[0.538725,0.620956,0.663725],[0.545588,0.630392,0.670588],[0.552451,0.639828,0.677451],[0.559314,0.649265,0.684314],[0.566176,0.658701,0.691176],[0.573039,0.668137,0.698039],[0.579902,0.677573,0.704902],[0.586765,0.68701,0.711765],[0.593627,0.696446,0.718627],[0.60049,0.705882,0.72549],[0.607353,0.715319,0.732353],[0.614216,0.724755,0.739216],[0.621078,0.734191,0.746078],[0.62451,0.738909,0.74951],[0.634804,0.753064,0.759804],[0.641667,0.7625,0.766667],[0.648529,0.771936,0.773529],[0.656863,0.780392,0.780392],[0.667586,0.787255,0.787255],[0.678309,0.794118,0.794118],[0.689032,0.80098,0.80098],[0.699755,0.807843,0.807843],[0.710478,0.814706,0.814706],[0.721201,0.821569,0.821569],[0.731924,0.828431,0.828431],[0.742647,0.835294,0.835294],[0.75337,0.842157,0.842157],[0.764093,0.84902,0.84902],[0.774816,0.855882,0.855882],[0.780178,0.859314,0.859314],[0.796262,0.869608,0.869608],[0.806985,0.876471,0.876471],[0.817708,0.883333,0.883333],[0.828431,0.890196,0.890196],[0.839154,0.897059,0.897059],[0.849877,0.903922,0.903922],[0.8606,0.910784,0.910784],[0.871323,0.917647,0.917647],[0.882047,0.92451,0.92451],[0.89277,0.931373,0.931373],[0.903493,0.938235,0.938235],[0.914216,0.945098,0.945098],[0.924939,0.951961,0.951961],[0.935662,0.958824,0.958824],[0.946385,0.965686,0.965686],[0.951746,0.969118,0.969118],[0.967831,0.979412,0.979412],[0.978554,0.986275,0.986275],[0.989277,0.993137,0.993137],[1.0,1.0,1.0]],"MPL_cool":[[0.003922,0.996078,1.0],[0.011765,0.988235,1.0],[0.019608,0.980392,1.0],[0.027451,0.972549,1.0],[0.035294,0.964706,1.0],[0.043137,0.956863,1.0],[0.05098,0.94902,1.0],[0.058824,0.941176,1.0],[0.066667,0.933333,1.0],[0.070588,0.929412,1.0],[0.082353,0.917647,1.0],[0.086275,0.913725,1.0],[0.098039,0.901961,1.0],[0.101961,0.898039,1.0],[0.113725,0.886275,1.0],[0.117647,0.882353,1.0],[0.129412,0.870588,1.0],[0.137255,0.862745,1.0],[0.141176,0.858824,1.0],[0.152941,0.847059,1.0],[0.160784,0.839216,1.0],[0.168627,0.831373,1.0],[0.172549,0.827451,1.0],[0.184314,0.815686,1.0],[0.192157,0.807843,1.0],[0.2,0.8,1.0],[0.203922,0.796078,1.0],[0.215686,0.784314,1.0],[0.223529,0.776471,1.0],[0.231373,0.768627,1.0],[0.235294,0.764706,1.0],[0.247059,0.752941,1.0],[0.254902,0.745098,1.0],[0.262745,0.737255,1.0],[0.270588,0.729412,1.0],[0.278431,0.721569,1.0],[0.286275,0.713725,1.0],[0.290196,0.709804,1.0],[0.301961,0.698039,1.0],[0.309804,0.690196,1.0],[0.317647,0.682353,1.0],[0.32549,0.67451,1.0],[0.333333,0.666667,1.0],[0.341176,0.658824,1.0],[0.34902,0.65098,1.0],[0.352941,0.647059,1.0],[0.364706,0.635294,1.0],[0.372549,0.627451,1.0],[0.380392,0.619608,1.0],[0.388235,0.611765,1.0],[0.396078,0.603922,1.0],[0.403922,0.596078,1.0],[0.411765,0.588235,1.0],[0.415686,0.584314,1.0],[0.427451,0.572549,1.0],[0.435294,0.564706,1.0],[0.443137,0.556863,1.0],[0.45098,0.54902,1.0],[0.458824,0.541176,1.0],[0.466667,0.533333,1.0],[0.47451,0.52549,1.0],[0.478431,0.521569,1.0],[0.490196,0.509804,1.0],[0.498039,0.501961,1.0],[0.505882,0.494118,1.0],[0.513725,0.486275,1.0],[0.521569,0.478431,1.0],[0.529412,0.470588,1.0],[0.537255,0.462745,1.0],[0.545098,0.454902,1.0],[0.552941,0.447059,1.0],[0.560784,0.439216,1.0],[0.568627,0.431373,1.0],[0.576471,0.423529,1.0],[0.584314,0.415686,1.0],[0.588235,0.411765,1.0],[0.6,0.4,1.0],[0.607843,0.392157,1.0],[0.615686,0.384314,1.0],[0.623529,0.376471,1.0],[0.631373,0.368627,1.0],[0.639216,0.360784,1.0],[0.647059,0.352941,1.0],[0.654902,0.345098,1.0],[0.662745,0.337255,1.0],[0.670588,0.329412,1.0],[0.678431,0.321569,1.0],[0.686275,0.313725,1.0],[0.694118,0.305882,1.0],[0.701961,0.298039,1.0],[0.709804,0.290196,1.0],[0.713725,0.286275,1.0],[0.72549,0.27451,1.0],[0.733333,0.266667,1.0],[0.741176,0.258824,1.0],[0.74902,0.25098,1.0],[0.756863,0.243137,1.0],[0.764706,0.235294,1.0],[0.772549,0.227451,1.0],[0.780392,0.219608,1.0],[0.788235,0.211765,1.0],[0.796078,0.203922,1.0],[0.803922,0.196078,1.0],[0.811765,0.188235,1.0],[0.819608,0.180392,1.0],[0.827451,0.172549,1.0],[0.835294,0.164706,1.0],[0.839216,0.160784,1.0],[0.85098,0.14902,1.0],[0.858824,0.141176,1.0],[0.866667,0.133333,1.0],[0.87451,0.12549,1.0],[0.882353,0.117647,1.0],[0.890196,0.109804,1.0],[0.898039,0.101961,1.0],[0.905882,0.094118,1.0],[0.913725,0.086275,1.0],[0.921569,0.078431,1.0],[0.929412,0.070588,1.0],[0.937255,0.062745,1.0],[0.945098,0.054902,1.0],[0.952941,0.047059,1.0],[0.960784,0.039216,1.0],[0.964706,0.035294,1.0],[0.976471,0.023529,1.0],[0.984314,0.015686,1.0],[0.992157,0.007843,1.0],[1.0,0.0,1.0]],"MPL_gist_rainbow":[[1.0,0.0,0.139085],[1.0,0.0,0.097255],[1.0,0.0,0.055425],[1.0,0.0,0.013595],[1.0,0.028617,0.0],[1.0,0.071012,0.0],[1.0,0.113408,0.0],[1.0,0.155803,0.0],[1.0,0.198198,0.0],[1.0,0.219396,0.0],[1.0,0.282989,0.0],[1.0,0.304187,0.0],[1.0,0.36778,0.0],[1.0,0.388977,0.0],[1.0,0.45257,0.0],[1.0,0.473768,0.0],[1.0,0.537361,0.0],[1.0,0.579756,0.0],[1.0,0.600954,0.0],[1.0,0.664547,0.0],[1.0,0.706942,0.0],[1.0,0.749338,0.0],[1.0,0.770535,0.0],[1.0,0.834128,0.0],[1.0,0.876524,0.0],[1.0,0.918919,0.0],[1.0,0.940117,0.0],[0.99629,1.0,0.0],[0.953895,1.0,0.0],[0.9115,1.0,0.0],[0.890302,1.0,0.0],[0.826709,1.0,0.0],[0.784314,1.0,0.0],[0.741918,1.0,0.0],[0.699523,1.0,0.0],[0.657128,1.0,0.0],[0.614732,1.0,0.0],[0.593535,1.0,0.0],[0.529942,1.0,0.0],[0.487546,1.0,0.0],[0.445151,1.0,0.0],[0.402756,1.0,0.0],[0.36036,1.0,0.0],[0.317965,1.0,0.0],[0.27557,1.0,0.0],[0.254372,1.0,0.0],[0.190779,1.0,0.0],[0.148384,1.0,0.0],[0.105988,1.0,0.0],[0.063593,1.0,0.0],[0.021198,1.0,0.0],[0.0,1.0,0.021084],[0.0,1.0,0.063251],[0.0,1.0,0.084335],[0.0,1.0,0.147586],[0.0,1.0,0.189753],[0.0,1.0,0.231921],[0.0,1.0,0.274088],[0.0,1.0,0.316256],[0.0,1.0,0.358423],[0.0,1.0,0.40059],[0.0,1.0,0.421674],[0.0,1.0,0.484925],[0.0,1.0,0.527093],[0.0,1.0,0.56926],[0.0,1.0,0.611427],[0.0,1.0,0.653595],[0.0,1.0,0.695762],[0.0,1.0,0.73793],[0.0,1.0,0.780097],[0.0,1.0,0.822264],[0.0,1.0,0.864432],[0.0,1.0,0.906599],[0.0,1.0,0.948767],[0.0,1.0,0.990934],[0.0,0.987852,1.0],[0.0,0.923913,1.0],[0.0,0.881287,1.0],[0.0,0.838662,1.0],[0.0,0.796036,1.0],[0.0,0.75341,1.0],[0.0,0.710784,1.0],[0.0,0.668159,1.0],[0.0,0.625533,1.0],[0.0,0.582907,1.0],[0.0,0.540281,1.0],[0.0,0.497656,1.0],[0.0,0.45503,1.0],[0.0,0.412404,1.0],[0.0,0.369778,1.0],[0.0,0.327153,1.0],[0.0,0.30584,1.0],[0.0,0.241901,1.0],[0.0,0.199275,1.0],[0.0,0.15665,1.0],[0.0,0.114024,1.0],[0.0,0.071398,1.0],[0.0,0.028772,1.0],[0.013853,0.0,1.0],[0.056479,0.0,1.0],[0.099105,0.0,1.0],[0.141731,0.0,1.0],[0.184356,0.0,1.0],[0.226982,0.0,1.0],[0.269608,0.0,1.0],[0.312234,0.0,1.0],[0.354859,0.0,1.0],[0.376172,0.0,1.0],[0.440111,0.0,1.0],[0.482737,0.0,1.0],[0.525362,0.0,1.0],[0.567988,0.0,1.0],[0.610614,0.0,1.0],[0.65324,0.0,1.0],[0.695865,0.0,1.0],[0.738491,0.0,1.0],[0.781117,0.0,1.0],[0.823743,0.0,1.0],[0.866368,0.0,1.0],[0.908994,0.0,1.0],[0.95162,0.0,1.0],[0.994246,0.0,1.0],[1.0,0.0,0.963129],[1.0,0.0,0.941816],[1.0,0.0,0.877877],[1.0,0.0,0.835251],[1.0,0.0,0.792626],[1.0,0.0,0.75]],"cmp_flux":[[0.0,253.0,253.0],[8.0,222.0,253.0],[16.0,189.0,253.0],[24.0,157.0,253.0],[32.0,125.0,253.0],[40.0,93.0,253.0],[48.0,60.0,253.0],[85.0,85.0,253.0],[133.0,133.0,253.0],[181.0,181.0,253.0],[230.0,230.0,253.0],[253.0,230.0,230.0],[253.0,181.0,181.0],[253.0,133.0,133.0],[253.0,85.0,85.0],[253.0,60.0,48.0],[253.0,93.0,40.0],[253.0,125.0,32.0],[253.0,157.0,24.0],[253.0,189.0,16.0],[253.0,224.0,8.0],[253.0,253.0,0.0]],"spread_15lev":[[255.0,255.0,255.0],[255.0,225.0,225.0],[255.0,210.0,210.0],[255.0,165.0,165.0],[255.0,120.0,120.0],[255.0,75.0,75.0],[255.0,0.0,0.0],[255.0,100.0,0.0],[255.0,150.0,0.0],[255.0,200.0,0.0],[255.0,255.0,0.0],[140.0,255.0,0.0],[0.0,255.0,0.0],[0.0,205.0,95.0],[0.0,145.0,200.0],[0.0,0.0,255.0]],"temp1":[[0.7,0.7,0.7],[0.65,0.65,0.7],[0.61,0.6,0.7],[0.55,0.55,0.7],[0.56,0.5,0.7],[0.45,0.45,0.7],[0.42,0.4,0.7],[0.35,0.35,0.7],[0.3,0.3,0.7],[0.25,0.25,0.7],[0.2,0.2,0.7],[0.15,0.15,0.7],[0.1,0.1,0.7],[0.05,0.05,0.7],[0.0,0.0,0.7],[0.0,0.05,0.7],[0.0,0.1,0.7],[0.0,0.15,0.7],[0.0,0.2,0.7],[0.0,0.25,0.7],[0.0,0.3,0.7],[0.0,0.35,0.7],[0.0,0.4,0.7],[0.0,0.45,0.6],[0.0,0.5,0.5],[0.0,0.55,0.4],[0.0,0.6,0.3],[0.0,0.65,0.2],[0.0,0.7,0.1],[0.0,0.725,0.0],[0.0,0.69,0.0],[0.03,0.685,0.0],[0.06,0.68,0.0],[0.1,0.575,0.0],[0.13,0.57,0.0],[0.16,0.565,0.0],[0.55,0.55,0.0],[0.555,0.545,0.0],[0.56,0.53,0.0],[0.565,0.485,0.0],[0.57,0.42,0.0],[0.675,0.375,0.0],[0.68,0.33,0.0],[0.69,0.3,0.0],[0.7,0.285,0.0],[0.7,0.27,0.0],[0.7,0.26,0.0],[0.7,0.24,0.0],[0.7,0.18,0.0],[0.7,0.13,0.0],[0.7,0.12,0.0],[0.7,0.1,0.0],[0.7,0.09,0.0],[0.75,0.09,0.0],[0.8,0.09,0.0],[0.83,0.07,0.0],[0.87,0.05,0.0],[0.9,0.03,0.0],[0.95,0.01,0.0],[0.99,0.0,0.0],[1.0,0.0,0.0]],"GMT_ocean":[[0.0,0.00098,0.004902],[0.0,0.002941,0.014706],[0.0,0.004902,0.02451],[0.0,0.006863,0.034314],[0.0,0.008824,0.044118],[0.0,0.010784,0.053922],[0.0,0.012745,0.063725],[0.0,0.014706,0.073529],[0.0,0.016667,0.083333],[0.0,0.018627,0.093137],[0.0,0.020588,0.102941],[0.0,0.022549,0.112745],[0.0,0.02451,0.122549],[0.0,0.026471,0.132353],[0.0,0.028431,0.142157],[0.0,0.030392,0.151961],[0.0,0.032353,0.161765],[0.0,0.034314,0.171569],[0.0,0.036275,0.181373],[0.0,0.038235,0.191176],[0.0,0.052941,0.210784],[0.0,0.080392,0.240196],[0.0,0.107843,0.269608],[0.0,0.135294,0.29902],[0.0,0.162745,0.328431],[0.0,0.190196,0.357843],[0.0,0.217647,0.387255],[0.0,0.245098,0.416667],[0.0,0.272549,0.446078],[0.0,0.3,0.47549],[0.0,0.327451,0.504902],[0.0,0.354902,0.534314],[0.0,0.382353,0.563725],[0.0,0.409804,0.593137],[0.0,0.437255,0.622549],[0.0,0.464706,0.651961],[0.0,0.492157,0.681373],[0.0,0.519608,0.710784],[0.0,0.547059,0.740196],[0.0,0.57451,0.769608],[0.016863,0.597451,0.781176],[0.050588,0.615882,0.774902],[0.084314,0.634314,0.768627],[0.118039,0.652745,0.762353],[0.151765,0.671176,0.756078],[0.18549,0.689608,0.749804],[0.219216,0.708039,0.743529],[0.252941,0.726471,0.737255],[0.286667,0.744902,0.73098],[0.320392,0.763333,0.724706],[0.354118,0.781961,0.718431],[0.387843,0.800784,0.712157],[0.421569,0.819608,0.705882],[0.455294,0.838431,0.699608],[0.48902,0.857255,0.693333],[0.522745,0.876078,0.687059],[0.556471,0.894902,0.680784],[0.590196,0.913725,0.67451],[0.623922,0.932549,0.668235],[0.657647,0.951373,0.661961],[0.682157,0.961765,0.667255],[0.697451,0.963725,0.684118],[0.712745,0.965686,0.70098],[0.728039,0.967647,0.717843],[0.743333,0.969608,0.734706],[0.758627,0.971569,0.751569],[0.773922,0.973529,0.768431],[0.789216,0.97549,0.785294],[0.80451,0.977451,0.802157],[0.819804,0.979412,0.81902],[0.835098,0.981373,0.836078],[0.850392,0.983333,0.853333],[0.865686,0.985294,0.870588],[0.88098,0.987255,0.887843],[0.896275,0.989216,0.905098],[0.911569,0.991176,0.922353],[0.926863,0.993137,0.939608],[0.942157,0.995098,0.956863],[0.957451,0.997059,0.974118],[0.972745,0.99902,0.991373]],"cosam12":[[100.0,0.0,116.0],[120.0,0.0,136.0],[90.0,0.0,184.0],[70.0,0.0,245.0],[0.0,170.0,225.0],[0.0,200.0,200.0],[0.0,200.0,125.0],[195.0,255.0,0.0],[255.0,255.0,0.0],[255.0,100.0,0.0],[255.0,155.0,0.0],[255.0,0.0,0.0]],"cosam":[[120.0,0.0,136.0],[90.0,0.0,184.0],[70.0,0.0,245.0],[0.0,170.0,225.0],[0.0,200.0,200.0],[0.0,200.0,125.0],[195.0,255.0,0.0],[255.0,255.0,0.0],[255.0,155.0,0.0],[255.0,0.0,0.0]],"MPL_cubehelix":[[0.006716,0.002119,0.00597],[0.019599,0.006514,0.018563],[0.031691,0.011164,0.031946],[0.042932,0.016118,0.046016],[0.053271,0.021423,0.060666],[0.06267,0.027119,0.075781],[0.071101,0.033243,0.091246],[0.078546,0.039824,0.106939],[0.085002,0.046889,0.12274],[0.08786,0.050609,0.130643],[0.094978,0.062542,0.15418],[0.096875,0.066781,0.161918],[0.101205,0.08029,0.184609],[0.102212,0.085055,0.191951],[0.104025,0.100126,0.213124],[0.104252,0.105403,0.219855],[0.103929,0.121956,0.238903],[0.102976,0.133564,0.250541],[0.10231,0.139529,0.256012],[0.099697,0.158016,0.270935],[0.097563,0.170785,0.279569],[0.095232,0.18386,0.287097],[0.094026,0.190498,0.290434],[0.090402,0.210739,0.298703],[0.088115,0.224441,0.302747],[0.086056,0.238247,0.305612],[0.085146,0.245171,0.306606],[0.083043,0.265946,0.307863],[0.082291,0.279726,0.307304],[0.082174,0.293383,0.305677],[0.082381,0.300147,0.30448],[0.084198,0.320102,0.299448],[0.086504,0.333055,0.294984],[0.089772,0.345666,0.289728],[0.094066,0.357887,0.283771],[0.099441,0.369671,0.277211],[0.105944,0.380974,0.270151],[0.10963,0.386433,0.266468],[0.122472,0.401985,0.254979],[0.132543,0.411627,0.247099],[0.143832,0.420656,0.239182],[0.156336,0.429052,0.23135],[0.170042,0.436798,0.223726],[0.184927,0.443882,0.216431],[0.200958,0.450301,0.209585],[0.209391,0.45326,0.206367],[0.236277,0.461144,0.197707],[0.255451,0.465584,0.192898],[0.275545,0.469391,0.188982],[0.296481,0.472584,0.186055],[0.318175,0.475191,0.184208],[0.340534,0.477243,0.183523],[0.363463,0.478776,0.184071],[0.375109,0.47936,0.184829],[0.410613,0.480448,0.189115],[0.434618,0.480679,0.193708],[0.458762,0.480574,0.199728],[0.48293,0.480186,0.207197],[0.507008,0.479572,0.216124],[0.530883,0.478789,0.22651],[0.554441,0.477898,0.238342],[0.566067,0.47743,0.244794],[0.600171,0.476032,0.266239],[0.622132,0.475178,0.282223],[0.643357,0.474459,0.299495],[0.663755,0.473933,0.317987],[0.683239,0.473658,0.337626],[0.701729,0.47369,0.358327],[0.719155,0.474083,0.379998],[0.735453,0.474886,0.402541],[0.750569,0.476148,0.425849],[0.764458,0.477911,0.449811],[0.777086,0.480216,0.47431],[0.788426,0.483098,0.499228],[0.798465,0.486587,0.524441],[0.802993,0.488567,0.537119],[0.814625,0.495483,0.575253],[0.820767,0.500927,0.600602],[0.825649,0.50705,0.625748],[0.829305,0.513857,0.65057],[0.831781,0.521346,0.674949],[0.83313,0.529511,0.698773],[0.833416,0.538342,0.721933],[0.832708,0.54782,0.744327],[0.831086,0.557924,0.765859],[0.828633,0.568627,0.786443],[0.825442,0.579897,0.805999],[0.821608,0.591698,0.824459],[0.817233,0.60399,0.841761],[0.812421,0.61673,0.857858],[0.807278,0.629869,0.872709],[0.804617,0.636573,0.879658],[0.796438,0.657146,0.898574],[0.790959,0.671176,0.909565],[0.785586,0.685392,0.919267],[0.780425,0.699738,0.927695],[0.775579,0.714157,0.934879],[0.771147,0.728589,0.940857],[0.767224,0.742979,0.945678],[0.763898,0.757269,0.949402],[0.761251,0.771405,0.952098],[0.75936,0.785335,0.953843],[0.75829,0.799008,0.954724],[0.758101,0.812378,0.954833],[0.758842,0.825399,0.95427],[0.760554,0.838033,0.95314],[0.763267,0.850242,0.951554],[0.765006,0.856178,0.950625],[0.771766,0.87327,0.947467],[0.777561,0.884039,0.945201],[0.784374,0.894289,0.942942],[0.792184,0.90401,0.940809],[0.800958,0.913194,0.938916],[0.810654,0.921845,0.937376],[0.821221,0.929967,0.936297],[0.832595,0.937572,0.935781],[0.844709,0.944679,0.935927],[0.857482,0.951311,0.936822],[0.87083,0.957495,0.93855],[0.884659,0.963266,0.941183],[0.898871,0.968662,0.944783],[0.913362,0.973726,0.949402],[0.928026,0.978504,0.955083],[0.935387,0.980802,0.958331],[0.957424,0.987412,0.969733],[0.971932,0.991652,0.978724],[0.986161,0.995828,0.98882],[1.0,1.0,1.0]],"hotcold_18lev":[[24.0,24.0,112.0],[16.0,78.0,139.0],[23.0,116.0,205.0],[72.0,118.0,255.0],[91.0,172.0,237.0],[173.0,215.0,230.0],[209.0,237.0,237.0],[229.0,239.0,249.0],[242.0,255.0,255.0],[255.0,255.0,255.0],[253.0,245.0,230.0],[255.0,228.0,180.0],[243.0,164.0,96.0],[237.0,118.0,0.0],[205.0,102.0,29.0],[224.0,49.0,15.0],[237.0,0.0,0.0],[205.0,0.0,0.0],[139.0,0.0,0.0]],"GreenMagenta16":[[0.0,80.0,0.0],[0.0,134.0,0.0],[0.0,187.0,0.0],[0.0,241.0,0.0],[80.0,255.0,80.0],[134.0,255.0,134.0],[187.0,255.0,187.0],[255.0,255.0,255.0],[255.0,241.0,255.0],[255.0,187.0,255.0],[255.0,134.0,255.0],[255.0,80.0,255.0],[241.0,0.0,241.0],[187.0,0.0,187.0],[134.0,0.0,134.0],[80.0,0.0,80.0]],"NCV_jaisnd":[[46.0,0.0,127.0],[45.0,0.0,133.0],[43.0,0.0,139.0],[40.0,0.0,144.0],[37.0,0.0,150.0],[34.0,0.0,155.0],[31.0,0.0,160.0],[27.0,0.0,165.0],[23.0,0.0,169.0],[19.0,0.0,174.0],[14.0,0.0,178.0],[10.0,0.0,182.0],[5.0,0.0,186.0],[0.0,0.0,190.0],[0.0,4.0,194.0],[0.0,10.0,197.0],[0.0,15.0,201.0],[0.0,21.0,204.0],[0.0,26.0,207.0],[0.0,32.0,210.0],[0.0,38.0,213.0],[0.0,44.0,216.0],[0.0,49.0,219.0],[0.0,55.0,221.0],[0.0,61.0,224.0],[0.0,67.0,226.0],[0.0,73.0,228.0],[0.0,78.0,230.0],[0.0,84.0,232.0],[0.0,90.0,234.0],[0.0,95.0,236.0],[0.0,100.0,237.0],[0.0,106.0,239.0],[0.0,111.0,240.0],[0.0,116.0,242.0],[0.0,121.0,243.0],[0.0,126.0,244.0],[0.0,131.0,245.0],[0.0,136.0,246.0],[0.0,141.0,247.0],[0.0,145.0,248.0],[0.0,150.0,249.0],[0.0,154.0,249.0],[0.0,158.0,250.0],[0.0,162.0,251.0],[0.0,166.0,251.0],[0.0,170.0,252.0],[0.0,174.0,252.0],[0.0,178.0,253.0],[0.0,181.0,253.0],[0.0,185.0,253.0],[0.0,188.0,253.0],[0.0,192.0,254.0],[0.0,195.0,254.0],[0.0,198.0,254.0],[0.0,201.0,254.0],[0.0,204.0,254.0],[0.0,208.0,254.0],[0.0,211.0,254.0],[0.0,214.0,254.0],[0.0,217.0,254.0],[1.0,220.0,254.0],[1.0,223.0,254.0],[2.0,225.0,254.0],[2.0,228.0,255.0],[3.0,231.0,255.0],[4.0,234.0,255.0],[5.0,237.0,255.0],[6.0,240.0,255.0],[7.0,243.0,255.0],[8.0,246.0,255.0],[9.0,249.0,255.0],[10.0,252.0,255.0],[12.0,255.0,254.0],[13.0,255.0,251.0],[15.0,255.0,248.0],[16.0,255.0,245.0],[18.0,255.0,242.0],[20.0,255.0,239.0],[21.0,255.0,236.0],[23.0,255.0,233.0],[25.0,255.0,230.0],[28.0,255.0,227.0],[30.0,255.0,224.0],[32.0,255.0,221.0],[34.0,255.0,218.0],[37.0,255.0,215.0],[39.0,255.0,212.0],[42.0,255.0,209.0],[45.0,255.0,206.0],[47.0,255.0,204.0],[50.0,255.0,201.0],[53.0,255.0,198.0],[56.0,255.0,196.0],[59.0,255.0,193.0],[63.0,255.0,191.0],[66.0,255.0,189.0],[69.0,255.0,187.0],[73.0,255.0,185.0],[76.0,255.0,183.0],[80.0,255.0,181.0],[84.0,255.0,180.0],[88.0,255.0,178.0],[91.0,255.0,177.0],[96.0,255.0,176.0],[100.0,255.0,175.0],[104.0,255.0,175.0],[108.0,255.0,175.0],[113.0,255.0,174.0],[117.0,255.0,174.0],[122.0,255.0,175.0],[127.0,255.0,175.0],[132.0,255.0,176.0],[137.0,255.0,178.0],[142.0,255.0,179.0],[148.0,255.0,181.0],[154.0,255.0,183.0],[159.0,255.0,186.0],[165.0,255.0,188.0],[172.0,255.0,192.0],[178.0,255.0,196.0],[185.0,255.0,200.0],[192.0,255.0,205.0],[200.0,255.0,210.0],[209.0,255.0,216.0],[218.0,255.0,223.0],[229.0,255.0,232.0],[243.0,255.0,244.0],[251.0,255.0,243.0],[248.0,255.0,229.0],[245.0,255.0,218.0],[243.0,255.0,209.0],[242.0,255.0,200.0],[241.0,255.0,192.0],[240.0,255.0,185.0],[240.0,255.0,178.0],[239.0,255.0,172.0],[239.0,255.0,165.0],[239.0,255.0,159.0],[240.0,255.0,154.0],[240.0,255.0,148.0],[241.0,255.0,142.0],[242.0,255.0,137.0],[242.0,255.0,132.0],[243.0,255.0,127.0],[244.0,255.0,122.0],[245.0,255.0,117.0],[247.0,255.0,113.0],[248.0,255.0,108.0],[249.0,255.0,104.0],[251.0,255.0,100.0],[252.0,255.0,96.0],[254.0,255.0,91.0],[255.0,254.0,88.0],[255.0,252.0,84.0],[255.0,250.0,80.0],[255.0,248.0,76.0],[255.0,247.0,73.0],[255.0,245.0,69.0],[255.0,243.0,66.0],[255.0,241.0,63.0],[255.0,239.0,59.0],[255.0,237.0,56.0],[255.0,235.0,53.0],[255.0,233.0,50.0],[255.0,231.0,47.0],[255.0,228.0,45.0],[255.0,226.0,42.0],[255.0,224.0,39.0],[255.0,222.0,37.0],[255.0,219.0,34.0],[255.0,217.0,32.0],[255.0,215.0,30.0],[255.0,212.0,28.0],[255.0,210.0,25.0],[255.0,207.0,23.0],[255.0,204.0,21.0],[255.0,202.0,20.0],[255.0,199.0,18.0],[255.0,196.0,16.0],[255.0,193.0,15.0],[255.0,190.0,13.0],[255.0,187.0,12.0],[255.0,183.0,10.0],[255.0,180.0,9.0],[255.0,177.0,8.0],[255.0,173.0,7.0],[255.0,170.0,6.0],[255.0,166.0,5.0],[255.0,162.0,4.0],[255.0,158.0,3.0],[255.0,154.0,2.0],[254.0,150.0,2.0],[254.0,146.0,1.0],[254.0,142.0,1.0],[254.0,138.0,0.0],[254.0,133.0,0.0],[254.0,129.0,0.0],[254.0,124.0,0.0],[254.0,119.0,0.0],[254.0,114.0,0.0],[254.0,109.0,0.0],[254.0,104.0,0.0],[254.0,99.0,0.0],[253.0,94.0,0.0],[253.0,88.0,0.0],[253.0,83.0,0.0],[253.0,77.0,0.0],[252.0,71.0,0.0],[252.0,65.0,0.0],[251.0,59.0,0.0],[251.0,53.0,0.0],[250.0,47.0,0.0],[249.0,41.0,0.0],[249.0,34.0,0.0],[248.0,28.0,0.0],[247.0,21.0,0.0],[246.0,15.0,0.0],[245.0,8.0,0.0],[244.0,2.0,0.0],[243.0,0.0,4.0],[242.0,0.0,10.0],[240.0,0.0,17.0],[239.0,0.0,24.0],[237.0,0.0,30.0],[236.0,0.0,37.0],[234.0,0.0,43.0],[232.0,0.0,49.0],[230.0,0.0,55.0],[228.0,0.0,61.0],[226.0,0.0,67.0],[224.0,0.0,73.0],[221.0,0.0,79.0],[219.0,0.0,84.0],[216.0,0.0,89.0],[213.0,0.0,94.0],[210.0,0.0,99.0],[207.0,0.0,104.0],[204.0,0.0,108.0],[201.0,0.0,112.0],[197.0,0.0,116.0],[194.0,0.0,119.0],[190.0,0.0,122.0],[186.0,0.0,125.0],[182.0,0.0,127.0],[178.0,0.0,129.0],[174.0,0.0,130.0],[169.0,0.0,132.0],[165.0,0.0,132.0],[160.0,0.0,133.0],[155.0,0.0,132.0],[150.0,0.0,132.0],[144.0,0.0,131.0],[139.0,0.0,129.0],[133.0,0.0,127.0],[127.0,0.0,125.0]],"MPL_sstanom":[[0.429066,0.0,0.85504],[0.447982,0.0,0.847474],[0.466897,0.0,0.839908],[0.486305,0.0,0.832834],[0.506482,0.0,0.826528],[0.526659,0.0,0.820223],[0.547543,0.0,0.81321],[0.570242,0.0,0.804383],[0.592941,0.0,0.795556],[0.604291,0.0,0.791142],[0.574856,0.035433,0.800046],[0.559093,0.050565,0.80509],[0.510188,0.096886,0.820838],[0.481184,0.119585,0.830927],[0.394171,0.187682,0.861192],[0.365167,0.210381,0.87128],[0.278155,0.279677,0.901546],[0.220146,0.326336,0.921722],[0.191142,0.349666,0.931811],[0.111557,0.418593,0.959954],[0.062376,0.463991,0.977609],[0.013195,0.509389,0.995263],[0.0,0.532088,1.0],[0.0,0.600185,1.0],[0.0,0.645583,1.0],[0.0,0.695686,1.0],[0.0,0.722168,1.0],[0.0,0.801615,1.0],[0.0,0.850704,1.0],[0.0,0.896101,1.0],[0.0,0.9188,1.0],[0.014717,0.972687,0.985283],[0.051288,0.982776,0.948712],[0.087858,0.992864,0.912142],[0.127013,1.0,0.872987],[0.172411,1.0,0.827589],[0.217809,1.0,0.782191],[0.240508,1.0,0.759492],[0.310096,1.0,0.691396],[0.356755,1.0,0.645998],[0.40286,1.0,0.601799],[0.441953,1.0,0.572795],[0.481046,1.0,0.543791],[0.520138,1.0,0.514787],[0.547082,1.0,0.525875],[0.560323,1.0,0.53218],[0.600046,1.0,0.551096],[0.624375,1.0,0.56263],[0.648335,1.0,0.573979],[0.672295,1.0,0.585329],[0.695317,1.0,0.596678],[0.718016,1.0,0.608028],[0.740715,1.0,0.619377],[0.749189,0.997124,0.625052],[0.75108,0.964967,0.642076],[0.752341,0.943529,0.653426],[0.75228,0.92143,0.664775],[0.751019,0.898731,0.676125],[0.749758,0.876032,0.687474],[0.74902,0.853333,0.698824],[0.74902,0.830634,0.710173],[0.74902,0.819285,0.715848],[0.753249,0.792157,0.728258],[0.76712,0.792157,0.724475],[0.780992,0.792157,0.720692],[0.796586,0.796586,0.713956],[0.819285,0.819285,0.69504],[0.841984,0.841984,0.676125],[0.864683,0.864683,0.657316],[0.887382,0.887382,0.639662],[0.910081,0.910081,0.622007],[0.93278,0.93278,0.604352],[0.954248,0.953018,0.583007],[0.975686,0.973195,0.561569],[0.997124,0.993372,0.540131],[1.0,0.987774,0.5188],[1.0,0.953725,0.443137],[1.0,0.931027,0.392695],[1.0,0.908328,0.343207],[1.0,0.885629,0.294025],[1.0,0.86293,0.244844],[1.0,0.837785,0.189143],[1.0,0.811303,0.129873],[1.0,0.784821,0.070604],[1.0,0.760369,0.035694],[1.0,0.73767,0.021822],[1.0,0.714971,0.007951],[1.0,0.692272,0.0],[1.0,0.669573,0.0],[1.0,0.646874,0.0],[1.0,0.623775,0.0],[1.0,0.611795,0.0],[1.0,0.575855,0.0],[1.0,0.551111,0.0],[1.0,0.523368,0.0],[1.0,0.495625,0.0],[1.0,0.466159,0.0],[1.0,0.420761,0.0],[1.0,0.375363,0.0],[1.0,0.329965,0.0],[1.0,0.275848,0.0],[1.0,0.221622,0.0],[1.0,0.167397,0.0],[1.0,0.120923,0.0],[1.0,0.075525,0.0],[1.0,0.030127,0.0],[0.99128,0.014764,0.035848],[0.985606,0.011611,0.059177],[0.968581,0.002153,0.129166],[0.956401,0.0,0.179977],[0.943791,0.0,0.232941],[0.93118,0.0,0.285905],[0.919262,0.0,0.339562],[0.907912,0.0,0.393787],[0.896563,0.0,0.448012],[0.881338,0.0,0.485629],[0.861161,0.0,0.502022],[0.840984,0.0,0.518416],[0.814579,0.0,0.508651],[0.775486,0.0,0.445598],[0.736394,0.0,0.382545],[0.698685,0.0,0.321707],[0.665898,0.0,0.268743],[0.649504,0.0,0.242261],[0.600323,0.0,0.162676],[0.567536,0.0,0.108451],[0.534748,0.0,0.054225],[0.501961,0.0,0.0]],"detail":[[0.0,0.0,255.0],[0.0,10.0,255.0],[1.0,20.0,254.0],[2.0,40.0,253.0],[3.0,60.0,252.0],[4.0,80.0,251.0],[5.0,114.0,250.0],[6.0,145.0,249.0],[7.0,175.0,248.0],[8.0,202.0,247.0],[9.0,225.0,246.0],[10.0,241.0,245.0],[11.0,251.0,244.0],[12.0,253.0,243.0],[13.0,248.0,242.0],[14.0,235.0,241.0],[15.0,216.0,240.0],[16.0,192.0,239.0],[17.0,163.0,238.0],[18.0,133.0,237.0],[19.0,102.0,236.0],[20.0,72.0,235.0],[21.0,46.0,234.0],[22.0,24.0,233.0],[23.0,9.0,232.0],[24.0,1.0,231.0],[25.0,0.0,230.0],[26.0,7.0,229.0],[27.0,21.0,228.0],[28.0,41.0,227.0],[29.0,67.0,226.0],[30.0,96.0,225.0],[31.0,126.0,224.0],[32.0,157.0,223.0],[33.0,186.0,222.0],[34.0,212.0,221.0],[35.0,232.0,220.0],[36.0,246.0,219.0],[37.0,253.0,218.0],[38.0,252.0,217.0],[39.0,244.0,216.0],[40.0,229.0,215.0],[41.0,207.0,214.0],[42.0,181.0,213.0],[43.0,151.0,212.0],[44.0,120.0,211.0],[45.0,90.0,210.0],[46.0,61.0,209.0],[47.0,37.0,208.0],[48.0,18.0,207.0],[49.0,5.0,206.0],[50.0,0.0,205.0],[51.0,2.0,204.0],[52.0,12.0,203.0],[53.0,28.0,202.0],[54.0,51.0,201.0],[55.0,78.0,200.0],[56.0,108.0,199.0],[57.0,139.0,198.0],[58.0,169.0,197.0],[59.0,197.0,196.0],[60.0,221.0,195.0],[61.0,239.0,194.0],[62.0,250.0,193.0],[63.0,254.0,192.0],[64.0,250.0,191.0],[65.0,239.0,190.0],[66.0,221.0,189.0],[67.0,197.0,188.0],[68.0,169.0,187.0],[69.0,139.0,186.0],[70.0,108.0,185.0],[71.0,78.0,184.0],[72.0,51.0,183.0],[73.0,28.0,182.0],[74.0,12.0,181.0],[75.0,2.0,180.0],[76.0,0.0,179.0],[77.0,5.0,178.0],[78.0,18.0,177.0],[79.0,37.0,176.0],[80.0,61.0,175.0],[81.0,90.0,174.0],[82.0,120.0,173.0],[83.0,151.0,172.0],[84.0,181.0,171.0],[85.0,207.0,170.0],[86.0,229.0,169.0],[87.0,244.0,168.0],[88.0,252.0,167.0],[89.0,253.0,166.0],[90.0,246.0,165.0],[91.0,232.0,164.0],[92.0,212.0,163.0],[93.0,186.0,162.0],[94.0,157.0,161.0],[95.0,127.0,160.0],[96.0,96.0,159.0],[97.0,67.0,158.0],[98.0,41.0,157.0],[99.0,21.0,156.0],[100.0,7.0,155.0],[101.0,0.0,154.0],[102.0,1.0,153.0],[103.0,9.0,152.0],[104.0,24.0,151.0],[105.0,46.0,150.0],[106.0,72.0,149.0],[107.0,102.0,148.0],[108.0,133.0,147.0],[109.0,163.0,146.0],[110.0,192.0,145.0],[111.0,216.0,144.0],[112.0,235.0,143.0],[113.0,248.0,142.0],[114.0,253.0,141.0],[115.0,251.0,140.0],[116.0,241.0,139.0],[117.0,225.0,138.0],[118.0,202.0,137.0],[119.0,175.0,136.0],[120.0,145.0,135.0],[121.0,114.0,134.0],[122.0,84.0,133.0],[123.0,56.0,132.0],[124.0,32.0,131.0],[125.0,14.0,130.0],[126.0,3.0,129.0],[127.0,0.0,128.0],[128.0,3.0,127.0],[129.0,14.0,126.0],[130.0,32.0,125.0],[131.0,56.0,124.0],[132.0,84.0,123.0],[133.0,114.0,122.0],[134.0,145.0,121.0],[135.0,175.0,120.0],[136.0,202.0,119.0],[137.0,225.0,118.0],[138.0,241.0,117.0],[139.0,251.0,116.0],[140.0,253.0,115.0],[141.0,248.0,114.0],[142.0,235.0,113.0],[143.0,216.0,112.0],[144.0,192.0,111.0],[145.0,163.0,110.0],[146.0,133.0,109.0],[147.0,102.0,108.0],[148.0,72.0,107.0],[149.0,46.0,106.0],[150.0,24.0,105.0],[151.0,9.0,104.0],[152.0,1.0,103.0],[153.0,0.0,102.0],[154.0,7.0,101.0],[155.0,21.0,100.0],[156.0,41.0,99.0],[157.0,67.0,98.0],[158.0,96.0,97.0],[159.0,126.0,96.0],[160.0,157.0,95.0],[161.0,186.0,94.0],[162.0,212.0,93.0],[163.0,232.0,92.0],[164.0,246.0,91.0],[165.0,253.0,90.0],[166.0,252.0,89.0],[167.0,244.0,88.0],[168.0,229.0,87.0],[169.0,207.0,86.0],[170.0,181.0,85.0],[171.0,151.0,84.0],[172.0,120.0,83.0],[173.0,90.0,82.0],[174.0,61.0,81.0],[175.0,37.0,80.0],[176.0,18.0,79.0],[177.0,5.0,78.0],[178.0,0.0,77.0],[179.0,2.0,76.0],[180.0,12.0,75.0],[181.0,28.0,74.0],[182.0,51.0,73.0],[183.0,78.0,72.0],[184.0,108.0,71.0],[185.0,139.0,70.0],[186.0,169.0,69.0],[187.0,197.0,68.0],[188.0,221.0,67.0],[189.0,239.0,66.0],[190.0,250.0,65.0],[191.0,254.0,64.0],[192.0,250.0,63.0],[193.0,239.0,62.0],[194.0,221.0,61.0],[195.0,197.0,60.0],[196.0,169.0,59.0],[197.0,139.0,58.0],[198.0,108.0,57.0],[199.0,78.0,56.0],[200.0,51.0,55.0],[201.0,28.0,54.0],[202.0,12.0,53.0],[203.0,2.0,52.0],[204.0,0.0,51.0],[205.0,5.0,50.0],[206.0,18.0,49.0],[207.0,37.0,48.0],[208.0,61.0,47.0],[209.0,90.0,46.0],[210.0,120.0,45.0],[211.0,151.0,44.0],[212.0,181.0,43.0],[213.0,207.0,42.0],[214.0,229.0,41.0],[215.0,244.0,40.0],[216.0,252.0,39.0],[217.0,253.0,38.0],[218.0,246.0,37.0],[219.0,232.0,36.0],[220.0,212.0,35.0],[221.0,186.0,34.0],[222.0,157.0,33.0],[223.0,127.0,32.0],[224.0,96.0,31.0],[225.0,67.0,30.0],[226.0,41.0,29.0],[227.0,21.0,28.0],[228.0,7.0,27.0],[229.0,0.0,26.0],[230.0,1.0,25.0],[231.0,9.0,24.0],[232.0,24.0,23.0],[233.0,46.0,22.0],[234.0,72.0,21.0],[235.0,102.0,20.0],[236.0,133.0,19.0],[237.0,163.0,18.0],[238.0,192.0,17.0],[239.0,216.0,16.0],[240.0,235.0,15.0],[241.0,248.0,14.0],[242.0,253.0,13.0],[243.0,251.0,12.0],[244.0,241.0,11.0],[245.0,225.0,10.0],[246.0,202.0,9.0],[247.0,175.0,8.0],[248.0,145.0,7.0],[249.0,114.0,6.0],[250.0,84.0,5.0],[251.0,56.0,4.0],[252.0,32.0,3.0]],"NCV_jet":[[0.0,0.0,127.0],[0.0,0.0,131.0],[0.0,0.0,135.0],[0.0,0.0,139.0],[0.0,0.0,143.0],[0.0,0.0,147.0],[0.0,0.0,151.0],[0.0,0.0,155.0],[0.0,0.0,159.0],[0.0,0.0,163.0],[0.0,0.0,167.0],[0.0,0.0,171.0],[0.0,0.0,175.0],[0.0,0.0,179.0],[0.0,0.0,183.0],[0.0,0.0,187.0],[0.0,0.0,191.0],[0.0,0.0,195.0],[0.0,0.0,199.0],[0.0,0.0,203.0],[0.0,0.0,207.0],[0.0,0.0,211.0],[0.0,0.0,215.0],[0.0,0.0,219.0],[0.0,0.0,223.0],[0.0,0.0,227.0],[0.0,0.0,231.0],[0.0,0.0,235.0],[0.0,0.0,239.0],[0.0,0.0,243.0],[0.0,0.0,247.0],[0.0,0.0,251.0],[0.0,0.0,255.0],[0.0,4.0,255.0],[0.0,8.0,255.0],[0.0,12.0,255.0],[0.0,16.0,255.0],[0.0,20.0,255.0],[0.0,24.0,255.0],[0.0,28.0,255.0],[0.0,32.0,255.0],[0.0,36.0,255.0],[0.0,40.0,255.0],[0.0,44.0,255.0],[0.0,48.0,255.0],[0.0,52.0,255.0],[0.0,56.0,255.0],[0.0,60.0,255.0],[0.0,64.0,255.0],[0.0,68.0,255.0],[0.0,72.0,255.0],[0.0,76.0,255.0],[0.0,80.0,255.0],[0.0,84.0,255.0],[0.0,88.0,255.0],[0.0,92.0,255.0],[0.0,96.0,255.0],[0.0,100.0,255.0],[0.0,104.0,255.0],[0.0,108.0,255.0],[0.0,112.0,255.0],[0.0,116.0,255.0],[0.0,120.0,255.0],[0.0,124.0,255.0],[0.0,128.0,255.0],[0.0,132.0,255.0],[0.0,136.0,255.0],[0.0,140.0,255.0],[0.0,144.0,255.0],[0.0,148.0,255.0],[0.0,152.0,255.0],[0.0,156.0,255.0],[0.0,160.0,255.0],[0.0,164.0,255.0],[0.0,168.0,255.0],[0.0,172.0,255.0],[0.0,176.0,255.0],[0.0,180.0,255.0],[0.0,184.0,255.0],[0.0,188.0,255.0],[0.0,192.0,255.0],[0.0,196.0,255.0],[0.0,200.0,255.0],[0.0,204.0,255.0],[0.0,208.0,255.0],[0.0,212.0,255.0],[0.0,216.0,255.0],[0.0,220.0,255.0],[0.0,224.0,255.0],[0.0,228.0,255.0],[0.0,232.0,255.0],[0.0,236.0,255.0],[0.0,240.0,255.0],[0.0,244.0,255.0],[0.0,248.0,255.0],[0.0,252.0,255.0],[1.0,255.0,253.0],[5.0,255.0,249.0],[9.0,255.0,245.0],[13.0,255.0,241.0],[17.0,255.0,237.0],[21.0,255.0,233.0],[25.0,255.0,229.0],[29.0,255.0,225.0],[33.0,255.0,221.0],[37.0,255.0,217.0],[41.0,255.0,213.0],[45.0,255.0,209.0],[49.0,255.0,205.0],[53.0,255.0,201.0],[57.0,255.0,197.0],[61.0,255.0,193.0],[65.0,255.0,189.0],[69.0,255.0,185.0],[73.0,255.0,181.0],[77.0,255.0,177.0],[81.0,255.0,173.0],[85.0,255.0,169.0],[89.0,255.0,165.0],[93.0,255.0,161.0],[97.0,255.0,157.0],[101.0,255.0,153.0],[105.0,255.0,149.0],[109.0,255.0,145.0],[113.0,255.0,141.0],[117.0,255.0,137.0],[121.0,255.0,133.0],[125.0,255.0,129.0],[129.0,255.0,125.0],[133.0,255.0,121.0],[137.0,255.0,117.0],[141.0,255.0,113.0],[145.0,255.0,109.0],[149.0,255.0,105.0],[153.0,255.0,101.0],[157.0,255.0,97.0],[161.0,255.0,93.0],[165.0,255.0,89.0],[169.0,255.0,85.0],[173.0,255.0,81.0],[177.0,255.0,77.0],[181.0,255.0,73.0],[185.0,255.0,69.0],[189.0,255.0,65.0],[193.0,255.0,61.0],[197.0,255.0,57.0],[201.0,255.0,53.0],[205.0,255.0,49.0],[209.0,255.0,45.0],[213.0,255.0,41.0],[217.0,255.0,37.0],[221.0,255.0,33.0],[225.0,255.0,29.0],[229.0,255.0,25.0],[233.0,255.0,21.0],[237.0,255.0,17.0],[241.0,255.0,13.0],[245.0,255.0,9.0],[249.0,255.0,5.0],[253.0,255.0,1.0],[255.0,252.0,0.0],[255.0,248.0,0.0],[255.0,244.0,0.0],[255.0,240.0,0.0],[255.0,236.0,0.0],[255.0,232.0,0.0],[255.0,228.0,0.0],[255.0,224.0,0.0],[255.0,220.0,0.0],[255.0,216.0,0.0],[255.0,212.0,0.0],[255.0,208.0,0.0],[255.0,204.0,0.0],[255.0,200.0,0.0],[255.0,196.0,0.0],[255.0,192.0,0.0],[255.0,188.0,0.0],[255.0,184.0,0.0],[255.0,180.0,0.0],[255.0,176.0,0.0],[255.0,172.0,0.0],[255.0,168.0,0.0],[255.0,164.0,0.0],[255.0,160.0,0.0],[255.0,156.0,0.0],[255.0,152.0,0.0],[255.0,148.0,0.0],[255.0,144.0,0.0],[255.0,140.0,0.0],[255.0,136.0,0.0],[255.0,132.0,0.0],[255.0,128.0,0.0],[255.0,124.0,0.0],[255.0,120.0,0.0],[255.0,116.0,0.0],[255.0,112.0,0.0],[255.0,108.0,0.0],[255.0,104.0,0.0],[255.0,100.0,0.0],[255.0,96.0,0.0],[255.0,92.0,0.0],[255.0,88.0,0.0],[255.0,84.0,0.0],[255.0,80.0,0.0],[255.0,76.0,0.0],[255.0,72.0,0.0],[255.0,68.0,0.0],[255.0,64.0,0.0],[255.0,60.0,0.0],[255.0,56.0,0.0],[255.0,52.0,0.0],[255.0,48.0,0.0],[255.0,44.0,0.0],[255.0,40.0,0.0],[255.0,36.0,0.0],[255.0,32.0,0.0],[255.0,28.0,0.0],[255.0,24.0,0.0],[255.0,20.0,0.0],[255.0,16.0,0.0],[255.0,12.0,0.0],[255.0,8.0,0.0],[255.0,4.0,0.0],[255.0,0.0,0.0],[251.0,0.0,0.0],[247.0,0.0,0.0],[243.0,0.0,0.0],[239.0,0.0,0.0],[235.0,0.0,0.0],[231.0,0.0,0.0],[227.0,0.0,0.0],[223.0,0.0,0.0],[219.0,0.0,0.0],[215.0,0.0,0.0],[211.0,0.0,0.0],[207.0,0.0,0.0],[203.0,0.0,0.0],[199.0,0.0,0.0],[195.0,0.0,0.0],[191.0,0.0,0.0],[187.0,0.0,0.0],[183.0,0.0,0.0],[179.0,0.0,0.0],[175.0,0.0,0.0],[171.0,0.0,0.0],[167.0,0.0,0.0],[163.0,0.0,0.0],[159.0,0.0,0.0],[155.0,0.0,0.0],[151.0,0.0,0.0],[147.0,0.0,0.0],[143.0,0.0,0.0],[139.0,0.0,0.0],[135.0,0.0,0.0],[131.0,0.0,0.0],[127.0,0.0,0.0]],"MPL_gist_gray":[[0.003922,0.003922,0.003922],[0.011765,0.011765,0.011765],[0.019608,0.019608,0.019608],[0.027451,0.027451,0.027451],[0.035294,0.035294,0.035294],[0.043137,0.043137,0.043137],[0.05098,0.05098,0.05098],[0.058824,0.058824,0.058824],[0.066667,0.066667,0.066667],[0.070588,0.070588,0.070588],[0.082353,0.082353,0.082353],[0.086275,0.086275,0.086275],[0.098039,0.098039,0.098039],[0.101961,0.101961,0.101961],[0.113725,0.113725,0.113725],[0.117647,0.117647,0.117647],[0.129412,0.129412,0.129412],[0.137255,0.137255,0.137255],[0.141176,0.141176,0.141176],[0.152941,0.152941,0.152941],[0.160784,0.160784,0.160784],[0.168627,0.168627,0.168627],[0.172549,0.172549,0.172549],[0.184314,0.184314,0.184314],[0.192157,0.192157,0.192157],[0.2,0.2,0.2],[0.203922,0.203922,0.203922],[0.215686,0.215686,0.215686],[0.223529,0.223529,0.223529],[0.231373,0.231373,0.231373],[0.235294,0.235294,0.235294],[0.247059,0.247059,0.247059],[0.254902,0.254902,0.254902],[0.262745,0.262745,0.262745],[0.270588,0.270588,0.270588],[0.278431,0.278431,0.278431],[0.286275,0.286275,0.286275],[0.290196,0.290196,0.290196],[0.301961,0.301961,0.301961],[0.309804,0.309804,0.309804],[0.317647,0.317647,0.317647],[0.32549,0.32549,0.32549],[0.333333,0.333333,0.333333],[0.341176,0.341176,0.341176],[0.34902,0.34902,0.34902],[0.352941,0.352941,0.352941],[0.364706,0.364706,0.364706],[0.372549,0.372549,0.372549],[0.380392,0.380392,0.380392],[0.388235,0.388235,0.388235],[0.396078,0.396078,0.396078],[0.403922,0.403922,0.403922],[0.411765,0.411765,0.411765],[0.415686,0.415686,0.415686],[0.427451,0.427451,0.427451],[0.435294,0.435294,0.435294],[0.443137,0.443137,0.443137],[0.45098,0.45098,0.45098],[0.458824,0.458824,0.458824],[0.466667,0.466667,0.466667],[0.47451,0.47451,0.47451],[0.478431,0.478431,0.478431],[0.490196,0.490196,0.490196],[0.498039,0.498039,0.498039],[0.505882,0.505882,0.505882],[0.513725,0.513725,0.513725],[0.521569,0.521569,0.521569],[0.529412,0.529412,0.529412],[0.537255,0.537255,0.537255],[0.545098,0.545098,0.545098],[0.552941,0.552941,0.552941],[0.560784,0.560784,0.560784],[0.568627,0.568627,0.568627],[0.576471,0.576471,0.576471],[0.584314,0.584314,0.584314],[0.588235,0.588235,0.588235],[0.6,0.6,0.6],[0.607843,0.607843,0.607843],[0.615686,0.615686,0.615686],[0.623529,0.623529,0.623529],[0.631373,0.631373,0.631373],[0.639216,0.639216,0.639216],[0.647059,0.647059,0.647059],[0.654902,0.654902,0.654902],[0.662745,0.662745,0.662745],[0.670588,0.670588,0.670588],[0.678431,0.678431,0.678431],[0.686275,0.686275,0.686275],[0.694118,0.694118,0.694118],[0.701961,0.701961,0.701961],[0.709804,0.709804,0.709804],[0.713725,0.713725,0.713725],[0.72549,0.72549,0.72549],[0.733333,0.733333,0.733333],[0.741176,0.741176,0.741176],[0.74902,0.74902,0.74902],[0.756863,0.756863,0.756863],[0.764706,0.764706,0.764706],[0.772549,0.772549,0.772549],[0.780392,0.780392,0.780392],[0.788235,0.788235,0.788235],[0.796078,0.796078,0.796078],[0.803922,0.803922,0.803922],[0.811765,0.811765,0.811765],[0.819608,0.819608,0.819608],[0.827451,0.827451,0.827451],[0.835294,0.835294,0.835294],[0.839216,0.839216,0.839216],[0.85098,0.85098,0.85098],[0.858824,0.858824,0.858824],[0.866667,0.866667,0.866667],[0.87451,0.87451,0.87451],[0.882353,0.882353,0.882353],[0.890196,0.890196,0.890196],[0.898039,0.898039,0.898039],[0.905882,0.905882,0.905882],[0.913725,0.913725,0.913725],[0.921569,0.921569,0.921569],[0.929412,0.929412,0.929412],[0.937255,0.937255,0.937255],[0.945098,0.945098,0.945098],[0.952941,0.952941,0.952941],[0.960784,0.960784,0.960784],[0.964706,0.964706,0.964706],[0.976471,0.976471,0.976471],[0.984314,0.984314,0.984314],[0.992157,0.992157,0.992157],[1.0,1.0,1.0]],"BlueRedGray":[[25.0,82.0,255.0],[27.0,84.0,255.0],[28.0,85.0,255.0],[30.0,86.0,255.0],[31.0,87.0,255.0],[33.0,88.0,255.0],[34.0,89.0,255.0],[36.0,90.0,255.0],[37.0,92.0,255.0],[39.0,93.0,255.0],[40.0,94.0,255.0],[42.0,95.0,255.0],[43.0,96.0,255.0],[45.0,97.0,255.0],[46.0,98.0,255.0],[48.0,100.0,255.0],[49.0,101.0,255.0],[51.0,102.0,255.0],[53.0,103.0,255.0],[54.0,104.0,255.0],[56.0,105.0,255.0],[57.0,106.0,255.0],[59.0,108.0,255.0],[60.0,109.0,255.0],[62.0,110.0,255.0],[63.0,111.0,255.0],[65.0,112.0,255.0],[66.0,113.0,255.0],[68.0,115.0,255.0],[69.0,116.0,255.0],[71.0,117.0,255.0],[72.0,118.0,255.0],[74.0,119.0,255.0],[75.0,120.0,255.0],[77.0,121.0,255.0],[79.0,123.0,255.0],[80.0,124.0,255.0],[82.0,125.0,255.0],[83.0,126.0,255.0],[85.0,127.0,255.0],[86.0,128.0,255.0],[88.0,129.0,255.0],[89.0,131.0,255.0],[91.0,132.0,255.0],[92.0,133.0,255.0],[94.0,134.0,255.0],[95.0,135.0,255.0],[97.0,136.0,255.0],[98.0,137.0,255.0],[100.0,139.0,255.0],[102.0,140.0,255.0],[103.0,141.0,255.0],[105.0,142.0,255.0],[106.0,143.0,255.0],[108.0,144.0,255.0],[109.0,145.0,255.0],[111.0,147.0,255.0],[112.0,148.0,255.0],[114.0,149.0,255.0],[115.0,150.0,255.0],[117.0,151.0,255.0],[118.0,152.0,255.0],[120.0,154.0,255.0],[121.0,155.0,255.0],[123.0,156.0,255.0],[124.0,157.0,255.0],[126.0,158.0,255.0],[128.0,159.0,255.0],[129.0,160.0,255.0],[131.0,162.0,255.0],[132.0,163.0,255.0],[134.0,164.0,255.0],[135.0,165.0,255.0],[137.0,166.0,255.0],[138.0,167.0,255.0],[140.0,168.0,255.0],[141.0,170.0,255.0],[143.0,171.0,255.0],[144.0,172.0,255.0],[146.0,173.0,255.0],[147.0,174.0,255.0],[149.0,175.0,255.0],[150.0,176.0,255.0],[152.0,178.0,255.0],[154.0,179.0,255.0],[155.0,180.0,255.0],[157.0,181.0,255.0],[158.0,182.0,255.0],[160.0,183.0,255.0],[161.0,185.0,255.0],[163.0,186.0,255.0],[164.0,187.0,255.0],[166.0,188.0,255.0],[167.0,189.0,255.0],[169.0,190.0,255.0],[170.0,191.0,255.0],[172.0,193.0,255.0],[173.0,194.0,255.0],[175.0,195.0,255.0],[176.0,196.0,255.0],[178.0,197.0,255.0],[180.0,198.0,255.0],[181.0,199.0,255.0],[183.0,201.0,255.0],[184.0,202.0,255.0],[186.0,203.0,255.0],[187.0,204.0,255.0],[189.0,205.0,255.0],[190.0,206.0,255.0],[192.0,207.0,255.0],[193.0,209.0,255.0],[195.0,210.0,255.0],[196.0,211.0,255.0],[198.0,212.0,255.0],[199.0,213.0,255.0],[201.0,214.0,255.0],[202.0,215.0,255.0],[204.0,217.0,255.0],[206.0,218.0,255.0],[207.0,219.0,255.0],[209.0,220.0,255.0],[210.0,221.0,255.0],[212.0,222.0,255.0],[213.0,224.0,255.0],[215.0,225.0,255.0],[216.0,226.0,255.0],[255.0,216.0,216.0],[255.0,215.0,215.0],[255.0,213.0,213.0],[255.0,212.0,212.0],[255.0,210.0,210.0],[255.0,209.0,209.0],[255.0,207.0,207.0],[255.0,206.0,206.0],[255.0,204.0,204.0],[255.0,202.0,202.0],[255.0,201.0,201.0],[255.0,199.0,199.0],[255.0,198.0,198.0],[255.0,196.0,196.0],[255.0,195.0,195.0],[255.0,193.0,193.0],[255.0,192.0,192.0],[255.0,190.0,190.0],[255.0,189.0,189.0],[255.0,187.0,187.0],[255.0,186.0,186.0],[255.0,184.0,184.0],[255.0,183.0,183.0],[255.0,181.0,181.0],[255.0,180.0,180.0],[255.0,178.0,178.0],[255.0,176.0,176.0],[255.0,175.0,175.0],[255.0,173.0,173.0],[255.0,172.0,172.0],[255.0,170.0,170.0],[255.0,169.0,169.0],[255.0,167.0,167.0],[255.0,166.0,166.0],[255.0,164.0,164.0],[255.0,163.0,163.0],[255.0,161.0,161.0],[255.0,160.0,160.0],[255.0,158.0,158.0],[255.0,157.0,157.0],[255.0,155.0,155.0],[255.0,154.0,154.0],[255.0,152.0,152.0],[255.0,150.0,150.0],[255.0,149.0,149.0],[255.0,147.0,147.0],[255.0,146.0,146.0],[255.0,144.0,144.0],[255.0,143.0,143.0],[255.0,141.0,141.0],[255.0,140.0,140.0],[255.0,138.0,138.0],[255.0,137.0,137.0],[255.0,135.0,135.0],[255.0,134.0,134.0],[255.0,132.0,132.0],[255.0,131.0,131.0],[255.0,129.0,129.0],[255.0,128.0,128.0],[255.0,126.0,126.0],[255.0,124.0,124.0],[255.0,123.0,123.0],[255.0,121.0,121.0],[255.0,120.0,120.0],[255.0,118.0,118.0],[255.0,117.0,117.0],[255.0,115.0,115.0],[255.0,114.0,114.0],[255.0,112.0,112.0],[255.0,111.0,111.0],[255.0,109.0,109.0],[255.0,108.0,108.0],[255.0,106.0,106.0],[255.0,105.0,105.0],[255.0,103.0,103.0],[255.0,101.0,101.0],[255.0,100.0,100.0],[255.0,98.0,98.0],[255.0,97.0,97.0],[255.0,95.0,95.0],[255.0,94.0,94.0],[255.0,92.0,92.0],[255.0,91.0,91.0],[255.0,89.0,89.0],[255.0,88.0,88.0],[255.0,86.0,86.0],[255.0,85.0,85.0],[255.0,83.0,83.0],[255.0,82.0,82.0],[255.0,80.0,80.0],[255.0,79.0,79.0],[255.0,77.0,77.0],[255.0,75.0,75.0],[255.0,74.0,74.0],[255.0,72.0,72.0],[255.0,71.0,71.0],[255.0,69.0,69.0],[255.0,68.0,68.0],[255.0,66.0,66.0],[255.0,65.0,65.0],[255.0,63.0,63.0],[255.0,62.0,62.0],[255.0,60.0,60.0],[255.0,59.0,59.0],[255.0,57.0,57.0],[255.0,56.0,56.0],[255.0,54.0,54.0],[255.0,53.0,53.0],[255.0,51.0,51.0],[255.0,49.0,49.0],[255.0,48.0,48.0],[255.0,46.0,46.0],[255.0,45.0,45.0],[255.0,43.0,43.0],[255.0,42.0,42.0],[255.0,40.0,40.0],[255.0,39.0,39.0],[255.0,37.0,37.0],[255.0,36.0,36.0],[255.0,34.0,34.0],[255.0,33.0,33.0],[255.0,31.0,31.0],[255.0,30.0,30.0],[255.0,28.0,28.0],[255.0,27.0,27.0],[255.0,25.0,25.0],[211.0,211.0,211.0]],"helix1":[[0.0,0.0,0.0],[0.0,0.0,0.0],[1.0,1.0,1.0],[2.0,1.0,1.0],[3.0,2.0,2.0],[4.0,2.0,2.0],[5.0,3.0,3.0],[6.0,4.0,4.0],[7.0,4.0,4.0],[7.0,5.0,5.0],[8.0,6.0,6.0],[9.0,6.0,6.0],[10.0,7.0,7.0],[10.0,8.0,8.0],[11.0,9.0,9.0],[12.0,10.0,10.0],[12.0,11.0,11.0],[13.0,11.0,11.0],[14.0,12.0,12.0],[14.0,13.0,13.0],[15.0,14.0,14.0],[15.0,15.0,15.0],[16.0,16.0,16.0],[16.0,17.0,17.0],[17.0,18.0,18.0],[17.0,19.0,19.0],[18.0,20.0,20.0],[18.0,21.0,21.0],[18.0,22.0,22.0],[19.0,23.0,23.0],[19.0,25.0,25.0],[19.0,26.0,26.0],[20.0,27.0,27.0],[20.0,28.0,28.0],[20.0,29.0,29.0],[20.0,30.0,30.0],[20.0,31.0,31.0],[21.0,33.0,33.0],[21.0,34.0,34.0],[21.0,35.0,35.0],[21.0,36.0,36.0],[21.0,37.0,37.0],[21.0,39.0,39.0],[21.0,40.0,40.0],[21.0,41.0,41.0],[21.0,42.0,42.0],[21.0,43.0,43.0],[21.0,44.0,44.0],[20.0,46.0,46.0],[20.0,47.0,47.0],[20.0,48.0,48.0],[20.0,49.0,49.0],[20.0,50.0,50.0],[19.0,52.0,52.0],[19.0,53.0,53.0],[19.0,54.0,54.0],[18.0,55.0,55.0],[18.0,56.0,56.0],[18.0,57.0,57.0],[17.0,58.0,58.0],[17.0,59.0,59.0],[17.0,60.0,60.0],[16.0,61.0,61.0],[16.0,62.0,62.0],[16.0,63.0,63.0],[15.0,64.0,64.0],[15.0,65.0,65.0],[14.0,66.0,66.0],[14.0,67.0,67.0],[13.0,68.0,68.0],[13.0,69.0,69.0],[12.0,70.0,70.0],[12.0,71.0,71.0],[11.0,72.0,72.0],[11.0,72.0,72.0],[10.0,73.0,73.0],[10.0,74.0,74.0],[9.0,75.0,75.0],[9.0,75.0,75.0],[8.0,76.0,76.0],[8.0,76.0,76.0],[7.0,77.0,77.0],[7.0,78.0,78.0],[6.0,78.0,78.0],[6.0,79.0,79.0],[5.0,79.0,79.0],[5.0,79.0,79.0],[4.0,80.0,80.0],[4.0,80.0,80.0],[4.0,80.0,80.0],[3.0,81.0,81.0],[3.0,81.0,81.0],[2.0,81.0,81.0],[2.0,81.0,81.0],[2.0,81.0,81.0],[1.0,81.0,81.0],[1.0,81.0,81.0],[1.0,81.0,81.0],[1.0,81.0,81.0],[0.0,81.0,81.0],[0.0,81.0,81.0],[0.0,81.0,81.0],[0.0,81.0,81.0],[0.0,81.0,81.0],[0.0,80.0,80.0],[0.0,80.0,80.0],[0.0,80.0,80.0],[0.0,79.0,79.0],[0.0,79.0,79.0],[0.0,79.0,79.0],[0.0,78.0,78.0],[0.0,77.0,77.0],[0.0,77.0,77.0],[0.0,76.0,76.0],[0.0,76.0,76.0],[1.0,75.0,75.0],[1.0,74.0,74.0],[1.0,74.0,74.0],[2.0,73.0,73.0],[2.0,72.0,72.0],[3.0,71.0,71.0],[3.0,70.0,70.0],[4.0,69.0,69.0],[4.0,69.0,69.0],[5.0,68.0,68.0],[6.0,67.0,67.0],[6.0,66.0,66.0],[7.0,65.0,65.0],[8.0,64.0,64.0],[9.0,62.0,62.0],[10.0,61.0,61.0],[11.0,60.0,60.0],[12.0,59.0,59.0],[13.0,58.0,58.0],[14.0,57.0,57.0],[15.0,55.0,55.0],[16.0,54.0,54.0],[18.0,53.0,53.0],[19.0,52.0,52.0],[20.0,50.0,50.0],[22.0,49.0,49.0],[23.0,48.0,48.0],[25.0,47.0,47.0],[26.0,45.0,45.0],[28.0,44.0,44.0],[29.0,43.0,43.0],[31.0,41.0,41.0],[33.0,40.0,40.0],[34.0,39.0,39.0],[36.0,37.0,37.0],[38.0,36.0,36.0],[40.0,35.0,35.0],[42.0,33.0,33.0],[44.0,32.0,32.0],[46.0,31.0,31.0],[48.0,29.0,29.0],[50.0,28.0,28.0],[52.0,27.0,27.0],[54.0,25.0,25.0],[57.0,24.0,24.0],[59.0,23.0,23.0],[61.0,22.0,22.0],[63.0,20.0,20.0],[66.0,19.0,19.0],[68.0,18.0,18.0],[71.0,17.0,17.0],[73.0,16.0,16.0],[75.0,15.0,15.0],[78.0,14.0,14.0],[81.0,13.0,13.0],[83.0,12.0,12.0],[86.0,11.0,11.0],[88.0,10.0,10.0],[91.0,9.0,9.0],[94.0,8.0,8.0],[96.0,7.0,7.0],[99.0,6.0,6.0],[102.0,5.0,5.0],[104.0,5.0,5.0],[107.0,4.0,4.0],[110.0,3.0,3.0],[113.0,3.0,3.0],[115.0,2.0,2.0],[118.0,2.0,2.0],[121.0,1.0,1.0],[124.0,1.0,1.0],[127.0,1.0,1.0],[129.0,0.0,0.0],[132.0,0.0,0.0],[135.0,0.0,0.0],[138.0,0.0,0.0],[141.0,0.0,0.0],[143.0,0.0,0.0],[146.0,0.0,0.0],[149.0,0.0,0.0],[152.0,0.0,0.0],[155.0,0.0,0.0],[157.0,0.0,0.0],[160.0,1.0,1.0],[163.0,1.0,1.0],[165.0,1.0,1.0],[168.0,2.0,2.0],[171.0,3.0,3.0],[173.0,3.0,3.0],[176.0,4.0,4.0],[179.0,5.0,5.0],[181.0,6.0,6.0],[184.0,6.0,6.0],[186.0,7.0,7.0],[188.0,8.0,8.0],[191.0,10.0,10.0],[193.0,11.0,11.0],[196.0,12.0,12.0],[198.0,13.0,13.0],[200.0,15.0,15.0],[202.0,16.0,16.0],[204.0,18.0,18.0],[206.0,19.0,19.0],[209.0,21.0,21.0],[211.0,23.0,23.0],[212.0,24.0,24.0],[214.0,26.0,26.0],[216.0,28.0,28.0],[218.0,30.0,30.0],[220.0,32.0,32.0],[221.0,34.0,34.0],[223.0,37.0,37.0],[224.0,39.0,39.0],[226.0,41.0,41.0],[227.0,44.0,44.0],[229.0,46.0,46.0],[230.0,48.0,48.0],[231.0,51.0,51.0],[232.0,54.0,54.0],[233.0,56.0,56.0],[234.0,59.0,59.0],[235.0,62.0,62.0],[236.0,65.0,65.0],[237.0,68.0,68.0],[238.0,71.0,71.0],[238.0,74.0,74.0],[239.0,77.0,77.0],[240.0,80.0,80.0],[240.0,83.0,83.0],[240.0,86.0,86.0],[241.0,89.0,89.0],[241.0,93.0,93.0],[241.0,96.0,96.0],[241.0,99.0,99.0],[241.0,103.0,103.0],[241.0,106.0,106.0],[241.0,110.0,110.0],[240.0,113.0,113.0],[240.0,117.0,117.0]],"cb_9step":[[255.0,0.0,0.0],[255.0,128.0,0.0],[255.0,255.0,0.0],[0.0,255.0,0.0],[0.0,0.0,255.0],[128.0,0.0,255.0],[219.0,219.0,255.0],[194.0,194.0,250.0],[158.0,158.0,247.0],[130.0,130.0,255.0],[97.0,97.0,255.0],[64.0,64.0,232.0],[0.0,0.0,194.0],[0.0,0.0,148.0],[222.0,250.0,245.0],[194.0,245.0,237.0],[156.0,230.0,217.0],[112.0,204.0,191.0],[43.0,184.0,163.0],[0.0,156.0,133.0],[0.0,120.0,102.0],[0.0,92.0,79.0],[219.0,255.0,219.0],[186.0,245.0,186.0],[140.0,235.0,140.0],[92.0,209.0,92.0],[0.0,184.0,0.0],[0.0,145.0,0.0],[0.0,105.0,0.0],[0.0,77.0,0.0],[235.0,204.0,255.0],[222.0,176.0,255.0],[199.0,148.0,237.0],[186.0,112.0,237.0],[171.0,77.0,237.0],[138.0,51.0,199.0],[107.0,0.0,186.0],[84.0,0.0,145.0],[250.0,227.0,240.0],[247.0,204.0,230.0],[245.0,173.0,214.0],[240.0,138.0,194.0],[217.0,92.0,163.0],[189.0,0.0,130.0],[153.0,0.0,107.0],[117.0,0.0,82.0],[255.0,219.0,219.0],[255.0,189.0,189.0],[255.0,145.0,145.0],[250.0,97.0,97.0],[214.0,26.0,26.0],[163.0,0.0,0.0],[125.0,0.0,0.0],[92.0,0.0,0.0],[255.0,252.0,214.0],[252.0,242.0,168.0],[252.0,237.0,128.0],[227.0,209.0,0.0],[199.0,186.0,43.0],[161.0,150.0,0.0],[120.0,112.0,0.0],[84.0,82.0,0.0],[255.0,222.0,199.0],[252.0,199.0,161.0],[250.0,176.0,125.0],[232.0,143.0,79.0],[209.0,105.0,31.0],[186.0,77.0,0.0],[153.0,64.0,0.0],[115.0,48.0,0.0],[240.0,240.0,240.0],[222.0,222.0,222.0],[199.0,199.0,199.0],[171.0,171.0,171.0],[145.0,145.0,145.0],[120.0,120.0,120.0],[94.0,94.0,94.0],[74.0,74.0,74.0]],"BlueYellowRed":[[5.0,35.0,80.0],[5.0,37.0,83.0],[5.0,39.0,86.0],[5.0,40.0,89.0],[5.0,42.0,92.0],[6.0,44.0,95.0],[6.0,46.0,98.0],[6.0,48.0,100.0],[6.0,49.0,103.0],[6.0,51.0,106.0],[6.0,53.0,109.0],[6.0,55.0,112.0],[6.0,57.0,115.0],[7.0,59.0,118.0],[7.0,60.0,121.0],[7.0,62.0,124.0],[7.0,64.0,127.0],[7.0,66.0,130.0],[7.0,68.0,133.0],[7.0,69.0,136.0],[7.0,71.0,138.0],[7.0,73.0,141.0],[8.0,75.0,144.0],[8.0,77.0,147.0],[8.0,78.0,150.0],[8.0,82.0,156.0],[10.0,84.0,158.0],[12.0,87.0,159.0],[15.0,89.0,161.0],[17.0,92.0,163.0],[19.0,94.0,164.0],[21.0,97.0,166.0],[24.0,99.0,168.0],[26.0,102.0,169.0],[28.0,104.0,171.0],[30.0,107.0,173.0],[33.0,109.0,174.0],[35.0,112.0,176.0],[37.0,114.0,178.0],[39.0,116.0,179.0],[41.0,119.0,181.0],[44.0,121.0,182.0],[46.0,124.0,184.0],[48.0,126.0,186.0],[50.0,129.0,187.0],[53.0,131.0,189.0],[55.0,134.0,191.0],[57.0,136.0,192.0],[59.0,139.0,194.0],[62.0,141.0,196.0],[66.0,146.0,199.0],[68.0,147.0,200.0],[69.0,149.0,200.0],[71.0,150.0,201.0],[72.0,152.0,201.0],[74.0,153.0,202.0],[76.0,155.0,202.0],[77.0,156.0,203.0],[79.0,157.0,204.0],[81.0,159.0,204.0],[82.0,160.0,205.0],[84.0,162.0,205.0],[85.0,163.0,206.0],[87.0,165.0,207.0],[89.0,166.0,207.0],[90.0,167.0,208.0],[92.0,169.0,208.0],[93.0,170.0,209.0],[95.0,172.0,209.0],[97.0,173.0,210.0],[98.0,174.0,211.0],[100.0,176.0,211.0],[102.0,177.0,212.0],[103.0,179.0,212.0],[105.0,180.0,213.0],[106.0,182.0,213.0],[108.0,183.0,214.0],[110.0,184.0,215.0],[113.0,186.0,215.0],[115.0,187.0,216.0],[118.0,189.0,216.0],[120.0,190.0,217.0],[122.0,192.0,218.0],[125.0,193.0,218.0],[127.0,194.0,219.0],[129.0,196.0,220.0],[132.0,197.0,220.0],[134.0,199.0,221.0],[137.0,200.0,221.0],[139.0,202.0,222.0],[141.0,203.0,223.0],[144.0,204.0,223.0],[146.0,206.0,224.0],[149.0,207.0,224.0],[151.0,209.0,225.0],[153.0,210.0,226.0],[156.0,211.0,226.0],[158.0,213.0,227.0],[160.0,214.0,228.0],[163.0,216.0,228.0],[165.0,217.0,229.0],[170.0,220.0,230.0],[172.0,221.0,231.0],[174.0,222.0,232.0],[176.0,223.0,233.0],[178.0,224.0,234.0],[179.0,225.0,235.0],[181.0,226.0,236.0],[183.0,227.0,237.0],[185.0,228.0,238.0],[187.0,229.0,239.0],[189.0,230.0,240.0],[191.0,231.0,241.0],[193.0,232.0,242.0],[195.0,233.0,243.0],[196.0,233.0,243.0],[198.0,234.0,244.0],[200.0,235.0,245.0],[202.0,236.0,246.0],[204.0,237.0,247.0],[206.0,238.0,248.0],[208.0,239.0,249.0],[210.0,240.0,250.0],[211.0,241.0,251.0],[213.0,242.0,252.0],[215.0,243.0,253.0],[219.0,245.0,255.0],[255.0,255.0,200.0],[255.0,254.0,197.0],[255.0,253.0,193.0],[255.0,252.0,190.0],[255.0,251.0,187.0],[255.0,250.0,184.0],[255.0,249.0,180.0],[255.0,248.0,177.0],[255.0,247.0,174.0],[255.0,246.0,171.0],[255.0,245.0,167.0],[255.0,244.0,164.0],[255.0,243.0,161.0],[255.0,243.0,158.0],[255.0,242.0,154.0],[255.0,241.0,151.0],[255.0,240.0,148.0],[255.0,239.0,144.0],[255.0,238.0,141.0],[255.0,237.0,138.0],[255.0,236.0,135.0],[255.0,235.0,131.0],[255.0,234.0,128.0],[255.0,233.0,125.0],[255.0,232.0,122.0],[255.0,230.0,115.0],[255.0,229.0,113.0],[254.0,227.0,111.0],[254.0,226.0,109.0],[253.0,225.0,108.0],[253.0,224.0,106.0],[252.0,222.0,104.0],[252.0,221.0,102.0],[251.0,220.0,100.0],[251.0,219.0,98.0],[250.0,217.0,97.0],[250.0,216.0,95.0],[249.0,215.0,93.0],[249.0,214.0,91.0],[248.0,212.0,89.0],[248.0,211.0,87.0],[247.0,210.0,85.0],[247.0,208.0,84.0],[246.0,207.0,82.0],[246.0,206.0,80.0],[245.0,205.0,78.0],[245.0,203.0,76.0],[244.0,202.0,74.0],[244.0,201.0,73.0],[243.0,200.0,71.0],[242.0,197.0,67.0],[242.0,194.0,65.0],[241.0,191.0,63.0],[241.0,188.0,62.0],[240.0,185.0,60.0],[240.0,182.0,58.0],[239.0,179.0,56.0],[239.0,176.0,54.0],[238.0,173.0,53.0],[238.0,170.0,51.0],[237.0,167.0,49.0],[237.0,164.0,47.0],[236.0,161.0,45.0],[236.0,159.0,44.0],[236.0,156.0,42.0],[235.0,153.0,40.0],[235.0,150.0,38.0],[234.0,147.0,36.0],[234.0,144.0,34.0],[233.0,141.0,33.0],[233.0,138.0,31.0],[232.0,135.0,29.0],[232.0,132.0,27.0],[231.0,129.0,25.0],[231.0,126.0,24.0],[230.0,123.0,22.0],[230.0,120.0,20.0],[229.0,118.0,19.0],[228.0,116.0,18.0],[227.0,114.0,18.0],[225.0,112.0,17.0],[224.0,110.0,16.0],[223.0,108.0,15.0],[222.0,107.0,15.0],[221.0,105.0,14.0],[220.0,103.0,13.0],[218.0,101.0,12.0],[217.0,99.0,12.0],[216.0,97.0,11.0],[215.0,95.0,10.0],[214.0,93.0,9.0],[213.0,91.0,8.0],[212.0,89.0,8.0],[210.0,87.0,7.0],[209.0,85.0,6.0],[208.0,83.0,5.0],[207.0,82.0,5.0],[206.0,80.0,4.0],[205.0,78.0,3.0],[203.0,76.0,2.0],[202.0,74.0,2.0],[200.0,70.0,0.0],[198.0,69.0,1.0],[195.0,68.0,2.0],[193.0,67.0,3.0],[190.0,65.0,4.0],[188.0,64.0,4.0],[185.0,63.0,5.0],[183.0,62.0,6.0],[180.0,61.0,7.0],[178.0,60.0,8.0],[175.0,58.0,9.0],[173.0,57.0,10.0],[170.0,56.0,11.0],[168.0,55.0,12.0],[165.0,54.0,12.0],[163.0,53.0,13.0],[160.0,52.0,14.0],[158.0,50.0,15.0],[155.0,49.0,16.0],[153.0,48.0,17.0],[150.0,47.0,18.0],[148.0,46.0,19.0],[145.0,45.0,19.0],[143.0,43.0,20.0],[140.0,42.0,21.0],[135.0,40.0,23.0]],"cyclic":[[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0],[1.0,1.0,0.0],[0.0,1.0,1.0],[1.0,0.0,1.0]],"matlab_hsv":[[255.0,0.0,0.0],[255.0,23.0,0.0],[255.0,47.0,0.0],[255.0,71.0,0.0],[255.0,95.0,0.0],[255.0,119.0,0.0],[255.0,143.0,0.0],[255.0,167.0,0.0],[255.0,191.0,0.0],[255.0,215.0,0.0],[255.0,239.0,0.0],[247.0,255.0,0.0],[223.0,255.0,0.0],[199.0,255.0,0.0],[175.0,255.0,0.0],[151.0,255.0,0.0],[127.0,255.0,0.0],[103.0,255.0,0.0],[79.0,255.0,0.0],[55.0,255.0,0.0],[31.0,255.0,0.0],[7.0,255.0,0.0],[0.0,255.0,15.0],[0.0,255.0,39.0],[0.0,255.0,63.0],[0.0,255.0,87.0],[0.0,255.0,111.0],[0.0,255.0,135.0],[0.0,255.0,159.0],[0.0,255.0,183.0],[0.0,255.0,207.0],[0.0,255.0,231.0],[0.0,255.0,255.0],[0.0,231.0,255.0],[0.0,207.0,255.0],[0.0,183.0,255.0],[0.0,159.0,255.0],[0.0,135.0,255.0],[0.0,111.0,255.0],[0.0,87.0,255.0],[0.0,63.0,255.0],[0.0,39.0,255.0],[0.0,15.0,255.0],[7.0,0.0,255.0],[31.0,0.0,255.0],[55.0,0.0,255.0],[79.0,0.0,255.0],[103.0,0.0,255.0],[127.0,0.0,255.0],[151.0,0.0,255.0],[175.0,0.0,255.0],[199.0,0.0,255.0],[223.0,0.0,255.0],[247.0,0.0,255.0],[255.0,0.0,239.0],[255.0,0.0,215.0],[255.0,0.0,191.0],[255.0,0.0,167.0],[255.0,0.0,143.0],[255.0,0.0,119.0],[255.0,0.0,95.0],[255.0,0.0,71.0],[255.0,0.0,47.0],[255.0,0.0,23.0]],"StepSeq25":[[153.0,15.0,15.0],[178.0,44.0,44.0],[204.0,81.0,81.0],[229.0,126.0,126.0],[255.0,178.0,178.0],[153.0,84.0,15.0],[178.0,111.0,44.0],[204.0,142.0,81.0],[229.0,177.0,126.0],[255.0,216.0,178.0],[107.0,153.0,15.0],[133.0,178.0,44.0],[163.0,204.0,81.0],[195.0,229.0,126.0],[229.0,255.0,178.0],[15.0,107.0,153.0],[44.0,133.0,178.0],[81.0,163.0,204.0],[126.0,195.0,229.0],[178.0,229.0,255.0],[38.0,15.0,153.0],[66.0,44.0,178.0],[101.0,81.0,204.0],[143.0,126.0,229.0],[191.0,178.0,255.0]],"MPL_YlGn":[[0.999016,0.999631,0.892626],[0.997047,0.998893,0.881799],[0.995079,0.998155,0.870973],[0.99311,0.997416,0.860146],[0.991142,0.996678,0.84932],[0.989173,0.99594,0.838493],[0.987205,0.995202,0.827666],[0.985236,0.994464,0.81684],[0.983268,0.993725,0.806013],[0.982284,0.993356,0.8006],[0.979331,0.992249,0.78436],[0.978347,0.99188,0.778947],[0.975394,0.990773,0.762707],[0.97441,0.990404,0.757293],[0.971457,0.989296,0.741053],[0.970473,0.988927,0.73564],[0.964475,0.986574,0.722445],[0.957093,0.983622,0.717032],[0.953403,0.982145,0.714325],[0.94233,0.977716,0.706205],[0.934948,0.974764,0.700792],[0.927566,0.971811,0.695379],[0.923875,0.970334,0.692672],[0.912803,0.965905,0.684552],[0.905421,0.962953,0.679139],[0.898039,0.96,0.673726],[0.894348,0.958524,0.671019],[0.883276,0.954095,0.662899],[0.875894,0.951142,0.657486],[0.868512,0.948189,0.652072],[0.864821,0.946713,0.649366],[0.853749,0.942284,0.641246],[0.844214,0.938255,0.635986],[0.833387,0.933579,0.630819],[0.822561,0.928904,0.625652],[0.811734,0.924229,0.620484],[0.800907,0.919554,0.615317],[0.795494,0.917216,0.612734],[0.779254,0.910204,0.604983],[0.768428,0.905529,0.599815],[0.757601,0.900854,0.594648],[0.746774,0.896178,0.589481],[0.735948,0.891503,0.584314],[0.725121,0.886828,0.579147],[0.714295,0.882153,0.573979],[0.708881,0.879815,0.571396],[0.692641,0.872803,0.563645],[0.681815,0.868128,0.558478],[0.669466,0.862776,0.55331],[0.656424,0.857117,0.548143],[0.643383,0.851457,0.542976],[0.630342,0.845798,0.537809],[0.617301,0.840138,0.532641],[0.61078,0.837309,0.530058],[0.591219,0.82882,0.522307],[0.578178,0.82316,0.51714],[0.565136,0.817501,0.511972],[0.552095,0.811842,0.506805],[0.539054,0.806182,0.501638],[0.526013,0.800523,0.496471],[0.512972,0.794864,0.491303],[0.506451,0.792034,0.48872],[0.48689,0.783545,0.480969],[0.473849,0.777885,0.475802],[0.460438,0.771488,0.469343],[0.446905,0.764844,0.462453],[0.433372,0.758201,0.455563],[0.419839,0.751557,0.448674],[0.406305,0.744914,0.441784],[0.392772,0.73827,0.434894],[0.379239,0.731626,0.428005],[0.365706,0.724983,0.421115],[0.352172,0.718339,0.414225],[0.338639,0.711696,0.407336],[0.325106,0.705052,0.400446],[0.318339,0.70173,0.397001],[0.298039,0.691765,0.386667],[0.284506,0.685121,0.379777],[0.270973,0.678478,0.372887],[0.257439,0.671834,0.365998],[0.248904,0.662791,0.359508],[0.241523,0.653195,0.35311],[0.234141,0.643599,0.346713],[0.226759,0.634002,0.340315],[0.219377,0.624406,0.333918],[0.211995,0.61481,0.32752],[0.204614,0.605213,0.321123],[0.197232,0.595617,0.314725],[0.18985,0.586021,0.308328],[0.182468,0.576424,0.30193],[0.175087,0.566828,0.295532],[0.171396,0.56203,0.292334],[0.160323,0.547636,0.282737],[0.152941,0.538039,0.27634],[0.145559,0.528443,0.269942],[0.138178,0.518847,0.263545],[0.129719,0.511619,0.260161],[0.121107,0.504729,0.257209],[0.112495,0.497839,0.254256],[0.103883,0.49095,0.251303],[0.095271,0.48406,0.248351],[0.086659,0.47717,0.245398],[0.078047,0.470281,0.242445],[0.069435,0.463391,0.239493],[0.060823,0.456501,0.23654],[0.052211,0.449612,0.233587],[0.043599,0.442722,0.230634],[0.039293,0.439277,0.229158],[0.026374,0.428943,0.224729],[0.017762,0.422053,0.221776],[0.00915,0.415163,0.218824],[0.000538,0.408274,0.215871],[0.0,0.399769,0.212457],[0.0,0.391157,0.209012],[0.0,0.382545,0.205567],[0.0,0.373933,0.202122],[0.0,0.365321,0.198677],[0.0,0.356709,0.195233],[0.0,0.348097,0.191788],[0.0,0.339485,0.188343],[0.0,0.330873,0.184898],[0.0,0.322261,0.181453],[0.0,0.313649,0.178008],[0.0,0.309343,0.176286],[0.0,0.296424,0.171119],[0.0,0.287812,0.167674],[0.0,0.2792,0.164229],[0.0,0.270588,0.160784]],"MPL_Paired":[[0.628143,0.793295,0.882245],[0.582468,0.764198,0.866344],[0.536794,0.735102,0.850442],[0.491119,0.706005,0.834541],[0.445444,0.676909,0.818639],[0.399769,0.647812,0.802737],[0.354095,0.618716,0.786836],[0.30842,0.589619,0.770934],[0.262745,0.560523,0.755033],[0.239908,0.545975,0.747082],[0.171396,0.50233,0.72323],[0.148558,0.487782,0.715279],[0.166782,0.502268,0.692964],[0.191649,0.519692,0.685859],[0.266251,0.571965,0.664544],[0.291119,0.589389,0.657439],[0.365721,0.641661,0.636125],[0.415456,0.676509,0.621915],[0.440323,0.693933,0.61481],[0.514925,0.746205,0.593495],[0.56466,0.781053,0.579285],[0.614394,0.815902,0.565075],[0.639262,0.833326,0.55797],[0.684368,0.867728,0.531057],[0.641399,0.846413,0.499254],[0.598431,0.825098,0.467451],[0.576947,0.814441,0.451549],[0.512495,0.782468,0.403845],[0.469527,0.761153,0.372042],[0.426559,0.739839,0.340238],[0.405075,0.729181,0.324337],[0.340623,0.697209,0.276632],[0.297655,0.675894,0.244829],[0.254687,0.654579,0.213026],[0.211719,0.633264,0.181223],[0.249212,0.625975,0.199369],[0.316878,0.623945,0.236248],[0.350711,0.62293,0.254687],[0.452211,0.619885,0.310004],[0.519877,0.617855,0.346882],[0.587543,0.615825,0.38376],[0.65521,0.613795,0.420638],[0.722876,0.611765,0.457516],[0.790542,0.609735,0.494394],[0.858208,0.607705,0.531273],[0.892042,0.60669,0.549712],[0.983206,0.598016,0.594233],[0.975087,0.55471,0.551942],[0.966967,0.511403,0.50965],[0.958847,0.468097,0.467359],[0.950727,0.42479,0.425067],[0.942607,0.381484,0.382776],[0.934487,0.338178,0.340484],[0.930427,0.316524,0.319339],[0.918247,0.251565,0.255902],[0.910127,0.208258,0.21361],[0.902007,0.164952,0.171319],[0.893887,0.121646,0.129027],[0.894994,0.132411,0.125121],[0.903791,0.188235,0.153203],[0.912587,0.24406,0.181284],[0.916986,0.271972,0.195325],[0.930181,0.355709,0.237447],[0.938977,0.411534,0.265529],[0.947774,0.467359,0.29361],[0.956571,0.523183,0.321692],[0.965367,0.579008,0.349773],[0.974164,0.634833,0.377855],[0.98296,0.690657,0.405936],[0.991757,0.746482,0.434018],[0.992803,0.728351,0.399446],[0.993479,0.706697,0.361892],[0.994156,0.685044,0.324337],[0.994833,0.663391,0.286782],[0.995509,0.641738,0.249227],[0.995848,0.630911,0.23045],[0.996863,0.598431,0.174118],[0.997539,0.576778,0.136563],[0.998216,0.555125,0.099008],[0.998893,0.533472,0.061453],[0.999569,0.511819,0.023899],[0.993479,0.504314,0.026328],[0.975548,0.521569,0.098731],[0.957616,0.538824,0.171134],[0.939685,0.556078,0.243537],[0.921753,0.573333,0.31594],[0.903822,0.590588,0.388343],[0.88589,0.607843,0.460746],[0.867958,0.625098,0.533149],[0.850027,0.642353,0.605552],[0.832095,0.659608,0.677955],[0.82313,0.668235,0.714156],[0.796232,0.694118,0.82276],[0.767059,0.667451,0.823529],[0.734579,0.627866,0.80323],[0.702099,0.588281,0.78293],[0.669619,0.548697,0.76263],[0.63714,0.509112,0.74233],[0.60466,0.469527,0.72203],[0.57218,0.429942,0.70173],[0.5397,0.390358,0.68143],[0.50722,0.350773,0.66113],[0.47474,0.311188,0.64083],[0.442261,0.271603,0.620531],[0.424852,0.25115,0.60386],[0.475263,0.316786,0.603522],[0.525675,0.382422,0.603183],[0.55088,0.41524,0.603014],[0.626498,0.513695,0.602507],[0.676909,0.579331,0.602168],[0.72732,0.644967,0.60183],[0.777732,0.710604,0.601492],[0.828143,0.77624,0.601153],[0.878554,0.841876,0.600815],[0.928966,0.907512,0.600477],[0.979377,0.973149,0.600138],[0.984406,0.966813,0.577409],[0.958016,0.91065,0.539177],[0.931626,0.854487,0.500946],[0.905236,0.798324,0.462714],[0.878847,0.742161,0.424483],[0.852457,0.685998,0.386251],[0.826067,0.629835,0.34802],[0.812872,0.601753,0.328904],[0.773287,0.517509,0.271557],[0.746897,0.461346,0.233326],[0.720508,0.405183,0.195094],[0.694118,0.34902,0.156863]],"3saw":[[0.0,255.0,255.0],[1.0,251.0,255.0],[2.0,246.0,254.0],[3.0,241.0,253.0],[4.0,236.0,252.0],[5.0,231.0,251.0],[6.0,226.0,250.0],[7.0,221.0,249.0],[8.0,216.0,248.0],[9.0,211.0,247.0],[10.0,206.0,246.0],[11.0,201.0,245.0],[12.0,196.0,244.0],[13.0,191.0,243.0],[14.0,186.0,242.0],[15.0,181.0,241.0],[16.0,176.0,240.0],[17.0,171.0,239.0],[18.0,166.0,238.0],[19.0,161.0,237.0],[20.0,156.0,236.0],[21.0,151.0,235.0],[22.0,146.0,234.0],[23.0,141.0,233.0],[24.0,136.0,232.0],[25.0,131.0,231.0],[26.0,126.0,230.0],[27.0,121.0,229.0],[28.0,116.0,228.0],[29.0,111.0,227.0],[30.0,106.0,226.0],[31.0,101.0,225.0],[32.0,96.0,224.0],[33.0,91.0,223.0],[34.0,86.0,222.0],[35.0,81.0,221.0],[36.0,76.0,220.0],[37.0,71.0,219.0],[38.0,66.0,218.0],[39.0,61.0,217.0],[40.0,56.0,216.0],[41.0,51.0,215.0],[42.0,46.0,214.0],[43.0,41.0,213.0],[44.0,36.0,212.0],[45.0,31.0,211.0],[46.0,26.0,210.0],[47.0,21.0,209.0],[48.0,16.0,208.0],[49.0,11.0,207.0],[50.0,6.0,206.0],[51.0,1.0,205.0],[52.0,252.0,204.0],[53.0,247.0,203.0],[54.0,242.0,202.0],[55.0,237.0,201.0],[56.0,232.0,200.0],[57.0,227.0,199.0],[58.0,222.0,198.0],[59.0,217.0,197.0],[60.0,212.0,196.0],[61.0,207.0,195.0],[62.0,202.0,194.0],[63.0,197.0,193.0],[64.0,192.0,192.0],[65.0,187.0,191.0],[66.0,182.0,190.0],[67.0,177.0,189.0],[68.0,172.0,188.0],[69.0,167.0,187.0],[70.0,162.0,186.0],[71.0,157.0,185.0],[72.0,152.0,184.0],[73.0,147.0,183.0],[74.0,142.0,182.0],[75.0,137.0,181.0],[76.0,132.0,180.0],[77.0,127.0,179.0],[78.0,122.0,178.0],[79.0,117.0,177.0],[80.0,112.0,176.0],[81.0,107.0,175.0],[82.0,102.0,174.0],[83.0,97.0,173.0],[84.0,92.0,172.0],[85.0,87.0,171.0],[86.0,82.0,170.0],[87.0,77.0,169.0],[88.0,72.0,168.0],[89.0,67.0,167.0],[90.0,62.0,166.0],[91.0,57.0,165.0],[92.0,52.0,164.0],[93.0,47.0,163.0],[94.0,42.0,162.0],[95.0,37.0,161.0],[96.0,32.0,160.0],[97.0,27.0,159.0],[98.0,22.0,158.0],[99.0,17.0,157.0],[100.0,12.0,156.0],[101.0,7.0,155.0],[102.0,2.0,154.0],[103.0,253.0,153.0],[104.0,248.0,152.0],[105.0,243.0,151.0],[106.0,238.0,150.0],[107.0,233.0,149.0],[108.0,228.0,148.0],[109.0,223.0,147.0],[110.0,218.0,146.0],[111.0,213.0,145.0],[112.0,208.0,144.0],[113.0,203.0,143.0],[114.0,198.0,142.0],[115.0,193.0,141.0],[116.0,188.0,140.0],[117.0,183.0,139.0],[118.0,178.0,138.0],[119.0,173.0,137.0],[120.0,168.0,136.0],[121.0,163.0,135.0],[122.0,158.0,134.0],[123.0,153.0,133.0],[124.0,148.0,132.0],[125.0,143.0,131.0],[126.0,138.0,130.0],[127.0,133.0,129.0],[128.0,128.0,128.0],[129.0,123.0,127.0],[130.0,118.0,126.0],[131.0,113.0,125.0],[132.0,108.0,124.0],[133.0,103.0,123.0],[134.0,98.0,122.0],[135.0,93.0,121.0],[136.0,88.0,120.0],[137.0,83.0,119.0],[138.0,78.0,118.0],[139.0,73.0,117.0],[140.0,68.0,116.0],[141.0,63.0,115.0],[142.0,58.0,114.0],[143.0,53.0,113.0],[144.0,48.0,112.0],[145.0,43.0,111.0],[146.0,38.0,110.0],[147.0,33.0,109.0],[148.0,28.0,108.0],[149.0,23.0,107.0],[150.0,18.0,106.0],[151.0,13.0,105.0],[152.0,8.0,104.0],[153.0,3.0,103.0],[154.0,254.0,102.0],[155.0,249.0,101.0],[156.0,244.0,100.0],[157.0,239.0,99.0],[158.0,234.0,98.0],[159.0,229.0,97.0],[160.0,224.0,96.0],[161.0,219.0,95.0],[162.0,214.0,94.0],[163.0,209.0,93.0],[164.0,204.0,92.0],[165.0,199.0,91.0],[166.0,194.0,90.0],[167.0,189.0,89.0],[168.0,184.0,88.0],[169.0,179.0,87.0],[170.0,174.0,86.0],[171.0,169.0,85.0],[172.0,164.0,84.0],[173.0,159.0,83.0],[174.0,154.0,82.0],[175.0,149.0,81.0],[176.0,144.0,80.0],[177.0,139.0,79.0],[178.0,134.0,78.0],[179.0,129.0,77.0],[180.0,124.0,76.0],[181.0,119.0,75.0],[182.0,114.0,74.0],[183.0,109.0,73.0],[184.0,104.0,72.0],[185.0,99.0,71.0],[186.0,94.0,70.0],[187.0,89.0,69.0],[188.0,84.0,68.0],[189.0,79.0,67.0],[190.0,74.0,66.0],[191.0,69.0,65.0],[192.0,64.0,64.0],[193.0,59.0,63.0],[194.0,54.0,62.0],[195.0,49.0,61.0],[196.0,44.0,60.0],[197.0,39.0,59.0],[198.0,34.0,58.0],[199.0,29.0,57.0],[200.0,24.0,56.0],[201.0,19.0,55.0],[202.0,14.0,54.0],[203.0,9.0,53.0],[204.0,4.0,52.0],[205.0,255.0,51.0],[206.0,250.0,50.0],[207.0,245.0,49.0],[208.0,240.0,48.0],[209.0,235.0,47.0],[210.0,230.0,46.0],[211.0,225.0,45.0],[212.0,220.0,44.0],[213.0,215.0,43.0],[214.0,210.0,42.0],[215.0,205.0,41.0],[216.0,200.0,40.0],[217.0,195.0,39.0],[218.0,190.0,38.0],[219.0,185.0,37.0],[220.0,180.0,36.0],[221.0,175.0,35.0],[222.0,170.0,34.0],[223.0,165.0,33.0],[224.0,160.0,32.0],[225.0,155.0,31.0],[226.0,150.0,30.0],[227.0,145.0,29.0],[228.0,140.0,28.0],[229.0,135.0,27.0],[230.0,130.0,26.0],[231.0,125.0,25.0],[232.0,120.0,24.0],[233.0,115.0,23.0],[234.0,110.0,22.0],[235.0,105.0,21.0],[236.0,100.0,20.0],[237.0,95.0,19.0],[238.0,90.0,18.0],[239.0,85.0,17.0],[240.0,80.0,16.0],[241.0,75.0,15.0],[242.0,70.0,14.0],[243.0,65.0,13.0],[244.0,60.0,12.0],[245.0,55.0,11.0],[246.0,50.0,10.0],[247.0,45.0,9.0],[248.0,40.0,8.0],[249.0,35.0,7.0],[250.0,30.0,6.0],[251.0,25.0,5.0],[252.0,20.0,4.0],[253.0,15.0,3.0]],"MPL_PRGn":[[0.259285,0.006459,0.30273],[0.275894,0.019377,0.319954],[0.292503,0.032295,0.337178],[0.309112,0.045213,0.354402],[0.325721,0.058131,0.371626],[0.34233,0.07105,0.38885],[0.358939,0.083968,0.406075],[0.375548,0.096886,0.423299],[0.392157,0.109804,0.440523],[0.400461,0.116263,0.449135],[0.425375,0.13564,0.474971],[0.433679,0.142099,0.483583],[0.458593,0.161476,0.509419],[0.465436,0.170088,0.516801],[0.481584,0.202384,0.535256],[0.486967,0.213149,0.541407],[0.503114,0.245444,0.559862],[0.513879,0.266974,0.572165],[0.519262,0.277739,0.578316],[0.535409,0.310035,0.59677],[0.546175,0.331565,0.609073],[0.55694,0.353095,0.621376],[0.562322,0.36386,0.627528],[0.57847,0.396155,0.645982],[0.589235,0.417686,0.658285],[0.6,0.439216,0.670588],[0.606305,0.447366,0.676125],[0.625221,0.471819,0.692734],[0.637832,0.48812,0.703806],[0.650442,0.504421,0.714879],[0.656747,0.512572,0.720415],[0.675663,0.537024,0.737024],[0.688274,0.553326,0.748097],[0.700884,0.569627,0.75917],[0.713495,0.585929,0.770242],[0.726105,0.60223,0.781315],[0.738716,0.618531,0.792388],[0.745021,0.626682,0.797924],[0.763629,0.650673,0.813687],[0.77501,0.665129,0.821376],[0.78639,0.679585,0.829066],[0.79777,0.694041,0.836755],[0.80915,0.708497,0.844444],[0.820531,0.722953,0.852134],[0.831911,0.737409,0.859823],[0.837601,0.744637,0.863668],[0.854671,0.766321,0.875202],[0.866052,0.780777,0.882891],[0.877432,0.795233,0.890581],[0.888812,0.809689,0.89827],[0.900192,0.824145,0.905959],[0.908343,0.836755,0.912111],[0.913264,0.84752,0.916724],[0.915725,0.852903,0.919031],[0.923107,0.86905,0.925952],[0.928028,0.879815,0.930565],[0.932949,0.890581,0.935179],[0.93787,0.901346,0.939792],[0.942791,0.912111,0.944406],[0.947712,0.922876,0.94902],[0.952634,0.933641,0.953633],[0.955094,0.939023,0.95594],[0.962476,0.955171,0.96286],[0.967397,0.965936,0.967474],[0.961707,0.967013,0.960323],[0.95248,0.96486,0.94925],[0.943253,0.962707,0.938178],[0.934025,0.960554,0.927105],[0.924798,0.958401,0.916032],[0.915571,0.956248,0.90496],[0.906344,0.954095,0.893887],[0.897116,0.951942,0.882814],[0.887889,0.949789,0.871742],[0.878662,0.947636,0.860669],[0.869435,0.945483,0.849596],[0.864821,0.944406,0.84406],[0.85098,0.941176,0.827451],[0.835294,0.934717,0.811765],[0.819608,0.928258,0.796078],[0.803922,0.921799,0.780392],[0.788235,0.91534,0.764706],[0.772549,0.908881,0.74902],[0.756863,0.902422,0.733333],[0.741176,0.895963,0.717647],[0.72549,0.889504,0.701961],[0.709804,0.883045,0.686275],[0.694118,0.876586,0.670588],[0.678431,0.870127,0.654902],[0.662745,0.863668,0.639216],[0.645137,0.855363,0.622607],[0.621761,0.841523,0.60323],[0.610073,0.834602,0.593541],[0.57501,0.813841,0.564475],[0.551634,0.8,0.545098],[0.528258,0.786159,0.525721],[0.504883,0.772318,0.506344],[0.481507,0.758478,0.486967],[0.458132,0.744637,0.467589],[0.434756,0.730796,0.448212],[0.41138,0.716955,0.428835],[0.388005,0.703114,0.409458],[0.364629,0.689273,0.390081],[0.343253,0.674048,0.373933],[0.323875,0.657439,0.361015],[0.304498,0.64083,0.348097],[0.285121,0.624221,0.335179],[0.265744,0.607612,0.322261],[0.256055,0.599308,0.315802],[0.22699,0.574394,0.296424],[0.207612,0.557785,0.283506],[0.188235,0.541176,0.270588],[0.168858,0.524567,0.25767],[0.149481,0.507958,0.244752],[0.130104,0.491349,0.231834],[0.110727,0.47474,0.218916],[0.099654,0.458593,0.209227],[0.091349,0.442599,0.200615],[0.083045,0.426605,0.192003],[0.07474,0.410611,0.183391],[0.066436,0.394617,0.174779],[0.058131,0.378624,0.166167],[0.049827,0.36263,0.157555],[0.041522,0.346636,0.148943],[0.03737,0.338639,0.144637],[0.024913,0.314648,0.131719],[0.016609,0.298654,0.123106],[0.008304,0.282661,0.114494],[0.0,0.266667,0.105882]],"NCV_rainbow2":[[38.0,0.0,50.0],[38.0,0.0,51.0],[38.0,0.0,51.0],[38.0,0.0,51.0],[39.0,0.0,52.0],[39.0,0.0,52.0],[39.0,0.0,53.0],[40.0,0.0,54.0],[41.0,0.0,55.0],[41.0,0.0,57.0],[42.0,0.0,58.0],[43.0,0.0,60.0],[44.0,0.0,61.0],[45.0,0.0,63.0],[46.0,0.0,65.0],[47.0,0.0,67.0],[48.0,0.0,70.0],[50.0,0.0,72.0],[51.0,0.0,75.0],[52.0,0.0,77.0],[53.0,0.0,80.0],[54.0,0.0,83.0],[56.0,0.0,86.0],[57.0,0.0,89.0],[58.0,0.0,92.0],[59.0,0.0,96.0],[60.0,0.0,99.0],[61.0,0.0,103.0],[62.0,0.0,106.0],[63.0,0.0,110.0],[64.0,0.0,114.0],[65.0,0.0,117.0],[65.0,0.0,121.0],[66.0,0.0,125.0],[66.0,0.0,129.0],[66.0,0.0,133.0],[66.0,0.0,137.0],[66.0,0.0,141.0],[66.0,0.0,145.0],[65.0,0.0,150.0],[65.0,0.0,154.0],[64.0,0.0,158.0],[63.0,0.0,162.0],[62.0,0.0,166.0],[60.0,0.0,170.0],[59.0,0.0,174.0],[57.0,0.0,179.0],[55.0,0.0,183.0],[52.0,0.0,187.0],[50.0,0.0,191.0],[47.0,0.0,195.0],[44.0,0.0,198.0],[41.0,0.0,202.0],[38.0,0.0,206.0],[34.0,0.0,210.0],[30.0,0.0,213.0],[26.0,0.0,217.0],[21.0,0.0,220.0],[17.0,0.0,223.0],[12.0,0.0,226.0],[7.0,0.0,229.0],[2.0,0.0,232.0],[0.0,3.0,235.0],[0.0,8.0,237.0],[0.0,14.0,240.0],[0.0,20.0,242.0],[0.0,26.0,244.0],[0.0,33.0,246.0],[0.0,39.0,247.0],[0.0,46.0,249.0],[0.0,52.0,250.0],[0.0,59.0,251.0],[0.0,66.0,252.0],[0.0,73.0,253.0],[0.0,80.0,253.0],[0.0,86.0,253.0],[0.0,93.0,253.0],[0.0,100.0,253.0],[0.0,107.0,253.0],[0.0,114.0,253.0],[0.0,121.0,253.0],[0.0,128.0,253.0],[0.0,136.0,252.0],[0.0,143.0,252.0],[0.0,150.0,252.0],[0.0,157.0,252.0],[0.0,165.0,252.0],[0.0,172.0,252.0],[0.0,180.0,252.0],[0.0,187.0,252.0],[0.0,194.0,251.0],[0.0,202.0,251.0],[0.0,210.0,251.0],[0.0,217.0,251.0],[0.0,225.0,250.0],[0.0,232.0,250.0],[0.0,240.0,250.0],[0.0,247.0,250.0],[0.0,249.0,244.0],[0.0,249.0,235.0],[0.0,248.0,227.0],[0.0,248.0,219.0],[0.0,247.0,210.0],[0.0,247.0,202.0],[0.0,246.0,193.0],[0.0,245.0,185.0],[0.0,245.0,176.0],[0.0,244.0,167.0],[0.0,243.0,159.0],[0.0,241.0,150.0],[0.0,240.0,141.0],[0.0,238.0,132.0],[0.0,237.0,123.0],[0.0,235.0,114.0],[0.0,232.0,105.0],[0.0,229.0,96.0],[0.0,226.0,87.0],[0.0,222.0,78.0],[0.0,217.0,69.0],[0.0,212.0,61.0],[0.0,206.0,52.0],[0.0,198.0,43.0],[0.0,190.0,35.0],[0.0,181.0,27.0],[0.0,172.0,20.0],[0.0,163.0,13.0],[0.0,157.0,7.0],[0.0,153.0,2.0],[2.0,153.0,0.0],[7.0,157.0,0.0],[13.0,163.0,0.0],[20.0,172.0,0.0],[27.0,181.0,0.0],[35.0,190.0,0.0],[43.0,198.0,0.0],[52.0,206.0,0.0],[61.0,212.0,0.0],[69.0,217.0,0.0],[78.0,222.0,0.0],[87.0,226.0,0.0],[96.0,229.0,0.0],[105.0,232.0,0.0],[114.0,235.0,0.0],[123.0,237.0,0.0],[132.0,238.0,0.0],[141.0,240.0,0.0],[150.0,241.0,0.0],[159.0,243.0,0.0],[167.0,244.0,0.0],[176.0,245.0,0.0],[185.0,245.0,0.0],[193.0,246.0,0.0],[202.0,247.0,0.0],[210.0,247.0,0.0],[219.0,248.0,0.0],[227.0,248.0,0.0],[235.0,249.0,0.0],[244.0,249.0,0.0],[250.0,247.0,0.0],[250.0,240.0,0.0],[250.0,232.0,0.0],[250.0,225.0,0.0],[251.0,217.0,0.0],[251.0,210.0,0.0],[251.0,202.0,0.0],[251.0,194.0,0.0],[252.0,187.0,0.0],[252.0,180.0,0.0],[252.0,172.0,0.0],[252.0,165.0,0.0],[252.0,157.0,0.0],[252.0,150.0,0.0],[252.0,143.0,0.0],[252.0,136.0,0.0],[253.0,128.0,0.0],[253.0,121.0,0.0],[253.0,114.0,0.0],[253.0,107.0,0.0],[253.0,100.0,0.0],[253.0,93.0,0.0],[253.0,86.0,0.0],[253.0,80.0,0.0],[253.0,73.0,0.0],[252.0,66.0,0.0],[251.0,59.0,0.0],[250.0,52.0,0.0],[249.0,46.0,0.0],[247.0,39.0,0.0],[246.0,33.0,0.0],[244.0,26.0,0.0],[242.0,20.0,0.0],[240.0,14.0,0.0],[237.0,8.0,0.0],[235.0,3.0,0.0],[232.0,0.0,2.0],[229.0,0.0,7.0],[226.0,0.0,12.0],[223.0,0.0,17.0],[220.0,0.0,21.0],[217.0,0.0,26.0],[213.0,0.0,30.0],[210.0,0.0,34.0],[206.0,0.0,38.0],[202.0,0.0,41.0],[198.0,0.0,44.0],[195.0,0.0,47.0],[191.0,0.0,50.0],[187.0,0.0,52.0],[183.0,0.0,55.0],[179.0,0.0,57.0],[174.0,0.0,59.0],[170.0,0.0,60.0],[166.0,0.0,62.0],[162.0,0.0,63.0],[158.0,0.0,64.0],[154.0,0.0,65.0],[150.0,0.0,65.0],[145.0,0.0,66.0],[141.0,0.0,66.0],[137.0,0.0,66.0],[133.0,0.0,66.0],[129.0,0.0,66.0],[125.0,0.0,66.0],[121.0,0.0,65.0],[117.0,0.0,65.0],[114.0,0.0,64.0],[110.0,0.0,63.0],[106.0,0.0,62.0],[103.0,0.0,61.0],[99.0,0.0,60.0],[96.0,0.0,59.0],[92.0,0.0,58.0],[89.0,0.0,57.0],[86.0,0.0,56.0],[83.0,0.0,54.0],[80.0,0.0,53.0],[77.0,0.0,52.0],[75.0,0.0,51.0],[72.0,0.0,50.0],[70.0,0.0,48.0],[67.0,0.0,47.0],[65.0,0.0,46.0],[63.0,0.0,45.0],[61.0,0.0,44.0],[60.0,0.0,43.0],[58.0,0.0,42.0],[57.0,0.0,41.0],[55.0,0.0,41.0],[54.0,0.0,40.0],[53.0,0.0,39.0],[52.0,0.0,39.0],[52.0,0.0,39.0],[51.0,0.0,38.0],[51.0,0.0,38.0],[51.0,0.0,38.0],[50.0,0.0,38.0]],"MPL_PuBuGn":[[0.997662,0.966044,0.98296],[0.992987,0.960877,0.980254],[0.988312,0.955709,0.977547],[0.983637,0.950542,0.97484],[0.978962,0.945375,0.972134],[0.974287,0.940208,0.969427],[0.969612,0.93504,0.96672],[0.964937,0.929873,0.964014],[0.960261,0.924706,0.961307],[0.957924,0.922122,0.959954],[0.950911,0.914371,0.955894],[0.948574,0.911788,0.954541],[0.941561,0.904037,0.950481],[0.939223,0.901453,0.949127],[0.932211,0.893702,0.945067],[0.929873,0.891119,0.943714],[0.921615,0.883922,0.939792],[0.914725,0.879739,0.937332],[0.91128,0.877647,0.936102],[0.900946,0.871373,0.932411],[0.894056,0.86719,0.92995],[0.887166,0.863007,0.927489],[0.883722,0.860915,0.926259],[0.873387,0.854641,0.922568],[0.866498,0.850458,0.920108],[0.859608,0.846275,0.917647],[0.856163,0.844183,0.916417],[0.845829,0.837909,0.912726],[0.838939,0.833726,0.910265],[0.832049,0.829542,0.907805],[0.828604,0.827451,0.906574],[0.81827,0.821176,0.902884],[0.809227,0.816532,0.900269],[0.798893,0.811611,0.897562],[0.788558,0.80669,0.894856],[0.778224,0.801769,0.892149],[0.767889,0.796847,0.889443],[0.762722,0.794387,0.888089],[0.74722,0.787005,0.884029],[0.736886,0.782084,0.881323],[0.726551,0.777163,0.878616],[0.716217,0.772241,0.875909],[0.705882,0.76732,0.873203],[0.695548,0.762399,0.870496],[0.685213,0.757478,0.867789],[0.680046,0.755017,0.866436],[0.664544,0.747636,0.862376],[0.65421,0.742714,0.859669],[0.640323,0.737793,0.856794],[0.624821,0.732872,0.853841],[0.60932,0.727951,0.850888],[0.593818,0.72303,0.847935],[0.578316,0.718108,0.844983],[0.570565,0.715648,0.843506],[0.547313,0.708266,0.839077],[0.531811,0.703345,0.836125],[0.516309,0.698424,0.833172],[0.500807,0.693503,0.830219],[0.485306,0.688581,0.827266],[0.469804,0.68366,0.824314],[0.454302,0.678739,0.821361],[0.446551,0.676278,0.819885],[0.423299,0.668897,0.815456],[0.407797,0.663975,0.812503],[0.394879,0.658132,0.808997],[0.382822,0.65198,0.805306],[0.370765,0.645829,0.801615],[0.358708,0.639677,0.797924],[0.346651,0.633526,0.794233],[0.334594,0.627374,0.790542],[0.322537,0.621223,0.786851],[0.310481,0.615071,0.78316],[0.298424,0.60892,0.779469],[0.286367,0.602768,0.775779],[0.27431,0.596617,0.772088],[0.268281,0.593541,0.770242],[0.250196,0.584314,0.764706],[0.238139,0.578162,0.761015],[0.226082,0.572011,0.757324],[0.214025,0.565859,0.753633],[0.201369,0.561707,0.742145],[0.188574,0.558016,0.728858],[0.175779,0.554325,0.715571],[0.162983,0.550634,0.702284],[0.150188,0.546944,0.688997],[0.137393,0.543253,0.675709],[0.124598,0.539562,0.662422],[0.111803,0.535871,0.649135],[0.099008,0.53218,0.635848],[0.086213,0.528489,0.622561],[0.073418,0.524798,0.609273],[0.06702,0.522953,0.60263],[0.047828,0.517416,0.582699],[0.035033,0.513726,0.569412],[0.022238,0.510035,0.556125],[0.009443,0.506344,0.542837],[0.007628,0.501361,0.530627],[0.007382,0.496194,0.51857],[0.007136,0.491027,0.506513],[0.00689,0.485859,0.494456],[0.006644,0.480692,0.482399],[0.006398,0.475525,0.470342],[0.006151,0.470358,0.458285],[0.005905,0.46519,0.446228],[0.005659,0.460023,0.434171],[0.005413,0.454856,0.422115],[0.005167,0.449689,0.410058],[0.005044,0.447105,0.404029],[0.004675,0.439354,0.385944],[0.004429,0.434187,0.373887],[0.004183,0.42902,0.36183],[0.003937,0.423852,0.349773],[0.003922,0.414764,0.340946],[0.003922,0.405413,0.332334],[0.003922,0.396063,0.323722],[0.003922,0.386713,0.31511],[0.003922,0.377363,0.306498],[0.003922,0.368012,0.297885],[0.003922,0.358662,0.289273],[0.003922,0.349312,0.280661],[0.003922,0.339962,0.272049],[0.003922,0.330611,0.263437],[0.003922,0.321261,0.254825],[0.003922,0.316586,0.250519],[0.003922,0.302561,0.237601],[0.003922,0.29321,0.228989],[0.003922,0.28386,0.220377],[0.003922,0.27451,0.211765]],"MPL_PiYG":[[0.565321,0.00792,0.328181],[0.582238,0.015917,0.341407],[0.599154,0.023914,0.354633],[0.616071,0.031911,0.367859],[0.632987,0.039908,0.381084],[0.649904,0.047905,0.39431],[0.66682,0.055902,0.407536],[0.683737,0.063899,0.420761],[0.700654,0.071895,0.433987],[0.709112,0.075894,0.4406],[0.734487,0.087889,0.460438],[0.742945,0.091888,0.467051],[0.76832,0.103883,0.48689],[0.774471,0.112957,0.493964],[0.786005,0.155402,0.516571],[0.78985,0.16955,0.524106],[0.801384,0.211995,0.546713],[0.809073,0.240292,0.561784],[0.812918,0.254441,0.56932],[0.824452,0.296886,0.591926],[0.832141,0.325183,0.606997],[0.839831,0.353479,0.622068],[0.843676,0.367628,0.629604],[0.85521,0.410073,0.652211],[0.862899,0.43837,0.667282],[0.870588,0.466667,0.682353],[0.87351,0.476355,0.68912],[0.882276,0.505421,0.709419],[0.88812,0.524798,0.722953],[0.893964,0.544175,0.736486],[0.896886,0.553864,0.743253],[0.905652,0.58293,0.763552],[0.911496,0.602307,0.777086],[0.917339,0.621684,0.790619],[0.923183,0.641061,0.804152],[0.929027,0.660438,0.817686],[0.934871,0.679815,0.831219],[0.937793,0.689504,0.837985],[0.946021,0.716955,0.856517],[0.949712,0.729873,0.862976],[0.953403,0.742791,0.869435],[0.957093,0.755709,0.875894],[0.960784,0.768627,0.882353],[0.964475,0.781546,0.888812],[0.968166,0.794464,0.895271],[0.970012,0.800923,0.898501],[0.975548,0.8203,0.908189],[0.979239,0.833218,0.914648],[0.98293,0.846136,0.921107],[0.986621,0.859054,0.927566],[0.990311,0.871972,0.934025],[0.991234,0.881968,0.938485],[0.989389,0.889043,0.940946],[0.988466,0.89258,0.942176],[0.985698,0.903191,0.945867],[0.983852,0.910265,0.948328],[0.982007,0.917339,0.950788],[0.980161,0.924414,0.953249],[0.978316,0.931488,0.955709],[0.976471,0.938562,0.95817],[0.974625,0.945636,0.960631],[0.973702,0.949173,0.961861],[0.970934,0.959785,0.965552],[0.969089,0.966859,0.968012],[0.964706,0.968166,0.959631],[0.959477,0.967551,0.947636],[0.954248,0.966936,0.93564],[0.94902,0.966321,0.923645],[0.943791,0.965705,0.911649],[0.938562,0.96509,0.899654],[0.933333,0.964475,0.887659],[0.928105,0.96386,0.875663],[0.922876,0.963245,0.863668],[0.917647,0.96263,0.851672],[0.912418,0.962015,0.839677],[0.909804,0.961707,0.833679],[0.901961,0.960784,0.815686],[0.887812,0.954633,0.792926],[0.873664,0.948481,0.770165],[0.859516,0.94233,0.747405],[0.845367,0.936178,0.724644],[0.831219,0.930027,0.701884],[0.81707,0.923875,0.679123],[0.802922,0.917724,0.656363],[0.788774,0.911572,0.633602],[0.774625,0.905421,0.610842],[0.760477,0.89927,0.588082],[0.746328,0.893118,0.565321],[0.73218,0.886967,0.542561],[0.717186,0.879508,0.520185],[0.699654,0.868128,0.498962],[0.690888,0.862438,0.488351],[0.664591,0.845367,0.456517],[0.647059,0.833987,0.435294],[0.629527,0.822607,0.414072],[0.611995,0.811226,0.392849],[0.594464,0.799846,0.371626],[0.576932,0.788466,0.350404],[0.5594,0.777086,0.329181],[0.541869,0.765706,0.307958],[0.524337,0.754325,0.286736],[0.506805,0.742945,0.265513],[0.49035,0.730796,0.249981],[0.474971,0.717878,0.240138],[0.459592,0.70496,0.230296],[0.444214,0.692042,0.220454],[0.428835,0.679123,0.210611],[0.421146,0.672664,0.20569],[0.398078,0.653287,0.190927],[0.382699,0.640369,0.181084],[0.36732,0.627451,0.171242],[0.351942,0.614533,0.161399],[0.336563,0.601615,0.151557],[0.321184,0.588697,0.141715],[0.305805,0.575779,0.131872],[0.293195,0.561938,0.127566],[0.281507,0.547789,0.125106],[0.269819,0.533641,0.122645],[0.258131,0.519493,0.120185],[0.246444,0.505344,0.117724],[0.234756,0.491196,0.115263],[0.223068,0.477047,0.112803],[0.21138,0.462899,0.110342],[0.205536,0.455825,0.109112],[0.188005,0.434602,0.105421],[0.176317,0.420454,0.10296],[0.164629,0.406305,0.1005],[0.152941,0.392157,0.098039]],"MPL_BrBG":[[0.338024,0.19331,0.020377],[0.355248,0.20346,0.021915],[0.372472,0.21361,0.023453],[0.389696,0.22376,0.02499],[0.40692,0.23391,0.026528],[0.424145,0.24406,0.028066],[0.441369,0.25421,0.029604],[0.458593,0.26436,0.031142],[0.475817,0.27451,0.03268],[0.484429,0.279585,0.033449],[0.510265,0.29481,0.035755],[0.518877,0.299885,0.036524],[0.544714,0.31511,0.038831],[0.552941,0.321338,0.041907],[0.576471,0.343483,0.058055],[0.584314,0.350865,0.063437],[0.607843,0.37301,0.079585],[0.623529,0.387774,0.09035],[0.631373,0.395156,0.095732],[0.654902,0.417301,0.11188],[0.670588,0.432065,0.122645],[0.686275,0.446828,0.13341],[0.694118,0.45421,0.138793],[0.717647,0.476355,0.15494],[0.733333,0.491119,0.165706],[0.74902,0.505882,0.176471],[0.753941,0.515879,0.188774],[0.768704,0.545867,0.225682],[0.778547,0.565859,0.250288],[0.788389,0.585852,0.274894],[0.79331,0.595848,0.287197],[0.808074,0.625836,0.324106],[0.817916,0.645829,0.348712],[0.827759,0.665821,0.373318],[0.837601,0.685813,0.397924],[0.847443,0.705805,0.42253],[0.857286,0.725798,0.447136],[0.862207,0.735794,0.459439],[0.876278,0.763706,0.495579],[0.883353,0.775394,0.517109],[0.890427,0.787082,0.538639],[0.897501,0.79877,0.560169],[0.904575,0.810458,0.581699],[0.911649,0.822145,0.60323],[0.918724,0.833833,0.62476],[0.922261,0.839677,0.635525],[0.932872,0.857209,0.66782],[0.939946,0.868897,0.68935],[0.94702,0.880584,0.71088],[0.954095,0.892272,0.732411],[0.961169,0.90396,0.753941],[0.964552,0.911803,0.772395],[0.964245,0.915802,0.787774],[0.964091,0.917801,0.795463],[0.963629,0.923799,0.818531],[0.963322,0.927797,0.83391],[0.963014,0.931795,0.849289],[0.962707,0.935794,0.864667],[0.962399,0.939792,0.880046],[0.962092,0.943791,0.895425],[0.961784,0.947789,0.910804],[0.96163,0.949789,0.918493],[0.961169,0.955786,0.941561],[0.960861,0.959785,0.95694],[0.950173,0.958247,0.957093],[0.936025,0.954864,0.952172],[0.921876,0.95148,0.947251],[0.907728,0.948097,0.94233],[0.893579,0.944714,0.937409],[0.879431,0.94133,0.932488],[0.865283,0.937947,0.927566],[0.851134,0.934564,0.922645],[0.836986,0.93118,0.917724],[0.822837,0.927797,0.912803],[0.808689,0.924414,0.907882],[0.801615,0.922722,0.905421],[0.780392,0.917647,0.898039],[0.758554,0.908727,0.886967],[0.736717,0.899808,0.875894],[0.714879,0.890888,0.864821],[0.693041,0.881968,0.853749],[0.671203,0.873049,0.842676],[0.649366,0.864129,0.831603],[0.627528,0.85521,0.820531],[0.60569,0.84629,0.809458],[0.583852,0.83737,0.798385],[0.562015,0.828451,0.787313],[0.540177,0.819531,0.77624],[0.518339,0.810611,0.765167],[0.496194,0.799769,0.753018],[0.473126,0.78316,0.737639],[0.461592,0.774856,0.72995],[0.42699,0.749942,0.706882],[0.403922,0.733333,0.691503],[0.380854,0.716724,0.676125],[0.357785,0.700115,0.660746],[0.334717,0.683506,0.645367],[0.311649,0.666897,0.629988],[0.288581,0.650288,0.61461],[0.265513,0.633679,0.599231],[0.242445,0.61707,0.583852],[0.219377,0.600461,0.568474],[0.199846,0.584621,0.553249],[0.183852,0.56955,0.538178],[0.167859,0.554479,0.523107],[0.151865,0.539408,0.508035],[0.135871,0.524337,0.492964],[0.127874,0.516801,0.485429],[0.103883,0.494195,0.462822],[0.087889,0.479123,0.447751],[0.071895,0.464052,0.43268],[0.055902,0.448981,0.417609],[0.039908,0.43391,0.402537],[0.023914,0.418839,0.387466],[0.00792,0.403768,0.372395],[0.003691,0.390311,0.358016],[0.003383,0.377393,0.343868],[0.003076,0.364475,0.329719],[0.002768,0.351557,0.315571],[0.002461,0.338639,0.301423],[0.002153,0.325721,0.287274],[0.001845,0.312803,0.273126],[0.001538,0.299885,0.258977],[0.001384,0.293426,0.251903],[0.000923,0.274048,0.230681],[0.000615,0.26113,0.216532],[0.000308,0.248212,0.202384],[0.0,0.235294,0.188235]],"wh-bl-gr-ye-re":[[255.0,255.0,255.0],[250.0,250.0,255.0],[245.0,245.0,255.0],[240.0,240.0,255.0],[235.0,235.0,255.0],[230.0,230.0,255.0],[224.0,224.0,255.0],[219.0,219.0,255.0],[214.0,214.0,255.0],[209.0,209.0,255.0],[204.0,204.0,255.0],[199.0,199.0,255.0],[194.0,194.0,255.0],[189.0,189.0,255.0],[184.0,184.0,255.0],[179.0,179.0,255.0],[173.0,173.0,255.0],[168.0,168.0,255.0],[163.0,163.0,255.0],[158.0,158.0,255.0],[153.0,153.0,255.0],[148.0,148.0,255.0],[143.0,143.0,255.0],[138.0,138.0,255.0],[133.0,133.0,255.0],[128.0,128.0,255.0],[122.0,122.0,255.0],[117.0,117.0,255.0],[112.0,112.0,255.0],[107.0,107.0,255.0],[102.0,102.0,255.0],[97.0,97.0,255.0],[92.0,92.0,255.0],[87.0,87.0,255.0],[82.0,82.0,255.0],[77.0,77.0,255.0],[71.0,71.0,255.0],[66.0,66.0,255.0],[61.0,61.0,255.0],[56.0,56.0,255.0],[51.0,51.0,255.0],[46.0,46.0,255.0],[41.0,41.0,255.0],[36.0,36.0,255.0],[31.0,31.0,255.0],[26.0,26.0,255.0],[20.0,20.0,255.0],[15.0,15.0,255.0],[10.0,10.0,255.0],[5.0,5.0,255.0],[0.0,0.0,255.0],[0.0,4.0,250.0],[0.0,7.0,245.0],[0.0,11.0,240.0],[1.0,15.0,235.0],[1.0,18.0,231.0],[1.0,22.0,226.0],[1.0,26.0,221.0],[1.0,29.0,216.0],[1.0,33.0,211.0],[2.0,37.0,206.0],[2.0,40.0,201.0],[2.0,44.0,196.0],[2.0,47.0,191.0],[2.0,51.0,186.0],[2.0,55.0,182.0],[3.0,58.0,177.0],[3.0,62.0,172.0],[3.0,66.0,167.0],[3.0,69.0,162.0],[3.0,73.0,157.0],[3.0,77.0,152.0],[4.0,80.0,147.0],[4.0,84.0,142.0],[4.0,88.0,137.0],[4.0,91.0,133.0],[4.0,95.0,128.0],[4.0,99.0,123.0],[5.0,102.0,118.0],[5.0,106.0,113.0],[5.0,110.0,108.0],[5.0,113.0,103.0],[5.0,117.0,98.0],[5.0,121.0,93.0],[6.0,124.0,88.0],[6.0,128.0,84.0],[6.0,132.0,79.0],[6.0,135.0,74.0],[6.0,139.0,69.0],[6.0,142.0,64.0],[7.0,146.0,59.0],[7.0,150.0,54.0],[7.0,153.0,49.0],[7.0,157.0,44.0],[7.0,161.0,39.0],[7.0,164.0,35.0],[8.0,168.0,30.0],[8.0,172.0,25.0],[8.0,175.0,20.0],[8.0,179.0,15.0],[13.0,181.0,15.0],[18.0,182.0,14.0],[23.0,184.0,14.0],[28.0,185.0,14.0],[33.0,187.0,14.0],[38.0,188.0,13.0],[43.0,190.0,13.0],[48.0,191.0,13.0],[52.0,193.0,12.0],[57.0,194.0,12.0],[62.0,196.0,12.0],[67.0,197.0,11.0],[72.0,199.0,11.0],[77.0,200.0,11.0],[82.0,202.0,11.0],[87.0,203.0,10.0],[92.0,205.0,10.0],[97.0,206.0,10.0],[102.0,208.0,9.0],[107.0,209.0,9.0],[112.0,211.0,9.0],[117.0,212.0,8.0],[122.0,214.0,8.0],[127.0,215.0,8.0],[132.0,217.0,8.0],[136.0,219.0,7.0],[141.0,220.0,7.0],[146.0,222.0,7.0],[151.0,223.0,6.0],[156.0,225.0,6.0],[161.0,226.0,6.0],[166.0,228.0,5.0],[171.0,229.0,5.0],[176.0,231.0,5.0],[181.0,232.0,5.0],[186.0,234.0,4.0],[191.0,235.0,4.0],[196.0,237.0,4.0],[201.0,238.0,3.0],[206.0,240.0,3.0],[211.0,241.0,3.0],[215.0,243.0,2.0],[220.0,244.0,2.0],[225.0,246.0,2.0],[230.0,247.0,2.0],[235.0,249.0,1.0],[240.0,250.0,1.0],[245.0,252.0,1.0],[250.0,253.0,0.0],[255.0,255.0,0.0],[255.0,250.0,0.0],[255.0,245.0,0.0],[255.0,239.0,0.0],[255.0,234.0,0.0],[255.0,229.0,0.0],[255.0,224.0,0.0],[255.0,219.0,0.0],[255.0,213.0,0.0],[255.0,208.0,0.0],[255.0,203.0,0.0],[255.0,198.0,0.0],[255.0,193.0,0.0],[255.0,187.0,0.0],[255.0,182.0,0.0],[255.0,177.0,0.0],[255.0,172.0,0.0],[255.0,167.0,0.0],[255.0,161.0,0.0],[255.0,156.0,0.0],[255.0,151.0,0.0],[255.0,146.0,0.0],[255.0,141.0,0.0],[255.0,135.0,0.0],[255.0,130.0,0.0],[255.0,125.0,0.0],[255.0,120.0,0.0],[255.0,114.0,0.0],[255.0,109.0,0.0],[255.0,104.0,0.0],[255.0,99.0,0.0],[255.0,94.0,0.0],[255.0,88.0,0.0],[255.0,83.0,0.0],[255.0,78.0,0.0],[255.0,73.0,0.0],[255.0,68.0,0.0],[255.0,62.0,0.0],[255.0,57.0,0.0],[255.0,52.0,0.0],[255.0,47.0,0.0],[255.0,42.0,0.0],[255.0,36.0,0.0],[255.0,31.0,0.0],[255.0,26.0,0.0],[255.0,21.0,0.0],[255.0,16.0,0.0],[255.0,10.0,0.0],[255.0,5.0,0.0],[255.0,0.0,0.0]],"amw":[[147.0,112.0,219.0],[0.0,0.0,200.0],[60.0,100.0,230.0],[120.0,155.0,242.0],[176.0,224.0,230.0],[32.0,178.0,170.0],[154.0,205.0,50.0],[46.0,139.0,87.0],[245.0,230.0,190.0],[222.0,184.0,135.0],[255.0,225.0,0.0],[255.0,165.0,0.0],[255.0,69.0,0.0],[178.0,34.0,34.0],[255.0,182.0,193.0],[255.0,20.0,147.0]],"tbr_stdev_0-30":[[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[5.0,0.0,7.0],[9.0,0.0,14.0],[14.0,0.0,21.0],[18.0,0.0,29.0],[23.0,0.0,36.0],[27.0,0.0,43.0],[32.0,0.0,50.0],[37.0,0.0,57.0],[41.0,0.0,64.0],[46.0,0.0,72.0],[50.0,0.0,79.0],[55.0,0.0,86.0],[60.0,0.0,93.0],[64.0,0.0,100.0],[69.0,0.0,107.0],[73.0,0.0,115.0],[78.0,0.0,122.0],[82.0,0.0,129.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[84.0,6.0,132.0],[82.0,12.0,128.0],[79.0,17.0,124.0],[77.0,23.0,120.0],[74.0,29.0,116.0],[72.0,35.0,113.0],[69.0,40.0,109.0],[67.0,46.0,105.0],[64.0,52.0,101.0],[62.0,58.0,97.0],[59.0,64.0,93.0],[56.0,69.0,89.0],[54.0,75.0,85.0],[51.0,81.0,81.0],[49.0,87.0,77.0],[46.0,92.0,74.0],[44.0,98.0,70.0],[41.0,104.0,66.0],[39.0,110.0,62.0],[36.0,115.0,58.0],[33.0,121.0,54.0],[31.0,127.0,50.0],[28.0,133.0,46.0],[26.0,139.0,42.0],[23.0,144.0,38.0],[21.0,150.0,35.0],[18.0,156.0,31.0],[16.0,162.0,27.0],[13.0,167.0,23.0],[11.0,173.0,19.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[20.0,183.0,14.0],[32.0,186.0,14.0],[43.0,190.0,13.0],[55.0,193.0,12.0],[67.0,197.0,11.0],[79.0,201.0,11.0],[90.0,204.0,10.0],[102.0,208.0,9.0],[114.0,212.0,9.0],[126.0,215.0,8.0],[137.0,219.0,7.0],[149.0,222.0,6.0],[161.0,226.0,6.0],[173.0,230.0,5.0],[184.0,233.0,4.0],[196.0,237.0,4.0],[208.0,241.0,3.0],[220.0,244.0,2.0],[231.0,248.0,1.0],[243.0,251.0,1.0],[255.0,255.0,0.0],[255.0,246.0,0.0],[255.0,237.0,0.0],[255.0,228.0,0.0],[255.0,219.0,0.0],[255.0,209.0,0.0],[255.0,200.0,0.0],[255.0,191.0,0.0],[255.0,182.0,0.0],[255.0,173.0,0.0],[255.0,164.0,0.0],[255.0,155.0,0.0],[255.0,146.0,0.0],[255.0,137.0,0.0],[255.0,128.0,0.0],[255.0,118.0,0.0],[255.0,109.0,0.0],[255.0,100.0,0.0],[255.0,91.0,0.0],[255.0,82.0,0.0],[255.0,73.0,0.0],[255.0,64.0,0.0],[255.0,55.0,0.0],[255.0,46.0,0.0],[255.0,36.0,0.0],[255.0,27.0,0.0],[255.0,18.0,0.0],[255.0,9.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[253.0,13.0,40.0],[250.0,27.0,80.0],[248.0,40.0,120.0],[245.0,53.0,160.0],[243.0,67.0,200.0],[240.0,80.0,240.0],[242.0,102.0,242.0],[244.0,124.0,244.0],[246.0,146.0,246.0],[248.0,168.0,248.0],[249.0,189.0,249.0],[251.0,211.0,251.0],[253.0,233.0,253.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0]],"seaice_1":[[0.0,0.0,139.0],[30.0,144.0,255.0],[30.0,250.0,160.0],[34.0,139.0,34.0],[0.0,250.0,0.0],[125.0,250.0,0.0],[173.0,255.0,47.0],[250.0,250.0,0.0],[250.0,125.0,0.0],[250.0,0.0,0.0],[186.0,85.0,211.0],[148.0,0.0,211.0],[120.0,0.0,90.0]],"GrayWhiteGray":[[95.0,95.0,95.0],[97.0,97.0,97.0],[99.0,99.0,99.0],[101.0,101.0,101.0],[103.0,103.0,103.0],[104.0,104.0,104.0],[106.0,106.0,106.0],[108.0,108.0,108.0],[110.0,110.0,110.0],[112.0,112.0,112.0],[114.0,114.0,114.0],[116.0,116.0,116.0],[118.0,118.0,118.0],[119.0,119.0,119.0],[121.0,121.0,121.0],[123.0,123.0,123.0],[125.0,125.0,125.0],[127.0,127.0,127.0],[129.0,129.0,129.0],[131.0,131.0,131.0],[133.0,133.0,133.0],[135.0,135.0,135.0],[136.0,136.0,136.0],[138.0,138.0,138.0],[140.0,140.0,140.0],[142.0,142.0,142.0],[144.0,144.0,144.0],[146.0,146.0,146.0],[148.0,148.0,148.0],[150.0,150.0,150.0],[151.0,151.0,151.0],[153.0,153.0,153.0],[155.0,155.0,155.0],[157.0,157.0,157.0],[159.0,159.0,159.0],[161.0,161.0,161.0],[163.0,163.0,163.0],[165.0,165.0,165.0],[167.0,167.0,167.0],[168.0,168.0,168.0],[170.0,170.0,170.0],[172.0,172.0,172.0],[174.0,174.0,174.0],[176.0,176.0,176.0],[178.0,178.0,178.0],[180.0,180.0,180.0],[182.0,182.0,182.0],[183.0,183.0,183.0],[185.0,185.0,185.0],[187.0,187.0,187.0],[189.0,189.0,189.0],[191.0,191.0,191.0],[193.0,193.0,193.0],[195.0,195.0,195.0],[197.0,197.0,197.0],[199.0,199.0,199.0],[200.0,200.0,200.0],[202.0,202.0,202.0],[204.0,204.0,204.0],[206.0,206.0,206.0],[208.0,208.0,208.0],[210.0,210.0,210.0],[212.0,212.0,212.0],[214.0,214.0,214.0],[215.0,215.0,215.0],[217.0,217.0,217.0],[219.0,219.0,219.0],[221.0,221.0,221.0],[223.0,223.0,223.0],[225.0,225.0,225.0],[227.0,227.0,227.0],[229.0,229.0,229.0],[231.0,231.0,231.0],[232.0,232.0,232.0],[234.0,234.0,234.0],[236.0,236.0,236.0],[238.0,238.0,238.0],[240.0,240.0,240.0],[242.0,242.0,242.0],[244.0,244.0,244.0],[246.0,246.0,246.0],[247.0,247.0,247.0],[249.0,249.0,249.0],[251.0,251.0,251.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[253.0,253.0,253.0],[251.0,251.0,251.0],[249.0,249.0,249.0],[247.0,247.0,247.0],[246.0,246.0,246.0],[244.0,244.0,244.0],[242.0,242.0,242.0],[240.0,240.0,240.0],[238.0,238.0,238.0],[236.0,236.0,236.0],[234.0,234.0,234.0],[232.0,232.0,232.0],[231.0,231.0,231.0],[229.0,229.0,229.0],[227.0,227.0,227.0],[225.0,225.0,225.0],[223.0,223.0,223.0],[221.0,221.0,221.0],[219.0,219.0,219.0],[217.0,217.0,217.0],[215.0,215.0,215.0],[214.0,214.0,214.0],[212.0,212.0,212.0],[210.0,210.0,210.0],[208.0,208.0,208.0],[206.0,206.0,206.0],[204.0,204.0,204.0],[202.0,202.0,202.0],[200.0,200.0,200.0],[199.0,199.0,199.0],[197.0,197.0,197.0],[195.0,195.0,195.0],[193.0,193.0,193.0],[191.0,191.0,191.0],[189.0,189.0,189.0],[187.0,187.0,187.0],[185.0,185.0,185.0],[183.0,183.0,183.0],[182.0,182.0,182.0],[180.0,180.0,180.0],[178.0,178.0,178.0],[176.0,176.0,176.0],[174.0,174.0,174.0],[172.0,172.0,172.0],[170.0,170.0,170.0],[168.0,168.0,168.0],[167.0,167.0,167.0],[165.0,165.0,165.0],[163.0,163.0,163.0],[161.0,161.0,161.0],[159.0,159.0,159.0],[157.0,157.0,157.0],[155.0,155.0,155.0],[153.0,153.0,153.0],[151.0,151.0,151.0],[150.0,150.0,150.0],[148.0,148.0,148.0],[146.0,146.0,146.0],[144.0,144.0,144.0],[142.0,142.0,142.0],[140.0,140.0,140.0],[138.0,138.0,138.0],[136.0,136.0,136.0],[135.0,135.0,135.0],[133.0,133.0,133.0],[131.0,131.0,131.0],[129.0,129.0,129.0],[127.0,127.0,127.0],[125.0,125.0,125.0],[123.0,123.0,123.0],[121.0,121.0,121.0],[119.0,119.0,119.0],[118.0,118.0,118.0],[116.0,116.0,116.0],[114.0,114.0,114.0],[112.0,112.0,112.0],[110.0,110.0,110.0],[108.0,108.0,108.0],[106.0,106.0,106.0],[104.0,104.0,104.0],[103.0,103.0,103.0],[101.0,101.0,101.0],[99.0,99.0,99.0],[95.0,95.0,95.0]],"extrema":[[0.0,0.0,255.0],[2.0,0.0,252.0],[5.0,0.0,249.0],[8.0,1.0,246.0],[11.0,3.0,243.0],[14.0,9.0,240.0],[17.0,20.0,237.0],[19.0,39.0,235.0],[22.0,67.0,232.0],[25.0,105.0,229.0],[27.0,149.0,227.0],[30.0,193.0,224.0],[32.0,229.0,222.0],[35.0,251.0,219.0],[37.0,253.0,217.0],[39.0,238.0,215.0],[42.0,208.0,212.0],[44.0,171.0,210.0],[46.0,133.0,208.0],[48.0,99.0,206.0],[50.0,74.0,204.0],[53.0,59.0,201.0],[55.0,54.0,199.0],[57.0,61.0,197.0],[59.0,77.0,195.0],[61.0,101.0,193.0],[62.0,130.0,192.0],[64.0,162.0,190.0],[66.0,194.0,188.0],[68.0,221.0,186.0],[70.0,241.0,184.0],[72.0,252.0,182.0],[73.0,254.0,181.0],[75.0,246.0,179.0],[77.0,231.0,177.0],[78.0,209.0,176.0],[80.0,184.0,174.0],[81.0,158.0,173.0],[83.0,132.0,171.0],[84.0,109.0,170.0],[86.0,89.0,168.0],[87.0,74.0,167.0],[88.0,63.0,166.0],[90.0,56.0,164.0],[91.0,54.0,163.0],[92.0,57.0,162.0],[93.0,63.0,161.0],[95.0,72.0,159.0],[96.0,84.0,158.0],[97.0,99.0,157.0],[98.0,116.0,156.0],[99.0,133.0,155.0],[100.0,151.0,154.0],[101.0,169.0,153.0],[102.0,187.0,152.0],[103.0,203.0,151.0],[104.0,217.0,150.0],[105.0,229.0,149.0],[106.0,239.0,148.0],[107.0,247.0,147.0],[108.0,252.0,146.0],[109.0,254.0,145.0],[110.0,254.0,144.0],[110.0,253.0,144.0],[111.0,249.0,143.0],[112.0,244.0,142.0],[113.0,237.0,141.0],[113.0,229.0,141.0],[114.0,221.0,140.0],[115.0,211.0,139.0],[115.0,202.0,139.0],[116.0,192.0,138.0],[116.0,182.0,138.0],[117.0,173.0,137.0],[117.0,163.0,137.0],[118.0,154.0,136.0],[118.0,146.0,136.0],[119.0,137.0,135.0],[119.0,130.0,135.0],[120.0,122.0,134.0],[120.0,116.0,134.0],[121.0,109.0,133.0],[121.0,104.0,133.0],[121.0,98.0,133.0],[122.0,93.0,132.0],[122.0,89.0,132.0],[122.0,85.0,132.0],[123.0,81.0,131.0],[123.0,78.0,131.0],[123.0,75.0,131.0],[124.0,73.0,130.0],[124.0,70.0,130.0],[124.0,68.0,130.0],[124.0,66.0,130.0],[125.0,65.0,129.0],[125.0,63.0,129.0],[125.0,62.0,129.0],[125.0,61.0,129.0],[125.0,60.0,129.0],[126.0,59.0,128.0],[126.0,59.0,128.0],[126.0,58.0,128.0],[126.0,57.0,128.0],[126.0,57.0,128.0],[126.0,57.0,128.0],[126.0,56.0,128.0],[126.0,56.0,128.0],[126.0,56.0,128.0],[127.0,56.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,55.0,127.0],[127.0,54.0,127.0],[127.0,54.0,127.0],[127.0,54.0,127.0],[127.0,54.0,127.0],[127.0,54.0,127.0],[127.0,54.0,127.0],[128.0,54.0,126.0],[128.0,54.0,126.0],[128.0,54.0,126.0],[128.0,55.0,126.0],[128.0,55.0,126.0],[128.0,55.0,126.0],[128.0,55.0,126.0],[128.0,55.0,126.0],[128.0,56.0,126.0],[129.0,56.0,125.0],[129.0,57.0,125.0],[129.0,57.0,125.0],[129.0,58.0,125.0],[129.0,59.0,125.0],[130.0,60.0,124.0],[130.0,61.0,124.0],[130.0,63.0,124.0],[130.0,64.0,124.0],[131.0,66.0,123.0],[131.0,69.0,123.0],[131.0,71.0,123.0],[132.0,74.0,122.0],[132.0,78.0,122.0],[132.0,81.0,122.0],[133.0,85.0,121.0],[133.0,90.0,121.0],[133.0,95.0,121.0],[134.0,101.0,120.0],[134.0,107.0,120.0],[135.0,114.0,119.0],[135.0,121.0,119.0],[136.0,129.0,118.0],[136.0,137.0,118.0],[137.0,146.0,117.0],[137.0,155.0,117.0],[138.0,165.0,116.0],[138.0,175.0,116.0],[139.0,185.0,115.0],[139.0,196.0,115.0],[140.0,206.0,114.0],[141.0,216.0,113.0],[141.0,225.0,113.0],[142.0,234.0,112.0],[143.0,241.0,111.0],[144.0,247.0,110.0],[144.0,252.0,110.0],[145.0,254.0,109.0],[146.0,254.0,108.0],[147.0,252.0,107.0],[148.0,247.0,106.0],[149.0,240.0,105.0],[150.0,230.0,104.0],[151.0,218.0,103.0],[152.0,203.0,102.0],[153.0,186.0,101.0],[154.0,169.0,100.0],[155.0,150.0,99.0],[156.0,132.0,98.0],[157.0,114.0,97.0],[158.0,97.0,96.0],[159.0,82.0,95.0],[161.0,70.0,93.0],[162.0,61.0,92.0],[163.0,56.0,91.0],[164.0,54.0,90.0],[166.0,58.0,88.0],[167.0,65.0,87.0],[168.0,78.0,86.0],[170.0,95.0,84.0],[171.0,116.0,83.0],[173.0,140.0,81.0],[174.0,167.0,80.0],[176.0,193.0,78.0],[177.0,218.0,77.0],[179.0,238.0,75.0],[181.0,250.0,73.0],[182.0,255.0,72.0],[184.0,249.0,70.0],[186.0,233.0,68.0],[188.0,209.0,66.0],[190.0,179.0,64.0],[192.0,147.0,62.0],[193.0,115.0,61.0],[195.0,88.0,59.0],[197.0,68.0,57.0],[199.0,56.0,55.0],[201.0,55.0,53.0],[204.0,65.0,50.0],[206.0,86.0,48.0],[208.0,116.0,46.0],[210.0,153.0,44.0],[212.0,192.0,42.0],[215.0,226.0,39.0],[217.0,249.0,37.0],[219.0,254.0,35.0],[222.0,240.0,32.0],[224.0,209.0,30.0],[227.0,167.0,27.0],[229.0,121.0,25.0],[232.0,80.0,22.0],[235.0,48.0,19.0],[237.0,26.0,17.0],[240.0,12.0,14.0],[243.0,5.0,11.0],[246.0,2.0,8.0]],"SVG_Gallet13":[[100.0,180.0,180.0],[100.0,180.0,180.0],[104.0,184.0,184.0],[108.0,184.0,184.0],[108.0,188.0,188.0],[112.0,192.0,192.0],[116.0,192.0,192.0],[120.0,200.0,200.0],[124.0,200.0,200.0],[124.0,204.0,204.0],[128.0,204.0,204.0],[132.0,208.0,208.0],[132.0,212.0,212.0],[140.0,216.0,216.0],[144.0,220.0,220.0],[148.0,220.0,220.0],[152.0,220.0,220.0],[156.0,220.0,220.0],[160.0,224.0,220.0],[168.0,224.0,216.0],[172.0,228.0,216.0],[176.0,228.0,216.0],[180.0,228.0,216.0],[184.0,228.0,216.0],[188.0,232.0,212.0],[196.0,232.0,212.0],[200.0,236.0,212.0],[204.0,236.0,212.0],[208.0,236.0,212.0],[212.0,240.0,208.0],[216.0,240.0,208.0],[224.0,240.0,208.0],[228.0,244.0,208.0],[232.0,244.0,204.0],[236.0,244.0,204.0],[240.0,248.0,204.0],[244.0,248.0,204.0],[252.0,252.0,200.0],[252.0,248.0,180.0],[252.0,244.0,160.0],[252.0,236.0,140.0],[252.0,232.0,120.0],[248.0,228.0,120.0],[240.0,212.0,112.0],[236.0,204.0,108.0],[232.0,200.0,108.0],[224.0,192.0,104.0],[220.0,184.0,100.0],[216.0,176.0,96.0],[208.0,164.0,92.0],[204.0,156.0,88.0],[196.0,148.0,84.0],[192.0,140.0,80.0],[188.0,132.0,76.0],[184.0,128.0,76.0],[176.0,112.0,68.0],[168.0,104.0,64.0],[164.0,96.0,60.0],[160.0,92.0,60.0],[156.0,84.0,56.0],[152.0,76.0,52.0],[140.0,60.0,44.0],[136.0,56.0,44.0],[132.0,48.0,40.0],[128.0,40.0,36.0],[124.0,32.0,32.0],[116.0,24.0,28.0],[120.0,40.0,36.0],[136.0,60.0,40.0],[152.0,80.0,44.0],[164.0,92.0,48.0],[172.0,104.0,52.0],[184.0,120.0,56.0],[204.0,144.0,68.0],[212.0,160.0,72.0],[224.0,172.0,76.0],[232.0,184.0,84.0],[244.0,200.0,88.0],[252.0,212.0,92.0],[236.0,208.0,100.0],[204.0,200.0,116.0],[188.0,200.0,124.0],[168.0,196.0,128.0],[152.0,192.0,136.0],[136.0,188.0,144.0],[120.0,184.0,152.0],[112.0,172.0,136.0],[108.0,168.0,124.0],[104.0,160.0,116.0],[96.0,156.0,108.0],[92.0,148.0,100.0],[88.0,144.0,92.0],[80.0,132.0,72.0],[76.0,124.0,64.0],[72.0,120.0,56.0],[68.0,112.0,48.0],[60.0,108.0,40.0],[56.0,100.0,28.0],[48.0,88.0,12.0],[40.0,80.0,0.0],[44.0,76.0,0.0],[48.0,72.0,0.0],[56.0,68.0,0.0],[60.0,64.0,0.0],[68.0,56.0,0.0],[76.0,52.0,0.0],[80.0,48.0,0.0],[84.0,40.0,0.0],[88.0,36.0,0.0],[96.0,32.0,0.0],[104.0,24.0,0.0],[108.0,20.0,0.0],[116.0,16.0,0.0],[120.0,12.0,0.0],[128.0,20.0,12.0],[136.0,32.0,24.0],[152.0,48.0,52.0],[156.0,56.0,64.0],[164.0,64.0,76.0],[172.0,76.0,88.0],[180.0,84.0,104.0],[188.0,96.0,116.0],[204.0,116.0,144.0],[212.0,128.0,156.0],[220.0,136.0,172.0],[228.0,148.0,184.0],[240.0,160.0,200.0],[232.0,152.0,192.0],[212.0,132.0,176.0],[200.0,120.0,172.0],[192.0,112.0,164.0],[180.0,100.0,156.0],[172.0,92.0,148.0],[160.0,80.0,140.0],[140.0,60.0,124.0],[132.0,52.0,116.0],[144.0,76.0,124.0],[160.0,104.0,132.0],[176.0,132.0,140.0],[192.0,156.0,152.0],[224.0,212.0,168.0],[240.0,240.0,180.0],[240.0,240.0,172.0],[244.0,236.0,160.0],[244.0,232.0,152.0],[248.0,228.0,140.0],[248.0,224.0,132.0],[248.0,220.0,120.0],[244.0,216.0,116.0],[240.0,216.0,112.0],[236.0,212.0,112.0],[232.0,208.0,108.0],[228.0,208.0,104.0],[216.0,200.0,100.0],[212.0,200.0,96.0],[208.0,196.0,96.0],[204.0,192.0,92.0],[200.0,192.0,88.0],[196.0,188.0,84.0],[184.0,184.0,80.0],[180.0,180.0,76.0],[176.0,180.0,76.0],[172.0,176.0,72.0],[168.0,172.0,68.0],[164.0,172.0,68.0],[152.0,164.0,60.0],[148.0,164.0,60.0],[144.0,160.0,56.0],[140.0,160.0,52.0],[136.0,156.0,48.0],[132.0,152.0,48.0],[120.0,148.0,40.0],[116.0,144.0,40.0],[112.0,144.0,36.0],[108.0,140.0,32.0],[104.0,136.0,32.0],[100.0,136.0,28.0],[88.0,128.0,20.0],[88.0,128.0,20.0],[88.0,128.0,20.0],[88.0,124.0,20.0],[84.0,124.0,20.0],[84.0,120.0,20.0],[84.0,120.0,24.0],[80.0,116.0,24.0],[80.0,116.0,24.0],[80.0,112.0,24.0],[76.0,112.0,28.0],[76.0,112.0,28.0],[76.0,108.0,28.0],[72.0,104.0,28.0],[72.0,104.0,32.0],[72.0,104.0,32.0],[68.0,100.0,32.0],[68.0,100.0,32.0],[68.0,96.0,32.0],[64.0,96.0,36.0],[64.0,92.0,36.0],[64.0,92.0,36.0],[60.0,88.0,36.0],[60.0,88.0,36.0],[60.0,84.0,40.0],[56.0,84.0,40.0],[56.0,80.0,40.0],[56.0,80.0,40.0],[52.0,76.0,44.0],[60.0,76.0,40.0],[68.0,76.0,40.0],[72.0,76.0,40.0],[76.0,76.0,40.0],[80.0,72.0,40.0],[84.0,72.0,40.0],[88.0,72.0,40.0],[96.0,72.0,40.0],[100.0,68.0,40.0],[104.0,68.0,40.0],[108.0,68.0,40.0],[112.0,68.0,40.0],[116.0,68.0,40.0],[120.0,64.0,44.0]],"MPL_GnBu":[[0.965798,0.987128,0.938593],[0.960138,0.984913,0.933426],[0.954479,0.982699,0.928258],[0.94882,0.980484,0.923091],[0.94316,0.97827,0.917924],[0.937501,0.976055,0.912757],[0.931842,0.973841,0.907589],[0.926182,0.971626,0.902422],[0.920523,0.969412,0.897255],[0.917693,0.968305,0.894671],[0.909204,0.964983,0.88692],[0.906374,0.963875,0.884337],[0.897885,0.960554,0.876586],[0.895056,0.959446,0.874002],[0.886567,0.956125,0.866251],[0.883737,0.955017,0.863668],[0.875663,0.951834,0.855779],[0.870742,0.949865,0.850365],[0.868281,0.948881,0.847659],[0.8609,0.945928,0.839539],[0.855978,0.94396,0.834125],[0.851057,0.941992,0.828712],[0.848597,0.941007,0.826005],[0.841215,0.938055,0.817885],[0.836294,0.936086,0.812472],[0.831373,0.934118,0.807059],[0.828912,0.933133,0.804352],[0.82153,0.930181,0.796232],[0.816609,0.928212,0.790819],[0.811688,0.926244,0.785406],[0.809227,0.92526,0.782699],[0.801845,0.922307,0.774579],[0.794464,0.919416,0.770088],[0.785606,0.915971,0.766151],[0.776747,0.912526,0.762215],[0.767889,0.909081,0.758278],[0.759031,0.905636,0.754341],[0.754602,0.903914,0.752372],[0.741315,0.898747,0.746467],[0.732457,0.895302,0.74253],[0.723599,0.891857,0.738593],[0.714741,0.888412,0.734656],[0.705882,0.884967,0.730719],[0.697024,0.881522,0.726782],[0.688166,0.878078,0.722845],[0.683737,0.876355,0.720877],[0.67045,0.871188,0.714971],[0.661592,0.867743,0.711034],[0.651211,0.863791,0.712341],[0.640138,0.859608,0.716032],[0.629066,0.855425,0.719723],[0.617993,0.851242,0.723414],[0.60692,0.847059,0.727105],[0.601384,0.844967,0.72895],[0.584775,0.838693,0.734487],[0.573702,0.83451,0.738178],[0.56263,0.830327,0.741869],[0.551557,0.826144,0.745559],[0.540484,0.821961,0.74925],[0.529412,0.817778,0.752941],[0.518339,0.813595,0.756632],[0.512803,0.811503,0.758478],[0.496194,0.805229,0.764014],[0.485121,0.801046,0.767705],[0.474048,0.795386,0.771396],[0.462976,0.789235,0.775087],[0.451903,0.783083,0.778777],[0.44083,0.776932,0.782468],[0.429758,0.77078,0.786159],[0.418685,0.764629,0.78985],[0.407612,0.758478,0.793541],[0.39654,0.752326,0.797232],[0.385467,0.746175,0.800923],[0.374394,0.740023,0.804614],[0.363322,0.733872,0.808305],[0.357785,0.730796,0.81015],[0.341176,0.721569,0.815686],[0.330104,0.715417,0.819377],[0.319031,0.709266,0.823068],[0.307958,0.703114,0.826759],[0.298885,0.694164,0.823253],[0.290273,0.684567,0.818085],[0.281661,0.674971,0.812918],[0.273049,0.665375,0.807751],[0.264437,0.655779,0.802584],[0.255825,0.646182,0.797416],[0.247213,0.636586,0.792249],[0.238601,0.62699,0.787082],[0.229988,0.617393,0.781915],[0.221376,0.607797,0.776747],[0.212764,0.598201,0.77158],[0.208458,0.593403,0.768997],[0.19554,0.579008,0.761246],[0.186928,0.569412,0.756078],[0.178316,0.559815,0.750911],[0.169704,0.550219,0.745744],[0.161092,0.541269,0.741223],[0.15248,0.532411,0.736794],[0.143868,0.523553,0.732364],[0.135256,0.514694,0.727935],[0.126644,0.505836,0.723506],[0.118032,0.496978,0.719077],[0.109419,0.48812,0.714648],[0.100807,0.479262,0.710219],[0.092195,0.470404,0.70579],[0.083583,0.461546,0.701361],[0.074971,0.452687,0.696932],[0.070665,0.448258,0.694717],[0.057747,0.434971,0.688074],[0.049135,0.426113,0.683645],[0.040523,0.417255,0.679216],[0.031911,0.408397,0.674787],[0.031373,0.398616,0.664591],[0.031373,0.388774,0.65401],[0.031373,0.378931,0.643429],[0.031373,0.369089,0.632849],[0.031373,0.359246,0.622268],[0.031373,0.349404,0.611688],[0.031373,0.339562,0.601107],[0.031373,0.329719,0.590527],[0.031373,0.319877,0.579946],[0.031373,0.310035,0.569366],[0.031373,0.300192,0.558785],[0.031373,0.295271,0.553495],[0.031373,0.280508,0.537624],[0.031373,0.270665,0.527043],[0.031373,0.260823,0.516463],[0.031373,0.25098,0.505882]],"GMT_relief":[[0.0,0.000613,0.003064],[0.0,0.001838,0.009191],[0.0,0.003064,0.015319],[0.0,0.004289,0.021446],[0.0,0.005515,0.027574],[0.0,0.00674,0.033701],[0.0,0.007966,0.039828],[0.0,0.009191,0.045956],[0.0,0.010417,0.052083],[0.0,0.011642,0.058211],[0.0,0.012868,0.064338],[0.0,0.014093,0.070466],[0.0,0.015319,0.076593],[0.0,0.016544,0.082721],[0.0,0.01777,0.088848],[0.0,0.018995,0.094975],[0.0,0.020221,0.101103],[0.0,0.021446,0.10723],[0.0,0.022672,0.113358],[0.0,0.023897,0.119485],[0.0,0.025123,0.125613],[0.0,0.026348,0.13174],[0.0,0.027574,0.137868],[0.0,0.028799,0.143995],[0.0,0.030025,0.150123],[0.0,0.03125,0.15625],[0.0,0.032475,0.162377],[0.0,0.033701,0.168505],[0.0,0.034926,0.174632],[0.0,0.036152,0.18076],[0.0,0.037377,0.186887],[0.0,0.038603,0.193015],[0.0,0.047794,0.20527],[0.0,0.064951,0.223652],[0.0,0.082108,0.242034],[0.0,0.099265,0.260417],[0.0,0.116422,0.278799],[0.0,0.133578,0.297181],[0.0,0.150735,0.315564],[0.0,0.167892,0.333946],[0.0,0.185049,0.352328],[0.0,0.202206,0.370711],[0.0,0.219363,0.389093],[0.0,0.23652,0.407475],[0.0,0.253676,0.425858],[0.0,0.270833,0.44424],[0.0,0.28799,0.462623],[0.0,0.305147,0.481005],[0.0,0.322304,0.499387],[0.0,0.339461,0.51777],[0.0,0.356618,0.536152],[0.0,0.373775,0.554534],[0.0,0.390931,0.572917],[0.0,0.408088,0.591299],[0.0,0.425245,0.609681],[0.0,0.442402,0.628064],[0.0,0.459559,0.646446],[0.0,0.476716,0.664828],[0.0,0.493873,0.683211],[0.0,0.511029,0.701593],[0.0,0.528186,0.719975],[0.0,0.545343,0.738358],[0.0,0.5625,0.75674],[0.0,0.579657,0.775123],[0.010539,0.593995,0.782353],[0.031618,0.605515,0.778431],[0.052696,0.617034,0.77451],[0.073775,0.628554,0.770588],[0.094853,0.640074,0.766667],[0.115931,0.651593,0.762745],[0.13701,0.663113,0.758824],[0.158088,0.674632,0.754902],[0.179167,0.686152,0.75098],[0.200245,0.697672,0.747059],[0.221324,0.709191,0.743137],[0.242402,0.720711,0.739216],[0.26348,0.73223,0.735294],[0.284559,0.74375,0.731373],[0.305637,0.75527,0.727451],[0.326716,0.766789,0.723529],[0.347794,0.778431,0.719608],[0.368873,0.790196,0.715686],[0.389951,0.801961,0.711765],[0.411029,0.813725,0.707843],[0.432108,0.82549,0.703922],[0.453186,0.837255,0.7],[0.474265,0.84902,0.696078],[0.495343,0.860784,0.692157],[0.516422,0.872549,0.688235],[0.5375,0.884314,0.684314],[0.558578,0.896078,0.680392],[0.579657,0.907843,0.676471],[0.600735,0.919608,0.672549],[0.621814,0.931373,0.668627],[0.642892,0.943137,0.664706],[0.663971,0.954902,0.660784],[0.679289,0.961397,0.664093],[0.688848,0.962623,0.674632],[0.698407,0.963848,0.685172],[0.707966,0.965074,0.695711],[0.717525,0.966299,0.70625],[0.727083,0.967525,0.716789],[0.736642,0.96875,0.727328],[0.746201,0.969975,0.737868],[0.75576,0.971201,0.748407],[0.765319,0.972426,0.758946],[0.774877,0.973652,0.769485],[0.784436,0.974877,0.780025],[0.793995,0.976103,0.790564],[0.803554,0.977328,0.801103],[0.813113,0.978554,0.811642],[0.822672,0.979779,0.822181],[0.83223,0.981005,0.832843],[0.841789,0.98223,0.843627],[0.851348,0.983456,0.854412],[0.860907,0.984681,0.865196],[0.870466,0.985907,0.87598],[0.880025,0.987132,0.886765],[0.889583,0.988358,0.897549],[0.899142,0.989583,0.908333],[0.908701,0.990809,0.919118],[0.91826,0.992034,0.929902],[0.927819,0.99326,0.940686],[0.937377,0.994485,0.951471],[0.946936,0.995711,0.962255],[0.956495,0.996936,0.973039],[0.966054,0.998162,0.983824],[0.975613,0.999387,0.994608],[0.284908,0.466429,0.196078],[0.309665,0.456526,0.196078],[0.334423,0.446623,0.196078],[0.35918,0.43672,0.196078],[0.383937,0.426817,0.196078],[0.408695,0.416914,0.196078],[0.433452,0.407011,0.196078],[0.45821,0.397108,0.196078],[0.476961,0.398529,0.198529],[0.489706,0.411275,0.203431],[0.502451,0.42402,0.208333],[0.515196,0.436765,0.213235],[0.527941,0.44951,0.218137],[0.540686,0.462255,0.223039],[0.553431,0.475,0.227941],[0.566176,0.487745,0.232843],[0.578922,0.50049,0.237745],[0.591667,0.513235,0.242647],[0.604412,0.52598,0.247549],[0.617157,0.538725,0.252451],[0.629902,0.551471,0.257353],[0.642647,0.564216,0.262255],[0.655392,0.576961,0.267157],[0.668137,0.589706,0.272059],[0.680882,0.602451,0.276961],[0.693627,0.615196,0.281863],[0.706373,0.627941,0.286765],[0.719118,0.640686,0.291667],[0.731863,0.653431,0.296569],[0.744608,0.666176,0.301471],[0.757353,0.678922,0.306373],[0.770098,0.691667,0.311275],[0.782843,0.704412,0.316176],[0.795588,0.717157,0.321078],[0.808333,0.729902,0.32598],[0.821078,0.742647,0.330882],[0.833824,0.755392,0.335784],[0.846569,0.768137,0.340686],[0.859314,0.780882,0.345588],[0.872059,0.793627,0.35049],[0.884804,0.806373,0.355392],[0.897549,0.819118,0.360294],[0.910294,0.831863,0.365196],[0.923039,0.844608,0.370098],[0.935784,0.857353,0.375],[0.948529,0.870098,0.379902],[0.961275,0.882843,0.384804],[0.97402,0.895588,0.389706],[0.980392,0.902451,0.395343],[0.980392,0.903431,0.401716],[0.980392,0.904412,0.408088],[0.980392,0.905392,0.414461],[0.980392,0.906373,0.420833],[0.980392,0.907353,0.427206],[0.980392,0.908333,0.433578],[0.980392,0.909314,0.439951],[0.980392,0.910294,0.446324],[0.980392,0.911275,0.452696],[0.980392,0.912255,0.459069],[0.980392,0.913235,0.465441],[0.980392,0.914216,0.471814],[0.980392,0.915196,0.478186],[0.980392,0.916176,0.484559],[0.980392,0.917157,0.490931],[0.980637,0.918137,0.497304],[0.981127,0.919118,0.503676],[0.981618,0.920098,0.510049],[0.982108,0.921078,0.516422],[0.982598,0.922059,0.522794],[0.983088,0.923039,0.529167],[0.983578,0.92402,0.535539],[0.984069,0.925,0.541912],[0.984559,0.92598,0.548284],[0.985049,0.926961,0.554657],[0.985539,0.927941,0.561029],[0.986029,0.928922,0.567402],[0.98652,0.929902,0.573775],[0.98701,0.930882,0.580147],[0.9875,0.931863,0.58652],[0.98799,0.932843,0.592892],[0.988235,0.933946,0.599142],[0.988235,0.935172,0.60527],[0.988235,0.936397,0.611397],[0.988235,0.937623,0.617525],[0.988235,0.938848,0.623652],[0.988235,0.940074,0.629779],[0.988235,0.941299,0.635907],[0.988235,0.942525,0.642034],[0.988235,0.94375,0.648162],[0.988235,0.944975,0.654289],[0.988235,0.946201,0.660417],[0.988235,0.947426,0.666544],[0.988235,0.948652,0.672672],[0.988235,0.949877,0.678799],[0.988235,0.951103,0.684926],[0.988235,0.952328,0.691054],[0.988358,0.953676,0.698897],[0.988603,0.955147,0.708456],[0.988848,0.956618,0.718015],[0.989093,0.958088,0.727574],[0.989338,0.959559,0.737132],[0.989583,0.961029,0.746691],[0.989828,0.9625,0.75625],[0.990074,0.963971,0.765809],[0.990319,0.965441,0.775368],[0.990564,0.966912,0.784926],[0.990809,0.968382,0.794485],[0.991054,0.969853,0.804044],[0.991299,0.971324,0.813603],[0.991544,0.972794,0.823162],[0.991789,0.974265,0.832721],[0.992034,0.975735,0.842279],[0.992402,0.977206,0.851838],[0.992892,0.978676,0.861397],[0.993382,0.980147,0.870956],[0.993873,0.981618,0.880515],[0.994363,0.983088,0.890074],[0.994853,0.984559,0.899632],[0.995343,0.986029,0.909191],[0.995833,0.9875,0.91875],[0.996324,0.988971,0.928309],[0.996814,0.990441,0.937868],[0.997304,0.991912,0.947426],[0.997794,0.993382,0.956985],[0.998284,0.994853,0.966544],[0.998775,0.996324,0.976103],[0.999265,0.997794,0.985662],[0.999755,0.999265,0.995221]],"MPL_sprin":[[1.0,0.003922,0.996078],[1.0,0.011765,0.988235],[1.0,0.019608,0.980392],[1.0,0.027451,0.972549],[1.0,0.035294,0.964706],[1.0,0.043137,0.956863],[1.0,0.05098,0.94902],[1.0,0.058824,0.941176],[1.0,0.066667,0.933333],[1.0,0.070588,0.929412],[1.0,0.082353,0.917647],[1.0,0.086275,0.913725],[1.0,0.098039,0.901961],[1.0,0.101961,0.898039],[1.0,0.113725,0.886275],[1.0,0.117647,0.882353],[1.0,0.129412,0.870588],[1.0,0.137255,0.862745],[1.0,0.141176,0.858824],[1.0,0.152941,0.847059],[1.0,0.160784,0.839216],[1.0,0.168627,0.831373],[1.0,0.172549,0.827451],[1.0,0.184314,0.815686],[1.0,0.192157,0.807843],[1.0,0.2,0.8],[1.0,0.203922,0.796078],[1.0,0.215686,0.784314],[1.0,0.223529,0.776471],[1.0,0.231373,0.768627],[1.0,0.235294,0.764706],[1.0,0.247059,0.752941],[1.0,0.254902,0.745098],[1.0,0.262745,0.737255],[1.0,0.270588,0.729412],[1.0,0.278431,0.721569],[1.0,0.286275,0.713725],[1.0,0.290196,0.709804],[1.0,0.301961,0.698039],[1.0,0.309804,0.690196],[1.0,0.317647,0.682353],[1.0,0.32549,0.67451],[1.0,0.333333,0.666667],[1.0,0.341176,0.658824],[1.0,0.34902,0.65098],[1.0,0.352941,0.647059],[1.0,0.364706,0.635294],[1.0,0.372549,0.627451],[1.0,0.380392,0.619608],[1.0,0.388235,0.611765],[1.0,0.396078,0.603922],[1.0,0.403922,0.596078],[1.0,0.411765,0.588235],[1.0,0.415686,0.584314],[1.0,0.427451,0.572549],[1.0,0.435294,0.564706],[1.0,0.443137,0.556863],[1.0,0.45098,0.54902],[1.0,0.458824,0.541176],[1.0,0.466667,0.533333],[1.0,0.47451,0.52549],[1.0,0.478431,0.521569],[1.0,0.490196,0.509804],[1.0,0.498039,0.501961],[1.0,0.505882,0.494118],[1.0,0.513725,0.486275],[1.0,0.521569,0.478431],[1.0,0.529412,0.470588],[1.0,0.537255,0.462745],[1.0,0.545098,0.454902],[1.0,0.552941,0.447059],[1.0,0.560784,0.439216],[1.0,0.568627,0.431373],[1.0,0.576471,0.423529],[1.0,0.584314,0.415686],[1.0,0.588235,0.411765],[1.0,0.6,0.4],[1.0,0.607843,0.392157],[1.0,0.615686,0.384314],[1.0,0.623529,0.376471],[1.0,0.631373,0.368627],[1.0,0.639216,0.360784],[1.0,0.647059,0.352941],[1.0,0.654902,0.345098],[1.0,0.662745,0.337255],[1.0,0.670588,0.329412],[1.0,0.678431,0.321569],[1.0,0.686275,0.313725],[1.0,0.694118,0.305882],[1.0,0.701961,0.298039],[1.0,0.709804,0.290196],[1.0,0.713725,0.286275],[1.0,0.72549,0.27451],[1.0,0.733333,0.266667],[1.0,0.741176,0.258824],[1.0,0.74902,0.25098],[1.0,0.756863,0.243137],[1.0,0.764706,0.235294],[1.0,0.772549,0.227451],[1.0,0.780392,0.219608],[1.0,0.788235,0.211765],[1.0,0.796078,0.203922],[1.0,0.803922,0.196078],[1.0,0.811765,0.188235],[1.0,0.819608,0.180392],[1.0,0.827451,0.172549],[1.0,0.835294,0.164706],[1.0,0.839216,0.160784],[1.0,0.85098,0.14902],[1.0,0.858824,0.141176],[1.0,0.866667,0.133333],[1.0,0.87451,0.12549],[1.0,0.882353,0.117647],[1.0,0.890196,0.109804],[1.0,0.898039,0.101961],[1.0,0.905882,0.094118],[1.0,0.913725,0.086275],[1.0,0.921569,0.078431],[1.0,0.929412,0.070588],[1.0,0.937255,0.062745],[1.0,0.945098,0.054902],[1.0,0.952941,0.047059],[1.0,0.960784,0.039216],[1.0,0.964706,0.035294],[1.0,0.976471,0.023529],[1.0,0.984314,0.015686],[1.0,0.992157,0.007843],[1.0,1.0,0.0]],"MPL_gist_ya":[[0.996078,0.996078,0.996078],[0.988235,0.988235,0.988235],[0.980392,0.980392,0.980392],[0.972549,0.972549,0.972549],[0.964706,0.964706,0.964706],[0.956863,0.956863,0.956863],[0.94902,0.94902,0.94902],[0.941176,0.941176,0.941176],[0.933333,0.933333,0.933333],[0.929412,0.929412,0.929412],[0.917647,0.917647,0.917647],[0.913725,0.913725,0.913725],[0.901961,0.901961,0.901961],[0.898039,0.898039,0.898039],[0.886275,0.886275,0.886275],[0.882353,0.882353,0.882353],[0.870588,0.870588,0.870588],[0.862745,0.862745,0.862745],[0.858824,0.858824,0.858824],[0.847059,0.847059,0.847059],[0.839216,0.839216,0.839216],[0.831373,0.831373,0.831373],[0.827451,0.827451,0.827451],[0.815686,0.815686,0.815686],[0.807843,0.807843,0.807843],[0.8,0.8,0.8],[0.796078,0.796078,0.796078],[0.784314,0.784314,0.784314],[0.776471,0.776471,0.776471],[0.768627,0.768627,0.768627],[0.764706,0.764706,0.764706],[0.752941,0.752941,0.752941],[0.745098,0.745098,0.745098],[0.737255,0.737255,0.737255],[0.729412,0.729412,0.729412],[0.721569,0.721569,0.721569],[0.713725,0.713725,0.713725],[0.709804,0.709804,0.709804],[0.698039,0.698039,0.698039],[0.690196,0.690196,0.690196],[0.682353,0.682353,0.682353],[0.67451,0.67451,0.67451],[0.666667,0.666667,0.666667],[0.658824,0.658824,0.658824],[0.65098,0.65098,0.65098],[0.647059,0.647059,0.647059],[0.635294,0.635294,0.635294],[0.627451,0.627451,0.627451],[0.619608,0.619608,0.619608],[0.611765,0.611765,0.611765],[0.603922,0.603922,0.603922],[0.596078,0.596078,0.596078],[0.588235,0.588235,0.588235],[0.584314,0.584314,0.584314],[0.572549,0.572549,0.572549],[0.564706,0.564706,0.564706],[0.556863,0.556863,0.556863],[0.54902,0.54902,0.54902],[0.541176,0.541176,0.541176],[0.533333,0.533333,0.533333],[0.52549,0.52549,0.52549],[0.521569,0.521569,0.521569],[0.509804,0.509804,0.509804],[0.501961,0.501961,0.501961],[0.494118,0.494118,0.494118],[0.486275,0.486275,0.486275],[0.478431,0.478431,0.478431],[0.470588,0.470588,0.470588],[0.462745,0.462745,0.462745],[0.454902,0.454902,0.454902],[0.447059,0.447059,0.447059],[0.439216,0.439216,0.439216],[0.431373,0.431373,0.431373],[0.423529,0.423529,0.423529],[0.415686,0.415686,0.415686],[0.411765,0.411765,0.411765],[0.4,0.4,0.4],[0.392157,0.392157,0.392157],[0.384314,0.384314,0.384314],[0.376471,0.376471,0.376471],[0.368627,0.368627,0.368627],[0.360784,0.360784,0.360784],[0.352941,0.352941,0.352941],[0.345098,0.345098,0.345098],[0.337255,0.337255,0.337255],[0.329412,0.329412,0.329412],[0.321569,0.321569,0.321569],[0.313725,0.313725,0.313725],[0.305882,0.305882,0.305882],[0.298039,0.298039,0.298039],[0.290196,0.290196,0.290196],[0.286275,0.286275,0.286275],[0.27451,0.27451,0.27451],[0.266667,0.266667,0.266667],[0.258824,0.258824,0.258824],[0.25098,0.25098,0.25098],[0.243137,0.243137,0.243137],[0.235294,0.235294,0.235294],[0.227451,0.227451,0.227451],[0.219608,0.219608,0.219608],[0.211765,0.211765,0.211765],[0.203922,0.203922,0.203922],[0.196078,0.196078,0.196078],[0.188235,0.188235,0.188235],[0.180392,0.180392,0.180392],[0.172549,0.172549,0.172549],[0.164706,0.164706,0.164706],[0.160784,0.160784,0.160784],[0.14902,0.14902,0.14902],[0.141176,0.141176,0.141176],[0.133333,0.133333,0.133333],[0.12549,0.12549,0.12549],[0.117647,0.117647,0.117647],[0.109804,0.109804,0.109804],[0.101961,0.101961,0.101961],[0.094118,0.094118,0.094118],[0.086275,0.086275,0.086275],[0.078431,0.078431,0.078431],[0.070588,0.070588,0.070588],[0.062745,0.062745,0.062745],[0.054902,0.054902,0.054902],[0.047059,0.047059,0.047059],[0.039216,0.039216,0.039216],[0.035294,0.035294,0.035294],[0.023529,0.023529,0.023529],[0.015686,0.015686,0.015686],[0.007843,0.007843,0.007843],[0.0,0.0,0.0]],"circular_1":[[255.0,0.0,0.0],[255.0,125.0,0.0],[255.0,255.0,0.0],[125.0,255.0,0.0],[102.0,204.0,0.0],[102.0,255.0,178.0],[0.0,255.0,255.0],[0.0,125.0,255.0],[0.0,0.0,255.0],[125.0,0.0,255.0],[255.0,0.0,255.0],[255.0,0.0,125.0]],"amwg256":[[146.0,112.0,219.0],[141.0,106.0,218.0],[135.0,101.0,217.0],[129.0,95.0,216.0],[123.0,90.0,215.0],[117.0,84.0,214.0],[111.0,79.0,213.0],[105.0,74.0,212.0],[98.0,69.0,212.0],[92.0,63.0,211.0],[85.0,58.0,210.0],[79.0,53.0,209.0],[72.0,48.0,208.0],[65.0,43.0,207.0],[58.0,38.0,206.0],[51.0,33.0,206.0],[44.0,28.0,205.0],[37.0,23.0,204.0],[29.0,18.0,203.0],[22.0,14.0,202.0],[15.0,9.0,201.0],[7.0,4.0,200.0],[0.0,0.0,200.0],[2.0,4.0,201.0],[4.0,9.0,202.0],[7.0,13.0,204.0],[9.0,18.0,205.0],[12.0,22.0,206.0],[14.0,27.0,208.0],[17.0,31.0,209.0],[20.0,36.0,210.0],[22.0,40.0,212.0],[25.0,45.0,213.0],[28.0,50.0,215.0],[30.0,54.0,216.0],[33.0,59.0,217.0],[36.0,63.0,219.0],[39.0,68.0,220.0],[42.0,72.0,221.0],[44.0,77.0,223.0],[47.0,81.0,224.0],[50.0,86.0,225.0],[53.0,90.0,227.0],[56.0,95.0,228.0],[60.0,99.0,230.0],[62.0,102.0,230.0],[65.0,105.0,231.0],[67.0,107.0,231.0],[70.0,110.0,232.0],[73.0,112.0,232.0],[75.0,115.0,233.0],[78.0,117.0,233.0],[81.0,120.0,234.0],[83.0,122.0,234.0],[86.0,125.0,235.0],[89.0,127.0,236.0],[92.0,130.0,236.0],[94.0,132.0,237.0],[97.0,135.0,237.0],[100.0,137.0,238.0],[103.0,140.0,238.0],[105.0,142.0,239.0],[108.0,145.0,239.0],[111.0,147.0,240.0],[114.0,150.0,240.0],[117.0,152.0,241.0],[120.0,155.0,242.0],[122.0,160.0,241.0],[125.0,164.0,240.0],[128.0,169.0,240.0],[130.0,173.0,239.0],[133.0,178.0,239.0],[135.0,182.0,238.0],[138.0,186.0,238.0],[141.0,189.0,237.0],[143.0,193.0,237.0],[146.0,196.0,236.0],[148.0,200.0,236.0],[151.0,203.0,235.0],[153.0,205.0,234.0],[156.0,208.0,234.0],[158.0,211.0,233.0],[161.0,213.0,233.0],[163.0,215.0,232.0],[166.0,217.0,232.0],[168.0,219.0,231.0],[171.0,221.0,231.0],[173.0,222.0,230.0],[176.0,224.0,230.0],[175.0,224.0,231.0],[174.0,225.0,232.0],[173.0,226.0,233.0],[172.0,227.0,234.0],[171.0,228.0,235.0],[170.0,229.0,237.0],[168.0,230.0,238.0],[167.0,231.0,239.0],[166.0,232.0,240.0],[165.0,233.0,241.0],[164.0,234.0,243.0],[163.0,235.0,244.0],[162.0,236.0,245.0],[160.0,237.0,246.0],[159.0,238.0,247.0],[158.0,239.0,249.0],[157.0,240.0,250.0],[155.0,241.0,251.0],[154.0,242.0,252.0],[153.0,243.0,253.0],[152.0,245.0,255.0],[152.0,248.0,252.0],[153.0,249.0,246.0],[153.0,246.0,237.0],[154.0,243.0,228.0],[154.0,240.0,220.0],[154.0,237.0,213.0],[155.0,234.0,206.0],[155.0,231.0,199.0],[155.0,228.0,193.0],[155.0,225.0,187.0],[155.0,222.0,181.0],[155.0,219.0,176.0],[155.0,216.0,171.0],[155.0,213.0,166.0],[155.0,210.0,162.0],[155.0,207.0,158.0],[155.0,205.0,155.0],[245.0,230.0,190.0],[243.0,227.0,186.0],[242.0,225.0,183.0],[240.0,222.0,179.0],[239.0,219.0,176.0],[238.0,217.0,173.0],[236.0,214.0,169.0],[235.0,212.0,166.0],[234.0,209.0,163.0],[232.0,206.0,159.0],[231.0,203.0,156.0],[230.0,201.0,153.0],[228.0,198.0,150.0],[227.0,195.0,147.0],[226.0,192.0,144.0],[224.0,189.0,141.0],[223.0,186.0,138.0],[222.0,184.0,135.0],[223.0,183.0,129.0],[225.0,183.0,123.0],[226.0,184.0,118.0],[228.0,184.0,112.0],[229.0,185.0,106.0],[231.0,186.0,100.0],[233.0,187.0,94.0],[234.0,188.0,88.0],[236.0,189.0,82.0],[237.0,191.0,75.0],[239.0,193.0,69.0],[240.0,195.0,62.0],[242.0,197.0,56.0],[244.0,200.0,49.0],[245.0,203.0,42.0],[247.0,206.0,35.0],[248.0,209.0,28.0],[250.0,212.0,21.0],[251.0,216.0,14.0],[253.0,220.0,7.0],[255.0,225.0,0.0],[255.0,222.0,0.0],[255.0,219.0,0.0],[255.0,216.0,0.0],[255.0,214.0,0.0],[255.0,211.0,0.0],[255.0,208.0,0.0],[255.0,205.0,0.0],[255.0,203.0,0.0],[255.0,200.0,0.0],[255.0,197.0,0.0],[255.0,195.0,0.0],[255.0,192.0,0.0],[255.0,189.0,0.0],[255.0,186.0,0.0],[255.0,184.0,0.0],[255.0,181.0,0.0],[255.0,178.0,0.0],[255.0,175.0,0.0],[255.0,173.0,0.0],[255.0,170.0,0.0],[255.0,167.0,0.0],[255.0,165.0,0.0],[255.0,160.0,0.0],[255.0,156.0,0.0],[255.0,151.0,0.0],[255.0,147.0,0.0],[255.0,143.0,0.0],[255.0,138.0,0.0],[255.0,134.0,0.0],[255.0,130.0,0.0],[255.0,125.0,0.0],[255.0,121.0,0.0],[255.0,117.0,0.0],[255.0,112.0,0.0],[255.0,108.0,0.0],[255.0,103.0,0.0],[255.0,99.0,0.0],[255.0,95.0,0.0],[255.0,90.0,0.0],[255.0,86.0,0.0],[255.0,82.0,0.0],[255.0,77.0,0.0],[255.0,73.0,0.0],[255.0,69.0,0.0],[251.0,66.0,2.0],[248.0,64.0,4.0],[244.0,62.0,6.0],[241.0,59.0,8.0],[237.0,57.0,10.0],[234.0,55.0,12.0],[230.0,53.0,14.0],[227.0,52.0,15.0],[223.0,50.0,17.0],[220.0,48.0,19.0],[216.0,47.0,20.0],[213.0,45.0,22.0],[209.0,44.0,23.0],[206.0,42.0,25.0],[202.0,41.0,26.0],[199.0,40.0,27.0],[195.0,39.0,28.0],[192.0,37.0,30.0],[188.0,36.0,31.0],[185.0,35.0,32.0],[181.0,34.0,33.0],[178.0,34.0,34.0],[181.0,38.0,38.0],[185.0,43.0,43.0],[188.0,49.0,49.0],[192.0,54.0,54.0],[195.0,59.0,59.0],[199.0,65.0,65.0],[202.0,71.0,71.0],[206.0,77.0,77.0],[209.0,83.0,83.0],[213.0,89.0,89.0],[216.0,96.0,96.0],[220.0,102.0,102.0],[223.0,109.0,109.0],[227.0,116.0,116.0],[230.0,123.0,123.0],[234.0,130.0,130.0],[237.0,138.0,138.0],[241.0,146.0,146.0],[244.0,153.0,153.0],[248.0,161.0,161.0],[251.0,169.0,169.0],[255.0,178.0,178.0]],"BlueRed":[[25.0,82.0,255.0],[27.0,84.0,255.0],[28.0,85.0,255.0],[30.0,86.0,255.0],[31.0,87.0,255.0],[33.0,88.0,255.0],[34.0,89.0,255.0],[36.0,90.0,255.0],[37.0,92.0,255.0],[39.0,93.0,255.0],[40.0,94.0,255.0],[42.0,95.0,255.0],[43.0,96.0,255.0],[45.0,97.0,255.0],[46.0,98.0,255.0],[48.0,100.0,255.0],[49.0,101.0,255.0],[51.0,102.0,255.0],[53.0,103.0,255.0],[54.0,104.0,255.0],[56.0,105.0,255.0],[57.0,106.0,255.0],[59.0,108.0,255.0],[60.0,109.0,255.0],[62.0,110.0,255.0],[63.0,111.0,255.0],[65.0,112.0,255.0],[66.0,113.0,255.0],[68.0,115.0,255.0],[69.0,116.0,255.0],[71.0,117.0,255.0],[72.0,118.0,255.0],[74.0,119.0,255.0],[75.0,120.0,255.0],[77.0,121.0,255.0],[79.0,123.0,255.0],[80.0,124.0,255.0],[82.0,125.0,255.0],[83.0,126.0,255.0],[85.0,127.0,255.0],[86.0,128.0,255.0],[88.0,129.0,255.0],[89.0,131.0,255.0],[91.0,132.0,255.0],[92.0,133.0,255.0],[94.0,134.0,255.0],[95.0,135.0,255.0],[97.0,136.0,255.0],[98.0,137.0,255.0],[100.0,139.0,255.0],[102.0,140.0,255.0],[103.0,141.0,255.0],[105.0,142.0,255.0],[106.0,143.0,255.0],[108.0,144.0,255.0],[109.0,145.0,255.0],[111.0,147.0,255.0],[112.0,148.0,255.0],[114.0,149.0,255.0],[115.0,150.0,255.0],[117.0,151.0,255.0],[118.0,152.0,255.0],[120.0,154.0,255.0],[121.0,155.0,255.0],[123.0,156.0,255.0],[124.0,157.0,255.0],[126.0,158.0,255.0],[128.0,159.0,255.0],[129.0,160.0,255.0],[131.0,162.0,255.0],[132.0,163.0,255.0],[134.0,164.0,255.0],[135.0,165.0,255.0],[137.0,166.0,255.0],[138.0,167.0,255.0],[140.0,168.0,255.0],[141.0,170.0,255.0],[143.0,171.0,255.0],[144.0,172.0,255.0],[146.0,173.0,255.0],[147.0,174.0,255.0],[149.0,175.0,255.0],[150.0,176.0,255.0],[152.0,178.0,255.0],[154.0,179.0,255.0],[155.0,180.0,255.0],[157.0,181.0,255.0],[158.0,182.0,255.0],[160.0,183.0,255.0],[161.0,185.0,255.0],[163.0,186.0,255.0],[164.0,187.0,255.0],[166.0,188.0,255.0],[167.0,189.0,255.0],[169.0,190.0,255.0],[170.0,191.0,255.0],[172.0,193.0,255.0],[173.0,194.0,255.0],[175.0,195.0,255.0],[176.0,196.0,255.0],[178.0,197.0,255.0],[180.0,198.0,255.0],[181.0,199.0,255.0],[183.0,201.0,255.0],[184.0,202.0,255.0],[186.0,203.0,255.0],[187.0,204.0,255.0],[189.0,205.0,255.0],[190.0,206.0,255.0],[192.0,207.0,255.0],[193.0,209.0,255.0],[195.0,210.0,255.0],[196.0,211.0,255.0],[198.0,212.0,255.0],[199.0,213.0,255.0],[201.0,214.0,255.0],[202.0,215.0,255.0],[204.0,217.0,255.0],[206.0,218.0,255.0],[207.0,219.0,255.0],[209.0,220.0,255.0],[210.0,221.0,255.0],[212.0,222.0,255.0],[213.0,224.0,255.0],[215.0,225.0,255.0],[216.0,226.0,255.0],[255.0,216.0,216.0],[255.0,215.0,215.0],[255.0,213.0,213.0],[255.0,212.0,212.0],[255.0,210.0,210.0],[255.0,209.0,209.0],[255.0,207.0,207.0],[255.0,206.0,206.0],[255.0,204.0,204.0],[255.0,202.0,202.0],[255.0,201.0,201.0],[255.0,199.0,199.0],[255.0,198.0,198.0],[255.0,196.0,196.0],[255.0,195.0,195.0],[255.0,193.0,193.0],[255.0,192.0,192.0],[255.0,190.0,190.0],[255.0,189.0,189.0],[255.0,187.0,187.0],[255.0,186.0,186.0],[255.0,184.0,184.0],[255.0,183.0,183.0],[255.0,181.0,181.0],[255.0,180.0,180.0],[255.0,178.0,178.0],[255.0,176.0,176.0],[255.0,175.0,175.0],[255.0,173.0,173.0],[255.0,172.0,172.0],[255.0,170.0,170.0],[255.0,169.0,169.0],[255.0,167.0,167.0],[255.0,166.0,166.0],[255.0,164.0,164.0],[255.0,163.0,163.0],[255.0,161.0,161.0],[255.0,160.0,160.0],[255.0,158.0,158.0],[255.0,157.0,157.0],[255.0,155.0,155.0],[255.0,154.0,154.0],[255.0,152.0,152.0],[255.0,150.0,150.0],[255.0,149.0,149.0],[255.0,147.0,147.0],[255.0,146.0,146.0],[255.0,144.0,144.0],[255.0,143.0,143.0],[255.0,141.0,141.0],[255.0,140.0,140.0],[255.0,138.0,138.0],[255.0,137.0,137.0],[255.0,135.0,135.0],[255.0,134.0,134.0],[255.0,132.0,132.0],[255.0,131.0,131.0],[255.0,129.0,129.0],[255.0,128.0,128.0],[255.0,126.0,126.0],[255.0,124.0,124.0],[255.0,123.0,123.0],[255.0,121.0,121.0],[255.0,120.0,120.0],[255.0,118.0,118.0],[255.0,117.0,117.0],[255.0,115.0,115.0],[255.0,114.0,114.0],[255.0,112.0,112.0],[255.0,111.0,111.0],[255.0,109.0,109.0],[255.0,108.0,108.0],[255.0,106.0,106.0],[255.0,105.0,105.0],[255.0,103.0,103.0],[255.0,101.0,101.0],[255.0,100.0,100.0],[255.0,98.0,98.0],[255.0,97.0,97.0],[255.0,95.0,95.0],[255.0,94.0,94.0],[255.0,92.0,92.0],[255.0,91.0,91.0],[255.0,89.0,89.0],[255.0,88.0,88.0],[255.0,86.0,86.0],[255.0,85.0,85.0],[255.0,83.0,83.0],[255.0,82.0,82.0],[255.0,80.0,80.0],[255.0,79.0,79.0],[255.0,77.0,77.0],[255.0,75.0,75.0],[255.0,74.0,74.0],[255.0,72.0,72.0],[255.0,71.0,71.0],[255.0,69.0,69.0],[255.0,68.0,68.0],[255.0,66.0,66.0],[255.0,65.0,65.0],[255.0,63.0,63.0],[255.0,62.0,62.0],[255.0,60.0,60.0],[255.0,59.0,59.0],[255.0,57.0,57.0],[255.0,56.0,56.0],[255.0,54.0,54.0],[255.0,53.0,53.0],[255.0,51.0,51.0],[255.0,49.0,49.0],[255.0,48.0,48.0],[255.0,46.0,46.0],[255.0,45.0,45.0],[255.0,43.0,43.0],[255.0,42.0,42.0],[255.0,40.0,40.0],[255.0,39.0,39.0],[255.0,37.0,37.0],[255.0,36.0,36.0],[255.0,34.0,34.0],[255.0,33.0,33.0],[255.0,31.0,31.0],[255.0,30.0,30.0],[255.0,28.0,28.0],[255.0,27.0,27.0],[255.0,25.0,25.0]],"MPL_hot":[[0.051895,0.0,0.0],[0.072485,0.0,0.0],[0.093074,0.0,0.0],[0.113664,0.0,0.0],[0.134254,0.0,0.0],[0.154843,0.0,0.0],[0.175433,0.0,0.0],[0.196023,0.0,0.0],[0.216612,0.0,0.0],[0.226907,0.0,0.0],[0.257792,0.0,0.0],[0.268087,0.0,0.0],[0.298971,0.0,0.0],[0.309266,0.0,0.0],[0.34015,0.0,0.0],[0.350445,0.0,0.0],[0.38133,0.0,0.0],[0.40192,0.0,0.0],[0.412214,0.0,0.0],[0.443099,0.0,0.0],[0.463689,0.0,0.0],[0.484278,0.0,0.0],[0.494573,0.0,0.0],[0.525458,0.0,0.0],[0.546047,0.0,0.0],[0.566637,0.0,0.0],[0.576932,0.0,0.0],[0.607816,0.0,0.0],[0.628406,0.0,0.0],[0.648996,0.0,0.0],[0.659291,0.0,0.0],[0.690175,0.0,0.0],[0.710765,0.0,0.0],[0.731355,0.0,0.0],[0.751944,0.0,0.0],[0.772534,0.0,0.0],[0.793124,0.0,0.0],[0.803418,0.0,0.0],[0.834303,0.0,0.0],[0.854893,0.0,0.0],[0.875482,0.0,0.0],[0.896072,0.0,0.0],[0.916662,0.0,0.0],[0.937251,0.0,0.0],[0.957841,0.0,0.0],[0.968136,0.0,0.0],[0.99902,0.0,0.0],[1.0,0.019609,0.0],[1.0,0.040197,0.0],[1.0,0.060785,0.0],[1.0,0.081373,0.0],[1.0,0.101962,0.0],[1.0,0.12255,0.0],[1.0,0.132844,0.0],[1.0,0.163726,0.0],[1.0,0.184314,0.0],[1.0,0.204903,0.0],[1.0,0.225491,0.0],[1.0,0.246079,0.0],[1.0,0.266667,0.0],[1.0,0.287255,0.0],[1.0,0.297549,0.0],[1.0,0.328432,0.0],[1.0,0.34902,0.0],[1.0,0.369608,0.0],[1.0,0.390196,0.0],[1.0,0.410785,0.0],[1.0,0.431373,0.0],[1.0,0.451961,0.0],[1.0,0.472549,0.0],[1.0,0.493137,0.0],[1.0,0.513726,0.0],[1.0,0.534314,0.0],[1.0,0.554902,0.0],[1.0,0.57549,0.0],[1.0,0.585784,0.0],[1.0,0.616667,0.0],[1.0,0.637255,0.0],[1.0,0.657843,0.0],[1.0,0.678431,0.0],[1.0,0.699019,0.0],[1.0,0.719608,0.0],[1.0,0.740196,0.0],[1.0,0.760784,0.0],[1.0,0.781372,0.0],[1.0,0.80196,0.0],[1.0,0.822549,0.0],[1.0,0.843137,0.0],[1.0,0.863725,0.0],[1.0,0.884313,0.0],[1.0,0.904901,0.0],[1.0,0.915196,0.0],[1.0,0.946078,0.0],[1.0,0.966666,0.0],[1.0,0.987254,0.0],[1.0,1.0,0.011764],[1.0,1.0,0.042646],[1.0,1.0,0.073528],[1.0,1.0,0.104411],[1.0,1.0,0.135293],[1.0,1.0,0.166176],[1.0,1.0,0.197058],[1.0,1.0,0.22794],[1.0,1.0,0.258823],[1.0,1.0,0.289705],[1.0,1.0,0.320588],[1.0,1.0,0.35147],[1.0,1.0,0.366911],[1.0,1.0,0.413235],[1.0,1.0,0.444117],[1.0,1.0,0.474999],[1.0,1.0,0.505882],[1.0,1.0,0.536764],[1.0,1.0,0.567647],[1.0,1.0,0.598529],[1.0,1.0,0.629411],[1.0,1.0,0.660294],[1.0,1.0,0.691176],[1.0,1.0,0.722059],[1.0,1.0,0.752941],[1.0,1.0,0.783823],[1.0,1.0,0.814706],[1.0,1.0,0.845588],[1.0,1.0,0.861029],[1.0,1.0,0.907353],[1.0,1.0,0.938235],[1.0,1.0,0.969118],[1.0,1.0,1.0]],"precip2_17lev":[[255.0,255.0,255.0],[235.0,246.0,255.0],[214.0,226.0,255.0],[181.0,201.0,255.0],[142.0,178.0,255.0],[127.0,150.0,255.0],[114.0,133.0,248.0],[99.0,112.0,248.0],[0.0,158.0,30.0],[60.0,188.0,61.0],[179.0,209.0,110.0],[185.0,249.0,110.0],[255.0,249.0,19.0],[255.0,163.0,9.0],[229.0,0.0,0.0],[189.0,0.0,0.0],[129.0,0.0,0.0],[0.0,0.0,0.0]],"MPL_gist_stern":[[0.071692,0.003922,0.007843],[0.215077,0.011765,0.023529],[0.358461,0.019608,0.039216],[0.501846,0.027451,0.054902],[0.645231,0.035294,0.070588],[0.788615,0.043137,0.086275],[0.932,0.05098,0.101961],[0.979456,0.058824,0.117647],[0.940381,0.066667,0.133333],[0.920844,0.070588,0.141176],[0.862231,0.082353,0.164706],[0.842693,0.086275,0.172549],[0.784081,0.098039,0.196078],[0.764543,0.101961,0.203922],[0.70593,0.113725,0.227451],[0.686393,0.117647,0.235294],[0.62778,0.129412,0.258824],[0.588705,0.137255,0.27451],[0.569167,0.141176,0.282353],[0.510555,0.152941,0.305882],[0.47148,0.160784,0.321569],[0.432404,0.168627,0.337255],[0.412867,0.172549,0.345098],[0.354254,0.184314,0.368627],[0.315179,0.192157,0.384314],[0.276104,0.2,0.4],[0.256566,0.203922,0.407843],[0.197954,0.215686,0.431373],[0.158879,0.223529,0.447059],[0.119803,0.231373,0.462745],[0.100266,0.235294,0.470588],[0.041653,0.247059,0.494118],[0.254902,0.254902,0.509804],[0.262745,0.262745,0.52549],[0.270588,0.270588,0.541176],[0.278431,0.278431,0.556863],[0.286275,0.286275,0.572549],[0.290196,0.290196,0.580392],[0.301961,0.301961,0.603922],[0.309804,0.309804,0.619608],[0.317647,0.317647,0.635294],[0.32549,0.32549,0.65098],[0.333333,0.333333,0.666667],[0.341176,0.341176,0.682353],[0.34902,0.34902,0.698039],[0.352941,0.352941,0.705882],[0.364706,0.364706,0.729412],[0.372549,0.372549,0.745098],[0.380392,0.380392,0.760784],[0.388235,0.388235,0.776471],[0.396078,0.396078,0.792157],[0.403922,0.403922,0.807843],[0.411765,0.411765,0.823529],[0.415686,0.415686,0.831373],[0.427451,0.427451,0.854902],[0.435294,0.435294,0.870588],[0.443137,0.443137,0.886275],[0.45098,0.45098,0.901961],[0.458824,0.458824,0.917647],[0.466667,0.466667,0.933333],[0.47451,0.47451,0.94902],[0.478431,0.478431,0.956863],[0.490196,0.490196,0.980392],[0.498039,0.498039,0.996078],[0.505882,0.505882,0.974969],[0.513725,0.513725,0.941594],[0.521569,0.521569,0.908219],[0.529412,0.529412,0.874844],[0.537255,0.537255,0.841469],[0.545098,0.545098,0.808093],[0.552941,0.552941,0.774718],[0.560784,0.560784,0.741343],[0.568627,0.568627,0.707968],[0.576471,0.576471,0.674593],[0.584314,0.584314,0.641218],[0.588235,0.588235,0.624531],[0.6,0.6,0.574468],[0.607843,0.607843,0.541093],[0.615686,0.615686,0.507718],[0.623529,0.623529,0.474343],[0.631373,0.631373,0.440968],[0.639216,0.639216,0.407593],[0.647059,0.647059,0.374218],[0.654902,0.654902,0.340843],[0.662745,0.662745,0.307468],[0.670588,0.670588,0.274093],[0.678431,0.678431,0.240718],[0.686275,0.686275,0.207343],[0.694118,0.694118,0.173967],[0.701961,0.701961,0.140592],[0.709804,0.709804,0.107217],[0.713725,0.713725,0.09053],[0.72549,0.72549,0.040467],[0.733333,0.733333,0.007092],[0.741176,0.741176,0.023307],[0.74902,0.74902,0.052904],[0.756863,0.756863,0.082501],[0.764706,0.764706,0.112098],[0.772549,0.772549,0.141694],[0.780392,0.780392,0.171291],[0.788235,0.788235,0.200888],[0.796078,0.796078,0.230485],[0.803922,0.803922,0.260081],[0.811765,0.811765,0.289678],[0.819608,0.819608,0.319275],[0.827451,0.827451,0.348872],[0.835294,0.835294,0.378468],[0.839216,0.839216,0.393267],[0.85098,0.85098,0.437662],[0.858824,0.858824,0.467259],[0.866667,0.866667,0.496855],[0.87451,0.87451,0.526452],[0.882353,0.882353,0.556049],[0.890196,0.890196,0.585646],[0.898039,0.898039,0.615242],[0.905882,0.905882,0.644839],[0.913725,0.913725,0.674436],[0.921569,0.921569,0.704033],[0.929412,0.929412,0.733629],[0.937255,0.937255,0.763226],[0.945098,0.945098,0.792823],[0.952941,0.952941,0.82242],[0.960784,0.960784,0.852016],[0.964706,0.964706,0.866815],[0.976471,0.976471,0.91121],[0.984314,0.984314,0.940807],[0.992157,0.992157,0.970403],[1.0,1.0,1.0]],"MPL_RdYlBu":[[0.654748,0.007382,0.149173],[0.670127,0.022145,0.149481],[0.685506,0.036909,0.149789],[0.700884,0.051672,0.150096],[0.716263,0.066436,0.150404],[0.731642,0.0812,0.150711],[0.74702,0.095963,0.151019],[0.762399,0.110727,0.151326],[0.777778,0.12549,0.151634],[0.785467,0.132872,0.151788],[0.808535,0.155017,0.152249],[0.816225,0.162399,0.152403],[0.839293,0.184544,0.152864],[0.845367,0.192926,0.155094],[0.858747,0.221069,0.168012],[0.863206,0.23045,0.172318],[0.876586,0.258593,0.185236],[0.885506,0.277355,0.193849],[0.889965,0.286736,0.198155],[0.903345,0.314879,0.211073],[0.912265,0.333641,0.219685],[0.921184,0.352403,0.228297],[0.925644,0.361784,0.232603],[0.939023,0.389927,0.245521],[0.947943,0.408689,0.254133],[0.956863,0.427451,0.262745],[0.958247,0.437447,0.267359],[0.962399,0.467436,0.2812],[0.965167,0.487428,0.290427],[0.967935,0.50742,0.299654],[0.969319,0.517416,0.304268],[0.973472,0.547405,0.318108],[0.97624,0.567397,0.327336],[0.979008,0.587389,0.336563],[0.981776,0.607382,0.34579],[0.984544,0.627374,0.355017],[0.987313,0.647366,0.364245],[0.988697,0.657363,0.368858],[0.992234,0.686198,0.384006],[0.992541,0.701576,0.398462],[0.992849,0.716955,0.412918],[0.993156,0.732334,0.427374],[0.993464,0.747712,0.44183],[0.993772,0.763091,0.456286],[0.994079,0.77847,0.470742],[0.994233,0.786159,0.47797],[0.994694,0.809227,0.499654],[0.995002,0.824606,0.51411],[0.995309,0.839985,0.528566],[0.995617,0.855363,0.543022],[0.995925,0.870742,0.557478],[0.996232,0.883199,0.571934],[0.99654,0.892734,0.58639],[0.996694,0.897501,0.593618],[0.997155,0.911803,0.615302],[0.997463,0.921338,0.629758],[0.99777,0.930873,0.644214],[0.998078,0.940408,0.65867],[0.998385,0.949942,0.673126],[0.998693,0.959477,0.687582],[0.999,0.969012,0.702038],[0.999154,0.973779,0.709266],[0.999616,0.988082,0.73095],[0.999923,0.997616,0.745406],[0.992849,0.997232,0.762168],[0.983314,0.993541,0.7797],[0.973779,0.98985,0.797232],[0.964245,0.986159,0.814764],[0.95471,0.982468,0.832295],[0.945175,0.978777,0.849827],[0.93564,0.975087,0.867359],[0.926105,0.971396,0.88489],[0.916571,0.967705,0.902422],[0.907036,0.964014,0.919954],[0.897501,0.960323,0.937486],[0.892734,0.958478,0.946251],[0.878431,0.952941,0.972549],[0.86213,0.944944,0.967935],[0.845829,0.936947,0.963322],[0.829527,0.92895,0.958708],[0.813226,0.920953,0.954095],[0.796924,0.912957,0.949481],[0.780623,0.90496,0.944867],[0.764321,0.896963,0.940254],[0.74802,0.888966,0.93564],[0.731719,0.880969,0.931027],[0.715417,0.872972,0.926413],[0.699116,0.864975,0.921799],[0.682814,0.856978,0.917186],[0.666359,0.847597,0.91188],[0.649443,0.834064,0.904498],[0.640984,0.827297,0.900807],[0.615609,0.806997,0.889735],[0.598693,0.793464,0.882353],[0.581776,0.779931,0.874971],[0.56486,0.766398,0.867589],[0.547943,0.752864,0.860208],[0.531027,0.739331,0.852826],[0.51411,0.725798,0.845444],[0.497193,0.712265,0.838062],[0.480277,0.698731,0.830681],[0.46336,0.685198,0.823299],[0.447674,0.669819,0.815148],[0.433218,0.652595,0.806228],[0.418762,0.635371,0.797309],[0.404306,0.618147,0.788389],[0.38985,0.600923,0.779469],[0.382622,0.592311,0.77501],[0.360938,0.566474,0.76163],[0.346482,0.54925,0.752711],[0.332026,0.532026,0.743791],[0.31757,0.514802,0.734871],[0.303114,0.497578,0.725952],[0.288658,0.480354,0.717032],[0.274202,0.46313,0.708112],[0.265975,0.444291,0.698731],[0.259823,0.424913,0.689196],[0.253672,0.405536,0.679662],[0.24752,0.386159,0.670127],[0.241369,0.366782,0.660592],[0.235217,0.347405,0.651057],[0.229066,0.328028,0.641522],[0.222914,0.30865,0.631988],[0.219839,0.298962,0.62722],[0.210611,0.269896,0.612918],[0.20446,0.250519,0.603383],[0.198308,0.231142,0.593849],[0.192157,0.211765,0.584314]],"MPL_s3pcpn":[[0.0,0.978547,0.912111],[0.265744,0.819377,0.0],[0.970704,0.992849,0.0],[1.0,0.590542,0.0],[1.0,0.221453,0.0],[1.0,0.029527,0.118108],[1.0,0.103345,0.413379],[0.975779,0.177163,0.707036],[0.941176,0.25098,1.0],[0.876586,0.232526,1.0],[0.682814,0.177163,1.0],[0.618224,0.158708,1.0],[0.472434,0.140254,1.0],[0.447828,0.152557,1.0],[0.37401,0.189466,1.0],[0.349404,0.201769,1.0],[0.275586,0.238677,1.0],[0.243599,0.243599,0.970704],[0.236217,0.236217,0.941407],[0.214072,0.214072,0.853518],[0.199308,0.199308,0.794925],[0.184544,0.184544,0.736332],[0.177163,0.177163,0.707036],[0.155017,0.155017,0.619147],[0.140254,0.140254,0.560554],[0.12549,0.12549,0.501961],[0.12549,0.12549,0.479815],[0.12549,0.12549,0.413379],[0.12549,0.12549,0.369089],[0.12549,0.12549,0.324798],[0.12549,0.12549,0.302653],[0.12549,0.12549,0.236217],[0.12549,0.12549,0.191926],[0.12549,0.12549,0.147636],[0.147636,0.147636,0.147636],[0.191926,0.191926,0.191926],[0.236217,0.236217,0.236217],[0.258362,0.258362,0.258362],[0.324798,0.324798,0.324798],[0.369089,0.369089,0.369089],[0.413379,0.413379,0.413379],[0.45767,0.45767,0.45767],[0.501961,0.501961,0.501961],[0.546251,0.546251,0.546251],[0.590542,0.590542,0.590542],[0.612687,0.612687,0.612687],[0.679123,0.679123,0.679123],[0.723414,0.723414,0.723414],[0.767705,0.767705,0.767705],[0.811995,0.811995,0.811995],[0.856286,0.856286,0.856286],[0.880046,0.877047,0.874279],[0.883276,0.874279,0.865975],[0.88489,0.872895,0.861822],[0.889735,0.868743,0.849366],[0.892964,0.865975,0.841061],[0.896194,0.863206,0.832757],[0.899423,0.860438,0.824452],[0.902653,0.85767,0.816148],[0.905882,0.854902,0.807843],[0.909112,0.852134,0.799539],[0.910727,0.85075,0.795386],[0.915571,0.846597,0.78293],[0.9188,0.843829,0.774625],[0.92203,0.841061,0.766321],[0.92526,0.838293,0.758016],[0.928489,0.835525,0.749712],[0.931719,0.832757,0.741407],[0.931027,0.826067,0.729412],[0.926413,0.815456,0.713726],[0.921799,0.804844,0.698039],[0.917186,0.794233,0.682353],[0.912572,0.783622,0.666667],[0.907958,0.77301,0.65098],[0.903345,0.762399,0.635294],[0.901038,0.757093,0.627451],[0.894118,0.741176,0.603922],[0.889504,0.730565,0.588235],[0.88489,0.719954,0.572549],[0.880277,0.709343,0.556863],[0.875663,0.698731,0.541176],[0.87105,0.68812,0.52549],[0.866436,0.677509,0.509804],[0.861822,0.666897,0.494118],[0.857209,0.656286,0.478431],[0.848212,0.644291,0.463668],[0.834833,0.630911,0.449827],[0.821453,0.617532,0.435986],[0.808074,0.604152,0.422145],[0.794694,0.590773,0.408304],[0.781315,0.577393,0.394464],[0.774625,0.570704,0.387543],[0.754556,0.550634,0.366782],[0.741176,0.537255,0.352941],[0.727797,0.523875,0.3391],[0.714418,0.510496,0.32526],[0.701038,0.497117,0.311419],[0.687659,0.483737,0.297578],[0.674279,0.470358,0.283737],[0.6609,0.456978,0.269896],[0.64752,0.443599,0.256055],[0.634141,0.430219,0.242215],[0.622991,0.419146,0.230681],[0.614072,0.410381,0.221453],[0.605152,0.401615,0.212226],[0.596232,0.392849,0.202999],[0.587313,0.384083,0.193772],[0.582853,0.3797,0.189158],[0.569473,0.366551,0.175317],[0.560554,0.357785,0.16609],[0.551634,0.34902,0.156863],[0.542714,0.340254,0.147636],[0.533795,0.331488,0.138408],[0.524875,0.322722,0.129181],[0.515955,0.313956,0.119954],[0.507036,0.30519,0.110727],[0.498116,0.296424,0.101499],[0.489196,0.287659,0.092272],[0.480277,0.278893,0.083045],[0.471357,0.270127,0.073818],[0.462438,0.261361,0.064591],[0.453518,0.252595,0.055363],[0.444598,0.243829,0.046136],[0.440138,0.239446,0.041522],[0.426759,0.226298,0.027682],[0.417839,0.217532,0.018454],[0.40892,0.208766,0.009227],[0.4,0.2,0.0]],"circular_2":[[255.0,0.0,0.0],[255.0,63.0,0.0],[255.0,125.0,0.0],[255.0,190.0,0.0],[255.0,225.0,0.0],[255.0,255.0,0.0],[125.0,255.0,0.0],[125.0,204.0,0.0],[0.0,150.0,0.0],[0.0,190.0,0.0],[0.0,255.0,90.0],[0.0,255.0,190.0],[0.0,255.0,255.0],[0.0,190.0,255.0],[0.0,125.0,255.0],[0.0,63.0,255.0],[0.0,0.0,255.0],[63.0,0.0,255.0],[125.0,0.0,255.0],[190.0,0.0,255.0],[255.0,0.0,255.0],[255.0,0.0,190.0],[255.0,0.0,125.0],[255.0,0.0,63.0]],"default":[[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0],[1.0,1.0,0.0],[0.0,1.0,1.0],[1.0,0.0,1.0],[0.5,0.0,0.0],[0.5,1.0,1.0],[0.0,0.0,0.5],[1.0,1.0,0.5],[0.5,0.0,1.0],[1.0,0.5,0.0],[0.0,0.5,1.0],[0.5,1.0,0.0],[0.5,0.0,0.5],[0.5,1.0,0.5],[1.0,0.5,1.0],[0.0,0.5,0.0],[0.5,0.5,1.0],[1.0,0.0,0.5],[0.5,0.5,0.0],[0.0,0.5,0.5],[1.0,0.5,0.5],[0.0,1.0,0.5],[0.5,0.5,0.5],[0.125,0.125,0.125],[0.75,0.75,0.75],[0.25,0.25,0.25],[0.625,0.625,0.625],[0.375,0.375,0.375]],"MPL_s3pcpn_l":[[0.946175,0.985544,0.985544],[0.838524,0.956632,0.956632],[0.730873,0.92772,0.92772],[0.623222,0.898808,0.898808],[0.515571,0.869896,0.869896],[0.40792,0.840984,0.840984],[0.307574,0.8193,0.8193],[0.258362,0.848212,0.848212],[0.20915,0.877124,0.877124],[0.184544,0.89158,0.89158],[0.110727,0.934948,0.934948],[0.086121,0.949404,0.949404],[0.012303,0.992772,0.992772],[0.0,0.995233,0.980469],[0.0,0.966628,0.863283],[0.0,0.957093,0.824221],[0.0,0.928489,0.707036],[0.0,0.909419,0.628912],[0.0,0.899885,0.58985],[0.0,0.87105,0.472434],[0.0,0.851365,0.393695],[0.0,0.83168,0.314956],[0.0,0.821838,0.275586],[0.0,0.792311,0.157478],[0.0,0.772626,0.078739],[0.0,0.752941,0.0],[0.039369,0.762784,0.0],[0.157478,0.792311,0.0],[0.236217,0.811995,0.0],[0.314956,0.83168,0.0],[0.354325,0.841523,0.0],[0.472434,0.87105,0.0],[0.550788,0.89035,0.0],[0.628912,0.909419,0.0],[0.707036,0.928489,0.0],[0.78516,0.947559,0.0],[0.863283,0.966628,0.0],[0.902345,0.976163,0.0],[1.0,0.98539,0.0],[1.0,0.926951,0.0],[1.0,0.868512,0.0],[1.0,0.810073,0.0],[1.0,0.751634,0.0],[1.0,0.693195,0.0],[1.0,0.634756,0.0],[1.0,0.590542,0.0],[1.0,0.442907,0.0],[1.0,0.344483,0.0],[1.0,0.246059,0.0],[1.0,0.147636,0.0],[1.0,0.049212,0.0],[1.0,0.009842,0.039369],[1.0,0.029527,0.118108],[1.0,0.039369,0.157478],[1.0,0.068897,0.275586],[1.0,0.088581,0.354325],[1.0,0.108266,0.433064],[0.998847,0.127951,0.511726],[0.989619,0.147636,0.58985],[0.980392,0.16732,0.667974],[0.971165,0.187005,0.746098],[0.966551,0.196847,0.78516],[0.95271,0.226374,0.902345],[0.943483,0.246059,0.980469],[0.889504,0.236217,1.0],[0.820607,0.216532,1.0],[0.751711,0.196847,1.0],[0.682814,0.177163,1.0],[0.613918,0.157478,1.0],[0.545021,0.137793,1.0],[0.487197,0.132872,1.0],[0.447828,0.152557,1.0],[0.408458,0.172241,1.0],[0.369089,0.191926,1.0],[0.329719,0.211611,1.0],[0.310035,0.221453,1.0],[0.25098,0.25098,1.0],[0.231296,0.231296,0.921876],[0.211611,0.211611,0.843752],[0.191926,0.191926,0.765629],[0.172241,0.172241,0.687505],[0.152557,0.152557,0.609381],[0.132872,0.132872,0.531257],[0.12549,0.12549,0.465052],[0.12549,0.12549,0.405998],[0.12549,0.12549,0.346944],[0.12549,0.12549,0.287889],[0.12549,0.12549,0.228835],[0.12549,0.12549,0.169781],[0.140254,0.140254,0.140254],[0.199308,0.199308,0.199308],[0.228835,0.228835,0.228835],[0.317416,0.317416,0.317416],[0.376471,0.376471,0.376471],[0.435525,0.435525,0.435525],[0.494579,0.494579,0.494579],[0.553633,0.553633,0.553633],[0.612687,0.612687,0.612687],[0.671742,0.671742,0.671742],[0.730796,0.730796,0.730796],[0.78985,0.78985,0.78985],[0.848904,0.848904,0.848904],[0.882737,0.87474,0.867359],[0.891349,0.867359,0.845213],[0.899962,0.859977,0.823068],[0.908574,0.852595,0.800923],[0.917186,0.845213,0.778777],[0.921492,0.841523,0.767705],[0.931795,0.827835,0.732026],[0.919493,0.799539,0.690196],[0.90719,0.771242,0.648366],[0.894887,0.742945,0.606536],[0.882584,0.714648,0.564706],[0.870281,0.686351,0.522876],[0.857978,0.658055,0.481046],[0.828143,0.624221,0.442907],[0.792464,0.588543,0.405998],[0.756786,0.552864,0.369089],[0.721107,0.517186,0.33218],[0.685429,0.481507,0.295271],[0.64975,0.445829,0.258362],[0.614072,0.410381,0.221453],[0.578393,0.375317,0.184544],[0.560554,0.357785,0.16609],[0.507036,0.30519,0.110727],[0.471357,0.270127,0.073818],[0.435679,0.235063,0.036909],[0.4,0.2,0.0]],"wxpEnIR":[[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[100.0,50.0,25.0],[100.0,50.0,25.0],[100.0,50.0,25.0],[100.0,50.0,25.0],[0.0,255.0,0.0],[0.0,255.0,0.0],[0.0,255.0,0.0],[0.0,255.0,0.0],[0.0,255.0,0.0],[0.0,128.0,0.0],[0.0,128.0,0.0],[0.0,128.0,0.0],[0.0,128.0,0.0],[0.0,128.0,0.0],[0.0,0.0,128.0],[0.0,0.0,128.0],[0.0,0.0,128.0],[0.0,0.0,128.0],[0.0,0.0,255.0],[0.0,0.0,255.0],[0.0,0.0,255.0],[0.0,0.0,255.0],[0.0,0.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,255.0,255.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[0.0,128.0,128.0],[205.0,205.0,205.0],[201.0,201.0,201.0],[197.0,197.0,197.0],[193.0,193.0,193.0],[189.0,189.0,189.0],[185.0,185.0,185.0],[180.0,180.0,180.0],[176.0,176.0,176.0],[172.0,172.0,172.0],[168.0,168.0,168.0],[164.0,164.0,164.0],[160.0,160.0,160.0],[156.0,156.0,156.0],[152.0,152.0,152.0],[148.0,148.0,148.0],[144.0,144.0,144.0],[139.0,139.0,139.0],[135.0,135.0,135.0],[131.0,131.0,131.0],[127.0,127.0,127.0],[123.0,123.0,123.0],[119.0,119.0,119.0],[115.0,115.0,115.0],[111.0,111.0,111.0],[107.0,107.0,107.0],[103.0,103.0,103.0],[98.0,98.0,98.0],[94.0,94.0,94.0],[90.0,90.0,90.0],[86.0,86.0,86.0],[82.0,82.0,82.0],[78.0,78.0,78.0],[74.0,74.0,74.0],[70.0,70.0,70.0],[66.0,66.0,66.0],[62.0,62.0,62.0],[57.0,57.0,57.0],[53.0,53.0,53.0],[49.0,49.0,49.0],[45.0,45.0,45.0],[41.0,41.0,41.0],[37.0,37.0,37.0],[33.0,33.0,33.0],[29.0,29.0,29.0],[25.0,25.0,25.0],[21.0,21.0,21.0],[16.0,16.0,16.0],[12.0,12.0,12.0],[8.0,8.0,8.0],[4.0,4.0,4.0],[0.0,0.0,0.0]],"NCV_banded":[[103.0,2.0,126.0],[107.0,5.0,133.0],[110.0,10.0,139.0],[113.0,16.0,143.0],[114.0,20.0,147.0],[113.0,23.0,148.0],[110.0,23.0,149.0],[107.0,20.0,149.0],[103.0,16.0,149.0],[99.0,10.0,152.0],[97.0,6.0,157.0],[95.0,2.0,164.0],[95.0,0.0,172.0],[95.0,0.0,181.0],[95.0,0.0,189.0],[95.0,4.0,196.0],[96.0,9.0,201.0],[96.0,17.0,204.0],[96.0,24.0,206.0],[95.0,30.0,206.0],[90.0,32.0,203.0],[84.0,30.0,200.0],[75.0,26.0,197.0],[64.0,19.0,195.0],[54.0,12.0,196.0],[45.0,6.0,199.0],[37.0,2.0,206.0],[31.0,0.0,214.0],[25.0,0.0,222.0],[21.0,1.0,229.0],[19.0,6.0,234.0],[20.0,13.0,237.0],[22.0,21.0,239.0],[30.0,35.0,238.0],[35.0,46.0,235.0],[36.0,52.0,230.0],[34.0,54.0,224.0],[27.0,53.0,219.0],[20.0,51.0,216.0],[12.0,50.0,216.0],[5.0,51.0,220.0],[1.0,55.0,226.0],[0.0,61.0,233.0],[0.0,69.0,241.0],[2.0,79.0,247.0],[7.0,89.0,250.0],[15.0,101.0,252.0],[25.0,112.0,252.0],[33.0,121.0,250.0],[37.0,126.0,245.0],[38.0,128.0,239.0],[34.0,127.0,232.0],[27.0,125.0,226.0],[19.0,123.0,223.0],[11.0,123.0,223.0],[5.0,127.0,226.0],[1.0,133.0,232.0],[0.0,141.0,239.0],[0.0,149.0,246.0],[3.0,158.0,251.0],[9.0,166.0,254.0],[17.0,173.0,254.0],[27.0,179.0,254.0],[34.0,183.0,251.0],[38.0,184.0,245.0],[37.0,182.0,238.0],[33.0,178.0,231.0],[25.0,175.0,226.0],[17.0,174.0,223.0],[9.0,175.0,223.0],[4.0,180.0,227.0],[0.0,188.0,234.0],[0.0,197.0,241.0],[0.0,205.0,248.0],[4.0,213.0,252.0],[11.0,219.0,254.0],[19.0,224.0,254.0],[28.0,227.0,253.0],[35.0,227.0,250.0],[38.0,225.0,244.0],[37.0,221.0,237.0],[31.0,217.0,230.0],[24.0,215.0,225.0],[15.0,215.0,223.0],[8.0,219.0,224.0],[3.0,227.0,229.0],[0.0,235.0,234.0],[0.0,242.0,237.0],[1.0,249.0,240.0],[5.0,253.0,240.0],[12.0,254.0,238.0],[21.0,254.0,235.0],[30.0,253.0,230.0],[36.0,249.0,224.0],[38.0,243.0,215.0],[36.0,235.0,205.0],[30.0,229.0,194.0],[22.0,224.0,185.0],[14.0,223.0,178.0],[7.0,225.0,174.0],[2.0,230.0,172.0],[0.0,237.0,172.0],[0.0,244.0,171.0],[1.0,250.0,171.0],[6.0,253.0,169.0],[14.0,254.0,167.0],[23.0,254.0,164.0],[32.0,252.0,161.0],[37.0,248.0,155.0],[38.0,241.0,147.0],[35.0,234.0,136.0],[28.0,228.0,125.0],[20.0,224.0,113.0],[12.0,223.0,103.0],[6.0,226.0,94.0],[1.0,231.0,87.0],[0.0,238.0,82.0],[0.0,245.0,77.0],[2.0,251.0,73.0],[8.0,254.0,71.0],[16.0,254.0,70.0],[25.0,254.0,70.0],[33.0,251.0,70.0],[38.0,246.0,66.0],[38.0,240.0,60.0],[34.0,232.0,49.0],[27.0,226.0,36.0],[19.0,223.0,22.0],[14.0,223.0,11.0],[15.0,226.0,4.0],[18.0,232.0,1.0],[25.0,240.0,0.0],[34.0,246.0,0.0],[45.0,251.0,3.0],[58.0,254.0,9.0],[72.0,254.0,18.0],[85.0,254.0,27.0],[96.0,251.0,34.0],[104.0,245.0,38.0],[107.0,238.0,37.0],[107.0,231.0,33.0],[106.0,226.0,25.0],[105.0,223.0,17.0],[107.0,224.0,9.0],[112.0,228.0,3.0],[119.0,234.0,0.0],[129.0,241.0,0.0],[139.0,248.0,0.0],[150.0,252.0,4.0],[160.0,254.0,11.0],[169.0,254.0,19.0],[176.0,253.0,28.0],[181.0,250.0,35.0],[183.0,244.0,38.0],[182.0,237.0,37.0],[180.0,230.0,31.0],[178.0,225.0,24.0],[179.0,223.0,15.0],[182.0,224.0,8.0],[190.0,229.0,3.0],[199.0,235.0,0.0],[209.0,243.0,0.0],[219.0,249.0,1.0],[228.0,253.0,5.0],[234.0,254.0,12.0],[239.0,254.0,21.0],[241.0,253.0,30.0],[241.0,249.0,36.0],[238.0,242.0,38.0],[234.0,235.0,36.0],[229.0,227.0,30.0],[224.0,219.0,22.0],[223.0,215.0,14.0],[225.0,214.0,7.0],[230.0,215.0,2.0],[237.0,218.0,0.0],[244.0,222.0,0.0],[250.0,224.0,1.0],[253.0,224.0,6.0],[254.0,223.0,14.0],[254.0,221.0,23.0],[252.0,217.0,32.0],[248.0,212.0,37.0],[241.0,204.0,38.0],[234.0,195.0,35.0],[227.0,186.0,28.0],[223.0,178.0,20.0],[223.0,173.0,12.0],[226.0,170.0,5.0],[231.0,170.0,1.0],[238.0,171.0,0.0],[245.0,172.0,0.0],[251.0,173.0,2.0],[254.0,173.0,8.0],[254.0,172.0,16.0],[254.0,172.0,25.0],[251.0,169.0,33.0],[246.0,164.0,38.0],[239.0,156.0,38.0],[232.0,147.0,34.0],[226.0,137.0,27.0],[223.0,127.0,18.0],[223.0,119.0,11.0],[226.0,113.0,4.0],[232.0,110.0,1.0],[239.0,107.0,0.0],[245.0,105.0,0.0],[250.0,103.0,3.0],[252.0,102.0,9.0],[252.0,102.0,18.0],[250.0,102.0,27.0],[247.0,101.0,34.0],[241.0,96.0,37.0],[233.0,89.0,37.0],[226.0,78.0,32.0],[220.0,66.0,24.0],[216.0,54.0,16.0],[216.0,42.0,9.0],[219.0,32.0,3.0],[224.0,24.0,0.0],[230.0,18.0,0.0],[235.0,13.0,0.0],[238.0,10.0,4.0],[239.0,10.0,11.0],[237.0,18.0,25.0],[234.0,26.0,39.0],[229.0,32.0,50.0],[222.0,35.0,56.0],[214.0,33.0,59.0],[206.0,28.0,59.0],[199.0,21.0,57.0],[196.0,13.0,55.0],[195.0,7.0,55.0],[197.0,2.0,58.0],[200.0,0.0,63.0],[203.0,0.0,69.0],[206.0,1.0,76.0],[206.0,4.0,84.0],[204.0,10.0,92.0],[201.0,17.0,100.0],[196.0,23.0,106.0],[189.0,28.0,109.0],[181.0,29.0,109.0],[172.0,26.0,107.0],[164.0,21.0,104.0],[157.0,15.0,100.0],[152.0,9.0,99.0],[149.0,4.0,99.0],[149.0,1.0,100.0],[149.0,0.0,103.0],[148.0,0.0,106.0],[147.0,1.0,109.0],[143.0,3.0,110.0],[139.0,8.0,110.0],[133.0,12.0,109.0],[126.0,16.0,106.0]],"BkBlAqGrYeOrReViWh200":[[0.0,0.0,0.0],[0.0,0.0,10.0],[0.0,0.0,20.0],[0.0,0.0,31.0],[0.0,0.0,41.0],[0.0,0.0,51.0],[0.0,0.0,61.0],[0.0,0.0,71.0],[0.0,0.0,82.0],[0.0,0.0,92.0],[0.0,0.0,102.0],[0.0,0.0,112.0],[0.0,0.0,122.0],[0.0,0.0,133.0],[0.0,0.0,143.0],[0.0,0.0,153.0],[0.0,0.0,163.0],[0.0,0.0,173.0],[0.0,0.0,184.0],[0.0,0.0,194.0],[0.0,0.0,204.0],[0.0,0.0,214.0],[0.0,0.0,224.0],[0.0,0.0,235.0],[0.0,0.0,245.0],[0.0,0.0,255.0],[0.0,10.0,255.0],[0.0,20.0,255.0],[0.0,31.0,255.0],[0.0,41.0,255.0],[0.0,51.0,255.0],[0.0,61.0,255.0],[0.0,71.0,255.0],[0.0,82.0,255.0],[0.0,92.0,255.0],[0.0,102.0,255.0],[0.0,112.0,255.0],[0.0,122.0,255.0],[0.0,133.0,255.0],[0.0,143.0,255.0],[0.0,153.0,255.0],[0.0,163.0,255.0],[0.0,173.0,255.0],[0.0,184.0,255.0],[0.0,194.0,255.0],[0.0,204.0,255.0],[0.0,214.0,255.0],[0.0,224.0,255.0],[0.0,235.0,255.0],[0.0,245.0,255.0],[0.0,255.0,255.0],[0.0,252.0,245.0],[1.0,249.0,236.0],[1.0,246.0,226.0],[1.0,243.0,217.0],[2.0,240.0,207.0],[2.0,237.0,197.0],[2.0,234.0,188.0],[3.0,231.0,178.0],[3.0,228.0,169.0],[3.0,225.0,159.0],[4.0,222.0,149.0],[4.0,219.0,140.0],[4.0,215.0,130.0],[4.0,212.0,121.0],[5.0,209.0,111.0],[5.0,206.0,101.0],[5.0,203.0,92.0],[6.0,200.0,82.0],[6.0,197.0,73.0],[6.0,194.0,63.0],[7.0,191.0,53.0],[7.0,188.0,44.0],[7.0,185.0,34.0],[8.0,182.0,25.0],[8.0,179.0,15.0],[18.0,182.0,14.0],[28.0,185.0,14.0],[38.0,188.0,13.0],[48.0,191.0,13.0],[57.0,194.0,12.0],[67.0,197.0,11.0],[77.0,200.0,11.0],[87.0,203.0,10.0],[97.0,206.0,10.0],[107.0,209.0,9.0],[117.0,212.0,8.0],[127.0,215.0,8.0],[136.0,219.0,7.0],[146.0,222.0,7.0],[156.0,225.0,6.0],[166.0,228.0,5.0],[176.0,231.0,5.0],[186.0,234.0,4.0],[196.0,237.0,4.0],[206.0,240.0,3.0],[215.0,243.0,2.0],[225.0,246.0,2.0],[235.0,249.0,1.0],[245.0,252.0,1.0],[255.0,255.0,0.0],[255.0,251.0,0.0],[255.0,248.0,0.0],[255.0,244.0,0.0],[255.0,240.0,0.0],[255.0,236.0,0.0],[255.0,233.0,0.0],[255.0,229.0,0.0],[255.0,225.0,0.0],[255.0,221.0,0.0],[255.0,218.0,0.0],[255.0,214.0,0.0],[255.0,210.0,0.0],[255.0,206.0,0.0],[255.0,203.0,0.0],[255.0,199.0,0.0],[255.0,195.0,0.0],[255.0,191.0,0.0],[255.0,188.0,0.0],[255.0,184.0,0.0],[255.0,180.0,0.0],[255.0,176.0,0.0],[255.0,173.0,0.0],[255.0,169.0,0.0],[255.0,165.0,0.0],[255.0,158.0,0.0],[255.0,152.0,0.0],[255.0,145.0,0.0],[255.0,139.0,0.0],[255.0,132.0,0.0],[255.0,125.0,0.0],[255.0,119.0,0.0],[255.0,112.0,0.0],[255.0,106.0,0.0],[255.0,99.0,0.0],[255.0,92.0,0.0],[255.0,86.0,0.0],[255.0,79.0,0.0],[255.0,73.0,0.0],[255.0,66.0,0.0],[255.0,59.0,0.0],[255.0,53.0,0.0],[255.0,46.0,0.0],[255.0,40.0,0.0],[255.0,33.0,0.0],[255.0,26.0,0.0],[255.0,20.0,0.0],[255.0,13.0,0.0],[255.0,7.0,0.0],[255.0,0.0,0.0],[248.0,0.0,5.0],[242.0,0.0,11.0],[235.0,0.0,16.0],[228.0,0.0,22.0],[221.0,0.0,27.0],[215.0,0.0,33.0],[208.0,0.0,38.0],[201.0,0.0,44.0],[195.0,0.0,49.0],[188.0,0.0,54.0],[181.0,0.0,60.0],[174.0,0.0,65.0],[168.0,0.0,71.0],[161.0,0.0,76.0],[154.0,0.0,82.0],[147.0,0.0,87.0],[141.0,0.0,92.0],[134.0,0.0,98.0],[127.0,0.0,103.0],[121.0,0.0,109.0],[114.0,0.0,114.0],[107.0,0.0,120.0],[100.0,0.0,125.0],[94.0,0.0,131.0],[87.0,0.0,136.0],[94.0,10.0,141.0],[100.0,20.0,146.0],[107.0,31.0,150.0],[114.0,41.0,155.0],[121.0,51.0,160.0],[127.0,61.0,165.0],[134.0,71.0,169.0],[141.0,82.0,174.0],[147.0,92.0,179.0],[154.0,102.0,184.0],[161.0,112.0,188.0],[168.0,122.0,193.0],[174.0,133.0,198.0],[181.0,143.0,203.0],[188.0,153.0,207.0],[195.0,163.0,212.0],[201.0,173.0,217.0],[208.0,184.0,222.0],[215.0,194.0,226.0],[221.0,204.0,231.0],[228.0,214.0,236.0],[235.0,224.0,241.0],[242.0,235.0,245.0],[248.0,245.0,250.0],[255.0,255.0,255.0]],"wind_17lev":[[255.0,255.0,255.0],[239.0,244.0,209.0],[232.0,244.0,158.0],[170.0,206.0,99.0],[226.0,237.0,22.0],[255.0,237.0,0.0],[255.0,237.0,130.0],[244.0,209.0,127.0],[237.0,165.0,73.0],[229.0,140.0,61.0],[219.0,124.0,61.0],[239.0,7.0,61.0],[232.0,86.0,163.0],[155.0,112.0,168.0],[99.0,112.0,247.0],[127.0,150.0,255.0],[142.0,178.0,255.0],[181.0,201.0,255.0]],"CBR_set3":[[141.0,211.0,199.0],[255.0,255.0,179.0],[190.0,186.0,218.0],[251.0,128.0,114.0],[128.0,177.0,211.0],[253.0,180.0,98.0],[179.0,222.0,105.0],[252.0,205.0,229.0],[217.0,217.0,217.0],[188.0,128.0,189.0],[204.0,235.0,197.0],[255.0,237.0,111.0]],"MPL_coolwarm":[[0.234377,0.305542,0.75968],[0.24352,0.319189,0.771672],[0.252663,0.332837,0.783665],[0.261805,0.346484,0.795658],[0.271104,0.360011,0.807095],[0.28055,0.373423,0.818011],[0.289996,0.386836,0.828926],[0.299441,0.400248,0.839842],[0.30906,0.413498,0.850128],[0.313946,0.420052,0.854993],[0.328604,0.439712,0.869587],[0.33349,0.446265,0.874452],[0.348323,0.465711,0.888346],[0.353369,0.472069,0.89257],[0.368507,0.491141,0.905243],[0.373552,0.497499,0.909467],[0.388852,0.516298,0.921373],[0.399231,0.528528,0.928459],[0.404421,0.534643,0.932002],[0.419991,0.552989,0.94263],[0.430507,0.564883,0.948889],[0.441123,0.576532,0.954545],[0.446431,0.582356,0.957373],[0.462354,0.59983,0.965857],[0.47307,0.611077,0.970634],[0.483854,0.62205,0.974808],[0.489246,0.627536,0.976896],[0.505423,0.643995,0.983157],[0.51626,0.654498,0.986407],[0.527132,0.6647,0.989065],[0.532568,0.669801,0.990393],[0.548876,0.685104,0.994379],[0.559747,0.694768,0.996075],[0.570616,0.704109,0.997195],[0.581486,0.713451,0.998314],[0.592356,0.722792,0.999434],[0.603162,0.731527,0.999565],[0.608547,0.735725,0.999354],[0.624703,0.748318,0.998719],[0.635474,0.756714,0.998297],[0.646113,0.764436,0.996868],[0.656683,0.771806,0.994914],[0.667253,0.779176,0.992959],[0.677823,0.786546,0.991005],[0.688188,0.793178,0.988038],[0.693321,0.796314,0.986308],[0.70872,0.805721,0.981117],[0.718985,0.811993,0.977656],[0.72897,0.817464,0.973188],[0.738826,0.822572,0.968261],[0.748682,0.827679,0.963334],[0.758539,0.832787,0.958408],[0.768034,0.837035,0.952488],[0.772706,0.838978,0.949319],[0.786721,0.844807,0.93981],[0.796064,0.848693,0.933471],[0.804965,0.851666,0.926165],[0.813693,0.854282,0.91848],[0.82242,0.856898,0.910795],[0.831148,0.859513,0.90311],[0.839351,0.861167,0.894494],[0.843358,0.86182,0.890017],[0.855378,0.863778,0.876587],[0.863392,0.865084,0.867634],[0.871493,0.862309,0.857016],[0.879622,0.858175,0.845844],[0.887752,0.85404,0.834671],[0.895882,0.849906,0.823499],[0.902849,0.844796,0.81197],[0.90946,0.839386,0.800331],[0.916071,0.833977,0.788693],[0.922681,0.828568,0.777054],[0.928116,0.822197,0.765141],[0.933221,0.815557,0.753151],[0.938326,0.808917,0.741162],[0.940879,0.805596,0.735167],[0.947345,0.794696,0.716991],[0.950956,0.786875,0.704761],[0.954566,0.779055,0.692531],[0.958176,0.771234,0.680301],[0.960581,0.762501,0.667964],[0.962708,0.753557,0.655601],[0.964835,0.744614,0.643239],[0.966962,0.73567,0.630877],[0.967874,0.725847,0.618489],[0.968533,0.715841,0.606097],[0.969192,0.705836,0.593704],[0.969851,0.69583,0.581312],[0.969289,0.684982,0.568975],[0.9685,0.673977,0.556649],[0.967711,0.662973,0.544323],[0.967317,0.657471,0.53816],[0.964911,0.640159,0.519806],[0.962701,0.628218,0.507636],[0.96049,0.616276,0.495467],[0.958279,0.604335,0.483297],[0.954853,0.591622,0.471337],[0.951254,0.578799,0.459408],[0.947654,0.565976,0.447478],[0.944055,0.553153,0.435548],[0.939254,0.539581,0.4239],[0.934305,0.525918,0.412286],[0.929357,0.512254,0.400673],[0.924409,0.49859,0.389059],[0.918282,0.484173,0.377794],[0.912033,0.46968,0.366565],[0.905783,0.455186,0.355336],[0.902659,0.447939,0.349721],[0.892138,0.425389,0.333289],[0.884643,0.410017,0.322507],[0.877149,0.394645,0.311724],[0.869655,0.379274,0.300941],[0.861054,0.362916,0.290628],[0.852378,0.346492,0.280346],[0.843703,0.330068,0.270065],[0.835027,0.313644,0.259783],[0.825294,0.295749,0.250025],[0.815508,0.277781,0.240294],[0.805723,0.259813,0.230562],[0.795938,0.241845,0.22083],[0.785153,0.220851,0.211673],[0.774337,0.199759,0.202535],[0.76352,0.178667,0.193396],[0.758112,0.168122,0.188827],[0.740957,0.12224,0.175744],[0.729196,0.086679,0.16724],[0.717435,0.051118,0.158737],[0.705673,0.015556,0.150233]],"NCV_gebco":[[18.0,10.0,58.0],[23.0,49.0,110.0],[19.0,89.0,140.0],[26.0,103.0,164.0],[30.0,114.0,178.0],[29.0,139.0,196.0],[26.0,165.0,210.0],[27.0,184.0,223.0],[26.0,204.0,235.0],[26.0,216.0,241.0],[38.0,223.0,241.0],[49.0,229.0,235.0],[104.0,242.0,233.0],[160.0,255.0,229.0],[195.0,209.0,80.0],[225.0,224.0,102.0],[223.0,196.0,91.0],[210.0,178.0,81.0],[189.0,150.0,46.0],[163.0,127.0,46.0],[153.0,118.0,43.0],[142.0,109.0,38.0],[134.0,103.0,36.0],[116.0,88.0,29.0]],"MPL_RdGy":[[0.415456,0.003691,0.123414],[0.438524,0.011073,0.127105],[0.461592,0.018454,0.130796],[0.48466,0.025836,0.134487],[0.507728,0.033218,0.138178],[0.530796,0.0406,0.141869],[0.553864,0.047982,0.145559],[0.576932,0.055363,0.14925],[0.6,0.062745,0.152941],[0.611534,0.066436,0.154787],[0.646136,0.077509,0.160323],[0.65767,0.0812,0.162168],[0.692272,0.092272,0.167705],[0.700807,0.099654,0.171242],[0.717416,0.132872,0.186928],[0.722953,0.143945,0.192157],[0.739562,0.177163,0.207843],[0.750634,0.199308,0.218301],[0.756171,0.210381,0.223529],[0.77278,0.243599,0.239216],[0.783852,0.265744,0.249673],[0.794925,0.287889,0.260131],[0.800461,0.298962,0.265359],[0.81707,0.33218,0.281046],[0.828143,0.354325,0.291503],[0.839216,0.376471,0.301961],[0.843829,0.387082,0.310112],[0.85767,0.418916,0.334564],[0.866897,0.440138,0.350865],[0.876125,0.461361,0.367166],[0.880738,0.471972,0.375317],[0.894579,0.503806,0.399769],[0.903806,0.525029,0.416071],[0.913033,0.546251,0.432372],[0.922261,0.567474,0.448674],[0.931488,0.588697,0.464975],[0.940715,0.609919,0.481276],[0.945329,0.620531,0.489427],[0.957555,0.651211,0.51511],[0.960323,0.66782,0.536332],[0.963091,0.684429,0.557555],[0.965859,0.701038,0.578777],[0.968627,0.717647,0.6],[0.971396,0.734256,0.621223],[0.974164,0.750865,0.642445],[0.975548,0.75917,0.653057],[0.9797,0.784083,0.68489],[0.982468,0.800692,0.706113],[0.985236,0.817301,0.727336],[0.988005,0.83391,0.748558],[0.990773,0.850519,0.769781],[0.992464,0.86436,0.789004],[0.99308,0.875433,0.806228],[0.993387,0.880969,0.81484],[0.99431,0.897578,0.840677],[0.994925,0.908651,0.857901],[0.99554,0.919723,0.875125],[0.996155,0.930796,0.892349],[0.99677,0.941869,0.909573],[0.997386,0.952941,0.926797],[0.998001,0.964014,0.944022],[0.998308,0.96955,0.952634],[0.999231,0.986159,0.97847],[0.999846,0.997232,0.995694],[0.992849,0.992849,0.992849],[0.983314,0.983314,0.983314],[0.973779,0.973779,0.973779],[0.964245,0.964245,0.964245],[0.95471,0.95471,0.95471],[0.945175,0.945175,0.945175],[0.93564,0.93564,0.93564],[0.926105,0.926105,0.926105],[0.916571,0.916571,0.916571],[0.907036,0.907036,0.907036],[0.897501,0.897501,0.897501],[0.892734,0.892734,0.892734],[0.878431,0.878431,0.878431],[0.866744,0.866744,0.866744],[0.855056,0.855056,0.855056],[0.843368,0.843368,0.843368],[0.83168,0.83168,0.83168],[0.819992,0.819992,0.819992],[0.808305,0.808305,0.808305],[0.796617,0.796617,0.796617],[0.784929,0.784929,0.784929],[0.773241,0.773241,0.773241],[0.761553,0.761553,0.761553],[0.749865,0.749865,0.749865],[0.738178,0.738178,0.738178],[0.72549,0.72549,0.72549],[0.709804,0.709804,0.709804],[0.701961,0.701961,0.701961],[0.678431,0.678431,0.678431],[0.662745,0.662745,0.662745],[0.647059,0.647059,0.647059],[0.631373,0.631373,0.631373],[0.615686,0.615686,0.615686],[0.6,0.6,0.6],[0.584314,0.584314,0.584314],[0.568627,0.568627,0.568627],[0.552941,0.552941,0.552941],[0.537255,0.537255,0.537255],[0.520492,0.520492,0.520492],[0.502653,0.502653,0.502653],[0.484814,0.484814,0.484814],[0.466974,0.466974,0.466974],[0.449135,0.449135,0.449135],[0.440215,0.440215,0.440215],[0.413456,0.413456,0.413456],[0.395617,0.395617,0.395617],[0.377778,0.377778,0.377778],[0.359939,0.359939,0.359939],[0.342099,0.342099,0.342099],[0.32426,0.32426,0.32426],[0.306421,0.306421,0.306421],[0.290196,0.290196,0.290196],[0.27451,0.27451,0.27451],[0.258824,0.258824,0.258824],[0.243137,0.243137,0.243137],[0.227451,0.227451,0.227451],[0.211765,0.211765,0.211765],[0.196078,0.196078,0.196078],[0.180392,0.180392,0.180392],[0.172549,0.172549,0.172549],[0.14902,0.14902,0.14902],[0.133333,0.133333,0.133333],[0.117647,0.117647,0.117647],[0.101961,0.101961,0.101961]],"rh_19lev":[[254.0,254.0,254.0],[254.0,254.0,160.0],[254.0,254.0,99.0],[244.0,244.0,110.0],[255.0,210.0,35.0],[255.0,163.0,25.0],[255.0,89.0,25.0],[230.0,122.0,101.0],[237.0,145.0,124.0],[239.0,178.0,146.0],[247.0,199.0,178.0],[255.0,230.0,230.0],[215.0,225.0,255.0],[150.0,210.0,255.0],[30.0,189.0,255.0],[20.0,159.0,255.0],[10.0,108.0,240.0],[11.0,116.0,255.0],[10.0,104.0,200.0],[0.0,89.0,159.0]],"WhiteGreen":[[255.0,255.0,255.0],[253.0,254.0,253.0],[252.0,254.0,252.0],[250.0,253.0,250.0],[249.0,252.0,248.0],[247.0,252.0,246.0],[246.0,251.0,245.0],[244.0,251.0,243.0],[243.0,250.0,241.0],[241.0,249.0,240.0],[240.0,249.0,238.0],[238.0,248.0,236.0],[237.0,247.0,234.0],[235.0,247.0,233.0],[234.0,246.0,231.0],[232.0,245.0,229.0],[231.0,245.0,228.0],[229.0,244.0,226.0],[227.0,244.0,224.0],[226.0,243.0,222.0],[224.0,242.0,221.0],[223.0,242.0,219.0],[221.0,241.0,217.0],[220.0,240.0,215.0],[218.0,240.0,214.0],[217.0,239.0,212.0],[215.0,238.0,210.0],[214.0,238.0,209.0],[212.0,237.0,207.0],[211.0,237.0,205.0],[209.0,236.0,203.0],[208.0,235.0,202.0],[206.0,235.0,200.0],[205.0,234.0,198.0],[203.0,233.0,197.0],[201.0,233.0,195.0],[200.0,232.0,193.0],[198.0,231.0,191.0],[197.0,231.0,190.0],[195.0,230.0,188.0],[194.0,230.0,186.0],[192.0,229.0,185.0],[191.0,228.0,183.0],[189.0,228.0,181.0],[188.0,227.0,179.0],[186.0,226.0,178.0],[185.0,226.0,176.0],[183.0,225.0,174.0],[182.0,225.0,173.0],[180.0,224.0,171.0],[179.0,223.0,169.0],[177.0,223.0,167.0],[175.0,222.0,166.0],[174.0,221.0,164.0],[172.0,221.0,162.0],[171.0,220.0,161.0],[169.0,219.0,159.0],[168.0,219.0,157.0],[166.0,218.0,155.0],[165.0,218.0,154.0],[163.0,217.0,152.0],[162.0,216.0,150.0],[160.0,216.0,149.0],[159.0,215.0,147.0],[157.0,214.0,145.0],[156.0,214.0,143.0],[154.0,213.0,142.0],[153.0,212.0,140.0],[151.0,212.0,138.0],[149.0,211.0,136.0],[148.0,211.0,135.0],[146.0,210.0,133.0],[145.0,209.0,131.0],[143.0,209.0,130.0],[142.0,208.0,128.0],[140.0,207.0,126.0],[139.0,207.0,124.0],[137.0,206.0,123.0],[136.0,205.0,121.0],[134.0,205.0,119.0],[133.0,204.0,118.0],[131.0,204.0,116.0],[130.0,203.0,114.0],[128.0,202.0,112.0],[125.0,201.0,109.0],[124.0,200.0,108.0],[122.0,200.0,107.0],[121.0,199.0,106.0],[119.0,199.0,105.0],[118.0,198.0,104.0],[117.0,198.0,103.0],[115.0,197.0,102.0],[114.0,197.0,101.0],[113.0,196.0,100.0],[111.0,196.0,99.0],[110.0,195.0,98.0],[108.0,195.0,97.0],[107.0,194.0,96.0],[106.0,194.0,95.0],[104.0,193.0,93.0],[103.0,193.0,92.0],[102.0,192.0,91.0],[100.0,191.0,90.0],[99.0,191.0,89.0],[97.0,190.0,88.0],[96.0,190.0,87.0],[95.0,189.0,86.0],[93.0,189.0,85.0],[92.0,188.0,84.0],[91.0,188.0,83.0],[89.0,187.0,82.0],[88.0,187.0,81.0],[86.0,186.0,80.0],[85.0,186.0,79.0],[84.0,185.0,78.0],[82.0,185.0,77.0],[81.0,184.0,76.0],[80.0,184.0,75.0],[78.0,183.0,74.0],[77.0,182.0,73.0],[75.0,182.0,72.0],[74.0,181.0,71.0],[73.0,181.0,70.0],[71.0,180.0,69.0],[70.0,180.0,68.0],[69.0,179.0,67.0],[67.0,179.0,66.0],[66.0,178.0,64.0],[64.0,178.0,63.0],[63.0,177.0,62.0],[62.0,177.0,61.0],[60.0,176.0,60.0],[59.0,176.0,59.0],[58.0,175.0,58.0],[56.0,175.0,57.0],[55.0,174.0,56.0],[53.0,173.0,55.0],[52.0,173.0,54.0],[51.0,172.0,53.0],[49.0,172.0,52.0],[48.0,171.0,51.0],[47.0,171.0,50.0],[45.0,170.0,49.0],[44.0,170.0,48.0],[42.0,169.0,47.0],[41.0,169.0,46.0],[40.0,168.0,45.0],[38.0,168.0,44.0],[37.0,167.0,43.0],[36.0,167.0,42.0],[34.0,166.0,41.0],[33.0,166.0,40.0],[31.0,165.0,39.0],[30.0,164.0,38.0],[29.0,164.0,37.0],[27.0,163.0,35.0],[26.0,163.0,34.0],[25.0,162.0,33.0],[23.0,162.0,32.0],[22.0,161.0,31.0],[20.0,161.0,30.0],[19.0,160.0,29.0],[18.0,160.0,28.0],[16.0,159.0,27.0],[15.0,159.0,26.0],[14.0,158.0,25.0],[12.0,158.0,24.0],[11.0,157.0,23.0],[9.0,157.0,22.0],[8.0,156.0,21.0],[8.0,155.0,21.0],[8.0,154.0,21.0],[8.0,153.0,21.0],[8.0,152.0,22.0],[8.0,152.0,22.0],[8.0,151.0,22.0],[8.0,150.0,22.0],[8.0,149.0,22.0],[8.0,148.0,22.0],[8.0,147.0,23.0],[8.0,146.0,23.0],[8.0,145.0,23.0],[8.0,144.0,23.0],[8.0,143.0,23.0],[7.0,143.0,23.0],[7.0,142.0,24.0],[7.0,141.0,24.0],[7.0,140.0,24.0],[7.0,139.0,24.0],[7.0,138.0,24.0],[7.0,137.0,24.0],[7.0,136.0,25.0],[7.0,135.0,25.0],[7.0,135.0,25.0],[7.0,134.0,25.0],[7.0,133.0,25.0],[7.0,132.0,25.0],[7.0,131.0,26.0],[7.0,130.0,26.0],[7.0,129.0,26.0],[7.0,128.0,26.0],[7.0,127.0,26.0],[7.0,126.0,26.0],[7.0,126.0,27.0],[7.0,125.0,27.0],[7.0,124.0,27.0],[7.0,123.0,27.0],[7.0,122.0,27.0],[7.0,121.0,27.0],[7.0,120.0,28.0],[7.0,119.0,28.0],[7.0,118.0,28.0],[6.0,118.0,28.0],[6.0,117.0,28.0],[6.0,116.0,28.0],[6.0,115.0,29.0],[6.0,114.0,29.0],[6.0,113.0,29.0],[6.0,112.0,29.0],[6.0,111.0,29.0],[6.0,110.0,29.0],[6.0,110.0,30.0],[6.0,109.0,30.0],[6.0,108.0,30.0],[6.0,107.0,30.0],[6.0,106.0,30.0],[6.0,105.0,30.0],[6.0,104.0,31.0],[6.0,103.0,31.0],[6.0,102.0,31.0],[6.0,101.0,31.0],[6.0,101.0,31.0],[6.0,100.0,31.0],[6.0,99.0,32.0],[6.0,98.0,32.0],[6.0,97.0,32.0],[6.0,96.0,32.0],[6.0,95.0,32.0],[6.0,94.0,32.0],[6.0,93.0,33.0],[5.0,93.0,33.0],[5.0,92.0,33.0],[5.0,91.0,33.0],[5.0,90.0,33.0],[5.0,89.0,33.0],[5.0,88.0,34.0],[5.0,87.0,34.0],[5.0,86.0,34.0],[5.0,85.0,34.0],[5.0,84.0,34.0],[5.0,84.0,34.0],[5.0,83.0,35.0],[5.0,82.0,35.0],[5.0,80.0,35.0]],"MPL_BuGn":[[0.966413,0.987374,0.991665],[0.961984,0.985652,0.990681],[0.957555,0.983929,0.989696],[0.953126,0.982207,0.988712],[0.948697,0.980484,0.987728],[0.944268,0.978762,0.986744],[0.939839,0.97704,0.985759],[0.935409,0.975317,0.984775],[0.93098,0.973595,0.983791],[0.928766,0.972734,0.983299],[0.922122,0.97015,0.981822],[0.919908,0.969289,0.98133],[0.913264,0.966705,0.979854],[0.91105,0.965844,0.979362],[0.904406,0.96326,0.977885],[0.902191,0.962399,0.977393],[0.894579,0.959539,0.973841],[0.888428,0.957324,0.969166],[0.885352,0.956217,0.966828],[0.876125,0.952895,0.959815],[0.869973,0.950681,0.95514],[0.863822,0.948466,0.950465],[0.860746,0.947359,0.948128],[0.851519,0.944037,0.941115],[0.845367,0.941822,0.93644],[0.839216,0.939608,0.931765],[0.83614,0.938501,0.929427],[0.826913,0.935179,0.922414],[0.820761,0.932964,0.917739],[0.81461,0.93075,0.913064],[0.811534,0.929642,0.910727],[0.802307,0.926321,0.903714],[0.792157,0.922414,0.897501],[0.779608,0.917493,0.890365],[0.767059,0.912572,0.88323],[0.75451,0.907651,0.876094],[0.741961,0.90273,0.868958],[0.735686,0.900269,0.86539],[0.716863,0.892887,0.854687],[0.704314,0.887966,0.847551],[0.691765,0.883045,0.840415],[0.679216,0.878124,0.83328],[0.666667,0.873203,0.826144],[0.654118,0.868281,0.819008],[0.641569,0.86336,0.811872],[0.635294,0.8609,0.808305],[0.616471,0.853518,0.797601],[0.603922,0.848597,0.790465],[0.591373,0.843337,0.781976],[0.578824,0.837924,0.772872],[0.566275,0.832511,0.763768],[0.553726,0.827097,0.754664],[0.541176,0.821684,0.745559],[0.534902,0.818977,0.741007],[0.516078,0.810857,0.727351],[0.503529,0.805444,0.718247],[0.49098,0.800031,0.709143],[0.478431,0.794617,0.700038],[0.465882,0.789204,0.690934],[0.453333,0.783791,0.68183],[0.440784,0.778378,0.672726],[0.43451,0.775671,0.668174],[0.415686,0.767551,0.654518],[0.403137,0.762138,0.645413],[0.393172,0.757093,0.634648],[0.384068,0.752172,0.62333],[0.374963,0.747251,0.612011],[0.365859,0.74233,0.600692],[0.356755,0.737409,0.589373],[0.347651,0.732488,0.578055],[0.338547,0.727566,0.566736],[0.329443,0.722645,0.555417],[0.320338,0.717724,0.544098],[0.311234,0.712803,0.53278],[0.30213,0.707882,0.521461],[0.297578,0.705421,0.515802],[0.283922,0.698039,0.498824],[0.274817,0.693118,0.487505],[0.265713,0.688197,0.476186],[0.256609,0.683276,0.464867],[0.248904,0.675356,0.452949],[0.241523,0.666744,0.440892],[0.234141,0.658132,0.428835],[0.226759,0.649519,0.416778],[0.219377,0.640907,0.404721],[0.211995,0.632295,0.392664],[0.204614,0.623683,0.380607],[0.197232,0.615071,0.368551],[0.18985,0.606459,0.356494],[0.182468,0.597847,0.344437],[0.175087,0.589235,0.33238],[0.171396,0.584929,0.326351],[0.160323,0.572011,0.308266],[0.152941,0.563399,0.296209],[0.145559,0.554787,0.284152],[0.138178,0.546175,0.272095],[0.129719,0.538639,0.265206],[0.121107,0.531257,0.259054],[0.112495,0.523875,0.252903],[0.103883,0.516494,0.246751],[0.095271,0.509112,0.2406],[0.086659,0.50173,0.234448],[0.078047,0.494348,0.228297],[0.069435,0.486967,0.222145],[0.060823,0.479585,0.215994],[0.052211,0.472203,0.209842],[0.043599,0.464821,0.203691],[0.039293,0.46113,0.200615],[0.026374,0.450058,0.191388],[0.017762,0.442676,0.185236],[0.00915,0.435294,0.179085],[0.000538,0.427912,0.172933],[0.0,0.417993,0.168627],[0.0,0.407905,0.164444],[0.0,0.397816,0.160261],[0.0,0.387728,0.156078],[0.0,0.377639,0.151895],[0.0,0.367551,0.147712],[0.0,0.357463,0.143529],[0.0,0.347374,0.139346],[0.0,0.337286,0.135163],[0.0,0.327197,0.13098],[0.0,0.317109,0.126797],[0.0,0.312065,0.124706],[0.0,0.296932,0.118431],[0.0,0.286844,0.114248],[0.0,0.276755,0.110065],[0.0,0.266667,0.105882]],"nrl_sirkes_nowhite":[[0.0,97.0,128.0],[0.0,128.0,161.0],[0.0,161.0,191.0],[0.0,191.0,224.0],[0.0,224.0,255.0],[0.0,255.0,255.0],[51.0,252.0,252.0],[102.0,252.0,252.0],[153.0,252.0,252.0],[252.0,252.0,0.0],[252.0,224.0,0.0],[252.0,191.0,0.0],[252.0,161.0,0.0],[252.0,128.0,0.0],[252.0,97.0,0.0],[252.0,64.0,0.0],[252.0,33.0,0.0],[191.0,0.0,0.0],[128.0,0.0,0.0]],"MPL_RdPu":[[0.999754,0.965798,0.950235],[0.999262,0.960138,0.944821],[0.99877,0.954479,0.939408],[0.998278,0.94882,0.933995],[0.997785,0.94316,0.928581],[0.997293,0.937501,0.923168],[0.996801,0.931842,0.917755],[0.996309,0.926182,0.912341],[0.995817,0.920523,0.906928],[0.995571,0.917693,0.904221],[0.994833,0.909204,0.896102],[0.994587,0.906374,0.893395],[0.993849,0.897885,0.885275],[0.993602,0.895056,0.882568],[0.992864,0.886567,0.874448],[0.992618,0.883737,0.871742],[0.992018,0.874694,0.862653],[0.991772,0.868051,0.855517],[0.991649,0.864729,0.851949],[0.99128,0.854764,0.841246],[0.991034,0.84812,0.83411],[0.990788,0.841476,0.826974],[0.990665,0.838155,0.823406],[0.990296,0.828189,0.812703],[0.99005,0.821546,0.805567],[0.989804,0.814902,0.798431],[0.989681,0.81158,0.794864],[0.989312,0.801615,0.78416],[0.989066,0.794971,0.777024],[0.98882,0.788328,0.769889],[0.988697,0.785006,0.766321],[0.988328,0.77504,0.755617],[0.987928,0.766705,0.75125],[0.987436,0.757355,0.748543],[0.986943,0.748005,0.745836],[0.986451,0.738654,0.74313],[0.985959,0.729304,0.740423],[0.985713,0.724629,0.73907],[0.984975,0.710604,0.73501],[0.984483,0.701253,0.732303],[0.983991,0.691903,0.729596],[0.983499,0.682553,0.72689],[0.983007,0.673203,0.724183],[0.982514,0.663852,0.721476],[0.982022,0.654502,0.71877],[0.981776,0.649827,0.717416],[0.981038,0.635802,0.713356],[0.980546,0.626451,0.71065],[0.979885,0.614225,0.706421],[0.979146,0.600692,0.701499],[0.978408,0.587159,0.696578],[0.97767,0.573626,0.691657],[0.976932,0.560092,0.686736],[0.976563,0.553326,0.684275],[0.975456,0.533026,0.676894],[0.974717,0.519493,0.671972],[0.973979,0.505959,0.667051],[0.973241,0.492426,0.66213],[0.972503,0.478893,0.657209],[0.971765,0.465359,0.652288],[0.971027,0.451826,0.647366],[0.970657,0.44506,0.644906],[0.96955,0.42476,0.637524],[0.968812,0.411226,0.632603],[0.963829,0.398247,0.629527],[0.957432,0.385452,0.627067],[0.951034,0.372657,0.624606],[0.944637,0.359862,0.622145],[0.938239,0.347067,0.619685],[0.931842,0.334271,0.617224],[0.925444,0.321476,0.614764],[0.919047,0.308681,0.612303],[0.912649,0.295886,0.609842],[0.906251,0.283091,0.607382],[0.899854,0.270296,0.604921],[0.896655,0.263899,0.603691],[0.887059,0.244706,0.6],[0.880661,0.231911,0.597539],[0.874264,0.219116,0.595079],[0.867866,0.206321,0.592618],[0.85727,0.193725,0.587159],[0.845706,0.181176,0.581007],[0.834141,0.168627,0.574856],[0.822576,0.156078,0.568704],[0.811011,0.143529,0.562553],[0.799446,0.13098,0.556401],[0.787882,0.118431,0.55025],[0.776317,0.105882,0.544098],[0.764752,0.093333,0.537947],[0.753187,0.080784,0.531795],[0.741622,0.068235,0.525644],[0.73584,0.061961,0.522568],[0.718493,0.043137,0.513341],[0.706928,0.030588,0.50719],[0.695363,0.018039,0.501038],[0.683799,0.00549,0.494887],[0.671157,0.003922,0.492611],[0.658362,0.003922,0.490888],[0.645567,0.003922,0.489166],[0.632772,0.003922,0.487443],[0.619977,0.003922,0.485721],[0.607182,0.003922,0.483998],[0.594387,0.003922,0.482276],[0.581592,0.003922,0.480554],[0.568797,0.003922,0.478831],[0.556002,0.003922,0.477109],[0.543206,0.003922,0.475386],[0.536809,0.003922,0.474525],[0.517616,0.003922,0.471942],[0.504821,0.003922,0.470219],[0.492026,0.003922,0.468497],[0.479231,0.003922,0.466774],[0.467128,0.003691,0.463668],[0.455071,0.003445,0.460469],[0.443014,0.003199,0.45727],[0.430957,0.002953,0.454072],[0.4189,0.002707,0.450873],[0.406844,0.002461,0.447674],[0.394787,0.002215,0.444475],[0.38273,0.001968,0.441276],[0.370673,0.001722,0.438078],[0.358616,0.001476,0.434879],[0.346559,0.00123,0.43168],[0.340531,0.001107,0.430081],[0.322445,0.000738,0.425283],[0.310388,0.000492,0.422084],[0.298331,0.000246,0.418885],[0.286275,0.0,0.415686]],"topo_15lev":[[40.0,54.0,154.0],[0.0,201.0,50.0],[30.0,211.0,104.0],[94.0,224.0,116.0],[162.0,235.0,130.0],[223.0,248.0,146.0],[246.0,229.0,149.0],[200.0,178.0,118.0],[162.0,126.0,94.0],[143.0,97.0,84.0],[162.0,125.0,116.0],[178.0,150.0,139.0],[199.0,176.0,170.0],[219.0,205.0,202.0],[236.0,228.0,226.0],[255.0,255.0,255.0]],"rainbow+white+gray":[[0.0,0.0,0.0],[4.0,0.0,3.0],[9.0,0.0,7.0],[13.0,0.0,10.0],[18.0,0.0,14.0],[22.0,0.0,19.0],[27.0,0.0,23.0],[31.0,0.0,28.0],[36.0,0.0,32.0],[40.0,0.0,38.0],[45.0,0.0,43.0],[50.0,0.0,48.0],[58.0,0.0,59.0],[64.0,0.0,68.0],[68.0,0.0,72.0],[69.0,0.0,77.0],[72.0,0.0,81.0],[74.0,0.0,86.0],[77.0,0.0,91.0],[79.0,0.0,95.0],[80.0,0.0,100.0],[82.0,0.0,104.0],[83.0,0.0,109.0],[84.0,0.0,118.0],[86.0,0.0,122.0],[88.0,0.0,132.0],[86.0,0.0,136.0],[87.0,0.0,141.0],[87.0,0.0,145.0],[87.0,0.0,150.0],[85.0,0.0,154.0],[84.0,0.0,159.0],[84.0,0.0,163.0],[84.0,0.0,168.0],[79.0,0.0,177.0],[78.0,0.0,182.0],[77.0,0.0,186.0],[76.0,0.0,191.0],[70.0,0.0,200.0],[68.0,0.0,204.0],[66.0,0.0,209.0],[60.0,0.0,214.0],[58.0,0.0,218.0],[55.0,0.0,223.0],[46.0,0.0,232.0],[43.0,0.0,236.0],[40.0,0.0,241.0],[36.0,0.0,245.0],[33.0,0.0,250.0],[25.0,0.0,255.0],[16.0,0.0,255.0],[12.0,0.0,255.0],[4.0,0.0,255.0],[0.0,0.0,255.0],[0.0,4.0,255.0],[0.0,16.0,255.0],[0.0,21.0,255.0],[0.0,25.0,255.0],[0.0,29.0,255.0],[0.0,38.0,255.0],[0.0,42.0,255.0],[0.0,46.0,255.0],[0.0,51.0,255.0],[0.0,63.0,255.0],[0.0,67.0,255.0],[0.0,72.0,255.0],[0.0,84.0,255.0],[0.0,89.0,255.0],[0.0,93.0,255.0],[0.0,97.0,255.0],[0.0,106.0,255.0],[0.0,110.0,255.0],[0.0,114.0,255.0],[0.0,119.0,255.0],[0.0,127.0,255.0],[0.0,135.0,255.0],[0.0,140.0,255.0],[0.0,152.0,255.0],[0.0,157.0,255.0],[0.0,161.0,255.0],[0.0,165.0,255.0],[0.0,174.0,255.0],[0.0,178.0,255.0],[0.0,182.0,255.0],[0.0,187.0,255.0],[0.0,195.0,255.0],[0.0,199.0,255.0],[0.0,216.0,255.0],[0.0,220.0,255.0],[0.0,225.0,255.0],[0.0,229.0,255.0],[0.0,233.0,255.0],[0.0,242.0,255.0],[0.0,246.0,255.0],[0.0,250.0,255.0],[0.0,255.0,255.0],[0.0,255.0,246.0],[0.0,255.0,242.0],[0.0,255.0,238.0],[0.0,255.0,225.0],[0.0,255.0,216.0],[0.0,255.0,212.0],[0.0,255.0,203.0],[0.0,255.0,199.0],[0.0,255.0,195.0],[0.0,255.0,191.0],[0.0,255.0,187.0],[0.0,255.0,178.0],[0.0,255.0,174.0],[0.0,255.0,170.0],[0.0,255.0,157.0],[0.0,255.0,152.0],[0.0,255.0,144.0],[0.0,255.0,135.0],[0.0,255.0,131.0],[0.0,255.0,127.0],[0.0,255.0,123.0],[0.0,255.0,114.0],[0.0,255.0,110.0],[0.0,255.0,106.0],[0.0,255.0,102.0],[0.0,255.0,89.0],[0.0,255.0,84.0],[0.0,255.0,80.0],[0.0,255.0,76.0],[0.0,255.0,63.0],[0.0,255.0,59.0],[0.0,255.0,55.0],[0.0,255.0,46.0],[0.0,255.0,42.0],[0.0,255.0,38.0],[0.0,255.0,25.0],[0.0,255.0,21.0],[0.0,255.0,16.0],[0.0,255.0,12.0],[0.0,255.0,8.0],[0.0,255.0,0.0],[8.0,255.0,0.0],[12.0,255.0,0.0],[21.0,255.0,0.0],[25.0,255.0,0.0],[29.0,255.0,0.0],[42.0,255.0,0.0],[46.0,255.0,0.0],[51.0,255.0,0.0],[55.0,255.0,0.0],[63.0,255.0,0.0],[67.0,255.0,0.0],[72.0,255.0,0.0],[76.0,255.0,0.0],[89.0,255.0,0.0],[93.0,255.0,0.0],[97.0,255.0,0.0],[110.0,255.0,0.0],[114.0,255.0,0.0],[119.0,255.0,0.0],[123.0,255.0,0.0],[131.0,255.0,0.0],[135.0,255.0,0.0],[140.0,255.0,0.0],[144.0,255.0,0.0],[153.0,255.0,0.0],[161.0,255.0,0.0],[165.0,255.0,0.0],[178.0,255.0,0.0],[182.0,255.0,0.0],[187.0,255.0,0.0],[191.0,255.0,0.0],[199.0,255.0,0.0],[203.0,255.0,0.0],[208.0,255.0,0.0],[212.0,255.0,0.0],[221.0,255.0,0.0],[225.0,255.0,0.0],[242.0,255.0,0.0],[246.0,255.0,0.0],[250.0,255.0,0.0],[255.0,255.0,0.0],[255.0,250.0,0.0],[255.0,242.0,0.0],[255.0,238.0,0.0],[255.0,233.0,0.0],[255.0,229.0,0.0],[255.0,221.0,0.0],[255.0,216.0,0.0],[255.0,212.0,0.0],[255.0,199.0,0.0],[255.0,191.0,0.0],[255.0,187.0,0.0],[255.0,178.0,0.0],[255.0,174.0,0.0],[255.0,170.0,0.0],[255.0,165.0,0.0],[255.0,161.0,0.0],[255.0,153.0,0.0],[255.0,148.0,0.0],[255.0,144.0,0.0],[255.0,131.0,0.0],[255.0,127.0,0.0],[255.0,119.0,0.0],[255.0,110.0,0.0],[255.0,106.0,0.0],[255.0,102.0,0.0],[255.0,97.0,0.0],[255.0,89.0,0.0],[255.0,85.0,0.0],[255.0,80.0,0.0],[255.0,76.0,0.0],[255.0,63.0,0.0],[255.0,59.0,0.0],[255.0,55.0,0.0],[255.0,51.0,0.0],[255.0,38.0,0.0],[255.0,34.0,0.0],[255.0,29.0,0.0],[255.0,21.0,0.0],[255.0,17.0,0.0],[255.0,12.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,255.0,255.0],[211.0,211.0,211.0]],"MPL_autumn":[[1.0,0.003922,0.0],[1.0,0.011765,0.0],[1.0,0.019608,0.0],[1.0,0.027451,0.0],[1.0,0.035294,0.0],[1.0,0.043137,0.0],[1.0,0.05098,0.0],[1.0,0.058824,0.0],[1.0,0.066667,0.0],[1.0,0.070588,0.0],[1.0,0.082353,0.0],[1.0,0.086275,0.0],[1.0,0.098039,0.0],[1.0,0.101961,0.0],[1.0,0.113725,0.0],[1.0,0.117647,0.0],[1.0,0.129412,0.0],[1.0,0.137255,0.0],[1.0,0.141176,0.0],[1.0,0.152941,0.0],[1.0,0.160784,0.0],[1.0,0.168627,0.0],[1.0,0.172549,0.0],[1.0,0.184314,0.0],[1.0,0.192157,0.0],[1.0,0.2,0.0],[1.0,0.203922,0.0],[1.0,0.215686,0.0],[1.0,0.223529,0.0],[1.0,0.231373,0.0],[1.0,0.235294,0.0],[1.0,0.247059,0.0],[1.0,0.254902,0.0],[1.0,0.262745,0.0],[1.0,0.270588,0.0],[1.0,0.278431,0.0],[1.0,0.286275,0.0],[1.0,0.290196,0.0],[1.0,0.301961,0.0],[1.0,0.309804,0.0],[1.0,0.317647,0.0],[1.0,0.32549,0.0],[1.0,0.333333,0.0],[1.0,0.341176,0.0],[1.0,0.34902,0.0],[1.0,0.352941,0.0],[1.0,0.364706,0.0],[1.0,0.372549,0.0],[1.0,0.380392,0.0],[1.0,0.388235,0.0],[1.0,0.396078,0.0],[1.0,0.403922,0.0],[1.0,0.411765,0.0],[1.0,0.415686,0.0],[1.0,0.427451,0.0],[1.0,0.435294,0.0],[1.0,0.443137,0.0],[1.0,0.45098,0.0],[1.0,0.458824,0.0],[1.0,0.466667,0.0],[1.0,0.47451,0.0],[1.0,0.478431,0.0],[1.0,0.490196,0.0],[1.0,0.498039,0.0],[1.0,0.505882,0.0],[1.0,0.513725,0.0],[1.0,0.521569,0.0],[1.0,0.529412,0.0],[1.0,0.537255,0.0],[1.0,0.545098,0.0],[1.0,0.552941,0.0],[1.0,0.560784,0.0],[1.0,0.568627,0.0],[1.0,0.576471,0.0],[1.0,0.584314,0.0],[1.0,0.588235,0.0],[1.0,0.6,0.0],[1.0,0.607843,0.0],[1.0,0.615686,0.0],[1.0,0.623529,0.0],[1.0,0.631373,0.0],[1.0,0.639216,0.0],[1.0,0.647059,0.0],[1.0,0.654902,0.0],[1.0,0.662745,0.0],[1.0,0.670588,0.0],[1.0,0.678431,0.0],[1.0,0.686275,0.0],[1.0,0.694118,0.0],[1.0,0.701961,0.0],[1.0,0.709804,0.0],[1.0,0.713725,0.0],[1.0,0.72549,0.0],[1.0,0.733333,0.0],[1.0,0.741176,0.0],[1.0,0.74902,0.0],[1.0,0.756863,0.0],[1.0,0.764706,0.0],[1.0,0.772549,0.0],[1.0,0.780392,0.0],[1.0,0.788235,0.0],[1.0,0.796078,0.0],[1.0,0.803922,0.0],[1.0,0.811765,0.0],[1.0,0.819608,0.0],[1.0,0.827451,0.0],[1.0,0.835294,0.0],[1.0,0.839216,0.0],[1.0,0.85098,0.0],[1.0,0.858824,0.0],[1.0,0.866667,0.0],[1.0,0.87451,0.0],[1.0,0.882353,0.0],[1.0,0.890196,0.0],[1.0,0.898039,0.0],[1.0,0.905882,0.0],[1.0,0.913725,0.0],[1.0,0.921569,0.0],[1.0,0.929412,0.0],[1.0,0.937255,0.0],[1.0,0.945098,0.0],[1.0,0.952941,0.0],[1.0,0.960784,0.0],[1.0,0.964706,0.0],[1.0,0.976471,0.0],[1.0,0.984314,0.0],[1.0,0.992157,0.0],[1.0,1.0,0.0]],"GMT_panoply":[[0.015686,0.054902,0.847059],[0.12549,0.313725,1.0],[0.254902,0.588235,1.0],[0.427451,0.756863,1.0],[0.52549,0.85098,1.0],[0.611765,0.933333,1.0],[0.686275,0.960784,1.0],[0.807843,1.0,1.0],[1.0,0.996078,0.278431],[1.0,0.921569,0.0],[1.0,0.768627,0.0],[1.0,0.564706,0.0],[1.0,0.282353,0.0],[1.0,0.0,0.0],[0.835294,0.0,0.0],[0.619608,0.0,0.0]],"BlWhRe":[[0.0,0.0,128.0],[0.0,0.0,133.0],[0.0,0.0,138.0],[0.0,0.0,143.0],[0.0,0.0,148.0],[0.0,0.0,153.0],[0.0,0.0,158.0],[0.0,0.0,164.0],[0.0,0.0,169.0],[0.0,0.0,174.0],[0.0,0.0,179.0],[0.0,0.0,184.0],[0.0,0.0,189.0],[0.0,0.0,194.0],[0.0,0.0,199.0],[0.0,0.0,204.0],[0.0,0.0,209.0],[0.0,0.0,214.0],[0.0,0.0,219.0],[0.0,0.0,225.0],[0.0,0.0,230.0],[0.0,0.0,235.0],[0.0,0.0,240.0],[0.0,0.0,245.0],[0.0,0.0,250.0],[0.0,0.0,255.0],[10.0,10.0,255.0],[20.0,20.0,255.0],[31.0,31.0,255.0],[41.0,41.0,255.0],[51.0,51.0,255.0],[61.0,61.0,255.0],[71.0,71.0,255.0],[82.0,82.0,255.0],[92.0,92.0,255.0],[102.0,102.0,255.0],[112.0,112.0,255.0],[122.0,122.0,255.0],[133.0,133.0,255.0],[143.0,143.0,255.0],[153.0,153.0,255.0],[163.0,163.0,255.0],[173.0,173.0,255.0],[184.0,184.0,255.0],[194.0,194.0,255.0],[204.0,204.0,255.0],[214.0,214.0,255.0],[224.0,224.0,255.0],[235.0,235.0,255.0],[245.0,245.0,255.0],[255.0,255.0,255.0],[255.0,245.0,245.0],[255.0,235.0,235.0],[255.0,224.0,224.0],[255.0,214.0,214.0],[255.0,204.0,204.0],[255.0,194.0,194.0],[255.0,184.0,184.0],[255.0,173.0,173.0],[255.0,163.0,163.0],[255.0,153.0,153.0],[255.0,143.0,143.0],[255.0,133.0,133.0],[255.0,122.0,122.0],[255.0,112.0,112.0],[255.0,102.0,102.0],[255.0,92.0,92.0],[255.0,82.0,82.0],[255.0,71.0,71.0],[255.0,61.0,61.0],[255.0,51.0,51.0],[255.0,41.0,41.0],[255.0,31.0,31.0],[255.0,20.0,20.0],[255.0,10.0,10.0],[255.0,0.0,0.0],[250.0,0.0,0.0],[245.0,0.0,0.0],[240.0,0.0,0.0],[235.0,0.0,0.0],[230.0,0.0,0.0],[225.0,0.0,0.0],[219.0,0.0,0.0],[214.0,0.0,0.0],[209.0,0.0,0.0],[204.0,0.0,0.0],[199.0,0.0,0.0],[194.0,0.0,0.0],[189.0,0.0,0.0],[184.0,0.0,0.0],[179.0,0.0,0.0],[174.0,0.0,0.0],[169.0,0.0,0.0],[164.0,0.0,0.0],[158.0,0.0,0.0],[153.0,0.0,0.0],[148.0,0.0,0.0],[143.0,0.0,0.0],[138.0,0.0,0.0],[133.0,0.0,0.0],[128.0,0.0,0.0]],"hotres":[[1.0,5.0,70.0],[8.0,25.0,100.0],[15.0,53.0,130.0],[23.0,68.0,160.0],[31.0,83.0,190.0],[39.0,98.0,220.0],[47.0,112.0,250.0],[55.0,127.0,253.0],[62.0,140.0,250.0],[69.0,153.0,244.0],[75.0,164.0,235.0],[82.0,174.0,224.0],[88.0,184.0,212.0],[95.0,193.0,199.0],[101.0,201.0,186.0],[107.0,208.0,173.0],[112.0,215.0,160.0],[118.0,221.0,147.0],[123.0,226.0,135.0],[128.0,231.0,123.0],[134.0,235.0,112.0],[139.0,239.0,102.0],[143.0,242.0,93.0],[148.0,245.0,84.0],[153.0,247.0,76.0],[157.0,249.0,69.0],[161.0,250.0,62.0],[165.0,251.0,56.0],[169.0,252.0,50.0],[173.0,253.0,45.0],[177.0,253.0,40.0],[181.0,253.0,36.0],[184.0,252.0,32.0],[188.0,252.0,29.0],[191.0,251.0,25.0],[194.0,250.0,23.0],[197.0,248.0,20.0],[200.0,247.0,18.0],[203.0,245.0,16.0],[206.0,243.0,14.0],[208.0,241.0,12.0],[211.0,239.0,11.0],[213.0,237.0,10.0],[216.0,235.0,9.0],[218.0,232.0,8.0],[220.0,230.0,7.0],[222.0,227.0,6.0],[224.0,225.0,5.0],[226.0,222.0,4.0],[228.0,219.0,4.0],[230.0,216.0,3.0],[232.0,213.0,3.0],[233.0,210.0,3.0],[235.0,207.0,2.0],[236.0,204.0,2.0],[238.0,201.0,2.0],[239.0,198.0,1.0],[240.0,195.0,1.0],[241.0,192.0,1.0],[242.0,189.0,1.0],[243.0,186.0,1.0],[244.0,183.0,0.0],[245.0,180.0,0.0],[246.0,177.0,0.0],[247.0,173.0,0.0],[248.0,170.0,0.0],[248.0,167.0,0.0],[249.0,164.0,0.0],[250.0,161.0,0.0],[250.0,158.0,0.0],[251.0,155.0,0.0],[251.0,152.0,0.0],[251.0,149.0,0.0],[252.0,147.0,0.0],[252.0,144.0,0.0],[252.0,141.0,0.0],[252.0,138.0,0.0],[253.0,135.0,0.0],[253.0,132.0,0.0],[253.0,130.0,0.0],[253.0,127.0,0.0],[253.0,124.0,0.0],[253.0,122.0,0.0],[253.0,119.0,0.0],[252.0,117.0,0.0],[252.0,114.0,0.0],[252.0,112.0,0.0],[252.0,109.0,0.0],[252.0,107.0,0.0],[251.0,105.0,0.0],[251.0,102.0,0.0],[251.0,100.0,0.0],[250.0,98.0,0.0],[250.0,96.0,0.0],[249.0,93.0,0.0],[249.0,91.0,0.0],[248.0,89.0,0.0],[248.0,87.0,0.0],[247.0,85.0,0.0],[247.0,83.0,0.0],[246.0,81.0,0.0],[245.0,79.0,0.0],[245.0,78.0,0.0],[244.0,76.0,0.0],[243.0,74.0,0.0],[243.0,72.0,0.0],[242.0,71.0,0.0],[241.0,69.0,0.0],[240.0,67.0,0.0],[240.0,66.0,0.0],[239.0,64.0,0.0],[238.0,62.0,0.0],[237.0,61.0,0.0],[236.0,59.0,0.0],[235.0,58.0,0.0],[235.0,57.0,0.0],[234.0,55.0,0.0],[233.0,54.0,0.0],[232.0,53.0,0.0],[231.0,51.0,0.0],[230.0,50.0,0.0],[229.0,49.0,0.0],[228.0,47.0,0.0],[227.0,46.0,0.0],[226.0,45.0,0.0],[225.0,44.0,0.0],[224.0,43.0,0.0],[223.0,42.0,0.0],[222.0,41.0,0.0],[221.0,40.0,0.0],[220.0,39.0,0.0],[219.0,38.0,0.0],[218.0,37.0,0.0],[217.0,36.0,0.0],[216.0,35.0,0.0],[214.0,34.0,0.0],[213.0,33.0,0.0],[212.0,32.0,0.0],[211.0,31.0,0.0],[210.0,31.0,0.0],[209.0,30.0,0.0],[208.0,29.0,0.0],[207.0,28.0,0.0],[205.0,27.0,0.0],[204.0,27.0,0.0],[203.0,26.0,0.0],[202.0,25.0,0.0],[201.0,25.0,0.0],[200.0,24.0,0.0],[199.0,23.0,0.0],[197.0,23.0,0.0],[196.0,22.0,0.0],[195.0,21.0,0.0],[194.0,21.0,0.0],[193.0,20.0,0.0],[192.0,20.0,0.0],[191.0,19.0,0.0],[189.0,19.0,0.0],[188.0,18.0,0.0],[187.0,18.0,0.0],[186.0,17.0,0.0],[185.0,17.0,0.0],[184.0,16.0,0.0],[182.0,16.0,0.0],[181.0,15.0,0.0],[180.0,15.0,0.0],[179.0,15.0,0.0],[178.0,14.0,0.0],[177.0,14.0,0.0],[175.0,13.0,0.0],[174.0,13.0,0.0],[173.0,13.0,0.0],[172.0,12.0,0.0],[171.0,12.0,0.0],[170.0,12.0,0.0],[168.0,11.0,0.0],[167.0,11.0,0.0],[166.0,11.0,0.0],[165.0,10.0,0.0],[164.0,10.0,0.0],[163.0,10.0,0.0],[162.0,9.0,0.0],[161.0,9.0,0.0],[159.0,9.0,0.0],[158.0,9.0,0.0],[157.0,8.0,0.0],[156.0,8.0,0.0],[155.0,8.0,0.0],[154.0,8.0,0.0],[153.0,7.0,0.0],[152.0,7.0,0.0],[150.0,7.0,0.0],[149.0,7.0,0.0],[148.0,7.0,0.0],[147.0,6.0,0.0],[146.0,6.0,0.0],[145.0,6.0,0.0],[144.0,6.0,0.0],[143.0,6.0,0.0],[142.0,6.0,0.0],[141.0,5.0,0.0],[140.0,5.0,0.0],[139.0,5.0,0.0],[138.0,5.0,0.0],[137.0,5.0,0.0],[136.0,5.0,0.0],[135.0,4.0,0.0],[133.0,4.0,0.0],[132.0,4.0,0.0],[131.0,4.0,0.0],[130.0,4.0,0.0],[129.0,4.0,0.0],[128.0,4.0,0.0],[127.0,4.0,0.0],[126.0,3.0,0.0],[125.0,3.0,0.0],[124.0,3.0,0.0],[123.0,3.0,0.0],[122.0,3.0,0.0],[122.0,3.0,0.0],[121.0,3.0,0.0],[120.0,3.0,0.0],[119.0,3.0,0.0],[118.0,3.0,0.0],[117.0,2.0,0.0],[116.0,2.0,0.0],[115.0,2.0,0.0],[114.0,2.0,0.0],[113.0,2.0,0.0],[112.0,2.0,0.0],[111.0,2.0,0.0],[110.0,2.0,0.0],[109.0,2.0,0.0],[108.0,2.0,0.0],[108.0,2.0,0.0],[107.0,2.0,0.0],[106.0,2.0,0.0],[105.0,2.0,0.0],[104.0,1.0,0.0],[103.0,1.0,0.0],[102.0,1.0,0.0],[101.0,1.0,0.0],[101.0,1.0,0.0],[100.0,1.0,0.0],[99.0,1.0,0.0],[98.0,1.0,0.0],[97.0,1.0,0.0],[96.0,1.0,0.0],[96.0,1.0,0.0],[95.0,1.0,0.0],[94.0,1.0,0.0],[93.0,1.0,0.0],[92.0,1.0,0.0],[92.0,1.0,0.0]],"MPL_fla":[[1.0,0.378411,0.209789],[1.0,0.918487,0.777382],[0.802941,0.932472,1.0],[0.235542,0.412356,1.0],[0.0,0.0,0.815567],[0.0,0.0,0.248556],[0.171914,0.0,0.0],[0.738344,0.0,0.0],[1.0,0.309017,0.159507],[1.0,0.645928,0.437702],[0.852783,0.956604,1.0],[0.576099,0.775204,1.0],[0.0,0.0,0.864953],[0.0,0.0,0.589873],[0.123001,0.0,0.0],[0.396383,0.0,0.0],[1.0,0.237935,0.111085],[1.0,0.850217,0.671713],[1.0,0.986201,0.935214],[0.341807,0.542053,1.0],[0.0,0.0,0.912346],[0.0,0.0,0.355382],[0.0,0.0,0.087654],[0.630994,0.0,0.0],[1.0,0.165554,0.064786],[1.0,0.809017,0.617326],[1.0,0.971281,0.888915],[0.396383,0.602635,1.0],[0.0,0.0,0.957487],[0.0,0.0,0.410127],[0.0,0.0,0.135047],[0.576099,0.0,0.0],[1.0,0.092268,0.020865],[1.0,0.763398,0.562298],[0.989716,0.997269,1.0],[0.451524,0.659925,1.0],[0.0,0.0,1.0],[0.0,0.0,0.751444],[0.0,0.0,0.0],[0.520787,0.0,0.0],[1.0,0.018479,0.0],[1.0,0.71361,0.50693],[1.0,1.0,1.0],[0.50693,0.71361,1.0],[0.0,0.018479,1.0],[0.0,0.0,0.802941],[0.0,0.0,0.0],[0.465362,0.0,0.0],[1.0,0.0,0.0],[1.0,0.659925,0.451524],[1.0,0.997269,0.989716],[0.562298,0.763398,1.0],[0.020865,0.092268,1.0],[0.0,0.0,0.852783],[0.0,0.0,0.031609],[0.410127,0.0,0.0],[0.957487,0.0,0.0],[1.0,0.602635,0.396383],[1.0,0.989092,0.946427],[0.617326,0.809017,1.0],[0.064786,0.165554,1.0],[0.0,0.0,0.900699],[0.0,0.0,0.076148],[0.355382,0.0,0.0],[0.912346,0.0,0.0],[1.0,0.542053,0.341807],[1.0,0.975512,0.900699],[0.671713,0.850217,1.0],[0.111085,0.237935,1.0],[0.0,0.0,0.685175],[0.0,0.0,0.123001],[0.301427,0.0,0.0],[0.864953,0.0,0.0],[1.0,0.478512,0.288096],[1.0,0.956604,0.852783],[0.979135,0.995734,1.0],[0.159507,0.309017,1.0],[0.0,0.0,0.738344],[0.0,0.0,0.171914],[0.248556,0.0,0.0],[0.815567,0.0,0.0],[1.0,0.412356,0.235542],[1.0,0.932472,0.802941],[0.777382,0.918487,1.0],[0.209789,0.378411,1.0],[0.0,0.0,0.790211],[0.0,0.0,0.222618],[0.197059,0.0,0.0],[0.764458,0.0,0.0],[1.0,0.343949,0.184433],[1.0,0.903247,0.751444],[1.0,0.998464,1.0],[0.261656,0.445738,1.0],[0.0,0.0,0.840493],[0.0,0.0,0.274838],[0.147217,0.0,0.0],[0.711904,0.0,0.0],[1.0,0.273663,0.135047],[1.0,0.869089,0.698573],[0.876999,0.966718,1.0],[0.314825,0.510631,1.0],[0.0,0.0,0.888915],[0.0,0.0,0.328287],[0.099301,0.0,0.0],[0.658193,0.0,0.0],[1.0,0.201882,0.087654],[1.0,0.830184,0.644618],[1.0,0.97941,0.912346],[0.369006,0.572735,1.0],[0.0,0.0,0.935214],[0.0,0.0,0.382674],[0.053573,0.0,0.0],[0.603617,0.0,0.0],[1.0,0.128999,0.042513],[1.0,0.786745,0.589873],[0.968391,0.993859,1.0],[0.423901,0.631711,1.0],[0.0,0.0,0.979135],[0.0,0.0,0.437702],[0.010284,0.0,0.0],[0.548476,0.0,0.0],[1.0,0.055411,0.0],[1.0,0.739009,0.534638],[1.0,0.938988,0.815567],[0.479213,0.687237,1.0],[0.0,0.0,1.0],[0.0,0.0,0.49307],[0.0,0.0,0.0]],"cmp_b2":[[49.0,54.0,149.0],[52.0,63.0,153.0],[55.0,72.0,158.0],[57.0,81.0,162.0],[60.0,89.0,166.0],[63.0,98.0,171.0],[66.0,107.0,175.0],[69.0,116.0,180.0],[75.0,124.0,184.0],[81.0,132.0,188.0],[88.0,140.0,192.0],[95.0,148.0,196.0],[101.0,156.0,200.0],[108.0,163.0,204.0],[115.0,171.0,208.0],[122.0,178.0,212.0],[130.0,184.0,215.0],[137.0,190.0,218.0],[145.0,196.0,222.0],[153.0,203.0,225.0],[161.0,209.0,228.0],[168.0,215.0,232.0],[176.0,219.0,234.0],[183.0,223.0,237.0],[191.0,227.0,239.0],[198.0,230.0,241.0],[206.0,234.0,243.0],[213.0,238.0,245.0],[221.0,241.0,247.0],[226.0,242.0,240.0],[231.0,239.0,225.0],[235.0,236.0,211.0],[239.0,234.0,196.0],[243.0,231.0,181.0],[247.0,228.0,167.0],[252.0,225.0,152.0],[254.0,221.0,141.0],[254.0,214.0,134.0],[254.0,207.0,128.0],[254.0,200.0,121.0],[253.0,193.0,115.0],[253.0,186.0,108.0],[253.0,179.0,101.0],[253.0,171.0,96.0],[251.0,162.0,91.0],[250.0,153.0,87.0],[249.0,144.0,83.0],[248.0,134.0,79.0],[246.0,125.0,74.0],[245.0,116.0,70.0],[243.0,107.0,66.0],[239.0,99.0,62.0],[235.0,90.0,58.0],[231.0,81.0,54.0],[227.0,73.0,50.0],[223.0,64.0,46.0],[219.0,56.0,43.0],[214.0,47.0,39.0],[207.0,40.0,39.0],[200.0,34.0,39.0],[193.0,27.0,39.0],[186.0,20.0,38.0],[179.0,13.0,38.0],[172.0,7.0,38.0]],"MPL_summe":[[0.003922,0.501961,0.4],[0.011765,0.505882,0.4],[0.019608,0.509804,0.4],[0.027451,0.513725,0.4],[0.035294,0.517647,0.4],[0.043137,0.521569,0.4],[0.05098,0.52549,0.4],[0.058824,0.529412,0.4],[0.066667,0.533333,0.4],[0.070588,0.535294,0.4],[0.082353,0.541176,0.4],[0.086275,0.543137,0.4],[0.098039,0.54902,0.4],[0.101961,0.55098,0.4],[0.113725,0.556863,0.4],[0.117647,0.558824,0.4],[0.129412,0.564706,0.4],[0.137255,0.568627,0.4],[0.141176,0.570588,0.4],[0.152941,0.576471,0.4],[0.160784,0.580392,0.4],[0.168627,0.584314,0.4],[0.172549,0.586275,0.4],[0.184314,0.592157,0.4],[0.192157,0.596078,0.4],[0.2,0.6,0.4],[0.203922,0.601961,0.4],[0.215686,0.607843,0.4],[0.223529,0.611765,0.4],[0.231373,0.615686,0.4],[0.235294,0.617647,0.4],[0.247059,0.623529,0.4],[0.254902,0.627451,0.4],[0.262745,0.631373,0.4],[0.270588,0.635294,0.4],[0.278431,0.639216,0.4],[0.286275,0.643137,0.4],[0.290196,0.645098,0.4],[0.301961,0.65098,0.4],[0.309804,0.654902,0.4],[0.317647,0.658824,0.4],[0.32549,0.662745,0.4],[0.333333,0.666667,0.4],[0.341176,0.670588,0.4],[0.34902,0.67451,0.4],[0.352941,0.676471,0.4],[0.364706,0.682353,0.4],[0.372549,0.686275,0.4],[0.380392,0.690196,0.4],[0.388235,0.694118,0.4],[0.396078,0.698039,0.4],[0.403922,0.701961,0.4],[0.411765,0.705882,0.4],[0.415686,0.707843,0.4],[0.427451,0.713725,0.4],[0.435294,0.717647,0.4],[0.443137,0.721569,0.4],[0.45098,0.72549,0.4],[0.458824,0.729412,0.4],[0.466667,0.733333,0.4],[0.47451,0.737255,0.4],[0.478431,0.739216,0.4],[0.490196,0.745098,0.4],[0.498039,0.74902,0.4],[0.505882,0.752941,0.4],[0.513725,0.756863,0.4],[0.521569,0.760784,0.4],[0.529412,0.764706,0.4],[0.537255,0.768627,0.4],[0.545098,0.772549,0.4],[0.552941,0.776471,0.4],[0.560784,0.780392,0.4],[0.568627,0.784314,0.4],[0.576471,0.788235,0.4],[0.584314,0.792157,0.4],[0.588235,0.794118,0.4],[0.6,0.8,0.4],[0.607843,0.803922,0.4],[0.615686,0.807843,0.4],[0.623529,0.811765,0.4],[0.631373,0.815686,0.4],[0.639216,0.819608,0.4],[0.647059,0.823529,0.4],[0.654902,0.827451,0.4],[0.662745,0.831373,0.4],[0.670588,0.835294,0.4],[0.678431,0.839216,0.4],[0.686275,0.843137,0.4],[0.694118,0.847059,0.4],[0.701961,0.85098,0.4],[0.709804,0.854902,0.4],[0.713725,0.856863,0.4],[0.72549,0.862745,0.4],[0.733333,0.866667,0.4],[0.741176,0.870588,0.4],[0.74902,0.87451,0.4],[0.756863,0.878431,0.4],[0.764706,0.882353,0.4],[0.772549,0.886275,0.4],[0.780392,0.890196,0.4],[0.788235,0.894118,0.4],[0.796078,0.898039,0.4],[0.803922,0.901961,0.4],[0.811765,0.905882,0.4],[0.819608,0.909804,0.4],[0.827451,0.913725,0.4],[0.835294,0.917647,0.4],[0.839216,0.919608,0.4],[0.85098,0.92549,0.4],[0.858824,0.929412,0.4],[0.866667,0.933333,0.4],[0.87451,0.937255,0.4],[0.882353,0.941176,0.4],[0.890196,0.945098,0.4],[0.898039,0.94902,0.4],[0.905882,0.952941,0.4],[0.913725,0.956863,0.4],[0.921569,0.960784,0.4],[0.929412,0.964706,0.4],[0.937255,0.968627,0.4],[0.945098,0.972549,0.4],[0.952941,0.976471,0.4],[0.960784,0.980392,0.4],[0.964706,0.982353,0.4],[0.976471,0.988235,0.4],[0.984314,0.992157,0.4],[0.992157,0.996078,0.4],[1.0,1.0,0.4]],"gscyclic":[[0.5,0.5,0.5],[0.125,0.125,0.125],[0.75,0.75,0.75],[0.25,0.25,0.25],[0.625,0.625,0.625],[0.375,0.375,0.375]],"radar_1":[[178.0,248.0,255.0],[178.0,184.0,255.0],[125.0,37.0,205.0],[84.0,26.0,139.0],[237.0,230.0,133.0],[205.0,198.0,115.0],[150.0,150.0,150.0],[255.0,255.0,255.0],[170.0,255.0,255.0],[85.0,160.0,255.0],[29.0,0.0,255.0],[126.0,229.0,91.0],[78.0,204.0,67.0],[46.0,178.0,57.0],[30.0,153.0,61.0],[255.0,255.0,102.0],[255.0,204.0,102.0],[255.0,136.0,76.0],[255.0,25.0,25.0],[204.0,61.0,61.0],[165.0,49.0,49.0],[237.0,0.0,237.0],[137.0,103.0,205.0],[250.0,240.0,230.0]],"WhBlReWh":[[255.0,255.0,255.0],[250.0,250.0,255.0],[245.0,245.0,255.0],[239.0,239.0,255.0],[234.0,234.0,255.0],[229.0,229.0,255.0],[224.0,224.0,255.0],[219.0,219.0,255.0],[213.0,213.0,255.0],[208.0,208.0,255.0],[203.0,203.0,255.0],[198.0,198.0,255.0],[193.0,193.0,255.0],[187.0,187.0,255.0],[182.0,182.0,255.0],[177.0,177.0,255.0],[172.0,172.0,255.0],[167.0,167.0,255.0],[161.0,161.0,255.0],[156.0,156.0,255.0],[151.0,151.0,255.0],[146.0,146.0,255.0],[141.0,141.0,255.0],[135.0,135.0,255.0],[130.0,130.0,255.0],[125.0,125.0,255.0],[120.0,120.0,255.0],[114.0,114.0,255.0],[109.0,109.0,255.0],[104.0,104.0,255.0],[99.0,99.0,255.0],[94.0,94.0,255.0],[88.0,88.0,255.0],[83.0,83.0,255.0],[78.0,78.0,255.0],[73.0,73.0,255.0],[68.0,68.0,255.0],[62.0,62.0,255.0],[57.0,57.0,255.0],[52.0,52.0,255.0],[47.0,47.0,255.0],[42.0,42.0,255.0],[36.0,36.0,255.0],[31.0,31.0,255.0],[26.0,26.0,255.0],[21.0,21.0,255.0],[16.0,16.0,255.0],[10.0,10.0,255.0],[5.0,5.0,255.0],[0.0,0.0,255.0],[255.0,0.0,0.0],[255.0,5.0,5.0],[255.0,10.0,10.0],[255.0,16.0,16.0],[255.0,21.0,21.0],[255.0,26.0,26.0],[255.0,31.0,31.0],[255.0,36.0,36.0],[255.0,42.0,42.0],[255.0,47.0,47.0],[255.0,52.0,52.0],[255.0,57.0,57.0],[255.0,62.0,62.0],[255.0,68.0,68.0],[255.0,73.0,73.0],[255.0,78.0,78.0],[255.0,83.0,83.0],[255.0,88.0,88.0],[255.0,94.0,94.0],[255.0,99.0,99.0],[255.0,104.0,104.0],[255.0,109.0,109.0],[255.0,114.0,114.0],[255.0,120.0,120.0],[255.0,125.0,125.0],[255.0,130.0,130.0],[255.0,135.0,135.0],[255.0,141.0,141.0],[255.0,146.0,146.0],[255.0,151.0,151.0],[255.0,156.0,156.0],[255.0,161.0,161.0],[255.0,167.0,167.0],[255.0,172.0,172.0],[255.0,177.0,177.0],[255.0,182.0,182.0],[255.0,187.0,187.0],[255.0,193.0,193.0],[255.0,198.0,198.0],[255.0,203.0,203.0],[255.0,208.0,208.0],[255.0,213.0,213.0],[255.0,219.0,219.0],[255.0,224.0,224.0],[255.0,229.0,229.0],[255.0,234.0,234.0],[255.0,239.0,239.0],[255.0,245.0,245.0],[255.0,250.0,250.0],[255.0,255.0,255.0]],"sunshine_diff_12lev":[[81.0,9.0,121.0],[149.0,15.0,223.0],[183.0,75.0,243.0],[203.0,126.0,246.0],[225.0,180.0,250.0],[236.0,208.0,252.0],[255.0,255.0,255.0],[255.0,245.0,204.0],[255.0,230.0,112.0],[255.0,204.0,51.0],[255.0,175.0,51.0],[255.0,111.0,0.0],[230.0,40.0,30.0]],"NCV_blue_red":[[0.0,0.0,127.0],[0.0,0.0,130.0],[0.0,0.0,133.0],[0.0,0.0,136.0],[0.0,0.0,139.0],[0.0,0.0,142.0],[0.0,0.0,145.0],[0.0,0.0,148.0],[0.0,0.0,151.0],[0.0,0.0,154.0],[0.0,0.0,157.0],[0.0,0.0,160.0],[0.0,0.0,163.0],[0.0,0.0,166.0],[0.0,0.0,169.0],[0.0,0.0,172.0],[0.0,0.0,175.0],[0.0,0.0,178.0],[0.0,0.0,181.0],[0.0,0.0,184.0],[0.0,0.0,187.0],[0.0,0.0,190.0],[0.0,0.0,193.0],[0.0,0.0,196.0],[0.0,0.0,199.0],[0.0,0.0,202.0],[0.0,0.0,205.0],[0.0,0.0,208.0],[0.0,0.0,211.0],[0.0,0.0,214.0],[0.0,0.0,217.0],[0.0,0.0,220.0],[0.0,0.0,223.0],[0.0,0.0,226.0],[0.0,0.0,229.0],[0.0,0.0,232.0],[0.0,0.0,235.0],[0.0,0.0,238.0],[0.0,0.0,241.0],[0.0,0.0,244.0],[0.0,0.0,247.0],[0.0,0.0,250.0],[0.0,0.0,253.0],[1.0,1.0,255.0],[4.0,4.0,255.0],[7.0,7.0,255.0],[10.0,10.0,255.0],[13.0,13.0,255.0],[16.0,16.0,255.0],[19.0,19.0,255.0],[22.0,22.0,255.0],[25.0,25.0,255.0],[28.0,28.0,255.0],[31.0,31.0,255.0],[34.0,34.0,255.0],[37.0,37.0,255.0],[40.0,40.0,255.0],[43.0,43.0,255.0],[46.0,46.0,255.0],[49.0,49.0,255.0],[52.0,52.0,255.0],[55.0,55.0,255.0],[58.0,58.0,255.0],[61.0,61.0,255.0],[64.0,64.0,255.0],[67.0,67.0,255.0],[70.0,70.0,255.0],[73.0,73.0,255.0],[76.0,76.0,255.0],[79.0,79.0,255.0],[82.0,82.0,255.0],[85.0,85.0,255.0],[88.0,88.0,255.0],[91.0,91.0,255.0],[94.0,94.0,255.0],[97.0,97.0,255.0],[100.0,100.0,255.0],[103.0,103.0,255.0],[106.0,106.0,255.0],[109.0,109.0,255.0],[112.0,112.0,255.0],[115.0,115.0,255.0],[118.0,118.0,255.0],[121.0,121.0,255.0],[124.0,124.0,255.0],[127.0,127.0,255.0],[130.0,130.0,255.0],[133.0,133.0,255.0],[136.0,136.0,255.0],[139.0,139.0,255.0],[142.0,142.0,255.0],[145.0,145.0,255.0],[148.0,148.0,255.0],[151.0,151.0,255.0],[154.0,154.0,255.0],[157.0,157.0,255.0],[160.0,160.0,255.0],[163.0,163.0,255.0],[166.0,166.0,255.0],[169.0,169.0,255.0],[172.0,172.0,255.0],[175.0,175.0,255.0],[178.0,178.0,255.0],[181.0,181.0,255.0],[184.0,184.0,255.0],[187.0,187.0,255.0],[190.0,190.0,255.0],[193.0,193.0,255.0],[196.0,196.0,255.0],[199.0,199.0,255.0],[202.0,202.0,255.0],[205.0,205.0,255.0],[208.0,208.0,255.0],[211.0,211.0,255.0],[214.0,214.0,255.0],[217.0,217.0,255.0],[220.0,220.0,255.0],[223.0,223.0,255.0],[226.0,226.0,255.0],[229.0,229.0,255.0],[232.0,232.0,255.0],[235.0,235.0,255.0],[238.0,238.0,255.0],[241.0,241.0,255.0],[244.0,244.0,255.0],[247.0,247.0,255.0],[250.0,250.0,255.0],[253.0,253.0,255.0],[255.0,253.0,253.0],[255.0,250.0,250.0],[255.0,247.0,247.0],[255.0,244.0,244.0],[255.0,241.0,241.0],[255.0,238.0,238.0],[255.0,235.0,235.0],[255.0,232.0,232.0],[255.0,229.0,229.0],[255.0,226.0,226.0],[255.0,223.0,223.0],[255.0,220.0,220.0],[255.0,217.0,217.0],[255.0,214.0,214.0],[255.0,211.0,211.0],[255.0,208.0,208.0],[255.0,205.0,205.0],[255.0,202.0,202.0],[255.0,199.0,199.0],[255.0,196.0,196.0],[255.0,193.0,193.0],[255.0,190.0,190.0],[255.0,187.0,187.0],[255.0,184.0,184.0],[255.0,181.0,181.0],[255.0,178.0,178.0],[255.0,175.0,175.0],[255.0,172.0,172.0],[255.0,169.0,169.0],[255.0,166.0,166.0],[255.0,163.0,163.0],[255.0,160.0,160.0],[255.0,157.0,157.0],[255.0,154.0,154.0],[255.0,151.0,151.0],[255.0,148.0,148.0],[255.0,145.0,145.0],[255.0,142.0,142.0],[255.0,139.0,139.0],[255.0,136.0,136.0],[255.0,133.0,133.0],[255.0,130.0,130.0],[255.0,127.0,127.0],[255.0,124.0,124.0],[255.0,121.0,121.0],[255.0,118.0,118.0],[255.0,115.0,115.0],[255.0,112.0,112.0],[255.0,109.0,109.0],[255.0,106.0,106.0],[255.0,103.0,103.0],[255.0,100.0,100.0],[255.0,97.0,97.0],[255.0,94.0,94.0],[255.0,91.0,91.0],[255.0,88.0,88.0],[255.0,85.0,85.0],[255.0,82.0,82.0],[255.0,79.0,79.0],[255.0,76.0,76.0],[255.0,73.0,73.0],[255.0,70.0,70.0],[255.0,67.0,67.0],[255.0,64.0,64.0],[255.0,61.0,61.0],[255.0,58.0,58.0],[255.0,55.0,55.0],[255.0,52.0,52.0],[255.0,49.0,49.0],[255.0,46.0,46.0],[255.0,43.0,43.0],[255.0,40.0,40.0],[255.0,37.0,37.0],[255.0,34.0,34.0],[255.0,31.0,31.0],[255.0,28.0,28.0],[255.0,25.0,25.0],[255.0,22.0,22.0],[255.0,19.0,19.0],[255.0,16.0,16.0],[255.0,13.0,13.0],[255.0,10.0,10.0],[255.0,7.0,7.0],[255.0,4.0,4.0],[255.0,1.0,1.0],[253.0,0.0,0.0],[250.0,0.0,0.0],[247.0,0.0,0.0],[244.0,0.0,0.0],[241.0,0.0,0.0],[238.0,0.0,0.0],[235.0,0.0,0.0],[232.0,0.0,0.0],[229.0,0.0,0.0],[226.0,0.0,0.0],[223.0,0.0,0.0],[220.0,0.0,0.0],[217.0,0.0,0.0],[214.0,0.0,0.0],[211.0,0.0,0.0],[208.0,0.0,0.0],[205.0,0.0,0.0],[202.0,0.0,0.0],[199.0,0.0,0.0],[196.0,0.0,0.0],[193.0,0.0,0.0],[190.0,0.0,0.0],[187.0,0.0,0.0],[184.0,0.0,0.0],[181.0,0.0,0.0],[178.0,0.0,0.0],[175.0,0.0,0.0],[172.0,0.0,0.0],[169.0,0.0,0.0],[166.0,0.0,0.0],[163.0,0.0,0.0],[160.0,0.0,0.0],[157.0,0.0,0.0],[154.0,0.0,0.0],[151.0,0.0,0.0],[148.0,0.0,0.0],[145.0,0.0,0.0],[142.0,0.0,0.0],[139.0,0.0,0.0],[136.0,0.0,0.0],[133.0,0.0,0.0],[130.0,0.0,0.0],[127.0,0.0,0.0]],"GMT_gebco":[[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.0,0.941176,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.137255,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.352941,1.0,1.0],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.54902,1.0,0.901961],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.647059,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.764706,1.0,0.843137],[0.823529,1.0,0.843137],[0.823529,1.0,0.843137],[0.823529,1.0,0.843137],[0.823529,1.0,0.843137],[0.823529,1.0,0.843137],[0.901961,1.0,0.941176],[0.901961,1.0,0.941176],[0.901961,1.0,0.941176],[0.921569,1.0,1.0],[0.921569,1.0,1.0]],"MPL_winte":[[0.0,0.003922,0.998039],[0.0,0.011765,0.994118],[0.0,0.019608,0.990196],[0.0,0.027451,0.986275],[0.0,0.035294,0.982353],[0.0,0.043137,0.978431],[0.0,0.05098,0.97451],[0.0,0.058824,0.970588],[0.0,0.066667,0.966667],[0.0,0.070588,0.964706],[0.0,0.082353,0.958824],[0.0,0.086275,0.956863],[0.0,0.098039,0.95098],[0.0,0.101961,0.94902],[0.0,0.113725,0.943137],[0.0,0.117647,0.941176],[0.0,0.129412,0.935294],[0.0,0.137255,0.931373],[0.0,0.141176,0.929412],[0.0,0.152941,0.923529],[0.0,0.160784,0.919608],[0.0,0.168627,0.915686],[0.0,0.172549,0.913725],[0.0,0.184314,0.907843],[0.0,0.192157,0.903922],[0.0,0.2,0.9],[0.0,0.203922,0.898039],[0.0,0.215686,0.892157],[0.0,0.223529,0.888235],[0.0,0.231373,0.884314],[0.0,0.235294,0.882353],[0.0,0.247059,0.876471],[0.0,0.254902,0.872549],[0.0,0.262745,0.868627],[0.0,0.270588,0.864706],[0.0,0.278431,0.860784],[0.0,0.286275,0.856863],[0.0,0.290196,0.854902],[0.0,0.301961,0.84902],[0.0,0.309804,0.845098],[0.0,0.317647,0.841176],[0.0,0.32549,0.837255],[0.0,0.333333,0.833333],[0.0,0.341176,0.829412],[0.0,0.34902,0.82549],[0.0,0.352941,0.823529],[0.0,0.364706,0.817647],[0.0,0.372549,0.813725],[0.0,0.380392,0.809804],[0.0,0.388235,0.805882],[0.0,0.396078,0.801961],[0.0,0.403922,0.798039],[0.0,0.411765,0.794118],[0.0,0.415686,0.792157],[0.0,0.427451,0.786275],[0.0,0.435294,0.782353],[0.0,0.443137,0.778431],[0.0,0.45098,0.77451],[0.0,0.458824,0.770588],[0.0,0.466667,0.766667],[0.0,0.47451,0.762745],[0.0,0.478431,0.760784],[0.0,0.490196,0.754902],[0.0,0.498039,0.75098],[0.0,0.505882,0.747059],[0.0,0.513725,0.743137],[0.0,0.521569,0.739216],[0.0,0.529412,0.735294],[0.0,0.537255,0.731373],[0.0,0.545098,0.727451],[0.0,0.552941,0.723529],[0.0,0.560784,0.719608],[0.0,0.568627,0.715686],[0.0,0.576471,0.711765],[0.0,0.584314,0.707843],[0.0,0.588235,0.705882],[0.0,0.6,0.7],[0.0,0.607843,0.696078],[0.0,0.615686,0.692157],[0.0,0.623529,0.688235],[0.0,0.631373,0.684314],[0.0,0.639216,0.680392],[0.0,0.647059,0.676471],[0.0,0.654902,0.672549],[0.0,0.662745,0.668627],[0.0,0.670588,0.664706],[0.0,0.678431,0.660784],[0.0,0.686275,0.656863],[0.0,0.694118,0.652941],[0.0,0.701961,0.64902],[0.0,0.709804,0.645098],[0.0,0.713725,0.643137],[0.0,0.72549,0.637255],[0.0,0.733333,0.633333],[0.0,0.741176,0.629412],[0.0,0.74902,0.62549],[0.0,0.756863,0.621569],[0.0,0.764706,0.617647],[0.0,0.772549,0.613725],[0.0,0.780392,0.609804],[0.0,0.788235,0.605882],[0.0,0.796078,0.601961],[0.0,0.803922,0.598039],[0.0,0.811765,0.594118],[0.0,0.819608,0.590196],[0.0,0.827451,0.586275],[0.0,0.835294,0.582353],[0.0,0.839216,0.580392],[0.0,0.85098,0.57451],[0.0,0.858824,0.570588],[0.0,0.866667,0.566667],[0.0,0.87451,0.562745],[0.0,0.882353,0.558824],[0.0,0.890196,0.554902],[0.0,0.898039,0.55098],[0.0,0.905882,0.547059],[0.0,0.913725,0.543137],[0.0,0.921569,0.539216],[0.0,0.929412,0.535294],[0.0,0.937255,0.531373],[0.0,0.945098,0.527451],[0.0,0.952941,0.523529],[0.0,0.960784,0.519608],[0.0,0.964706,0.517647],[0.0,0.976471,0.511765],[0.0,0.984314,0.507843],[0.0,0.992157,0.503922],[0.0,1.0,0.5]],"lithology":[[253.0,244.0,63.0],[255.0,255.0,137.0],[255.0,211.0,69.0],[255.0,203.0,35.0],[255.0,255.0,213.0],[236.0,180.0,0.0],[255.0,250.0,233.0],[255.0,250.0,200.0],[255.0,255.0,183.0],[250.0,238.0,122.0],[244.0,239.0,228.0],[241.0,229.0,223.0],[228.0,208.0,190.0],[228.0,216.0,190.0],[255.0,246.0,217.0],[224.0,197.0,158.0],[224.0,210.0,180.0],[219.0,204.0,169.0],[245.0,225.0,189.0],[224.0,176.0,158.0],[207.0,187.0,143.0],[225.0,227.0,195.0],[229.0,219.0,179.0],[220.0,213.0,180.0],[211.0,202.0,159.0],[201.0,190.0,137.0],[188.0,175.0,108.0],[191.0,167.0,67.0],[210.0,194.0,124.0],[255.0,238.0,191.0],[255.0,229.0,157.0],[255.0,223.0,133.0],[254.0,230.0,112.0],[254.0,226.0,88.0],[254.0,219.0,46.0],[247.0,243.0,161.0],[255.0,207.0,129.0],[255.0,204.0,153.0],[255.0,227.0,137.0],[255.0,219.0,103.0],[146.0,220.0,183.0],[217.0,253.0,211.0],[207.0,239.0,223.0],[213.0,230.0,204.0],[192.0,208.0,192.0],[172.0,228.0,200.0],[219.0,254.0,188.0],[187.0,255.0,221.0],[225.0,240.0,216.0],[214.0,254.0,154.0],[149.0,255.0,202.0],[205.0,255.0,217.0],[166.0,252.0,170.0],[203.0,239.0,206.0],[154.0,206.0,254.0],[105.0,207.0,156.0],[189.0,219.0,241.0],[184.0,234.0,195.0],[144.0,165.0,101.0],[183.0,217.0,204.0],[167.0,186.0,134.0],[165.0,170.0,173.0],[141.0,190.0,205.0],[187.0,192.0,197.0],[86.0,224.0,252.0],[67.0,175.0,249.0],[107.0,195.0,255.0],[56.0,180.0,177.0],[96.0,204.0,191.0],[191.0,227.0,220.0],[205.0,222.0,255.0],[1.0,156.0,205.0],[154.0,191.0,192.0],[192.0,174.0,182.0],[185.0,149.0,152.0],[217.0,194.0,163.0],[130.0,0.0,65.0],[110.0,73.0,9.0],[255.0,183.0,222.0],[255.0,195.0,228.0],[255.0,209.0,234.0],[255.0,195.0,248.0],[255.0,229.0,243.0],[255.0,224.0,222.0],[249.0,211.0,211.0],[255.0,243.0,201.0],[255.0,239.0,217.0],[255.0,229.0,195.0],[255.0,213.0,157.0],[255.0,162.0,39.0],[255.0,193.0,111.0],[244.0,139.0,0.0],[254.0,220.0,126.0],[254.0,204.0,104.0],[254.0,198.0,42.0],[254.0,205.0,172.0],[254.0,183.0,134.0],[254.0,160.0,96.0],[254.0,135.0,54.0],[254.0,117.0,24.0],[235.0,96.0,1.0],[201.0,82.0,1.0],[177.0,72.0,1.0],[147.0,60.0,1.0],[236.0,213.0,198.0],[221.0,179.0,151.0],[211.0,157.0,121.0],[198.0,128.0,80.0],[169.0,101.0,55.0],[194.0,65.0,0.0],[95.0,57.0,31.0],[133.0,79.0,43.0],[160.0,53.0,0.0],[110.0,37.0,0.0],[252.0,110.0,124.0],[255.0,193.0,183.0],[255.0,225.0,232.0],[228.0,88.0,145.0],[255.0,239.0,243.0],[221.0,41.0,114.0],[255.0,209.0,220.0],[255.0,129.0,159.0],[255.0,169.0,157.0],[232.0,28.0,0.0],[255.0,51.0,23.0],[214.0,0.0,0.0],[249.0,181.0,187.0],[248.0,190.0,174.0],[255.0,179.0,197.0],[255.0,111.0,107.0],[252.0,82.0,98.0],[233.0,121.0,166.0],[252.0,182.0,182.0],[255.0,167.0,188.0],[244.0,60.0,108.0],[251.0,35.0,56.0],[244.0,26.0,135.0],[255.0,99.0,136.0],[255.0,39.0,90.0],[172.0,0.0,0.0],[255.0,111.0,91.0],[227.0,119.0,173.0],[237.0,167.0,202.0],[233.0,147.0,190.0],[255.0,214.0,209.0],[255.0,191.0,206.0],[255.0,149.0,174.0],[255.0,111.0,145.0],[255.0,27.0,81.0],[232.0,0.0,55.0],[206.0,0.0,49.0],[176.0,0.0,42.0],[193.0,1.0,10.0],[148.0,0.0,35.0],[163.0,1.0,9.0],[117.0,1.0,7.0],[167.0,167.0,255.0],[234.0,175.0,255.0],[206.0,157.0,255.0],[164.0,73.0,255.0],[129.0,3.0,255.0],[70.0,0.0,140.0],[0.0,92.0,0.0],[125.0,255.0,125.0],[201.0,255.0,201.0],[230.0,205.0,255.0],[159.0,255.0,159.0],[233.0,255.0,233.0],[0.0,0.0,255.0],[255.0,87.0,255.0],[255.0,141.0,255.0],[255.0,167.0,255.0],[254.0,103.0,0.0],[255.0,0.0,0.0],[185.0,59.0,104.0],[135.0,43.0,76.0],[201.0,85.0,126.0],[0.0,128.0,0.0],[180.0,207.0,228.0],[219.0,219.0,231.0],[237.0,237.0,243.0],[192.0,192.0,192.0],[177.0,177.0,177.0],[202.0,202.0,220.0],[162.0,162.0,192.0],[182.0,182.0,206.0],[150.0,150.0,150.0],[163.0,55.0,253.0],[236.0,214.0,254.0],[224.0,188.0,254.0],[213.0,164.0,254.0],[200.0,134.0,254.0],[204.0,183.0,255.0],[179.0,149.0,255.0],[144.0,99.0,255.0],[159.0,0.0,202.0],[123.0,0.0,156.0],[106.0,0.0,106.0],[132.0,97.0,62.0],[208.0,203.0,176.0],[176.0,167.0,120.0],[136.0,127.0,80.0],[172.0,127.0,80.0],[109.0,80.0,51.0],[100.0,2.0,11.0],[136.0,127.0,80.0],[255.0,255.0,255.0],[153.0,204.0,255.0],[255.0,213.0,157.0],[255.0,209.0,220.0],[133.0,79.0,43.0],[107.0,195.0,255.0],[160.0,53.0,0.0]],"GMT_coppe":[[0.012549,0.007825,0.00502],[0.037647,0.023474,0.015059],[0.062745,0.039123,0.025098],[0.087843,0.054773,0.035137],[0.112941,0.070422,0.045176],[0.138039,0.086072,0.055216],[0.163137,0.101721,0.065255],[0.188235,0.11737,0.075294],[0.213333,0.13302,0.085333],[0.238431,0.148669,0.095373],[0.263529,0.164318,0.105412],[0.288627,0.179968,0.115451],[0.313725,0.195617,0.12549],[0.338824,0.211266,0.135529],[0.363922,0.226916,0.145569],[0.38902,0.242565,0.155608],[0.414118,0.258215,0.165647],[0.439216,0.273864,0.175686],[0.464314,0.289513,0.185725],[0.489412,0.305163,0.195765],[0.51451,0.320812,0.205804],[0.539608,0.336461,0.215843],[0.564706,0.352111,0.225882],[0.589804,0.36776,0.235922],[0.614902,0.383409,0.245961],[0.64,0.399059,0.256],[0.665098,0.414708,0.266039],[0.690196,0.430358,0.276078],[0.715294,0.446007,0.286118],[0.740392,0.461656,0.296157],[0.76549,0.477306,0.306196],[0.790588,0.492955,0.316235],[0.815686,0.508604,0.326275],[0.840784,0.524254,0.336314],[0.865882,0.539903,0.346353],[0.89098,0.555552,0.356392],[0.916078,0.571202,0.366431],[0.941176,0.586851,0.376471],[0.966275,0.602501,0.38651],[0.991373,0.61815,0.396549],[1.0,0.633919,0.406588],[1.0,0.64975,0.416627],[1.0,0.665581,0.426667],[1.0,0.681412,0.436706],[1.0,0.697243,0.446745],[1.0,0.713074,0.456784],[1.0,0.728905,0.466824],[1.0,0.744736,0.476863],[1.0,0.760567,0.486902],[1.0,0.776398,0.496941]],"MPL_bw":[[0.007843,0.007843,1.0],[0.023529,0.023529,1.0],[0.039216,0.039216,1.0],[0.054902,0.054902,1.0],[0.070588,0.070588,1.0],[0.086275,0.086275,1.0],[0.101961,0.101961,1.0],[0.117647,0.117647,1.0],[0.133333,0.133333,1.0],[0.141176,0.141176,1.0],[0.164706,0.164706,1.0],[0.172549,0.172549,1.0],[0.196078,0.196078,1.0],[0.203922,0.203922,1.0],[0.227451,0.227451,1.0],[0.235294,0.235294,1.0],[0.258824,0.258824,1.0],[0.27451,0.27451,1.0],[0.282353,0.282353,1.0],[0.305882,0.305882,1.0],[0.321569,0.321569,1.0],[0.337255,0.337255,1.0],[0.345098,0.345098,1.0],[0.368627,0.368627,1.0],[0.384314,0.384314,1.0],[0.4,0.4,1.0],[0.407843,0.407843,1.0],[0.431373,0.431373,1.0],[0.447059,0.447059,1.0],[0.462745,0.462745,1.0],[0.470588,0.470588,1.0],[0.494118,0.494118,1.0],[0.509804,0.509804,1.0],[0.52549,0.52549,1.0],[0.541176,0.541176,1.0],[0.556863,0.556863,1.0],[0.572549,0.572549,1.0],[0.580392,0.580392,1.0],[0.603922,0.603922,1.0],[0.619608,0.619608,1.0],[0.635294,0.635294,1.0],[0.65098,0.65098,1.0],[0.666667,0.666667,1.0],[0.682353,0.682353,1.0],[0.698039,0.698039,1.0],[0.705882,0.705882,1.0],[0.729412,0.729412,1.0],[0.745098,0.745098,1.0],[0.760784,0.760784,1.0],[0.776471,0.776471,1.0],[0.792157,0.792157,1.0],[0.807843,0.807843,1.0],[0.823529,0.823529,1.0],[0.831373,0.831373,1.0],[0.854902,0.854902,1.0],[0.870588,0.870588,1.0],[0.886275,0.886275,1.0],[0.901961,0.901961,1.0],[0.917647,0.917647,1.0],[0.933333,0.933333,1.0],[0.94902,0.94902,1.0],[0.956863,0.956863,1.0],[0.980392,0.980392,1.0],[0.996078,0.996078,1.0],[1.0,0.988235,0.988235],[1.0,0.972549,0.972549],[1.0,0.956863,0.956863],[1.0,0.941176,0.941176],[1.0,0.92549,0.92549],[1.0,0.909804,0.909804],[1.0,0.894118,0.894118],[1.0,0.878431,0.878431],[1.0,0.862745,0.862745],[1.0,0.847059,0.847059],[1.0,0.831373,0.831373],[1.0,0.823529,0.823529],[1.0,0.8,0.8],[1.0,0.784314,0.784314],[1.0,0.768627,0.768627],[1.0,0.752941,0.752941],[1.0,0.737255,0.737255],[1.0,0.721569,0.721569],[1.0,0.705882,0.705882],[1.0,0.690196,0.690196],[1.0,0.67451,0.67451],[1.0,0.658824,0.658824],[1.0,0.643137,0.643137],[1.0,0.627451,0.627451],[1.0,0.611765,0.611765],[1.0,0.596078,0.596078],[1.0,0.580392,0.580392],[1.0,0.572549,0.572549],[1.0,0.54902,0.54902],[1.0,0.533333,0.533333],[1.0,0.517647,0.517647],[1.0,0.501961,0.501961],[1.0,0.486275,0.486275],[1.0,0.470588,0.470588],[1.0,0.454902,0.454902],[1.0,0.439216,0.439216],[1.0,0.423529,0.423529],[1.0,0.407843,0.407843],[1.0,0.392157,0.392157],[1.0,0.376471,0.376471],[1.0,0.360784,0.360784],[1.0,0.345098,0.345098],[1.0,0.329412,0.329412],[1.0,0.321569,0.321569],[1.0,0.298039,0.298039],[1.0,0.282353,0.282353],[1.0,0.266667,0.266667],[1.0,0.25098,0.25098],[1.0,0.235294,0.235294],[1.0,0.219608,0.219608],[1.0,0.203922,0.203922],[1.0,0.188235,0.188235],[1.0,0.172549,0.172549],[1.0,0.156863,0.156863],[1.0,0.141176,0.141176],[1.0,0.12549,0.12549],[1.0,0.109804,0.109804],[1.0,0.094118,0.094118],[1.0,0.078431,0.078431],[1.0,0.070588,0.070588],[1.0,0.047059,0.047059],[1.0,0.031373,0.031373],[1.0,0.015686,0.015686],[1.0,0.0,0.0]],"MPL_gist_heat":[[0.005882,0.0,0.0],[0.017647,0.0,0.0],[0.029412,0.0,0.0],[0.041176,0.0,0.0],[0.052941,0.0,0.0],[0.064706,0.0,0.0],[0.076471,0.0,0.0],[0.088235,0.0,0.0],[0.1,0.0,0.0],[0.105882,0.0,0.0],[0.123529,0.0,0.0],[0.129412,0.0,0.0],[0.147059,0.0,0.0],[0.152941,0.0,0.0],[0.170588,0.0,0.0],[0.176471,0.0,0.0],[0.194118,0.0,0.0],[0.205882,0.0,0.0],[0.211765,0.0,0.0],[0.229412,0.0,0.0],[0.241176,0.0,0.0],[0.252941,0.0,0.0],[0.258824,0.0,0.0],[0.276471,0.0,0.0],[0.288235,0.0,0.0],[0.3,0.0,0.0],[0.305882,0.0,0.0],[0.323529,0.0,0.0],[0.335294,0.0,0.0],[0.347059,0.0,0.0],[0.352941,0.0,0.0],[0.370588,0.0,0.0],[0.382353,0.0,0.0],[0.394118,0.0,0.0],[0.405882,0.0,0.0],[0.417647,0.0,0.0],[0.429412,0.0,0.0],[0.435294,0.0,0.0],[0.452941,0.0,0.0],[0.464706,0.0,0.0],[0.476471,0.0,0.0],[0.488235,0.0,0.0],[0.5,0.0,0.0],[0.511765,0.0,0.0],[0.523529,0.0,0.0],[0.529412,0.0,0.0],[0.547059,0.0,0.0],[0.558824,0.0,0.0],[0.570588,0.0,0.0],[0.582353,0.0,0.0],[0.594118,0.0,0.0],[0.605882,0.0,0.0],[0.617647,0.0,0.0],[0.623529,0.0,0.0],[0.641176,0.0,0.0],[0.652941,0.0,0.0],[0.664706,0.0,0.0],[0.676471,0.0,0.0],[0.688235,0.0,0.0],[0.7,0.0,0.0],[0.711765,0.0,0.0],[0.717647,0.0,0.0],[0.735294,0.0,0.0],[0.747059,0.0,0.0],[0.758824,0.011765,0.0],[0.770588,0.027451,0.0],[0.782353,0.043137,0.0],[0.794118,0.058824,0.0],[0.805882,0.07451,0.0],[0.817647,0.090196,0.0],[0.829412,0.105882,0.0],[0.841176,0.121569,0.0],[0.852941,0.137255,0.0],[0.864706,0.152941,0.0],[0.876471,0.168627,0.0],[0.882353,0.176471,0.0],[0.9,0.2,0.0],[0.911765,0.215686,0.0],[0.923529,0.231373,0.0],[0.935294,0.247059,0.0],[0.947059,0.262745,0.0],[0.958824,0.278431,0.0],[0.970588,0.294118,0.0],[0.982353,0.309804,0.0],[0.994118,0.32549,0.0],[1.0,0.341176,0.0],[1.0,0.356863,0.0],[1.0,0.372549,0.0],[1.0,0.388235,0.0],[1.0,0.403922,0.0],[1.0,0.419608,0.0],[1.0,0.427451,0.0],[1.0,0.45098,0.0],[1.0,0.466667,0.0],[1.0,0.482353,0.0],[1.0,0.498039,0.0],[1.0,0.513725,0.027451],[1.0,0.529412,0.058824],[1.0,0.545098,0.090196],[1.0,0.560784,0.121569],[1.0,0.576471,0.152941],[1.0,0.592157,0.184314],[1.0,0.607843,0.215686],[1.0,0.623529,0.247059],[1.0,0.639216,0.278431],[1.0,0.654902,0.309804],[1.0,0.670588,0.341176],[1.0,0.678431,0.356863],[1.0,0.701961,0.403922],[1.0,0.717647,0.435294],[1.0,0.733333,0.466667],[1.0,0.74902,0.498039],[1.0,0.764706,0.529412],[1.0,0.780392,0.560784],[1.0,0.796078,0.592157],[1.0,0.811765,0.623529],[1.0,0.827451,0.654902],[1.0,0.843137,0.686275],[1.0,0.858824,0.717647],[1.0,0.87451,0.74902],[1.0,0.890196,0.780392],[1.0,0.905882,0.811765],[1.0,0.921569,0.843137],[1.0,0.929412,0.858824],[1.0,0.952941,0.905882],[1.0,0.968627,0.937255],[1.0,0.984314,0.968627],[1.0,1.0,1.0]],"WhiteBlueGreenYellowRed":[[255.0,255.0,255.0],[252.0,254.0,255.0],[250.0,253.0,255.0],[247.0,252.0,254.0],[244.0,251.0,254.0],[242.0,250.0,254.0],[239.0,249.0,254.0],[236.0,248.0,253.0],[234.0,247.0,253.0],[231.0,246.0,253.0],[229.0,245.0,253.0],[226.0,244.0,253.0],[223.0,243.0,252.0],[221.0,242.0,252.0],[218.0,241.0,252.0],[215.0,240.0,252.0],[213.0,239.0,252.0],[210.0,238.0,251.0],[207.0,237.0,251.0],[205.0,236.0,251.0],[202.0,235.0,251.0],[199.0,234.0,250.0],[197.0,233.0,250.0],[194.0,232.0,250.0],[191.0,231.0,250.0],[189.0,230.0,250.0],[186.0,229.0,249.0],[183.0,228.0,249.0],[181.0,227.0,249.0],[178.0,226.0,249.0],[176.0,225.0,249.0],[173.0,224.0,248.0],[170.0,223.0,248.0],[168.0,222.0,248.0],[165.0,221.0,248.0],[162.0,220.0,247.0],[157.0,218.0,247.0],[155.0,216.0,246.0],[152.0,214.0,245.0],[150.0,212.0,243.0],[148.0,210.0,242.0],[146.0,208.0,241.0],[143.0,206.0,240.0],[141.0,204.0,238.0],[139.0,202.0,237.0],[136.0,200.0,236.0],[134.0,197.0,235.0],[132.0,195.0,234.0],[129.0,193.0,232.0],[127.0,191.0,231.0],[125.0,189.0,230.0],[123.0,187.0,229.0],[120.0,185.0,228.0],[118.0,183.0,226.0],[116.0,181.0,225.0],[113.0,179.0,224.0],[111.0,177.0,223.0],[109.0,175.0,221.0],[106.0,173.0,220.0],[104.0,171.0,219.0],[102.0,169.0,218.0],[100.0,167.0,217.0],[97.0,165.0,215.0],[95.0,163.0,214.0],[93.0,160.0,213.0],[90.0,158.0,212.0],[88.0,156.0,211.0],[86.0,154.0,209.0],[83.0,152.0,208.0],[81.0,150.0,207.0],[79.0,148.0,206.0],[77.0,146.0,204.0],[72.0,142.0,202.0],[72.0,143.0,198.0],[72.0,144.0,195.0],[72.0,145.0,191.0],[72.0,146.0,188.0],[72.0,147.0,184.0],[72.0,148.0,181.0],[72.0,149.0,177.0],[72.0,150.0,173.0],[72.0,151.0,170.0],[72.0,153.0,166.0],[72.0,154.0,163.0],[72.0,155.0,159.0],[72.0,156.0,156.0],[72.0,157.0,152.0],[72.0,158.0,148.0],[72.0,159.0,145.0],[72.0,160.0,141.0],[72.0,161.0,138.0],[73.0,162.0,134.0],[73.0,163.0,131.0],[73.0,164.0,127.0],[73.0,165.0,124.0],[73.0,166.0,120.0],[73.0,167.0,116.0],[73.0,168.0,113.0],[73.0,169.0,109.0],[73.0,170.0,106.0],[73.0,172.0,102.0],[73.0,173.0,99.0],[73.0,174.0,95.0],[73.0,175.0,91.0],[73.0,176.0,88.0],[73.0,177.0,84.0],[73.0,178.0,81.0],[73.0,179.0,77.0],[73.0,181.0,70.0],[78.0,182.0,71.0],[83.0,184.0,71.0],[87.0,185.0,72.0],[92.0,187.0,72.0],[97.0,188.0,73.0],[102.0,189.0,74.0],[106.0,191.0,74.0],[111.0,192.0,75.0],[116.0,193.0,75.0],[121.0,195.0,76.0],[126.0,196.0,77.0],[130.0,198.0,77.0],[135.0,199.0,78.0],[140.0,200.0,78.0],[145.0,202.0,79.0],[150.0,203.0,80.0],[154.0,204.0,80.0],[159.0,206.0,81.0],[164.0,207.0,81.0],[169.0,209.0,82.0],[173.0,210.0,82.0],[178.0,211.0,83.0],[183.0,213.0,84.0],[188.0,214.0,84.0],[193.0,215.0,85.0],[197.0,217.0,85.0],[202.0,218.0,86.0],[207.0,220.0,87.0],[212.0,221.0,87.0],[217.0,222.0,88.0],[221.0,224.0,88.0],[226.0,225.0,89.0],[231.0,226.0,90.0],[236.0,228.0,90.0],[240.0,229.0,91.0],[245.0,231.0,91.0],[250.0,232.0,92.0],[250.0,229.0,91.0],[250.0,225.0,89.0],[250.0,222.0,88.0],[249.0,218.0,86.0],[249.0,215.0,85.0],[249.0,212.0,84.0],[249.0,208.0,82.0],[249.0,205.0,81.0],[249.0,201.0,80.0],[249.0,198.0,78.0],[249.0,195.0,77.0],[248.0,191.0,75.0],[248.0,188.0,74.0],[248.0,184.0,73.0],[248.0,181.0,71.0],[248.0,178.0,70.0],[248.0,174.0,69.0],[248.0,171.0,67.0],[247.0,167.0,66.0],[247.0,164.0,64.0],[247.0,160.0,63.0],[247.0,157.0,62.0],[247.0,154.0,60.0],[247.0,150.0,59.0],[247.0,147.0,58.0],[246.0,143.0,56.0],[246.0,140.0,55.0],[246.0,137.0,53.0],[246.0,133.0,52.0],[246.0,130.0,51.0],[246.0,126.0,49.0],[246.0,123.0,48.0],[246.0,120.0,47.0],[245.0,116.0,45.0],[245.0,113.0,44.0],[245.0,106.0,41.0],[244.0,104.0,41.0],[243.0,102.0,41.0],[242.0,100.0,41.0],[241.0,98.0,41.0],[240.0,96.0,41.0],[239.0,94.0,41.0],[239.0,92.0,41.0],[238.0,90.0,41.0],[237.0,88.0,41.0],[236.0,86.0,41.0],[235.0,84.0,41.0],[234.0,82.0,41.0],[233.0,80.0,41.0],[232.0,78.0,41.0],[231.0,76.0,41.0],[230.0,74.0,41.0],[229.0,72.0,41.0],[228.0,70.0,41.0],[228.0,67.0,40.0],[227.0,65.0,40.0],[226.0,63.0,40.0],[225.0,61.0,40.0],[224.0,59.0,40.0],[223.0,57.0,40.0],[222.0,55.0,40.0],[221.0,53.0,40.0],[220.0,51.0,40.0],[219.0,49.0,40.0],[218.0,47.0,40.0],[217.0,45.0,40.0],[217.0,43.0,40.0],[216.0,41.0,40.0],[215.0,39.0,40.0],[214.0,37.0,40.0],[213.0,35.0,40.0],[211.0,31.0,40.0],[209.0,31.0,40.0],[207.0,30.0,39.0],[206.0,30.0,39.0],[204.0,30.0,38.0],[202.0,30.0,38.0],[200.0,29.0,38.0],[199.0,29.0,37.0],[197.0,29.0,37.0],[195.0,29.0,36.0],[193.0,28.0,36.0],[192.0,28.0,36.0],[190.0,28.0,35.0],[188.0,27.0,35.0],[186.0,27.0,34.0],[185.0,27.0,34.0],[183.0,27.0,34.0],[181.0,26.0,33.0],[179.0,26.0,33.0],[178.0,26.0,32.0],[176.0,26.0,32.0],[174.0,25.0,31.0],[172.0,25.0,31.0],[171.0,25.0,31.0],[169.0,25.0,30.0],[167.0,24.0,30.0],[165.0,24.0,29.0],[164.0,24.0,29.0],[162.0,23.0,29.0],[160.0,23.0,28.0],[158.0,23.0,28.0],[157.0,23.0,27.0],[155.0,22.0,27.0],[153.0,22.0,27.0],[151.0,22.0,26.0],[150.0,22.0,26.0],[146.0,21.0,25.0]],"SVG_fs2006":[[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[0.0,121.0,56.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[163.0,211.0,149.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[254.0,211.0,170.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[247.0,152.0,107.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[242.0,97.0,34.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[171.0,68.0,18.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0],[237.0,28.0,36.0]],"nrl_sirkes":[[0.0,97.0,128.0],[0.0,128.0,161.0],[0.0,161.0,191.0],[0.0,191.0,224.0],[0.0,224.0,255.0],[0.0,255.0,255.0],[51.0,252.0,252.0],[102.0,252.0,252.0],[153.0,252.0,252.0],[204.0,252.0,252.0],[255.0,255.0,255.0],[252.0,252.0,0.0],[252.0,224.0,0.0],[252.0,191.0,0.0],[252.0,161.0,0.0],[252.0,128.0,0.0],[252.0,97.0,0.0],[252.0,64.0,0.0],[252.0,33.0,0.0],[191.0,0.0,0.0],[128.0,0.0,0.0]],"precip_diff_12lev":[[182.0,106.0,40.0],[205.0,133.0,63.0],[225.0,165.0,100.0],[245.0,205.0,132.0],[245.0,224.0,158.0],[255.0,245.0,186.0],[255.0,255.0,255.0],[205.0,255.0,205.0],[153.0,240.0,178.0],[83.0,189.0,159.0],[110.0,170.0,200.0],[5.0,112.0,176.0],[2.0,56.0,88.0]],"MPL_StepSeq":[[0.990404,0.952388,0.952388],[0.971211,0.857163,0.857163],[0.952018,0.761938,0.761938],[0.932826,0.666713,0.666713],[0.913633,0.571488,0.571488],[0.894579,0.487889,0.487889],[0.876125,0.454671,0.454671],[0.85767,0.421453,0.421453],[0.839216,0.388235,0.388235],[0.829988,0.371626,0.371626],[0.802307,0.321799,0.321799],[0.792803,0.307405,0.307405],[0.764014,0.266436,0.266436],[0.754418,0.25278,0.25278],[0.725629,0.211811,0.211811],[0.716032,0.198155,0.198155],[0.687659,0.160508,0.160508],[0.669204,0.1391,0.1391],[0.659977,0.128397,0.128397],[0.632295,0.096286,0.096286],[0.613841,0.074879,0.074879],[0.618824,0.095917,0.088904],[0.656471,0.170104,0.149066],[0.769412,0.392664,0.32955],[0.844706,0.541038,0.449873],[0.92,0.689412,0.570196],[0.957647,0.763599,0.630358],[0.982007,0.820069,0.662053],[0.962814,0.79128,0.623668],[0.943622,0.762491,0.585283],[0.934025,0.748097,0.56609],[0.905236,0.704914,0.508512],[0.886505,0.67797,0.473356],[0.868051,0.652134,0.440138],[0.849596,0.626298,0.40692],[0.831142,0.600461,0.373702],[0.812687,0.574625,0.340484],[0.80346,0.561707,0.323875],[0.77481,0.526828,0.281799],[0.755617,0.503945,0.254487],[0.736424,0.481061,0.227174],[0.717232,0.458178,0.199862],[0.698039,0.435294,0.172549],[0.679585,0.415363,0.151142],[0.66113,0.395433,0.129735],[0.651903,0.385467,0.119031],[0.624221,0.355571,0.08692],[0.605767,0.33564,0.065513],[0.63857,0.416194,0.141546],[0.694671,0.542422,0.261869],[0.750773,0.668651,0.382191],[0.806874,0.794879,0.502514],[0.862976,0.921107,0.622837],[0.891027,0.984221,0.682999],[0.863529,0.97361,0.64526],[0.838431,0.954418,0.606874],[0.813333,0.935225,0.568489],[0.788235,0.916032,0.530104],[0.76323,0.896886,0.492042],[0.739608,0.878431,0.458824],[0.715986,0.859977,0.425606],[0.704175,0.85075,0.408997],[0.668743,0.823068,0.35917],[0.645121,0.804614,0.325952],[0.622607,0.785606,0.297163],[0.600461,0.766413,0.26985],[0.578316,0.74722,0.242537],[0.556171,0.728028,0.215225],[0.534025,0.708835,0.187912],[0.513172,0.689965,0.163183],[0.493979,0.671511,0.141776],[0.474787,0.653057,0.120369],[0.455594,0.634602,0.098962],[0.436401,0.616148,0.077555],[0.426159,0.607013,0.080969],[0.452364,0.635063,0.16955],[0.53098,0.719216,0.435294],[0.583391,0.775317,0.612457],[0.635802,0.831419,0.789619],[0.688212,0.88752,0.966782],[0.666851,0.877647,0.984406],[0.628466,0.852549,0.965213],[0.590081,0.827451,0.946021],[0.551696,0.802353,0.926828],[0.51331,0.777255,0.907636],[0.477509,0.752895,0.888812],[0.444291,0.729273,0.870358],[0.411073,0.705652,0.851903],[0.377855,0.68203,0.833449],[0.344637,0.658408,0.814994],[0.312526,0.635063,0.796401],[0.29887,0.623991,0.786805],[0.257901,0.590773,0.758016],[0.230588,0.568627,0.738824],[0.203276,0.546482,0.719631],[0.175963,0.524337,0.700438],[0.153818,0.504775,0.681892],[0.132411,0.485582,0.663437],[0.111003,0.46639,0.644983],[0.089596,0.447197,0.626528],[0.068189,0.428005,0.608074],[0.131903,0.449089,0.642353],[0.261822,0.501499,0.717647],[0.391742,0.55391,0.792941],[0.521661,0.606321,0.868235],[0.65158,0.658731,0.943529],[0.740161,0.688443,0.995202],[0.722445,0.66925,0.985606],[0.669296,0.611672,0.956817],[0.633864,0.573287,0.937624],[0.598431,0.534902,0.918431],[0.562999,0.496517,0.899239],[0.531719,0.462976,0.880738],[0.500715,0.429758,0.862284],[0.469712,0.39654,0.843829],[0.438708,0.363322,0.825375],[0.407705,0.330104,0.80692],[0.379931,0.300577,0.788005],[0.354095,0.273264,0.768812],[0.328258,0.245952,0.749619],[0.302422,0.218639,0.730427],[0.276586,0.191326,0.711234],[0.252364,0.165859,0.692272],[0.24203,0.155156,0.683045],[0.211027,0.123045,0.655363],[0.190358,0.101638,0.636909],[0.169689,0.080231,0.618454],[0.14902,0.058824,0.6]],"WhViBlGrYeOrRe":[[255.0,255.0,255.0],[245.0,240.0,248.0],[235.0,225.0,241.0],[225.0,210.0,234.0],[215.0,195.0,227.0],[206.0,180.0,220.0],[196.0,165.0,213.0],[186.0,150.0,206.0],[176.0,135.0,199.0],[166.0,120.0,192.0],[156.0,105.0,185.0],[146.0,90.0,178.0],[136.0,75.0,171.0],[127.0,60.0,164.0],[117.0,45.0,157.0],[107.0,30.0,150.0],[97.0,15.0,143.0],[87.0,0.0,136.0],[82.0,0.0,143.0],[76.0,0.0,151.0],[71.0,0.0,158.0],[65.0,0.0,166.0],[60.0,0.0,173.0],[54.0,0.0,181.0],[49.0,0.0,188.0],[44.0,0.0,196.0],[38.0,0.0,203.0],[33.0,0.0,210.0],[27.0,0.0,218.0],[22.0,0.0,225.0],[16.0,0.0,233.0],[11.0,0.0,240.0],[5.0,0.0,248.0],[0.0,0.0,255.0],[0.0,11.0,241.0],[1.0,21.0,227.0],[1.0,32.0,213.0],[2.0,42.0,199.0],[2.0,53.0,184.0],[3.0,63.0,170.0],[3.0,74.0,156.0],[4.0,84.0,142.0],[4.0,95.0,128.0],[5.0,105.0,114.0],[5.0,116.0,100.0],[6.0,126.0,86.0],[6.0,137.0,71.0],[7.0,147.0,57.0],[7.0,158.0,43.0],[8.0,168.0,29.0],[8.0,179.0,15.0],[23.0,183.0,14.0],[37.0,188.0,13.0],[52.0,192.0,12.0],[66.0,197.0,11.0],[81.0,201.0,11.0],[95.0,206.0,10.0],[110.0,210.0,9.0],[124.0,215.0,8.0],[139.0,219.0,7.0],[153.0,224.0,6.0],[168.0,228.0,5.0],[182.0,233.0,4.0],[197.0,237.0,4.0],[211.0,242.0,3.0],[226.0,246.0,2.0],[240.0,251.0,1.0],[255.0,255.0,0.0],[255.0,249.0,0.0],[255.0,244.0,0.0],[255.0,238.0,0.0],[255.0,233.0,0.0],[255.0,227.0,0.0],[255.0,221.0,0.0],[255.0,216.0,0.0],[255.0,210.0,0.0],[255.0,204.0,0.0],[255.0,199.0,0.0],[255.0,193.0,0.0],[255.0,188.0,0.0],[255.0,182.0,0.0],[255.0,176.0,0.0],[255.0,171.0,0.0],[255.0,165.0,0.0],[255.0,155.0,0.0],[255.0,146.0,0.0],[255.0,136.0,0.0],[255.0,126.0,0.0],[255.0,116.0,0.0],[255.0,107.0,0.0],[255.0,97.0,0.0],[255.0,87.0,0.0],[255.0,78.0,0.0],[255.0,68.0,0.0],[255.0,58.0,0.0],[255.0,49.0,0.0],[255.0,39.0,0.0],[255.0,29.0,0.0],[255.0,19.0,0.0],[255.0,10.0,0.0],[255.0,0.0,0.0]],"MPL_":[[0.007843,0.0,0.992157],[0.023529,0.0,0.976471],[0.039216,0.0,0.960784],[0.054902,0.0,0.945098],[0.070588,0.0,0.929412],[0.086275,0.0,0.913725],[0.101961,0.0,0.898039],[0.117647,0.0,0.882353],[0.133333,0.0,0.866667],[0.141176,0.0,0.858824],[0.164706,0.0,0.835294],[0.172549,0.0,0.827451],[0.196078,0.0,0.803922],[0.203922,0.0,0.796078],[0.227451,0.0,0.772549],[0.235294,0.0,0.764706],[0.258824,0.0,0.741176],[0.27451,0.0,0.72549],[0.282353,0.0,0.717647],[0.305882,0.0,0.694118],[0.321569,0.0,0.678431],[0.337255,0.0,0.662745],[0.345098,0.0,0.654902],[0.368627,0.0,0.631373],[0.384314,0.0,0.615686],[0.4,0.0,0.6],[0.407843,0.0,0.592157],[0.431373,0.0,0.568627],[0.447059,0.0,0.552941],[0.462745,0.0,0.537255],[0.470588,0.0,0.529412],[0.494118,0.0,0.505882],[0.509804,0.0,0.490196],[0.52549,0.0,0.47451],[0.541176,0.0,0.458824],[0.556863,0.0,0.443137],[0.572549,0.0,0.427451],[0.580392,0.0,0.419608],[0.603922,0.0,0.396078],[0.619608,0.0,0.380392],[0.635294,0.0,0.364706],[0.65098,0.0,0.34902],[0.666667,0.0,0.333333],[0.682353,0.0,0.317647],[0.698039,0.0,0.301961],[0.705882,0.0,0.294118],[0.729412,0.0,0.270588],[0.745098,0.0,0.254902],[0.760784,0.0,0.239216],[0.776471,0.0,0.223529],[0.792157,0.0,0.207843],[0.807843,0.0,0.192157],[0.823529,0.0,0.176471],[0.831373,0.0,0.168627],[0.854902,0.0,0.145098],[0.870588,0.0,0.129412],[0.886275,0.0,0.113725],[0.901961,0.0,0.098039],[0.917647,0.0,0.082353],[0.933333,0.0,0.066667],[0.94902,0.0,0.05098],[0.956863,0.0,0.043137],[0.980392,0.0,0.019608],[0.996078,0.0,0.003922],[0.988235,0.011765,0.0],[0.972549,0.027451,0.0],[0.956863,0.043137,0.0],[0.941176,0.058824,0.0],[0.92549,0.07451,0.0],[0.909804,0.090196,0.0],[0.894118,0.105882,0.0],[0.878431,0.121569,0.0],[0.862745,0.137255,0.0],[0.847059,0.152941,0.0],[0.831373,0.168627,0.0],[0.823529,0.176471,0.0],[0.8,0.2,0.0],[0.784314,0.215686,0.0],[0.768627,0.231373,0.0],[0.752941,0.247059,0.0],[0.737255,0.262745,0.0],[0.721569,0.278431,0.0],[0.705882,0.294118,0.0],[0.690196,0.309804,0.0],[0.67451,0.32549,0.0],[0.658824,0.341176,0.0],[0.643137,0.356863,0.0],[0.627451,0.372549,0.0],[0.611765,0.388235,0.0],[0.596078,0.403922,0.0],[0.580392,0.419608,0.0],[0.572549,0.427451,0.0],[0.54902,0.45098,0.0],[0.533333,0.466667,0.0],[0.517647,0.482353,0.0],[0.501961,0.498039,0.0],[0.486275,0.513725,0.0],[0.470588,0.529412,0.0],[0.454902,0.545098,0.0],[0.439216,0.560784,0.0],[0.423529,0.576471,0.0],[0.407843,0.592157,0.0],[0.392157,0.607843,0.0],[0.376471,0.623529,0.0],[0.360784,0.639216,0.0],[0.345098,0.654902,0.0],[0.329412,0.670588,0.0],[0.321569,0.678431,0.0],[0.298039,0.701961,0.0],[0.282353,0.717647,0.0],[0.266667,0.733333,0.0],[0.25098,0.74902,0.0],[0.235294,0.764706,0.0],[0.219608,0.780392,0.0],[0.203922,0.796078,0.0],[0.188235,0.811765,0.0],[0.172549,0.827451,0.0],[0.156863,0.843137,0.0],[0.141176,0.858824,0.0],[0.12549,0.87451,0.0],[0.109804,0.890196,0.0],[0.094118,0.905882,0.0],[0.078431,0.921569,0.0],[0.070588,0.929412,0.0],[0.047059,0.952941,0.0],[0.031373,0.968627,0.0],[0.015686,0.984314,0.0],[0.0,1.0,0.0]],"grads_default":[[250.0,60.0,60.0],[0.0,220.0,0.0],[30.0,60.0,255.0],[0.0,200.0,200.0],[240.0,0.0,130.0],[230.0,220.0,50.0],[240.0,130.0,40.0],[160.0,0.0,200.0],[160.0,230.0,50.0],[0.0,160.0,255.0],[230.0,175.0,45.0],[0.0,210.0,140.0],[130.0,0.0,220.0],[170.0,170.0,170.0]],"precip4_11lev":[[254.0,254.0,254.0],[223.0,255.0,249.0],[154.0,217.0,202.0],[103.0,194.0,163.0],[64.0,173.0,117.0],[50.0,166.0,150.0],[90.0,160.0,205.0],[66.0,146.0,199.0],[76.0,141.0,196.0],[7.0,47.0,107.0],[7.0,30.0,70.0],[76.0,0.0,115.0]],"GMT_pola":[[0.05,0.05,1.0],[0.15,0.15,1.0],[0.25,0.25,1.0],[0.35,0.35,1.0],[0.45,0.45,1.0],[0.55,0.55,1.0],[0.65,0.65,1.0],[0.75,0.75,1.0],[0.85,0.85,1.0],[0.95,0.95,1.0],[1.0,0.95,0.95],[1.0,0.85,0.85],[1.0,0.75,0.75],[1.0,0.65,0.65],[1.0,0.55,0.55],[1.0,0.45,0.45],[1.0,0.35,0.35],[1.0,0.25,0.25],[1.0,0.15,0.15],[1.0,0.05,0.05]],"MPL_PuBu":[[0.997662,0.966659,0.983206],[0.992987,0.962722,0.980992],[0.988312,0.958785,0.978777],[0.983637,0.954848,0.976563],[0.978962,0.950911,0.974348],[0.974287,0.946974,0.972134],[0.969612,0.943037,0.969919],[0.964937,0.9391,0.967705],[0.960261,0.935163,0.96549],[0.957924,0.933195,0.964383],[0.950911,0.92729,0.961061],[0.948574,0.925321,0.959954],[0.941561,0.919416,0.956632],[0.939223,0.917447,0.955525],[0.932211,0.911542,0.952203],[0.929873,0.909573,0.951096],[0.921615,0.902837,0.947359],[0.914725,0.897424,0.944406],[0.91128,0.894717,0.94293],[0.900946,0.886597,0.938501],[0.894056,0.881184,0.935548],[0.887166,0.875771,0.932595],[0.883722,0.873064,0.931119],[0.873387,0.864944,0.92669],[0.866498,0.859531,0.923737],[0.859608,0.854118,0.920784],[0.856163,0.851411,0.919308],[0.845829,0.843291,0.914879],[0.838939,0.837878,0.911926],[0.832049,0.832464,0.908973],[0.828604,0.829758,0.907497],[0.81827,0.821638,0.903068],[0.809227,0.816532,0.900269],[0.798893,0.811611,0.897562],[0.788558,0.80669,0.894856],[0.778224,0.801769,0.892149],[0.767889,0.796847,0.889443],[0.762722,0.794387,0.888089],[0.74722,0.787005,0.884029],[0.736886,0.782084,0.881323],[0.726551,0.777163,0.878616],[0.716217,0.772241,0.875909],[0.705882,0.76732,0.873203],[0.695548,0.762399,0.870496],[0.685213,0.757478,0.867789],[0.680046,0.755017,0.866436],[0.664544,0.747636,0.862376],[0.65421,0.742714,0.859669],[0.642522,0.737793,0.856794],[0.630219,0.732872,0.853841],[0.617916,0.727951,0.850888],[0.605613,0.72303,0.847935],[0.59331,0.718108,0.844983],[0.587159,0.715648,0.843506],[0.568704,0.708266,0.839077],[0.556401,0.703345,0.836125],[0.544098,0.698424,0.833172],[0.531795,0.693503,0.830219],[0.519493,0.688581,0.827266],[0.50719,0.68366,0.824314],[0.494887,0.678739,0.821361],[0.488735,0.676278,0.819885],[0.470281,0.668897,0.815456],[0.457978,0.663975,0.812503],[0.44346,0.658132,0.808997],[0.428205,0.65198,0.805306],[0.412949,0.645829,0.801615],[0.397693,0.639677,0.797924],[0.382438,0.633526,0.794233],[0.367182,0.627374,0.790542],[0.351926,0.621223,0.786851],[0.336671,0.615071,0.78316],[0.321415,0.60892,0.779469],[0.306159,0.602768,0.775779],[0.290904,0.596617,0.772088],[0.283276,0.593541,0.770242],[0.260392,0.584314,0.764706],[0.245136,0.578162,0.761015],[0.229881,0.572011,0.757324],[0.214625,0.565859,0.753633],[0.201968,0.558308,0.749742],[0.189912,0.550434,0.745805],[0.177855,0.542561,0.741869],[0.165798,0.534687,0.737932],[0.153741,0.526813,0.733995],[0.141684,0.518939,0.730058],[0.129627,0.511065,0.726121],[0.11757,0.503191,0.722184],[0.105513,0.495317,0.718247],[0.093456,0.487443,0.71431],[0.081399,0.479569,0.710373],[0.075371,0.475632,0.708404],[0.057286,0.463822,0.702499],[0.045229,0.455948,0.698562],[0.033172,0.448074,0.694625],[0.021115,0.4402,0.690688],[0.019393,0.434479,0.682661],[0.019146,0.429066,0.674048],[0.0189,0.423652,0.665436],[0.018654,0.418239,0.656824],[0.018408,0.412826,0.648212],[0.018162,0.407413,0.6396],[0.017916,0.401999,0.630988],[0.01767,0.396586,0.622376],[0.017424,0.391173,0.613764],[0.017178,0.385759,0.605152],[0.016932,0.380346,0.59654],[0.016809,0.377639,0.592234],[0.01644,0.369519,0.579316],[0.016194,0.364106,0.570704],[0.015948,0.358693,0.562092],[0.015702,0.35328,0.553479],[0.015225,0.345098,0.540715],[0.014733,0.336732,0.527674],[0.014241,0.328366,0.514633],[0.013749,0.32,0.501592],[0.013256,0.311634,0.488551],[0.012764,0.303268,0.475509],[0.012272,0.294902,0.462468],[0.01178,0.286536,0.449427],[0.011288,0.27817,0.436386],[0.010796,0.269804,0.423345],[0.010304,0.261438,0.410304],[0.010058,0.257255,0.403783],[0.009319,0.244706,0.384221],[0.008827,0.23634,0.37118],[0.008335,0.227974,0.358139],[0.007843,0.219608,0.345098]],"GMT_relief_oceanonly":[[0.0,0.00098,0.004902],[0.0,0.002941,0.014706],[0.0,0.004902,0.02451],[0.0,0.006863,0.034314],[0.0,0.008824,0.044118],[0.0,0.010784,0.053922],[0.0,0.012745,0.063725],[0.0,0.014706,0.073529],[0.0,0.016667,0.083333],[0.0,0.018627,0.093137],[0.0,0.020588,0.102941],[0.0,0.022549,0.112745],[0.0,0.02451,0.122549],[0.0,0.026471,0.132353],[0.0,0.028431,0.142157],[0.0,0.030392,0.151961],[0.0,0.032353,0.161765],[0.0,0.034314,0.171569],[0.0,0.036275,0.181373],[0.0,0.038235,0.191176],[0.0,0.052941,0.210784],[0.0,0.080392,0.240196],[0.0,0.107843,0.269608],[0.0,0.135294,0.29902],[0.0,0.162745,0.328431],[0.0,0.190196,0.357843],[0.0,0.217647,0.387255],[0.0,0.245098,0.416667],[0.0,0.272549,0.446078],[0.0,0.3,0.47549],[0.0,0.327451,0.504902],[0.0,0.354902,0.534314],[0.0,0.382353,0.563725],[0.0,0.409804,0.593137],[0.0,0.437255,0.622549],[0.0,0.464706,0.651961],[0.0,0.492157,0.681373],[0.0,0.519608,0.710784],[0.0,0.547059,0.740196],[0.0,0.57451,0.769608],[0.016863,0.597451,0.781176],[0.050588,0.615882,0.774902],[0.084314,0.634314,0.768627],[0.118039,0.652745,0.762353],[0.151765,0.671176,0.756078],[0.18549,0.689608,0.749804],[0.219216,0.708039,0.743529],[0.252941,0.726471,0.737255],[0.286667,0.744902,0.73098],[0.320392,0.763333,0.724706],[0.354118,0.781961,0.718431],[0.387843,0.800784,0.712157],[0.421569,0.819608,0.705882],[0.455294,0.838431,0.699608],[0.48902,0.857255,0.693333],[0.522745,0.876078,0.687059],[0.556471,0.894902,0.680784],[0.590196,0.913725,0.67451],[0.623922,0.932549,0.668235],[0.657647,0.951373,0.661961],[0.682157,0.961765,0.667255],[0.697451,0.963725,0.684118],[0.712745,0.965686,0.70098],[0.728039,0.967647,0.717843],[0.743333,0.969608,0.734706],[0.758627,0.971569,0.751569],[0.773922,0.973529,0.768431],[0.789216,0.97549,0.785294],[0.80451,0.977451,0.802157],[0.819804,0.979412,0.81902],[0.835098,0.981373,0.836078],[0.850392,0.983333,0.853333],[0.865686,0.985294,0.870588],[0.88098,0.987255,0.887843],[0.896275,0.989216,0.905098],[0.911569,0.991176,0.922353],[0.926863,0.993137,0.939608],[0.942157,0.995098,0.956863],[0.957451,0.997059,0.974118],[0.972745,0.99902,0.991373],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314],[0.784314,0.784314,0.784314]],"so4_23":[[0.0,0.0,0.0],[87.0,0.0,136.0],[58.0,0.0,176.0],[29.0,0.0,215.0],[0.0,0.0,255.0],[3.0,60.0,175.0],[5.0,119.0,95.0],[8.0,179.0,15.0],[70.0,198.0,11.0],[132.0,217.0,8.0],[193.0,236.0,4.0],[255.0,255.0,0.0],[255.0,191.0,0.0],[255.0,128.0,0.0],[255.0,64.0,0.0],[255.0,0.0,0.0],[250.0,27.0,80.0],[245.0,53.0,160.0],[240.0,80.0,240.0],[244.0,124.0,244.0],[248.0,168.0,248.0],[251.0,211.0,251.0],[255.0,255.0,255.0]],"precip3_16lev":[[255.0,255.0,255.0],[214.0,226.0,255.0],[181.0,201.0,255.0],[142.0,178.0,255.0],[127.0,150.0,255.0],[99.0,112.0,247.0],[0.0,99.0,255.0],[0.0,150.0,150.0],[0.0,198.0,51.0],[99.0,255.0,0.0],[150.0,255.0,0.0],[198.0,255.0,51.0],[255.0,255.0,0.0],[255.0,198.0,0.0],[255.0,160.0,0.0],[255.0,124.0,0.0],[255.0,25.0,0.0]],"tbrVar1":[[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[17.0,0.0,27.0],[35.0,0.0,54.0],[52.0,0.0,82.0],[70.0,0.0,109.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[80.0,16.0,125.0],[73.0,33.0,114.0],[65.0,49.0,103.0],[58.0,65.0,92.0],[51.0,81.0,81.0],[44.0,98.0,70.0],[37.0,114.0,59.0],[30.0,130.0,48.0],[22.0,146.0,37.0],[15.0,163.0,26.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[35.0,187.0,13.0],[63.0,196.0,12.0],[90.0,204.0,10.0],[118.0,213.0,8.0],[145.0,221.0,7.0],[173.0,230.0,5.0],[200.0,238.0,3.0],[228.0,247.0,2.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,243.0,0.0],[255.0,231.0,0.0],[255.0,219.0,0.0],[255.0,206.0,0.0],[255.0,194.0,0.0],[255.0,182.0,0.0],[255.0,170.0,0.0],[255.0,158.0,0.0],[255.0,146.0,0.0],[255.0,134.0,0.0],[255.0,121.0,0.0],[255.0,109.0,0.0],[255.0,97.0,0.0],[255.0,85.0,0.0],[255.0,73.0,0.0],[255.0,61.0,0.0],[255.0,49.0,0.0],[255.0,36.0,0.0],[255.0,24.0,0.0],[255.0,12.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[251.0,20.0,60.0],[248.0,40.0,120.0],[244.0,60.0,180.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[241.0,95.0,241.0],[243.0,109.0,243.0],[244.0,124.0,244.0],[245.0,138.0,245.0],[246.0,153.0,246.0],[248.0,168.0,248.0],[249.0,182.0,249.0],[250.0,197.0,250.0],[251.0,211.0,251.0],[253.0,226.0,253.0],[254.0,240.0,254.0],[255.0,255.0,255.0]],"rainbow+gray":[[0.0,0.0,0.0],[4.0,0.0,3.0],[9.0,0.0,7.0],[13.0,0.0,10.0],[18.0,0.0,14.0],[22.0,0.0,19.0],[27.0,0.0,23.0],[31.0,0.0,28.0],[36.0,0.0,32.0],[40.0,0.0,38.0],[45.0,0.0,43.0],[50.0,0.0,48.0],[58.0,0.0,59.0],[64.0,0.0,68.0],[68.0,0.0,72.0],[69.0,0.0,77.0],[72.0,0.0,81.0],[74.0,0.0,86.0],[77.0,0.0,91.0],[79.0,0.0,95.0],[80.0,0.0,100.0],[82.0,0.0,104.0],[83.0,0.0,109.0],[84.0,0.0,118.0],[86.0,0.0,122.0],[88.0,0.0,132.0],[86.0,0.0,136.0],[87.0,0.0,141.0],[87.0,0.0,145.0],[87.0,0.0,150.0],[85.0,0.0,154.0],[84.0,0.0,159.0],[84.0,0.0,163.0],[84.0,0.0,168.0],[79.0,0.0,177.0],[78.0,0.0,182.0],[77.0,0.0,186.0],[76.0,0.0,191.0],[70.0,0.0,200.0],[68.0,0.0,204.0],[66.0,0.0,209.0],[60.0,0.0,214.0],[58.0,0.0,218.0],[55.0,0.0,223.0],[46.0,0.0,232.0],[43.0,0.0,236.0],[40.0,0.0,241.0],[36.0,0.0,245.0],[33.0,0.0,250.0],[25.0,0.0,255.0],[16.0,0.0,255.0],[12.0,0.0,255.0],[4.0,0.0,255.0],[0.0,0.0,255.0],[0.0,4.0,255.0],[0.0,16.0,255.0],[0.0,21.0,255.0],[0.0,25.0,255.0],[0.0,29.0,255.0],[0.0,38.0,255.0],[0.0,42.0,255.0],[0.0,46.0,255.0],[0.0,51.0,255.0],[0.0,63.0,255.0],[0.0,67.0,255.0],[0.0,72.0,255.0],[0.0,84.0,255.0],[0.0,89.0,255.0],[0.0,93.0,255.0],[0.0,97.0,255.0],[0.0,106.0,255.0],[0.0,110.0,255.0],[0.0,114.0,255.0],[0.0,119.0,255.0],[0.0,127.0,255.0],[0.0,135.0,255.0],[0.0,140.0,255.0],[0.0,152.0,255.0],[0.0,157.0,255.0],[0.0,161.0,255.0],[0.0,165.0,255.0],[0.0,174.0,255.0],[0.0,178.0,255.0],[0.0,182.0,255.0],[0.0,187.0,255.0],[0.0,195.0,255.0],[0.0,199.0,255.0],[0.0,216.0,255.0],[0.0,220.0,255.0],[0.0,225.0,255.0],[0.0,229.0,255.0],[0.0,233.0,255.0],[0.0,242.0,255.0],[0.0,246.0,255.0],[0.0,250.0,255.0],[0.0,255.0,255.0],[0.0,255.0,246.0],[0.0,255.0,242.0],[0.0,255.0,238.0],[0.0,255.0,225.0],[0.0,255.0,216.0],[0.0,255.0,212.0],[0.0,255.0,203.0],[0.0,255.0,199.0],[0.0,255.0,195.0],[0.0,255.0,191.0],[0.0,255.0,187.0],[0.0,255.0,178.0],[0.0,255.0,174.0],[0.0,255.0,170.0],[0.0,255.0,157.0],[0.0,255.0,152.0],[0.0,255.0,144.0],[0.0,255.0,135.0],[0.0,255.0,131.0],[0.0,255.0,127.0],[0.0,255.0,123.0],[0.0,255.0,114.0],[0.0,255.0,110.0],[0.0,255.0,106.0],[0.0,255.0,102.0],[0.0,255.0,89.0],[0.0,255.0,84.0],[0.0,255.0,80.0],[0.0,255.0,76.0],[0.0,255.0,63.0],[0.0,255.0,59.0],[0.0,255.0,55.0],[0.0,255.0,46.0],[0.0,255.0,42.0],[0.0,255.0,38.0],[0.0,255.0,25.0],[0.0,255.0,21.0],[0.0,255.0,16.0],[0.0,255.0,12.0],[0.0,255.0,8.0],[0.0,255.0,0.0],[8.0,255.0,0.0],[12.0,255.0,0.0],[21.0,255.0,0.0],[25.0,255.0,0.0],[29.0,255.0,0.0],[42.0,255.0,0.0],[46.0,255.0,0.0],[51.0,255.0,0.0],[55.0,255.0,0.0],[63.0,255.0,0.0],[67.0,255.0,0.0],[72.0,255.0,0.0],[76.0,255.0,0.0],[89.0,255.0,0.0],[93.0,255.0,0.0],[97.0,255.0,0.0],[110.0,255.0,0.0],[114.0,255.0,0.0],[119.0,255.0,0.0],[123.0,255.0,0.0],[131.0,255.0,0.0],[135.0,255.0,0.0],[140.0,255.0,0.0],[144.0,255.0,0.0],[153.0,255.0,0.0],[161.0,255.0,0.0],[165.0,255.0,0.0],[178.0,255.0,0.0],[182.0,255.0,0.0],[187.0,255.0,0.0],[191.0,255.0,0.0],[199.0,255.0,0.0],[203.0,255.0,0.0],[208.0,255.0,0.0],[212.0,255.0,0.0],[221.0,255.0,0.0],[225.0,255.0,0.0],[242.0,255.0,0.0],[246.0,255.0,0.0],[250.0,255.0,0.0],[255.0,255.0,0.0],[255.0,250.0,0.0],[255.0,242.0,0.0],[255.0,238.0,0.0],[255.0,233.0,0.0],[255.0,229.0,0.0],[255.0,221.0,0.0],[255.0,216.0,0.0],[255.0,212.0,0.0],[255.0,199.0,0.0],[255.0,191.0,0.0],[255.0,187.0,0.0],[255.0,178.0,0.0],[255.0,174.0,0.0],[255.0,170.0,0.0],[255.0,165.0,0.0],[255.0,161.0,0.0],[255.0,153.0,0.0],[255.0,148.0,0.0],[255.0,144.0,0.0],[255.0,131.0,0.0],[255.0,127.0,0.0],[255.0,119.0,0.0],[255.0,110.0,0.0],[255.0,106.0,0.0],[255.0,102.0,0.0],[255.0,97.0,0.0],[255.0,89.0,0.0],[255.0,85.0,0.0],[255.0,80.0,0.0],[255.0,76.0,0.0],[255.0,63.0,0.0],[255.0,59.0,0.0],[255.0,55.0,0.0],[255.0,51.0,0.0],[255.0,38.0,0.0],[255.0,34.0,0.0],[255.0,29.0,0.0],[255.0,21.0,0.0],[255.0,17.0,0.0],[255.0,12.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[211.0,211.0,211.0]],"SVG_bhw3_22":[[36.0,20.0,46.0],[37.0,22.0,50.0],[39.0,25.0,54.0],[40.0,28.0,58.0],[42.0,31.0,62.0],[44.0,34.0,66.0],[45.0,37.0,70.0],[47.0,40.0,74.0],[48.0,43.0,78.0],[50.0,45.0,82.0],[52.0,48.0,86.0],[53.0,51.0,90.0],[55.0,54.0,94.0],[57.0,57.0,98.0],[58.0,60.0,102.0],[60.0,63.0,106.0],[61.0,66.0,110.0],[63.0,69.0,114.0],[65.0,71.0,118.0],[66.0,74.0,122.0],[68.0,77.0,126.0],[69.0,80.0,130.0],[71.0,83.0,134.0],[73.0,86.0,138.0],[74.0,89.0,143.0],[76.0,92.0,147.0],[78.0,94.0,151.0],[79.0,97.0,155.0],[81.0,100.0,159.0],[83.0,102.0,161.0],[85.0,103.0,162.0],[87.0,104.0,163.0],[89.0,105.0,164.0],[91.0,106.0,165.0],[93.0,107.0,166.0],[95.0,108.0,166.0],[97.0,109.0,167.0],[99.0,110.0,168.0],[101.0,111.0,169.0],[103.0,112.0,170.0],[105.0,113.0,171.0],[107.0,114.0,172.0],[109.0,115.0,173.0],[111.0,116.0,174.0],[113.0,116.0,175.0],[115.0,117.0,176.0],[117.0,118.0,177.0],[119.0,119.0,177.0],[121.0,120.0,178.0],[121.0,119.0,177.0],[120.0,118.0,175.0],[118.0,116.0,172.0],[117.0,114.0,170.0],[116.0,113.0,168.0],[115.0,111.0,166.0],[114.0,109.0,164.0],[113.0,108.0,162.0],[112.0,106.0,160.0],[111.0,104.0,157.0],[110.0,103.0,155.0],[109.0,101.0,153.0],[108.0,100.0,151.0],[107.0,98.0,149.0],[106.0,96.0,147.0],[104.0,95.0,144.0],[103.0,93.0,142.0],[102.0,91.0,140.0],[101.0,90.0,138.0],[100.0,88.0,136.0],[99.0,87.0,134.0],[98.0,85.0,132.0],[97.0,83.0,129.0],[96.0,82.0,127.0],[95.0,80.0,125.0],[94.0,78.0,123.0],[93.0,77.0,121.0],[92.0,75.0,119.0],[91.0,74.0,117.0],[89.0,72.0,114.0],[89.0,71.0,113.0],[93.0,75.0,117.0],[98.0,79.0,120.0],[102.0,83.0,124.0],[106.0,88.0,128.0],[111.0,92.0,132.0],[115.0,96.0,135.0],[119.0,100.0,139.0],[123.0,104.0,143.0],[128.0,108.0,146.0],[132.0,112.0,150.0],[136.0,117.0,154.0],[141.0,121.0,158.0],[145.0,125.0,161.0],[149.0,129.0,165.0],[154.0,133.0,169.0],[158.0,137.0,172.0],[162.0,141.0,176.0],[166.0,146.0,180.0],[171.0,150.0,183.0],[175.0,154.0,187.0],[179.0,158.0,191.0],[184.0,162.0,195.0],[188.0,166.0,198.0],[192.0,170.0,202.0],[197.0,175.0,206.0],[201.0,179.0,209.0],[205.0,183.0,213.0],[209.0,187.0,217.0],[214.0,191.0,221.0],[218.0,195.0,224.0],[222.0,199.0,228.0],[227.0,204.0,232.0],[231.0,208.0,235.0],[235.0,212.0,239.0],[240.0,216.0,243.0],[244.0,220.0,247.0],[248.0,224.0,250.0],[247.0,221.0,247.0],[244.0,218.0,243.0],[242.0,215.0,239.0],[240.0,211.0,235.0],[238.0,208.0,231.0],[236.0,204.0,227.0],[234.0,201.0,222.0],[231.0,197.0,218.0],[229.0,194.0,214.0],[227.0,191.0,210.0],[225.0,187.0,206.0],[223.0,184.0,202.0],[221.0,180.0,198.0],[219.0,177.0,194.0],[216.0,174.0,190.0],[214.0,170.0,186.0],[212.0,167.0,182.0],[210.0,163.0,178.0],[208.0,160.0,174.0],[206.0,157.0,170.0],[204.0,153.0,166.0],[201.0,150.0,162.0],[199.0,146.0,158.0],[197.0,143.0,154.0],[195.0,139.0,150.0],[193.0,136.0,146.0],[191.0,133.0,142.0],[189.0,129.0,138.0],[189.0,128.0,135.0],[192.0,130.0,133.0],[194.0,132.0,131.0],[197.0,134.0,129.0],[200.0,135.0,127.0],[203.0,137.0,125.0],[205.0,139.0,123.0],[208.0,141.0,121.0],[211.0,142.0,120.0],[213.0,144.0,118.0],[216.0,146.0,116.0],[219.0,148.0,114.0],[222.0,150.0,112.0],[224.0,151.0,110.0],[227.0,153.0,108.0],[230.0,155.0,106.0],[233.0,157.0,104.0],[235.0,158.0,103.0],[234.0,156.0,102.0],[232.0,154.0,101.0],[230.0,151.0,100.0],[229.0,149.0,99.0],[227.0,146.0,98.0],[225.0,144.0,97.0],[223.0,142.0,96.0],[221.0,139.0,95.0],[220.0,137.0,94.0],[218.0,134.0,93.0],[216.0,132.0,92.0],[214.0,129.0,91.0],[213.0,127.0,90.0],[211.0,125.0,89.0],[209.0,122.0,88.0],[207.0,120.0,87.0],[205.0,117.0,86.0],[204.0,115.0,85.0],[202.0,112.0,84.0],[200.0,110.0,83.0],[196.0,107.0,81.0],[193.0,104.0,80.0],[189.0,101.0,78.0],[186.0,98.0,76.0],[182.0,95.0,74.0],[179.0,92.0,72.0],[176.0,89.0,71.0],[172.0,86.0,69.0],[169.0,83.0,67.0],[165.0,80.0,65.0],[162.0,77.0,64.0],[158.0,74.0,62.0],[155.0,71.0,60.0],[151.0,68.0,58.0],[148.0,65.0,56.0],[144.0,62.0,55.0],[141.0,59.0,53.0],[138.0,56.0,51.0],[134.0,53.0,49.0],[131.0,52.0,49.0],[129.0,52.0,51.0],[127.0,53.0,53.0],[124.0,53.0,54.0],[122.0,54.0,56.0],[120.0,54.0,57.0],[118.0,54.0,59.0],[115.0,55.0,61.0],[113.0,55.0,62.0],[111.0,56.0,64.0],[108.0,56.0,65.0],[106.0,57.0,67.0],[104.0,57.0,69.0],[102.0,58.0,70.0],[99.0,58.0,72.0],[97.0,59.0,73.0],[95.0,59.0,75.0],[93.0,60.0,77.0]],"circular_0":[[61.0,100.0,226.0],[235.0,110.0,110.0],[240.0,128.0,128.0],[114.0,200.0,242.0],[184.0,225.0,244.0],[207.0,235.0,249.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[207.0,235.0,249.0],[184.0,225.0,244.0],[114.0,200.0,242.0],[240.0,128.0,128.0],[235.0,110.0,110.0],[61.0,100.0,226.0]],"MPL_Pastel2":[[0.709927,0.884014,0.800369],[0.725859,0.879493,0.793264],[0.741792,0.874971,0.786159],[0.757724,0.87045,0.779054],[0.773656,0.865928,0.771949],[0.789589,0.861407,0.764844],[0.805521,0.856886,0.757739],[0.821453,0.852364,0.750634],[0.837386,0.847843,0.743529],[0.845352,0.845582,0.739977],[0.86925,0.8388,0.72932],[0.877216,0.83654,0.725767],[0.901115,0.829758,0.71511],[0.909081,0.827497,0.711557],[0.93298,0.820715,0.7009],[0.940946,0.818454,0.697347],[0.964844,0.811672,0.68669],[0.980777,0.807151,0.679585],[0.988743,0.80489,0.676032],[0.978316,0.806136,0.691119],[0.967551,0.807859,0.704037],[0.956786,0.809581,0.716955],[0.951403,0.810442,0.723414],[0.935256,0.813026,0.742791],[0.924491,0.814748,0.755709],[0.913725,0.816471,0.768627],[0.908343,0.817332,0.775087],[0.892195,0.819915,0.794464],[0.88143,0.821638,0.807382],[0.870665,0.82336,0.8203],[0.865283,0.824221,0.826759],[0.849135,0.826805,0.846136],[0.83837,0.828527,0.859054],[0.827605,0.83025,0.871972],[0.81684,0.831972,0.88489],[0.806075,0.833695,0.897809],[0.796709,0.835125,0.909742],[0.801123,0.833941,0.909312],[0.814364,0.830388,0.90802],[0.823191,0.82802,0.907159],[0.832018,0.825652,0.906298],[0.840846,0.823283,0.905436],[0.849673,0.820915,0.904575],[0.858501,0.818547,0.903714],[0.867328,0.816178,0.902853],[0.871742,0.814994,0.902422],[0.884983,0.811442,0.90113],[0.89381,0.809073,0.900269],[0.902637,0.806705,0.899408],[0.911465,0.804337,0.898547],[0.920292,0.801968,0.897686],[0.92912,0.7996,0.896824],[0.937947,0.797232,0.895963],[0.942361,0.796048,0.895532],[0.955602,0.792495,0.894241],[0.954279,0.800092,0.889135],[0.951265,0.80935,0.883322],[0.948251,0.818608,0.877509],[0.945236,0.827866,0.871696],[0.942222,0.837124,0.865882],[0.939208,0.846382,0.860069],[0.937701,0.851011,0.857163],[0.93318,0.864898,0.848443],[0.930165,0.874156,0.84263],[0.927151,0.883414,0.836817],[0.924137,0.892672,0.831003],[0.921123,0.90193,0.82519],[0.918108,0.911188,0.819377],[0.915094,0.920446,0.813564],[0.91208,0.929704,0.807751],[0.909066,0.938962,0.801938],[0.906052,0.94822,0.796125],[0.903037,0.957478,0.790311],[0.905421,0.960369,0.784498],[0.910804,0.959723,0.778685],[0.913495,0.9594,0.775779],[0.921569,0.958431,0.767059],[0.926951,0.957785,0.761246],[0.932334,0.95714,0.755433],[0.937716,0.956494,0.749619],[0.943099,0.955848,0.743806],[0.948481,0.955202,0.737993],[0.953864,0.954556,0.73218],[0.959246,0.95391,0.726367],[0.964629,0.953264,0.720554],[0.970012,0.952618,0.714741],[0.975394,0.951972,0.708927],[0.980777,0.951326,0.703114],[0.986159,0.950681,0.697301],[0.991542,0.950035,0.691488],[0.996924,0.949389,0.685675],[0.999616,0.949066,0.682768],[0.995694,0.944098,0.69158],[0.99268,0.940654,0.698039],[0.989666,0.937209,0.704498],[0.986651,0.933764,0.710957],[0.983637,0.930319,0.717416],[0.980623,0.926874,0.723875],[0.977609,0.923429,0.730335],[0.974594,0.919985,0.736794],[0.97158,0.91654,0.743253],[0.968566,0.913095,0.749712],[0.965552,0.90965,0.756171],[0.962537,0.906205,0.76263],[0.959523,0.90276,0.769089],[0.956509,0.899316,0.775548],[0.953495,0.895871,0.782007],[0.951988,0.894148,0.785236],[0.947466,0.888981,0.794925],[0.943391,0.88526,0.8],[0.935425,0.880523,0.8],[0.927459,0.875786,0.8],[0.919493,0.87105,0.8],[0.911526,0.866313,0.8],[0.90356,0.861576,0.8],[0.895594,0.85684,0.8],[0.887628,0.852103,0.8],[0.879662,0.847366,0.8],[0.871696,0.84263,0.8],[0.863729,0.837893,0.8],[0.855763,0.833156,0.8],[0.847797,0.82842,0.8],[0.839831,0.823683,0.8],[0.835848,0.821315,0.8],[0.823899,0.81421,0.8],[0.815932,0.809473,0.8],[0.807966,0.804737,0.8],[0.8,0.8,0.8]],"SVG_foggy_sunrise":[[90.0,69.0,88.0],[94.0,72.0,92.0],[97.0,74.0,93.0],[100.0,75.0,94.0],[102.0,77.0,95.0],[103.0,78.0,95.0],[104.0,79.0,95.0],[105.0,80.0,97.0],[106.0,81.0,98.0],[108.0,81.0,99.0],[110.0,82.0,102.0],[111.0,82.0,103.0],[112.0,83.0,103.0],[114.0,85.0,104.0],[115.0,86.0,104.0],[115.0,86.0,105.0],[116.0,87.0,106.0],[117.0,88.0,107.0],[119.0,89.0,107.0],[121.0,90.0,109.0],[122.0,91.0,110.0],[123.0,92.0,111.0],[125.0,93.0,112.0],[127.0,94.0,113.0],[129.0,96.0,114.0],[134.0,99.0,116.0],[139.0,101.0,118.0],[144.0,104.0,119.0],[149.0,107.0,120.0],[154.0,111.0,120.0],[159.0,114.0,121.0],[164.0,119.0,124.0],[167.0,122.0,126.0],[170.0,125.0,127.0],[173.0,128.0,129.0],[176.0,132.0,130.0],[177.0,134.0,131.0],[179.0,137.0,134.0],[181.0,139.0,136.0],[182.0,140.0,137.0],[183.0,142.0,139.0],[184.0,144.0,141.0],[185.0,145.0,142.0],[187.0,148.0,144.0],[188.0,149.0,146.0],[190.0,151.0,148.0],[190.0,153.0,149.0],[191.0,155.0,151.0],[192.0,156.0,152.0],[194.0,159.0,155.0],[196.0,160.0,157.0],[196.0,161.0,159.0],[197.0,163.0,161.0],[198.0,164.0,163.0],[201.0,166.0,164.0],[206.0,165.0,164.0],[213.0,164.0,163.0],[219.0,161.0,162.0],[224.0,159.0,159.0],[227.0,158.0,159.0],[227.0,157.0,158.0],[226.0,153.0,154.0],[225.0,150.0,152.0],[224.0,143.0,148.0],[222.0,137.0,145.0],[217.0,132.0,142.0],[211.0,128.0,140.0],[204.0,126.0,140.0],[202.0,126.0,140.0],[202.0,127.0,142.0],[205.0,127.0,142.0],[209.0,128.0,142.0],[214.0,129.0,144.0],[218.0,131.0,146.0],[218.0,132.0,147.0],[219.0,135.0,148.0],[219.0,138.0,151.0],[218.0,139.0,152.0],[218.0,139.0,152.0],[217.0,139.0,154.0],[213.0,139.0,155.0],[210.0,139.0,155.0],[208.0,140.0,157.0],[206.0,141.0,159.0],[205.0,141.0,160.0],[203.0,143.0,162.0],[200.0,144.0,164.0],[200.0,145.0,165.0],[199.0,146.0,167.0],[199.0,145.0,167.0],[197.0,143.0,165.0],[195.0,140.0,163.0],[193.0,136.0,159.0],[193.0,135.0,157.0],[194.0,134.0,157.0],[196.0,134.0,157.0],[198.0,135.0,158.0],[200.0,135.0,158.0],[203.0,136.0,160.0],[205.0,137.0,161.0],[204.0,136.0,161.0],[203.0,136.0,161.0],[202.0,136.0,162.0],[201.0,136.0,163.0],[199.0,138.0,165.0],[193.0,139.0,165.0],[188.0,141.0,167.0],[185.0,142.0,169.0],[182.0,143.0,170.0],[177.0,144.0,171.0],[176.0,148.0,175.0],[175.0,152.0,179.0],[176.0,155.0,182.0],[179.0,160.0,187.0],[182.0,165.0,191.0],[183.0,166.0,192.0],[184.0,166.0,191.0],[186.0,165.0,192.0],[186.0,164.0,191.0],[186.0,163.0,190.0],[186.0,160.0,187.0],[185.0,157.0,185.0],[182.0,152.0,180.0],[182.0,149.0,176.0],[181.0,146.0,174.0],[179.0,143.0,171.0],[175.0,138.0,167.0],[172.0,133.0,163.0],[169.0,130.0,159.0],[167.0,128.0,158.0],[166.0,126.0,157.0],[164.0,124.0,156.0],[164.0,124.0,155.0],[163.0,123.0,154.0],[162.0,122.0,154.0],[160.0,122.0,154.0],[160.0,121.0,154.0],[159.0,121.0,154.0],[158.0,120.0,153.0],[157.0,120.0,153.0],[156.0,120.0,153.0],[155.0,120.0,153.0],[155.0,120.0,153.0],[154.0,120.0,153.0],[153.0,120.0,153.0],[152.0,120.0,154.0],[151.0,120.0,155.0],[150.0,121.0,155.0],[149.0,121.0,155.0],[148.0,121.0,155.0],[148.0,122.0,156.0],[148.0,122.0,156.0],[147.0,122.0,156.0],[147.0,124.0,158.0],[147.0,124.0,159.0],[146.0,124.0,159.0],[146.0,125.0,160.0],[146.0,125.0,161.0],[145.0,126.0,162.0],[146.0,128.0,164.0],[146.0,129.0,166.0],[147.0,130.0,167.0],[147.0,132.0,169.0],[148.0,134.0,171.0],[149.0,136.0,174.0],[153.0,141.0,179.0],[154.0,143.0,181.0],[155.0,145.0,183.0],[157.0,148.0,185.0],[157.0,149.0,186.0],[158.0,151.0,189.0],[159.0,152.0,191.0],[160.0,153.0,192.0],[161.0,155.0,193.0],[161.0,155.0,193.0],[161.0,155.0,193.0],[160.0,154.0,192.0],[159.0,152.0,191.0],[158.0,151.0,190.0],[157.0,150.0,188.0],[154.0,148.0,186.0],[153.0,146.0,185.0],[152.0,144.0,183.0],[149.0,141.0,180.0],[147.0,139.0,178.0],[146.0,138.0,177.0],[145.0,136.0,175.0],[144.0,135.0,174.0],[142.0,134.0,173.0],[140.0,131.0,170.0],[139.0,130.0,169.0],[138.0,129.0,168.0],[137.0,128.0,168.0],[137.0,128.0,167.0],[136.0,128.0,167.0],[135.0,127.0,166.0],[135.0,127.0,166.0],[136.0,128.0,167.0],[137.0,129.0,169.0],[137.0,130.0,169.0],[137.0,130.0,169.0],[135.0,128.0,167.0],[134.0,128.0,167.0],[134.0,127.0,167.0],[133.0,126.0,167.0],[133.0,126.0,167.0],[133.0,127.0,167.0],[131.0,126.0,166.0],[131.0,126.0,166.0],[130.0,126.0,167.0],[129.0,126.0,166.0],[129.0,126.0,166.0],[129.0,126.0,166.0],[130.0,126.0,166.0],[130.0,126.0,166.0],[129.0,125.0,165.0],[127.0,124.0,164.0],[127.0,124.0,164.0],[126.0,124.0,164.0],[125.0,123.0,162.0]],"cb_rainbow_inv":[[255.0,179.0,255.0],[249.0,174.0,252.0],[244.0,170.0,250.0],[238.0,166.0,247.0],[232.0,162.0,245.0],[225.0,157.0,242.0],[219.0,153.0,240.0],[213.0,149.0,237.0],[206.0,145.0,235.0],[200.0,142.0,232.0],[193.0,138.0,230.0],[186.0,134.0,227.0],[179.0,130.0,224.0],[172.0,126.0,222.0],[165.0,123.0,219.0],[158.0,119.0,217.0],[151.0,116.0,214.0],[144.0,112.0,212.0],[137.0,109.0,209.0],[130.0,105.0,207.0],[123.0,102.0,204.0],[115.0,99.0,201.0],[108.0,95.0,199.0],[101.0,92.0,196.0],[94.0,89.0,194.0],[86.0,86.0,191.0],[83.0,87.0,189.0],[80.0,88.0,186.0],[77.0,90.0,184.0],[74.0,91.0,181.0],[71.0,92.0,179.0],[69.0,94.0,176.0],[66.0,96.0,173.0],[63.0,97.0,171.0],[61.0,99.0,168.0],[58.0,101.0,166.0],[55.0,102.0,163.0],[53.0,104.0,161.0],[51.0,106.0,158.0],[48.0,108.0,156.0],[46.0,110.0,153.0],[44.0,111.0,150.0],[41.0,113.0,148.0],[39.0,115.0,145.0],[37.0,117.0,143.0],[35.0,119.0,140.0],[33.0,120.0,138.0],[31.0,122.0,135.0],[29.0,124.0,133.0],[27.0,125.0,130.0],[25.0,127.0,128.0],[24.0,125.0,122.0],[22.0,122.0,115.0],[20.0,120.0,109.0],[19.0,117.0,102.0],[17.0,115.0,96.0],[16.0,112.0,90.0],[14.0,110.0,84.0],[13.0,107.0,78.0],[12.0,105.0,72.0],[10.0,102.0,66.0],[9.0,99.0,60.0],[8.0,97.0,55.0],[7.0,94.0,49.0],[6.0,92.0,44.0],[4.0,89.0,39.0],[3.0,87.0,34.0],[3.0,84.0,29.0],[2.0,82.0,25.0],[1.0,79.0,20.0],[0.0,77.0,16.0],[1.0,79.0,14.0],[2.0,82.0,12.0],[3.0,84.0,10.0],[3.0,87.0,8.0],[4.0,89.0,5.0],[8.0,92.0,6.0],[13.0,94.0,7.0],[18.0,97.0,8.0],[23.0,99.0,9.0],[28.0,102.0,10.0],[33.0,105.0,12.0],[38.0,107.0,13.0],[44.0,110.0,14.0],[49.0,112.0,16.0],[55.0,115.0,17.0],[61.0,117.0,19.0],[67.0,120.0,20.0],[73.0,122.0,22.0],[79.0,125.0,24.0],[86.0,128.0,25.0],[92.0,130.0,27.0],[98.0,133.0,29.0],[105.0,135.0,31.0],[111.0,138.0,33.0],[118.0,140.0,35.0],[125.0,143.0,37.0],[131.0,145.0,39.0],[138.0,148.0,41.0],[145.0,150.0,44.0],[152.0,153.0,46.0],[156.0,153.0,48.0],[158.0,151.0,51.0],[161.0,149.0,53.0],[163.0,147.0,55.0],[166.0,146.0,58.0],[168.0,144.0,61.0],[171.0,142.0,63.0],[173.0,140.0,66.0],[176.0,139.0,69.0],[179.0,137.0,71.0],[181.0,135.0,74.0],[184.0,134.0,77.0],[186.0,132.0,80.0],[189.0,131.0,83.0],[191.0,130.0,86.0],[194.0,128.0,89.0],[196.0,127.0,92.0],[199.0,126.0,95.0],[201.0,125.0,99.0],[204.0,124.0,102.0],[207.0,123.0,105.0],[209.0,122.0,109.0],[212.0,122.0,112.0],[214.0,121.0,116.0],[217.0,121.0,119.0],[219.0,123.0,125.0],[222.0,126.0,133.0],[224.0,130.0,140.0],[227.0,134.0,147.0],[230.0,138.0,155.0],[232.0,142.0,162.0],[235.0,145.0,169.0],[237.0,149.0,176.0],[240.0,153.0,183.0],[242.0,157.0,190.0],[245.0,162.0,197.0],[247.0,166.0,204.0],[250.0,170.0,210.0],[252.0,174.0,217.0],[255.0,179.0,223.0],[250.0,171.0,217.0],[245.0,165.0,211.0],[240.0,158.0,206.0],[235.0,151.0,200.0],[230.0,145.0,194.0],[224.0,138.0,188.0],[219.0,132.0,183.0],[214.0,126.0,177.0],[209.0,120.0,172.0],[204.0,114.0,167.0],[199.0,109.0,161.0],[194.0,103.0,156.0],[189.0,98.0,151.0],[184.0,93.0,146.0],[179.0,87.0,141.0],[173.0,83.0,136.0],[168.0,78.0,131.0],[163.0,73.0,126.0],[158.0,69.0,121.0],[153.0,64.0,116.0],[148.0,60.0,111.0],[143.0,56.0,107.0],[138.0,52.0,102.0],[133.0,48.0,97.0],[128.0,45.0,93.0],[122.0,41.0,89.0],[117.0,38.0,84.0],[112.0,35.0,80.0],[107.0,31.0,76.0],[102.0,29.0,71.0],[97.0,26.0,67.0],[92.0,23.0,63.0],[87.0,21.0,59.0],[82.0,18.0,55.0],[77.0,16.0,51.0],[71.0,14.0,47.0],[66.0,12.0,44.0],[61.0,10.0,40.0],[56.0,9.0,36.0],[51.0,7.0,33.0],[46.0,6.0,29.0],[41.0,5.0,26.0],[36.0,3.0,22.0],[31.0,3.0,19.0],[26.0,2.0,16.0],[20.0,1.0,12.0],[15.0,1.0,9.0],[10.0,0.0,6.0],[5.0,0.0,3.0],[255.0,255.0,255.0],[250.0,250.0,250.0],[245.0,245.0,245.0],[240.0,240.0,240.0],[235.0,235.0,235.0],[230.0,230.0,230.0],[224.0,224.0,224.0],[219.0,219.0,219.0],[214.0,214.0,214.0],[209.0,209.0,209.0],[204.0,204.0,204.0],[199.0,199.0,199.0],[194.0,194.0,194.0],[189.0,189.0,189.0],[184.0,184.0,184.0],[179.0,179.0,179.0],[173.0,173.0,173.0],[168.0,168.0,168.0],[163.0,163.0,163.0],[158.0,158.0,158.0],[153.0,153.0,153.0],[148.0,148.0,148.0],[143.0,143.0,143.0],[138.0,138.0,138.0],[133.0,133.0,133.0],[128.0,128.0,128.0],[122.0,122.0,122.0],[117.0,117.0,117.0],[112.0,112.0,112.0],[107.0,107.0,107.0],[102.0,102.0,102.0],[97.0,97.0,97.0],[92.0,92.0,92.0],[87.0,87.0,87.0],[82.0,82.0,82.0],[77.0,77.0,77.0],[71.0,71.0,71.0],[66.0,66.0,66.0],[61.0,61.0,61.0],[56.0,56.0,56.0],[51.0,51.0,51.0],[46.0,46.0,46.0],[41.0,41.0,41.0],[36.0,36.0,36.0],[31.0,31.0,31.0],[26.0,26.0,26.0],[20.0,20.0,20.0],[15.0,15.0,15.0],[10.0,10.0,10.0],[5.0,5.0,5.0],[0.0,0.0,0.0]],"posneg_1":[[255.0,255.0,255.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[24.0,24.0,112.0],[16.0,78.0,139.0],[23.0,116.0,205.0],[72.0,118.0,255.0],[91.0,172.0,237.0],[173.0,215.0,230.0],[209.0,237.0,237.0],[230.0,230.0,250.0],[255.0,228.0,180.0],[243.0,164.0,96.0],[237.0,118.0,0.0],[210.0,105.0,30.0],[255.0,0.0,0.0],[237.0,0.0,0.0],[205.0,0.0,0.0],[139.0,0.0,0.0]],"OceanLakeLandSnow":[[24.0,116.0,205.0],[135.0,206.0,255.0],[38.0,103.0,40.0],[42.0,107.0,40.0],[46.0,110.0,41.0],[50.0,114.0,41.0],[54.0,117.0,41.0],[58.0,121.0,42.0],[62.0,124.0,42.0],[66.0,128.0,42.0],[70.0,131.0,43.0],[74.0,135.0,43.0],[78.0,138.0,43.0],[82.0,142.0,44.0],[86.0,145.0,44.0],[90.0,149.0,44.0],[94.0,152.0,45.0],[98.0,156.0,45.0],[102.0,159.0,46.0],[106.0,163.0,46.0],[110.0,166.0,46.0],[114.0,170.0,47.0],[118.0,173.0,47.0],[122.0,177.0,47.0],[126.0,180.0,48.0],[130.0,184.0,48.0],[134.0,187.0,48.0],[138.0,191.0,49.0],[142.0,194.0,49.0],[146.0,198.0,49.0],[154.0,205.0,50.0],[155.0,206.0,52.0],[156.0,207.0,54.0],[158.0,208.0,56.0],[159.0,210.0,57.0],[160.0,211.0,59.0],[161.0,212.0,61.0],[162.0,213.0,63.0],[163.0,214.0,65.0],[165.0,215.0,67.0],[166.0,216.0,69.0],[167.0,218.0,70.0],[168.0,219.0,72.0],[169.0,220.0,74.0],[170.0,221.0,76.0],[172.0,222.0,78.0],[173.0,223.0,80.0],[174.0,224.0,82.0],[175.0,225.0,84.0],[176.0,227.0,85.0],[177.0,228.0,87.0],[179.0,229.0,89.0],[180.0,230.0,91.0],[181.0,231.0,93.0],[182.0,232.0,95.0],[183.0,233.0,97.0],[184.0,235.0,98.0],[186.0,236.0,100.0],[188.0,238.0,104.0],[190.0,238.0,107.0],[192.0,238.0,111.0],[194.0,239.0,114.0],[197.0,239.0,117.0],[199.0,239.0,121.0],[201.0,239.0,124.0],[203.0,240.0,127.0],[205.0,240.0,130.0],[207.0,240.0,134.0],[209.0,240.0,137.0],[212.0,241.0,140.0],[214.0,241.0,144.0],[216.0,241.0,147.0],[218.0,241.0,150.0],[220.0,242.0,154.0],[222.0,242.0,157.0],[224.0,242.0,160.0],[226.0,242.0,164.0],[229.0,243.0,167.0],[231.0,243.0,170.0],[233.0,243.0,174.0],[235.0,243.0,177.0],[237.0,244.0,180.0],[239.0,244.0,183.0],[241.0,244.0,187.0],[244.0,244.0,190.0],[246.0,245.0,193.0],[250.0,245.0,200.0],[250.0,244.0,199.0],[249.0,244.0,197.0],[249.0,243.0,196.0],[249.0,243.0,194.0],[248.0,242.0,193.0],[248.0,242.0,191.0],[248.0,241.0,190.0],[247.0,241.0,188.0],[247.0,240.0,187.0],[247.0,239.0,186.0],[246.0,239.0,184.0],[246.0,238.0,183.0],[246.0,238.0,181.0],[245.0,237.0,180.0],[245.0,237.0,178.0],[244.0,236.0,177.0],[244.0,236.0,175.0],[244.0,235.0,174.0],[243.0,235.0,172.0],[243.0,234.0,171.0],[243.0,233.0,170.0],[242.0,233.0,168.0],[242.0,232.0,167.0],[242.0,232.0,165.0],[241.0,231.0,164.0],[241.0,231.0,162.0],[241.0,230.0,161.0],[240.0,229.0,158.0],[239.0,228.0,155.0],[238.0,226.0,153.0],[237.0,225.0,150.0],[236.0,224.0,148.0],[235.0,222.0,145.0],[234.0,221.0,142.0],[233.0,220.0,140.0],[233.0,219.0,137.0],[232.0,217.0,135.0],[231.0,216.0,132.0],[230.0,215.0,130.0],[229.0,213.0,127.0],[228.0,212.0,124.0],[227.0,211.0,122.0],[226.0,209.0,119.0],[225.0,208.0,117.0],[224.0,207.0,114.0],[223.0,205.0,111.0],[222.0,204.0,109.0],[221.0,203.0,106.0],[220.0,201.0,104.0],[220.0,200.0,101.0],[219.0,199.0,99.0],[218.0,198.0,96.0],[217.0,196.0,93.0],[216.0,195.0,91.0],[213.0,191.0,83.0],[213.0,190.0,81.0],[212.0,189.0,79.0],[212.0,187.0,77.0],[212.0,186.0,76.0],[212.0,185.0,74.0],[211.0,184.0,72.0],[211.0,182.0,70.0],[211.0,181.0,68.0],[211.0,180.0,66.0],[210.0,179.0,64.0],[210.0,177.0,63.0],[210.0,176.0,61.0],[209.0,175.0,59.0],[209.0,174.0,57.0],[209.0,172.0,55.0],[209.0,171.0,53.0],[208.0,170.0,51.0],[208.0,169.0,49.0],[208.0,167.0,48.0],[207.0,166.0,46.0],[207.0,165.0,44.0],[207.0,164.0,42.0],[207.0,162.0,40.0],[206.0,161.0,38.0],[206.0,160.0,36.0],[206.0,159.0,35.0],[206.0,157.0,33.0],[205.0,155.0,29.0],[203.0,153.0,29.0],[200.0,151.0,30.0],[198.0,148.0,30.0],[196.0,146.0,31.0],[194.0,144.0,31.0],[191.0,142.0,32.0],[189.0,139.0,32.0],[187.0,137.0,33.0],[185.0,135.0,33.0],[182.0,133.0,34.0],[180.0,130.0,34.0],[178.0,128.0,35.0],[175.0,126.0,35.0],[173.0,124.0,36.0],[171.0,121.0,36.0],[169.0,119.0,37.0],[166.0,117.0,37.0],[164.0,115.0,38.0],[162.0,112.0,38.0],[159.0,110.0,39.0],[157.0,108.0,39.0],[155.0,106.0,40.0],[153.0,103.0,40.0],[150.0,101.0,41.0],[148.0,99.0,41.0],[146.0,97.0,42.0],[144.0,94.0,42.0],[139.0,90.0,43.0],[137.0,89.0,42.0],[135.0,88.0,42.0],[133.0,86.0,41.0],[131.0,85.0,41.0],[129.0,84.0,40.0],[127.0,83.0,39.0],[125.0,81.0,39.0],[124.0,80.0,38.0],[122.0,79.0,38.0],[120.0,78.0,37.0],[118.0,76.0,37.0],[116.0,75.0,36.0],[114.0,74.0,35.0],[112.0,73.0,35.0],[110.0,71.0,34.0],[108.0,70.0,34.0],[106.0,69.0,33.0],[104.0,68.0,32.0],[102.0,66.0,32.0],[100.0,65.0,31.0],[98.0,64.0,31.0],[97.0,63.0,30.0],[95.0,61.0,30.0],[93.0,60.0,29.0],[91.0,59.0,28.0],[89.0,58.0,28.0],[87.0,56.0,27.0],[83.0,54.0,26.0],[89.0,61.0,34.0],[94.0,67.0,42.0],[100.0,74.0,50.0],[106.0,81.0,58.0],[111.0,87.0,65.0],[117.0,94.0,73.0],[123.0,101.0,81.0],[129.0,108.0,89.0],[134.0,114.0,97.0],[140.0,121.0,105.0],[146.0,128.0,113.0],[151.0,134.0,121.0],[157.0,141.0,129.0],[163.0,148.0,137.0],[168.0,154.0,144.0],[174.0,161.0,152.0],[180.0,168.0,160.0],[185.0,174.0,168.0],[191.0,181.0,176.0],[197.0,188.0,184.0],[202.0,194.0,192.0],[208.0,201.0,200.0],[214.0,208.0,208.0],[220.0,215.0,216.0],[225.0,221.0,223.0],[231.0,228.0,231.0],[237.0,235.0,239.0],[248.0,248.0,255.0]],"MPL_PuO":[[0.506036,0.235832,0.031065],[0.52203,0.244752,0.03045],[0.538024,0.253672,0.029835],[0.554018,0.262591,0.02922],[0.570012,0.271511,0.028604],[0.586005,0.280431,0.027989],[0.601999,0.28935,0.027374],[0.617993,0.29827,0.026759],[0.633987,0.30719,0.026144],[0.641984,0.311649,0.025836],[0.665975,0.325029,0.024913],[0.673972,0.329489,0.024606],[0.697962,0.342868,0.023683],[0.705421,0.348328,0.024606],[0.726182,0.367705,0.031065],[0.733103,0.374164,0.033218],[0.753864,0.393541,0.039677],[0.767705,0.406459,0.043983],[0.774625,0.412918,0.046136],[0.795386,0.432295,0.052595],[0.809227,0.445213,0.056901],[0.823068,0.458132,0.061207],[0.829988,0.464591,0.06336],[0.85075,0.483968,0.069819],[0.864591,0.496886,0.074125],[0.878431,0.509804,0.078431],[0.882891,0.518108,0.090581],[0.896271,0.543022,0.127028],[0.90519,0.559631,0.151326],[0.91411,0.57624,0.175625],[0.91857,0.584544,0.187774],[0.931949,0.609458,0.224221],[0.940869,0.626067,0.24852],[0.949789,0.642676,0.272818],[0.958708,0.659285,0.297116],[0.967628,0.675894,0.321415],[0.976547,0.692503,0.345713],[0.981007,0.700807,0.357862],[0.992234,0.724644,0.394617],[0.992541,0.736947,0.420146],[0.992849,0.74925,0.445675],[0.993156,0.761553,0.471203],[0.993464,0.773856,0.496732],[0.993772,0.786159,0.522261],[0.994079,0.798462,0.547789],[0.994233,0.804614,0.560554],[0.994694,0.823068,0.598847],[0.995002,0.835371,0.624375],[0.995309,0.847674,0.649904],[0.995617,0.859977,0.675433],[0.995925,0.87228,0.700961],[0.995002,0.881968,0.723722],[0.992849,0.889043,0.743714],[0.991772,0.89258,0.75371],[0.988543,0.903191,0.783699],[0.98639,0.910265,0.803691],[0.984237,0.917339,0.823683],[0.982084,0.924414,0.843676],[0.979931,0.931488,0.863668],[0.977778,0.938562,0.88366],[0.975625,0.945636,0.903652],[0.974548,0.949173,0.913649],[0.971319,0.959785,0.943637],[0.969166,0.966859,0.963629],[0.961476,0.961938,0.965859],[0.951942,0.953018,0.962168],[0.942407,0.944098,0.958478],[0.932872,0.935179,0.954787],[0.923337,0.926259,0.951096],[0.913802,0.917339,0.947405],[0.904268,0.90842,0.943714],[0.894733,0.8995,0.940023],[0.885198,0.890581,0.936332],[0.875663,0.881661,0.932641],[0.866128,0.872741,0.92895],[0.861361,0.868281,0.927105],[0.847059,0.854902,0.921569],[0.835371,0.840446,0.913879],[0.823683,0.82599,0.90619],[0.811995,0.811534,0.898501],[0.800308,0.797078,0.890811],[0.78862,0.782622,0.883122],[0.776932,0.768166,0.875433],[0.765244,0.75371,0.867743],[0.753556,0.739254,0.860054],[0.741869,0.724798,0.852364],[0.730181,0.710342,0.844675],[0.718493,0.695886,0.836986],[0.706805,0.68143,0.829296],[0.694195,0.666282,0.820607],[0.678816,0.649058,0.80892],[0.671127,0.640446,0.803076],[0.648058,0.61461,0.785544],[0.63268,0.597386,0.773856],[0.617301,0.580161,0.762168],[0.601922,0.562937,0.750481],[0.586544,0.545713,0.738793],[0.571165,0.528489,0.727105],[0.555786,0.511265,0.715417],[0.540408,0.494041,0.703729],[0.525029,0.476817,0.692042],[0.50965,0.459592,0.680354],[0.495194,0.439293,0.668973],[0.481661,0.415917,0.657901],[0.468128,0.392541,0.646828],[0.454594,0.369166,0.635756],[0.441061,0.34579,0.624683],[0.434295,0.334102,0.619147],[0.413995,0.299039,0.602538],[0.400461,0.275663,0.591465],[0.386928,0.252288,0.580392],[0.373395,0.228912,0.56932],[0.359862,0.205536,0.558247],[0.346328,0.182161,0.547174],[0.332795,0.158785,0.536102],[0.320415,0.143945,0.519262],[0.30842,0.131949,0.5005],[0.296424,0.119954,0.481738],[0.284429,0.107958,0.462976],[0.272434,0.095963,0.444214],[0.260438,0.083968,0.425452],[0.248443,0.071972,0.40669],[0.236448,0.059977,0.387928],[0.23045,0.053979,0.378547],[0.212457,0.035986,0.350404],[0.200461,0.023991,0.331642],[0.188466,0.011995,0.31288],[0.176471,0.0,0.294118]],"percent_11lev":[[100.0,0.0,150.0],[39.0,48.0,215.0],[89.0,141.0,252.0],[139.0,239.0,217.0],[96.0,207.0,145.0],[26.0,152.0,80.0],[145.0,207.0,96.0],[217.0,239.0,139.0],[254.0,224.0,139.0],[252.0,141.0,89.0],[215.0,48.0,39.0],[150.0,0.0,100.0]],"t2m_29lev":[[109.0,227.0,255.0],[175.0,240.0,255.0],[255.0,196.0,226.0],[255.0,153.0,204.0],[255.0,0.0,255.0],[128.0,0.0,128.0],[0.0,0.0,128.0],[70.0,70.0,255.0],[51.0,102.0,255.0],[133.0,162.0,255.0],[255.0,255.0,255.0],[204.0,204.0,204.0],[179.0,179.0,179.0],[153.0,153.0,153.0],[96.0,96.0,96.0],[128.0,128.0,0.0],[0.0,92.0,0.0],[0.0,128.0,0.0],[51.0,153.0,102.0],[157.0,213.0,0.0],[212.0,255.0,91.0],[255.0,255.0,0.0],[255.0,184.0,112.0],[255.0,153.0,0.0],[255.0,102.0,0.0],[255.0,0.0,0.0],[188.0,75.0,0.0],[171.0,0.0,56.0],[128.0,0.0,0.0],[163.0,112.0,255.0]],"temp_19lev":[[7.0,30.0,70.0],[7.0,47.0,107.0],[8.0,82.0,156.0],[33.0,113.0,181.0],[66.0,146.0,199.0],[90.0,160.0,205.0],[120.0,191.0,214.0],[170.0,220.0,230.0],[219.0,245.0,255.0],[240.0,252.0,255.0],[255.0,240.0,245.0],[255.0,224.0,224.0],[252.0,187.0,170.0],[252.0,146.0,114.0],[251.0,106.0,74.0],[240.0,60.0,43.0],[204.0,24.0,30.0],[166.0,15.0,20.0],[120.0,10.0,15.0],[95.0,0.0,0.0]],"MPL_Greys":[[0.998155,0.998155,0.998155],[0.994464,0.994464,0.994464],[0.990773,0.990773,0.990773],[0.987082,0.987082,0.987082],[0.983391,0.983391,0.983391],[0.9797,0.9797,0.9797],[0.976009,0.976009,0.976009],[0.972318,0.972318,0.972318],[0.968627,0.968627,0.968627],[0.966782,0.966782,0.966782],[0.961246,0.961246,0.961246],[0.9594,0.9594,0.9594],[0.953864,0.953864,0.953864],[0.952018,0.952018,0.952018],[0.946482,0.946482,0.946482],[0.944637,0.944637,0.944637],[0.937993,0.937993,0.937993],[0.932334,0.932334,0.932334],[0.929504,0.929504,0.929504],[0.921015,0.921015,0.921015],[0.915356,0.915356,0.915356],[0.909696,0.909696,0.909696],[0.906867,0.906867,0.906867],[0.898378,0.898378,0.898378],[0.892718,0.892718,0.892718],[0.887059,0.887059,0.887059],[0.884229,0.884229,0.884229],[0.87574,0.87574,0.87574],[0.870081,0.870081,0.870081],[0.864421,0.864421,0.864421],[0.861592,0.861592,0.861592],[0.853103,0.853103,0.853103],[0.846674,0.846674,0.846674],[0.839785,0.839785,0.839785],[0.832895,0.832895,0.832895],[0.826005,0.826005,0.826005],[0.819116,0.819116,0.819116],[0.815671,0.815671,0.815671],[0.805336,0.805336,0.805336],[0.798447,0.798447,0.798447],[0.791557,0.791557,0.791557],[0.784667,0.784667,0.784667],[0.777778,0.777778,0.777778],[0.770888,0.770888,0.770888],[0.763998,0.763998,0.763998],[0.760554,0.760554,0.760554],[0.750219,0.750219,0.750219],[0.74333,0.74333,0.74333],[0.734579,0.734579,0.734579],[0.724983,0.724983,0.724983],[0.715386,0.715386,0.715386],[0.70579,0.70579,0.70579],[0.696194,0.696194,0.696194],[0.691396,0.691396,0.691396],[0.677001,0.677001,0.677001],[0.667405,0.667405,0.667405],[0.657809,0.657809,0.657809],[0.648212,0.648212,0.648212],[0.638616,0.638616,0.638616],[0.62902,0.62902,0.62902],[0.619423,0.619423,0.619423],[0.614625,0.614625,0.614625],[0.600231,0.600231,0.600231],[0.590634,0.590634,0.590634],[0.581776,0.581776,0.581776],[0.573164,0.573164,0.573164],[0.564552,0.564552,0.564552],[0.55594,0.55594,0.55594],[0.547328,0.547328,0.547328],[0.538716,0.538716,0.538716],[0.530104,0.530104,0.530104],[0.521492,0.521492,0.521492],[0.51288,0.51288,0.51288],[0.504268,0.504268,0.504268],[0.495656,0.495656,0.495656],[0.491349,0.491349,0.491349],[0.478431,0.478431,0.478431],[0.469819,0.469819,0.469819],[0.461207,0.461207,0.461207],[0.452595,0.452595,0.452595],[0.444383,0.444383,0.444383],[0.436263,0.436263,0.436263],[0.428143,0.428143,0.428143],[0.420023,0.420023,0.420023],[0.411903,0.411903,0.411903],[0.403783,0.403783,0.403783],[0.395663,0.395663,0.395663],[0.387543,0.387543,0.387543],[0.379423,0.379423,0.379423],[0.371303,0.371303,0.371303],[0.363183,0.363183,0.363183],[0.359123,0.359123,0.359123],[0.346943,0.346943,0.346943],[0.338824,0.338824,0.338824],[0.330704,0.330704,0.330704],[0.322584,0.322584,0.322584],[0.31188,0.31188,0.31188],[0.300807,0.300807,0.300807],[0.289735,0.289735,0.289735],[0.278662,0.278662,0.278662],[0.267589,0.267589,0.267589],[0.256517,0.256517,0.256517],[0.245444,0.245444,0.245444],[0.234371,0.234371,0.234371],[0.223299,0.223299,0.223299],[0.212226,0.212226,0.212226],[0.201153,0.201153,0.201153],[0.195617,0.195617,0.195617],[0.179008,0.179008,0.179008],[0.167935,0.167935,0.167935],[0.156863,0.156863,0.156863],[0.14579,0.14579,0.14579],[0.136563,0.136563,0.136563],[0.127459,0.127459,0.127459],[0.118354,0.118354,0.118354],[0.10925,0.10925,0.10925],[0.100146,0.100146,0.100146],[0.091042,0.091042,0.091042],[0.081938,0.081938,0.081938],[0.072834,0.072834,0.072834],[0.063729,0.063729,0.063729],[0.054625,0.054625,0.054625],[0.045521,0.045521,0.045521],[0.040969,0.040969,0.040969],[0.027313,0.027313,0.027313],[0.018208,0.018208,0.018208],[0.009104,0.009104,0.009104],[0.0,0.0,0.0]],"BlueWhiteOrangeRed_c":[[27.0,44.0,98.0],[27.0,46.0,101.0],[28.0,48.0,104.0],[28.0,50.0,107.0],[29.0,52.0,110.0],[29.0,53.0,112.0],[29.0,55.0,115.0],[30.0,57.0,118.0],[30.0,59.0,121.0],[30.0,61.0,124.0],[31.0,63.0,127.0],[31.0,65.0,130.0],[32.0,67.0,133.0],[32.0,68.0,135.0],[32.0,70.0,138.0],[33.0,72.0,141.0],[33.0,74.0,144.0],[33.0,76.0,147.0],[34.0,78.0,150.0],[34.0,80.0,153.0],[35.0,82.0,156.0],[35.0,83.0,158.0],[35.0,85.0,161.0],[36.0,89.0,167.0],[38.0,92.0,169.0],[40.0,95.0,171.0],[42.0,98.0,173.0],[45.0,102.0,175.0],[47.0,105.0,177.0],[49.0,108.0,179.0],[51.0,111.0,181.0],[53.0,114.0,183.0],[55.0,117.0,185.0],[57.0,120.0,187.0],[59.0,123.0,189.0],[62.0,127.0,192.0],[64.0,130.0,194.0],[66.0,133.0,196.0],[68.0,136.0,198.0],[70.0,139.0,200.0],[72.0,142.0,202.0],[74.0,145.0,204.0],[76.0,148.0,206.0],[79.0,152.0,208.0],[81.0,155.0,210.0],[83.0,158.0,212.0],[87.0,164.0,216.0],[90.0,166.0,217.0],[93.0,169.0,219.0],[96.0,171.0,220.0],[99.0,173.0,221.0],[102.0,175.0,222.0],[105.0,178.0,224.0],[107.0,180.0,225.0],[110.0,182.0,226.0],[113.0,184.0,228.0],[116.0,187.0,229.0],[119.0,189.0,230.0],[122.0,191.0,232.0],[125.0,193.0,233.0],[128.0,196.0,234.0],[131.0,198.0,235.0],[134.0,200.0,237.0],[137.0,202.0,238.0],[140.0,205.0,239.0],[142.0,207.0,241.0],[145.0,209.0,242.0],[148.0,211.0,243.0],[151.0,214.0,244.0],[157.0,218.0,247.0],[159.0,219.0,247.0],[162.0,220.0,247.0],[164.0,221.0,247.0],[167.0,222.0,247.0],[169.0,222.0,247.0],[172.0,223.0,248.0],[174.0,224.0,248.0],[176.0,225.0,248.0],[179.0,226.0,248.0],[181.0,227.0,248.0],[184.0,228.0,248.0],[186.0,229.0,248.0],[188.0,229.0,248.0],[191.0,230.0,248.0],[193.0,231.0,248.0],[196.0,232.0,248.0],[198.0,233.0,248.0],[201.0,234.0,249.0],[203.0,235.0,249.0],[205.0,236.0,249.0],[208.0,236.0,249.0],[210.0,237.0,249.0],[215.0,239.0,249.0],[217.0,240.0,249.0],[218.0,240.0,250.0],[220.0,241.0,250.0],[222.0,242.0,250.0],[223.0,242.0,250.0],[225.0,243.0,251.0],[227.0,244.0,251.0],[228.0,244.0,251.0],[230.0,245.0,251.0],[232.0,246.0,252.0],[233.0,246.0,252.0],[235.0,247.0,252.0],[237.0,248.0,252.0],[238.0,248.0,253.0],[240.0,249.0,253.0],[242.0,250.0,253.0],[243.0,250.0,253.0],[245.0,251.0,254.0],[247.0,252.0,254.0],[248.0,252.0,254.0],[250.0,253.0,254.0],[252.0,254.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,254.0,251.0],[255.0,253.0,247.0],[255.0,253.0,243.0],[255.0,252.0,238.0],[254.0,251.0,234.0],[254.0,250.0,230.0],[254.0,249.0,226.0],[254.0,248.0,222.0],[254.0,248.0,218.0],[254.0,247.0,213.0],[254.0,246.0,209.0],[254.0,245.0,205.0],[253.0,244.0,201.0],[253.0,243.0,197.0],[253.0,243.0,193.0],[253.0,242.0,188.0],[253.0,241.0,184.0],[253.0,240.0,180.0],[253.0,239.0,176.0],[253.0,238.0,172.0],[252.0,238.0,168.0],[252.0,237.0,163.0],[252.0,235.0,155.0],[252.0,233.0,151.0],[252.0,230.0,146.0],[252.0,228.0,142.0],[252.0,225.0,138.0],[252.0,223.0,133.0],[253.0,220.0,129.0],[253.0,218.0,124.0],[253.0,215.0,120.0],[253.0,213.0,116.0],[253.0,210.0,111.0],[253.0,208.0,107.0],[253.0,206.0,103.0],[253.0,203.0,98.0],[253.0,201.0,94.0],[253.0,198.0,89.0],[253.0,196.0,85.0],[253.0,193.0,81.0],[254.0,191.0,76.0],[254.0,188.0,72.0],[254.0,186.0,68.0],[254.0,183.0,63.0],[254.0,181.0,59.0],[254.0,176.0,50.0],[254.0,173.0,50.0],[253.0,170.0,49.0],[253.0,167.0,49.0],[253.0,164.0,49.0],[252.0,161.0,48.0],[252.0,159.0,48.0],[251.0,156.0,47.0],[251.0,153.0,47.0],[251.0,150.0,47.0],[250.0,147.0,46.0],[250.0,144.0,46.0],[250.0,141.0,46.0],[249.0,138.0,45.0],[249.0,135.0,45.0],[248.0,132.0,44.0],[248.0,129.0,44.0],[248.0,126.0,44.0],[247.0,124.0,43.0],[247.0,121.0,43.0],[247.0,118.0,43.0],[246.0,115.0,42.0],[246.0,112.0,42.0],[245.0,106.0,41.0],[244.0,103.0,41.0],[242.0,100.0,41.0],[241.0,97.0,41.0],[239.0,94.0,41.0],[238.0,90.0,41.0],[237.0,87.0,41.0],[235.0,84.0,41.0],[234.0,81.0,41.0],[232.0,78.0,41.0],[231.0,75.0,41.0],[229.0,72.0,41.0],[228.0,69.0,41.0],[227.0,65.0,40.0],[225.0,62.0,40.0],[224.0,59.0,40.0],[222.0,56.0,40.0],[221.0,53.0,40.0],[220.0,50.0,40.0],[218.0,47.0,40.0],[217.0,44.0,40.0],[215.0,40.0,40.0],[214.0,37.0,40.0],[211.0,31.0,40.0],[208.0,31.0,39.0],[206.0,30.0,39.0],[203.0,30.0,38.0],[200.0,29.0,38.0],[197.0,29.0,37.0],[195.0,29.0,36.0],[192.0,28.0,36.0],[189.0,28.0,35.0],[187.0,27.0,34.0],[184.0,27.0,34.0],[181.0,26.0,33.0],[179.0,26.0,33.0],[176.0,26.0,32.0],[173.0,25.0,31.0],[170.0,25.0,31.0],[168.0,24.0,30.0],[165.0,24.0,29.0],[162.0,24.0,29.0],[160.0,23.0,28.0],[157.0,23.0,28.0],[154.0,22.0,27.0],[151.0,22.0,26.0],[146.0,21.0,25.0]],"BlueWhiteOrangeRed":[[27.0,44.0,98.0],[27.0,46.0,101.0],[28.0,48.0,104.0],[28.0,50.0,107.0],[29.0,52.0,110.0],[29.0,53.0,112.0],[29.0,55.0,115.0],[30.0,57.0,118.0],[30.0,59.0,121.0],[30.0,61.0,124.0],[31.0,63.0,127.0],[31.0,65.0,130.0],[32.0,67.0,133.0],[32.0,68.0,135.0],[32.0,70.0,138.0],[33.0,72.0,141.0],[33.0,74.0,144.0],[33.0,76.0,147.0],[34.0,78.0,150.0],[34.0,80.0,153.0],[35.0,82.0,156.0],[35.0,83.0,158.0],[35.0,85.0,161.0],[36.0,89.0,167.0],[38.0,92.0,169.0],[40.0,95.0,171.0],[42.0,98.0,173.0],[45.0,102.0,175.0],[47.0,105.0,177.0],[49.0,108.0,179.0],[51.0,111.0,181.0],[53.0,114.0,183.0],[55.0,117.0,185.0],[57.0,120.0,187.0],[59.0,123.0,189.0],[62.0,127.0,192.0],[64.0,130.0,194.0],[66.0,133.0,196.0],[68.0,136.0,198.0],[70.0,139.0,200.0],[72.0,142.0,202.0],[74.0,145.0,204.0],[76.0,148.0,206.0],[79.0,152.0,208.0],[81.0,155.0,210.0],[83.0,158.0,212.0],[87.0,164.0,216.0],[90.0,166.0,217.0],[93.0,169.0,219.0],[96.0,171.0,220.0],[99.0,173.0,221.0],[102.0,175.0,222.0],[105.0,178.0,224.0],[107.0,180.0,225.0],[110.0,182.0,226.0],[113.0,184.0,228.0],[116.0,187.0,229.0],[119.0,189.0,230.0],[122.0,191.0,232.0],[125.0,193.0,233.0],[128.0,196.0,234.0],[131.0,198.0,235.0],[134.0,200.0,237.0],[137.0,202.0,238.0],[140.0,205.0,239.0],[142.0,207.0,241.0],[145.0,209.0,242.0],[148.0,211.0,243.0],[151.0,214.0,244.0],[157.0,218.0,247.0],[159.0,219.0,247.0],[162.0,220.0,247.0],[164.0,221.0,247.0],[167.0,222.0,247.0],[169.0,222.0,247.0],[172.0,223.0,248.0],[174.0,224.0,248.0],[176.0,225.0,248.0],[179.0,226.0,248.0],[181.0,227.0,248.0],[184.0,228.0,248.0],[186.0,229.0,248.0],[188.0,229.0,248.0],[191.0,230.0,248.0],[193.0,231.0,248.0],[196.0,232.0,248.0],[198.0,233.0,248.0],[201.0,234.0,249.0],[203.0,235.0,249.0],[205.0,236.0,249.0],[208.0,236.0,249.0],[210.0,237.0,249.0],[215.0,239.0,249.0],[217.0,240.0,249.0],[218.0,240.0,250.0],[220.0,241.0,250.0],[222.0,242.0,250.0],[223.0,242.0,250.0],[225.0,243.0,251.0],[227.0,244.0,251.0],[228.0,244.0,251.0],[230.0,245.0,251.0],[232.0,246.0,252.0],[233.0,246.0,252.0],[235.0,247.0,252.0],[237.0,248.0,252.0],[238.0,248.0,253.0],[240.0,249.0,253.0],[242.0,250.0,253.0],[243.0,250.0,253.0],[245.0,251.0,254.0],[247.0,252.0,254.0],[248.0,252.0,254.0],[250.0,253.0,254.0],[252.0,254.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,255.0,255.0],[255.0,254.0,251.0],[255.0,253.0,247.0],[255.0,253.0,243.0],[255.0,252.0,238.0],[254.0,251.0,234.0],[254.0,250.0,230.0],[254.0,249.0,226.0],[254.0,248.0,222.0],[254.0,248.0,218.0],[254.0,247.0,213.0],[254.0,246.0,209.0],[254.0,245.0,205.0],[253.0,244.0,201.0],[253.0,243.0,197.0],[253.0,243.0,193.0],[253.0,242.0,188.0],[253.0,241.0,184.0],[253.0,240.0,180.0],[253.0,239.0,176.0],[253.0,238.0,172.0],[252.0,238.0,168.0],[252.0,237.0,163.0],[252.0,235.0,155.0],[252.0,233.0,151.0],[252.0,230.0,146.0],[252.0,228.0,142.0],[252.0,225.0,138.0],[252.0,223.0,133.0],[253.0,220.0,129.0],[253.0,218.0,124.0],[253.0,215.0,120.0],[253.0,213.0,116.0],[253.0,210.0,111.0],[253.0,208.0,107.0],[253.0,206.0,103.0],[253.0,203.0,98.0],[253.0,201.0,94.0],[253.0,198.0,89.0],[253.0,196.0,85.0],[253.0,193.0,81.0],[254.0,191.0,76.0],[254.0,188.0,72.0],[254.0,186.0,68.0],[254.0,183.0,63.0],[254.0,181.0,59.0],[254.0,176.0,50.0],[254.0,173.0,50.0],[253.0,170.0,49.0],[253.0,167.0,49.0],[253.0,164.0,49.0],[252.0,161.0,48.0],[252.0,159.0,48.0],[251.0,156.0,47.0],[251.0,153.0,47.0],[251.0,150.0,47.0],[250.0,147.0,46.0],[250.0,144.0,46.0],[250.0,141.0,46.0],[249.0,138.0,45.0],[249.0,135.0,45.0],[248.0,132.0,44.0],[248.0,129.0,44.0],[248.0,126.0,44.0],[247.0,124.0,43.0],[247.0,121.0,43.0],[247.0,118.0,43.0],[246.0,115.0,42.0],[246.0,112.0,42.0],[245.0,106.0,41.0],[244.0,103.0,41.0],[242.0,100.0,41.0],[241.0,97.0,41.0],[239.0,94.0,41.0],[238.0,90.0,41.0],[237.0,87.0,41.0],[235.0,84.0,41.0],[234.0,81.0,41.0],[232.0,78.0,41.0],[231.0,75.0,41.0],[229.0,72.0,41.0],[228.0,69.0,41.0],[227.0,65.0,40.0],[225.0,62.0,40.0],[224.0,59.0,40.0],[222.0,56.0,40.0],[221.0,53.0,40.0],[220.0,50.0,40.0],[218.0,47.0,40.0],[217.0,44.0,40.0],[215.0,40.0,40.0],[214.0,37.0,40.0],[211.0,31.0,40.0],[208.0,31.0,39.0],[206.0,30.0,39.0],[203.0,30.0,38.0],[200.0,29.0,38.0],[197.0,29.0,37.0],[195.0,29.0,36.0],[192.0,28.0,36.0],[189.0,28.0,35.0],[187.0,27.0,34.0],[184.0,27.0,34.0],[181.0,26.0,33.0],[179.0,26.0,33.0],[176.0,26.0,32.0],[173.0,25.0,31.0],[170.0,25.0,31.0],[168.0,24.0,30.0],[165.0,24.0,29.0],[162.0,24.0,29.0],[160.0,23.0,28.0],[157.0,23.0,28.0],[154.0,22.0,27.0],[151.0,22.0,26.0],[146.0,21.0,25.0]],"CBR_coldhot":[[5.0,48.0,97.0],[33.0,102.0,172.0],[67.0,147.0,195.0],[146.0,197.0,222.0],[209.0,229.0,240.0],[247.0,247.0,247.0],[254.0,219.0,199.0],[244.0,165.0,130.0],[214.0,96.0,77.0],[178.0,24.0,43.0],[103.0,0.0,31.0]],"CBR_wet":[[255.0,255.0,255.0],[247.0,252.0,240.0],[224.0,243.0,219.0],[204.0,235.0,197.0],[168.0,221.0,181.0],[123.0,204.0,196.0],[78.0,179.0,211.0],[43.0,140.0,190.0],[8.0,104.0,172.0],[8.0,64.0,129.0],[0.0,32.0,62.0]],"testcmap":[[87.0,0.0,136.0],[84.0,0.0,140.0],[82.0,0.0,143.0],[79.0,0.0,147.0],[76.0,0.0,150.0],[74.0,0.0,154.0],[71.0,0.0,158.0],[69.0,0.0,161.0],[66.0,0.0,165.0],[63.0,0.0,168.0],[61.0,0.0,172.0],[58.0,0.0,176.0],[55.0,0.0,179.0],[53.0,0.0,183.0],[50.0,0.0,186.0],[47.0,0.0,190.0],[45.0,0.0,194.0],[42.0,0.0,197.0],[40.0,0.0,201.0],[37.0,0.0,205.0],[34.0,0.0,208.0],[32.0,0.0,212.0],[29.0,0.0,215.0],[26.0,0.0,219.0],[24.0,0.0,223.0],[21.0,0.0,226.0],[18.0,0.0,230.0],[16.0,0.0,233.0],[13.0,0.0,237.0],[11.0,0.0,241.0],[8.0,0.0,244.0],[5.0,0.0,248.0],[3.0,0.0,251.0],[0.0,0.0,255.0],[0.0,5.0,248.0],[0.0,11.0,240.0],[1.0,16.0,233.0],[1.0,22.0,226.0],[1.0,27.0,219.0],[1.0,33.0,211.0],[2.0,38.0,204.0],[2.0,43.0,197.0],[2.0,49.0,190.0],[2.0,54.0,182.0],[3.0,60.0,175.0],[3.0,65.0,168.0],[3.0,71.0,160.0],[3.0,76.0,153.0],[4.0,81.0,146.0],[4.0,87.0,139.0],[4.0,92.0,131.0],[4.0,98.0,124.0],[5.0,103.0,117.0],[5.0,108.0,110.0],[5.0,114.0,102.0],[5.0,119.0,95.0],[6.0,125.0,88.0],[6.0,130.0,80.0],[6.0,136.0,73.0],[6.0,141.0,66.0],[7.0,146.0,59.0],[7.0,152.0,51.0],[7.0,157.0,44.0],[7.0,163.0,37.0],[8.0,168.0,30.0],[8.0,174.0,22.0],[8.0,179.0,15.0],[15.0,181.0,22.0],[23.0,184.0,30.0],[30.0,186.0,37.0],[38.0,188.0,44.0],[45.0,191.0,51.0],[53.0,193.0,59.0],[60.0,195.0,66.0],[68.0,197.0,73.0],[75.0,200.0,80.0],[83.0,202.0,88.0],[90.0,204.0,95.0],[98.0,207.0,102.0],[105.0,209.0,110.0],[113.0,211.0,117.0],[120.0,214.0,124.0],[128.0,216.0,131.0],[135.0,218.0,139.0],[143.0,220.0,146.0],[150.0,223.0,153.0],[158.0,225.0,160.0],[165.0,227.0,168.0],[173.0,230.0,175.0],[180.0,232.0,182.0],[188.0,234.0,190.0],[195.0,237.0,197.0],[203.0,239.0,204.0],[210.0,241.0,211.0],[218.0,243.0,219.0],[225.0,246.0,226.0],[233.0,248.0,233.0],[240.0,250.0,240.0],[248.0,253.0,248.0],[255.0,255.0,255.0],[255.0,255.0,247.0],[255.0,255.0,240.0],[255.0,255.0,232.0],[255.0,255.0,224.0],[255.0,255.0,216.0],[255.0,255.0,209.0],[255.0,255.0,201.0],[255.0,255.0,193.0],[255.0,255.0,185.0],[255.0,255.0,178.0],[255.0,255.0,170.0],[255.0,255.0,162.0],[255.0,255.0,155.0],[255.0,255.0,147.0],[255.0,255.0,139.0],[255.0,255.0,131.0],[255.0,255.0,124.0],[255.0,255.0,116.0],[255.0,255.0,108.0],[255.0,255.0,100.0],[255.0,255.0,93.0],[255.0,255.0,85.0],[255.0,255.0,77.0],[255.0,255.0,70.0],[255.0,255.0,62.0],[255.0,255.0,54.0],[255.0,255.0,46.0],[255.0,255.0,39.0],[255.0,255.0,31.0],[255.0,255.0,23.0],[255.0,255.0,15.0],[255.0,255.0,8.0],[255.0,255.0,0.0],[255.0,252.0,0.0],[255.0,250.0,0.0],[255.0,247.0,0.0],[255.0,244.0,0.0],[255.0,241.0,0.0],[255.0,239.0,0.0],[255.0,236.0,0.0],[255.0,233.0,0.0],[255.0,230.0,0.0],[255.0,228.0,0.0],[255.0,225.0,0.0],[255.0,222.0,0.0],[255.0,220.0,0.0],[255.0,217.0,0.0],[255.0,214.0,0.0],[255.0,211.0,0.0],[255.0,209.0,0.0],[255.0,206.0,0.0],[255.0,203.0,0.0],[255.0,200.0,0.0],[255.0,198.0,0.0],[255.0,195.0,0.0],[255.0,192.0,0.0],[255.0,190.0,0.0],[255.0,187.0,0.0],[255.0,184.0,0.0],[255.0,181.0,0.0],[255.0,179.0,0.0],[255.0,176.0,0.0],[255.0,173.0,0.0],[255.0,170.0,0.0],[255.0,168.0,0.0],[255.0,165.0,0.0],[255.0,160.0,0.0],[255.0,155.0,0.0],[255.0,150.0,0.0],[255.0,145.0,0.0],[255.0,140.0,0.0],[255.0,135.0,0.0],[255.0,130.0,0.0],[255.0,125.0,0.0],[255.0,120.0,0.0],[255.0,115.0,0.0],[255.0,110.0,0.0],[255.0,105.0,0.0],[255.0,100.0,0.0],[255.0,95.0,0.0],[255.0,90.0,0.0],[255.0,85.0,0.0],[255.0,80.0,0.0],[255.0,75.0,0.0],[255.0,70.0,0.0],[255.0,65.0,0.0],[255.0,60.0,0.0],[255.0,55.0,0.0],[255.0,50.0,0.0],[255.0,45.0,0.0],[255.0,40.0,0.0],[255.0,35.0,0.0],[255.0,30.0,0.0],[255.0,25.0,0.0],[255.0,20.0,0.0],[255.0,15.0,0.0],[255.0,10.0,0.0],[255.0,5.0,0.0],[255.0,0.0,0.0]],"3gauss":[[0.0,0.0,255.0],[0.0,0.0,255.0],[1.0,2.0,254.0],[2.0,4.0,253.0],[3.0,6.0,252.0],[4.0,9.0,251.0],[5.0,12.0,250.0],[6.0,16.0,249.0],[7.0,21.0,248.0],[8.0,26.0,247.0],[9.0,32.0,246.0],[10.0,39.0,245.0],[11.0,46.0,244.0],[12.0,53.0,243.0],[13.0,61.0,242.0],[14.0,69.0,241.0],[15.0,78.0,240.0],[16.0,87.0,239.0],[17.0,96.0,238.0],[18.0,105.0,237.0],[19.0,114.0,236.0],[20.0,123.0,235.0],[21.0,133.0,234.0],[22.0,142.0,233.0],[23.0,151.0,232.0],[24.0,160.0,231.0],[25.0,169.0,230.0],[26.0,178.0,229.0],[27.0,186.0,228.0],[28.0,194.0,227.0],[29.0,202.0,226.0],[30.0,209.0,225.0],[31.0,216.0,224.0],[32.0,223.0,223.0],[33.0,229.0,222.0],[34.0,234.0,221.0],[35.0,239.0,220.0],[36.0,243.0,219.0],[37.0,246.0,218.0],[38.0,249.0,217.0],[39.0,251.0,216.0],[40.0,253.0,215.0],[41.0,253.0,214.0],[42.0,253.0,213.0],[43.0,253.0,212.0],[44.0,252.0,211.0],[45.0,250.0,210.0],[46.0,247.0,209.0],[47.0,244.0,208.0],[48.0,240.0,207.0],[49.0,235.0,206.0],[50.0,230.0,205.0],[51.0,225.0,204.0],[52.0,218.0,203.0],[53.0,212.0,202.0],[54.0,205.0,201.0],[55.0,197.0,200.0],[56.0,189.0,199.0],[57.0,181.0,198.0],[58.0,172.0,197.0],[59.0,163.0,196.0],[60.0,154.0,195.0],[61.0,145.0,194.0],[62.0,136.0,193.0],[63.0,127.0,192.0],[64.0,117.0,191.0],[65.0,108.0,190.0],[66.0,99.0,189.0],[67.0,90.0,188.0],[68.0,81.0,187.0],[69.0,72.0,186.0],[70.0,64.0,185.0],[71.0,56.0,184.0],[72.0,48.0,183.0],[73.0,41.0,182.0],[74.0,35.0,181.0],[75.0,28.0,180.0],[76.0,23.0,179.0],[77.0,18.0,178.0],[78.0,13.0,177.0],[79.0,9.0,176.0],[80.0,6.0,175.0],[81.0,3.0,174.0],[82.0,1.0,173.0],[83.0,0.0,172.0],[84.0,0.0,171.0],[85.0,0.0,170.0],[86.0,0.0,169.0],[87.0,2.0,168.0],[88.0,4.0,167.0],[89.0,7.0,166.0],[90.0,10.0,165.0],[91.0,14.0,164.0],[92.0,19.0,163.0],[93.0,24.0,162.0],[94.0,30.0,161.0],[95.0,37.0,160.0],[96.0,44.0,159.0],[97.0,51.0,158.0],[98.0,59.0,157.0],[99.0,67.0,156.0],[100.0,75.0,155.0],[101.0,84.0,154.0],[102.0,93.0,153.0],[103.0,102.0,152.0],[104.0,111.0,151.0],[105.0,120.0,150.0],[106.0,130.0,149.0],[107.0,139.0,148.0],[108.0,148.0,147.0],[109.0,157.0,146.0],[110.0,166.0,145.0],[111.0,175.0,144.0],[112.0,184.0,143.0],[113.0,192.0,142.0],[114.0,200.0,141.0],[115.0,207.0,140.0],[116.0,214.0,139.0],[117.0,221.0,138.0],[118.0,227.0,137.0],[119.0,232.0,136.0],[120.0,237.0,135.0],[121.0,241.0,134.0],[122.0,245.0,133.0],[123.0,248.0,132.0],[124.0,250.0,131.0],[125.0,252.0,130.0],[126.0,253.0,129.0],[127.0,254.0,128.0],[128.0,253.0,127.0],[129.0,252.0,126.0],[130.0,250.0,125.0],[131.0,248.0,124.0],[132.0,245.0,123.0],[133.0,241.0,122.0],[134.0,237.0,121.0],[135.0,232.0,120.0],[136.0,227.0,119.0],[137.0,221.0,118.0],[138.0,214.0,117.0],[139.0,207.0,116.0],[140.0,200.0,115.0],[141.0,192.0,114.0],[142.0,184.0,113.0],[143.0,175.0,112.0],[144.0,166.0,111.0],[145.0,157.0,110.0],[146.0,148.0,109.0],[147.0,139.0,108.0],[148.0,130.0,107.0],[149.0,120.0,106.0],[150.0,111.0,105.0],[151.0,102.0,104.0],[152.0,93.0,103.0],[153.0,84.0,102.0],[154.0,75.0,101.0],[155.0,67.0,100.0],[156.0,59.0,99.0],[157.0,51.0,98.0],[158.0,44.0,97.0],[159.0,37.0,96.0],[160.0,30.0,95.0],[161.0,24.0,94.0],[162.0,19.0,93.0],[163.0,14.0,92.0],[164.0,10.0,91.0],[165.0,7.0,90.0],[166.0,4.0,89.0],[167.0,2.0,88.0],[168.0,0.0,87.0],[169.0,0.0,86.0],[170.0,0.0,85.0],[171.0,0.0,84.0],[172.0,1.0,83.0],[173.0,3.0,82.0],[174.0,6.0,81.0],[175.0,9.0,80.0],[176.0,13.0,79.0],[177.0,18.0,78.0],[178.0,23.0,77.0],[179.0,28.0,76.0],[180.0,35.0,75.0],[181.0,41.0,74.0],[182.0,48.0,73.0],[183.0,56.0,72.0],[184.0,64.0,71.0],[185.0,72.0,70.0],[186.0,81.0,69.0],[187.0,90.0,68.0],[188.0,99.0,67.0],[189.0,108.0,66.0],[190.0,117.0,65.0],[191.0,126.0,64.0],[192.0,136.0,63.0],[193.0,145.0,62.0],[194.0,154.0,61.0],[195.0,163.0,60.0],[196.0,172.0,59.0],[197.0,181.0,58.0],[198.0,189.0,57.0],[199.0,197.0,56.0],[200.0,205.0,55.0],[201.0,212.0,54.0],[202.0,218.0,53.0],[203.0,225.0,52.0],[204.0,230.0,51.0],[205.0,235.0,50.0],[206.0,240.0,49.0],[207.0,244.0,48.0],[208.0,247.0,47.0],[209.0,250.0,46.0],[210.0,252.0,45.0],[211.0,253.0,44.0],[212.0,253.0,43.0],[213.0,253.0,42.0],[214.0,253.0,41.0],[215.0,251.0,40.0],[216.0,249.0,39.0],[217.0,246.0,38.0],[218.0,243.0,37.0],[219.0,239.0,36.0],[220.0,234.0,35.0],[221.0,229.0,34.0],[222.0,223.0,33.0],[223.0,216.0,32.0],[224.0,209.0,31.0],[225.0,202.0,30.0],[226.0,194.0,29.0],[227.0,186.0,28.0],[228.0,178.0,27.0],[229.0,169.0,26.0],[230.0,160.0,25.0],[231.0,151.0,24.0],[232.0,142.0,23.0],[233.0,133.0,22.0],[234.0,123.0,21.0],[235.0,114.0,20.0],[236.0,105.0,19.0],[237.0,96.0,18.0],[238.0,87.0,17.0],[239.0,78.0,16.0],[240.0,69.0,15.0],[241.0,61.0,14.0],[242.0,53.0,13.0],[243.0,46.0,12.0],[244.0,39.0,11.0],[245.0,32.0,10.0],[246.0,26.0,9.0],[247.0,21.0,8.0],[248.0,16.0,7.0],[249.0,12.0,6.0],[250.0,8.0,5.0],[251.0,5.0,4.0],[252.0,3.0,3.0]],"GMT_hot":[[0.013333,0.0,0.0],[0.04,0.0,0.0],[0.066667,0.0,0.0],[0.093333,0.0,0.0],[0.12,0.0,0.0],[0.146667,0.0,0.0],[0.173333,0.0,0.0],[0.2,0.0,0.0],[0.226667,0.0,0.0],[0.253333,0.0,0.0],[0.28,0.0,0.0],[0.306667,0.0,0.0],[0.333333,0.0,0.0],[0.36,0.0,0.0],[0.386667,0.0,0.0],[0.413333,0.0,0.0],[0.44,0.0,0.0],[0.466667,0.0,0.0],[0.493333,0.0,0.0],[0.52,0.0,0.0],[0.546667,0.0,0.0],[0.573333,0.0,0.0],[0.6,0.0,0.0],[0.626667,0.0,0.0],[0.653333,0.0,0.0],[0.68,0.0,0.0],[0.706667,0.0,0.0],[0.733333,0.0,0.0],[0.76,0.0,0.0],[0.786667,0.0,0.0],[0.813333,0.0,0.0],[0.84,0.0,0.0],[0.866667,0.0,0.0],[0.893333,0.0,0.0],[0.92,0.0,0.0],[0.946667,0.0,0.0],[0.973333,0.0,0.0],[1.0,0.0,0.0],[1.0,0.026667,0.0],[1.0,0.053333,0.0],[1.0,0.08,0.0],[1.0,0.106667,0.0],[1.0,0.133333,0.0],[1.0,0.16,0.0],[1.0,0.186667,0.0],[1.0,0.213333,0.0],[1.0,0.24,0.0],[1.0,0.266667,0.0],[1.0,0.293333,0.0],[1.0,0.32,0.0],[1.0,0.346667,0.0],[1.0,0.373333,0.0],[1.0,0.4,0.0],[1.0,0.426667,0.0],[1.0,0.453333,0.0],[1.0,0.48,0.0],[1.0,0.506667,0.0],[1.0,0.533333,0.0],[1.0,0.56,0.0],[1.0,0.586667,0.0],[1.0,0.613333,0.0],[1.0,0.64,0.0],[1.0,0.666667,0.0],[1.0,0.693333,0.0],[1.0,0.72,0.0],[1.0,0.746667,0.0],[1.0,0.773333,0.0],[1.0,0.8,0.0],[1.0,0.826667,0.0],[1.0,0.853333,0.0],[1.0,0.88,0.0],[1.0,0.906667,0.0],[1.0,0.933333,0.0],[1.0,0.96,0.0],[1.0,0.986667,0.0],[1.0,1.0,0.02],[1.0,1.0,0.06],[1.0,1.0,0.1],[1.0,1.0,0.14],[1.0,1.0,0.18],[1.0,1.0,0.22],[1.0,1.0,0.26],[1.0,1.0,0.3],[1.0,1.0,0.34],[1.0,1.0,0.38],[1.0,1.0,0.42],[1.0,1.0,0.46],[1.0,1.0,0.5],[1.0,1.0,0.54],[1.0,1.0,0.58],[1.0,1.0,0.62],[1.0,1.0,0.66],[1.0,1.0,0.7],[1.0,1.0,0.74],[1.0,1.0,0.78],[1.0,1.0,0.82],[1.0,1.0,0.86],[1.0,1.0,0.9],[1.0,1.0,0.94],[1.0,1.0,0.98]],"CBR_drywet":[[84.0,48.0,5.0],[140.0,81.0,10.0],[191.0,129.0,45.0],[223.0,194.0,125.0],[246.0,232.0,195.0],[245.0,245.0,245.0],[199.0,234.0,229.0],[128.0,205.0,193.0],[53.0,151.0,143.0],[1.0,102.0,95.0],[0.0,60.0,48.0]],"MPL_gist_earth":[[0.002613,0.0,0.168692],[0.00784,0.0,0.263805],[0.013067,0.0,0.348089],[0.018294,0.0,0.432373],[0.023521,0.017927,0.455606],[0.028748,0.035968,0.457028],[0.033975,0.054008,0.458449],[0.039202,0.072048,0.459871],[0.044429,0.090088,0.461293],[0.047042,0.099108,0.462004],[0.054883,0.126168,0.464136],[0.057496,0.135189,0.464847],[0.065336,0.162249,0.46698],[0.06795,0.171269,0.467691],[0.07579,0.197466,0.469824],[0.078404,0.205623,0.470534],[0.086244,0.230095,0.472667],[0.091471,0.24641,0.474089],[0.094084,0.254568,0.4748],[0.101925,0.27904,0.476932],[0.107152,0.295355,0.478354],[0.112378,0.310845,0.479776],[0.114992,0.318178,0.480487],[0.122832,0.340179,0.482619],[0.128059,0.354846,0.484041],[0.133286,0.369513,0.485463],[0.1359,0.376847,0.486174],[0.14374,0.396564,0.488306],[0.148967,0.408959,0.489728],[0.154194,0.421355,0.49115],[0.156807,0.427552,0.491861],[0.164648,0.446146,0.493994],[0.169874,0.458541,0.495415],[0.175101,0.470937,0.496837],[0.180328,0.483332,0.498259],[0.185555,0.495728,0.499681],[0.190027,0.50423,0.495657],[0.191877,0.506488,0.490857],[0.197426,0.513261,0.476456],[0.201125,0.517776,0.466855],[0.204824,0.522291,0.457254],[0.208524,0.526806,0.447654],[0.212223,0.531321,0.438053],[0.215922,0.535836,0.428452],[0.219621,0.540351,0.418852],[0.221471,0.542608,0.414051],[0.22702,0.549381,0.39965],[0.230719,0.553896,0.390049],[0.234419,0.558411,0.380449],[0.238118,0.562926,0.370848],[0.241817,0.567441,0.361247],[0.245516,0.571956,0.351647],[0.249216,0.576471,0.342046],[0.251065,0.578729,0.337245],[0.256614,0.585501,0.322844],[0.260313,0.590016,0.313244],[0.264013,0.594531,0.303643],[0.267712,0.599046,0.294042],[0.271452,0.603562,0.284442],[0.288886,0.608077,0.274841],[0.30632,0.612592,0.279352],[0.315037,0.614849,0.281638],[0.341188,0.621622,0.288496],[0.358622,0.626137,0.293068],[0.376056,0.630652,0.29764],[0.39349,0.635167,0.302212],[0.410924,0.639682,0.306783],[0.428359,0.643128,0.311355],[0.445793,0.646569,0.315927],[0.463227,0.65001,0.320499],[0.478399,0.653452,0.322978],[0.491332,0.656893,0.325457],[0.504266,0.660334,0.327936],[0.517199,0.663776,0.330415],[0.530132,0.667217,0.332894],[0.536599,0.668938,0.334133],[0.555999,0.6741,0.337851],[0.568932,0.677541,0.34033],[0.581865,0.680983,0.342809],[0.594798,0.684424,0.345288],[0.607732,0.687866,0.347767],[0.620665,0.691307,0.350246],[0.633598,0.694748,0.352724],[0.646532,0.69819,0.355203],[0.659465,0.701631,0.357682],[0.672398,0.705072,0.360161],[0.685331,0.708514,0.36264],[0.698265,0.711955,0.365119],[0.711198,0.715397,0.367598],[0.719255,0.713679,0.370076],[0.722534,0.706906,0.372555],[0.724173,0.703519,0.373795],[0.72909,0.693358,0.377513],[0.732368,0.686585,0.379992],[0.735646,0.679811,0.382471],[0.738924,0.673038,0.38495],[0.742202,0.666264,0.387428],[0.74548,0.65949,0.389907],[0.748759,0.652717,0.392386],[0.752037,0.645943,0.394865],[0.755339,0.639219,0.405741],[0.764112,0.642991,0.424956],[0.772885,0.646409,0.444171],[0.781657,0.651513,0.463386],[0.79043,0.658287,0.482601],[0.799203,0.665084,0.501816],[0.807975,0.671882,0.521031],[0.812361,0.67528,0.530638],[0.82552,0.685476,0.559461],[0.834293,0.692274,0.578676],[0.843066,0.699071,0.597891],[0.851838,0.710314,0.617106],[0.860611,0.721533,0.636321],[0.869383,0.732295,0.655536],[0.878156,0.743077,0.676973],[0.886929,0.758418,0.700614],[0.895701,0.773759,0.724254],[0.904474,0.789101,0.747895],[0.913246,0.804442,0.771535],[0.922019,0.819783,0.795176],[0.930792,0.836438,0.818816],[0.939564,0.854422,0.842457],[0.948337,0.872514,0.866097],[0.952723,0.881617,0.877918],[0.965882,0.915975,0.913378],[0.974655,0.93888,0.937019],[0.983427,0.961785,0.960659],[0.9922,0.9843,0.9843]],"matlab_jet":[[0.0,0.0,143.0],[0.0,0.0,159.0],[0.0,0.0,175.0],[0.0,0.0,191.0],[0.0,0.0,207.0],[0.0,0.0,223.0],[0.0,0.0,239.0],[0.0,0.0,255.0],[0.0,15.0,255.0],[0.0,31.0,255.0],[0.0,47.0,255.0],[0.0,63.0,255.0],[0.0,79.0,255.0],[0.0,95.0,255.0],[0.0,111.0,255.0],[0.0,127.0,255.0],[0.0,143.0,255.0],[0.0,159.0,255.0],[0.0,175.0,255.0],[0.0,191.0,255.0],[0.0,207.0,255.0],[0.0,223.0,255.0],[0.0,239.0,255.0],[0.0,255.0,255.0],[15.0,255.0,239.0],[31.0,255.0,223.0],[47.0,255.0,207.0],[63.0,255.0,191.0],[79.0,255.0,175.0],[95.0,255.0,159.0],[111.0,255.0,143.0],[127.0,255.0,127.0],[143.0,255.0,111.0],[159.0,255.0,95.0],[175.0,255.0,79.0],[191.0,255.0,63.0],[207.0,255.0,47.0],[223.0,255.0,31.0],[239.0,255.0,15.0],[255.0,255.0,0.0],[255.0,239.0,0.0],[255.0,223.0,0.0],[255.0,207.0,0.0],[255.0,191.0,0.0],[255.0,175.0,0.0],[255.0,159.0,0.0],[255.0,143.0,0.0],[255.0,127.0,0.0],[255.0,111.0,0.0],[255.0,95.0,0.0],[255.0,79.0,0.0],[255.0,63.0,0.0],[255.0,47.0,0.0],[255.0,31.0,0.0],[255.0,15.0,0.0],[255.0,0.0,0.0],[239.0,0.0,0.0],[223.0,0.0,0.0],[207.0,0.0,0.0],[191.0,0.0,0.0],[175.0,0.0,0.0],[159.0,0.0,0.0],[143.0,0.0,0.0],[127.0,0.0,0.0]],"mch_default":[[255.0,255.0,255.0],[0.0,0.0,0.0],[32.0,32.0,32.0],[64.0,64.0,64.0],[96.0,96.0,96.0],[128.0,128.0,128.0],[160.0,160.0,160.0],[192.0,192.0,192.0],[224.0,224.0,224.0],[255.0,0.0,0.0],[0.0,255.0,0.0],[0.0,0.0,255.0],[255.0,255.0,0.0],[0.0,255.0,255.0],[255.0,0.0,255.0]],"GHRSST_anomaly":[[107.0,0.0,219.0],[122.0,0.0,213.0],[138.0,0.0,208.0],[156.0,0.0,201.0],[131.0,24.0,209.0],[85.0,60.0,225.0],[39.0,97.0,241.0],[0.0,133.0,255.0],[0.0,169.0,255.0],[0.0,211.0,255.0],[0.0,247.0,255.0],[29.0,255.0,226.0],[65.0,255.0,190.0],[102.0,255.0,154.0],[133.0,255.0,131.0],[154.0,255.0,141.0],[173.0,255.0,150.0],[191.0,255.0,159.0],[192.0,238.0,168.0],[191.0,220.0,177.0],[191.0,202.0,186.0],[202.0,202.0,183.0],[220.0,220.0,168.0],[238.0,238.0,154.0],[255.0,254.0,137.0],[255.0,236.0,97.0],[255.0,218.0,58.0],[255.0,197.0,11.0],[255.0,179.0,0.0],[255.0,161.0,0.0],[255.0,142.0,0.0],[255.0,120.0,0.0],[255.0,84.0,0.0],[255.0,41.0,0.0],[255.0,5.0,0.0],[246.0,0.0,37.0],[236.0,0.0,79.0],[227.0,0.0,122.0],[211.0,0.0,135.0],[180.0,0.0,85.0],[154.0,0.0,43.0],[128.0,0.0,0.0]],"GMT_gray":[[0.05,0.05,0.05],[0.15,0.15,0.15],[0.25,0.25,0.25],[0.35,0.35,0.35],[0.45,0.45,0.45],[0.55,0.55,0.55],[0.65,0.65,0.65],[0.75,0.75,0.75],[0.85,0.85,0.85],[0.95,0.95,0.95]],"temp_diff_18lev":[[7.0,30.0,70.0],[7.0,47.0,107.0],[8.0,87.0,156.0],[33.0,113.0,181.0],[66.0,146.0,199.0],[90.0,160.0,205.0],[120.0,191.0,214.0],[170.0,220.0,230.0],[219.0,245.0,255.0],[255.0,255.0,255.0],[255.0,224.0,224.0],[252.0,187.0,170.0],[252.0,146.0,114.0],[251.0,106.0,74.0],[240.0,60.0,43.0],[204.0,24.0,30.0],[166.0,15.0,20.0],[120.0,10.0,15.0],[95.0,0.0,0.0]],"BlAqGrYeOrReVi200":[[0.0,0.0,255.0],[0.0,8.0,255.0],[0.0,15.0,255.0],[0.0,23.0,255.0],[0.0,31.0,255.0],[0.0,39.0,255.0],[0.0,46.0,255.0],[0.0,54.0,255.0],[0.0,62.0,255.0],[0.0,70.0,255.0],[0.0,77.0,255.0],[0.0,85.0,255.0],[0.0,93.0,255.0],[0.0,100.0,255.0],[0.0,108.0,255.0],[0.0,116.0,255.0],[0.0,124.0,255.0],[0.0,131.0,255.0],[0.0,139.0,255.0],[0.0,147.0,255.0],[0.0,155.0,255.0],[0.0,162.0,255.0],[0.0,170.0,255.0],[0.0,178.0,255.0],[0.0,185.0,255.0],[0.0,193.0,255.0],[0.0,201.0,255.0],[0.0,209.0,255.0],[0.0,216.0,255.0],[0.0,224.0,255.0],[0.0,232.0,255.0],[0.0,240.0,255.0],[0.0,247.0,255.0],[0.0,255.0,255.0],[0.0,253.0,248.0],[0.0,250.0,240.0],[1.0,248.0,233.0],[1.0,246.0,226.0],[1.0,243.0,219.0],[1.0,241.0,211.0],[2.0,239.0,204.0],[2.0,237.0,197.0],[2.0,234.0,190.0],[2.0,232.0,182.0],[3.0,230.0,175.0],[3.0,227.0,168.0],[3.0,225.0,160.0],[3.0,223.0,153.0],[4.0,220.0,146.0],[4.0,218.0,139.0],[4.0,216.0,131.0],[4.0,214.0,124.0],[5.0,211.0,117.0],[5.0,209.0,110.0],[5.0,207.0,102.0],[5.0,204.0,95.0],[6.0,202.0,88.0],[6.0,200.0,80.0],[6.0,197.0,73.0],[6.0,195.0,66.0],[7.0,193.0,59.0],[7.0,191.0,51.0],[7.0,188.0,44.0],[7.0,186.0,37.0],[8.0,184.0,30.0],[8.0,181.0,22.0],[8.0,179.0,15.0],[15.0,181.0,15.0],[23.0,183.0,14.0],[30.0,186.0,14.0],[37.0,188.0,13.0],[44.0,190.0,13.0],[52.0,192.0,12.0],[59.0,195.0,12.0],[66.0,197.0,11.0],[73.0,199.0,11.0],[81.0,201.0,11.0],[88.0,204.0,10.0],[95.0,206.0,10.0],[102.0,208.0,9.0],[110.0,210.0,9.0],[117.0,213.0,8.0],[124.0,215.0,8.0],[132.0,217.0,8.0],[139.0,219.0,7.0],[146.0,221.0,7.0],[153.0,224.0,6.0],[161.0,226.0,6.0],[168.0,228.0,5.0],[175.0,230.0,5.0],[182.0,233.0,4.0],[190.0,235.0,4.0],[197.0,237.0,4.0],[204.0,239.0,3.0],[211.0,242.0,3.0],[219.0,244.0,2.0],[226.0,246.0,2.0],[233.0,248.0,1.0],[240.0,251.0,1.0],[248.0,253.0,0.0],[255.0,255.0,0.0],[255.0,252.0,0.0],[255.0,250.0,0.0],[255.0,247.0,0.0],[255.0,244.0,0.0],[255.0,241.0,0.0],[255.0,239.0,0.0],[255.0,236.0,0.0],[255.0,233.0,0.0],[255.0,230.0,0.0],[255.0,228.0,0.0],[255.0,225.0,0.0],[255.0,222.0,0.0],[255.0,220.0,0.0],[255.0,217.0,0.0],[255.0,214.0,0.0],[255.0,211.0,0.0],[255.0,209.0,0.0],[255.0,206.0,0.0],[255.0,203.0,0.0],[255.0,200.0,0.0],[255.0,198.0,0.0],[255.0,195.0,0.0],[255.0,192.0,0.0],[255.0,190.0,0.0],[255.0,187.0,0.0],[255.0,184.0,0.0],[255.0,181.0,0.0],[255.0,179.0,0.0],[255.0,176.0,0.0],[255.0,173.0,0.0],[255.0,170.0,0.0],[255.0,168.0,0.0],[255.0,165.0,0.0],[255.0,160.0,0.0],[255.0,155.0,0.0],[255.0,150.0,0.0],[255.0,145.0,0.0],[255.0,140.0,0.0],[255.0,135.0,0.0],[255.0,130.0,0.0],[255.0,125.0,0.0],[255.0,120.0,0.0],[255.0,115.0,0.0],[255.0,110.0,0.0],[255.0,105.0,0.0],[255.0,100.0,0.0],[255.0,95.0,0.0],[255.0,90.0,0.0],[255.0,85.0,0.0],[255.0,80.0,0.0],[255.0,75.0,0.0],[255.0,70.0,0.0],[255.0,65.0,0.0],[255.0,60.0,0.0],[255.0,55.0,0.0],[255.0,50.0,0.0],[255.0,45.0,0.0],[255.0,40.0,0.0],[255.0,35.0,0.0],[255.0,30.0,0.0],[255.0,25.0,0.0],[255.0,20.0,0.0],[255.0,15.0,0.0],[255.0,10.0,0.0],[255.0,5.0,0.0],[255.0,0.0,0.0],[250.0,0.0,4.0],[245.0,0.0,8.0],[240.0,0.0,12.0],[235.0,0.0,16.0],[230.0,0.0,21.0],[224.0,0.0,25.0],[219.0,0.0,29.0],[214.0,0.0,33.0],[209.0,0.0,37.0],[204.0,0.0,41.0],[199.0,0.0,45.0],[194.0,0.0,49.0],[189.0,0.0,54.0],[184.0,0.0,58.0],[179.0,0.0,62.0],[174.0,0.0,66.0],[168.0,0.0,70.0],[163.0,0.0,74.0],[158.0,0.0,78.0],[153.0,0.0,82.0],[148.0,0.0,87.0],[143.0,0.0,91.0],[138.0,0.0,95.0],[133.0,0.0,99.0],[128.0,0.0,103.0],[123.0,0.0,107.0],[118.0,0.0,111.0],[112.0,0.0,115.0],[107.0,0.0,120.0],[102.0,0.0,124.0],[97.0,0.0,128.0],[92.0,0.0,132.0],[87.0,0.0,136.0]],"MPL_Set1":[[0.872834,0.114264,0.128997],[0.830265,0.13887,0.167382],[0.787697,0.163476,0.205767],[0.745129,0.188082,0.244152],[0.702561,0.212687,0.282537],[0.659992,0.237293,0.320923],[0.617424,0.261899,0.359308],[0.574856,0.286505,0.397693],[0.532288,0.311111,0.436078],[0.511003,0.323414,0.455271],[0.447151,0.360323,0.512849],[0.425867,0.372626,0.532042],[0.362015,0.409535,0.589619],[0.34073,0.421838,0.608812],[0.276878,0.458747,0.66639],[0.255594,0.47105,0.685582],[0.218731,0.5009,0.706344],[0.224145,0.512957,0.679277],[0.226851,0.518985,0.665744],[0.234971,0.53707,0.625144],[0.240384,0.549127,0.598078],[0.245798,0.561184,0.571011],[0.248504,0.567213,0.557478],[0.256624,0.585298,0.516878],[0.262038,0.597355,0.489812],[0.267451,0.609412,0.462745],[0.270158,0.61544,0.449212],[0.278278,0.633526,0.408612],[0.283691,0.645582,0.381546],[0.289104,0.657639,0.354479],[0.291811,0.663668,0.340946],[0.299931,0.681753,0.300346],[0.313495,0.671357,0.303883],[0.331949,0.647489,0.325782],[0.350404,0.623622,0.347682],[0.368858,0.599754,0.369581],[0.387313,0.575886,0.39148],[0.39654,0.563952,0.40243],[0.424221,0.528151,0.435279],[0.442676,0.504283,0.457178],[0.46113,0.480415,0.479077],[0.479585,0.456547,0.500977],[0.498039,0.43268,0.522876],[0.516494,0.408812,0.544775],[0.534948,0.384944,0.566674],[0.544175,0.37301,0.577624],[0.571857,0.337209,0.610473],[0.590311,0.313341,0.632372],[0.613503,0.314171,0.611642],[0.638847,0.326228,0.571534],[0.664191,0.338285,0.531426],[0.689535,0.350342,0.491319],[0.714879,0.362399,0.451211],[0.727551,0.368428,0.431157],[0.765567,0.386513,0.370996],[0.790911,0.39857,0.330888],[0.816255,0.410627,0.29078],[0.841599,0.422684,0.250673],[0.866943,0.43474,0.210565],[0.892288,0.446797,0.170458],[0.917632,0.458854,0.13035],[0.930304,0.464883,0.110296],[0.96832,0.482968,0.050135],[0.993664,0.495025,0.010027],[1.0,0.521661,0.009412],[1.0,0.553156,0.021961],[1.0,0.584652,0.03451],[1.0,0.616148,0.047059],[1.0,0.647643,0.059608],[1.0,0.679139,0.072157],[1.0,0.710634,0.084706],[1.0,0.74213,0.097255],[1.0,0.773626,0.109804],[1.0,0.805121,0.122353],[1.0,0.836617,0.134902],[1.0,0.852364,0.141176],[1.0,0.899608,0.16],[1.0,0.931103,0.172549],[1.0,0.962599,0.185098],[1.0,0.994095,0.197647],[0.982207,0.966213,0.197801],[0.960308,0.924629,0.195094],[0.938408,0.883045,0.192388],[0.916509,0.841461,0.189681],[0.89461,0.799877,0.186974],[0.872711,0.758293,0.184268],[0.850811,0.716709,0.181561],[0.828912,0.675125,0.178854],[0.807013,0.633541,0.176148],[0.785113,0.591957,0.173441],[0.763214,0.550373,0.170734],[0.752265,0.529581,0.169381],[0.719416,0.467205,0.165321],[0.697516,0.425621,0.162614],[0.675617,0.384037,0.159908],[0.653718,0.342453,0.157201],[0.66842,0.346513,0.189373],[0.688351,0.357093,0.226528],[0.708281,0.367674,0.263683],[0.728212,0.378255,0.300838],[0.748143,0.388835,0.337993],[0.768074,0.399416,0.375148],[0.788005,0.409996,0.412303],[0.807935,0.420577,0.449458],[0.827866,0.431157,0.486613],[0.847797,0.441738,0.523768],[0.867728,0.452318,0.560923],[0.877693,0.457609,0.5795],[0.907589,0.473479,0.635233],[0.92752,0.48406,0.672388],[0.947451,0.494641,0.709542],[0.967382,0.505221,0.746697],[0.946943,0.511419,0.740254],[0.923814,0.517324,0.730904],[0.900684,0.52323,0.721553],[0.877555,0.529135,0.712203],[0.854425,0.53504,0.702853],[0.831296,0.540946,0.693503],[0.808166,0.546851,0.684152],[0.785037,0.552757,0.674802],[0.761907,0.558662,0.665452],[0.738777,0.564568,0.656102],[0.715648,0.570473,0.646751],[0.704083,0.573426,0.642076],[0.669389,0.582284,0.628051],[0.646259,0.588189,0.618701],[0.62313,0.594095,0.60935],[0.6,0.6,0.6]],"MPL_prism":[[1.0,0.0,0.0],[1.0,0.320298,0.0],[1.0,0.69091,0.0],[1.0,0.967906,0.0],[0.699099,1.0,0.0],[0.326218,0.996569,0.0],[0.042511,0.740801,0.224725],[0.0,0.378476,0.725917],[0.0,0.003577,1.0],[0.100146,0.0,1.0],[0.602179,0.0,0.844967],[0.794621,0.0,0.637761],[1.0,0.0,0.0],[1.0,0.056056,0.0],[1.0,0.621063,0.0],[1.0,0.787487,0.0],[0.776362,1.0,0.0],[0.396916,1.0,0.0],[0.228041,0.935947,0.0],[0.0,0.455532,0.636657],[0.0,0.075077,0.995886],[0.181686,0.0,1.0],[0.342745,0.0,1.0],[0.906591,0.0,0.492737],[1.0,0.0,0.0],[1.0,0.166393,0.0],[1.0,0.358175,0.0],[1.0,0.873235,0.0],[0.852487,1.0,0.0],[0.470536,1.0,0.0],[0.293001,0.978361,0.0],[0.0,0.531245,0.540584],[0.0,0.149306,0.942302],[0.125492,0.0,1.0],[0.450132,0.0,0.971666],[0.831803,0.0,0.591696],[1.0,0.0,0.058246],[1.0,0.0,0.0],[1.0,0.472804,0.0],[1.0,0.81691,0.0],[0.92666,1.0,0.0],[0.54629,1.0,0.0],[0.19801,0.912859,0.0],[0.0,0.604804,0.438728],[0.0,0.225468,0.878635],[0.0,0.039789,1.0],[0.377235,0.0,1.0],[0.755285,0.0,0.684324],[1.0,0.0,0.171409],[1.0,0.019471,0.0],[1.0,0.39598,0.0],[1.0,0.755376,0.0],[0.998086,1.0,0.0],[0.815525,1.0,0.0],[0.260746,0.958499,0.0],[0.00428,0.675423,0.332176],[0.0,0.302748,0.805567],[0.031124,0.0,1.0],[0.307471,0.0,1.0],[0.677854,0.0,0.76963],[1.0,0.0,0.282737],[1.0,0.0,0.00271],[1.0,0.31845,0.0],[1.0,0.689289,0.0],[1.0,0.966932,0.0],[0.700945,1.0,0.0],[0.327862,0.997414,0.0],[0.043525,0.742346,0.222071],[0.0,0.38032,0.723878],[0.0,0.005241,1.0],[0.241586,0.0,1.0],[0.600339,0.0,0.8467],[0.977161,0.0,0.39104],[1.0,0.0,0.0],[1.0,0.241044,0.0],[1.0,0.433617,0.0],[1.0,0.922616,0.0],[0.778191,1.0,0.0],[0.398638,1.0,0.0],[0.089474,0.804857,0.109589],[0.0,0.457354,0.634445],[0.0,0.076816,0.994732],[0.180284,0.0,1.0],[0.523569,0.0,0.914711],[0.904836,0.0,0.495159],[1.0,0.0,0.0],[1.0,0.16459,0.0],[1.0,0.546332,0.0],[1.0,0.871959,0.0],[0.854279,1.0,0.0],[0.472318,1.0,0.0],[0.2946,0.979288,0.0],[0.0,0.533024,0.538222],[0.0,0.1511,0.940901],[0.124223,0.0,1.0],[0.448366,0.0,0.972934],[0.829998,0.0,0.593979],[1.0,0.0,0.060953],[1.0,0.089905,0.0],[1.0,0.47099,0.0],[1.0,0.815503,0.0],[0.928395,1.0,0.0],[0.548113,1.0,0.0],[0.199447,0.914021,0.0],[0.0,0.606523,0.436241],[0.0,0.227298,0.877002],[0.074002,0.0,1.0],[0.20959,0.0,1.0],[0.753449,0.0,0.686444],[1.0,0.0,0.174085],[1.0,0.017789,0.0],[1.0,0.394139,0.0],[1.0,0.753852,0.0],[0.999747,1.0,0.0],[0.625213,1.0,0.0],[0.262296,0.959506,0.0],[0.005133,0.677063,0.329591],[0.0,0.304595,0.803718],[0.030158,0.0,1.0],[0.305854,0.0,1.0],[0.676006,0.0,0.771564],[1.0,0.0,0.285355],[1.0,0.0,0.0],[1.0,0.126086,0.0],[1.0,0.687666,0.0],[1.0,0.965954,0.0],[0.702791,1.0,0.0],[0.329507,0.998255,0.0]],"WhiteBlue":[[255.0,255.0,255.0],[254.0,255.0,255.0],[253.0,254.0,255.0],[253.0,254.0,255.0],[252.0,254.0,255.0],[251.0,253.0,254.0],[250.0,253.0,254.0],[250.0,253.0,254.0],[249.0,253.0,254.0],[248.0,252.0,254.0],[247.0,252.0,254.0],[247.0,252.0,254.0],[246.0,251.0,254.0],[245.0,251.0,254.0],[244.0,251.0,253.0],[243.0,250.0,253.0],[243.0,250.0,253.0],[242.0,250.0,253.0],[241.0,249.0,253.0],[240.0,249.0,253.0],[240.0,249.0,253.0],[239.0,249.0,253.0],[238.0,248.0,252.0],[237.0,248.0,252.0],[237.0,248.0,252.0],[236.0,247.0,252.0],[235.0,247.0,252.0],[234.0,247.0,252.0],[233.0,246.0,252.0],[233.0,246.0,252.0],[232.0,246.0,252.0],[231.0,245.0,251.0],[230.0,245.0,251.0],[230.0,245.0,251.0],[229.0,245.0,251.0],[228.0,244.0,251.0],[227.0,244.0,251.0],[227.0,244.0,251.0],[226.0,243.0,251.0],[225.0,243.0,251.0],[224.0,243.0,250.0],[223.0,242.0,250.0],[223.0,242.0,250.0],[222.0,242.0,250.0],[221.0,241.0,250.0],[220.0,241.0,250.0],[220.0,241.0,250.0],[219.0,241.0,250.0],[218.0,240.0,249.0],[217.0,240.0,249.0],[217.0,240.0,249.0],[215.0,239.0,249.0],[214.0,239.0,249.0],[213.0,238.0,249.0],[212.0,238.0,249.0],[211.0,237.0,249.0],[209.0,237.0,249.0],[208.0,237.0,249.0],[207.0,236.0,249.0],[206.0,236.0,249.0],[205.0,235.0,249.0],[204.0,235.0,249.0],[203.0,235.0,249.0],[202.0,234.0,249.0],[201.0,234.0,249.0],[199.0,233.0,248.0],[198.0,233.0,248.0],[197.0,233.0,248.0],[196.0,232.0,248.0],[195.0,232.0,248.0],[194.0,231.0,248.0],[193.0,231.0,248.0],[192.0,231.0,248.0],[190.0,230.0,248.0],[189.0,230.0,248.0],[188.0,229.0,248.0],[187.0,229.0,248.0],[186.0,229.0,248.0],[185.0,228.0,248.0],[184.0,228.0,248.0],[183.0,227.0,248.0],[182.0,227.0,248.0],[180.0,226.0,248.0],[179.0,226.0,248.0],[178.0,226.0,248.0],[177.0,225.0,248.0],[176.0,225.0,248.0],[175.0,224.0,248.0],[174.0,224.0,248.0],[173.0,224.0,248.0],[172.0,223.0,248.0],[170.0,223.0,247.0],[169.0,222.0,247.0],[168.0,222.0,247.0],[167.0,222.0,247.0],[166.0,221.0,247.0],[165.0,221.0,247.0],[164.0,220.0,247.0],[163.0,220.0,247.0],[161.0,220.0,247.0],[160.0,219.0,247.0],[157.0,218.0,247.0],[156.0,217.0,246.0],[154.0,216.0,246.0],[153.0,215.0,245.0],[152.0,214.0,245.0],[150.0,213.0,244.0],[149.0,212.0,243.0],[148.0,211.0,243.0],[146.0,210.0,242.0],[145.0,209.0,242.0],[144.0,208.0,241.0],[142.0,207.0,240.0],[141.0,206.0,240.0],[140.0,205.0,239.0],[138.0,203.0,239.0],[137.0,202.0,238.0],[135.0,201.0,237.0],[134.0,200.0,237.0],[133.0,199.0,236.0],[131.0,198.0,236.0],[130.0,197.0,235.0],[129.0,196.0,234.0],[127.0,195.0,234.0],[126.0,194.0,233.0],[125.0,193.0,233.0],[123.0,192.0,232.0],[122.0,191.0,232.0],[121.0,190.0,231.0],[119.0,189.0,230.0],[118.0,188.0,230.0],[117.0,187.0,229.0],[115.0,186.0,229.0],[114.0,185.0,228.0],[113.0,184.0,227.0],[111.0,183.0,227.0],[110.0,182.0,226.0],[109.0,181.0,226.0],[107.0,180.0,225.0],[106.0,179.0,224.0],[105.0,178.0,224.0],[103.0,176.0,223.0],[102.0,175.0,223.0],[100.0,174.0,222.0],[99.0,173.0,221.0],[98.0,172.0,221.0],[96.0,171.0,220.0],[95.0,170.0,220.0],[94.0,169.0,219.0],[92.0,168.0,218.0],[91.0,167.0,218.0],[90.0,166.0,217.0],[87.0,164.0,216.0],[86.0,163.0,215.0],[85.0,161.0,214.0],[84.0,160.0,213.0],[83.0,158.0,212.0],[82.0,157.0,211.0],[81.0,155.0,210.0],[80.0,154.0,209.0],[79.0,152.0,208.0],[78.0,151.0,208.0],[77.0,150.0,207.0],[76.0,148.0,206.0],[75.0,147.0,205.0],[74.0,145.0,204.0],[73.0,144.0,203.0],[72.0,142.0,202.0],[71.0,141.0,201.0],[70.0,139.0,200.0],[69.0,138.0,199.0],[68.0,137.0,198.0],[67.0,135.0,197.0],[66.0,134.0,196.0],[65.0,132.0,195.0],[64.0,131.0,194.0],[63.0,129.0,193.0],[62.0,128.0,192.0],[62.0,127.0,192.0],[61.0,125.0,191.0],[60.0,124.0,190.0],[59.0,122.0,189.0],[58.0,121.0,188.0],[57.0,119.0,187.0],[56.0,118.0,186.0],[55.0,116.0,185.0],[54.0,115.0,184.0],[53.0,114.0,183.0],[52.0,112.0,182.0],[51.0,111.0,181.0],[50.0,109.0,180.0],[49.0,108.0,179.0],[48.0,106.0,178.0],[47.0,105.0,177.0],[46.0,103.0,176.0],[45.0,102.0,175.0],[44.0,101.0,175.0],[43.0,99.0,174.0],[42.0,98.0,173.0],[41.0,96.0,172.0],[40.0,95.0,171.0],[39.0,93.0,170.0],[36.0,89.0,167.0],[36.0,88.0,166.0],[36.0,87.0,164.0],[35.0,86.0,163.0],[35.0,86.0,162.0],[35.0,85.0,160.0],[35.0,84.0,159.0],[35.0,83.0,158.0],[35.0,82.0,156.0],[34.0,81.0,155.0],[34.0,80.0,154.0],[34.0,79.0,152.0],[34.0,79.0,151.0],[34.0,78.0,150.0],[34.0,77.0,148.0],[33.0,76.0,147.0],[33.0,75.0,146.0],[33.0,74.0,144.0],[33.0,73.0,143.0],[33.0,73.0,142.0],[33.0,72.0,140.0],[32.0,71.0,139.0],[32.0,70.0,138.0],[32.0,69.0,136.0],[32.0,68.0,135.0],[32.0,67.0,134.0],[32.0,67.0,133.0],[31.0,66.0,131.0],[31.0,65.0,130.0],[31.0,64.0,129.0],[31.0,63.0,127.0],[31.0,62.0,126.0],[30.0,61.0,125.0],[30.0,60.0,123.0],[30.0,60.0,122.0],[30.0,59.0,121.0],[30.0,58.0,119.0],[30.0,57.0,118.0],[29.0,56.0,117.0],[29.0,55.0,115.0],[29.0,54.0,114.0],[29.0,54.0,113.0],[29.0,53.0,111.0],[29.0,52.0,110.0],[28.0,51.0,109.0],[28.0,50.0,107.0],[28.0,49.0,106.0],[28.0,48.0,105.0],[28.0,47.0,103.0],[28.0,47.0,102.0],[27.0,46.0,101.0],[27.0,44.0,98.0]],"perc2_9lev":[[215.0,227.0,238.0],[181.0,202.0,255.0],[143.0,179.0,255.0],[127.0,151.0,255.0],[171.0,207.0,99.0],[232.0,245.0,158.0],[255.0,250.0,20.0],[255.0,209.0,33.0],[255.0,163.0,10.0],[255.0,76.0,0.0]],"SVG_Lindaa06":[[240.0,60.0,0.0],[236.0,56.0,0.0],[232.0,56.0,0.0],[228.0,52.0,0.0],[228.0,48.0,0.0],[224.0,48.0,0.0],[220.0,44.0,0.0],[212.0,36.0,0.0],[204.0,32.0,0.0],[200.0,28.0,0.0],[192.0,24.0,0.0],[188.0,20.0,0.0],[180.0,16.0,0.0],[168.0,8.0,0.0],[160.0,0.0,0.0],[164.0,4.0,0.0],[168.0,4.0,0.0],[172.0,8.0,0.0],[176.0,12.0,0.0],[184.0,16.0,0.0],[188.0,20.0,0.0],[192.0,24.0,0.0],[196.0,24.0,0.0],[200.0,28.0,0.0],[204.0,32.0,0.0],[212.0,36.0,0.0],[216.0,40.0,0.0],[220.0,44.0,0.0],[220.0,52.0,0.0],[220.0,60.0,0.0],[224.0,72.0,0.0],[228.0,88.0,0.0],[228.0,100.0,0.0],[232.0,108.0,0.0],[232.0,116.0,0.0],[236.0,128.0,0.0],[236.0,140.0,0.0],[240.0,168.0,0.0],[244.0,184.0,0.0],[244.0,196.0,0.0],[248.0,212.0,0.0],[252.0,228.0,0.0],[252.0,240.0,0.0],[252.0,240.0,0.0],[252.0,228.0,0.0],[252.0,212.0,0.0],[252.0,200.0,0.0],[252.0,184.0,0.0],[252.0,172.0,0.0],[248.0,148.0,0.0],[244.0,136.0,0.0],[244.0,128.0,0.0],[240.0,116.0,0.0],[240.0,108.0,0.0],[236.0,96.0,0.0],[232.0,76.0,0.0],[232.0,68.0,0.0],[228.0,56.0,0.0],[224.0,44.0,0.0],[212.0,44.0,8.0],[196.0,40.0,16.0],[168.0,32.0,32.0],[152.0,28.0,40.0],[136.0,28.0,48.0],[120.0,24.0,56.0],[108.0,20.0,64.0],[92.0,16.0,72.0],[60.0,8.0,88.0],[64.0,12.0,104.0],[72.0,12.0,112.0],[80.0,16.0,124.0],[88.0,20.0,132.0],[96.0,24.0,144.0],[116.0,32.0,164.0],[124.0,36.0,176.0],[132.0,40.0,188.0],[140.0,44.0,196.0],[152.0,48.0,208.0],[160.0,52.0,220.0],[168.0,56.0,228.0],[188.0,64.0,252.0],[180.0,60.0,248.0],[172.0,56.0,244.0],[160.0,52.0,240.0],[152.0,44.0,236.0],[144.0,40.0,232.0],[100.0,24.0,168.0],[68.0,16.0,112.0],[36.0,8.0,56.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[28.0,0.0,0.0],[44.0,0.0,0.0],[60.0,0.0,0.0],[72.0,0.0,0.0],[88.0,0.0,0.0],[104.0,0.0,0.0],[108.0,0.0,0.0],[92.0,0.0,0.0],[76.0,0.0,0.0],[60.0,0.0,0.0],[48.0,0.0,0.0],[32.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[24.0,4.0,44.0],[52.0,12.0,88.0],[76.0,16.0,132.0],[132.0,32.0,224.0],[144.0,36.0,232.0],[156.0,44.0,244.0],[168.0,48.0,248.0],[180.0,56.0,252.0],[188.0,60.0,252.0],[172.0,56.0,232.0],[164.0,52.0,224.0],[156.0,48.0,212.0],[144.0,44.0,200.0],[136.0,40.0,192.0],[128.0,40.0,180.0],[120.0,36.0,168.0],[100.0,28.0,148.0],[92.0,24.0,136.0],[84.0,20.0,128.0],[76.0,16.0,116.0],[64.0,12.0,104.0],[60.0,8.0,88.0],[88.0,12.0,72.0],[104.0,16.0,64.0],[116.0,20.0,56.0],[132.0,24.0,48.0],[148.0,24.0,40.0],[164.0,28.0,32.0],[192.0,36.0,16.0],[208.0,40.0,8.0],[224.0,44.0,0.0],[224.0,56.0,0.0],[228.0,68.0,0.0],[232.0,80.0,0.0],[240.0,104.0,0.0],[240.0,112.0,0.0],[240.0,120.0,0.0],[244.0,128.0,0.0],[244.0,140.0,0.0],[248.0,148.0,0.0],[252.0,168.0,0.0],[252.0,168.0,0.0],[252.0,184.0,0.0],[252.0,200.0,0.0],[252.0,216.0,0.0],[252.0,232.0,0.0],[252.0,240.0,0.0],[252.0,228.0,0.0],[248.0,212.0,0.0],[248.0,200.0,0.0],[244.0,184.0,0.0],[244.0,172.0,0.0],[240.0,144.0,0.0],[236.0,128.0,0.0],[236.0,116.0,0.0],[232.0,100.0,0.0],[232.0,88.0,0.0],[228.0,72.0,0.0],[224.0,44.0,0.0],[224.0,44.0,0.0],[220.0,44.0,0.0],[220.0,44.0,0.0],[216.0,40.0,0.0],[212.0,36.0,0.0],[204.0,32.0,0.0],[200.0,28.0,0.0],[196.0,28.0,0.0],[192.0,24.0,0.0],[188.0,20.0,0.0],[184.0,20.0,0.0],[176.0,12.0,0.0],[172.0,12.0,0.0],[168.0,8.0,0.0],[164.0,4.0,0.0],[160.0,0.0,0.0],[156.0,0.0,0.0],[168.0,8.0,0.0],[176.0,12.0,0.0],[184.0,20.0,0.0],[192.0,24.0,0.0],[200.0,28.0,0.0],[208.0,32.0,0.0],[216.0,40.0,0.0],[220.0,44.0,0.0],[224.0,48.0,0.0],[228.0,48.0,0.0],[232.0,52.0,0.0],[236.0,56.0,0.0],[240.0,60.0,0.0]],"MPL_BuPu":[[0.965798,0.986267,0.99105],[0.960138,0.98233,0.988835],[0.954479,0.978393,0.986621],[0.94882,0.974456,0.984406],[0.94316,0.970519,0.982191],[0.937501,0.966582,0.979977],[0.931842,0.962645,0.977762],[0.926182,0.958708,0.975548],[0.920523,0.954771,0.973333],[0.917693,0.952803,0.972226],[0.909204,0.946897,0.968904],[0.906374,0.944929,0.967797],[0.897885,0.939023,0.964475],[0.895056,0.937055,0.963368],[0.886567,0.93115,0.960046],[0.883737,0.929181,0.958939],[0.873864,0.92203,0.954925],[0.865744,0.915879,0.95148],[0.861684,0.912803,0.949758],[0.849504,0.903576,0.944591],[0.841384,0.897424,0.941146],[0.833264,0.891273,0.937701],[0.829204,0.888197,0.935978],[0.817024,0.87897,0.930811],[0.808904,0.872818,0.927366],[0.800784,0.866667,0.923922],[0.796724,0.863591,0.922199],[0.784544,0.854364,0.917032],[0.776424,0.848212,0.913587],[0.768305,0.842061,0.910142],[0.764245,0.838985,0.90842],[0.752065,0.829758,0.903253],[0.743945,0.823914,0.900115],[0.735825,0.818255,0.897163],[0.727705,0.812595,0.89421],[0.719585,0.806936,0.891257],[0.711465,0.801276,0.888305],[0.707405,0.798447,0.886828],[0.695225,0.789958,0.882399],[0.687105,0.784298,0.879446],[0.678985,0.778639,0.876494],[0.670865,0.77298,0.873541],[0.662745,0.76732,0.870588],[0.654625,0.761661,0.867636],[0.646505,0.756002,0.864683],[0.642445,0.753172,0.863206],[0.630265,0.744683,0.858777],[0.622145,0.739023,0.855825],[0.616563,0.730827,0.851519],[0.612134,0.721476,0.846597],[0.607705,0.712126,0.841676],[0.603276,0.702776,0.836755],[0.598847,0.693426,0.831834],[0.596632,0.68875,0.829373],[0.589988,0.674725,0.821992],[0.585559,0.665375,0.81707],[0.58113,0.656025,0.812149],[0.576701,0.646674,0.807228],[0.572272,0.637324,0.802307],[0.567843,0.627974,0.797386],[0.563414,0.618624,0.792464],[0.5612,0.613949,0.790004],[0.554556,0.599923,0.782622],[0.550127,0.590573,0.777701],[0.54902,0.5803,0.772595],[0.54902,0.569719,0.767428],[0.54902,0.559139,0.762261],[0.54902,0.548558,0.757093],[0.54902,0.537978,0.751926],[0.54902,0.527397,0.746759],[0.54902,0.516817,0.741592],[0.54902,0.506236,0.736424],[0.54902,0.495656,0.731257],[0.54902,0.485075,0.72609],[0.54902,0.474494,0.720923],[0.54902,0.469204,0.718339],[0.54902,0.453333,0.710588],[0.54902,0.442753,0.705421],[0.54902,0.432172,0.700254],[0.54902,0.421592,0.695087],[0.54822,0.411211,0.690119],[0.547236,0.400877,0.685198],[0.546251,0.390542,0.680277],[0.545267,0.380208,0.675356],[0.544283,0.369873,0.670434],[0.543299,0.359539,0.665513],[0.542315,0.349204,0.660592],[0.54133,0.33887,0.655671],[0.540346,0.328535,0.65075],[0.539362,0.318201,0.645829],[0.538378,0.307866,0.640907],[0.537885,0.302699,0.638447],[0.536409,0.287197,0.631065],[0.535425,0.276863,0.626144],[0.534441,0.266528,0.621223],[0.533456,0.256194,0.616301],[0.531826,0.244137,0.608581],[0.530104,0.231834,0.600461],[0.528381,0.219531,0.592341],[0.526659,0.207228,0.584221],[0.524937,0.194925,0.576102],[0.523214,0.182622,0.567982],[0.521492,0.170319,0.559862],[0.519769,0.158016,0.551742],[0.518047,0.145713,0.543622],[0.516325,0.13341,0.535502],[0.514602,0.121107,0.527382],[0.513741,0.114956,0.523322],[0.511157,0.096501,0.511142],[0.509435,0.084198,0.503022],[0.507712,0.071895,0.494902],[0.50599,0.059592,0.486782],[0.493887,0.055363,0.474971],[0.481092,0.051672,0.462914],[0.468297,0.047982,0.450857],[0.455502,0.044291,0.4388],[0.442707,0.0406,0.426744],[0.429912,0.036909,0.414687],[0.417117,0.033218,0.40263],[0.404321,0.029527,0.390573],[0.391526,0.025836,0.378516],[0.378731,0.022145,0.366459],[0.365936,0.018454,0.354402],[0.359539,0.016609,0.348374],[0.340346,0.011073,0.330288],[0.327551,0.007382,0.318231],[0.314756,0.003691,0.306175],[0.301961,0.0,0.294118]],"MPL_seismic":[[0.0,0.0,0.31098],[0.0,0.0,0.332941],[0.0,0.0,0.354902],[0.0,0.0,0.376863],[0.0,0.0,0.398824],[0.0,0.0,0.420784],[0.0,0.0,0.442745],[0.0,0.0,0.464706],[0.0,0.0,0.486667],[0.0,0.0,0.497647],[0.0,0.0,0.530588],[0.0,0.0,0.541569],[0.0,0.0,0.57451],[0.0,0.0,0.58549],[0.0,0.0,0.618431],[0.0,0.0,0.629412],[0.0,0.0,0.662353],[0.0,0.0,0.684314],[0.0,0.0,0.695294],[0.0,0.0,0.728235],[0.0,0.0,0.750196],[0.0,0.0,0.772157],[0.0,0.0,0.783137],[0.0,0.0,0.816078],[0.0,0.0,0.838039],[0.0,0.0,0.86],[0.0,0.0,0.87098],[0.0,0.0,0.903922],[0.0,0.0,0.925882],[0.0,0.0,0.947843],[0.0,0.0,0.958824],[0.0,0.0,0.991765],[0.019608,0.019608,1.0],[0.05098,0.05098,1.0],[0.082353,0.082353,1.0],[0.113725,0.113725,1.0],[0.145098,0.145098,1.0],[0.160784,0.160784,1.0],[0.207843,0.207843,1.0],[0.239216,0.239216,1.0],[0.270588,0.270588,1.0],[0.301961,0.301961,1.0],[0.333333,0.333333,1.0],[0.364706,0.364706,1.0],[0.396078,0.396078,1.0],[0.411765,0.411765,1.0],[0.458824,0.458824,1.0],[0.490196,0.490196,1.0],[0.521569,0.521569,1.0],[0.552941,0.552941,1.0],[0.584314,0.584314,1.0],[0.615686,0.615686,1.0],[0.647059,0.647059,1.0],[0.662745,0.662745,1.0],[0.709804,0.709804,1.0],[0.741176,0.741176,1.0],[0.772549,0.772549,1.0],[0.803922,0.803922,1.0],[0.835294,0.835294,1.0],[0.866667,0.866667,1.0],[0.898039,0.898039,1.0],[0.913725,0.913725,1.0],[0.960784,0.960784,1.0],[0.992157,0.992157,1.0],[1.0,0.976471,0.976471],[1.0,0.945098,0.945098],[1.0,0.913725,0.913725],[1.0,0.882353,0.882353],[1.0,0.85098,0.85098],[1.0,0.819608,0.819608],[1.0,0.788235,0.788235],[1.0,0.756863,0.756863],[1.0,0.72549,0.72549],[1.0,0.694118,0.694118],[1.0,0.662745,0.662745],[1.0,0.647059,0.647059],[1.0,0.6,0.6],[1.0,0.568627,0.568627],[1.0,0.537255,0.537255],[1.0,0.505882,0.505882],[1.0,0.47451,0.47451],[1.0,0.443137,0.443137],[1.0,0.411765,0.411765],[1.0,0.380392,0.380392],[1.0,0.34902,0.34902],[1.0,0.317647,0.317647],[1.0,0.286275,0.286275],[1.0,0.254902,0.254902],[1.0,0.223529,0.223529],[1.0,0.192157,0.192157],[1.0,0.160784,0.160784],[1.0,0.145098,0.145098],[1.0,0.098039,0.098039],[1.0,0.066667,0.066667],[1.0,0.035294,0.035294],[1.0,0.003922,0.003922],[0.986275,0.0,0.0],[0.970588,0.0,0.0],[0.954902,0.0,0.0],[0.939216,0.0,0.0],[0.923529,0.0,0.0],[0.907843,0.0,0.0],[0.892157,0.0,0.0],[0.876471,0.0,0.0],[0.860784,0.0,0.0],[0.845098,0.0,0.0],[0.829412,0.0,0.0],[0.821569,0.0,0.0],[0.798039,0.0,0.0],[0.782353,0.0,0.0],[0.766667,0.0,0.0],[0.75098,0.0,0.0],[0.735294,0.0,0.0],[0.719608,0.0,0.0],[0.703922,0.0,0.0],[0.688235,0.0,0.0],[0.672549,0.0,0.0],[0.656863,0.0,0.0],[0.641176,0.0,0.0],[0.62549,0.0,0.0],[0.609804,0.0,0.0],[0.594118,0.0,0.0],[0.578431,0.0,0.0],[0.570588,0.0,0.0],[0.547059,0.0,0.0],[0.531373,0.0,0.0],[0.515686,0.0,0.0],[0.5,0.0,0.0]],"MPL_hsv":[[1.0,0.023162,0.0],[1.0,0.069485,0.0],[1.0,0.115809,0.0],[1.0,0.162133,0.0],[1.0,0.208456,0.0],[1.0,0.25478,0.0],[1.0,0.301103,0.0],[1.0,0.347427,0.0],[1.0,0.39375,0.0],[1.0,0.416912,0.0],[1.0,0.486398,0.0],[1.0,0.509559,0.0],[1.0,0.579045,0.0],[1.0,0.602206,0.0],[1.0,0.671692,0.0],[1.0,0.694854,0.0],[1.0,0.764339,0.0],[1.0,0.810663,0.0],[1.0,0.833824,0.0],[1.0,0.90331,0.0],[0.995956,0.945589,0.0],[0.980514,0.976471,0.0],[0.972794,0.991912,0.0],[0.911396,1.0,0.0],[0.865072,1.0,0.0],[0.818749,1.0,0.0],[0.795587,1.0,0.0],[0.726102,1.0,0.0],[0.679778,1.0,0.0],[0.633455,1.0,0.0],[0.610293,1.0,0.0],[0.540807,1.0,0.0],[0.494484,1.0,0.0],[0.44816,1.0,0.0],[0.401837,1.0,0.0],[0.355513,1.0,0.0],[0.309189,1.0,0.0],[0.286028,1.0,0.0],[0.216542,1.0,0.0],[0.170219,1.0,0.0],[0.123895,1.0,0.0],[0.077572,1.0,0.0],[0.031249,1.0,1e-06],[0.015808,1.0,0.030884],[0.000367,1.0,0.061766],[0.0,1.0,0.084561],[0.0,1.0,0.154046],[0.0,1.0,0.200369],[0.0,1.0,0.246692],[0.0,1.0,0.293016],[0.0,1.0,0.339339],[0.0,1.0,0.385662],[0.0,1.0,0.431985],[0.0,1.0,0.455147],[0.0,1.0,0.524632],[0.0,1.0,0.570955],[0.0,1.0,0.617279],[0.0,1.0,0.663602],[0.0,1.0,0.709925],[0.0,1.0,0.756248],[0.0,1.0,0.802572],[0.0,1.0,0.825733],[0.0,1.0,0.895218],[0.0,1.0,0.941542],[0.0,1.0,0.987865],[0.0,0.965812,1.0],[0.0,0.919488,1.0],[0.0,0.873165,1.0],[0.0,0.826841,1.0],[0.0,0.780517,1.0],[0.0,0.734194,1.0],[0.0,0.68787,1.0],[0.0,0.641547,1.0],[0.0,0.595223,1.0],[0.0,0.5489,1.0],[0.0,0.525738,1.0],[0.0,0.456252,1.0],[0.0,0.409929,1.0],[0.0,0.363605,1.0],[0.0,0.317282,1.0],[0.0,0.270958,1.0],[0.0,0.224634,1.0],[0.0,0.178311,1.0],[0.0,0.131987,1.0],[0.0,0.085664,1.0],[0.00772,0.04706,1.0],[0.023161,0.016178,1.0],[0.053307,0.0,1.0],[0.099631,0.0,1.0],[0.145954,0.0,1.0],[0.192278,0.0,1.0],[0.215439,0.0,1.0],[0.284925,0.0,1.0],[0.331248,0.0,1.0],[0.377572,0.0,1.0],[0.423896,0.0,1.0],[0.470219,0.0,1.0],[0.516543,0.0,1.0],[0.562866,0.0,1.0],[0.60919,0.0,1.0],[0.655513,0.0,1.0],[0.701837,0.0,1.0],[0.748161,0.0,1.0],[0.794484,0.0,1.0],[0.840808,0.0,1.0],[0.887131,0.0,1.0],[0.933455,0.0,1.0],[0.956617,0.0,1.0],[0.987867,0.0,0.961765],[1.0,0.0,0.927574],[1.0,0.0,0.881251],[1.0,0.0,0.834927],[1.0,0.0,0.788604],[1.0,0.0,0.74228],[1.0,0.0,0.695956],[1.0,0.0,0.649633],[1.0,0.0,0.603309],[1.0,0.0,0.556986],[1.0,0.0,0.510662],[1.0,0.0,0.464339],[1.0,0.0,0.418015],[1.0,0.0,0.371691],[1.0,0.0,0.325368],[1.0,0.0,0.302206],[1.0,0.0,0.232721],[1.0,0.0,0.186397],[1.0,0.0,0.140074],[1.0,0.0,0.09375]],"Cat12":[[255.0,191.0,127.0],[255.0,127.0,0.0],[255.0,255.0,153.0],[255.0,255.0,50.0],[178.0,255.0,140.0],[50.0,255.0,0.0],[165.0,237.0,255.0],[25.0,178.0,255.0],[204.0,191.0,255.0],[101.0,76.0,255.0],[255.0,153.0,191.0],[229.0,25.0,50.0]],"GMT_nighttime":[[0.1225,0.002756,0.106335],[0.1675,0.011306,0.166719],[0.188926,0.023906,0.2125],[0.202179,0.040556,0.2575],[0.209621,0.061256,0.3025],[0.212831,0.086006,0.3475],[0.213388,0.114806,0.3925],[0.212871,0.147656,0.4375],[0.212861,0.184556,0.4825],[0.225506,0.236076,0.5275],[0.493403,0.568182,0.266012],[0.578968,0.613636,0.315186],[0.659091,0.654688,0.368492],[0.704545,0.663738,0.42593],[0.75,0.677083,0.4875],[0.795455,0.696351,0.553202],[0.840909,0.72317,0.623037],[0.886364,0.759168,0.697004],[0.931818,0.805971,0.775103],[0.977273,0.865209,0.857335]],"sunshine_9lev":[[255.0,255.0,255.0],[255.0,245.0,204.0],[255.0,230.0,112.0],[255.0,204.0,51.0],[255.0,175.0,51.0],[255.0,153.0,51.0],[255.0,111.0,51.0],[255.0,85.0,0.0],[230.0,40.0,30.0],[200.0,30.0,20.0]],"MPL_OrRd":[[0.999877,0.966782,0.921061],[0.999631,0.963091,0.912203],[0.999385,0.9594,0.903345],[0.999139,0.955709,0.894487],[0.998893,0.952018,0.885629],[0.998647,0.948328,0.87677],[0.998401,0.944637,0.867912],[0.998155,0.940946,0.859054],[0.997908,0.937255,0.850196],[0.997785,0.935409,0.845767],[0.997416,0.929873,0.83248],[0.997293,0.928028,0.828051],[0.996924,0.922491,0.814764],[0.996801,0.920646,0.810334],[0.996432,0.91511,0.797047],[0.996309,0.913264,0.792618],[0.99594,0.907036,0.778501],[0.995694,0.902115,0.768166],[0.995571,0.899654,0.762999],[0.995202,0.892272,0.747497],[0.994956,0.887351,0.737163],[0.99471,0.88243,0.726828],[0.994587,0.879969,0.721661],[0.994218,0.872587,0.706159],[0.993972,0.867666,0.695825],[0.993725,0.862745,0.68549],[0.993602,0.860285,0.680323],[0.993233,0.852903,0.664821],[0.992987,0.847982,0.654487],[0.992741,0.84306,0.644152],[0.992618,0.8406,0.638985],[0.992249,0.833218,0.623483],[0.992157,0.827528,0.615609],[0.992157,0.821376,0.609212],[0.992157,0.815225,0.602814],[0.992157,0.809073,0.596417],[0.992157,0.802922,0.590019],[0.992157,0.799846,0.58682],[0.992157,0.790619,0.577224],[0.992157,0.784468,0.570827],[0.992157,0.778316,0.564429],[0.992157,0.772165,0.558032],[0.992157,0.766013,0.551634],[0.992157,0.759862,0.545236],[0.992157,0.75371,0.538839],[0.992157,0.750634,0.53564],[0.992157,0.741407,0.526044],[0.992157,0.735256,0.519646],[0.991988,0.725552,0.510373],[0.991742,0.714233,0.499792],[0.991496,0.702914,0.489212],[0.99125,0.691596,0.478631],[0.991003,0.680277,0.468051],[0.99088,0.674617,0.46276],[0.990511,0.657639,0.44689],[0.990265,0.646321,0.436309],[0.990019,0.635002,0.425729],[0.989773,0.623683,0.415148],[0.989527,0.612364,0.404567],[0.989281,0.601046,0.393987],[0.989035,0.589727,0.383406],[0.988912,0.584068,0.378116],[0.988543,0.56709,0.362245],[0.988297,0.555771,0.351665],[0.985836,0.545559,0.345882],[0.982637,0.535717,0.341699],[0.979439,0.525875,0.337516],[0.97624,0.516032,0.333333],[0.973041,0.50619,0.32915],[0.969842,0.496348,0.324967],[0.966644,0.486505,0.320784],[0.963445,0.476663,0.316601],[0.960246,0.46682,0.312418],[0.957047,0.456978,0.308235],[0.953849,0.447136,0.304052],[0.952249,0.442215,0.301961],[0.947451,0.427451,0.295686],[0.944252,0.417609,0.291503],[0.941053,0.407766,0.28732],[0.937855,0.397924,0.283137],[0.932457,0.385483,0.274156],[0.926551,0.372441,0.264068],[0.920646,0.3594,0.253979],[0.91474,0.346359,0.243891],[0.908835,0.333318,0.233802],[0.90293,0.320277,0.223714],[0.897024,0.307236,0.213626],[0.891119,0.294195,0.203537],[0.885213,0.281153,0.193449],[0.879308,0.268112,0.18336],[0.873403,0.255071,0.173272],[0.87045,0.248551,0.168228],[0.861592,0.228989,0.153095],[0.855686,0.215948,0.143007],[0.849781,0.202907,0.132918],[0.843875,0.189865,0.12283],[0.835386,0.177901,0.114894],[0.826528,0.16609,0.107266],[0.81767,0.154279,0.099639],[0.808812,0.142468,0.092011],[0.799954,0.130657,0.084383],[0.791096,0.118847,0.076755],[0.782238,0.107036,0.069127],[0.773379,0.095225,0.061499],[0.764521,0.083414,0.053872],[0.755663,0.071603,0.046244],[0.746805,0.059792,0.038616],[0.742376,0.053887,0.034802],[0.729089,0.036171,0.02336],[0.720231,0.02436,0.015732],[0.711373,0.012549,0.008105],[0.702514,0.000738,0.000477],[0.689965,0.0,0.0],[0.67717,0.0,0.0],[0.664375,0.0,0.0],[0.65158,0.0,0.0],[0.638785,0.0,0.0],[0.62599,0.0,0.0],[0.613195,0.0,0.0],[0.6004,0.0,0.0],[0.587605,0.0,0.0],[0.57481,0.0,0.0],[0.562015,0.0,0.0],[0.555617,0.0,0.0],[0.536424,0.0,0.0],[0.523629,0.0,0.0],[0.510834,0.0,0.0],[0.498039,0.0,0.0]],"tbr_var_0-500":[[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[0.0,0.0,0.0],[9.0,0.0,14.0],[17.0,0.0,27.0],[26.0,0.0,41.0],[35.0,0.0,54.0],[44.0,0.0,68.0],[52.0,0.0,82.0],[61.0,0.0,95.0],[70.0,0.0,109.0],[78.0,0.0,122.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[87.0,0.0,136.0],[83.0,9.0,130.0],[79.0,17.0,124.0],[76.0,26.0,119.0],[72.0,34.0,113.0],[68.0,43.0,107.0],[64.0,51.0,101.0],[61.0,60.0,96.0],[57.0,68.0,90.0],[53.0,77.0,84.0],[49.0,85.0,78.0],[46.0,94.0,73.0],[42.0,102.0,67.0],[38.0,111.0,61.0],[34.0,119.0,55.0],[31.0,128.0,50.0],[27.0,136.0,44.0],[23.0,145.0,38.0],[19.0,153.0,32.0],[16.0,162.0,27.0],[12.0,170.0,21.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[8.0,179.0,15.0],[21.0,183.0,14.0],[34.0,187.0,13.0],[47.0,191.0,13.0],[60.0,195.0,12.0],[73.0,199.0,11.0],[86.0,203.0,10.0],[99.0,207.0,9.0],[112.0,211.0,9.0],[125.0,215.0,8.0],[138.0,219.0,7.0],[151.0,223.0,6.0],[164.0,227.0,6.0],[177.0,231.0,5.0],[190.0,235.0,4.0],[203.0,239.0,3.0],[216.0,243.0,2.0],[229.0,247.0,2.0],[242.0,251.0,1.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,255.0,0.0],[255.0,249.0,0.0],[255.0,243.0,0.0],[255.0,237.0,0.0],[255.0,231.0,0.0],[255.0,225.0,0.0],[255.0,219.0,0.0],[255.0,213.0,0.0],[255.0,206.0,0.0],[255.0,200.0,0.0],[255.0,194.0,0.0],[255.0,188.0,0.0],[255.0,182.0,0.0],[255.0,176.0,0.0],[255.0,170.0,0.0],[255.0,164.0,0.0],[255.0,158.0,0.0],[255.0,152.0,0.0],[255.0,146.0,0.0],[255.0,140.0,0.0],[255.0,134.0,0.0],[255.0,128.0,0.0],[255.0,121.0,0.0],[255.0,115.0,0.0],[255.0,109.0,0.0],[255.0,103.0,0.0],[255.0,97.0,0.0],[255.0,91.0,0.0],[255.0,85.0,0.0],[255.0,79.0,0.0],[255.0,73.0,0.0],[255.0,67.0,0.0],[255.0,61.0,0.0],[255.0,55.0,0.0],[255.0,49.0,0.0],[255.0,43.0,0.0],[255.0,36.0,0.0],[255.0,30.0,0.0],[255.0,24.0,0.0],[255.0,18.0,0.0],[255.0,12.0,0.0],[255.0,6.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[255.0,0.0,0.0],[254.0,8.0,24.0],[252.0,16.0,48.0],[251.0,24.0,72.0],[249.0,32.0,96.0],[248.0,40.0,120.0],[246.0,48.0,144.0],[245.0,56.0,168.0],[243.0,64.0,192.0],[242.0,72.0,216.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[240.0,80.0,240.0],[241.0,87.0,241.0],[241.0,95.0,241.0],[242.0,102.0,242.0],[243.0,109.0,243.0],[243.0,116.0,243.0],[244.0,124.0,244.0],[244.0,131.0,244.0],[245.0,138.0,245.0],[246.0,146.0,246.0],[246.0,153.0,246.0],[247.0,160.0,247.0],[248.0,168.0,248.0],[248.0,175.0,248.0],[249.0,182.0,249.0],[249.0,189.0,249.0],[250.0,197.0,250.0],[251.0,204.0,251.0],[251.0,211.0,251.0],[252.0,219.0,252.0],[253.0,226.0,253.0],[253.0,233.0,253.0],[254.0,240.0,254.0],[254.0,248.0,254.0],[255.0,255.0,255.0]],"hlu_default":[[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0],[1.0,1.0,0.0],[0.0,1.0,1.0],[1.0,0.0,1.0],[0.5,0.0,0.0],[0.5,1.0,1.0],[0.0,0.0,0.5],[1.0,1.0,0.5],[0.5,0.0,1.0],[1.0,0.5,0.0],[0.0,0.5,1.0],[0.5,1.0,0.0],[0.5,0.0,0.5],[0.5,1.0,0.5],[1.0,0.5,1.0],[0.0,0.5,0.0],[0.5,0.5,1.0],[1.0,0.0,0.5],[0.5,0.5,0.0],[0.0,0.5,0.5],[1.0,0.5,0.5],[0.0,1.0,0.5],[0.5,0.5,0.5],[0.125,0.125,0.125],[0.75,0.75,0.75],[0.25,0.25,0.25],[0.625,0.625,0.625],[0.375,0.375,0.375]],"BlGrYeOrReVi200":[[0.0,0.0,255.0],[0.0,4.0,249.0],[0.0,9.0,243.0],[1.0,13.0,237.0],[1.0,18.0,231.0],[1.0,22.0,225.0],[1.0,27.0,219.0],[1.0,31.0,213.0],[2.0,36.0,207.0],[2.0,40.0,201.0],[2.0,45.0,195.0],[2.0,49.0,189.0],[2.0,54.0,183.0],[3.0,58.0,177.0],[3.0,63.0,171.0],[3.0,67.0,165.0],[3.0,72.0,159.0],[3.0,76.0,153.0],[4.0,81.0,147.0],[4.0,85.0,141.0],[4.0,90.0,135.0],[4.0,94.0,129.0],[4.0,98.0,123.0],[5.0,103.0,117.0],[5.0,107.0,111.0],[5.0,112.0,105.0],[5.0,116.0,99.0],[5.0,121.0,93.0],[6.0,125.0,87.0],[6.0,130.0,81.0],[6.0,134.0,75.0],[6.0,139.0,69.0],[6.0,143.0,63.0],[7.0,148.0,57.0],[7.0,152.0,51.0],[7.0,157.0,45.0],[7.0,161.0,39.0],[7.0,166.0,33.0],[8.0,170.0,27.0],[8.0,175.0,21.0],[8.0,179.0,15.0],[14.0,181.0,15.0],[20.0,183.0,14.0],[27.0,185.0,14.0],[33.0,187.0,14.0],[39.0,189.0,13.0],[45.0,190.0,13.0],[51.0,192.0,12.0],[57.0,194.0,12.0],[64.0,196.0,12.0],[70.0,198.0,11.0],[76.0,200.0,11.0],[82.0,202.0,11.0],[88.0,204.0,10.0],[94.0,206.0,10.0],[101.0,208.0,9.0],[107.0,209.0,9.0],[113.0,211.0,9.0],[119.0,213.0,8.0],[125.0,215.0,8.0],[132.0,217.0,8.0],[138.0,219.0,7.0],[144.0,221.0,7.0],[150.0,223.0,6.0],[156.0,225.0,6.0],[162.0,227.0,6.0],[169.0,228.0,5.0],[175.0,230.0,5.0],[181.0,232.0,5.0],[187.0,234.0,4.0],[193.0,236.0,4.0],[199.0,238.0,3.0],[206.0,240.0,3.0],[212.0,242.0,3.0],[218.0,244.0,2.0],[224.0,246.0,2.0],[230.0,247.0,2.0],[236.0,249.0,1.0],[243.0,251.0,1.0],[249.0,253.0,0.0],[255.0,255.0,0.0],[255.0,253.0,0.0],[255.0,250.0,0.0],[255.0,248.0,0.0],[255.0,246.0,0.0],[255.0,243.0,0.0],[255.0,241.0,0.0],[255.0,239.0,0.0],[255.0,237.0,0.0],[255.0,234.0,0.0],[255.0,232.0,0.0],[255.0,230.0,0.0],[255.0,227.0,0.0],[255.0,225.0,0.0],[255.0,223.0,0.0],[255.0,220.0,0.0],[255.0,218.0,0.0],[255.0,216.0,0.0],[255.0,213.0,0.0],[255.0,211.0,0.0],[255.0,209.0,0.0],[255.0,207.0,0.0],[255.0,204.0,0.0],[255.0,202.0,0.0],[255.0,200.0,0.0],[255.0,197.0,0.0],[255.0,195.0,0.0],[255.0,193.0,0.0],[255.0,190.0,0.0],[255.0,188.0,0.0],[255.0,186.0,0.0],[255.0,183.0,0.0],[255.0,181.0,0.0],[255.0,179.0,0.0],[255.0,177.0,0.0],[255.0,174.0,0.0],[255.0,172.0,0.0],[255.0,170.0,0.0],[255.0,167.0,0.0],[255.0,165.0,0.0],[255.0,161.0,0.0],[255.0,157.0,0.0],[255.0,153.0,0.0],[255.0,149.0,0.0],[255.0,144.0,0.0],[255.0,140.0,0.0],[255.0,136.0,0.0],[255.0,132.0,0.0],[255.0,128.0,0.0],[255.0,124.0,0.0],[255.0,120.0,0.0],[255.0,116.0,0.0],[255.0,111.0,0.0],[255.0,107.0,0.0],[255.0,103.0,0.0],[255.0,99.0,0.0],[255.0,95.0,0.0],[255.0,91.0,0.0],[255.0,87.0,0.0],[255.0,83.0,0.0],[255.0,78.0,0.0],[255.0,74.0,0.0],[255.0,70.0,0.0],[255.0,66.0,0.0],[255.0,62.0,0.0],[255.0,58.0,0.0],[255.0,54.0,0.0],[255.0,50.0,0.0],[255.0,45.0,0.0],[255.0,41.0,0.0],[255.0,37.0,0.0],[255.0,33.0,0.0],[255.0,29.0,0.0],[255.0,25.0,0.0],[255.0,21.0,0.0],[255.0,17.0,0.0],[255.0,12.0,0.0],[255.0,8.0,0.0],[255.0,4.0,0.0],[255.0,0.0,0.0],[251.0,0.0,3.0],[247.0,0.0,7.0],[242.0,0.0,10.0],[238.0,0.0,14.0],[234.0,0.0,17.0],[230.0,0.0,20.0],[226.0,0.0,24.0],[221.0,0.0,27.0],[217.0,0.0,31.0],[213.0,0.0,34.0],[209.0,0.0,37.0],[205.0,0.0,41.0],[200.0,0.0,44.0],[196.0,0.0,48.0],[192.0,0.0,51.0],[188.0,0.0,54.0],[184.0,0.0,58.0],[179.0,0.0,61.0],[175.0,0.0,65.0],[171.0,0.0,68.0],[167.0,0.0,71.0],[163.0,0.0,75.0],[158.0,0.0,78.0],[154.0,0.0,82.0],[150.0,0.0,85.0],[146.0,0.0,88.0],[142.0,0.0,92.0],[137.0,0.0,95.0],[133.0,0.0,99.0],[129.0,0.0,102.0],[125.0,0.0,105.0],[121.0,0.0,109.0],[116.0,0.0,112.0],[112.0,0.0,116.0],[108.0,0.0,119.0],[104.0,0.0,122.0],[100.0,0.0,126.0],[95.0,0.0,129.0],[91.0,0.0,133.0],[87.0,0.0,136.0]],"MPL_RdBu":[[0.415456,0.003691,0.123414],[0.438524,0.011073,0.127105],[0.461592,0.018454,0.130796],[0.48466,0.025836,0.134487],[0.507728,0.033218,0.138178],[0.530796,0.0406,0.141869],[0.553864,0.047982,0.145559],[0.576932,0.055363,0.14925],[0.6,0.062745,0.152941],[0.611534,0.066436,0.154787],[0.646136,0.077509,0.160323],[0.65767,0.0812,0.162168],[0.692272,0.092272,0.167705],[0.700807,0.099654,0.171242],[0.717416,0.132872,0.186928],[0.722953,0.143945,0.192157],[0.739562,0.177163,0.207843],[0.750634,0.199308,0.218301],[0.756171,0.210381,0.223529],[0.77278,0.243599,0.239216],[0.783852,0.265744,0.249673],[0.794925,0.287889,0.260131],[0.800461,0.298962,0.265359],[0.81707,0.33218,0.281046],[0.828143,0.354325,0.291503],[0.839216,0.376471,0.301961],[0.843829,0.387082,0.310112],[0.85767,0.418916,0.334564],[0.866897,0.440138,0.350865],[0.876125,0.461361,0.367166],[0.880738,0.471972,0.375317],[0.894579,0.503806,0.399769],[0.903806,0.525029,0.416071],[0.913033,0.546251,0.432372],[0.922261,0.567474,0.448674],[0.931488,0.588697,0.464975],[0.940715,0.609919,0.481276],[0.945329,0.620531,0.489427],[0.957555,0.651211,0.51511],[0.960323,0.66782,0.536332],[0.963091,0.684429,0.557555],[0.965859,0.701038,0.578777],[0.968627,0.717647,0.6],[0.971396,0.734256,0.621223],[0.974164,0.750865,0.642445],[0.975548,0.75917,0.653057],[0.9797,0.784083,0.68489],[0.982468,0.800692,0.706113],[0.985236,0.817301,0.727336],[0.988005,0.83391,0.748558],[0.990773,0.850519,0.769781],[0.991234,0.86313,0.787774],[0.989389,0.871742,0.802537],[0.988466,0.876048,0.809919],[0.985698,0.888966,0.832065],[0.983852,0.897578,0.846828],[0.982007,0.90619,0.861592],[0.980161,0.914802,0.876355],[0.978316,0.923414,0.891119],[0.976471,0.932026,0.905882],[0.974625,0.940638,0.920646],[0.973702,0.944944,0.928028],[0.970934,0.957862,0.950173],[0.969089,0.966474,0.964937],[0.959862,0.964475,0.967013],[0.948174,0.958939,0.96486],[0.936486,0.953403,0.962707],[0.924798,0.947866,0.960554],[0.91311,0.94233,0.958401],[0.901423,0.936794,0.956248],[0.889735,0.931257,0.954095],[0.878047,0.925721,0.951942],[0.866359,0.920185,0.949789],[0.854671,0.914648,0.947636],[0.842983,0.909112,0.945483],[0.83714,0.906344,0.944406],[0.819608,0.898039,0.941176],[0.800231,0.888197,0.93564],[0.780854,0.878354,0.930104],[0.761476,0.868512,0.924567],[0.742099,0.85867,0.919031],[0.722722,0.848827,0.913495],[0.703345,0.838985,0.907958],[0.683968,0.829143,0.902422],[0.664591,0.8193,0.896886],[0.645213,0.809458,0.891349],[0.625836,0.799616,0.885813],[0.606459,0.789773,0.880277],[0.587082,0.779931,0.87474],[0.566474,0.768704,0.868512],[0.542176,0.753326,0.860208],[0.530027,0.745636,0.856055],[0.493579,0.722568,0.843599],[0.469281,0.70719,0.835294],[0.444983,0.691811,0.82699],[0.420684,0.676432,0.818685],[0.396386,0.661053,0.810381],[0.372088,0.645675,0.802076],[0.347789,0.630296,0.793772],[0.323491,0.614917,0.785467],[0.299193,0.599539,0.777163],[0.274894,0.58416,0.768858],[0.257516,0.56955,0.761169],[0.247059,0.555709,0.754095],[0.236601,0.541869,0.74702],[0.226144,0.528028,0.739946],[0.215686,0.514187,0.732872],[0.210458,0.507266,0.729335],[0.194771,0.486505,0.718724],[0.184314,0.472664,0.711649],[0.173856,0.458824,0.704575],[0.163399,0.444983,0.697501],[0.152941,0.431142,0.690427],[0.142484,0.417301,0.683353],[0.132026,0.40346,0.676278],[0.122953,0.387543,0.657209],[0.114341,0.370934,0.634141],[0.105729,0.354325,0.611073],[0.097116,0.337716,0.588005],[0.088504,0.321107,0.564937],[0.079892,0.304498,0.541869],[0.07128,0.287889,0.5188],[0.062668,0.27128,0.495732],[0.058362,0.262976,0.484198],[0.045444,0.238062,0.449596],[0.036832,0.221453,0.426528],[0.02822,0.204844,0.40346],[0.019608,0.188235,0.380392]],"GMT_cool":[[0.05,0.95,1.0],[0.15,0.85,1.0],[0.25,0.75,1.0],[0.35,0.65,1.0],[0.45,0.55,1.0],[0.55,0.45,1.0],[0.65,0.35,1.0],[0.75,0.25,1.0],[0.85,0.15,1.0],[0.95,0.05,1.0]],"SVG_Lindaa07":[[20.0,32.0,112.0],[28.0,40.0,112.0],[36.0,48.0,116.0],[44.0,52.0,116.0],[52.0,60.0,120.0],[56.0,68.0,120.0],[64.0,76.0,124.0],[80.0,88.0,128.0],[88.0,96.0,128.0],[92.0,100.0,132.0],[100.0,108.0,132.0],[108.0,116.0,136.0],[116.0,124.0,136.0],[132.0,136.0,140.0],[136.0,144.0,140.0],[144.0,148.0,144.0],[152.0,156.0,144.0],[160.0,164.0,148.0],[168.0,172.0,148.0],[180.0,184.0,152.0],[188.0,192.0,156.0],[196.0,196.0,156.0],[204.0,204.0,160.0],[208.0,212.0,160.0],[216.0,220.0,164.0],[232.0,232.0,168.0],[240.0,240.0,168.0],[248.0,248.0,172.0],[244.0,244.0,168.0],[236.0,240.0,164.0],[228.0,232.0,160.0],[212.0,224.0,152.0],[204.0,216.0,144.0],[196.0,212.0,140.0],[188.0,204.0,136.0],[180.0,200.0,132.0],[172.0,196.0,128.0],[160.0,184.0,116.0],[152.0,180.0,112.0],[144.0,172.0,108.0],[136.0,168.0,104.0],[128.0,160.0,96.0],[120.0,156.0,92.0],[104.0,144.0,84.0],[96.0,140.0,80.0],[88.0,136.0,76.0],[84.0,128.0,68.0],[76.0,124.0,64.0],[68.0,116.0,60.0],[52.0,108.0,52.0],[44.0,100.0,44.0],[36.0,96.0,40.0],[28.0,92.0,36.0],[20.0,84.0,32.0],[12.0,80.0,28.0],[8.0,76.0,24.0],[12.0,80.0,28.0],[16.0,88.0,32.0],[24.0,92.0,36.0],[28.0,96.0,40.0],[32.0,104.0,44.0],[44.0,112.0,56.0],[48.0,120.0,60.0],[52.0,124.0,64.0],[60.0,128.0,68.0],[64.0,136.0,72.0],[68.0,140.0,80.0],[80.0,152.0,88.0],[84.0,156.0,92.0],[88.0,160.0,96.0],[96.0,168.0,100.0],[100.0,172.0,104.0],[104.0,176.0,112.0],[116.0,188.0,120.0],[120.0,192.0,124.0],[124.0,200.0,128.0],[132.0,204.0,132.0],[136.0,208.0,140.0],[140.0,216.0,144.0],[144.0,220.0,148.0],[156.0,232.0,156.0],[160.0,236.0,160.0],[168.0,244.0,168.0],[164.0,240.0,168.0],[160.0,236.0,164.0],[156.0,228.0,160.0],[148.0,216.0,156.0],[144.0,212.0,152.0],[136.0,204.0,148.0],[132.0,200.0,148.0],[128.0,192.0,144.0],[124.0,188.0,140.0],[116.0,176.0,136.0],[108.0,168.0,132.0],[104.0,164.0,128.0],[100.0,156.0,128.0],[96.0,152.0,124.0],[92.0,148.0,120.0],[84.0,136.0,116.0],[76.0,128.0,112.0],[72.0,124.0,108.0],[68.0,116.0,108.0],[64.0,112.0,104.0],[60.0,104.0,100.0],[48.0,92.0,96.0],[44.0,88.0,92.0],[40.0,80.0,88.0],[36.0,76.0,88.0],[32.0,68.0,84.0],[28.0,64.0,80.0],[24.0,60.0,80.0],[28.0,68.0,84.0],[32.0,72.0,92.0],[36.0,80.0,96.0],[40.0,84.0,100.0],[48.0,92.0,108.0],[56.0,104.0,120.0],[60.0,108.0,124.0],[64.0,116.0,128.0],[72.0,120.0,136.0],[76.0,128.0,140.0],[80.0,132.0,144.0],[88.0,144.0,156.0],[96.0,152.0,164.0],[100.0,160.0,168.0],[104.0,164.0,172.0],[108.0,172.0,180.0],[112.0,176.0,184.0],[124.0,188.0,196.0],[128.0,196.0,200.0],[132.0,200.0,208.0],[136.0,208.0,212.0],[140.0,212.0,216.0],[148.0,220.0,224.0],[156.0,232.0,232.0],[160.0,236.0,240.0],[164.0,244.0,244.0],[172.0,252.0,252.0],[172.0,248.0,248.0],[168.0,240.0,244.0],[160.0,228.0,236.0],[156.0,220.0,232.0],[152.0,216.0,224.0],[148.0,208.0,220.0],[144.0,200.0,216.0],[140.0,196.0,212.0],[136.0,188.0,208.0],[128.0,176.0,196.0],[124.0,168.0,192.0],[120.0,160.0,188.0],[116.0,156.0,184.0],[112.0,148.0,176.0],[108.0,140.0,172.0],[100.0,128.0,164.0],[96.0,120.0,160.0],[92.0,116.0,156.0],[88.0,108.0,148.0],[84.0,100.0,144.0],[80.0,96.0,140.0],[72.0,80.0,132.0],[68.0,76.0,124.0],[64.0,68.0,120.0],[60.0,60.0,116.0],[56.0,56.0,112.0],[52.0,48.0,108.0],[52.0,44.0,104.0],[56.0,48.0,108.0],[60.0,52.0,112.0],[64.0,56.0,116.0],[68.0,60.0,120.0],[72.0,64.0,124.0],[84.0,72.0,132.0],[88.0,76.0,136.0],[92.0,80.0,140.0],[96.0,84.0,144.0],[100.0,88.0,148.0],[104.0,92.0,152.0],[112.0,100.0,160.0],[120.0,108.0,164.0],[124.0,112.0,168.0],[128.0,116.0,172.0],[132.0,120.0,176.0],[136.0,124.0,180.0],[144.0,132.0,188.0],[148.0,136.0,192.0],[156.0,140.0,196.0],[160.0,144.0,200.0],[164.0,148.0,204.0],[168.0,152.0,208.0],[176.0,160.0,216.0],[180.0,164.0,220.0],[184.0,168.0,224.0],[192.0,176.0,228.0],[188.0,172.0,228.0],[184.0,168.0,224.0],[172.0,160.0,216.0],[164.0,156.0,212.0],[160.0,148.0,208.0],[156.0,144.0,204.0],[148.0,140.0,200.0],[144.0,136.0,196.0],[132.0,124.0,188.0],[124.0,120.0,184.0],[120.0,116.0,180.0],[116.0,112.0,176.0],[108.0,108.0,172.0],[104.0,100.0,172.0],[92.0,92.0,164.0],[88.0,88.0,160.0],[80.0,84.0,156.0],[76.0,76.0,152.0],[68.0,72.0,148.0],[64.0,68.0,144.0],[52.0,60.0,136.0],[48.0,52.0,132.0],[40.0,48.0,128.0],[36.0,44.0,124.0],[28.0,40.0,120.0],[24.0,36.0,116.0],[16.0,28.0,112.0]],"GMT_wysiwy":[[0.25098,0.0,0.25098],[0.25098,0.0,0.752941],[0.0,0.25098,1.0],[0.0,0.501961,1.0],[0.0,0.627451,1.0],[0.25098,0.752941,1.0],[0.25098,0.878431,1.0],[0.25098,1.0,1.0],[0.25098,1.0,0.752941],[0.25098,1.0,0.25098],[0.501961,1.0,0.25098],[0.752941,1.0,0.25098],[1.0,1.0,0.25098],[1.0,0.878431,0.25098],[1.0,0.627451,0.25098],[1.0,0.376471,0.25098],[1.0,0.12549,0.25098],[1.0,0.376471,0.752941],[1.0,0.627451,1.0],[1.0,0.878431,1.0]],"BlRe":[[0.0,0.0,128.0],[0.0,0.0,133.0],[0.0,0.0,138.0],[0.0,0.0,143.0],[0.0,0.0,148.0],[0.0,0.0,153.0],[0.0,0.0,158.0],[0.0,0.0,164.0],[0.0,0.0,169.0],[0.0,0.0,174.0],[0.0,0.0,179.0],[0.0,0.0,184.0],[0.0,0.0,189.0],[0.0,0.0,194.0],[0.0,0.0,199.0],[0.0,0.0,204.0],[0.0,0.0,209.0],[0.0,0.0,214.0],[0.0,0.0,219.0],[0.0,0.0,225.0],[0.0,0.0,230.0],[0.0,0.0,235.0],[0.0,0.0,240.0],[0.0,0.0,245.0],[0.0,0.0,250.0],[0.0,0.0,255.0],[10.0,10.0,255.0],[20.0,20.0,255.0],[31.0,31.0,255.0],[41.0,41.0,255.0],[51.0,51.0,255.0],[61.0,61.0,255.0],[71.0,71.0,255.0],[82.0,82.0,255.0],[92.0,92.0,255.0],[102.0,102.0,255.0],[112.0,112.0,255.0],[122.0,122.0,255.0],[133.0,133.0,255.0],[143.0,143.0,255.0],[153.0,153.0,255.0],[163.0,163.0,255.0],[173.0,173.0,255.0],[184.0,184.0,255.0],[194.0,194.0,255.0],[204.0,204.0,255.0],[214.0,214.0,255.0],[224.0,224.0,255.0],[255.0,224.0,224.0],[255.0,214.0,214.0],[255.0,204.0,204.0],[255.0,194.0,194.0],[255.0,184.0,184.0],[255.0,173.0,173.0],[255.0,163.0,163.0],[255.0,153.0,153.0],[255.0,143.0,143.0],[255.0,133.0,133.0],[255.0,122.0,122.0],[255.0,112.0,112.0],[255.0,102.0,102.0],[255.0,92.0,92.0],[255.0,82.0,82.0],[255.0,71.0,71.0],[255.0,61.0,61.0],[255.0,51.0,51.0],[255.0,41.0,41.0],[255.0,31.0,31.0],[255.0,20.0,20.0],[255.0,10.0,10.0],[255.0,0.0,0.0],[250.0,0.0,0.0],[245.0,0.0,0.0],[240.0,0.0,0.0],[235.0,0.0,0.0],[230.0,0.0,0.0],[225.0,0.0,0.0],[219.0,0.0,0.0],[214.0,0.0,0.0],[209.0,0.0,0.0],[204.0,0.0,0.0],[199.0,0.0,0.0],[194.0,0.0,0.0],[189.0,0.0,0.0],[184.0,0.0,0.0],[179.0,0.0,0.0],[174.0,0.0,0.0],[169.0,0.0,0.0],[164.0,0.0,0.0],[158.0,0.0,0.0],[153.0,0.0,0.0],[148.0,0.0,0.0],[143.0,0.0,0.0],[138.0,0.0,0.0],[133.0,0.0,0.0],[128.0,0.0,0.0]],"posneg_2":[[255.0,255.0,255.0],[0.0,0.0,0.0],[24.0,24.0,112.0],[16.0,78.0,139.0],[23.0,116.0,205.0],[72.0,118.0,255.0],[91.0,172.0,237.0],[173.0,215.0,230.0],[209.0,237.0,237.0],[229.0,239.0,249.0],[242.0,255.0,255.0],[253.0,245.0,230.0],[255.0,228.0,180.0],[243.0,164.0,96.0],[237.0,118.0,0.0],[205.0,102.0,29.0],[224.0,49.0,15.0],[237.0,0.0,0.0],[205.0,0.0,0.0],[139.0,0.0,0.0]],"MPL_jet":[[0.0,0.0,0.517825],[0.0,0.0,0.553476],[0.0,0.0,0.589127],[0.0,0.0,0.624777],[0.0,0.0,0.660428],[0.0,0.0,0.696078],[0.0,0.0,0.731729],[0.0,0.0,0.76738],[0.0,0.0,0.80303],[0.0,0.0,0.820856],[0.0,0.0,0.874332],[0.0,0.0,0.892157],[0.0,0.0,0.945633],[0.0,0.0,0.963458],[0.0,0.0,1.0],[0.0,0.0,1.0],[0.0,0.017647,1.0],[0.0,0.04902,1.0],[0.0,0.064706,1.0],[0.0,0.111765,1.0],[0.0,0.143137,1.0],[0.0,0.17451,1.0],[0.0,0.190196,1.0],[0.0,0.237255,1.0],[0.0,0.268627,1.0],[0.0,0.3,1.0],[0.0,0.315686,1.0],[0.0,0.362745,1.0],[0.0,0.394118,1.0],[0.0,0.42549,1.0],[0.0,0.441176,1.0],[0.0,0.488235,1.0],[0.0,0.519608,1.0],[0.0,0.55098,1.0],[0.0,0.582353,1.0],[0.0,0.613725,1.0],[0.0,0.645098,1.0],[0.0,0.660784,1.0],[0.0,0.707843,1.0],[0.0,0.739216,1.0],[0.0,0.770588,1.0],[0.0,0.801961,1.0],[0.0,0.833333,1.0],[0.0,0.864706,0.996205],[0.0,0.896078,0.970904],[0.009488,0.911765,0.958254],[0.047438,0.958824,0.920304],[0.072739,0.990196,0.895003],[0.098039,1.0,0.869703],[0.12334,1.0,0.844402],[0.14864,1.0,0.819102],[0.173941,1.0,0.793801],[0.199241,1.0,0.768501],[0.211891,1.0,0.755851],[0.249842,1.0,0.7179],[0.275142,1.0,0.6926],[0.300443,1.0,0.667299],[0.325743,1.0,0.641999],[0.351044,1.0,0.616698],[0.376344,1.0,0.591398],[0.401645,1.0,0.566097],[0.414295,1.0,0.553447],[0.452245,1.0,0.515497],[0.477546,1.0,0.490196],[0.502846,1.0,0.464896],[0.528147,1.0,0.439595],[0.553447,1.0,0.414295],[0.578748,1.0,0.388994],[0.604048,1.0,0.363694],[0.629349,1.0,0.338393],[0.654649,1.0,0.313093],[0.679949,1.0,0.287793],[0.70525,1.0,0.262492],[0.73055,1.0,0.237192],[0.755851,1.0,0.211891],[0.768501,1.0,0.199241],[0.806452,1.0,0.16129],[0.831752,1.0,0.13599],[0.857052,1.0,0.110689],[0.882353,1.0,0.085389],[0.907653,1.0,0.060089],[0.932954,1.0,0.034788],[0.958254,0.973856,0.009488],[0.983555,0.944808,0.0],[1.0,0.915759,0.0],[1.0,0.88671,0.0],[1.0,0.857662,0.0],[1.0,0.828613,0.0],[1.0,0.799564,0.0],[1.0,0.770516,0.0],[1.0,0.741467,0.0],[1.0,0.726943,0.0],[1.0,0.68337,0.0],[1.0,0.654321,0.0],[1.0,0.625272,0.0],[1.0,0.596224,0.0],[1.0,0.567175,0.0],[1.0,0.538126,0.0],[1.0,0.509078,0.0],[1.0,0.480029,0.0],[1.0,0.45098,0.0],[1.0,0.421932,0.0],[1.0,0.392883,0.0],[1.0,0.363834,0.0],[1.0,0.334786,0.0],[1.0,0.305737,0.0],[1.0,0.276688,0.0],[1.0,0.262164,0.0],[1.0,0.218591,0.0],[1.0,0.189542,0.0],[1.0,0.160494,0.0],[1.0,0.131445,0.0],[1.0,0.102397,0.0],[0.999109,0.073348,0.0],[0.963458,0.044299,0.0],[0.927807,0.015251,0.0],[0.892157,0.0,0.0],[0.856506,0.0,0.0],[0.820856,0.0,0.0],[0.785205,0.0,0.0],[0.749554,0.0,0.0],[0.713904,0.0,0.0],[0.678253,0.0,0.0],[0.660428,0.0,0.0],[0.606952,0.0,0.0],[0.571301,0.0,0.0],[0.535651,0.0,0.0],[0.5,0.0,0.0]]} 
+@functools.lru_cache(maxsize=None)
+def colormap_table():
+    """
+    RGB values of the colormaps (name: list of [r,g,b])
+    """
+    with open(COLORMAP_FILE) as colormap_file:
+        return json.load(colormap_file)
 
 def cmap(name,start=-10,ende=10):
-    data = np.array(colors[name])
+    from matplotlib.colors import ListedColormap
+    data = np.array(colormap_table()[name])
     data = data / np.max(data)
     max_in = np.max([abs(start),abs(ende)])
     start=(data.shape[0]-1)/2 * start/max_in
@@ -129,8 +137,25 @@ def create_synthetic_data(number_gnss=500,
                             miss_gnss_factor=20,
                             miss_sattg_factor=2,
                             miss_data_background_factor=10,
-                            relaxation_coeff=5):
+                            relaxation_coeff=5,
+                            number_of_pcs=1,
+                            missing_fraction=None):
+    """create synthetic GNSS and 'altimetry minus tide gauge' (SATTG) data
+    
+    data = trends + PCs*EOFs + white noise, the first PC is an earthquake-like 
+    response, additional PCs (number_of_pcs > 1) are smooth random walks 
+    modulating random Gaussian pattern
     
+    Parameters
+    ----------
+    number_of_pcs: int, default: 1,
+        number of PCs
+        
+    missing_fraction: None or float, default: None,
+        scale the missing-data profiles to this mean fraction of missing data
+        
+    See create_synthetic_cube for a vectorized generator of large data cubes.
+    """
     random.seed(random_seed)
     np.random.seed(random_seed)
 
@@ -148,13 +173,17 @@ def create_synthetic_data(number_gnss=500,
 
     field_1,field_2,field_1_eq,field_2_eq=make_field(x,y)
     
-    x_stations_range_sattg,y_stations_range_sattg,x_stations_range,y_stations_range,field_1p,field_2p,field_1_eqp,field_2_eqp,field_1sattg,field_2sattg,field_1_eqsattg,field_2_eqsattg=make_datapoint_fields(number_gnss = 500,number_sattg = 30,max_lev = 20,coast_=coast_)
+    x_stations_range_sattg,y_stations_range_sattg,x_stations_range,y_stations_range,field_1p,field_2p,field_1_eqp,field_2_eqp,field_1sattg,field_2sattg,field_1_eqsattg,field_2_eqsattg=make_datapoint_fields(number_gnss = number_gnss,number_sattg = number_sattg,max_lev = max_lev,coast_=coast_)
 
     years=time_series_length
     time_series_pc = np.linspace(0,years-1,years)
     
     miss_sattg  =0.01*(np.exp(-0.1*time_series_pc)*miss_sattg_factor+miss_data_background_factor)
     miss_gnss =  0.01*(np.exp(-0.4*time_series_pc)*miss_gnss_factor+miss_data_background_factor)
+    if missing_fraction is not None:
+        mean_missing = (np.mean(miss_gnss)*number_gnss + np.mean(miss_sattg)*number_sattg)/(number_gnss+number_sattg)
+        miss_gnss = np.clip(miss_gnss*missing_fraction/mean_missing,0,1)
+        miss_sattg = np.clip(miss_sattg*missing_fraction/mean_missing,0,1)
     
     time_eq=14
     
@@ -173,9 +202,27 @@ def create_synthetic_data(number_gnss=500,
     pc_gps=field_1_eqp+np.random.normal(0,scale=std_deviation_pcs,size=number_gnss)
     pc_sattg =field_1_eqsattg+np.random.normal(0,scale=std_deviation_pcs,size=number_sattg)
     
+    # additional pcs = random walks with random gaussian pattern
+    pcs = [eq_time]
+    eofs_gps = [pc_gps]
+    eofs_sattg = [pc_sattg]
+    for i in range(1,number_of_pcs):
+        pc_ = np.cumsum(np.random.normal(0,scale=1,size=years))
+        pcs.append((pc_-pc_.mean())*amp/(2.*(i+1)*pc_.std()))
+        center = np.random.uniform(low=0.0, high=max_lev, size=2)
+        eofs_gps.append(makeGaussian2(x_center=center[0], y_center=center[1], sigma_x = max_lev/4, sigma_y=max_lev/4, amp=5,
+                                      x=x_stations_range,y=y_stations_range)+np.random.normal(0,scale=std_deviation_pcs,size=number_gnss))
+        eofs_sattg.append(makeGaussian2(x_center=center[0], y_center=center[1], sigma_x = max_lev/4, sigma_y=max_lev/4, amp=5,
+                                        x=x_stations_range_sattg,y=y_stations_range_sattg)+np.random.normal(0,scale=std_deviation_pcs,size=number_sattg))
+    pcs = np.asarray(pcs)
+    eofs_gps = np.asarray(eofs_gps)
+    eofs_sattg = np.asarray(eofs_sattg)
+    
     # combined data = trends + pc + white noise
-    data_gps = np.outer((time_series),trend_gps) + np.outer(eq_time,pc_gps) +np.random.normal(0,scale=sigma_gnss,size=(len(time_series),number_gnss))
-    data_sattg = np.outer((time_series),trend_sattg) + np.outer(eq_time,pc_sattg) +np.random.normal(0,scale=sigma_sattg,size=(len(time_series),number_sattg))
+    signal_gps = np.outer((time_series),trend_gps) + np.matmul(pcs.T,eofs_gps)
+    signal_sattg = np.outer((time_series),trend_sattg) + np.matmul(pcs.T,eofs_sattg)
+    data_gps = signal_gps +np.random.normal(0,scale=sigma_gnss,size=(len(time_series),number_gnss))
+    data_sattg = signal_sattg +np.random.normal(0,scale=sigma_sattg,size=(len(time_series),number_sattg))
     
     # remove missing data
     i=0
@@ -188,8 +235,7 @@ def create_synthetic_data(number_gnss=500,
         data_sattg[i,np.random.randint(0, int(data_sattg.shape[1]-1),int(data_sattg.shape[1]*dat))] =np.nan
         i=i+1  
         
-    data_set_synt = xr.Dataset({'data': (['time','x'], np.concatenate([np.outer((time_series),trend_gps) + np.outer(eq_time,pc_gps),
-                                                                       np.outer((time_series),trend_sattg) + np.outer(eq_time,pc_sattg)],axis=1)),
+    data_set_synt = xr.Dataset({'data': (['time','x'], np.concatenate([signal_gps,signal_sattg],axis=1)),
                                'data_with_noise': (['time','x'], np.concatenate([data_gps,data_sattg],axis=1)),
                             'trend' : (['x'], np.concatenate([field_1p+field_2p +field_2_eqp,field_1sattg+field_2sattg +field_2_eqsattg])),
                             'trend_with_noise' : (['x'], np.concatenate([trend_gps,trend_sattg])),
@@ -198,26 +244,277 @@ def create_synthetic_data(number_gnss=500,
                             'pc_timeseries' : (['time'], eq_time),
                             'time_series' : (['time'], time_series_pc),
                             'missing_data_gps' : (['time'], miss_gnss),  
-                            'missing_data_sattg' : (['time'], miss_sattg)},                                
+                            'missing_data_sattg' : (['time'], miss_sattg),
+                            'eofs_with_noise' : (['pc','x'], np.concatenate([eofs_gps,eofs_sattg],axis=1)),
+                            'pcs' : (['pc','time'], pcs)},                                
                              coords={'lon': (['x'],np.concatenate([y_stations_range,y_stations_range_sattg])),
                             'lat': (['x'],np.concatenate([x_stations_range,x_stations_range_sattg])),
                             'ID' : (['x'], pd.concat([pd.DataFrame(np.zeros(number_gnss)),pd.DataFrame(np.ones(number_sattg))]).values.flatten()),
-                            'time':pd.date_range(start='1995-12-31',freq='Y',periods=synthetic_data_settings['time_series_length'])})   
+                            'time':pd.date_range(start='1995-12-31',freq='Y',periods=time_series_length)})   
     
     return data_set_synt,coastline
 
 
 
+def _coast(x):
+    """
+    coastline of the synthetic region
+    """
+    return x*-1/np.cos(-20) + 36
+
+def _synthetic_station_locations(rng,number_gnss,number_sattg,max_lev):
+    """
+    random GNSS locations on land and SATTG locations along the coast
+    """
+    x_gnss = np.empty(0)
+    y_gnss = np.empty(0)
+    while len(x_gnss) < number_gnss:
+        # about half of the region is land, oversample and reject
+        x_ = rng.uniform(0.0,max_lev,size=2*(number_gnss-len(x_gnss))+10)
+        y_ = rng.uniform(0.0,max_lev,size=len(x_))
+        select = y_ <= _coast(x_)
+        x_gnss = np.concatenate([x_gnss,x_[select]])
+        y_gnss = np.concatenate([y_gnss,y_[select]])
+    # coastal section within the region
+    x_coast = np.sort([(36-max_lev)*np.cos(-20),36*np.cos(-20)])
+    x_sattg = rng.uniform(max(x_coast[0],0.),min(x_coast[1],max_lev),size=number_sattg)
+    return x_gnss[:number_gnss],y_gnss[:number_gnss],x_sattg,_coast(x_sattg)
+
+def create_synthetic_cube(number_gnss=500,
+                          number_sattg=30,
+                          time_series_length=26,
+                          freq='Y',
+                          start='1995-12-31',
+                          number_of_pcs=1,
+                          sigma_gnss=5,
+                          sigma_sattg=25,
+                          std_deviation_trends=0.5,
+                          std_deviation_pcs=0.5,
+                          max_lev=20,
+                          miss_gnss_factor=20,
+                          miss_sattg_factor=2,
+                          miss_data_background_factor=10,
+                          missing_fraction=None,
+                          relaxation_coeff=5,
+                          random_seed=100,
+                          chunk_size=None,
+                          store=None,
+                          dtype='float64'):
+    """create synthetic GNSS and SATTG data cubes of arbitrary size
+    
+    Vectorized and scalable version of create_synthetic_data (same model 
+    and output variables) using numpy.random.Generator. Station locations 
+    are not limited in number, the time axis can have any pandas frequency 
+    (e.g. 'D' for daily data) and missing data are drawn independently 
+    for every observation with the time-dependent missing-data probability. 
+    The cube is generated in chunks of time steps, which can be streamed 
+    into a Zarr store, so that cubes larger than memory can be created.
+    Results are reproducible for a given random_seed and chunk_size.
+    
+    Parameters
+    ----------
+    time_series_length: int,
+        number of time steps
+        
+    freq: str, default: 'Y',
+        pandas frequency of the time axis
+        
+    chunk_size: None or int, default: None,
+        number of time steps generated at once, None: all
+        
+    store: None or str, default: None,
+        path of a Zarr store, the cube is written chunk by chunk and 
+        returned as lazy (dask-backed) dataset
+        
+    dtype: str, default: 'float64',
+        dtype of the data cube
+    
+    other parameters: see create_synthetic_data
+    
+    Returns
+    -------
+    xarray.Dataset, coastline
+    """
+    rng = np.random.default_rng(random_seed)
+    number_stations = number_gnss + number_sattg
+    
+    x_gnss,y_gnss,x_sattg,y_sattg = _synthetic_station_locations(rng,number_gnss,number_sattg,max_lev)
+    x_stations = np.concatenate([x_gnss,x_sattg])
+    y_stations = np.concatenate([y_gnss,y_sattg])
+    is_sattg = np.arange(number_stations) >= number_gnss
+    field_1,field_2,field_1_eq,field_2_eq = make_field(x_stations,y_stations)
+    
+    # time axis in years, the time scales of the original (26 years) setup are stretched to the series length
+    time = pd.date_range(start=start,freq=freq,periods=time_series_length)
+    years = np.asarray((time-time[0]).days,dtype=float)/365.25
+    span = max(years[-1],1.)
+    time_eq = 14./25.*span
+    reference_epoch = 19./25.*span
+    
+    amp=10
+    eq_time = amp*np.log(1+np.clip(years-time_eq,0,None)/relaxation_coeff)
+    eq_time = eq_time-np.interp(reference_epoch,years,eq_time)
+    time_series = years-reference_epoch
+    
+    miss_sattg = 0.01*(np.exp(-0.1*years)*miss_sattg_factor+miss_data_background_factor)
+    miss_gnss = 0.01*(np.exp(-0.4*years)*miss_gnss_factor+miss_data_background_factor)
+    if missing_fraction is not None:
+        mean_missing = (np.mean(miss_gnss)*number_gnss + np.mean(miss_sattg)*number_sattg)/number_stations
+        miss_gnss = np.clip(miss_gnss*missing_fraction/mean_missing,0,1)
+        miss_sattg = np.clip(miss_sattg*missing_fraction/mean_missing,0,1)
+    
+    trend = field_1+field_2+field_2_eq
+    trend_with_noise = trend+rng.normal(0,std_deviation_trends,size=number_stations)
+    
+    # first pc: earthquake response, additional pcs: random walks with random gaussian pattern
+    pcs = np.empty((number_of_pcs,time_series_length))
+    eofs = np.empty((number_of_pcs,number_stations))
+    pcs[0] = eq_time
+    eofs[0] = field_1_eq
+    for i in range(1,number_of_pcs):
+        pc_ = np.cumsum(rng.normal(0,1,size=time_series_length))
+        pcs[i] = (pc_-pc_.mean())*amp/(2.*(i+1)*max(pc_.std(),1e-12))
+        center = rng.uniform(0.0,max_lev,size=2)
+        eofs[i] = makeGaussian2(x_center=center[0], y_center=center[1], sigma_x = max_lev/4, sigma_y=max_lev/4, amp=5,
+                                x=x_stations,y=y_stations)
+    eofs_with_noise = eofs+rng.normal(0,std_deviation_pcs,size=eofs.shape)
+    sigma_stations = np.where(is_sattg,sigma_sattg,sigma_gnss)
+    
+    dataset = xr.Dataset({'trend' : (['x'], trend),
+                          'trend_with_noise' : (['x'], trend_with_noise),
+                          'eof' : (['x'], eofs[0]),
+                          'eof_with_noise' : (['x'], eofs_with_noise[0]),
+                          'eofs_with_noise' : (['pc','x'], eofs_with_noise),
+                          'pc_timeseries' : (['time'], eq_time),
+                          'time_series' : (['time'], years),
+                          'missing_data_gps' : (['time'], miss_gnss),  
+                          'missing_data_sattg' : (['time'], miss_sattg),
+                          'pcs' : (['pc','time'], pcs)},
+                         coords={'lon': (['x'],y_stations),
+                                 'lat': (['x'],x_stations),
+                                 'ID' : (['x'], is_sattg*1.),
+                                 'time': time})
+    dataset.attrs = {'reference_epoch':reference_epoch,'random_seed':random_seed}
+    
+    if chunk_size is None:
+        chunk_size = time_series_length
+    if store is None:
+        data = np.empty((time_series_length,number_stations),dtype=dtype)
+        data_with_noise = np.empty((time_series_length,number_stations),dtype=dtype)
+        
+    for start_index in range(0,time_series_length,chunk_size):
+        chunk = slice(start_index,min(start_index+chunk_size,time_series_length))
+        signal = (np.outer(time_series[chunk],trend_with_noise) + np.matmul(pcs[:,chunk].T,eofs_with_noise)).astype(dtype)
+        noisy = signal + (rng.standard_normal(signal.shape)*sigma_stations).astype(dtype)
+        miss_probability = np.where(is_sattg[np.newaxis,:],miss_sattg[chunk,np.newaxis],miss_gnss[chunk,np.newaxis])
+        noisy[rng.random(signal.shape) < miss_probability] = np.nan
+        if store is None:
+            data[chunk] = signal
+            data_with_noise[chunk] = noisy
+        else:
+            chunk_dataset = dataset.isel(time=chunk)
+            chunk_dataset['data'] = (['time','x'],signal)
+            chunk_dataset['data_with_noise'] = (['time','x'],noisy)
+            if start_index == 0:
+                encoding = {name: {'chunks':(chunk_size,min(number_stations,10000))} for name in ['data','data_with_noise']}
+                chunk_dataset.to_zarr(store,mode='w',encoding=encoding)
+            else:
+                chunk_dataset[[name for name in chunk_dataset.data_vars if 'time' in chunk_dataset[name].dims]].drop_vars(
+                    ['lon','lat','ID']).to_zarr(store,append_dim='time')
+                
+    if store is None:
+        dataset['data'] = (['time','x'],data)
+        dataset['data_with_noise'] = (['time','x'],data_with_noise)
+    else:
+        dataset = xr.open_zarr(store)
+    return dataset,_coast(np.linspace(0,max_lev,101))
+
+
+def batched_least_squares(X,Y,weights=None,residual_variance=None):
+    """weighted least squares for many stations with missing data
+    
+    Solves Y[:,s] = X b_s + e_s for all stations s at once. Missing data 
+    (NaN in Y) are masked per station, i.e. every station has its own normal 
+    equations X^T W_s X b_s = X^T W_s y_s, which are stacked and solved in 
+    one vectorized call.
+    
+    Parameters
+    ----------
+    X: np.array() of size time*parameters,
+        design matrix (shared by all stations)
+        
+    Y: np.array() of size time*space,
+        observations, NaN = missing
+        
+    weights: None or np.array() broadcastable to time*space, default: None,
+        observation weights (inverse variances), generalized least squares with 
+        diagonal covariance, None: ordinary least squares
+        
+    residual_variance: None or np.array() of size space, default: None,
+        known (relative) residual variance, None: estimated from the weighted residuals
+        
+    Returns
+    -------
+    dict: 'coefficients' (space*parameters), 'standard_errors' (space*parameters),
+    'covariance' (space*parameters*parameters), 'residual_variance' (space),
+    'dof' (space), stations with too few observations are NaN
+    """
+    X = np.asarray(X,dtype=float)
+    Y = np.asarray(Y,dtype=float)
+    time_dim,n_params = X.shape
+    mask = np.isfinite(Y)
+    W = mask*1. if weights is None else np.where(mask,np.broadcast_to(weights,Y.shape),0.)
+    Y = np.where(mask,Y,0.)
+    
+    # stacked normal equations, X^T W X via (time x parameters^2) products
+    XX = (X[:,:,np.newaxis]*X[:,np.newaxis,:]).reshape(time_dim,n_params**2)
+    XtWX = np.matmul(W.T,XX).reshape(-1,n_params,n_params)
+    XtWy = np.matmul((W*Y).T,X)
+    
+    dof = mask.sum(axis=0)-n_params
+    solvable = (dof > 0) & (np.linalg.matrix_rank(XtWX) == n_params)
+    XtWX_inverse = np.full(XtWX.shape,np.nan)
+    XtWX_inverse[solvable] = np.linalg.inv(XtWX[solvable])
+    coefficients = np.matmul(XtWX_inverse,XtWy[:,:,np.newaxis])[:,:,0]
+    
+    if residual_variance is None:
+        residuals = Y-np.matmul(X,np.where(solvable[:,np.newaxis],coefficients,0.).T)
+        residual_variance = np.where(solvable,(W*residuals**2).sum(axis=0)/np.maximum(dof,1),np.nan)
+    residual_variance = np.asarray(residual_variance,dtype=float)
+    covariance = XtWX_inverse*residual_variance[:,np.newaxis,np.newaxis]
+    return {'coefficients':coefficients,
+            'standard_errors':np.sqrt(np.diagonal(covariance,axis1=1,axis2=2)),
+            'covariance':covariance,
+            'residual_variance':residual_variance,
+            'dof':dof}
+
 def compute_analytical_uncertainties(data_set_synt):
-    X = np.array([data_set_synt['time_series'].values-19,data_set_synt['pc_timeseries'].values]).T # Design matrix
-    residual_variance = ((data_set_synt['data_with_noise']-data_set_synt['data'])**2).sum(dim='time')/(data_set_synt['data_with_noise'].count(dim='time').values - X.shape[1])
-    XtX_inverse = np.linalg.inv(np.dot(X.T, X))
-
-    errors_=[]
-    for i in np.arange(len(residual_variance)):
-        var_cov_matrix = float(residual_variance[i]) * XtX_inverse
-        coeff_standard_errors = np.sqrt(np.diag(var_cov_matrix))
-        errors_.append(coeff_standard_errors)
-    data_set_synt['trend_un'] = copy.deepcopy(data_set_synt['trend']*0)+np.asarray(errors_)[:,0]
-    data_set_synt['eof_un'] = copy.deepcopy(data_set_synt['eof']*0)+np.asarray(errors_)[:,1]
-    return data_set_synt
\ No newline at end of file
+    """least-squares trends and EOF amplitudes and their standard errors
+    
+    Fits the known trend and all PC time series ('pcs', pc*time) to every 
+    station, accounting for the missing data of each station. The residual 
+    variance is computed from the known noise. Adds 'trend_un', 'eofs_un' 
+    (standard errors, pc*x) and the least-squares estimates 'trend_ls', 
+    'eofs_ls' to the dataset, 'eof_un' and 'eof_ls' are those of the first PC.
+    """
+    reference_epoch = data_set_synt.attrs.get('reference_epoch',19)
+    if 'pcs' in data_set_synt:
+        pcs = data_set_synt['pcs'].transpose('pc','time').values
+    else:
+        pcs = data_set_synt['pc_timeseries'].values[np.newaxis,:]
+    X = np.concatenate([[data_set_synt['time_series'].values-reference_epoch],pcs]).T # Design matrix
+    Y = data_set_synt['data_with_noise'].transpose('time','x').values
+    noise = (data_set_synt['data_with_noise']-data_set_synt['data']).transpose('time','x').values
+    # stations with too few observations are NaN (as in batched_least_squares)
+    dof = np.isfinite(Y).sum(axis=0) - X.shape[1]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        residual_variance = np.where(dof > 0,np.nansum(noise**2,axis=0)/dof,np.nan)
+    
+    fit = batched_least_squares(X,Y,residual_variance=residual_variance)
+    data_set_synt['trend_un'] = copy.deepcopy(data_set_synt['trend']*0)+fit['standard_errors'][:,0]
+    data_set_synt['trend_ls'] = copy.deepcopy(data_set_synt['trend']*0)+fit['coefficients'][:,0]
+    data_set_synt['eofs_un'] = (['pc','x'],fit['standard_errors'][:,1:].T)
+    data_set_synt['eofs_ls'] = (['pc','x'],fit['coefficients'][:,1:].T)
+    data_set_synt['eof_un'] = copy.deepcopy(data_set_synt['eof']*0)+fit['standard_errors'][:,1]
+    data_set_synt['eof_ls'] = copy.deepcopy(data_set_synt['eof']*0)+fit['coefficients'][:,1]
+    return data_set_synt
@@ -92,6 +92,7 @@ if __name__ == "__main__":
         # Also see MANIFEST.in
         # package_data={'docs': ['*']},
         include_package_data=True,
+        package_data={'bpca': ['colormaps.json']},
         classifiers=classifiers,
         python_requires=">=3.7",
         install_requires=install_reqs,
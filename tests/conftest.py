@@ -0,0 +1,46 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+import xarray as xr
+
+
+def synthetic_field(time_dim=40,space_dim=6,seed=0):
+    """
+    one random-walk component, trends, offsets and white noise (time*space DataArray)
+    """
+    rng = np.random.default_rng(seed)
+    time_ = np.arange(time_dim)
+    pc = np.cumsum(rng.normal(0.,0.3,time_dim))
+    values = (pc[:,np.newaxis]*rng.normal(1.,0.3,space_dim) + 0.02*time_[:,np.newaxis]*rng.normal(1.,0.2,space_dim) +
+              rng.normal(0.,1.,space_dim) + rng.normal(0.,0.1,(time_dim,space_dim)))
+    return xr.DataArray(values,dims=('time','x'),coords={'time':time_,'x':np.arange(space_dim)})
+
+@pytest.fixture
+def field():
+    return synthetic_field
+
+@pytest.fixture
+def run_settings():
+    """
+    short, sequential runs (compress() needs at least 100 draws)
+    """
+    return {'n_samples':100,'compress':True,'resource_settings':{'manage':False},
+            'sample_settings':{'tune':100,'chains':2,'cores':1,'progressbar':False,'return_inferencedata':True,
+                               'random_seed':[1,2],'compute_convergence_checks':False}}
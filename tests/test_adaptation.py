@@ -0,0 +1,65 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+pm = pytest.importorskip('pymc3')
+
+from bpca.bpca import bpca
+
+MODEL_SETTINGS = {'number_of_pcs':1,'estimate_offsets':True,'trend_factor_sigma':0.1}
+NORMALIZATION_SETTINGS = {'center':'station','scale':'station'}
+
+
+def test_adaptation_state_round_trip(field,run_settings,tmp_path):
+    data = field()
+    run_settings['adjust_pca_symmetry'] = True
+    model = bpca(data,run_settings=run_settings,model_settings=MODEL_SETTINGS,
+                 normalization_settings=NORMALIZATION_SETTINGS,name='first')
+    # keep the raw chains, the state has to be exported before the symmetry adjustment
+    raw = {}
+    adjust_pca_symmetry = model.adjust_pca_symmetry
+    def adjust():
+        raw['posterior'] = model.trace.posterior.copy(deep=True)
+        adjust_pca_symmetry()
+    model.adjust_pca_symmetry = adjust
+    model.run()
+    state = model.adaptation_state
+    assert np.allclose(state['chains']['mean']['PC0'],raw['posterior']['PC0'].mean(dim='draw').values)
+    assert np.allclose(state['chains']['var']['W0'],raw['posterior']['W0'].var(dim='draw').values)
+    assert np.allclose(state['chains']['mean']['sigma_log__'],np.log(raw['posterior']['sigma']).mean(dim='draw').values)
+    assert np.isclose(state['step_size'],np.mean(state['chains']['step_size']))
+
+    save_dir = str(tmp_path)+'/'
+    model.save(save_dir,kind='adaptation')
+    second_settings = dict(run_settings,adaptation_state=save_dir+'first.adaptation',
+                           adaptation_settings={'tune':20})
+    second = bpca(data,run_settings=second_settings,model_settings=MODEL_SETTINGS,
+                  normalization_settings=NORMALIZATION_SETTINGS,name='second')
+    with second.model:
+        step,sample_settings = second._adapted_step(save_dir+'first.adaptation')
+    n = second.model.ndim
+    assert np.isclose(step.step_size,state['step_size'])
+    # diagonal potential: velocity = variance * momentum
+    assert np.allclose(step.potential.velocity(np.ones(n)),second.model.dict_to_array(state['var']))
+
+    second.run()
+    assert second.compressed
+    assert second.run_report.sampler['draws'] == run_settings['n_samples']
+    assert second.adaptation_state is not None
@@ -0,0 +1,65 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+pm = pytest.importorskip('pymc3')
+
+from bpca.bpca import bpca
+
+
+def adaptive_model(data,run_settings,adaptive_settings):
+    run_settings = dict(run_settings,adaptive_sampling=True,compress=False,
+                        adaptive_settings=dict({'increment':100},**adaptive_settings))
+    model = bpca(data,run_settings=run_settings,model_settings={'number_of_pcs':1,'trend_factor_sigma':0.1},
+                 normalization_settings={'center':'station','scale':'station'})
+    model.run()
+    return model
+
+def test_early_stop(field,run_settings):
+    model = adaptive_model(field(),run_settings,{'r_hat':10.,'ess_bulk':1.,'max_samples':1000})
+    stats = model.adaptive_sampling_stats
+    assert stats['converged']
+    assert len(model.trace.posterior.draw) == 100
+    assert stats['draw_time'] > 0
+    assert all(np.isclose(stats['ess_per_second'][var],stats['ess_bulk'][var]/stats['draw_time']) for var in stats['ess_bulk'])
+
+def test_max_samples(field,run_settings):
+    model = adaptive_model(field(),run_settings,{'ess_bulk':1e9,'max_samples':250})
+    stats = model.adaptive_sampling_stats
+    assert not stats['converged']
+    trace = model.trace
+    assert len(trace.posterior.chain) == 2
+    assert len(trace.posterior.draw) == 200
+    # the continued chains keep the final step size of their adaptation
+    step_size = trace.sample_stats['step_size'].values
+    assert np.allclose(step_size[:,100:],step_size[:,99:100])
+    assert np.all(np.isfinite(trace.posterior['PC0'].values))
+    # the run report refers to the same draw time
+    sampler = model.run_report.sampler
+    assert np.isclose(sampler['draws_wall_time'],stats['draw_time'])
+    for var,ess in stats['ess_per_second'].items():
+        assert np.isclose(sampler['ess_per_second'][var],ess)
+
+def test_time_budget(field,run_settings):
+    model = adaptive_model(field(),run_settings,{'ess_bulk':1e9,'max_samples':1000,'time_budget':1e-6})
+    stats = model.adaptive_sampling_stats
+    assert not stats['converged']
+    assert len(model.trace.posterior.draw) == 100
+    assert stats['draw_time']*2 > 1e-6
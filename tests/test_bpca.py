@@ -0,0 +1,109 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from bpca.bpca import (decimal_year_to_datetime,mjd_to_datetime,read_tenv3,
+                       observation_statistics,sparse_observations)
+
+TENV3_HEADER = ('site YYMMMDD yyyy.yyyy __MJD week d reflon _e0(m) __east(m) ____n0(m) _north(m) '
+                'u0(m) ____up(m) _ant(m) sig_e(m) sig_n(m) sig_u(m) __corr_en __corr_eu __corr_nu '
+                '_latitude(deg) _longitude(deg) __height(m)')
+
+
+def test_decimal_year_to_datetime():
+    times = decimal_year_to_datetime([2021.,2020.5,2019.5,1969.25])
+    expected = np.array(['2021-01-01','2020-07-02','2019-07-02T12:00','1969-04-02T06:00'],dtype='datetime64[ns]')
+    assert np.array_equal(times,expected)
+
+def test_mjd_to_datetime():
+    times = mjd_to_datetime([0.,51544.5,59945.25])
+    expected = np.array(['1858-11-17','2000-01-01T12:00','2023-01-01T06:00'],dtype='datetime64[ns]')
+    assert np.array_equal(times,expected)
+
+def write_tenv3(file,mjd,up,lat=53.5,lon=8.1):
+    lines = [TENV3_HEADER]
+    for mjd_,up_ in zip(mjd,up):
+        columns = ['STAT','23JAN01','2023.0000',str(mjd_),'2243','0','8.1','0','0.1','0','0.2','0',
+                   repr(up_),'0','0.001','0.001','0.003','0','0','0',str(lat),str(lon),'40.0']
+        lines.append(' '.join(columns))
+    with open(file,'w') as file_:
+        file_.write('\n'.join(lines)+'\n')
+
+def test_read_tenv3_columns(tmp_path):
+    file = str(tmp_path/'STAT.tenv3')
+    # two epochs on the first day, a gap on the third
+    mjd = [59945.,59945.5,59946.,59948.]
+    up = [0.1,0.3,0.5,0.7]
+    write_tenv3(file,mjd,up)
+
+    data = read_tenv3(file)
+    assert data.name == '____up(m)'
+    assert data.attrs == {'lat':53.5,'lon':8.1}
+    assert list(data.index) == list(pd.date_range('2023-01-01','2023-01-04',freq='D'))
+    assert np.allclose(data.values,[0.2,0.5,np.nan,0.7],equal_nan=True)
+
+    data = read_tenv3(file,resample=None)
+    assert np.array_equal(data.index.values,mjd_to_datetime(mjd))
+    assert np.allclose(data.values,up)
+
+    # columns by index
+    data = read_tenv3(file,variable=8)
+    assert data.name == '__east(m)'
+    assert np.allclose(data.dropna().values,0.1)
+
+
+def random_field(time_dim=60,space_dim=7,seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(rng.normal(0.,5.,space_dim),rng.uniform(0.5,2.,space_dim),(time_dim,space_dim))
+    values[rng.uniform(size=values.shape) < 0.3] = np.nan
+    # a station without observations
+    values[:,-1] = np.nan
+    return xr.DataArray(values,dims=('time','x'),coords={'time':np.arange(time_dim),'x':np.arange(space_dim)})
+
+def reference_statistics(values):
+    count = np.isfinite(values).sum(axis=0)
+    time_index = np.where(np.isfinite(values),np.arange(values.shape[0])[:,np.newaxis],-1)
+    first = np.where(count > 0,np.where(time_index >= 0,time_index,values.shape[0]).min(axis=0),-1)
+    return {'count':count,'first':first,'last':time_index.max(axis=0)}
+
+@pytest.mark.parametrize('chunk_size',[1,7,25,None])
+def test_observation_statistics_blocks(chunk_size):
+    data = random_field()
+    values = data.values
+    statistics = observation_statistics(data,chunk_size=chunk_size)
+    reference = reference_statistics(values)
+    for key in ['count','first','last']:
+        assert np.array_equal(statistics[key],reference[key])
+    observed = values[:,:-1]
+    assert np.allclose(statistics['mean'][:-1],np.nanmean(observed,axis=0))
+    assert np.allclose(statistics['std'][:-1],np.nanstd(observed,axis=0))
+    assert np.isnan(statistics['mean'][-1]) and np.isnan(statistics['std'][-1])
+
+def test_observation_statistics_sparse():
+    data = random_field()
+    time_index,space_index = np.nonzero(np.isfinite(data.values))
+    sparse = sparse_observations(time_index,space_index,data.values[time_index,space_index],
+                                 data.time.values,space_dim=data.shape[1])
+    dense = observation_statistics(data,chunk_size=9)
+    statistics = observation_statistics(sparse)
+    for key in dense:
+        assert np.allclose(statistics[key],dense[key],equal_nan=True)
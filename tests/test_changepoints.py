@@ -0,0 +1,93 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from bpca.changepoints import _binary_segmentation,prescreen_changepoints,changepoint_events
+
+
+def steps(n_stations=3,time_dim=120,seed=4):
+    """
+    noisy series with offsets at different epochs per station (one station without offsets)
+    """
+    rng = np.random.default_rng(seed)
+    x = np.tile(np.arange(time_dim,dtype=float),(n_stations,1))
+    y = rng.normal(0.,0.2,(n_stations,time_dim))
+    y[0,40:] += 3.
+    y[1,30:] += 2.
+    y[1,85:] -= 4.
+    return x,y
+
+def test_binary_segmentation():
+    x,y = steps()
+    mask = np.ones(y.shape,dtype=bool)
+    residuals = y-y.mean(axis=1,keepdims=True)
+    threshold = 3*0.2**2*np.log(y.shape[1])*np.ones(len(y))
+    factor = np.ones(y.shape)
+    is_start = _binary_segmentation(x,residuals,mask,threshold,factor,max_changepoints=5,min_size=5)
+    assert is_start.shape == (3,y.shape[1]+1)
+    assert np.array_equal(np.nonzero(is_start[0])[0],[0,40,120])
+    assert np.array_equal(np.nonzero(is_start[1])[0],[0,30,85,120])
+    assert np.array_equal(np.nonzero(is_start[2])[0],[0,120])
+
+    # at most max_changepoints and segments of at least min_size
+    is_start = _binary_segmentation(x,residuals,mask,threshold,factor,max_changepoints=1,min_size=5)
+    assert np.array_equal(np.nonzero(is_start[1])[0],[0,85,120])
+    is_start = _binary_segmentation(x,residuals,mask,threshold,factor,max_changepoints=5,min_size=50)
+    # the largest offset (at 85) is closest to the last admissible split
+    assert np.array_equal(np.nonzero(is_start[1])[0],[0,70,120])
+
+def test_prescreen_changepoints():
+    x,y = steps()
+    # a trend does not produce changepoints
+    y = y+0.01*x
+    result = prescreen_changepoints(x,y,max_changepoints=3)
+    assert np.array_equal(result['n_changepoints'],[1,2,0])
+    assert np.allclose(result['positions'][0,:1],39.5)
+    assert np.allclose(result['positions'][1,:2],[29.5,84.5])
+    assert np.allclose(result['offsets'][0,:1],3.,atol=0.2)
+    assert np.allclose(result['offsets'][1,:2],[2.,-4.],atol=0.2)
+    assert np.all(np.isnan(result['positions'][2]))
+
+def test_changepoint_events():
+    rng = np.random.default_rng(5)
+    n_chains,n_draws = 2,200
+    shape = (n_chains,n_draws,2,3)
+    # station 0: a changepoint at 40 in all draws, station 1: at 30 in 70 % of the draws
+    positions = rng.uniform(0.,120.,shape)
+    offsets = rng.normal(0.,0.1,shape)
+    mult = np.zeros(shape)
+    positions[:,:,0,0] = rng.normal(40.,0.5,shape[:2])
+    offsets[:,:,0,0] = rng.normal(3.,0.1,shape[:2])
+    mult[:,:,0,0] = 1.
+    positions[:,:,1,1] = rng.normal(30.,0.5,shape[:2])
+    offsets[:,:,1,1] = rng.normal(2.,0.1,shape[:2])
+    mult[:,:,1,1] = rng.uniform(size=shape[:2]) < 0.7
+    trace = {'positions':positions,'offsets':offsets,'mult':mult}
+
+    events = changepoint_events(trace,bandwidth=2.)
+    assert np.array_equal(events['station'],[0,1])
+    assert np.allclose(events['time'],[40.,30.],atol=0.2)
+    assert np.allclose(events['probability'],[1.,mult[:,:,1,1].mean()])
+    assert np.allclose(events['offset'],[3.,2.],atol=0.05)
+    assert np.all(events['time_lower'] < events['time']) and np.all(events['time'] < events['time_upper'])
+    assert np.all(events['offset_lower'] < events['offset']) and np.all(events['offset'] < events['offset_upper'])
+
+    assert len(changepoint_events(trace,bandwidth=2.,min_probability=0.9)['station']) == 1
+    trace['mult'] = np.zeros(shape)
+    assert all(len(values) == 0 for values in changepoint_events(trace).values())
@@ -0,0 +1,53 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pm = pytest.importorskip('pymc3')
+tensor = pytest.importorskip('theano.tensor')
+
+from bpca.models import ar1_conditional,discotimes_model
+from bpca.observed import observed_series
+
+
+def test_ar1_conditional_regular():
+    rng = np.random.default_rng(2)
+    x = np.arange(50,dtype=float)
+    mu = 0.05*x
+    y = mu + rng.normal(0.,0.5,len(x))
+    phi,sigma = 0.6,0.3
+    dt = np.concatenate([[0.],np.diff(x)])
+    mu_cond,sigma_cond = ar1_conditional(mu,y,dt,phi,sigma)
+    # pm.AR (flat init) conditions on the first observation
+    conditional = pm.Normal.dist(mu=mu_cond[1:],sigma=sigma_cond[1:]).logp(y[1:]).sum().eval()
+    reference = pm.AR.dist([phi],sigma=sigma).logp(tensor.as_tensor_variable(y-mu)).eval()
+    assert np.isclose(conditional,reference)
+
+def test_discotimes_ar1():
+    rng = np.random.default_rng(3)
+    time = pd.date_range('2000-01-01',periods=48,freq='MS').values
+    observed = observed_series(time,rng.normal(0.,1.,len(time)))
+    model = discotimes_model(observed=observed,AR1=True)
+    assert 'AR1_coeff' in model.named_vars and 'Y_obs' not in model.named_vars
+    assert isinstance(model['beta'].distribution,pm.HalfNormal)
+    model = discotimes_model(observed=observed,AR1='exact')
+    assert 'Y_obs' in model.named_vars and 'AR1_coeff' not in model.named_vars
+    assert isinstance(model['beta'].distribution,pm.Uniform)
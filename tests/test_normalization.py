@@ -0,0 +1,84 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bpca.bpca import sparse_observations
+from bpca.normalization import normalizer
+
+SETTINGS = [{'center':'station'},
+            {'center':'station','scale':'station'},
+            {'detrend':True,'scale':'station'},
+            {'center':'group','scale':'group','group_index':np.array([0,0,1,1,1,2])},
+            {'detrend':True,'scale':'global','outlier_threshold':5.}]
+
+
+def field(time_dim=80,space_dim=6,seed=1):
+    rng = np.random.default_rng(seed)
+    time_ = np.arange(time_dim)[:,np.newaxis]
+    values = (rng.normal(100.,20.,space_dim) + time_*rng.normal(0.,0.2,space_dim) +
+              rng.normal(0.,1.,(time_dim,space_dim))*rng.uniform(0.5,3.,space_dim))
+    values[rng.uniform(size=values.shape) < 0.2] = np.nan
+    return xr.DataArray(values,dims=('time','x'),coords={'time':np.arange(time_dim),'x':np.arange(space_dim)})
+
+@pytest.mark.parametrize('settings',SETTINGS)
+def test_round_trip(settings):
+    data = field()
+    transformer = normalizer(**settings)
+    normalized = transformer.fit_transform(data)
+    # observations kept by the outlier rejection
+    mask = np.isfinite(normalized.values)
+    if settings.get('scale') == 'station':
+        assert np.allclose(np.nanstd(normalized.values,axis=0),1.)
+    restored = transformer.inverse_transform(normalized)
+    assert np.allclose(restored.values[mask],data.values[mask])
+
+@pytest.mark.parametrize('settings',SETTINGS)
+def test_round_trip_sparse(settings):
+    data = field()
+    time_index,space_index = np.nonzero(np.isfinite(data.values))
+    sparse = sparse_observations(time_index,space_index,data.values[time_index,space_index],data.time.values)
+    transformer = normalizer(**settings)
+    normalized = transformer.fit_transform(sparse)
+    dense = normalizer(**settings).fit_transform(data)
+    assert np.allclose(normalized.values,dense.values[normalized.time_index,normalized.space_index])
+    restored = transformer.inverse_transform(normalized.values,normalized.time_index,normalized.space_index)
+    assert np.allclose(restored,data.values[normalized.time_index,normalized.space_index])
+
+@pytest.mark.parametrize('chunk_size',[1,4])
+def test_blocks(chunk_size):
+    data = field()
+    transformer = normalizer(detrend=True,scale='station',chunk_size=chunk_size).fit(data)
+    reference = normalizer(detrend=True,scale='station').fit(data)
+    lazy = normalizer(detrend=True,scale='station').fit(data.chunk({'x':2}))
+    for name in ['center','slope','scale']:
+        assert np.allclose(transformer.statistics[name],reference.statistics[name])
+        assert np.allclose(lazy.statistics[name],reference.statistics[name])
+
+def test_inverse_trend():
+    data = field()
+    transformer = normalizer(detrend=True,scale='station').fit(data)
+    # the detrended series have zero trends, a unit trend is one scale per time step
+    assert np.allclose(transformer.inverse_trend(np.zeros(data.shape[1])),transformer.statistics['slope'])
+    assert np.allclose(transformer.inverse_trend(np.ones(data.shape[1]),std=True),transformer.statistics['scale'])
+
+def test_unknown_settings():
+    with pytest.raises(TypeError):
+        normalizer(centre='station')
@@ -0,0 +1,118 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import types
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bpca.bpca import bpca,sparse_observations
+from bpca.normalization import normalizer
+
+
+def fitted_bpca(data,normalization_settings):
+    """
+    compressed bpca object of data, posterior means from least squares on the normalized data
+    """
+    time_dim,space_dim = data.shape
+    model = bpca.__new__(bpca)
+    model.normalization_settings = normalization_settings
+    model.normalizer = normalizer(**normalization_settings)
+    model.dataset = model.normalizer.fit_transform(data)
+    model.model_settings = {'number_of_pcs':1,'model_trend':True,'estimate_offsets':False,
+                            'trend_factor_sigma':1e3,'cluster_index':normalization_settings.get('group_index')}
+    model.compressed = True
+
+    pc = np.sin(np.arange(time_dim)/7.)
+    trend_series = np.linspace(-time_dim/2-6,time_dim-1-time_dim/2-6,time_dim)
+    X = np.stack([pc,trend_series],axis=1)
+    coefficients = np.linalg.lstsq(X,model.dataset.values,rcond=None)[0]
+    posterior = xr.Dataset({'PC0':(['chain','time'],pc[np.newaxis]),
+                            'W0':(['chain','x'],coefficients[0][np.newaxis]),
+                            'trend_g':(['chain','x'],coefficients[1][np.newaxis]),
+                            'sigma_eof':(['chain','pc'],[[1e3]]),
+                            'sigma':(['chain'],[1e-4])})
+    model.trace = {op: types.SimpleNamespace(posterior=posterior) for op in ['mean','std']}
+    return model
+
+
+@pytest.mark.parametrize('settings',[{'center':'station','scale':'station'},
+                                     {'detrend':True,'scale':'station'},
+                                     {'center':'group','scale':'group','group_index':np.array([0,0,1,1,1])},
+                                     {'detrend':True,'scale':'global','outlier_threshold':5.}])
+def test_project_fitted_station_round_trip(settings):
+    rng = np.random.default_rng(0)
+    time_dim,space_dim = 150,5
+    pc = np.sin(np.arange(time_dim)/7.)
+    values = (pc[:,np.newaxis]*rng.normal(3.,1.,space_dim) + np.arange(time_dim)[:,np.newaxis]*rng.normal(0.1,0.05,space_dim) +
+              rng.normal(100.,10.,space_dim))
+    data = xr.DataArray(values,dims=('time','x'),coords={'time':np.arange(time_dim),'x':np.arange(space_dim)})
+    model = fitted_bpca(data,settings)
+
+    station = 3
+    cluster_index = settings['group_index'][[station]] if 'group_index' in settings else None
+    projected = model.project_stations(data.isel(x=[station]),cluster_index=cluster_index)
+    trends = model.get_trends()
+    assert np.allclose(projected['mean']['trend_g'].values[0],trends['trend'].values[station],rtol=1e-6,atol=1e-8)
+    # EOF loading per unit PC in physical units
+    scale = model.normalizer.statistics['scale'][station]
+    assert np.allclose(projected['mean']['W0'].values[0],model.trace['mean'].posterior['W0'].values[0,station]*scale)
+
+def test_project_formal_errors():
+    rng = np.random.default_rng(1)
+    time_dim,space_dim = 120,4
+    pc = np.sin(np.arange(time_dim)/7.)
+    values = pc[:,np.newaxis]*rng.normal(3.,1.,space_dim) + rng.normal(10.,1.,space_dim) + rng.normal(0.,0.3,(time_dim,space_dim))
+    values[rng.uniform(size=values.shape) < 0.2] = np.nan
+    data = xr.DataArray(values,dims=('time','x'),coords={'time':np.arange(time_dim),'x':np.arange(space_dim)})
+    errors = data.copy(data=rng.uniform(0.05,2.,data.shape))
+    model = fitted_bpca(data,{'center':'station','scale':'station'})
+
+    projected = model.project_stations(data,errors=errors)
+    # weighted least squares of the normalized series, weights 1/(sigma**2 + errors**2)
+    sigma = float(model.trace['mean'].posterior['sigma'].mean())
+    scale = model.normalizer.statistics['scale']
+    X = np.stack([pc,np.linspace(-time_dim/2-6,time_dim-1-time_dim/2-6,time_dim)],axis=1)
+    for station in range(space_dim):
+        mask = np.isfinite(values[:,station])
+        weights = 1./np.sqrt(sigma**2+(errors.values[mask,station]/scale[station])**2)
+        coefficients = np.linalg.lstsq(X[mask]*weights[:,np.newaxis],model.dataset.values[mask,station]*weights,rcond=None)[0]
+        assert np.allclose(projected['mean']['W0'].values[station],coefficients[0]*scale[station],rtol=1e-4)
+
+    # the same from sparse_observations with errors
+    time_index,space_index = np.nonzero(np.isfinite(values))
+    sparse = sparse_observations(time_index,space_index,values[time_index,space_index],data.time.values,
+                                 errors=errors.values[time_index,space_index])
+    projected_sparse = model.project_stations(sparse)
+    for op in ['mean','std']:
+        for name in projected[op]:
+            assert np.allclose(projected_sparse[op][name].values,projected[op][name].values)
+
+def test_project_unknown_cluster():
+    data = xr.DataArray(np.random.default_rng(2).normal(size=(50,3)),dims=('time','x'),
+                        coords={'time':np.arange(50),'x':np.arange(3)})
+    model = fitted_bpca(data,{'center':'station'})
+    model.model_settings['cluster_index'] = np.array([0,2,2])
+    posterior = model.trace['mean'].posterior
+    posterior['sigma_hier'] = (['chain','sigma_hier_dim_0'],[[0.1,0.2]])
+    projected = model.project_stations(data.isel(x=[1]),cluster_index=np.array([2]))
+    assert np.all(np.isfinite(projected['mean']['W0'].values))
+    for cluster_index in [np.array([1]),np.array([3])]:
+        with pytest.raises(Exception,match='unknown clusters'):
+            model.project_stations(data.isel(x=[1]),cluster_index=cluster_index)
@@ -0,0 +1,95 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bpca.bpca import prune_posterior,prune_adaptation_state
+
+
+def component_posterior(number_of_pcs=3,time_dim=8,space_dim=4):
+    """
+    posterior with the values of component i equal to i
+    """
+    variables = {}
+    for i in range(number_of_pcs):
+        variables['PC'+str(i)] = (['chain','draw','PC'+str(i)+'_dim_0'],np.full((2,5,time_dim),float(i)))
+        variables['W'+str(i)] = (['chain','draw','W'+str(i)+'_dim_0'],np.full((2,5,space_dim),float(i)))
+        variables['W_raw'+str(i)] = (['chain','draw','W_raw'+str(i)+'_dim_0'],np.full((2,5,space_dim),float(i)))
+    for name in ['sigma_eof','ard_lambda','ard_relevance']:
+        variables[name] = (['chain','draw',name+'_dim_0'],np.tile(np.arange(number_of_pcs,dtype=float),(2,5,1)))
+    variables['trend_g'] = (['chain','draw','trend_g_dim_0'],np.ones((2,5,space_dim)))
+    return xr.Dataset(variables,coords={'chain':[0,1],'draw':np.arange(5)})
+
+def test_prune_posterior():
+    posterior = prune_posterior(component_posterior(),np.array([0,2]),3)
+    for variable in ['PC','W','W_raw']:
+        assert variable+'2' not in posterior
+        assert posterior[variable+'1'].dims[-1] == variable+'1_dim_0'
+        assert np.all(posterior[variable+'1'].values == 2.)
+        assert np.all(posterior[variable+'0'].values == 0.)
+    for name in ['sigma_eof','ard_lambda','ard_relevance']:
+        assert np.all(posterior[name].values == [0.,2.])
+    assert posterior['trend_g'].shape == (2,5,4)
+    assert 'PC2_dim_0' not in posterior.coords
+
+def test_prune_adaptation_state():
+    moments = {'PC0':np.zeros(8),'PC1':np.ones(8),'PC2':np.full(8,2.),
+               'W_raw0':np.zeros(4),'W_raw1':np.ones(4),'W_raw2':np.full(4,2.),
+               'sigma_eof_log__':np.arange(3.),'ard_lambda_log__':np.arange(3.),'sigma_log__':np.zeros(4)}
+    chain_moments = {name: np.stack([values,values]) for name,values in moments.items()}
+    state = {'step_size':0.1,'mean':moments,'var':moments,'cov':np.eye(3),
+             'chains':{'step_size':np.array([0.1,0.2]),'mean':chain_moments,'var':chain_moments}}
+    pruned = prune_adaptation_state(state,np.array([2]),3)
+    assert pruned['cov'] is None and pruned['step_size'] == 0.1
+    for moments in [pruned['mean'],pruned['chains']['var']]:
+        assert sorted(moments) == ['PC0','W_raw0','ard_lambda_log__','sigma_eof_log__','sigma_log__']
+        assert np.all(moments['PC0'] == 2.) and np.all(moments['W_raw0'] == 2.)
+        assert np.all(moments['sigma_eof_log__'] == 2.)
+        assert moments['sigma_log__'].shape[-1] == 4
+    # the state is not modified
+    assert sorted(state['mean'])[0] == 'PC0' and len(state['mean']) == 9
+
+def test_prune_components_ard(field,run_settings):
+    pytest.importorskip('pymc3')
+    from bpca.bpca import bpca
+    time_dim,new_steps = 40,10
+    data = field(time_dim+new_steps)
+    model = bpca(data.isel(time=slice(0,time_dim)),run_settings=run_settings,
+                 model_settings={'number_of_pcs':2,'ARD':True,'trend_factor_sigma':0.1},
+                 normalization_settings={'center':'station','scale':'station'})
+    model.run()
+    for variable in ['W_raw0','W_raw1','W0','ard_relevance']:
+        assert variable in model.trace['mean'].posterior
+
+    components = model.prune_components(threshold=1.0)
+    assert components['effective_number_of_pcs'] == 1
+    assert model.model_settings['number_of_pcs'] == 1
+    posterior = model.trace['mean'].posterior
+    assert all(variable not in posterior for variable in ['PC1','W1','W_raw1'])
+    assert posterior['ard_relevance'].shape[-1] == 1
+    assert all(name not in model.adaptation_state['mean'] for name in ['PC1','W_raw1'])
+    assert model.adaptation_state['mean']['ard_lambda_log__'].shape == (1,)
+
+    model.update(data,n_samples=100,tune=50)
+    posterior = model.trace['mean'].posterior
+    assert posterior['PC0'].shape == (2,time_dim+new_steps)
+    assert 'PC1' not in posterior
+    assert np.all(np.isfinite(posterior['W0'].values))
@@ -0,0 +1,52 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+az = pytest.importorskip('arviz')
+
+from bpca.report import draws_wall_time, sampler_statistics
+
+
+def timed_trace(timed=True):
+    rng = np.random.default_rng(0)
+    sample_stats = {'step_size':np.full((2,50),0.1),'diverging':np.zeros((2,50),dtype=bool)}
+    if timed:
+        sample_stats['perf_counter_diff'] = np.stack([np.full(50,0.01),np.full(50,0.02)])
+    return az.from_dict(posterior={'PC0':rng.normal(size=(2,50,10)),'sigma':rng.normal(size=(2,50))},
+                        sample_stats=sample_stats)
+
+def test_draws_wall_time():
+    trace = timed_trace()
+    assert np.isclose(draws_wall_time(trace),1.)
+    assert np.isclose(draws_wall_time(trace,parallel=False),1.5)
+    assert draws_wall_time(timed_trace(timed=False)) is None
+
+def test_ess_per_second_of_draws():
+    # sampling time includes tuning and compilation
+    stats = sampler_statistics(timed_trace(),sampling_time=10.)
+    assert np.isclose(stats['draws_wall_time'],1.)
+    assert np.isclose(stats['tuning_wall_time'],9.)
+    for var,ess in stats['ess_bulk'].items():
+        assert np.isclose(stats['ess_per_second'][var],ess/stats['draws_wall_time'])
+    stats = sampler_statistics(timed_trace(),sampling_time=10.,draw_time=1.5)
+    assert all(np.isclose(stats['ess_per_second'][var],ess/1.5) for var,ess in stats['ess_bulk'].items())
+    # untimed draws
+    stats = sampler_statistics(timed_trace(timed=False),sampling_time=10.)
+    assert all(np.isclose(stats['ess_per_second'][var],ess/10.) for var,ess in stats['ess_bulk'].items())
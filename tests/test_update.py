@@ -0,0 +1,61 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+pm = pytest.importorskip('pymc3')
+
+from bpca.bpca import bpca
+
+
+def test_update_from_compressed(field,run_settings):
+    time_dim,new_steps = 40,10
+    data = field(time_dim+new_steps)
+    model = bpca(data.isel(time=slice(0,time_dim)),run_settings=run_settings,
+                 model_settings={'number_of_pcs':1,'estimate_offsets':True,'trend_factor_sigma':0.1,'AR1':True},
+                 normalization_settings={'center':'station','scale':'station'})
+    model.run()
+    assert model.compressed
+    mean_trace = model.trace['mean'].posterior.mean(dim='chain')
+    std_trace = model.trace['std'].posterior.mean(dim='chain')
+
+    # warm start from the compressed trace without an exported adaptation state
+    model.adaptation_state = None
+    state = model._compressed_adaptation_state()
+    beta,beta_std = float(mean_trace['AR1_beta']),float(std_trace['AR1_beta'])
+    assert np.isclose(state['mean']['AR1_beta_interval__'],np.log(beta/(1-beta)))
+    assert np.isclose(state['var']['AR1_beta_interval__'],(beta_std/(beta*(1-beta)))**2)
+    sigma,sigma_std = float(mean_trace['sigma']),float(std_trace['sigma'])
+    assert np.isclose(state['mean']['sigma_log__'],np.log(sigma))
+    assert np.isclose(state['var']['sigma_log__'],(sigma_std/sigma)**2)
+    assert np.allclose(state['var']['W0'],std_trace['W0'].values**2)
+
+    # PCs extended forward, offsets re-centred on the extended trend axis
+    start = model._warm_start_values(time_dim+new_steps)
+    for chain,point in enumerate(start):
+        chain_trace = model.trace['mean'].posterior.sel(chain=chain)
+        assert point['PC0'].shape == (time_dim+new_steps,)
+        assert np.allclose(point['PC0'][time_dim:],chain_trace['PC0'].values[-1])
+        assert np.allclose(point['offset'],chain_trace['offset'].values+chain_trace['trend_g'].values*new_steps/2.)
+
+    model.update(data,n_samples=100,tune=50)
+    assert model.compressed
+    assert model.dataset.shape == (time_dim+new_steps,data.shape[1])
+    assert model.trace['mean'].posterior['PC0'].shape == (2,time_dim+new_steps)
+    assert np.all(np.isfinite(model.trace['mean'].posterior['trend_g'].values))
@@ -0,0 +1,92 @@
+#    GPLv3 License
+
+#    BPCA: Bayesian Principal Component Analysis
+#    Copyright (C) 2023  Julius Oelsmann
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import warnings
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bpca.utils import batched_least_squares,compute_analytical_uncertainties
+
+
+def design(time_dim=50):
+    time_ = np.arange(time_dim)
+    return np.stack([np.ones(time_dim),time_,np.sin(time_/5.)],axis=1)
+
+@pytest.mark.parametrize('missing',[0.,0.3])
+def test_batched_least_squares(missing):
+    rng = np.random.default_rng(2)
+    X = design()
+    Y = X @ rng.normal(0.,1.,(3,8)) + rng.normal(0.,0.1,(X.shape[0],8))
+    Y[rng.uniform(size=Y.shape) < missing] = np.nan
+    result = batched_least_squares(X,Y)
+    for station in range(Y.shape[1]):
+        mask = np.isfinite(Y[:,station])
+        coefficients,residuals,_,_ = np.linalg.lstsq(X[mask],Y[mask,station],rcond=None)
+        dof = mask.sum()-X.shape[1]
+        assert result['dof'][station] == dof
+        assert np.allclose(result['coefficients'][station],coefficients)
+        assert np.isclose(result['residual_variance'][station],residuals[0]/dof)
+        covariance = np.linalg.inv(X[mask].T @ X[mask])*residuals[0]/dof
+        assert np.allclose(result['covariance'][station],covariance)
+
+def test_batched_least_squares_weights():
+    rng = np.random.default_rng(3)
+    X = design()
+    Y = X @ rng.normal(0.,1.,(3,4)) + rng.normal(0.,0.1,(X.shape[0],4))
+    weights = rng.uniform(0.5,2.,Y.shape)
+    result = batched_least_squares(X,Y,weights=weights)
+    for station in range(Y.shape[1]):
+        # weighted least squares as ordinary least squares of the scaled equations
+        w = np.sqrt(weights[:,station])
+        coefficients = np.linalg.lstsq(X*w[:,np.newaxis],Y[:,station]*w,rcond=None)[0]
+        assert np.allclose(result['coefficients'][station],coefficients)
+
+def test_batched_least_squares_unsolvable():
+    X = design()
+    Y = np.ones((X.shape[0],2))
+    # fewer observations than parameters
+    Y[3:,1] = np.nan
+    result = batched_least_squares(X,Y)
+    assert np.all(np.isfinite(result['coefficients'][0]))
+    assert np.all(np.isnan(result['coefficients'][1]))
+    assert np.isnan(result['residual_variance'][1])
+
+def test_analytical_uncertainties_sparse_stations():
+    rng = np.random.default_rng(4)
+    time_dim,space_dim = 60,5
+    time_series = np.arange(time_dim,dtype=float)
+    pcs = np.stack([np.sin(time_series/5.),np.cos(time_series/11.)])
+    trend,eof = rng.normal(0.,0.1,space_dim),rng.normal(1.,0.3,space_dim)
+    data = (time_series-19)[:,np.newaxis]*trend + pcs[0][:,np.newaxis]*eof
+    data_with_noise = data + rng.normal(0.,0.2,data.shape)
+    # three observations for three parameters, one missing station
+    data_with_noise[3:,3] = np.nan
+    data_with_noise[:,4] = np.nan
+    dataset = xr.Dataset({'time_series':('time',time_series),'pcs':(['pc','time'],pcs),
+                          'data':(['time','x'],data),'data_with_noise':(['time','x'],data_with_noise),
+                          'trend':('x',trend),'eof':('x',eof)})
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        dataset = compute_analytical_uncertainties(dataset)
+    for name in ['trend_un','eof_un','trend_ls']:
+        assert np.all(np.isfinite(dataset[name].values[:3]))
+        assert np.all(np.isnan(dataset[name].values[3:]))
+    assert np.all(np.isnan(dataset['eofs_un'].values[:,3:]))
+    assert np.all(dataset['eofs_un'].values[:,:3] > 0)